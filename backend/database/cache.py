@@ -36,6 +36,17 @@ def _ensure_initialized():
         'get_popular_apps_data',
         lambda keys: [_memory_cache.delete(k) for k in keys]
     )
+    _pubsub_manager.register_callback(
+        'public_conversations_feed',
+        lambda keys: [_memory_cache.delete(k) for k in keys]
+    )
+    # Compiled per-user enabled app sets, 'enabled_apps:*' drops them for every user
+    _pubsub_manager.register_callback(
+        'enabled_apps:*',
+        lambda keys: [
+            _memory_cache.delete_prefix(k[:-1]) if k.endswith('*') else _memory_cache.delete(k) for k in keys
+        ]
+    )
 
     # Start pub/sub subscription
     _pubsub_manager.start()
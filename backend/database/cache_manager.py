@@ -3,27 +3,141 @@ In-memory LRU cache manager for reducing Redis egress costs.
 
 This module provides a thread-safe in-memory cache with:
 - LRU eviction when memory limit reached
-- Per-entry TTL support
-- Memory usage tracking
-- Thread-safe operations
+- Per-entry TTL support, optionally serving stale entries while one thread refreshes them
+- Memory usage tracking, from the serialized payload when known and a sampling estimate otherwise
+- Lock striping: keys are spread over shards, each with its own lock, LRU and share of the memory
+- Singleflight fetches whose per-key state only lives while the fetch runs
+- Optional storage of pre-serialized bytes, decoded on read
 """
 
+import itertools
 import json
 import sys
 import threading
 import time
 from collections import OrderedDict
-from dataclasses import dataclass
-from typing import Any, Callable, Dict, Optional
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+# Containers larger than this are sized from an evenly spaced sample of their items
+SIZE_SAMPLE = 16
+# Nesting below this depth is sized shallowly
+SIZE_MAX_DEPTH = 6
+
+_LEAF_TYPES = (str, bytes, bytearray, int, float, bool, type(None))
+
+
+def estimate_size(obj: Any, sample: int = SIZE_SAMPLE, _depth: int = 0) -> int:
+    """
+    Estimate the memory footprint of obj in bytes, without serializing it.
+
+    Containers larger than `sample` are sized from `sample` of their items and extrapolated, objects whose class
+    defines __sizeof__ report their own size, other objects are sized from their __dict__.
+
+    Args:
+        obj: Object to measure
+        sample: Number of items measured per container
+
+    Returns:
+        Estimated size in bytes
+    """
+    if isinstance(obj, _LEAF_TYPES) or _depth >= SIZE_MAX_DEPTH:
+        return sys.getsizeof(obj)
+
+    if isinstance(obj, dict):
+        count = len(obj)
+        items = obj.items()
+        if count > sample:
+            items = itertools.islice(items, 0, None, count // sample)
+        measured = 0
+        seen = 0
+        for key, value in items:
+            measured += estimate_size(key, sample, _depth + 1) + estimate_size(value, sample, _depth + 1)
+            seen += 1
+        return sys.getsizeof(obj) + (measured * count // seen if seen else 0)
+
+    if isinstance(obj, (list, tuple)):
+        count = len(obj)
+        items = obj[:: count // sample] if count > sample else obj
+        measured = sum(estimate_size(item, sample, _depth + 1) for item in items)
+        return sys.getsizeof(obj) + (measured * count // len(items) if items else 0)
+
+    if isinstance(obj, (set, frozenset)):
+        count = len(obj)
+        items = list(itertools.islice(obj, 0, None, count // sample)) if count > sample else list(obj)
+        measured = sum(estimate_size(item, sample, _depth + 1) for item in items)
+        return sys.getsizeof(obj) + (measured * count // len(items) if items else 0)
+
+    if type(obj).__sizeof__ is not object.__sizeof__:
+        return sys.getsizeof(obj)
+
+    attributes = getattr(obj, '__dict__', None)
+    if isinstance(attributes, dict):
+        return sys.getsizeof(obj) + estimate_size(attributes, sample, _depth + 1)
+    return sys.getsizeof(obj)
+
+
+@dataclass
+class SizedValue:
+    """
+    A value returned by a get_or_fetch fetch function along with its size, e.g. the length of the Redis payload
+    it was decoded from, so the cache doesn't have to estimate it.
+    """
+
+    data: Any
+    size_bytes: int
 
 
 @dataclass
 class CacheEntry:
     """Represents a cache entry with metadata."""
+
     data: Any
     timestamp: float
     size_bytes: int
     ttl: int
+    stale_ttl: int = 0
+    loads: Optional[Callable[[bytes], Any]] = None  # set when data holds pre-serialized bytes
+
+    def is_fresh(self, now: float) -> bool:
+        return now - self.timestamp <= self.ttl
+
+    def value(self) -> Any:
+        return self.loads(self.data) if self.loads else self.data
+
+
+class _Shard:
+    def __init__(self, max_memory_bytes: int):
+        self.max_memory_bytes = max_memory_bytes
+        self.entries: OrderedDict[str, CacheEntry] = OrderedDict()
+        self.lock = threading.Lock()
+        self.current_size = 0
+        # Bumped by deletes, a fetch that started before one doesn't write its result back
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def pop(self, key: str):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.current_size -= entry.size_bytes
+
+    def evict_if_needed(self, required_bytes: int):
+        while self.current_size + required_bytes > self.max_memory_bytes and self.entries:
+            # Remove oldest (first item in OrderedDict)
+            _, entry = self.entries.popitem(last=False)
+            self.current_size -= entry.size_bytes
+            self.evictions += 1
+
+
+@dataclass
+class _Flight:
+    """A running fetch of one key, the callers that find it wait for its result instead of fetching again."""
+
+    done: threading.Event = field(default_factory=threading.Event)
+    result: Any = None
+    error: Optional[BaseException] = None
 
 
 class InMemoryCacheManager:
@@ -31,37 +145,46 @@ class InMemoryCacheManager:
     Thread-safe LRU in-memory cache with size-based eviction.
 
     Features:
-    - LRU eviction when memory limit reached
-    - Per-entry TTL support
+    - LRU eviction when memory limit reached, per shard
+    - Per-entry TTL support, with an optional stale window during which get_or_fetch serves the old value while
+      a background thread refreshes it
     - Memory usage tracking
-    - Thread-safe operations
+    - Thread-safe operations, a lock per shard
 
     Example:
         cache = InMemoryCacheManager(max_memory_mb=100)
         cache.set('key', {'data': 'value'}, ttl=30)
         data = cache.get('key')  # Returns {'data': 'value'} if not expired
+        apps = cache.get_or_fetch('apps', fetch_apps, ttl=30, stale_ttl=60)
     """
 
-    def __init__(self, max_memory_mb: int = 100):
+    def __init__(self, max_memory_mb: int = 100, shards: int = 8):
         """
         Initialize cache manager.
 
         Args:
             max_memory_mb: Maximum memory in MB for cache (default: 100MB)
+            shards: Number of lock stripes, each gets an equal share of the memory (default: 8)
         """
         self.max_memory_bytes = max_memory_mb * 1024 * 1024
-        self.cache: OrderedDict[str, CacheEntry] = OrderedDict()
-        self.lock = threading.RLock()
-        self.current_size = 0
+        self._shards: List[_Shard] = [_Shard(self.max_memory_bytes // shards) for _ in range(shards)]
+
+        # Singleflight: one entry per key being fetched, removed when the fetch ends
+        self._flights: Dict[str, _Flight] = {}
+        self._flights_lock = threading.Lock()
 
         # Stats
-        self.hits = 0
-        self.misses = 0
-        self.evictions = 0
+        self.fetches = 0
+        self.coalesced = 0
+        self.stale_hits = 0
+        self.refreshes = 0
+
+    def _shard(self, key: str) -> _Shard:
+        return self._shards[hash(key) % len(self._shards)]
 
-        # Singleflight: per-key locks to prevent thundering herd
-        self._fetch_locks: Dict[str, threading.Lock] = {}
-        self._fetch_lock_manager = threading.Lock()
+    @property
+    def current_size(self) -> int:
+        return sum(shard.current_size for shard in self._shards)
 
     def get(self, key: str) -> Optional[Any]:
         """
@@ -73,62 +196,140 @@ class InMemoryCacheManager:
         Returns:
             Cached data if exists and not expired, None otherwise
         """
-        with self.lock:
-            if key not in self.cache:
-                self.misses += 1
-                return None
+        entry = self._get_entry(key, allow_stale=False)
+        return entry.value() if entry is not None else None
 
-            entry = self.cache[key]
+    def get_serialized(self, key: str) -> Optional[bytes]:
+        """
+        Get the bytes of an entry stored with set_serialized, without decoding them.
 
-            # Check TTL
-            if time.time() - entry.timestamp > entry.ttl:
-                self._delete_locked(key)
-                self.misses += 1
+        Args:
+            key: Cache key
+
+        Returns:
+            The stored bytes if exists, not expired and pre-serialized, None otherwise
+        """
+        entry = self._get_entry(key, allow_stale=False)
+        if entry is None or entry.loads is None:
+            return None
+        return entry.data
+
+    def _get_entry(self, key: str, allow_stale: bool) -> Optional[CacheEntry]:
+        shard = self._shards[hash(key) % len(self._shards)]
+        now = time.time()
+        with shard.lock:
+            entry = shard.entries.get(key)
+            if entry is None:
+                shard.misses += 1
                 return None
 
+            # Check TTL, an entry in its stale window stays for get_or_fetch
+            age = now - entry.timestamp
+            if age > entry.ttl:
+                if age > entry.ttl + entry.stale_ttl:
+                    shard.pop(key)
+                    shard.misses += 1
+                    return None
+                if not allow_stale:
+                    shard.misses += 1
+                    return None
+
             # Move to end (LRU)
-            self.cache.move_to_end(key)
-            self.hits += 1
-            return entry.data
+            shard.entries.move_to_end(key)
+            shard.hits += 1
+            return entry
 
-    def get_or_fetch(self, key: str, fetch_fn: Callable[[], Any], ttl: int = 30) -> Any:
+    def get_or_fetch(self, key: str, fetch_fn: Callable[[], Any], ttl: int = 30, stale_ttl: int = 0) -> Any:
         """
         Get from cache or fetch with singleflight pattern.
 
-        Only ONE concurrent request will call fetch_fn, others wait.
+        Only ONE concurrent request will call fetch_fn, others wait for its result (or its exception).
         This prevents the thundering herd problem.
 
         Args:
             key: Cache key
-            fetch_fn: Function to call if cache miss (should return data)
+            fetch_fn: Function to call if cache miss (should return data, or a SizedValue)
             ttl: Time to live in seconds (default: 30)
+            stale_ttl: Seconds past the TTL during which the old value is returned while a background thread
+                refetches it (default: 0, expired entries are fetched by the caller)
 
         Returns:
             Cached or fetched data
         """
         # Fast path: cache hit
-        if (value := self.get(key)) is not None:
-            return value
-
-        # Get or create lock for this key
-        with self._fetch_lock_manager:
-            if key not in self._fetch_locks:
-                self._fetch_locks[key] = threading.Lock()
-            fetch_lock = self._fetch_locks[key]
-
-        # Only one request fetches, others wait
-        with fetch_lock:
-            # Double-check after acquiring lock (another thread may have fetched)
-            if (value := self.get(key)) is not None:
-                return value
-
-            # Fetch and cache
-            value = fetch_fn()
-            if value is not None:
-                self.set(key, value, ttl=ttl)
-            return value
-
-    def set(self, key: str, data: Any, ttl: int = 30):
+        entry = self._get_entry(key, allow_stale=True)
+        if entry is not None:
+            if not entry.is_fresh(time.time()):
+                self._refresh_in_background(key, fetch_fn, ttl, stale_ttl)
+            return entry.value()
+
+        with self._flights_lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = self._fetch(key, fetch_fn, ttl, stale_ttl)
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            self._end_flight(key, flight)
+        return flight.result
+
+    def _fetch(self, key: str, fetch_fn: Callable[[], Any], ttl: int, stale_ttl: int) -> Any:
+        # Double-check, the previous fetch may have ended between the cache miss and taking the flight
+        entry = self._get_entry(key, allow_stale=False)
+        if entry is not None:
+            return entry.value()
+
+        shard = self._shard(key)
+        generation = shard.generation
+        with self._flights_lock:
+            self.fetches += 1
+        value = fetch_fn()
+        size_bytes = None
+        if isinstance(value, SizedValue):
+            value, size_bytes = value.data, value.size_bytes
+        if value is not None:
+            self._store(key, value, ttl, stale_ttl, size_bytes, generation=generation)
+        return value
+
+    def _end_flight(self, key: str, flight: _Flight):
+        with self._flights_lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        flight.done.set()
+
+    def _refresh_in_background(self, key: str, fetch_fn: Callable[[], Any], ttl: int, stale_ttl: int):
+        with self._flights_lock:
+            self.stale_hits += 1
+            if key in self._flights:
+                return
+            flight = self._flights[key] = _Flight()
+            self.refreshes += 1
+
+        def _refresh():
+            try:
+                flight.result = self._fetch(key, fetch_fn, ttl, stale_ttl)
+            except Exception as e:
+                flight.error = e
+                print(f'InMemoryCacheManager: refreshing {key} failed, serving the stale value: {e}')
+            finally:
+                self._end_flight(key, flight)
+
+        threading.Thread(target=_refresh, name=f'cache-refresh-{key}', daemon=True).start()
+
+    def set(self, key: str, data: Any, ttl: int = 30, size_bytes: Optional[int] = None, stale_ttl: int = 0):
         """
         Set cache entry with automatic eviction if needed.
 
@@ -136,87 +337,102 @@ class InMemoryCacheManager:
             key: Cache key
             data: Data to cache
             ttl: Time to live in seconds (default: 30)
+            size_bytes: Size of data when known, e.g. the length of the payload it was decoded from
+                (default: estimated)
+            stale_ttl: Seconds past the TTL during which get_or_fetch may serve it (default: 0)
         """
-        with self.lock:
-            # Calculate size
-            size_bytes = self._calculate_size(data)
-
-            # Remove old entry if exists
-            if key in self.cache:
-                self._delete_locked(key)
-
-            # Evict if needed
-            self._evict_if_needed(size_bytes)
-
-            # Add new entry
-            entry = CacheEntry(
-                data=data,
-                timestamp=time.time(),
-                size_bytes=size_bytes,
-                ttl=ttl
-            )
-            self.cache[key] = entry
-            self.current_size += size_bytes
+        self._store(key, data, ttl, stale_ttl, size_bytes)
 
-    def delete(self, key: str):
+    def set_serialized(
+        self, key: str, payload: bytes, ttl: int = 30, loads: Callable[[bytes], Any] = json.loads, stale_ttl: int = 0
+    ):
         """
-        Delete cache entry.
+        Store pre-serialized bytes, decoded with `loads` on every get. Trades CPU per read for a much smaller
+        footprint than the decoded objects, for large values that are read rarely.
 
         Args:
             key: Cache key
+            payload: Serialized data, e.g. the raw Redis value or a zlib-compressed JSON
+            ttl: Time to live in seconds (default: 30)
+            loads: Decoder applied by get (default: json.loads)
+            stale_ttl: Seconds past the TTL during which get_or_fetch may serve it (default: 0)
         """
-        with self.lock:
-            self._delete_locked(key)
-
-    def clear(self):
-        """Clear all cache entries."""
-        with self.lock:
-            self.cache.clear()
-            self.current_size = 0
-            self.hits = 0
-            self.misses = 0
-            self.evictions = 0
+        self._store(key, bytes(payload), ttl, stale_ttl, len(payload), loads=loads)
+
+    def _store(
+        self,
+        key: str,
+        data: Any,
+        ttl: int,
+        stale_ttl: int,
+        size_bytes: Optional[int],
+        loads: Optional[Callable[[bytes], Any]] = None,
+        generation: Optional[int] = None,
+    ):
+        # Sized outside of the lock, readers of the shard don't wait for it
+        if size_bytes is None:
+            size_bytes = estimate_size(data)
+        size_bytes += sys.getsizeof(key)
+        entry = CacheEntry(
+            data=data, timestamp=time.time(), size_bytes=size_bytes, ttl=ttl, stale_ttl=stale_ttl, loads=loads
+        )
+
+        shard = self._shard(key)
+        with shard.lock:
+            if generation is not None and generation != shard.generation:
+                # Deleted while it was being fetched
+                return
+            # Remove old entry if exists
+            shard.pop(key)
+            # Evict if needed
+            shard.evict_if_needed(size_bytes)
+            shard.entries[key] = entry
+            shard.current_size += size_bytes
 
-    def _delete_locked(self, key: str):
+    def delete(self, key: str):
         """
-        Internal delete (assumes lock is held).
+        Delete cache entry.
 
         Args:
             key: Cache key
         """
-        if key in self.cache:
-            entry = self.cache.pop(key)
-            self.current_size -= entry.size_bytes
+        shard = self._shard(key)
+        with shard.lock:
+            shard.pop(key)
+            shard.generation += 1
 
-    def _evict_if_needed(self, required_bytes: int):
+    def delete_prefix(self, prefix: str) -> int:
         """
-        Evict LRU entries until space available.
+        Delete all cache entries whose key starts with prefix.
 
         Args:
-            required_bytes: Bytes needed for new entry
-        """
-        while (self.current_size + required_bytes > self.max_memory_bytes
-               and len(self.cache) > 0):
-            # Remove oldest (first item in OrderedDict)
-            key, entry = self.cache.popitem(last=False)
-            self.current_size -= entry.size_bytes
-            self.evictions += 1
-
-    def _calculate_size(self, obj: Any) -> int:
-        """
-        Estimate object size in bytes.
-
-        Args:
-            obj: Object to measure
+            prefix: Cache key prefix
 
         Returns:
-            Estimated size in bytes
+            Number of deleted entries
         """
-        if isinstance(obj, (list, dict)):
-            # Serialize to JSON and measure
-            json_str = json.dumps(obj, default=str)
-            return sys.getsizeof(json_str)
-        return sys.getsizeof(obj)
+        deleted = 0
+        for shard in self._shards:
+            with shard.lock:
+                keys = [key for key in shard.entries if key.startswith(prefix)]
+                for key in keys:
+                    shard.pop(key)
+                shard.generation += 1
+                deleted += len(keys)
+        return deleted
+
+    def clear(self):
+        """Clear all cache entries."""
+        for shard in self._shards:
+            with shard.lock:
+                shard.entries.clear()
+                shard.current_size = 0
+                shard.generation += 1
+                shard.hits = 0
+                shard.misses = 0
+                shard.evictions = 0
+        with self._flights_lock:
+            self.fetches = self.coalesced = self.stale_hits = self.refreshes = 0
 
     def get_stats(self) -> dict:
         """
@@ -225,17 +441,30 @@ class InMemoryCacheManager:
         Returns:
             Dictionary with cache stats
         """
-        with self.lock:
-            total_requests = self.hits + self.misses
-            hit_rate = (self.hits / total_requests * 100) if total_requests > 0 else 0
-
-            return {
-                'entries': len(self.cache),
-                'size_mb': round(self.current_size / (1024 * 1024), 2),
-                'max_size_mb': round(self.max_memory_bytes / (1024 * 1024), 2),
-                'utilization': round(self.current_size / self.max_memory_bytes * 100, 2),
-                'hits': self.hits,
-                'misses': self.misses,
-                'hit_rate': round(hit_rate, 2),
-                'evictions': self.evictions
-            }
+        entries = size = hits = misses = evictions = 0
+        for shard in self._shards:
+            with shard.lock:
+                entries += len(shard.entries)
+                size += shard.current_size
+                hits += shard.hits
+                misses += shard.misses
+                evictions += shard.evictions
+        total_requests = hits + misses
+        hit_rate = (hits / total_requests * 100) if total_requests > 0 else 0
+
+        return {
+            'entries': entries,
+            'size_mb': round(size / (1024 * 1024), 2),
+            'max_size_mb': round(self.max_memory_bytes / (1024 * 1024), 2),
+            'utilization': round(size / self.max_memory_bytes * 100, 2),
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hit_rate, 2),
+            'evictions': evictions,
+            'shards': len(self._shards),
+            'fetches': self.fetches,
+            'coalesced': self.coalesced,
+            'stale_hits': self.stale_hits,
+            'refreshes': self.refreshes,
+            'in_flight': len(self._flights),
+        }
@@ -2,15 +2,18 @@ import copy
 import json
 import uuid
 import zlib
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from typing import List, Tuple, Optional, Dict, Any
 
 from google.cloud import firestore
+from google.cloud.exceptions import NotFound
 from google.cloud.firestore_v1 import FieldFilter
 
 import utils.other.hume as hume
-from database import users as users_db
+from database import users as users_db, redis_db
 from models.conversation import (
+    Conversation,
     ConversationPhoto,
     PostProcessingStatus,
     PostProcessingModel,
@@ -25,6 +28,22 @@ from utils.other.storage import list_audio_chunks
 
 conversations_collection = 'conversations'
 
+# Fields read for list views when the transcript is not needed (Firestore projection)
+CONVERSATION_LIST_FIELDS = [
+    field
+    for field in Conversation.model_fields
+    if field not in ('transcript_segments', 'photos', 'plugins_results', 'processing_memory_id')
+]
+PHOTO_HYDRATION_MAX_WORKERS = 16
+
+# Fields of the public feed, list fields without the transcript flag and geolocation
+PUBLIC_CONVERSATION_FIELDS = [
+    field
+    for field in CONVERSATION_LIST_FIELDS
+    if field not in ('transcript_segments_compressed', 'geolocation', 'data_protection_level')
+]
+PUBLIC_CONVERSATIONS_BATCH_SIZE = 100
+
 
 def _ensure_timezone_aware(dt: datetime) -> datetime:
     """
@@ -41,7 +60,9 @@ def _ensure_timezone_aware(dt: datetime) -> datetime:
 # *********************************
 
 
-def _decrypt_conversation_data(conversation_data: Dict[str, Any], uid: str) -> Dict[str, Any]:
+def _decrypt_conversation_data(
+    conversation_data: Dict[str, Any], uid: str, decrypted_payload: Optional[str] = None
+) -> Dict[str, Any]:
     data = copy.deepcopy(conversation_data)
 
     if 'transcript_segments' not in data:
@@ -49,7 +70,8 @@ def _decrypt_conversation_data(conversation_data: Dict[str, Any], uid: str) -> D
 
     if isinstance(data['transcript_segments'], str):
         try:
-            decrypted_payload = encryption.decrypt(data['transcript_segments'], uid)
+            if decrypted_payload is None:
+                decrypted_payload = encryption.decrypt(data['transcript_segments'], uid)
             if data.get('transcript_segments_compressed'):
                 compressed_bytes = bytes.fromhex(decrypted_payload)
                 decompressed_json = zlib.decompress(compressed_bytes).decode('utf-8')
@@ -112,6 +134,32 @@ def _prepare_conversation_for_read(conversation_data: Optional[Dict[str, Any]],
     return data
 
 
+def _prepare_conversations_for_read(conversations: List[Any], uid: str) -> List[Any]:
+    """
+    Bulk variant of _prepare_conversation_for_read: decrypts the transcripts of all enhanced conversations
+    with one key lookup.
+    """
+    indexes = [
+        i
+        for i, conversation in enumerate(conversations)
+        if isinstance(conversation, dict)
+        and conversation.get('data_protection_level') == 'enhanced'
+        and isinstance(conversation.get('transcript_segments'), str)
+    ]
+    payloads = encryption.decrypt_many([conversations[i]['transcript_segments'] for i in indexes], uid)
+    decrypted_payloads = dict(zip(indexes, payloads))
+
+    results = []
+    for i, conversation in enumerate(conversations):
+        if i in decrypted_payloads:
+            results.append(_decrypt_conversation_data(conversation, uid, decrypted_payloads[i]))
+        elif isinstance(conversation, dict):
+            results.append(_prepare_conversation_for_read(conversation, uid))
+        else:
+            results.append(conversation)
+    return results
+
+
 def _prepare_photo_for_write(data: Dict[str, Any], uid: str, level: str) -> Dict[str, Any]:
     data = copy.deepcopy(data)
     data['data_protection_level'] = level
@@ -135,7 +183,26 @@ def _prepare_photo_for_read(photo_data: Optional[Dict[str, Any]], uid: str) -> O
     return data
 
 
-@prepare_for_read(decrypt_func=_prepare_photo_for_read)
+def _prepare_photos_for_read(photos: List[Any], uid: str) -> List[Any]:
+    """
+    Bulk variant of _prepare_photo_for_read: decrypts all enhanced photos with one key lookup.
+    """
+    results = [(copy.deepcopy(photo) or None) if isinstance(photo, dict) else photo for photo in photos]
+    indexes = [
+        i
+        for i, photo in enumerate(results)
+        if photo
+        and isinstance(photo, dict)
+        and photo.get('data_protection_level') == 'enhanced'
+        and isinstance(photo.get('base64'), str)
+    ]
+    decrypted = encryption.decrypt_many([results[i]['base64'] for i in indexes], uid)
+    for i, base64_data in zip(indexes, decrypted):
+        results[i]['base64'] = base64_data
+    return results
+
+
+@prepare_for_read(decrypt_func=_prepare_photo_for_read, bulk_decrypt_func=_prepare_photos_for_read)
 def get_conversation_photos(uid: str, conversation_id: str):
     user_ref = db.collection('users').document(uid)
     conversation_ref = user_ref.collection(conversations_collection).document(conversation_id)
@@ -144,6 +211,28 @@ def get_conversation_photos(uid: str, conversation_id: str):
     return photos
 
 
+def get_conversations_photos(uid: str, conversation_ids: List[str]) -> Dict[str, List[dict]]:
+    """
+    Photos of several conversations keyed by conversation id, for with_photos on list reads.
+    The sub-collection streams run in parallel (bounded) and all photos are decrypted in one bulk call.
+    """
+    if not conversation_ids:
+        return {}
+    conversations_ref = db.collection('users').document(uid).collection(conversations_collection)
+
+    def _stream(conversation_id: str) -> List[dict]:
+        return [doc.to_dict() for doc in conversations_ref.document(conversation_id).collection('photos').stream()]
+
+    with ThreadPoolExecutor(max_workers=min(PHOTO_HYDRATION_MAX_WORKERS, len(conversation_ids))) as executor:
+        photos_per_conversation = list(executor.map(_stream, conversation_ids))
+
+    decrypted = iter(_prepare_photos_for_read([photo for photos in photos_per_conversation for photo in photos], uid))
+    return {
+        conversation_id: [next(decrypted) for _ in photos]
+        for conversation_id, photos in zip(conversation_ids, photos_per_conversation)
+    }
+
+
 # *****************************
 # ********** CRUD *************
 # *****************************
@@ -171,8 +260,8 @@ def get_conversation(uid, conversation_id):
     return conversation_data
 
 
-@prepare_for_read(decrypt_func=_prepare_conversation_for_read)
-@with_photos(get_conversation_photos)
+@prepare_for_read(decrypt_func=_prepare_conversation_for_read, bulk_decrypt_func=_prepare_conversations_for_read)
+@with_photos(get_conversation_photos, get_conversations_photos)
 def get_conversations(
     uid: str,
     limit: int = 100,
@@ -184,7 +273,14 @@ def get_conversations(
     categories: Optional[List[str]] = None,
     folder_id: Optional[str] = None,
     starred: Optional[bool] = None,
+    start_after: Optional[str] = None,
+    include_transcript: bool = True,
 ):
+    """
+    start_after: id of the last conversation of the previous page. A cursor costs one document read, while an
+        offset is billed as reading every skipped conversation.
+    include_transcript: False reads the list fields only (no transcript download or decoding), for list views.
+    """
     conversations_ref = db.collection('users').document(uid).collection(conversations_collection)
     if not include_discarded:
         conversations_ref = conversations_ref.where(filter=FieldFilter('discarded', '==', False))
@@ -209,14 +305,95 @@ def get_conversations(
     # Sort
     conversations_ref = conversations_ref.order_by('created_at', direction=firestore.Query.DESCENDING)
 
+    if not include_transcript:
+        conversations_ref = conversations_ref.select(CONVERSATION_LIST_FIELDS)
+
     # Limits
-    conversations_ref = conversations_ref.limit(limit).offset(offset)
+    cursor = None
+    if start_after:
+        cursor = db.collection('users').document(uid).collection(conversations_collection).document(start_after).get()
+    if cursor is not None and cursor.exists:
+        conversations_ref = conversations_ref.start_after(cursor).limit(limit)
+    else:
+        conversations_ref = conversations_ref.limit(limit).offset(offset)
 
     conversations = [doc.to_dict() for doc in conversations_ref.stream()]
     return conversations
 
 
-@prepare_for_read(decrypt_func=_prepare_conversation_for_read)
+def iter_conversations(
+    uid: str,
+    limit: int = 100,
+    offset: int = 0,
+    include_discarded: bool = False,
+    statuses: List[str] = [],
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    include_transcript: bool = True,
+    include_photos: bool = False,
+    page_size: int = 20,
+):
+    """
+    The get_conversations query, newest first, yielded in pages as the stream comes in. A caller that stops early
+    (a full prompt) doesn't download or decrypt the rest.
+    include_transcript: False reads the list fields only.
+    """
+    conversations_ref = db.collection('users').document(uid).collection(conversations_collection)
+    if not include_discarded:
+        conversations_ref = conversations_ref.where(filter=FieldFilter('discarded', '==', False))
+    if len(statuses) > 0:
+        conversations_ref = conversations_ref.where(filter=FieldFilter('status', 'in', statuses))
+    if start_date:
+        conversations_ref = conversations_ref.where(filter=FieldFilter('created_at', '>=', start_date))
+    if end_date:
+        conversations_ref = conversations_ref.where(filter=FieldFilter('created_at', '<=', end_date))
+    conversations_ref = (
+        conversations_ref.order_by('created_at', direction=firestore.Query.DESCENDING).limit(limit).offset(offset)
+    )
+    if not include_transcript:
+        conversations_ref = conversations_ref.select(CONVERSATION_LIST_FIELDS)
+
+    page = []
+    for doc in conversations_ref.stream():
+        page.append(doc.to_dict())
+        if len(page) >= page_size:
+            yield _read_page(uid, page, include_photos)
+            page = []
+    if page:
+        yield _read_page(uid, page, include_photos)
+
+
+def iter_conversations_by_id(uid: str, conversation_ids: List[str], include_photos: bool = False, page_size: int = 10):
+    """Conversations in the order of conversation_ids, read page by page as the caller asks for more."""
+    conversations_ref = db.collection('users').document(uid).collection(conversations_collection)
+    for i in range(0, len(conversation_ids), page_size):
+        ids = conversation_ids[i : i + page_size]
+        docs = {doc.id: doc.to_dict() for doc in db.get_all([conversations_ref.document(str(c)) for c in ids])}
+        page = [docs[c] for c in ids if docs.get(c) and not docs[c].get('discarded')]
+        if page:
+            yield _read_page(uid, page, include_photos)
+
+
+def get_conversations_list_fields_by_id(uid: str, conversation_ids: List[str]) -> List[dict]:
+    """The list fields (no transcript, no photos) of the conversations, in the order of conversation_ids."""
+    conversations_ref = db.collection('users').document(uid).collection(conversations_collection)
+    docs = db.get_all(
+        [conversations_ref.document(str(c)) for c in conversation_ids], field_paths=CONVERSATION_LIST_FIELDS
+    )
+    by_id = {doc.id: doc.to_dict() for doc in docs if doc.exists}
+    return [by_id[c] for c in conversation_ids if by_id.get(c) and not by_id[c].get('discarded')]
+
+
+def _read_page(uid: str, page: List[dict], include_photos: bool) -> List[dict]:
+    page = _prepare_conversations_for_read(page, uid)
+    if include_photos:
+        photos = get_conversations_photos(uid, [conversation['id'] for conversation in page])
+        for conversation in page:
+            conversation['photos'] = photos.get(conversation['id'], [])
+    return page
+
+
+@prepare_for_read(decrypt_func=_prepare_conversation_for_read, bulk_decrypt_func=_prepare_conversations_for_read)
 def get_conversations_without_photos(
     uid: str,
     limit: int = 100,
@@ -413,7 +590,7 @@ def delete_conversation_photos(uid: str, conversation_id: str) -> int:
 
 def delete_conversation(uid, conversation_id):
     """
-    Delete a conversation and its photos subcollection.
+    Delete a conversation and its photos and transcript deltas subcollections.
 
     Args:
         uid: User ID
@@ -421,10 +598,12 @@ def delete_conversation(uid, conversation_id):
     """
     # Delete photos subcollection first
     delete_conversation_photos(uid, conversation_id)
+    delete_conversation_segments_deltas(uid, conversation_id)
 
     user_ref = db.collection('users').document(uid)
     conversation_ref = user_ref.collection(conversations_collection).document(conversation_id)
     conversation_ref.delete()
+    _notify_status(uid, conversation_id, 'deleted')
 
 
 def update_conversation_merged_data(uid: str, conversation_id: str, merged_data: dict):
@@ -486,8 +665,8 @@ def delete_conversations_by_source(uid: str, source: str, batch_size: int = 450)
     return total_deleted
 
 
-@prepare_for_read(decrypt_func=_prepare_conversation_for_read)
-@with_photos(get_conversation_photos)
+@prepare_for_read(decrypt_func=_prepare_conversation_for_read, bulk_decrypt_func=_prepare_conversations_for_read)
+@with_photos(get_conversation_photos, get_conversations_photos)
 def filter_conversations_by_date(uid, start_date, end_date):
     user_ref = db.collection('users').document(uid)
     query = (
@@ -501,8 +680,8 @@ def filter_conversations_by_date(uid, start_date, end_date):
     return conversations
 
 
-@prepare_for_read(decrypt_func=_prepare_conversation_for_read)
-@with_photos(get_conversation_photos)
+@prepare_for_read(decrypt_func=_prepare_conversation_for_read, bulk_decrypt_func=_prepare_conversations_for_read)
+@with_photos(get_conversation_photos, get_conversations_photos)
 def get_conversations_by_id(uid, conversation_ids):
     user_ref = db.collection('users').document(uid)
     conversations_ref = user_ref.collection(conversations_collection)
@@ -649,8 +828,8 @@ def get_in_progress_conversation(uid: str):
     return conversation
 
 
-@prepare_for_read(decrypt_func=_prepare_conversation_for_read)
-@with_photos(get_conversation_photos)
+@prepare_for_read(decrypt_func=_prepare_conversation_for_read, bulk_decrypt_func=_prepare_conversations_for_read)
+@with_photos(get_conversation_photos, get_conversations_photos)
 def get_in_progress_conversations(uid: str):
     """Get all in-progress conversations for a user, ordered by created_at descending."""
     user_ref = db.collection('users').document(uid)
@@ -663,8 +842,8 @@ def get_in_progress_conversations(uid: str):
     return conversations
 
 
-@prepare_for_read(decrypt_func=_prepare_conversation_for_read)
-@with_photos(get_conversation_photos)
+@prepare_for_read(decrypt_func=_prepare_conversation_for_read, bulk_decrypt_func=_prepare_conversations_for_read)
+@with_photos(get_conversation_photos, get_conversations_photos)
 def get_processing_conversations(uid: str):
     user_ref = db.collection('users').document(uid)
     conversations_ref = user_ref.collection(conversations_collection).where(
@@ -678,6 +857,15 @@ def update_conversation_status(uid: str, conversation_id: str, status: str):
     user_ref = db.collection('users').document(uid)
     conversation_ref = user_ref.collection(conversations_collection).document(conversation_id)
     conversation_ref.update({'status': status})
+    _notify_status(uid, conversation_id, status)
+
+
+def _notify_status(uid: str, conversation_id: str, status: str):
+    # Live sessions follow their conversation through these instead of reading it back
+    try:
+        redis_db.publish_conversation_status(uid, conversation_id, status)
+    except Exception as e:
+        print(f"Error publishing conversation status: {e}")
 
 
 def set_conversation_as_discarded(uid: str, conversation_id: str):
@@ -737,9 +925,10 @@ def get_action_items(
         raw_action_items = structured.get('action_items', [])
 
         if raw_action_items:
-            # Decrypt conversation data for proper reading
-            decrypted_data = _prepare_conversation_for_read(conversation_data, uid)
-            conversations.append(decrypted_data)
+            conversations.append(conversation_data)
+
+    # Decrypt conversation data for proper reading
+    conversations = _prepare_conversations_for_read(conversations, uid)
 
     # Extract and flatten action items with metadata
     action_items = []
@@ -820,18 +1009,251 @@ def update_conversation_finished_at(uid: str, conversation_id: str, finished_at:
     conversation_ref.update({'finished_at': finished_at})
 
 
-def update_conversation_segments(uid: str, conversation_id: str, segments: List[dict], finished_at: datetime = None):
+def update_conversation_fields(uid: str, conversation_id: str, fields: dict, level: str = 'standard') -> bool:
+    """
+    Updates several fields in one write without reading the document first, the caller knows its protection level.
+    Returns False if the conversation does not exist.
+    """
+    doc_ref = db.collection('users').document(uid).collection(conversations_collection).document(conversation_id)
+    try:
+        doc_ref.update(_prepare_conversation_for_write(fields, uid, level))
+    except NotFound:
+        return False
+    return True
+
+
+def update_conversation_segments(
+    uid: str, conversation_id: str, segments: List[dict], finished_at: datetime = None, level: Optional[str] = None
+):
+    update_payload = {'transcript_segments': segments}
+    if finished_at:
+        update_payload['finished_at'] = finished_at
+    if level:
+        update_conversation_fields(uid, conversation_id, update_payload, level)
+        return
+
     doc_ref = db.collection('users').document(uid).collection(conversations_collection).document(conversation_id)
     doc_snapshot = doc_ref.get(field_paths=['data_protection_level'])
     if not doc_snapshot.exists:
         return
 
     doc_level = doc_snapshot.to_dict().get('data_protection_level', 'standard')
+    prepared_payload = _prepare_conversation_for_write(update_payload, uid, doc_level)
+    doc_ref.update(prepared_payload)
+
+
+# *******************************************
+# ********** TRANSCRIPT DELTAS **************
+# *******************************************
+#
+# In-progress conversations persist transcript changes as small append-only delta documents under
+# `transcript_deltas` instead of rewriting the whole `transcript_segments` blob on every update.
+# The blob is rewritten (and the deltas dropped) only at checkpoints, see utils/transcript_persistence.py.
+# Delta ids are prefixed with the writing session, so two sessions on one conversation never overwrite each
+# other's deltas; they're replayed in `(created_at, seq)` order. Checkpoints drop only the deltas folded into the
+# blob they write, one appended meanwhile stays for the next checkpoint.
+
+transcript_deltas_collection = 'transcript_deltas'
+
+
+def _payload_size(value) -> int:
+    if isinstance(value, (bytes, str)):
+        return len(value)
+    return 0
+
+
+def get_conversation_data_protection_level(uid: str, conversation_id: str) -> Optional[str]:
+    doc_ref = db.collection('users').document(uid).collection(conversations_collection).document(conversation_id)
+    doc_snapshot = doc_ref.get(field_paths=['data_protection_level'])
+    if not doc_snapshot.exists:
+        return None
+    return doc_snapshot.to_dict().get('data_protection_level', 'standard')
+
+
+def apply_segments_deltas(segments: List[dict], deltas: List[dict]) -> List[dict]:
+    """
+    Replays transcript deltas (in order) on top of a segments list.
+    Segments with a known id are replaced in place, unknown ids are appended, removed ids are dropped.
+    """
+    merged = list(segments)
+    index = {segment.get('id'): i for i, segment in enumerate(merged)}
+    for delta in deltas:
+        removed_ids = set(delta.get('removed_ids') or [])
+        if removed_ids:
+            merged = [segment for segment in merged if segment.get('id') not in removed_ids]
+            index = {segment.get('id'): i for i, segment in enumerate(merged)}
+        for segment in delta.get('segments') or []:
+            i = index.get(segment.get('id'))
+            if i is None:
+                index[segment.get('id')] = len(merged)
+                merged.append(segment)
+            else:
+                merged[i] = segment
+    return merged
+
+
+def _delta_id(session: Optional[str], seq: int) -> str:
+    # Deltas written before sessions were recorded are keyed by seq alone
+    return f'{session}-{seq:010d}' if session else f'{seq:010d}'
+
+
+def append_conversation_segments_delta(
+    uid: str,
+    conversation_id: str,
+    session: str,
+    seq: int,
+    segments: List[dict],
+    removed_ids: List[str],
+    level: str,
+    finished_at: datetime = None,
+    fields: Optional[dict] = None,
+) -> int:
+    """
+    Appends one transcript delta and bumps `finished_at` (plus any other conversation `fields`) in a single batch.
+    Returns the number of transcript bytes written.
+    """
+    conversation_ref = (
+        db.collection('users').document(uid).collection(conversations_collection).document(conversation_id)
+    )
+    prepared = _prepare_conversation_for_write({'transcript_segments': segments}, uid, level)
+
+    batch = db.batch()
+    batch.set(
+        conversation_ref.collection(transcript_deltas_collection).document(_delta_id(session, seq)),
+        {
+            'session': session,
+            'seq': seq,
+            'segments': prepared['transcript_segments'],
+            'removed_ids': removed_ids or [],
+            'data_protection_level': level,
+            'created_at': datetime.now(timezone.utc),
+        },
+    )
+    conversation_fields = dict(fields or {})
+    if finished_at:
+        conversation_fields['finished_at'] = finished_at
+    if conversation_fields:
+        batch.update(conversation_ref, conversation_fields)
+    batch.commit()
+    return _payload_size(prepared['transcript_segments'])
+
+
+def get_conversation_segments_deltas(uid: str, conversation_id: str) -> List[dict]:
+    conversation_ref = (
+        db.collection('users').document(uid).collection(conversations_collection).document(conversation_id)
+    )
+    docs = [doc.to_dict() for doc in conversation_ref.collection(transcript_deltas_collection).stream()]
+    docs.sort(key=lambda data: (data.get('created_at'), data.get('seq')))
+    deltas = []
+    for data in docs:
+        decoded = _prepare_conversation_for_read(
+            {
+                'transcript_segments': data.get('segments'),
+                'transcript_segments_compressed': True,
+                'data_protection_level': data.get('data_protection_level'),
+            },
+            uid,
+        )
+        segments = decoded.get('transcript_segments')
+        deltas.append(
+            {
+                'session': data.get('session'),
+                'seq': data.get('seq'),
+                'segments': segments if isinstance(segments, list) else [],
+                'removed_ids': data.get('removed_ids') or [],
+            }
+        )
+    return deltas
+
+
+def merge_conversation_segments_deltas(uid: str, conversation: Optional[dict]) -> Optional[dict]:
+    """
+    Replays pending transcript deltas onto a conversation that was just read, in memory only.
+    Readers use this instead of compacting, the deltas stay for the owning session or processing to fold in.
+    """
+    if not conversation:
+        return conversation
+    deltas = get_conversation_segments_deltas(uid, conversation['id'])
+    if deltas:
+        conversation['transcript_segments'] = apply_segments_deltas(
+            conversation.get('transcript_segments') or [], deltas
+        )
+    return conversation
+
+
+def checkpoint_conversation_segments(
+    uid: str,
+    conversation_id: str,
+    segments: List[dict],
+    level: str,
+    deltas: List[dict],
+    finished_at: datetime = None,
+) -> int:
+    """
+    Writes the compacted `transcript_segments` blob and drops the `deltas` (`session` and `seq`) folded into it.
+    Returns the number of transcript bytes written.
+    """
+    conversation_ref = (
+        db.collection('users').document(uid).collection(conversations_collection).document(conversation_id)
+    )
     update_payload = {'transcript_segments': segments}
     if finished_at:
         update_payload['finished_at'] = finished_at
-    prepared_payload = _prepare_conversation_for_write(update_payload, uid, doc_level)
-    doc_ref.update(prepared_payload)
+    prepared_payload = _prepare_conversation_for_write(update_payload, uid, level)
+
+    conversation_ref.update(prepared_payload)
+    # Replaying a delta is idempotent, so a crash between the two steps is harmless
+    delete_conversation_segments_deltas(uid, conversation_id, deltas)
+    return _payload_size(prepared_payload['transcript_segments'])
+
+
+def delete_conversation_segments_deltas(uid: str, conversation_id: str, deltas: Optional[List[dict]] = None) -> int:
+    """Deletes the given `deltas` (`session` and `seq`), all of them if None."""
+    conversation_ref = (
+        db.collection('users').document(uid).collection(conversations_collection).document(conversation_id)
+    )
+    deltas_ref = conversation_ref.collection(transcript_deltas_collection)
+    if deltas is None:
+        doc_refs = deltas_ref.list_documents()
+    else:
+        doc_refs = [deltas_ref.document(_delta_id(delta.get('session'), delta['seq'])) for delta in deltas]
+    deleted_count = 0
+    batch = db.batch()
+    batch_count = 0
+    for doc_ref in doc_refs:
+        batch.delete(doc_ref)
+        batch_count += 1
+        deleted_count += 1
+        if batch_count >= 500:
+            batch.commit()
+            batch = db.batch()
+            batch_count = 0
+    if batch_count > 0:
+        batch.commit()
+    return deleted_count
+
+
+def compact_conversation_segments(uid: str, conversation_id: str) -> bool:
+    """
+    Folds pending transcript deltas (e.g. left behind by a dropped session) into the conversation.
+    Only the deltas read here are dropped, so one appended meanwhile survives.
+    Returns True if anything was compacted.
+    """
+    deltas = get_conversation_segments_deltas(uid, conversation_id)
+    if not deltas:
+        return False
+
+    conversation_ref = (
+        db.collection('users').document(uid).collection(conversations_collection).document(conversation_id)
+    )
+    conversation = _prepare_conversation_for_read(conversation_ref.get().to_dict(), uid)
+    if not conversation:
+        return False
+
+    segments = apply_segments_deltas(conversation.get('transcript_segments') or [], deltas)
+    level = conversation.get('data_protection_level', 'standard')
+    checkpoint_conversation_segments(uid, conversation_id, segments, level, deltas)
+    return True
 
 
 # ***********************************
@@ -875,12 +1297,22 @@ def unlock_all_conversations(uid: str):
 
 def get_public_conversations(data: List[Tuple[str, str]]):
     """
-    Fetches multiple public conversations sequentially.
+    Fetches multiple public conversations, in the given order, with batched get_all reads.
+    Only PUBLIC_CONVERSATION_FIELDS are read: no transcript, photos or geolocation.
     """
+    refs = [
+        db.collection('users').document(uid).collection(conversations_collection).document(conversation_id)
+        for uid, conversation_id in data
+    ]
+    docs = {}
+    for i in range(0, len(refs), PUBLIC_CONVERSATIONS_BATCH_SIZE):
+        for doc in db.get_all(refs[i : i + PUBLIC_CONVERSATIONS_BATCH_SIZE], field_paths=PUBLIC_CONVERSATION_FIELDS):
+            if doc.exists:
+                docs[doc.reference.path] = doc.to_dict()
+
     conversations = []
-    for uid, conversation_id in data:
-        # get_conversation is already decorated to return a fully populated and decrypted conversation
-        conversation_data = get_conversation(uid=uid, conversation_id=conversation_id)
+    for ref in refs:
+        conversation_data = docs.get(ref.path)
         if conversation_data and conversation_data.get('visibility') == 'public':
             conversations.append(conversation_data)
     return conversations
@@ -970,14 +1402,17 @@ def get_conversation_transcripts_by_model(uid: str, conversation_id: str):
 # ***********************************
 
 
-def store_conversation_photos(uid: str, conversation_id: str, photos: List[ConversationPhoto]):
+def store_conversation_photos(
+    uid: str, conversation_id: str, photos: List[ConversationPhoto], level: Optional[str] = None
+):
     user_ref = db.collection('users').document(uid)
     conversation_ref = user_ref.collection(conversations_collection).document(conversation_id)
 
-    conversation_snapshot = conversation_ref.get(field_paths=['data_protection_level'])
-    level = 'standard'
-    if conversation_snapshot.exists:
-        level = conversation_snapshot.to_dict().get('data_protection_level', 'standard')
+    if not level:
+        conversation_snapshot = conversation_ref.get(field_paths=['data_protection_level'])
+        level = 'standard'
+        if conversation_snapshot.exists:
+            level = conversation_snapshot.to_dict().get('data_protection_level', 'standard')
 
     photos_ref = conversation_ref.collection('photos')
     batch = db.batch()
@@ -0,0 +1,157 @@
+"""
+Non-blocking access to database/conversations.py for the streaming paths (listen websocket, pusher).
+
+The Firestore calls stay the synchronous ones in database/conversations.py, they carry the encryption and photo
+decorators. They run on a bounded thread pool, so a session never blocks the event loop for a round trip and the
+pool size caps the Firestore calls in flight per process.
+"""
+
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+import database.conversations as conversations_db
+from models.conversation import ConversationPhoto
+
+FIRESTORE_MAX_WORKERS = int(os.getenv('FIRESTORE_MAX_WORKERS', '32'))
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=FIRESTORE_MAX_WORKERS, thread_name_prefix='firestore')
+    return _executor
+
+
+async def run(func: Callable, *args, **kwargs):
+    """Runs a blocking Firestore call on the bounded pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), functools.partial(func, *args, **kwargs))
+
+
+# *********************************
+# ********** FUNCTIONS ************
+# *********************************
+#
+# Resolved at call time so tests can patch database.conversations.
+
+
+async def get_conversation(uid: str, conversation_id: str):
+    return await run(conversations_db.get_conversation, uid, conversation_id)
+
+
+async def get_processing_conversations(uid: str):
+    return await run(conversations_db.get_processing_conversations, uid)
+
+
+async def get_last_completed_conversation(uid: str):
+    return await run(conversations_db.get_last_completed_conversation, uid)
+
+
+async def upsert_conversation(uid: str, conversation_data: dict):
+    return await run(conversations_db.upsert_conversation, uid, conversation_data=conversation_data)
+
+
+async def update_conversation(uid: str, conversation_id: str, update_data: dict):
+    return await run(conversations_db.update_conversation, uid, conversation_id, update_data)
+
+
+async def update_conversation_status(uid: str, conversation_id: str, status: str):
+    return await run(conversations_db.update_conversation_status, uid, conversation_id, status)
+
+
+async def set_conversation_as_discarded(uid: str, conversation_id: str):
+    return await run(conversations_db.set_conversation_as_discarded, uid, conversation_id)
+
+
+async def delete_conversation(uid: str, conversation_id: str):
+    return await run(conversations_db.delete_conversation, uid, conversation_id)
+
+
+async def compact_conversation_segments(uid: str, conversation_id: str) -> bool:
+    return await run(conversations_db.compact_conversation_segments, uid, conversation_id)
+
+
+# *********************************
+# ******** SESSION WRITER *********
+# *********************************
+
+
+class ConversationSessionWriter:
+    """
+    Conversation writes of one streaming session.
+
+    Remembers the data protection level of every conversation the session touches, so writes skip the
+    `data_protection_level` read, and coalesces the field updates staged during a tick into one write.
+    """
+
+    def __init__(self, uid: str):
+        self.uid = uid
+        self._levels: Dict[str, str] = {}
+        self._pending: Dict[str, dict] = {}
+
+        # Stats
+        self.level_reads = 0
+        self.writes = 0
+
+    def set_level(self, conversation_id: str, level: Optional[str]):
+        self._levels[conversation_id] = level or 'standard'
+
+    async def get_level(self, conversation_id: str) -> Optional[str]:
+        level = self._levels.get(conversation_id)
+        if level is None:
+            self.level_reads += 1
+            level = await run(conversations_db.get_conversation_data_protection_level, self.uid, conversation_id)
+            if level is None:
+                return None
+            self._levels[conversation_id] = level
+        return level
+
+    def forget(self, conversation_id: str):
+        self._levels.pop(conversation_id, None)
+        self._pending.pop(conversation_id, None)
+
+    def stage(self, conversation_id: str, fields: dict):
+        """Queues field updates, later values of the same field win."""
+        self._pending.setdefault(conversation_id, {}).update(fields)
+
+    def take(self, conversation_id: str) -> dict:
+        """Removes and returns the staged fields, for callers that fold them into their own write."""
+        return self._pending.pop(conversation_id, {})
+
+    async def flush(self, conversation_id: Optional[str] = None):
+        """Writes the staged fields, one update per conversation."""
+        conversation_ids = [conversation_id] if conversation_id else list(self._pending)
+        for cid in conversation_ids:
+            fields = self._pending.pop(cid, None)
+            if not fields:
+                continue
+            level = await self.get_level(cid)
+            if level is None:
+                continue
+            self.writes += 1
+            await run(conversations_db.update_conversation_fields, self.uid, cid, fields, level)
+
+    async def update_segments(self, conversation_id: str, segments: List[dict], finished_at=None):
+        level = await self.get_level(conversation_id)
+        if level is None:
+            return
+        fields = self.take(conversation_id)
+        fields['transcript_segments'] = segments
+        if finished_at:
+            fields['finished_at'] = finished_at
+        self.writes += 1
+        await run(conversations_db.update_conversation_fields, self.uid, conversation_id, fields, level)
+
+    async def store_photos(self, conversation_id: str, photos: List[ConversationPhoto]):
+        level = await self.get_level(conversation_id)
+        self.writes += 1
+        await run(conversations_db.store_conversation_photos, self.uid, conversation_id, photos, level=level)
@@ -141,12 +141,18 @@ def prepare_for_write(data_arg_name: str, prepare_func: Callable[[Dict[str, Any]
     return decorator
 
 
-def prepare_for_read(decrypt_func: Callable[[Dict[str, Any], str], Dict[str, Any]]):
+def prepare_for_read(
+    decrypt_func: Callable[[Dict[str, Any], str], Dict[str, Any]],
+    bulk_decrypt_func: Callable[[List[Dict[str, Any]], str], List[Dict[str, Any]]] | None = None,
+):
     """
     Decorator to decrypt data after reading from the database.
     It processes the return value of the decorated function. If the return value is a dict or
     list of dicts, it applies the decrypt_func based on the 'data_protection_level' field.
 
+    Lists are handed to bulk_decrypt_func when one is given, so the whole page is decrypted
+    with a single key lookup.
+
     Assumes 'uid' is an argument to the decorated function to be used for decryption.
     """
 
@@ -171,10 +177,15 @@ def prepare_for_read(decrypt_func: Callable[[Dict[str, Any], str], Dict[str, Any
                     return decrypt_func(item, uid)
                 return item
 
+            def _process_list(items):
+                if bulk_decrypt_func is not None:
+                    return bulk_decrypt_func(items, uid)
+                return [_process(item) for item in items]
+
             if isinstance(result, dict):
                 return _process(result)
             elif isinstance(result, list):
-                return [_process(item) for item in result]
+                return _process_list(result)
             elif isinstance(result, tuple):
                 # Handle functions that return a tuple, e.g., (data, doc_id)
                 processed_elements = []
@@ -182,7 +193,7 @@ def prepare_for_read(decrypt_func: Callable[[Dict[str, Any], str], Dict[str, Any
                     if isinstance(element, dict):
                         processed_elements.append(_process(element))
                     elif isinstance(element, list):
-                        processed_elements.append([_process(item) for item in element])
+                        processed_elements.append(_process_list(element))
                     else:
                         processed_elements.append(element)
                 return tuple(processed_elements)
@@ -193,10 +204,11 @@ def prepare_for_read(decrypt_func: Callable[[Dict[str, Any], str], Dict[str, Any
     return decorator
 
 
-def with_photos(photos_getter: Callable):
+def with_photos(photos_getter: Callable, bulk_photos_getter: Callable | None = None):
     """
     Decorator to automatically populate the 'photos' field for a conversation or a list of conversations.
     It fetches documents from the 'photos' sub-collection and attaches them using the provided getter.
+    If bulk_photos_getter is given, lists are hydrated with one call returning photos keyed by conversation id.
     This should be applied to functions that return conversation dicts and have a 'uid' parameter.
     """
 
@@ -231,17 +243,31 @@ def with_photos(photos_getter: Callable):
                 conversation_data['photos'] = photos
                 return conversation_data
 
+            def _fetch_and_attach_photos_bulk(conversations):
+                if bulk_photos_getter is None:
+                    return [_fetch_and_attach_photos(item) for item in conversations]
+                missing = [
+                    item['id']
+                    for item in conversations
+                    if isinstance(item, dict) and 'id' in item and not item.get('photos')
+                ]
+                photos_by_id = bulk_photos_getter(uid=uid, conversation_ids=missing) if missing else {}
+                for item in conversations:
+                    if isinstance(item, dict) and item.get('id') in photos_by_id:
+                        item['photos'] = photos_by_id[item['id']]
+                return conversations
+
             if isinstance(result, dict):
                 return _fetch_and_attach_photos(result)
             elif isinstance(result, list):
-                return [_fetch_and_attach_photos(item) for item in result]
+                return _fetch_and_attach_photos_bulk(result)
             elif isinstance(result, tuple):
                 processed_elements = []
                 for element in result:
                     if isinstance(element, dict):
                         processed_elements.append(_fetch_and_attach_photos(element))
                     elif isinstance(element, list):
-                        processed_elements.append([_fetch_and_attach_photos(item) for item in element])
+                        processed_elements.append(_fetch_and_attach_photos_bulk(element))
                     else:
                         processed_elements.append(element)
                 return tuple(processed_elements)
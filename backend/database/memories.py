@@ -1,12 +1,13 @@
 import copy
 from datetime import datetime, timezone
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 
 from google.cloud import firestore
 from google.cloud.firestore_v1 import FieldFilter
 
 from ._client import db
-from database import users as users_db
+from database import users as users_db, redis_db
+from database.cache import get_memory_cache
 from utils import encryption
 from .helpers import set_data_protection_level, prepare_for_write, prepare_for_read
 
@@ -55,12 +56,31 @@ def _prepare_memory_for_read(memory_data: Optional[Dict[str, Any]], uid: str) ->
     return memory_data
 
 
+def _prepare_memories_for_read(memories: List[Any], uid: str) -> List[Any]:
+    """
+    Bulk variant of _prepare_memory_for_read: decrypts every enhanced memory's content with one key lookup.
+    """
+    results = list(memories)
+    indexes = [
+        i
+        for i, memory in enumerate(results)
+        if isinstance(memory, dict)
+        and memory.get('data_protection_level') == 'enhanced'
+        and isinstance(memory.get('content'), str)
+    ]
+    contents = encryption.decrypt_many([results[i]['content'] for i in indexes], uid)
+    for i, content in zip(indexes, contents):
+        results[i] = {**results[i], 'content': content}
+
+    return [(memory or None) if isinstance(memory, dict) else memory for memory in results]
+
+
 # *****************************
 # ********** CRUD *************
 # *****************************
 
 
-@prepare_for_read(decrypt_func=_prepare_memory_for_read)
+@prepare_for_read(decrypt_func=_prepare_memory_for_read, bulk_decrypt_func=_prepare_memories_for_read)
 def get_memories(
     uid: str,
     limit: int = 100,
@@ -95,7 +115,50 @@ def get_memories(
     return result
 
 
-@prepare_for_read(decrypt_func=_prepare_memory_for_read)
+def get_all_memories(uid: str, limit: int) -> Tuple[List[dict], bool]:
+    """
+    The user's memories in get_memories order, without the rejected ones, and whether that's all of them. Builds the
+    memory snapshots (utils/memory_snapshot.py), which readers go through instead of get_memories.
+    """
+    memories_ref = (
+        db.collection(users_collection)
+        .document(uid)
+        .collection(memories_collection)
+        .order_by('scoring', direction=firestore.Query.DESCENDING)
+        .order_by('created_at', direction=firestore.Query.DESCENDING)
+        .limit(limit)
+    )
+    memories = [{'id': doc.id, **doc.to_dict()} for doc in memories_ref.stream()]
+    complete = len(memories) < limit
+    memories = [memory for memory in memories if memory.get('user_review') is not False]
+    return _prepare_memories_for_read(memories, uid), complete
+
+
+def _memories_changed(uid: str, memory_ids: Optional[List[str]] = None):
+    # Memory snapshots of an older version refresh these ids, or everything when memory_ids is None
+    try:
+        redis_db.bump_memories_version(uid, memory_ids)
+    except Exception as e:
+        print(f"Error bumping memories version: {e}")
+
+
+def memory_snapshot_cache_key(uid: str) -> str:
+    return f'memory_snapshot:{uid}'
+
+
+def evict_memory_snapshot(uid: str):
+    """
+    Drops the user's memory snapshot (utils/memory_snapshot.py) from Redis and from this process' cache, so deleted
+    memories don't stay around in them until they expire.
+    """
+    get_memory_cache().delete(memory_snapshot_cache_key(uid))
+    try:
+        redis_db.delete_memory_snapshot(uid)
+    except Exception as e:
+        print(f"Error deleting memory snapshot: {e}")
+
+
+@prepare_for_read(decrypt_func=_prepare_memory_for_read, bulk_decrypt_func=_prepare_memories_for_read)
 def get_user_public_memories(uid: str, limit: int = 100, offset: int = 0):
     print('get_public_memories', limit, offset)
 
@@ -114,7 +177,7 @@ def get_user_public_memories(uid: str, limit: int = 100, offset: int = 0):
     return public_memories
 
 
-@prepare_for_read(decrypt_func=_prepare_memory_for_read)
+@prepare_for_read(decrypt_func=_prepare_memory_for_read, bulk_decrypt_func=_prepare_memories_for_read)
 def get_non_filtered_memories(uid: str, limit: int = 100, offset: int = 0):
     print('get_non_filtered_memories', uid, limit, offset)
     memories_ref = db.collection(users_collection).document(uid).collection(memories_collection)
@@ -131,6 +194,7 @@ def create_memory(uid: str, data: dict):
     memories_ref = user_ref.collection(memories_collection)
     memory_ref = memories_ref.document(data['id'])
     memory_ref.set(data)
+    _memories_changed(uid, [data['id']])
 
 
 @set_data_protection_level(data_arg_name='data')
@@ -146,6 +210,7 @@ def save_memories(uid: str, data: List[dict]):
         memory_ref = memories_ref.document(memory['id'])
         batch.set(memory_ref, memory)
     batch.commit()
+    _memories_changed(uid, [memory['id'] for memory in data])
 
 
 def delete_memories(uid: str):
@@ -155,6 +220,8 @@ def delete_memories(uid: str):
     for doc in memories_ref.stream():
         batch.delete(doc.reference)
     batch.commit()
+    _memories_changed(uid)
+    evict_memory_snapshot(uid)
 
 
 @prepare_for_read(decrypt_func=_prepare_memory_for_read)
@@ -180,16 +247,9 @@ def get_memories_by_ids(uid: str, memory_ids: List[str]) -> List[dict]:
     doc_refs = [memories_ref.document(memory_id) for memory_id in memory_ids]
     docs = db.get_all(doc_refs)
 
-    memories = []
-    for doc in docs:
-        if doc.exists:
-            memory_data = doc.to_dict()
-            # Apply decryption if needed
-            memory_data = _prepare_memory_for_read(memory_data, uid)
-            if memory_data:
-                memories.append(memory_data)
-
-    return memories
+    memories = [doc.to_dict() for doc in docs if doc.exists]
+    # Apply decryption if needed
+    return [memory for memory in _prepare_memories_for_read(memories, uid) if memory]
 
 
 def review_memory(uid: str, memory_id: str, value: bool):
@@ -197,6 +257,7 @@ def review_memory(uid: str, memory_id: str, value: bool):
     memories_ref = user_ref.collection(memories_collection)
     memory_ref = memories_ref.document(memory_id)
     memory_ref.update({'reviewed': True, 'user_review': value})
+    _memories_changed(uid, [memory_id])
 
 
 def set_memory_kg_extracted(uid: str, memory_id: str):
@@ -204,6 +265,7 @@ def set_memory_kg_extracted(uid: str, memory_id: str):
     memories_ref = user_ref.collection(memories_collection)
     memory_ref = memories_ref.document(memory_id)
     memory_ref.update({'kg_extracted': True})
+    _memories_changed(uid, [memory_id])
 
 
 def change_memory_visibility(uid: str, memory_id: str, value: str):
@@ -211,6 +273,7 @@ def change_memory_visibility(uid: str, memory_id: str, value: str):
     memories_ref = user_ref.collection(memories_collection)
     memory_ref = memories_ref.document(memory_id)
     memory_ref.update({'visibility': value})
+    _memories_changed(uid, [memory_id])
 
 
 def update_memory_fields(uid: str, memory_id: str, data: dict):
@@ -225,6 +288,7 @@ def update_memory_fields(uid: str, memory_id: str, data: dict):
     update_payload = data.copy()
     update_payload['updated_at'] = datetime.now(timezone.utc)
     memory_ref.update(update_payload)
+    _memories_changed(uid, [memory_id])
 
 
 def edit_memory(uid: str, memory_id: str, value: str):
@@ -242,6 +306,7 @@ def edit_memory(uid: str, memory_id: str, value: str):
         content = encryption.encrypt(content, uid)
 
     memory_ref.update({'content': content, 'edited': True, 'updated_at': datetime.now(timezone.utc)})
+    _memories_changed(uid, [memory_id])
 
 
 def delete_memory(uid: str, memory_id: str):
@@ -249,6 +314,7 @@ def delete_memory(uid: str, memory_id: str):
     memories_ref = user_ref.collection(memories_collection)
     memory_ref = memories_ref.document(memory_id)
     memory_ref.delete()
+    _memories_changed(uid, [memory_id])
 
 
 def delete_all_memories(uid: str):
@@ -258,6 +324,8 @@ def delete_all_memories(uid: str):
     for doc in memories_ref.stream():
         batch.delete(doc.reference)
     batch.commit()
+    _memories_changed(uid)
+    evict_memory_snapshot(uid)
 
 
 def get_memory_ids_for_conversation(uid: str, conversation_id: str) -> List[str]:
@@ -282,6 +350,8 @@ def delete_memories_for_conversation(uid: str, memory_id: str):
         removed_ids.append(doc.id)
     batch.commit()
     print('delete_memories_for_conversation', memory_id, len(removed_ids))
+    if removed_ids:
+        _memories_changed(uid, removed_ids)
 
 
 def unlock_all_memories(uid: str):
@@ -303,6 +373,7 @@ def unlock_all_memories(uid: str):
             count = 0
     if count > 0:
         batch.commit()
+    _memories_changed(uid)
     print(f"Unlocked all memories for user {uid}")
 
 
@@ -364,6 +435,7 @@ def migrate_memories_level_batch(uid: str, memory_ids: List[str], target_level:
         batch.update(doc_snapshot.reference, update_data)
 
     batch.commit()
+    _memories_changed(uid, memory_ids)
 
 
 def migrate_memories(prev_uid: str, new_uid: str, app_id: str = None):
@@ -402,5 +474,6 @@ def migrate_memories(prev_uid: str, new_uid: str, app_id: str = None):
 
     # Commit batch
     batch.commit()
+    _memories_changed(new_uid, [memory['id'] for memory in memories_to_migrate])
     print(f'Migrated {len(memories_to_migrate)} memories from {prev_uid} to {new_uid}')
     return len(memories_to_migrate)
@@ -7,6 +7,8 @@ users/{uid}/fcm_tokens (subcollection)
       ├── token: "actual_token_value"
       ├── created_at: timestamp
       └── time_zone: "America/New_York"
+
+users/{uid}.fcm_token_time_zones: time_zone of every device ('' for none), see _may_have_tokens_outside
 """
 
 import asyncio
@@ -21,7 +23,7 @@ def save_token(uid: str, data: dict):
     """
     Store token in subcollection with device key as document ID
     Structure: users/{uid}/fcm_tokens/{device_key}
-    Also maintains time_zone in main user document for backward compatibility
+    Also maintains time_zone and fcm_token_time_zones in main user document
     Migrates legacy fcm_token to subcollection
     """
     device_key = data.get('device_key', 'unknown_default')
@@ -29,6 +31,7 @@ def save_token(uid: str, data: dict):
     time_zone = data.get('time_zone')
 
     user_ref = db.collection('users').document(uid)
+    device_time_zones = [time_zone or '']
 
     # Step 1: Migrate legacy token if exists
     user_doc = user_ref.get()
@@ -54,6 +57,11 @@ def save_token(uid: str, data: dict):
             # Remove legacy field
             user_ref.update({'fcm_token': DELETE_FIELD})
 
+        if 'fcm_token_time_zones' not in user_data:
+            # Not tracked yet: start from the devices already there
+            for doc in user_ref.collection('fcm_tokens').stream():
+                device_time_zones.append(doc.to_dict().get('time_zone') or '')
+
     # Step 2: If new token has proper device_key, replace unknown_default
     if device_key != 'unknown_default':
         unknown_ref = user_ref.collection('fcm_tokens').document('unknown_default')
@@ -70,8 +78,10 @@ def save_token(uid: str, data: dict):
     )
 
     # Also update time_zone in main user document (for backward compatibility and efficient queries)
+    user_update = {'fcm_token_time_zones': firestore.ArrayUnion(sorted(set(device_time_zones)))}
     if time_zone:
-        user_ref.set({'time_zone': time_zone}, merge=True)
+        user_update['time_zone'] = time_zone
+    user_ref.set(user_update, merge=True)
 
 
 def get_user_time_zone(uid: str):
@@ -89,6 +99,7 @@ def get_user_time_zone(uid: str):
 
 # Default: 22:00 local time (10 PM)
 DEFAULT_DAILY_SUMMARY_HOUR_LOCAL = 22
+TOKEN_READS_MAX_WORKERS = 16
 
 
 def get_daily_summary_hour_local(uid: str) -> int | None:
@@ -246,6 +257,62 @@ def remove_bulk_tokens(tokens: list[str]):
             batch.commit()
 
 
+def _get_tokens_by_uid_in_timezones(timezones: list[str]) -> dict[str, list[str]] | None:
+    """
+    Device tokens registered in the given timezones (30 max), keyed by uid, with one collection group query.
+    Relies on the fcm_tokens.time_zone collection group index (firestore.indexes.json). None when the query fails,
+    the tokens are then read per user.
+    """
+    tokens_by_uid = {}
+    try:
+        query = db.collection_group('fcm_tokens').where(filter=FieldFilter('time_zone', 'in', timezones))
+        for token_doc in query.stream():
+            token = token_doc.to_dict().get('token')
+            if token:
+                tokens_by_uid.setdefault(token_doc.reference.parent.parent.id, []).append(token)
+    except Exception as e:
+        print(f"fcm_tokens collection group query failed, reading tokens per user: {e}")
+        return None
+    return tokens_by_uid
+
+
+def _may_have_tokens_outside(user_data: dict, timezones: list[str]) -> bool:
+    """
+    Whether the collection group query over timezones may have missed some of the user's devices: devices without a
+    time_zone or in another one, or devices whose time zones save_token hasn't recorded yet.
+    """
+    device_time_zones = user_data.get('fcm_token_time_zones')
+    return device_time_zones is None or any(time_zone not in timezones for time_zone in device_time_zones)
+
+
+def _collect_user_tokens(uid: str, user_data: dict, tokens_by_uid: dict[str, list[str]]) -> list[str]:
+    """Tokens of a user found by _get_tokens_by_uid_in_timezones, plus the legacy token."""
+    tokens = list(tokens_by_uid.get(uid, []))
+
+    # Add legacy token if exists and not already in list
+    legacy_token = user_data.get('fcm_token')
+    if legacy_token and legacy_token not in tokens:
+        tokens.append(legacy_token)
+    return tokens
+
+
+def _get_device_tokens(uid: str) -> list[str]:
+    token_docs = db.collection('users').document(uid).collection('fcm_tokens').stream()
+    return [token for token in (doc.to_dict().get('token') for doc in token_docs) if token]
+
+
+async def _read_users_tokens(users: list[tuple[str, dict]]) -> list[list[str]]:
+    """Every device token of each (uid, user_data) plus the legacy one, at most TOKEN_READS_MAX_WORKERS reads at once."""
+    semaphore = asyncio.Semaphore(TOKEN_READS_MAX_WORKERS)
+
+    async def _read(uid: str, user_data: dict) -> list[str]:
+        async with semaphore:
+            tokens = await asyncio.to_thread(_get_device_tokens, uid)
+        return _collect_user_tokens(uid, user_data, {uid: tokens})
+
+    return await asyncio.gather(*[_read(uid, user_data) for uid, user_data in users])
+
+
 async def get_users_token_in_timezones(timezones: list[str]):
     return await _get_users_in_timezones(timezones, 'fcm_token')
 
@@ -268,7 +335,8 @@ async def get_users_for_daily_summary(timezones: list[str], target_local_hour: i
         target_local_hour: The local hour we're sending notifications for (0-23)
 
     Returns:
-        List of (uid, [tokens], time_zone) tuples.
+        List of (uid, [tokens], time_zone) tuples. tokens is None for users with devices the timezone query can't
+        see, the fan-out's Firestore stage reads them.
     """
     if not timezones:
         return []
@@ -282,11 +350,24 @@ async def get_users_for_daily_summary(timezones: list[str], target_local_hour: i
         def sync_query():
             chunk_users = []
             try:
+                tokens_by_uid = _get_tokens_by_uid_in_timezones(chunk)
+
                 # Query users in these timezones
-                query = db.collection('users').where(filter=FieldFilter('time_zone', 'in', chunk))
+                query = (
+                    db.collection('users')
+                    .where(filter=FieldFilter('time_zone', 'in', chunk))
+                    .select(
+                        [
+                            'time_zone',
+                            'fcm_token',
+                            'fcm_token_time_zones',
+                            'daily_summary_enabled',
+                            'daily_summary_hour_local',
+                        ]
+                    )
+                )
 
                 for user_doc in query.stream():
-                    uid = user_doc.id
                     user_data = user_doc.to_dict()
 
                     # Check if daily summary is enabled (default: True)
@@ -299,25 +380,17 @@ async def get_users_for_daily_summary(timezones: list[str], target_local_hour: i
                     if user_hour != target_local_hour:
                         continue
 
-                    # Collect tokens from subcollection
-                    tokens = []
-                    token_docs = db.collection('users').document(uid).collection('fcm_tokens').stream()
-                    for token_doc in token_docs:
-                        token_data = token_doc.to_dict()
-                        if token_data.get('token'):
-                            tokens.append(token_data['token'])
-
-                    # Add legacy token if exists and not already in list
-                    legacy_token = user_data.get('fcm_token')
-                    if legacy_token and legacy_token not in tokens:
-                        tokens.append(legacy_token)
+                    time_zone = user_data.get('time_zone')
+                    if tokens_by_uid is None or _may_have_tokens_outside(user_data, chunk):
+                        chunk_users.append((user_doc.id, None, time_zone))
+                        continue
+                    tokens = _collect_user_tokens(user_doc.id, user_data, tokens_by_uid)
 
                     # Skip users with no tokens
                     if not tokens:
                         continue
 
-                    time_zone = user_data.get('time_zone')
-                    chunk_users.append((uid, tokens, time_zone))
+                    chunk_users.append((user_doc.id, tokens, time_zone))
 
             except Exception as e:
                 print(f"Error querying chunk for daily summary: {e}")
@@ -345,37 +418,21 @@ async def _get_users_in_timezones(timezones: list[str], filter: str):
         def sync_query():
             chunk_users = []
             try:
+                tokens_by_uid = _get_tokens_by_uid_in_timezones(chunk)
+
                 # Query main user documents by time_zone
-                query = db.collection('users').where(filter=FieldFilter('time_zone', 'in', chunk))
+                query = (
+                    db.collection('users')
+                    .where(filter=FieldFilter('time_zone', 'in', chunk))
+                    .select(['time_zone', 'fcm_token', 'fcm_token_time_zones'])
+                )
 
                 for user_doc in query.stream():
-                    uid = user_doc.id
                     user_data = user_doc.to_dict()
-
-                    # Collect tokens from subcollection
-                    tokens = []
-                    token_docs = db.collection('users').document(uid).collection('fcm_tokens').stream()
-                    for token_doc in token_docs:
-                        token_data = token_doc.to_dict()
-                        if token_data.get('token'):
-                            tokens.append(token_data['token'])
-
-                    # Add legacy token if exists and not already in list
-                    legacy_token = user_data.get('fcm_token')
-                    if legacy_token and legacy_token not in tokens:
-                        tokens.append(legacy_token)
-
-                    # Skip users with no tokens
-                    if not tokens:
-                        continue
-
-                    if filter == 'fcm_token':
-                        # Return flat list of tokens
-                        chunk_users.extend(tokens)
-                    else:
-                        # Return list of (uid, [tokens], time_zone) tuples
-                        time_zone = user_data.get('time_zone')
-                        chunk_users.append((uid, tokens, time_zone))
+                    tokens = None
+                    if tokens_by_uid is not None and not _may_have_tokens_outside(user_data, chunk):
+                        tokens = _collect_user_tokens(user_doc.id, user_data, tokens_by_uid)
+                    chunk_users.append((user_doc.id, user_data, tokens))
 
             except Exception as e:
                 print(f"Error querying chunk {chunk}: {e}")
@@ -384,9 +441,24 @@ async def _get_users_in_timezones(timezones: list[str], filter: str):
         return await asyncio.to_thread(sync_query)
 
     tasks = [query_chunk(chunk) for chunk in timezone_chunks]
-    results = await asyncio.gather(*tasks)
+    candidates = [candidate for chunk_users in await asyncio.gather(*tasks) for candidate in chunk_users]
 
-    for chunk_users in results:
-        users.extend(chunk_users)
+    # Users with devices the timezone query can't see, read one by one
+    unread = [(uid, user_data) for uid, user_data, tokens in candidates if tokens is None]
+    read_tokens = dict(zip([uid for uid, _ in unread], await _read_users_tokens(unread)))
+
+    for uid, user_data, tokens in candidates:
+        tokens = read_tokens[uid] if tokens is None else tokens
+
+        # Skip users with no tokens
+        if not tokens:
+            continue
+
+        if filter == 'fcm_token':
+            # Return flat list of tokens
+            users.extend(tokens)
+        else:
+            # Return list of (uid, [tokens], time_zone) tuples
+            users.append((uid, tokens, user_data.get('time_zone')))
 
     return users
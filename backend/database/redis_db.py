@@ -1,12 +1,19 @@
+import asyncio
 import base64
+import functools
 import json
 import os
-from typing import List, Union, Optional
+import time
+import weakref
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterable, List, Set, Tuple, Union, Optional
 from datetime import datetime, timedelta, timezone
 
 import redis
+import redis.asyncio
 
-r = redis.Redis(
+_connection_kwargs = dict(
     host=os.getenv('REDIS_DB_HOST'),
     port=int(os.getenv('REDIS_DB_PORT')) if os.getenv('REDIS_DB_PORT') is not None else 6379,
     username='default',
@@ -15,6 +22,79 @@ r = redis.Redis(
     ssl=True if os.getenv('REDIS_DB_HOST', '').endswith('.upstash.io') else False,
 )
 
+r = redis.Redis(**_connection_kwargs)
+
+# Async clients for coroutine call sites, so they don't block the event loop on a round trip. One per event loop,
+# their connections can't be shared across loops.
+_async_clients: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, redis.asyncio.Redis]' = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_async_redis() -> redis.asyncio.Redis:
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = redis.asyncio.Redis(**_connection_kwargs)
+    return client
+
+
+# ******************************************************
+# **************** REQUEST-SCOPED MEMO *****************
+# ******************************************************
+#
+# Inside redis_request_memo() (every HTTP request through RedisRequestMemoMiddleware, every pusher tick), reads
+# marked with @request_memoized hit Redis once per arguments. Writes through this module clear the memo so a
+# request reads its own writes. Memoized values are shared by the callers, treat them as read-only.
+
+_request_memo: ContextVar[Optional[dict]] = ContextVar('redis_request_memo', default=None)
+
+
+@contextmanager
+def redis_request_memo():
+    if _request_memo.get() is not None:
+        # Nested, the outer scope's memo keeps applying
+        yield
+        return
+    token = _request_memo.set({})
+    try:
+        yield
+    finally:
+        _request_memo.reset(token)
+
+
+def request_memoized(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        memo = _request_memo.get()
+        if memo is None:
+            return func(*args, **kwargs)
+        key = (func.__name__, args, tuple(sorted(kwargs.items())))
+        if key not in memo:
+            memo[key] = func(*args, **kwargs)
+        return memo[key]
+
+    return wrapper
+
+
+def _get_memoized(key: tuple):
+    memo = _request_memo.get()
+    if memo is None or key not in memo:
+        return False, None
+    return True, memo[key]
+
+
+def _set_memoized(key: tuple, value):
+    memo = _request_memo.get()
+    if memo is not None:
+        memo[key] = value
+
+
+def _forget_request_memo():
+    memo = _request_memo.get()
+    if memo:
+        memo.clear()
+
 
 def try_catch_decorator(func):
     def wrapper(*args, **kwargs):
@@ -29,11 +109,17 @@ def try_catch_decorator(func):
 
 @try_catch_decorator
 def get_generic_cache(path: str):
+    data = get_generic_cache_payload(path)
+    return json.loads(data) if data else None
+
+
+@try_catch_decorator
+def get_generic_cache_payload(path: str) -> Optional[bytes]:
+    """The serialized JSON of get_generic_cache, for callers that need its size."""
     key = base64.b64encode(f'{path}'.encode('utf-8'))
     key = key.decode('utf-8')
 
-    data = r.get(f'cache:{key}')
-    return json.loads(data) if data else None
+    return r.get(f'cache:{key}')
 
 
 @try_catch_decorator
@@ -227,13 +313,16 @@ def get_user_app_subscription_customer_id(app_id: str, uid: str) -> str:
 
 
 def enable_app(uid: str, app_id: str):
+    _forget_request_memo()
     r.sadd(f'users:{uid}:enabled_plugins', app_id)
 
 
 def disable_app(uid: str, app_id: str):
+    _forget_request_memo()
     r.srem(f'users:{uid}:enabled_plugins', app_id)
 
 
+@request_memoized
 def get_enabled_apps(uid: str):
     val = r.smembers(f'users:{uid}:enabled_plugins')
     if not val:
@@ -241,6 +330,38 @@ def get_enabled_apps(uid: str):
     return [x.decode() for x in val]
 
 
+def get_apps_listing_counters(
+    uid: Optional[str], app_ids: list, include_reviews: bool = True
+) -> Tuple[Set[str], dict, dict]:
+    """
+    The user's enabled apps with the installs and reviews of app_ids, in one round trip instead of three.
+
+    Returns:
+        (enabled app ids, {app_id: installs}, {app_id: reviews}), no enabled apps without a uid and no reviews
+        unless include_reviews
+    """
+    keys = [f'plugins:{app_id}:installs' for app_id in app_ids]
+    if include_reviews:
+        keys += [f'plugins:{app_id}:reviews' for app_id in app_ids]
+    pipe = r.pipeline(transaction=False)
+    if uid:
+        pipe.smembers(f'users:{uid}:enabled_plugins')
+    if keys:
+        pipe.mget(keys)
+    results = pipe.execute() if uid or keys else []
+
+    enabled = set()
+    if uid:
+        enabled = {x.decode() for x in results.pop(0) or []}
+        _set_memoized(('get_enabled_apps', (uid,), ()), list(enabled))
+    values = results[0] if keys else []
+    installs = {app_id: int(count) if count else 0 for app_id, count in zip(app_ids, values)}
+    reviews = {}
+    if include_reviews:
+        reviews = {app_id: eval(review) if review else {} for app_id, review in zip(app_ids, values[len(app_ids) :])}
+    return enabled, installs, reviews
+
+
 def get_app_reviews(app_id: str) -> dict:
     reviews = r.get(f'plugins:{app_id}:reviews')
     if not reviews:
@@ -313,17 +434,61 @@ def get_cached_user_name(uid: str) -> str:
     return name.decode()
 
 
-# TODO: cache memories if speed improves dramatically
-def cache_memories(uid: str, memories: List[dict]):
-    r.set(f'users:{uid}:facts', str(memories))
-    r.expire(f'users:{uid}:facts', 60 * 60)  # 1 hour, most people chat during a few minutes
+# Memory snapshots (utils/memory_snapshot.py): the version is bumped on every memory write, the ids changed at each
+# version are kept in a capped sorted set so a snapshot a few versions behind only reads those again.
+MEMORIES_CHANGES_KEPT = 500
+MEMORIES_ALL_CHANGED = '*'
+
+_bump_memories_version = r.register_script("""
+    local version = redis.call('INCR', KEYS[1])
+    for i = 1, #ARGV - 1 do
+        redis.call('ZADD', KEYS[2], version, ARGV[i])
+    end
+    redis.call('ZREMRANGEBYRANK', KEYS[2], 0, -tonumber(ARGV[#ARGV]) - 1)
+    return version
+    """)
+
+
+def get_memories_version(uid: str) -> int:
+    version = r.get(f'users:{uid}:memories_version')
+    return int(version) if version else 0
+
+
+def bump_memories_version(uid: str, memory_ids: Optional[List[str]] = None) -> int:
+    """New version of the user's memories, with the ids that changed (None when any of them may have)."""
+    ids = list(memory_ids) if memory_ids is not None else [MEMORIES_ALL_CHANGED]
+    return _bump_memories_version(
+        keys=[f'users:{uid}:memories_version', f'users:{uid}:memories_changes'], args=ids + [MEMORIES_CHANGES_KEPT]
+    )
+
+
+def get_memories_changes(uid: str, since_version: int) -> Optional[List[str]]:
+    """Ids of the memories changed after since_version, None when that's not known anymore (reload everything)."""
+    key = f'users:{uid}:memories_changes'
+    pipe = r.pipeline()
+    pipe.zcard(key)
+    pipe.zrange(key, 0, 0, withscores=True)
+    pipe.zrangebyscore(key, f'({since_version}', '+inf')
+    count, oldest, changed = pipe.execute()
+    # Trimmed: the changes right after since_version may be gone
+    if count >= MEMORIES_CHANGES_KEPT and oldest and oldest[0][1] > since_version:
+        return None
+    ids = [memory_id.decode() for memory_id in changed]
+    if MEMORIES_ALL_CHANGED in ids:
+        return None
+    return ids
 
 
-def get_cached_memories(uid: str) -> List[dict]:
-    memories = r.get(f'users:{uid}:facts')
-    if not memories:
-        return []
-    return eval(memories)
+def get_memory_snapshot(uid: str, part: str = 'memories') -> Optional[bytes]:
+    return r.get(f'users:{uid}:memories_snapshot:{part}')
+
+
+def set_memory_snapshot(uid: str, data: bytes, part: str = 'memories', ttl: int = 60 * 60 * 6):
+    r.set(f'users:{uid}:memories_snapshot:{part}', data, ex=ttl)
+
+
+def delete_memory_snapshot(uid: str):
+    r.delete(f'users:{uid}:memories_snapshot:memories', f'users:{uid}:memories_snapshot:vectors')
 
 
 def cache_signed_url(blob_path: str, signed_url: str, ttl: int = 60 * 60):
@@ -381,12 +546,26 @@ def get_conversation_uids(conversation_ids: list) -> dict:
     return conversation_uids
 
 
-def add_public_conversation(conversation_id: str):
-    r.sadd('public-memories', conversation_id)
+# Public conversation ids scored by publish time, newest first in the feed. 'public-memories' is the legacy
+# unordered set, still written so both stay in sync.
+PUBLIC_CONVERSATIONS_FEED_KEY = 'public-memories-feed'
+PUBLIC_CONVERSATIONS_SNAPSHOT_KEY = 'public-memories-feed:snapshot'
+
 
+def add_public_conversation(conversation_id: str, published_at: Optional[float] = None):
+    pipe = r.pipeline()
+    pipe.sadd('public-memories', conversation_id)
+    pipe.zadd(PUBLIC_CONVERSATIONS_FEED_KEY, {conversation_id: published_at or time.time()}, nx=True)
+    pipe.execute()
 
-def remove_public_conversation(conversation_id: str):
-    r.srem('public-memories', conversation_id)
+
+def remove_public_conversation(conversation_id: str) -> bool:
+    """Returns True if the conversation was in the feed."""
+    pipe = r.pipeline()
+    pipe.srem('public-memories', conversation_id)
+    pipe.zrem(PUBLIC_CONVERSATIONS_FEED_KEY, conversation_id)
+    removed_legacy, removed = pipe.execute()
+    return bool(removed_legacy or removed)
 
 
 def get_public_conversations() -> List[str]:
@@ -396,6 +575,50 @@ def get_public_conversations() -> List[str]:
     return [x.decode() for x in val]
 
 
+def get_public_conversation_ids(offset: int, limit: int) -> List[str]:
+    """A page of the public feed, newest first."""
+    if limit <= 0:
+        return []
+    return [x.decode() for x in r.zrevrange(PUBLIC_CONVERSATIONS_FEED_KEY, offset, offset + limit - 1)]
+
+
+def get_public_feed_counts() -> Tuple[int, int]:
+    """(legacy set size, feed size), they differ until the legacy entries are backfilled."""
+    pipe = r.pipeline()
+    pipe.scard('public-memories')
+    pipe.zcard(PUBLIC_CONVERSATIONS_FEED_KEY)
+    legacy, feed = pipe.execute()
+    return legacy, feed
+
+
+def get_public_feed_missing_ids() -> List[str]:
+    """Legacy public conversations not in the feed yet."""
+    feed = {x.decode() for x in r.zrange(PUBLIC_CONVERSATIONS_FEED_KEY, 0, -1)}
+    return [conversation_id for conversation_id in get_public_conversations() if conversation_id not in feed]
+
+
+def add_public_conversations_to_feed(published_at_by_id: Dict[str, float]):
+    if published_at_by_id:
+        r.zadd(PUBLIC_CONVERSATIONS_FEED_KEY, published_at_by_id, nx=True)
+
+
+def set_public_feed_snapshot(items: List[bytes], ttl: int):
+    pipe = r.pipeline()
+    pipe.delete(PUBLIC_CONVERSATIONS_SNAPSHOT_KEY)
+    if items:
+        pipe.rpush(PUBLIC_CONVERSATIONS_SNAPSHOT_KEY, *items)
+        pipe.expire(PUBLIC_CONVERSATIONS_SNAPSHOT_KEY, ttl)
+    pipe.execute()
+
+
+def get_public_feed_snapshot() -> List[bytes]:
+    return r.lrange(PUBLIC_CONVERSATIONS_SNAPSHOT_KEY, 0, -1) or []
+
+
+def delete_public_feed_snapshot():
+    r.delete(PUBLIC_CONVERSATIONS_SNAPSHOT_KEY)
+
+
 def set_in_progress_conversation_id(uid: str, conversation_id: str, ttl: int = 300):
     r.set(f'users:{uid}:in_progress_memory_id', conversation_id)
     r.expire(f'users:{uid}:in_progress_memory_id', ttl)
@@ -432,24 +655,32 @@ def remove_conversation_meeting_id(conversation_id: str):
 
 
 def set_user_webhook_db(uid: str, wtype: str, url: str):
+    _forget_request_memo()
     r.set(f'users:{uid}:developer:webhook:{wtype}', url)
 
 
 def disable_user_webhook_db(uid: str, wtype: str):
+    _forget_request_memo()
     r.set(f'users:{uid}:developer:webhook_status:{wtype}', str(False).lower())
 
 
 def enable_user_webhook_db(uid: str, wtype: str):
+    _forget_request_memo()
     r.set(f'users:{uid}:developer:webhook_status:{wtype}', str(True).lower())
 
 
-def user_webhook_status_db(uid: str, wtype: str):
-    status = r.get(f'users:{uid}:developer:webhook_status:{wtype}')
+def _parse_webhook_status(status) -> Optional[bool]:
     if status is None:
         return None
     return status.decode() == str(True).lower()
 
 
+@request_memoized
+def user_webhook_status_db(uid: str, wtype: str):
+    return _parse_webhook_status(r.get(f'users:{uid}:developer:webhook_status:{wtype}'))
+
+
+@request_memoized
 def get_user_webhook_db(uid: str, wtype: str) -> str:
     url = r.get(f'users:{uid}:developer:webhook:{wtype}')
     if not url:
@@ -457,6 +688,46 @@ def get_user_webhook_db(uid: str, wtype: str) -> str:
     return url.decode()
 
 
+def _webhook_keys(uid: str, wtypes: Iterable[str]) -> List[str]:
+    keys = []
+    for wtype in wtypes:
+        keys += [f'users:{uid}:developer:webhook_status:{wtype}', f'users:{uid}:developer:webhook:{wtype}']
+    return keys
+
+
+def _parse_webhooks(uid: str, wtypes: List[str], values: list) -> Dict[str, Tuple[Optional[bool], str]]:
+    webhooks = {}
+    for i, wtype in enumerate(wtypes):
+        status, url = _parse_webhook_status(values[2 * i]), values[2 * i + 1].decode() if values[2 * i + 1] else ''
+        webhooks[wtype] = (status, url)
+        _set_memoized(('user_webhook_status_db', (uid, wtype), ()), status)
+        _set_memoized(('get_user_webhook_db', (uid, wtype), ()), url)
+    return webhooks
+
+
+def get_user_webhooks(uid: str, wtypes: List[str]) -> Dict[str, Tuple[Optional[bool], str]]:
+    """{wtype: (status, url)} in one MGET, status None when never set, url '' when missing."""
+    wtypes = list(wtypes)
+    cached = [_get_memoized(('get_user_webhook_db', (uid, wtype), ())) for wtype in wtypes]
+    if all(found for found, _ in cached):
+        return {wtype: (user_webhook_status_db(uid, wtype), url) for wtype, (_, url) in zip(wtypes, cached)}
+    return _parse_webhooks(uid, wtypes, r.mget(_webhook_keys(uid, wtypes)))
+
+
+def get_user_webhook(uid: str, wtype: str) -> Tuple[Optional[bool], str]:
+    """(status, url) of one webhook type in one round trip."""
+    return get_user_webhooks(uid, [wtype])[wtype]
+
+
+async def aget_user_webhook(uid: str, wtype: str) -> Tuple[Optional[bool], str]:
+    """get_user_webhook on the async client."""
+    found, url = _get_memoized(('get_user_webhook_db', (uid, wtype), ()))
+    if found:
+        return _get_memoized(('user_webhook_status_db', (uid, wtype), ()))[1], url
+    values = await get_async_redis().mget(_webhook_keys(uid, [wtype]))
+    return _parse_webhooks(uid, [wtype], values)[wtype]
+
+
 def get_filter_category_items(uid: str, category: str, limit: Optional[int] = None) -> List[str]:
     key = f'users:{uid}:filters:{category}'
     if limit:
@@ -510,10 +781,12 @@ def get_proactive_noti_sent_at_ttl(uid: str, app_id: str):
 
 def set_user_preferred_app(uid: str, app_id: str):
     """Stores the user's preferred app ID."""
+    _forget_request_memo()
     key = f'user:{uid}:preferred_app'
     r.set(key, app_id)
 
 
+@request_memoized
 def get_user_preferred_app(uid: str) -> Optional[str]:
     """Retrieves the user's preferred app ID, if set."""
     key = f'user:{uid}:preferred_app'
@@ -524,10 +797,12 @@ def get_user_preferred_app(uid: str) -> Optional[str]:
 @try_catch_decorator
 def set_user_data_protection_level(uid: str, level: str):
     """Caches the user's data protection level."""
+    _forget_request_memo()
     key = f'user:{uid}:data_protection_level'
     r.set(key, level)
 
 
+@request_memoized
 @try_catch_decorator
 def get_user_data_protection_level(uid: str) -> Optional[str]:
     """Retrieves the user's cached data protection level."""
@@ -676,9 +951,11 @@ def delete_auth_code(auth_code: str):
 
 def set_credit_limit_notification_sent(uid: str, ttl: int = 60 * 60 * 24):
     """Cache that credit limit notification was sent to user (24 hours TTL by default)"""
+    _forget_request_memo()
     r.set(f'users:{uid}:credit_limit_notification_sent', '1', ex=ttl)
 
 
+@request_memoized
 def has_credit_limit_notification_been_sent(uid: str) -> bool:
     """Check if credit limit notification was already sent to user recently"""
     return r.exists(f'users:{uid}:credit_limit_notification_sent')
@@ -817,3 +1094,87 @@ def has_daily_summary_been_sent(uid: str, date: str) -> bool:
         True if summary was already sent for this date, False otherwise
     """
     return r.exists(f'users:{uid}:daily_summary_sent:{date}')
+
+
+def set_daily_summary_checkpoint(uid: str, date: str, checkpoint: dict, ttl: int = 60 * 60 * 2):
+    """
+    Store how far the daily summary job got for a user and date, so a restarted job resumes from there.
+
+    Args:
+        uid: User ID
+        date: Date string in YYYY-MM-DD format
+        checkpoint: e.g. {'stage': 'stored', 'summary_id': '...'} or {'stage': 'sending'}
+        ttl: Time to live in seconds (default: 2 hours, same window as the sent flag)
+    """
+    r.set(f'users:{uid}:daily_summary_checkpoint:{date}', json.dumps(checkpoint), ex=ttl)
+
+
+def get_daily_summary_checkpoint(uid: str, date: str) -> Optional[dict]:
+    data = r.get(f'users:{uid}:daily_summary_checkpoint:{date}')
+    return json.loads(data) if data else None
+
+
+# ******************************************************
+# ***************** SPEAKER GALLERIES ******************
+# ******************************************************
+
+
+def get_speaker_gallery_version(uid: str) -> int:
+    """Version of the user's speaker embeddings, bumped on every change so cached galleries know they're stale."""
+    version = r.get(f'users:{uid}:speaker_gallery_version')
+    return int(version) if version else 0
+
+
+def bump_speaker_gallery_version(uid: str) -> int:
+    return r.incr(f'users:{uid}:speaker_gallery_version')
+
+
+# ******************************************************
+# ******************* TRANSLATIONS *********************
+# ******************************************************
+
+
+def get_cached_translations(dest_language: str, text_hashes: List[str]) -> List[Optional[str]]:
+    """Translations by source text hash, None where not cached, in one MGET."""
+    if not text_hashes:
+        return []
+    values = r.mget([f'translations:{dest_language}:{text_hash}' for text_hash in text_hashes])
+    return [value.decode() if value is not None else None for value in values]
+
+
+def cache_translations(dest_language: str, translations: Dict[str, str], ttl: int = 60 * 60 * 24 * 7):
+    """{text hash: translation} in one pipeline."""
+    if not translations:
+        return
+    pipe = r.pipeline()
+    for text_hash, translated in translations.items():
+        pipe.set(f'translations:{dest_language}:{text_hash}', translated, ex=ttl)
+    pipe.execute()
+
+
+# ******************************************************
+# ********** CONVERSATION STATUS NOTIFICATIONS *********
+# ******************************************************
+
+
+def conversation_status_channel(uid: str) -> str:
+    return f'users:{uid}:conversation_status'
+
+
+def publish_conversation_status(uid: str, conversation_id: str, status: str):
+    """Tells the user's live sessions, on any instance, that a conversation changed status ('deleted' when removed)."""
+    r.publish(conversation_status_channel(uid), json.dumps({'conversation_id': conversation_id, 'status': status}))
+
+
+# ******************************************************
+# ***************** OFFLINE SYNC JOBS ******************
+# ******************************************************
+
+
+def set_sync_job(uid: str, job_id: str, job: dict, ttl: int = 60 * 60 * 24):
+    r.set(f'users:{uid}:sync_jobs:{job_id}', json.dumps(job, default=str), ex=ttl)
+
+
+def get_sync_job(uid: str, job_id: str) -> Optional[dict]:
+    data = r.get(f'users:{uid}:sync_jobs:{job_id}')
+    return json.loads(data) if data else None
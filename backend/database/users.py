@@ -438,6 +438,11 @@ def delete_user_data(uid: str):
                 print(f"Processed all documents in {collection_ref.path}")
                 break
 
+    # Cached copies of the memories (imported here, database.memories imports this module)
+    from database.memories import evict_memory_snapshot
+
+    evict_memory_snapshot(uid)
+
     # delete the user document itself
     print(f"Deleting user document: {uid}")
     user_ref.delete()
@@ -1,20 +1,38 @@
 import json
 import os
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone, timedelta
-from typing import List
+from typing import Dict, List, Tuple
 
 from pinecone import Pinecone
 
+from database import redis_db
 from models.conversation import Conversation
 from utils.llm.clients import embeddings
+from .vector_store import LocalVectorIndex
 
-if os.getenv('PINECONE_API_KEY') is not None:
+# VECTOR_DB_BACKEND=local keeps vectors in-process (persisted under VECTOR_DB_LOCAL_PATH if set)
+if os.getenv('VECTOR_DB_BACKEND') == 'local':
+    index = LocalVectorIndex(path=os.getenv('VECTOR_DB_LOCAL_PATH') or None)
+elif os.getenv('PINECONE_API_KEY') is not None:
     pc = Pinecone(api_key=os.getenv('PINECONE_API_KEY', ''))
     index = pc.Index(os.getenv('PINECONE_INDEX_NAME', ''))
 else:
     index = None
 
+# Pinecone recommends at most 100 vectors per upsert request
+UPSERT_BATCH_SIZE = 100
+# Fetch takes the ids in the query string
+FETCH_BATCH_SIZE = 200
+
+
+def _upsert_in_batches(data: List[dict], namespace: str):
+    results = []
+    for i in range(0, len(data), UPSERT_BATCH_SIZE):
+        results.append(index.upsert(vectors=data[i : i + UPSERT_BATCH_SIZE], namespace=namespace))
+    return results
+
 
 def _get_data(uid: str, conversation_id: str, vector: List[float]):
     return {
@@ -48,20 +66,64 @@ def update_vector_metadata(uid: str, conversation_id: str, metadata: dict):
 
 def upsert_vectors(uid: str, vectors: List[List[float]], conversations: List[Conversation]):
     data = [_get_data(uid, conversation.id, vector) for conversation, vector in zip(conversations, vectors)]
-    res = index.upsert(vectors=data, namespace="ns1")
-    print('upsert_vectors', res)
+    res = _upsert_in_batches(data, "ns1")
+    print('upsert_vectors', len(data), res)
 
 
-def query_vectors(query: str, uid: str, starts_at: int = None, ends_at: int = None, k: int = 5) -> List[str]:
+def upsert_vectors2_bulk(uid: str, conversations: List[Conversation], vectors: List[List[float]], metadata: List[dict]):
+    """
+    Bulk variant of upsert_vector2: one upsert request per UPSERT_BATCH_SIZE conversations.
+    """
+    data = []
+    for conversation, vector, meta in zip(conversations, vectors, metadata):
+        item = _get_data(uid, conversation.id, vector)
+        item['metadata'].update(meta)
+        data.append(item)
+    if not data:
+        return
+    res = _upsert_in_batches(data, "ns1")
+    print('upsert_vectors2_bulk', len(data), res)
+
+
+def _query_filter(uid: str, starts_at: int = None, ends_at: int = None) -> dict:
     filter_data = {'uid': uid}
     if starts_at is not None:
         filter_data['created_at'] = {'$gte': starts_at, '$lte': ends_at}
+    return filter_data
+
+
+def query_vectors(query: str, uid: str, starts_at: int = None, ends_at: int = None, k: int = 5) -> List[str]:
+    filter_data = _query_filter(uid, starts_at, ends_at)
 
     xq = embeddings.embed_query(query)
     xc = index.query(vector=xq, top_k=k, include_metadata=False, filter=filter_data, namespace="ns1")
     return [item['id'].replace(f'{uid}-', '') for item in xc['matches']]
 
 
+def query_vectors_many(
+    queries: List[str], uid: str, starts_at: int = None, ends_at: int = None, k: int = 5
+) -> List[List[str]]:
+    """
+    Batched query_vectors: embeds all queries in one request, then queries the index once per query
+    (in a single call for the local backend, concurrently for Pinecone).
+    """
+    if not queries:
+        return []
+    filter_data = _query_filter(uid, starts_at, ends_at)
+    vectors = embeddings.embed_documents(queries)
+
+    if isinstance(index, LocalVectorIndex):
+        results = index.query_many(vectors, top_k=k, filter=filter_data, namespace="ns1")
+    else:
+
+        def _query(vector):
+            return index.query(vector=vector, top_k=k, include_metadata=False, filter=filter_data, namespace="ns1")
+
+        with ThreadPoolExecutor(max_workers=min(len(vectors), 8)) as executor:
+            results = list(executor.map(_query, vectors))
+    return [[item['id'].replace(f'{uid}-', '') for item in xc['matches']] for xc in results]
+
+
 def query_vectors_by_metadata(
     uid: str,
     vector: List[float],
@@ -142,6 +204,16 @@ def delete_vector(uid: str, conversation_id: str):
     print('delete_vector', vector_id, result)
 
 
+def delete_vectors(uid: str, conversation_ids: List[str]):
+    """
+    Delete several conversation vectors in one request per UPSERT_BATCH_SIZE ids.
+    """
+    vector_ids = [f'{uid}-{conversation_id}' for conversation_id in conversation_ids]
+    for i in range(0, len(vector_ids), UPSERT_BATCH_SIZE):
+        result = index.delete(ids=vector_ids[i : i + UPSERT_BATCH_SIZE], namespace="ns1")
+        print('delete_vectors', len(vector_ids[i : i + UPSERT_BATCH_SIZE]), result)
+
+
 # ==========================================
 # Memory Vector Functions
 # For memory embeddings and semantic search
@@ -171,9 +243,68 @@ def upsert_memory_vector(uid: str, memory_id: str, content: str, category: str):
     }
     res = index.upsert(vectors=[data], namespace=MEMORIES_NAMESPACE)
     print('upsert_memory_vector', memory_id, res)
+    _memory_vectors_changed(uid, [memory_id])
     return vector
 
 
+def upsert_memory_vectors(uid: str, memories: List[Tuple[str, str, str]]) -> List[List[float]]:
+    """
+    Bulk variant of upsert_memory_vector for (memory_id, content, category) tuples:
+    embeds all contents in one batch and upserts them in UPSERT_BATCH_SIZE requests.
+    """
+    if index is None:
+        print('Pinecone index not initialized, skipping memory vectors upsert')
+        return []
+    if not memories:
+        return []
+
+    vectors = embeddings.embed_documents([content for _, content, _ in memories])
+    created_at = int(datetime.now(timezone.utc).timestamp())
+    data = [
+        {
+            "id": f'{uid}-{memory_id}',
+            "values": vector,
+            "metadata": {
+                "uid": uid,
+                "memory_id": memory_id,
+                "category": category,
+                "created_at": created_at,
+            },
+        }
+        for (memory_id, _, category), vector in zip(memories, vectors)
+    ]
+    res = _upsert_in_batches(data, MEMORIES_NAMESPACE)
+    print('upsert_memory_vectors', len(data), res)
+    _memory_vectors_changed(uid, [memory_id for memory_id, _, _ in memories])
+    return vectors
+
+
+def _memory_vectors_changed(uid: str, memory_ids: List[str]):
+    # Memory snapshots hold the embeddings too, the memory was saved before its vector
+    try:
+        redis_db.bump_memories_version(uid, memory_ids)
+    except Exception as e:
+        print(f"Error bumping memories version: {e}")
+
+
+def fetch_memory_vectors(uid: str, memory_ids: List[str]) -> Dict[str, List[float]]:
+    """
+    Stored embeddings by memory id, memories without one left out.
+    """
+    if index is None:
+        print('Pinecone index not initialized, skipping memory vectors fetch')
+        return {}
+
+    vectors = {}
+    for i in range(0, len(memory_ids), FETCH_BATCH_SIZE):
+        ids = [f'{uid}-{memory_id}' for memory_id in memory_ids[i : i + FETCH_BATCH_SIZE]]
+        result = index.fetch(ids=ids, namespace=MEMORIES_NAMESPACE)
+        fetched = result['vectors'] if isinstance(result, dict) else result.vectors
+        for vector_id, vector in fetched.items():
+            vectors[vector_id[len(uid) + 1 :]] = vector['values']
+    return vectors
+
+
 def find_similar_memories(uid: str, content: str, threshold: float = 0.85, limit: int = 5) -> List[dict]:
     """
     Find memories similar to the given content.
@@ -247,3 +378,19 @@ def delete_memory_vector(uid: str, memory_id: str):
     vector_id = f'{uid}-{memory_id}'
     result = index.delete(ids=[vector_id], namespace=MEMORIES_NAMESPACE)
     print('delete_memory_vector', vector_id, result)
+
+
+def delete_memory_vectors(uid: str, memory_ids: List[str]):
+    """
+    Delete several memory vectors in one request per UPSERT_BATCH_SIZE ids.
+    """
+    if index is None:
+        print('Pinecone index not initialized, skipping memory vectors delete')
+        return
+    if not memory_ids:
+        return
+
+    vector_ids = [f'{uid}-{memory_id}' for memory_id in memory_ids]
+    for i in range(0, len(vector_ids), UPSERT_BATCH_SIZE):
+        result = index.delete(ids=vector_ids[i : i + UPSERT_BATCH_SIZE], namespace=MEMORIES_NAMESPACE)
+        print('delete_memory_vectors', len(vector_ids[i : i + UPSERT_BATCH_SIZE]), result)
@@ -0,0 +1,557 @@
+"""
+Local, in-process vector index with the subset of the Pinecone Index API used by database.vector_db.
+
+- Vectors are partitioned per namespace and per metadata 'uid', so user-scoped queries only touch that user's rows
+- Exact (flat) cosine search; large partitions get an IVF coarse index (spherical k-means) with exact re-ranking
+  and an exact fallback when filters leave too few candidates
+- Pinecone-style metadata filters: implicit equality, $eq/$ne/$in/$nin/$gt/$gte/$lt/$lte, $and/$or, list fields
+- Deletes leave a tombstone in the row, so the IVF lists stay valid; rows are compacted once tombstones pile up
+- Optional persistence: one .npy (memory-mapped on load) + one .json file per partition. Writes only mark the
+  partition dirty, dirty partitions are written together every flush interval and at exit, or on flush()
+"""
+
+import json
+import math
+import os
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from utils.other.scheduler import get_delayed_calls
+
+DEFAULT_PARTITION = '_'
+IVF_MIN_SIZE = 20000
+IVF_REBUILD_RATIO = 0.2
+TOMBSTONE_RATIO = 0.2  # deleted rows, of all rows, before a partition is compacted
+FLUSH_INTERVAL = 5.0  # seconds
+
+
+# *********************************
+# ******** METADATA FILTERS *******
+# *********************************
+
+
+def _eq(value, arg) -> bool:
+    if isinstance(value, list):
+        return arg in value
+    return value == arg
+
+
+def _in(value, arg) -> bool:
+    if value is None:
+        return False
+    if isinstance(value, list):
+        return any(item in arg for item in value)
+    return value in arg
+
+
+def _compare(op):
+    def _check(value, arg) -> bool:
+        if value is None or isinstance(value, (list, dict, str)) != isinstance(arg, (list, dict, str)):
+            return False
+        try:
+            return op(value, arg)
+        except TypeError:
+            return False
+
+    return _check
+
+
+_OPERATORS = {
+    '$eq': _eq,
+    '$ne': lambda value, arg: not _eq(value, arg),
+    '$in': _in,
+    '$nin': lambda value, arg: not _in(value, arg),
+    '$gt': _compare(lambda a, b: a > b),
+    '$gte': _compare(lambda a, b: a >= b),
+    '$lt': _compare(lambda a, b: a < b),
+    '$lte': _compare(lambda a, b: a <= b),
+}
+
+
+def matches_filter(metadata: Dict[str, Any], filter: Optional[Dict[str, Any]]) -> bool:
+    """Evaluates a Pinecone-style metadata filter."""
+    if not filter:
+        return True
+    for key, condition in filter.items():
+        if key == '$and':
+            if not all(matches_filter(metadata, item) for item in condition):
+                return False
+        elif key == '$or':
+            if not any(matches_filter(metadata, item) for item in condition):
+                return False
+        else:
+            value = metadata.get(key)
+            if not isinstance(condition, dict):
+                condition = {'$eq': condition}
+            for op, arg in condition.items():
+                check = _OPERATORS.get(op)
+                if check is None:
+                    raise ValueError(f'Unsupported filter operator: {op}')
+                if not check(value, arg):
+                    return False
+    return True
+
+
+def _filter_partition(filter: Optional[Dict[str, Any]]) -> Optional[str]:
+    """Returns the uid the filter pins results to, if any."""
+    if not filter:
+        return None
+    condition = filter.get('uid')
+    if isinstance(condition, str):
+        return condition
+    if isinstance(condition, dict) and isinstance(condition.get('$eq'), str):
+        return condition['$eq']
+    for item in filter.get('$and', []):
+        uid = _filter_partition(item)
+        if uid is not None:
+            return uid
+    return None
+
+
+# *********************************
+# ********** PARTITIONS ***********
+# *********************************
+
+
+class _IVF:
+    def __init__(self, centroids: np.ndarray, lists: List[np.ndarray], built_size: int):
+        self.centroids = centroids
+        self.lists = lists
+        self.built_size = built_size
+
+
+class _Partition:
+    def __init__(self, dimensions: int):
+        self.dimensions = dimensions
+        self.vectors = np.zeros((0, dimensions), dtype=np.float32)
+        self.ids: List[str] = []
+        self.metadata: List[Dict[str, Any]] = []
+        self.positions: Dict[str, int] = {}
+        self.deleted = np.zeros(0, dtype=bool)  # tombstones, per row
+        self.tombstones = 0
+        self.ivf: Optional[_IVF] = None
+        self.dirty = False
+
+    @property
+    def size(self) -> int:
+        """Rows, tombstones included."""
+        return len(self.ids)
+
+    @property
+    def count(self) -> int:
+        return len(self.positions)
+
+    def _writable(self, capacity: int):
+        # Loaded partitions are read-only memory maps until first modified; grow by doubling
+        if isinstance(self.vectors, np.memmap) or not self.vectors.flags.writeable or capacity > len(self.vectors):
+            grown = np.zeros((max(capacity, len(self.vectors) * 2, 16), self.dimensions), dtype=np.float32)
+            grown[: self.size] = self.vectors[: self.size]
+            self.vectors = grown
+        if len(self.deleted) < len(self.vectors):
+            deleted = np.zeros(len(self.vectors), dtype=bool)
+            deleted[: self.size] = self.deleted[: self.size]
+            self.deleted = deleted
+
+    def upsert(self, ids: List[str], vectors: np.ndarray, metadata: List[Dict[str, Any]]):
+        new_ids = [vector_id for vector_id in dict.fromkeys(ids) if vector_id not in self.positions]
+        self._writable(self.size + len(new_ids))
+        for vector_id in new_ids:
+            self.positions[vector_id] = self.size
+            self.ids.append(vector_id)
+            self.metadata.append({})
+        rows = np.fromiter((self.positions[vector_id] for vector_id in ids), dtype=np.int64, count=len(ids))
+        self.vectors[rows] = vectors
+        for row, meta in zip(rows, metadata):
+            self.metadata[row] = meta
+        self.dirty = True
+
+    def delete(self, ids: Iterable[str]) -> int:
+        deleted = 0
+        for vector_id in ids:
+            row = self.positions.pop(vector_id, None)
+            if row is None:
+                continue
+            self.deleted[row] = True
+            self.metadata[row] = {}
+            deleted += 1
+        if deleted:
+            self.tombstones += deleted
+            self.dirty = True
+            if self.tombstones > TOMBSTONE_RATIO * self.size:
+                self.compact()
+        return deleted
+
+    def compact(self):
+        """Drops the tombstoned rows, the IVF lists are renumbered rather than rebuilt."""
+        if not self.tombstones:
+            return
+        deleted = self.deleted[: self.size]
+        keep = np.flatnonzero(~deleted)
+        if self.ivf is not None:
+            renumbered = np.cumsum(~deleted) - 1
+            lists = [renumbered[rows[~deleted[rows]]] for rows in self.ivf.lists]
+            built_size = int(np.count_nonzero(~deleted[: self.ivf.built_size]))
+            self.ivf = _IVF(self.ivf.centroids, lists, built_size) if built_size else None
+        self.vectors = self.vectors[keep]
+        self.ids = [self.ids[row] for row in keep]
+        self.metadata = [self.metadata[row] for row in keep]
+        self.positions = {vector_id: i for i, vector_id in enumerate(self.ids)}
+        self.deleted = np.zeros(len(self.ids), dtype=bool)
+        self.tombstones = 0
+
+    def active(self) -> np.ndarray:
+        return self.vectors[: self.size]
+
+    def live_rows(self) -> np.ndarray:
+        if not self.tombstones:
+            return np.arange(self.size)
+        return np.flatnonzero(~self.deleted[: self.size])
+
+    # ****** IVF ******
+
+    def maybe_build_ivf(self, min_size: int, seed: int = 0):
+        n = self.size
+        if n < min_size:
+            self.ivf = None
+            return
+        if self.ivf is not None and n - self.ivf.built_size <= IVF_REBUILD_RATIO * self.ivf.built_size:
+            return
+
+        vectors = self.active()
+        rng = np.random.default_rng(seed)
+        nlist = max(8, int(math.sqrt(n)))
+        sample = vectors[np.sort(rng.choice(n, size=min(n, nlist * 32), replace=False))]
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+        for _ in range(8):
+            # Spherical k-means: assign by cosine, centroid = normalized sum of its members
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            order = np.argsort(assignment, kind='stable')
+            counts = np.bincount(assignment, minlength=nlist)
+            present = np.flatnonzero(counts)
+            sums = np.add.reduceat(sample[order], np.concatenate(([0], np.cumsum(counts[present])[:-1])), axis=0)
+            centroids[present] = _normalize(sums)
+
+        assignment = np.empty(n, dtype=np.int64)
+        for start in range(0, n, 65536):
+            assignment[start : start + 65536] = np.argmax(vectors[start : start + 65536] @ centroids.T, axis=1)
+        order = np.argsort(assignment, kind='stable')
+        bounds = np.searchsorted(assignment[order], np.arange(nlist + 1))
+        lists = [order[bounds[i] : bounds[i + 1]] for i in range(nlist)]
+        self.ivf = _IVF(centroids, lists, n)
+
+    def candidates(self, query: np.ndarray, nprobe: int) -> Optional[np.ndarray]:
+        if self.ivf is None:
+            return None
+        nprobe = min(nprobe, len(self.ivf.lists))
+        probes = np.argpartition(-(self.ivf.centroids @ query), nprobe - 1)[:nprobe]
+        tail = np.arange(self.ivf.built_size, self.size, dtype=np.int64)
+        return np.concatenate([self.ivf.lists[i] for i in probes] + [tail])
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+# *********************************
+# ************ INDEX **************
+# *********************************
+
+
+class LocalVectorIndex:
+    """
+    Drop-in replacement for the Pinecone Index methods used by database.vector_db
+    (upsert, update, query, fetch, delete), plus query_many for batched queries.
+
+    Scores are cosine similarities. flush_interval is the seconds between writes of the dirty partitions,
+    0 writes on every change and None on flush() only.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        ivf_min_size: int = IVF_MIN_SIZE,
+        nprobe: int = 16,
+        flush_interval: Optional[float] = FLUSH_INTERVAL,
+    ):
+        self.path = path
+        self.ivf_min_size = ivf_min_size
+        self.nprobe = nprobe
+        self.flush_interval = flush_interval
+
+        self._namespaces: Dict[str, Dict[str, _Partition]] = {}
+        self._id_partition: Dict[str, Dict[str, str]] = {}
+        self._loaded: set = set()
+        self._lock = threading.RLock()
+        self._flush_scheduled = False
+
+    # ****** PERSISTENCE ******
+
+    def _partition_file(self, namespace: str, partition: str) -> str:
+        safe = ''.join(c if c.isalnum() or c in '-_' else f'%{ord(c):02x}' for c in partition)
+        return os.path.join(self.path, namespace, safe)
+
+    def _load_namespace(self, namespace: str) -> Dict[str, _Partition]:
+        partitions = self._namespaces.setdefault(namespace, {})
+        id_partition = self._id_partition.setdefault(namespace, {})
+        if namespace in self._loaded:
+            return partitions
+        self._loaded.add(namespace)
+        if not self.path or not os.path.isdir(os.path.join(self.path, namespace)):
+            return partitions
+
+        for filename in os.listdir(os.path.join(self.path, namespace)):
+            if not filename.endswith('.json'):
+                continue
+            base = os.path.join(self.path, namespace, filename[: -len('.json')])
+            with open(base + '.json') as f:
+                stored = json.load(f)
+            vectors = np.load(base + '.npy', mmap_mode='r')
+            partition = _Partition(vectors.shape[1])
+            partition.vectors = vectors
+            partition.deleted = np.zeros(len(vectors), dtype=bool)
+            partition.ids = stored['ids']
+            partition.metadata = stored['metadata']
+            partition.positions = {vector_id: i for i, vector_id in enumerate(partition.ids)}
+            partitions[stored['partition']] = partition
+            for vector_id in partition.ids:
+                id_partition[vector_id] = stored['partition']
+        return partitions
+
+    def _write_partition(self, namespace: str, key: str, partition: _Partition):
+        base = self._partition_file(namespace, key)
+        os.makedirs(os.path.dirname(base), exist_ok=True)
+        if partition.count == 0:
+            for ext in ('.npy', '.json'):
+                if os.path.exists(base + ext):
+                    os.remove(base + ext)
+        else:
+            # Tombstones aren't written, a reload starts without any
+            rows = partition.live_rows()
+            with open(base + '.npy.tmp', 'wb') as f:
+                np.save(f, np.ascontiguousarray(partition.active()[rows]))
+            with open(base + '.json.tmp', 'w') as f:
+                ids = [partition.ids[row] for row in rows]
+                metadata = [partition.metadata[row] for row in rows]
+                json.dump({'partition': key, 'ids': ids, 'metadata': metadata}, f)
+            os.replace(base + '.npy.tmp', base + '.npy')
+            os.replace(base + '.json.tmp', base + '.json')
+        partition.dirty = False
+
+    def flush(self):
+        """Writes the dirty partitions."""
+        if not self.path:
+            return
+        with self._lock:
+            self._flush_scheduled = False
+            for namespace, partitions in self._namespaces.items():
+                for key, partition in partitions.items():
+                    if partition.dirty:
+                        self._write_partition(namespace, key, partition)
+
+    def _after_write(self, namespace: str, keys: Iterable[str]):
+        if not self.path or self.flush_interval is None:
+            return
+        if self.flush_interval == 0:
+            partitions = self._namespaces[namespace]
+            for key in set(keys):
+                if key in partitions and partitions[key].dirty:
+                    self._write_partition(namespace, key, partitions[key])
+        elif not self._flush_scheduled:
+            # Everything written until then goes in one flush, the delayed calls also run at exit
+            self._flush_scheduled = True
+            get_delayed_calls().schedule(self.flush_interval, self.flush)
+
+    # ****** WRITES ******
+
+    def upsert(self, vectors: List[dict], namespace: str = ''):
+        if not vectors:
+            return {'upserted_count': 0}
+        with self._lock:
+            partitions = self._load_namespace(namespace)
+            id_partition = self._id_partition[namespace]
+
+            grouped: Dict[str, List[dict]] = {}
+            for item in vectors:
+                metadata = dict(item.get('metadata') or {})
+                key = metadata.get('uid') or DEFAULT_PARTITION
+                previous = id_partition.get(item['id'])
+                if previous is not None and previous != key:
+                    partitions[previous].delete([item['id']])
+                grouped.setdefault(key, []).append({**item, 'metadata': metadata})
+
+            for key, items in grouped.items():
+                values = _normalize(np.asarray([item['values'] for item in items], dtype=np.float32))
+                partition = partitions.get(key)
+                if partition is None:
+                    partition = partitions[key] = _Partition(values.shape[1])
+                if values.shape[1] != partition.dimensions:
+                    raise ValueError(f'Vector dimension {values.shape[1]} does not match index {partition.dimensions}')
+                partition.upsert([item['id'] for item in items], values, [item['metadata'] for item in items])
+                for item in items:
+                    id_partition[item['id']] = key
+
+            self._after_write(namespace, grouped.keys())
+        return {'upserted_count': len(vectors)}
+
+    def update(self, id: str, set_metadata: Optional[dict] = None, values: Optional[List[float]] = None, namespace=''):
+        with self._lock:
+            self._load_namespace(namespace)
+            key = self._id_partition[namespace].get(id)
+            if key is None:
+                return {}
+            partition = self._namespaces[namespace][key]
+            row = partition.positions[id]
+            metadata = {**partition.metadata[row], **(set_metadata or {})}
+            vector = partition.active()[row] if values is None else values
+            self.upsert([{'id': id, 'values': vector, 'metadata': metadata}], namespace=namespace)
+        return {}
+
+    def delete(self, ids: Optional[List[str]] = None, namespace: str = '', filter: Optional[dict] = None):
+        with self._lock:
+            partitions = self._load_namespace(namespace)
+            id_partition = self._id_partition[namespace]
+            by_partition: Dict[str, List[str]] = {}
+
+            for vector_id in ids or []:
+                key = id_partition.pop(vector_id, None)
+                if key is not None:
+                    by_partition.setdefault(key, []).append(vector_id)
+
+            if filter:
+                pinned = _filter_partition(filter)
+                keys = [pinned] if pinned is not None else list(partitions)
+                for key in keys:
+                    partition = partitions.get(key)
+                    if partition is None:
+                        continue
+                    matched = [
+                        vector_id
+                        for vector_id, row in partition.positions.items()
+                        if matches_filter(partition.metadata[row], filter)
+                    ]
+                    for vector_id in matched:
+                        id_partition.pop(vector_id, None)
+                    by_partition.setdefault(key, []).extend(matched)
+
+            for key, vector_ids in by_partition.items():
+                partitions[key].delete(vector_ids)
+            self._after_write(namespace, by_partition.keys())
+        return {}
+
+    # ****** READS ******
+
+    def fetch(self, ids: List[str], namespace: str = ''):
+        with self._lock:
+            self._load_namespace(namespace)
+            result = {}
+            for vector_id in ids:
+                key = self._id_partition[namespace].get(vector_id)
+                if key is None:
+                    continue
+                partition = self._namespaces[namespace][key]
+                row = partition.positions[vector_id]
+                result[vector_id] = {
+                    'id': vector_id,
+                    'values': partition.active()[row].tolist(),
+                    'metadata': partition.metadata[row],
+                }
+        return {'vectors': result, 'namespace': namespace}
+
+    def _search_partition(self, partition: _Partition, query: np.ndarray, top_k: int, filter, exact: bool):
+        rows = None if exact else partition.candidates(query, self.nprobe)
+        if rows is None:
+            scores = partition.active() @ query
+            rows = np.arange(partition.size)
+        else:
+            scores = partition.active()[rows] @ query
+
+        # Filter the best-scoring rows first and widen the window only if filters reject too many
+        found = []
+        window = min(len(scores), max(4 * top_k, 256))
+        seen = 0
+        while True:
+            if window < len(scores):
+                top = np.argpartition(-scores, window - 1)[:window]
+            else:
+                top = np.arange(len(scores))
+            top = top[np.argsort(-scores[top], kind='stable')]
+            for i in top[seen:]:
+                row = int(rows[i])
+                if partition.deleted[row]:
+                    continue
+                if matches_filter(partition.metadata[row], filter):
+                    found.append((float(scores[i]), row))
+                    if len(found) >= top_k:
+                        return found
+            seen = len(top)
+            if window >= len(scores):
+                return found
+            window = min(len(scores), window * 4)
+
+    def _query_one(self, partitions, keys, query: np.ndarray, top_k: int, filter, include_values, include_metadata):
+        results = []
+        for key in keys:
+            partition = partitions.get(key)
+            if partition is None or partition.count == 0:
+                continue
+            if len(query) != partition.dimensions:
+                raise ValueError(f'Query dimension {len(query)} does not match index {partition.dimensions}')
+            partition.maybe_build_ivf(self.ivf_min_size)
+            found = self._search_partition(partition, query, top_k, filter, exact=False)
+            if len(found) < top_k and partition.ivf is not None:
+                found = self._search_partition(partition, query, top_k, filter, exact=True)
+            results.extend((score, partition, row) for score, row in found)
+
+        results.sort(key=lambda item: -item[0])
+        matches = []
+        for score, partition, row in results[:top_k]:
+            match = {'id': partition.ids[row], 'score': score}
+            if include_metadata:
+                match['metadata'] = partition.metadata[row]
+            if include_values:
+                match['values'] = partition.active()[row].tolist()
+            matches.append(match)
+        return {'matches': matches, 'namespace': ''}
+
+    def query_many(
+        self,
+        vectors: List[List[float]],
+        top_k: int = 10,
+        filter: Optional[dict] = None,
+        namespace: str = '',
+        include_values: bool = False,
+        include_metadata: bool = False,
+    ) -> List[dict]:
+        with self._lock:
+            partitions = self._load_namespace(namespace)
+            pinned = _filter_partition(filter)
+            keys = [pinned] if pinned is not None else list(partitions)
+            queries = _normalize(np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1))
+            results = []
+            for query in queries:
+                result = self._query_one(partitions, keys, query, top_k, filter, include_values, include_metadata)
+                result['namespace'] = namespace
+                results.append(result)
+            return results
+
+    def query(
+        self,
+        vector: List[float],
+        top_k: int = 10,
+        filter: Optional[dict] = None,
+        namespace: str = '',
+        include_values: bool = False,
+        include_metadata: bool = False,
+    ) -> dict:
+        return self.query_many([vector], top_k, filter, namespace, include_values, include_metadata)[0]
+
+    def describe_index_stats(self) -> dict:
+        with self._lock:
+            namespaces = {}
+            for namespace, partitions in self._namespaces.items():
+                namespaces[namespace] = {'vector_count': sum(p.count for p in partitions.values())}
+            return {'namespaces': namespaces, 'total_vector_count': sum(n['vector_count'] for n in namespaces.values())}
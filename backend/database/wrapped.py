@@ -3,7 +3,9 @@ Database operations for Wrapped (yearly recap) stored in users/{uid}/wrapped/{ye
 """
 
 from datetime import datetime, timezone
-from typing import Optional
+from typing import Any, Optional
+
+from google.cloud import firestore
 
 from ._client import db
 
@@ -114,6 +116,7 @@ def update_wrapped_status(
         update_data['completed_at'] = now
         update_data['result'] = result
         update_data['error'] = None
+        update_data['stages'] = firestore.DELETE_FIELD
     elif status == WrappedStatus.ERROR:
         update_data['error'] = error
         update_data['result'] = None
@@ -149,9 +152,35 @@ def update_wrapped_progress(uid: str, year: int, progress: dict) -> bool:
     return True
 
 
+def save_wrapped_stage(uid: str, year: int, stage: str, result: Any, progress: Optional[dict] = None):
+    """
+    Checkpoint the result of a generation stage, so a retry of a failed or stuck generation skips it.
+    Also a heartbeat, like update_wrapped_progress.
+
+    Args:
+        uid: User ID
+        year: Year (e.g., 2025)
+        stage: Stage name
+        result: Stage result
+        progress: Progress info to update along with it
+    """
+    user_ref = db.collection('users').document(uid)
+    wrapped_ref = user_ref.collection(WRAPPED_COLLECTION).document(str(year))
+
+    update_data = {
+        f'stages.{stage}': result,
+        'updated_at': datetime.now(timezone.utc),
+    }
+    if progress is not None:
+        update_data['progress'] = progress
+
+    wrapped_ref.update(update_data)
+
+
 def reset_wrapped_for_regeneration(uid: str, year: int) -> dict:
     """
     Reset a stuck or errored wrapped document for regeneration.
+    The stages checkpointed by the previous attempt are kept, the regeneration doesn't run them again.
 
     Args:
         uid: User ID
@@ -175,7 +204,7 @@ def reset_wrapped_for_regeneration(uid: str, year: int) -> dict:
 
     user_ref = db.collection('users').document(uid)
     wrapped_ref = user_ref.collection(WRAPPED_COLLECTION).document(str(year))
-    wrapped_ref.set(wrapped_data)
+    wrapped_ref.set(wrapped_data, merge=True)
 
     return wrapped_data
 
@@ -3,9 +3,12 @@ import shutil
 import uuid
 
 import torch
-from fastapi import UploadFile
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import Response
 from pyannote.audio import Model, Inference
 
+from embedding_batch import BadBlobsError, BatchEmbedder, pyannote_model
+
 # Instantiate pretrained speaker embedding model
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 embedding_model = Model.from_pretrained(
@@ -22,6 +25,7 @@ embedding_model_v2 = Model.from_pretrained(
 )
 embedding_inference_v2 = Inference(embedding_model_v2, window="whole")
 embedding_inference_v2.to(device)
+batch_embedder_v2 = BatchEmbedder(pyannote_model(embedding_model_v2.to(device), device))
 
 os.makedirs('_temp', exist_ok=True)
 
@@ -88,3 +92,22 @@ def embedding_endpoint_v2(file: UploadFile):
         # Clean up temporary file
         if os.path.exists(file_path):
             os.remove(file_path)
+
+
+def batch_embedding_endpoint_v2(blobs: list[bytes], sample_rate: int = 16000):
+    """
+    Extract speaker embeddings of many audio blobs with one forward pass of the v2 model.
+
+    Args:
+        blobs: WAV files or raw s16le mono PCM at sample_rate, decoded in memory
+
+    Returns:
+        float32 payload, see embedding_batch.encode_embeddings
+    """
+    try:
+        payload = batch_embedder_v2.embed_blobs(blobs, sample_rate)
+    except BadBlobsError as e:
+        raise HTTPException(status_code=400, detail=e.detail())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return Response(content=payload, media_type='application/octet-stream')
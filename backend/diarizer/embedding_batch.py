@@ -0,0 +1,177 @@
+"""
+Batched speaker embedding inference.
+
+Many audio blobs per request, decoded in memory (no temp files), embedded with one padded forward pass and
+returned as a float32 binary payload.
+
+Request body, either:
+- multipart/form-data with one or more `files` parts
+- application/octet-stream, each blob prefixed with its length as a little-endian uint32
+
+Each blob is a WAV file, or raw 16-bit little-endian mono PCM at the `sample_rate` query parameter.
+
+Response body (application/octet-stream): uint32 count, uint32 dimension, then count x dimension little-endian
+float32 values, row by row. Blobs that can't be decoded fail the request with a 400 whose detail lists their
+indexes in `bad_blobs`, so the client can send the rest again without them.
+"""
+
+import io
+import struct
+import wave
+from math import gcd
+from typing import Callable, Dict, List
+
+import numpy as np
+from fastapi import Request
+from scipy.signal import resample_poly
+
+MODEL_SAMPLE_RATE = 16000
+MAX_BATCH_SIZE = 64
+
+_LENGTH_PREFIX = struct.Struct('<I')
+_PAYLOAD_HEADER = struct.Struct('<II')
+
+# (waveforms (batch, samples) float32, weights (batch, samples) float32) -> (batch, dimension) float32
+EmbeddingModel = Callable[[np.ndarray, np.ndarray], np.ndarray]
+
+
+class BadBlobsError(ValueError):
+    """Blobs of a batch that can't be embedded, by index, with their errors."""
+
+    def __init__(self, errors: Dict[int, str]):
+        super().__init__('; '.join(f'blob {i}: {error}' for i, error in errors.items()))
+        self.errors = errors
+
+    def detail(self) -> dict:
+        return {'message': str(self), 'bad_blobs': sorted(self.errors)}
+
+
+def split_length_prefixed(body: bytes) -> List[bytes]:
+    blobs = []
+    offset = 0
+    while offset < len(body):
+        if offset + _LENGTH_PREFIX.size > len(body):
+            raise ValueError('truncated length prefix')
+        (length,) = _LENGTH_PREFIX.unpack_from(body, offset)
+        offset += _LENGTH_PREFIX.size
+        if offset + length > len(body):
+            raise ValueError('truncated blob')
+        blobs.append(body[offset : offset + length])
+        offset += length
+    return blobs
+
+
+def join_length_prefixed(blobs: List[bytes]) -> bytes:
+    return b''.join(_LENGTH_PREFIX.pack(len(blob)) + blob for blob in blobs)
+
+
+async def read_batch_blobs(request: Request) -> List[bytes]:
+    """Audio blobs of a multipart or length-prefixed request body."""
+    if request.headers.get('content-type', '').startswith('multipart/form-data'):
+        form = await request.form()
+        return [await part.read() for part in form.getlist('files')]
+    return split_length_prefixed(await request.body())
+
+
+def decode_audio(blob: bytes, sample_rate: int = MODEL_SAMPLE_RATE) -> np.ndarray:
+    """WAV or raw s16le PCM to mono float32 at MODEL_SAMPLE_RATE."""
+    if blob[:4] == b'RIFF':
+        with wave.open(io.BytesIO(blob)) as wav:
+            if wav.getsampwidth() != 2:
+                raise ValueError(f'unsupported sample width {wav.getsampwidth()}')
+            channels = wav.getnchannels()
+            sample_rate = wav.getframerate()
+            pcm = np.frombuffer(wav.readframes(wav.getnframes()), dtype='<i2')
+        if channels > 1:
+            pcm = pcm.reshape(-1, channels).mean(axis=1)
+    else:
+        pcm = np.frombuffer(blob[: len(blob) - len(blob) % 2], dtype='<i2')
+
+    waveform = pcm.astype(np.float32) / 32768.0
+    if sample_rate != MODEL_SAMPLE_RATE:
+        divisor = gcd(sample_rate, MODEL_SAMPLE_RATE)
+        waveform = resample_poly(waveform, MODEL_SAMPLE_RATE // divisor, sample_rate // divisor).astype(np.float32)
+    return waveform
+
+
+def encode_embeddings(embeddings: np.ndarray) -> bytes:
+    embeddings = np.ascontiguousarray(embeddings, dtype='<f4')
+    count, dimension = embeddings.shape
+    return _PAYLOAD_HEADER.pack(count, dimension) + embeddings.tobytes()
+
+
+def decode_embeddings(payload: bytes) -> np.ndarray:
+    count, dimension = _PAYLOAD_HEADER.unpack_from(payload)
+    values = np.frombuffer(payload, dtype='<f4', offset=_PAYLOAD_HEADER.size, count=count * dimension)
+    return values.reshape(count, dimension)
+
+
+class BatchEmbedder:
+    """
+    Pads a batch of waveforms to the longest one and runs the model once.
+
+    Shorter waveforms are padded by repeating them rather than with silence: wespeaker normalizes its fbank
+    features over all frames, zero padding moves the embedding (cosine 0.65 to the unpadded one on a random
+    init model) while repeated audio keeps it (0.9998). The weights mark the real samples for statistics pooling.
+    """
+
+    def __init__(self, model: EmbeddingModel, max_batch_size: int = MAX_BATCH_SIZE):
+        self.model = model
+        self.max_batch_size = max_batch_size
+
+    def embed(self, waveforms: List[np.ndarray]) -> np.ndarray:
+        if not waveforms:
+            raise ValueError('empty batch')
+        if len(waveforms) > self.max_batch_size:
+            raise ValueError(f'batch of {len(waveforms)} is larger than {self.max_batch_size}')
+        longest = max(len(waveform) for waveform in waveforms)
+
+        batch = np.zeros((len(waveforms), longest), dtype=np.float32)
+        weights = np.zeros((len(waveforms), longest), dtype=np.float32)
+        for i, waveform in enumerate(waveforms):
+            if len(waveform) == 0:
+                raise ValueError(f'empty audio at {i}')
+            batch[i] = np.resize(waveform, longest)
+            weights[i, : len(waveform)] = 1.0
+        return np.asarray(self.model(batch, weights), dtype=np.float32)
+
+    def embed_blobs(self, blobs: List[bytes], sample_rate: int = MODEL_SAMPLE_RATE) -> bytes:
+        """
+        Raises:
+            BadBlobsError: with every blob that can't be decoded or has no audio, nothing is embedded
+        """
+        waveforms, errors = [], {}
+        for i, blob in enumerate(blobs):
+            try:
+                waveform = decode_audio(blob, sample_rate)
+            except Exception as e:
+                errors[i] = str(e) or type(e).__name__
+                continue
+            if len(waveform) == 0:
+                errors[i] = 'empty audio'
+            else:
+                waveforms.append(waveform)
+        if errors:
+            raise BadBlobsError(errors)
+        return encode_embeddings(self.embed(waveforms))
+
+
+def pyannote_model(model, device) -> EmbeddingModel:
+    """Adapts a pyannote embedding model (pyannote/embedding, wespeaker) to the batch interface."""
+    import warnings
+
+    import torch
+
+    model.eval()
+
+    def _forward(waveforms: np.ndarray, weights: np.ndarray) -> np.ndarray:
+        with torch.inference_mode(), warnings.catch_warnings():
+            # Sample-level weights are interpolated to the model's frame rate
+            warnings.simplefilter('ignore')
+            embeddings = model(
+                torch.from_numpy(waveforms).unsqueeze(1).to(device),
+                weights=torch.from_numpy(weights).to(device),
+            )
+        return embeddings.cpu().numpy()
+
+    return _forward
@@ -1,9 +1,11 @@
 from typing import List
 
-from fastapi import FastAPI, UploadFile, File, Form
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 
 from diarization import diarization_endpoint
-from embedding import embedding_endpoint, embedding_endpoint_v2
+from embedding import embedding_endpoint, embedding_endpoint_v2, batch_embedding_endpoint_v2
+from embedding_batch import read_batch_blobs
 
 app = FastAPI()
 
@@ -26,6 +28,16 @@ def embedding_v2(file: UploadFile = File(...)):
     return embedding_endpoint_v2(file)
 
 
+@app.post('/v2/embedding/batch')
+async def embedding_v2_batch(request: Request, sample_rate: int = 16000):
+    try:
+        blobs = await read_batch_blobs(request)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    print('embedding v2 batch', len(blobs))
+    return await run_in_threadpool(batch_embedding_endpoint_v2, blobs, sample_rate)
+
+
 @app.get('/health')
 def health_check():
     return {"status": "healthy"}
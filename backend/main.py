@@ -42,6 +42,7 @@ from routers import (
     announcements,
 )
 
+from utils.other.request_memo import RedisRequestMemoMiddleware
 from utils.other.timeout import TimeoutMiddleware
 from utils.observability import log_langsmith_status
 
@@ -107,6 +108,7 @@ methods_timeout = {
 }
 
 app.add_middleware(TimeoutMiddleware, methods_timeout=methods_timeout)
+app.add_middleware(RedisRequestMemoMiddleware)
 
 
 modal_app = App(
@@ -6,6 +6,13 @@ from pydantic import BaseModel, Field
 
 from models.other import Person
 
+_SENTENCE_SPLIT_RE = re.compile(r'(?<=[.?!])\s*')
+
+
+def _normalize_text(text: str) -> str:
+    # Speechmatics specific issue with punctuation
+    return text.strip().replace('  ', ' ').replace(' ,', ',').replace(' .', '.').replace(' ?', '?')
+
 
 class Translation(BaseModel):
     lang: str
@@ -40,7 +47,7 @@ class TranscriptSegment(BaseModel):
     def segments_as_string(segments, include_timestamps=False, user_name: str = None, people: List[Person] = None):
         if not user_name:
             user_name = 'User'
-        transcript = ''
+        lines = []
         people_map = {person.id: person.name for person in people} if people else {}
         include_timestamps = include_timestamps and TranscriptSegment.can_display_seconds(segments)
         for segment in segments:
@@ -52,16 +59,22 @@ class TranscriptSegment(BaseModel):
                     speaker_name = people_map[segment.person_id]
                 else:
                     speaker_name = f'Speaker {segment.speaker_id}'
-            transcript += f'{timestamp_str}{speaker_name}: {segment_text}\n\n'
+            lines.append(f'{timestamp_str}{speaker_name}: {segment_text}\n\n')
 
-        return transcript.strip()
+        return ''.join(lines).strip()
 
     @staticmethod
     def can_display_seconds(segments):
-        for i in range(len(segments)):
-            for j in range(i + 1, len(segments)):
-                if segments[i].start > segments[j].end or segments[i].end > segments[j].start:
-                    return False
+        """
+        True if no segment starts after, or ends past the start of, a later segment.
+        One sweep keeping the max start/end seen so far instead of comparing every pair.
+        """
+        max_start = max_end = float('-inf')
+        for segment in segments:
+            if max_start > segment.end or max_end > segment.start:
+                return False
+            max_start = max(max_start, segment.start)
+            max_end = max(max_end, segment.end)
         return True
 
     @staticmethod
@@ -74,7 +87,7 @@ class TranscriptSegment(BaseModel):
             if not text:
                 return None, ""
             # Use lookbehind to split after sentence-ending punctuation
-            parts = [p for p in re.split(r'(?<=[.?!])\s*', text) if p]
+            parts = [p for p in _SENTENCE_SPLIT_RE.split(text) if p]
             if not parts:
                 return None, text
             last = parts[-1]
@@ -88,7 +101,7 @@ class TranscriptSegment(BaseModel):
             text = text.strip()
             if not text:
                 return "", ""
-            parts = [p for p in re.split(r'(?<=[.?!])\s*', text) if p]
+            parts = [p for p in _SENTENCE_SPLIT_RE.split(text) if p]
             if not parts:
                 return "", ""
             first = parts[0]
@@ -195,14 +208,11 @@ class TranscriptSegment(BaseModel):
         elif segments and joined_similar_segments and segments[-1].id == joined_similar_segments[0].id:
             segments.pop(-1)
 
+        # Only the joined segments are new or changed, the rest were normalized when they were added
+        for segment in joined_similar_segments:
+            segment.text = _normalize_text(segment.text)
         segments.extend(joined_similar_segments)
 
-        # Speechmatics specific issue with punctuation
-        for i, segment in enumerate(segments):
-            segments[i].text = (
-                segments[i].text.strip().replace('  ', ' ').replace(' ,', ',').replace(' .', '.').replace(' ?', '?')
-            )
-
         return segments, joined_similar_segments, removed_ids
 
 
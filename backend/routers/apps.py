@@ -64,11 +64,11 @@ from database.redis_db import (
     get_conversation_summary_app_ids,
     add_conversation_summary_app_id,
     remove_conversation_summary_app_id,
-    get_apps_installs_count,
-    get_apps_reviews,
+    get_apps_listing_counters,
 )
 from utils.apps import (
     get_available_apps,
+    invalidate_enabled_apps_cache,
     get_available_app_by_id,
     get_approved_available_apps,
     invalidate_approved_apps_cache,
@@ -305,11 +305,8 @@ def search_apps(
         enabled_app_ids=enabled_app_ids,
     )
 
-    user_enabled = set(get_enabled_apps(uid))
-
     app_ids = [app['id'] for app in apps_data]
-    apps_installs = get_apps_installs_count(app_ids)
-    apps_reviews = get_apps_reviews(app_ids)
+    user_enabled, apps_installs, apps_reviews = get_apps_listing_counters(uid, app_ids)
 
     apps = []
 
@@ -573,6 +570,7 @@ async def update_persona(
     if persona['approved'] and (persona['private'] is None or persona['private'] is False):
         invalidate_approved_apps_cache()
     delete_app_cache_by_id(persona_id)
+    invalidate_enabled_apps_cache()
     return {'status': 'ok', 'app_id': persona_id, 'username': data['username']}
 
 
@@ -725,6 +723,7 @@ def update_app(
     if app['approved'] and (app['private'] is None or app['private'] is False):
         invalidate_approved_apps_cache()
     delete_app_cache_by_id(app_id)
+    invalidate_enabled_apps_cache()
     return {'status': 'ok'}
 
 
@@ -739,6 +738,7 @@ def delete_app(app_id: str, uid: str = Depends(auth.get_current_user_uid)):
     if app['approved']:
         invalidate_approved_apps_cache()
     delete_app_cache_by_id(app_id)
+    invalidate_enabled_apps_cache()
     return {'status': 'ok'}
 
 
@@ -925,6 +925,7 @@ def change_app_visibility(app_id: str, private: bool, uid: str = Depends(auth.ge
         raise HTTPException(status_code=403, detail='You are not authorized to perform this action')
     update_app_visibility_in_db(app_id, private)
     delete_app_cache_by_id(app_id)
+    invalidate_enabled_apps_cache()
     return {'status': 'ok'}
 
 
@@ -1298,6 +1299,7 @@ async def update_omi_persona_connected_accounts(uid: str):
 
                 update_app_in_db(update_data)
                 delete_app_cache_by_id(persona['id'])
+                invalidate_enabled_apps_cache()
     except Exception as e:
         print(f"Error updating persona connected accounts: {e}")
 
@@ -1535,9 +1537,11 @@ async def mcp_oauth_callback(code: str, state: str):
     }
     update_app_in_db(update_dict)
     delete_app_cache_by_id(app_id)
+    invalidate_enabled_apps_cache()
 
     # Auto-enable the app for the user
     enable_app(uid, app_id)
+    invalidate_enabled_apps_cache(uid)
 
     tool_count = len(tools)
     tool_names = ', '.join(t.name for t in tools)
@@ -1608,6 +1612,7 @@ async def refresh_mcp_tools(app_id: str, uid: str = Depends(auth.get_current_use
             }
             update_app_in_db(update_dict)
             delete_app_cache_by_id(app_id)
+            invalidate_enabled_apps_cache()
 
             return {'tools_count': len(tools), 'tool_names': [t.name for t in tools]}
         raise HTTPException(status_code=401, detail='MCP server requires re-authorization')
@@ -1620,6 +1625,7 @@ async def refresh_mcp_tools(app_id: str, uid: str = Depends(auth.get_current_use
     }
     update_app_in_db(update_dict)
     delete_app_cache_by_id(app_id)
+    invalidate_enabled_apps_cache()
 
     return {'tools_count': len(tools), 'tool_names': [t.name for t in tools]}
 
@@ -1649,6 +1655,7 @@ def enable_app_endpoint(app_id: str, uid: str = Depends(auth.get_current_user_ui
         raise HTTPException(status_code=403, detail='You are not authorized to perform this action')
 
     enable_app(uid, app_id)
+    invalidate_enabled_apps_cache(uid)
     if (app.private is None or not app.private) and (app.uid is None or app.uid != uid) and not is_tester(uid):
         increase_app_installs_count(app_id)
     return {'status': 'ok'}
@@ -1664,6 +1671,7 @@ def disable_app_endpoint(app_id: str, uid: str = Depends(auth.get_current_user_u
         if app.private and app.uid != uid and not is_tester(uid):
             raise HTTPException(status_code=403, detail='You are not authorized to perform this action')
     disable_app(uid, app_id)
+    invalidate_enabled_apps_cache(uid)
     if (app.private is None or not app.private) and (app.uid is None or app.uid != uid) and not is_tester(uid):
         decrease_app_installs_count(app_id)
     return {'status': 'ok'}
@@ -1732,6 +1740,7 @@ def set_app_popular(app_id: str, value: bool = Query(...), secret_key: str = Hea
         raise HTTPException(status_code=403, detail='You are not authorized to perform this action')
     set_app_popular_db(app_id, value)
     delete_app_cache_by_id(app_id)
+    invalidate_enabled_apps_cache()
     invalidate_popular_apps_cache()
     return {'status': 'ok'}
 
@@ -1743,6 +1752,7 @@ def approve_app(app_id: str, uid: str, secret_key: str = Header(...)):
     change_app_approval_status(app_id, True)
     invalidate_approved_apps_cache()  # App is now public, invalidate cache
     delete_app_cache_by_id(app_id)
+    invalidate_enabled_apps_cache()
     app = get_available_app_by_id(app_id, uid)
     send_notification(
         uid,
@@ -1759,6 +1769,7 @@ def reject_app(app_id: str, uid: str, secret_key: str = Header(...)):
     change_app_approval_status(app_id, False)
     invalidate_approved_apps_cache()  # App removed from public list, invalidate cache
     delete_app_cache_by_id(app_id)
+    invalidate_enabled_apps_cache()
     app = get_available_app_by_id(app_id, uid)
     # TODO: Add reason for rejection in payload and also redirect to the app page
     send_notification(
@@ -30,6 +30,7 @@ from models.transcript_segment import TranscriptSegment
 from models.other import Person
 
 from utils.conversations.process_conversation import process_conversation, retrieve_in_progress_conversation
+from utils.conversations import public_feed
 from utils.conversations.search import search_conversations
 from utils.llm.conversation_processing import generate_summary_with_prompt
 from utils.speaker_identification import extract_speaker_samples
@@ -64,6 +65,7 @@ def process_in_progress_conversation(
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation in progress not found")
     redis_db.remove_in_progress_conversation_id(uid)
+    conversations_db.compact_conversation_segments(uid, conversation['id'])
 
     conversation = Conversation(**conversation)
 
@@ -122,9 +124,11 @@ def get_conversations(
     end_date: Optional[datetime] = Query(None, description="Filter by end date (inclusive)"),
     folder_id: Optional[str] = Query(None, description="Filter by folder ID"),
     starred: Optional[bool] = Query(None, description="Filter by starred status"),
+    cursor: Optional[str] = Query(None, description="ID of the last conversation of the previous page"),
+    include_transcript: bool = Query(True, description="Set to false to skip transcript segments in list views"),
     uid: str = Depends(auth.get_current_user_uid),
 ):
-    print('get_conversations', uid, limit, offset, statuses, folder_id, starred)
+    print('get_conversations', uid, limit, offset, statuses, folder_id, starred, cursor)
     # force convos statuses to processing, completed on the empty filter
     if len(statuses) == 0:
         statuses = "processing,completed"
@@ -139,6 +143,8 @@ def get_conversations(
         end_date=end_date,
         folder_id=folder_id,
         starred=starred,
+        start_after=cursor,
+        include_transcript=include_transcript,
     )
 
     for conv in conversations:
@@ -187,6 +193,7 @@ def delete_conversation(conversation_id: str, uid: str = Depends(auth.get_curren
     print('delete_conversation', conversation_id, uid)
     conversations_db.delete_conversation(uid, conversation_id)
     delete_vector(uid, conversation_id)
+    public_feed.unpublish_conversation(conversation_id)
     return {"status": "Ok"}
 
 
@@ -552,11 +559,9 @@ def set_conversation_visibility(
     _get_valid_conversation_by_id(uid, conversation_id)
     conversations_db.set_conversation_visibility(uid, conversation_id, value)
     if value == ConversationVisibility.private:
-        redis_db.remove_conversation_to_uid(conversation_id)
-        redis_db.remove_public_conversation(conversation_id)
+        public_feed.unpublish_conversation(conversation_id)
     else:
-        redis_db.store_conversation_to_uid(conversation_id, uid)
-        redis_db.add_public_conversation(conversation_id)
+        public_feed.publish_conversation(uid, conversation_id)
 
     return {"status": "Ok"}
 
@@ -597,18 +602,8 @@ def get_shared_conversation_by_id(conversation_id: str):
 
 @router.get("/v1/public-conversations", response_model=List[Conversation], tags=['conversations'])
 def get_public_conversations(offset: int = 0, limit: int = 1000):
-    conversations = redis_db.get_public_conversations()
-    data = []
-
-    conversation_uids = redis_db.get_conversation_uids(conversations)
-
-    data = [[uid, conversation_id] for conversation_id, uid in conversation_uids.items() if uid]
-    # TODO: sort in some way to have proper pagination
-
-    conversations = conversations_db.get_public_conversations(data[offset : offset + limit])
-    for conversation in conversations:
-        conversation['geolocation'] = None
-    return conversations
+    # Newest published first, without transcripts and geolocation
+    return public_feed.get_public_conversations_page(offset, limit)
 
 
 @router.post("/v1/conversations/search", response_model=dict, tags=['conversations'])
@@ -33,6 +33,7 @@ from dependencies import (
     get_uid_with_action_items_write,
 )
 from models.dev_api_key import DevApiKey, DevApiKeyCreate, DevApiKeyCreated
+from utils import memory_snapshot
 from utils.scopes import AVAILABLE_SCOPES, validate_scopes
 from utils.apps import update_personas_async
 from utils.notifications import send_action_item_data_message
@@ -157,7 +158,7 @@ def get_memories(
             category_list = [MemoryCategory(c.strip()) for c in categories.split(",") if c.strip()]
         except ValueError as e:
             raise HTTPException(status_code=400, detail=f"Invalid category {str(e)}")
-    memories = memories_db.get_memories(uid, limit, offset, [c.value for c in category_list])
+    memories = memory_snapshot.get_memories(uid, limit, offset, [c.value for c in category_list])
     for memory in memories:
         if memory.get('is_locked', False):
             content = memory.get('content', '')
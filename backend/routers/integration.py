@@ -11,7 +11,6 @@ import database.conversations as conversations_db
 import utils.apps as apps_utils
 from utils.apps import verify_api_key, app_can_read_tasks
 import database.redis_db as redis_db
-import database.memories as memory_db
 from database.redis_db import get_enabled_apps, r as redis_client
 import database.notifications as notification_db
 import database.action_items as action_items_db
@@ -23,6 +22,7 @@ from routers.conversations import process_conversation, trigger_external_integra
 from utils.conversations.location import get_google_maps_location
 from utils.conversations.memories import process_external_integration_memory
 from utils.conversations.search import search_conversations
+from utils import memory_snapshot
 from utils.app_integrations import send_app_notification
 
 # Rate limit settings - more conservative limits to prevent notification fatigue
@@ -228,7 +228,7 @@ async def get_memories_via_integration(
     if not apps_utils.app_can_read_memories(app):
         raise HTTPException(status_code=403, detail="App does not have the capability to read memories")
 
-    memories = memory_db.get_memories(uid, limit=limit, offset=offset)
+    memories = memory_snapshot.get_memories(uid, limit=limit, offset=offset)
     for memory in memories:
         if memory.get('is_locked', False):
             content = memory.get('content', '')
@@ -3,8 +3,8 @@ from pydantic import BaseModel
 from typing import List, Dict, Any
 
 from database import knowledge_graph as kg_db
-from database import memories as memories_db
 from database import users as users_db
+from utils import memory_snapshot
 from utils.llm.knowledge_graph import extract_knowledge_from_memory, rebuild_knowledge_graph
 from utils.other import endpoints as auth
 
@@ -48,7 +48,7 @@ def get_knowledge_graph(uid: str = Depends(auth.get_current_user_uid)):
     )
 
 def _rebuild_graph_task(uid: str, user_name: str):
-    memories = memories_db.get_memories(uid, limit=500)
+    memories = memory_snapshot.get_memories(uid, limit=500)
     rebuild_knowledge_graph(uid, memories, user_name)
 
 
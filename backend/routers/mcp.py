@@ -13,6 +13,7 @@ import database.users as users_db
 # from database.vector_db import query_vectors_by_metadata
 from models.memories import MemoryDB, Memory, MemoryCategory
 from models.conversation import CategoryEnum
+from utils import memory_snapshot
 from utils.apps import update_personas_async
 from utils.llm.memories import identify_category_for_memory
 from dependencies import get_uid_from_mcp_api_key, get_current_user_id
@@ -83,7 +84,7 @@ def get_memories(
             category_list = [MemoryCategory(c.strip()) for c in categories.split(",") if c.strip()]
         except ValueError as e:
             raise HTTPException(status_code=400, detail=f"Invalid category {str(e)}")
-    memories = memories_db.get_memories(uid, limit, offset, [c.value for c in category_list])
+    memories = memory_snapshot.get_memories(uid, limit, offset, [c.value for c in category_list])
     for memory in memories:
         if memory.get('is_locked', False):
             content = memory.get('content', '')
@@ -23,6 +23,7 @@ import database.conversations as conversations_db
 import database.mcp_api_key as mcp_api_key_db
 from models.memories import MemoryDB, Memory, MemoryCategory
 from models.conversation import CategoryEnum
+from utils import memory_snapshot
 from utils.llm.memories import identify_category_for_memory
 
 router = APIRouter()
@@ -171,7 +172,7 @@ def execute_tool(user_id: str, tool_name: str, arguments: dict) -> dict:
             except ValueError:
                 raise ToolExecutionError(f"Invalid memory category: '{cat}'", code=-32602)
 
-        memories = memories_db.get_memories(user_id, limit, offset, valid_categories)
+        memories = memory_snapshot.get_memories(user_id, limit, offset, valid_categories)
         # Apply locked content truncation
         for memory in memories:
             if memory.get('is_locked', False):
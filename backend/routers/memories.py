@@ -8,6 +8,7 @@ from pydantic import ValidationError
 import database.memories as memories_db
 from database.vector_db import upsert_memory_vector, delete_memory_vector
 from models.memories import MemoryDB, Memory, MemoryCategory
+from utils import memory_snapshot
 from utils.apps import update_personas_async
 from utils.other import endpoints as auth
 
@@ -46,7 +47,7 @@ def get_memories(limit: int = 100, offset: int = 0, uid: str = Depends(auth.get_
     # Warn: should remove
     if offset == 0:
         limit = 5000
-    memories = memories_db.get_memories(uid, limit, offset)
+    memories = memory_snapshot.get_memories(uid, limit, offset)
 
     valid_memories = []
     for memory in memories:
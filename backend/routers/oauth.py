@@ -8,7 +8,7 @@ import requests
 
 from database.apps import get_app_by_id_db
 from database.redis_db import enable_app, increase_app_installs_count
-from utils.apps import is_user_app_enabled, get_is_user_paid_app, is_tester
+from utils.apps import is_user_app_enabled, get_is_user_paid_app, is_tester, invalidate_enabled_apps_cache
 from models.app import App as AppModel, ActionType
 
 router = APIRouter(
@@ -165,6 +165,7 @@ async def oauth_token(firebase_id_token: str = Form(...), app_id: str = Form(...
 
         try:
             enable_app(uid, app_id)
+            invalidate_enabled_apps_cache(uid)
             if (app.private is None or not app.private) and (app.uid is None or app.uid != uid) and not is_tester(uid):
                 increase_app_installs_count(app_id)
         except Exception as e:
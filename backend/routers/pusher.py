@@ -10,8 +10,9 @@ from fastapi.websockets import WebSocketDisconnect, WebSocket
 from starlette.websockets import WebSocketState
 
 import database.conversations as conversations_db
+import database.conversations_async as conversations_async
 from database import users as users_db
-from database.redis_db import get_cached_user_geolocation
+from database.redis_db import get_cached_user_geolocation, redis_request_memo
 from models.conversation import Conversation, ConversationStatus, Geolocation
 from utils.apps import is_audio_bytes_app_enabled
 from utils.app_integrations import (
@@ -29,6 +30,7 @@ from utils.webhooks import (
 from utils.other.storage import upload_audio_chunk
 from utils.other.task import safe_create_task
 from utils.speaker_identification import extract_speaker_samples
+from utils.webhook_dispatcher import coalesce_transcript_batches
 
 router = APIRouter()
 
@@ -56,7 +58,8 @@ AUDIO_BYTES_QUEUE_WARN_SIZE = 20
 async def _process_conversation_task(uid: str, conversation_id: str, language: str, websocket: WebSocket):
     """Process a conversation and send result back to _listen via websocket."""
     try:
-        conversation_data = conversations_db.get_conversation(uid, conversation_id)
+        await conversations_async.compact_conversation_segments(uid, conversation_id)
+        conversation_data = await conversations_async.get_conversation(uid, conversation_id)
         if not conversation_data:
             # Send error response
             response = {"conversation_id": conversation_id, "error": "conversation_not_found"}
@@ -69,7 +72,7 @@ async def _process_conversation_task(uid: str, conversation_id: str, language: s
         conversation = Conversation(**conversation_data)
 
         if conversation.status != ConversationStatus.processing:
-            conversations_db.update_conversation_status(uid, conversation.id, ConversationStatus.processing)
+            await conversations_async.update_conversation_status(uid, conversation.id, ConversationStatus.processing)
             conversation.status = ConversationStatus.processing
 
         try:
@@ -84,7 +87,7 @@ async def _process_conversation_task(uid: str, conversation_id: str, language: s
             messages = await asyncio.to_thread(trigger_external_integrations, uid, conversation)
         except Exception as e:
             print(f"Error processing conversation: {e}", uid, conversation_id)
-            conversations_db.set_conversation_as_discarded(uid, conversation.id)
+            await conversations_async.set_conversation_as_discarded(uid, conversation.id)
             conversation.discarded = True
             messages = []
 
@@ -251,14 +254,18 @@ async def _websocket_util_trigger(
             batch = transcript_queue.copy()
             transcript_queue = []
 
-            for item in batch:
-                segments = item['segments']
-                memory_id = item['memory_id']
-                try:
-                    await trigger_realtime_integrations(uid, segments, memory_id)
-                    await realtime_transcript_webhook(uid, segments)
-                except Exception as e:
-                    print(f"Error processing transcript batch: {e}", uid)
+            # One call per conversation per flush; integrations and the developer webhook run concurrently.
+            # The user's webhook and app settings are read from Redis once per flush.
+            with redis_request_memo():
+                for memory_id, segments in coalesce_transcript_batches(batch):
+                    results = await asyncio.gather(
+                        trigger_realtime_integrations(uid, segments, memory_id),
+                        realtime_transcript_webhook(uid, segments),
+                        return_exceptions=True,
+                    )
+                    for result in results:
+                        if isinstance(result, Exception):
+                            print(f"Error processing transcript batch: {result}", uid)
 
     async def process_audio_bytes_queue():
         """Event-driven consumer for audio bytes triggers (app integrations + webhooks)."""
@@ -280,14 +287,15 @@ async def _websocket_util_trigger(
             batch = audio_bytes_queue.copy()
             audio_bytes_queue = []
 
-            for item in batch:
-                try:
-                    if item['type'] == 'app':
-                        await trigger_realtime_audio_bytes(uid, item['sample_rate'], item['data'])
-                    elif item['type'] == 'webhook':
-                        await send_audio_bytes_developer_webhook(uid, item['sample_rate'], item['data'])
-                except Exception as e:
-                    print(f"Error processing audio bytes: {e}", uid)
+            with redis_request_memo():
+                for item in batch:
+                    try:
+                        if item['type'] == 'app':
+                            await trigger_realtime_audio_bytes(uid, item['sample_rate'], item['data'])
+                        elif item['type'] == 'webhook':
+                            await send_audio_bytes_developer_webhook(uid, item['sample_rate'], item['data'])
+                    except Exception as e:
+                        print(f"Error processing audio bytes: {e}", uid)
 
     async def receive_tasks():
         nonlocal websocket_active
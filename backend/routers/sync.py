@@ -1,39 +1,37 @@
+import asyncio
 import io
 import os
 import re
 import struct
 import threading
-import time
 import wave
 from concurrent.futures import ThreadPoolExecutor
-from datetime import datetime, timezone
-from typing import List
+from datetime import datetime
+from typing import List, Optional
 
 from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, Query, Header, Request, Response
 from fastapi.responses import StreamingResponse
 from opuslib import Decoder
-from pydub import AudioSegment
 
 from database import conversations as conversations_db
+from database import redis_db
 from database import users as users_db
-from database.conversations import get_closest_conversation_to_timestamps, update_conversation_segments
-from models.conversation import CreateConversation, ConversationSource, Conversation
-from models.transcript_segment import TranscriptSegment
-from utils.conversations.process_conversation import process_conversation
+from models.conversation import ConversationSource
+from utils.conversations.offline_sync import SyncJob, get_timestamp_from_path, run_sync_job
 from utils.other import endpoints as auth
+from utils.other.task import safe_create_task
 from utils.other.storage import (
-    get_syncing_file_temporal_signed_url,
-    delete_syncing_temporal_file,
     download_audio_chunks_and_merge,
     get_or_create_merged_audio,
     get_merged_audio_signed_url,
+    get_audio_chunk_sizes,
+    download_audio_chunk_pcm,
 )
+from utils.audio_stream import build_audio_stream_index, iter_audio_range
 
 # Audio constants
 AUDIO_SAMPLE_RATE = 16000
 from utils import encryption
-from utils.stt.pre_recorded import deepgram_prerecorded, postprocess_words
-from utils.stt.vad import vad_is_empty
 
 router = APIRouter()
 
@@ -264,23 +262,90 @@ def get_audio_signed_urls_endpoint(
 # **********************************************
 
 
+def _stream_audio_file_response(
+    uid: str,
+    conversation_id: str,
+    timestamps: List[float],
+    wav: bool,
+    media_type: str,
+    base_headers: dict,
+    range_header: str | None,
+):
+    """
+    Serve the merged audio file without merging it: the layout is computed from chunk sizes and only the
+    chunks overlapping the requested range are downloaded, a few at a time.
+    """
+    chunks = get_audio_chunk_sizes(uid, conversation_id, timestamps)
+    if not chunks:
+        raise HTTPException(status_code=404, detail="Audio chunks not found in storage")
+
+    index = build_audio_stream_index(
+        {timestamp: chunk['pcm_size'] for timestamp, chunk in chunks.items()},
+        timestamps,
+        fill_gaps=True,
+        sample_rate=AUDIO_SAMPLE_RATE,
+        wav=wav,
+    )
+    file_size = index.size
+
+    def _fetch_chunk(timestamp: float) -> bytes:
+        chunk = chunks[timestamp]
+        return download_audio_chunk_pcm(uid, chunk['path'], chunk['encrypted'])
+
+    if range_header:
+        range_tuple = parse_range_header(range_header, file_size)
+        if range_tuple is None:
+            return Response(
+                status_code=416,
+                headers={
+                    "Content-Range": f"bytes */{file_size}",
+                    **base_headers,
+                },
+            )
+
+        start, end = range_tuple
+        return StreamingResponse(
+            iter_audio_range(index, start, end, _fetch_chunk),
+            status_code=206,
+            media_type=media_type,
+            headers={
+                "Content-Length": str(end - start + 1),
+                "Content-Range": f"bytes {start}-{end}/{file_size}",
+                **base_headers,
+            },
+        )
+
+    return StreamingResponse(
+        iter_audio_range(index, 0, file_size - 1, _fetch_chunk),
+        status_code=200,
+        media_type=media_type,
+        headers={
+            "Content-Length": str(file_size),
+            **base_headers,
+        },
+    )
+
+
 @router.get("/v1/sync/audio/{conversation_id}/{audio_file_id}", tags=['v1'])
 def download_audio_file_endpoint(
     conversation_id: str,
     audio_file_id: str,
     request: Request,
     format: str = Query(default="wav", regex="^(wav|pcm)$"),
+    stream: bool = Query(default=True),
     uid: str = Depends(auth.get_current_user_uid),
 ):
     """
     Download audio file from private cloud sync in the specified format.
-    Merges chunks on-demand.
+    Streams only the chunks overlapping the requested range; with stream=false, merges chunks on-demand
+    (served from the merged-audio cache when available).
 
     Args:
         conversation_id: ID of the conversation
         audio_file_id: ID of the audio file within the conversation
         request: FastAPI Request object (for Range header)
         format: Output format - 'wav' or 'pcm' (raw) (default: wav)
+        stream: Stream chunks by range instead of merging the whole file (default: true)
         uid: User ID (from authentication)
 
     Returns:
@@ -303,6 +368,32 @@ def download_audio_file_endpoint(
     if not audio_file:
         raise HTTPException(status_code=404, detail="Audio file not found in conversation")
 
+    if stream:
+        if not audio_file.get('chunk_timestamps'):
+            raise HTTPException(status_code=500, detail="Audio file has no chunk timestamps")
+
+        extension = "wav" if format == "wav" else "pcm"
+        filename = f"conversation_{conversation_id}_audio_{audio_file_id}.{extension}"
+        try:
+            return _stream_audio_file_response(
+                uid,
+                conversation_id,
+                audio_file['chunk_timestamps'],
+                wav=format == "wav",
+                media_type="audio/wav" if format == "wav" else "application/octet-stream",
+                base_headers={
+                    "Content-Disposition": f"attachment; filename={filename}",
+                    "Accept-Ranges": "bytes",
+                    "Cache-Control": "public, max-age=3600",
+                },
+                range_header=request.headers.get("Range"),
+            )
+        except HTTPException:
+            raise
+        except Exception as e:
+            print(f"Error streaming audio file: {e}")
+            raise HTTPException(status_code=500, detail="Failed to download audio file")
+
     # Get audio data - use cache if available, otherwise merge and cache
     try:
         if not audio_file.get('chunk_timestamps'):
@@ -449,13 +540,6 @@ def decode_opus_file_to_wav(opus_file_path, wav_file_path, sample_rate=16000, ch
         return False
 
 
-def get_timestamp_from_path(path: str):
-    timestamp = int(path.split('/')[-1].split('_')[-1].split('.')[0])
-    if timestamp > 1e10:
-        return int(timestamp / 1000)
-    return timestamp
-
-
 def retrieve_file_paths(files: List[UploadFile], uid: str):
     directory = f'syncing/{uid}/'
     os.makedirs(directory, exist_ok=True)
@@ -500,192 +584,47 @@ def get_wav_duration(wav_path: str) -> float:
         return 0.0
 
 
-def decode_files_to_wav(files_path: List[str]):
-    wav_files = []
-    for path in files_path:
-        wav_path = path.replace('.bin', '.wav')
-        filename = os.path.basename(path)
-        frame_size = 160  # Default frame size
-        match = re.search(r'_fs(\d+)', filename)
-        if match:
-            try:
-                frame_size = int(match.group(1))
-                print(f"Found frame size {frame_size} in filename: {filename}")
-            except ValueError:
-                print(f"Invalid frame size format in filename: {filename}, using default {frame_size}")
-
-        success = decode_opus_file_to_wav(path, wav_path, frame_size=frame_size)
-        if not success:
-            # Clean up .bin file even on decode failure
-            if os.path.exists(path):
-                os.remove(path)
-            continue
+def decode_file_to_wav(path: str) -> Optional[str]:
+    """Decodes an uploaded .bin and removes it, returns the WAV's path or None when there's nothing to sync in it."""
+    wav_path = path.replace('.bin', '.wav')
+    filename = os.path.basename(path)
+    frame_size = 160  # Default frame size
+    match = re.search(r'_fs(\d+)', filename)
+    if match:
+        try:
+            frame_size = int(match.group(1))
+            print(f"Found frame size {frame_size} in filename: {filename}")
+        except ValueError:
+            print(f"Invalid frame size format in filename: {filename}, using default {frame_size}")
 
-        # Always remove .bin file after decode attempt
-        if os.path.exists(path):
-            os.remove(path)
+    success = decode_opus_file_to_wav(path, wav_path, frame_size=frame_size)
 
-        # Check duration without loading entire file into memory
-        duration = get_wav_duration(wav_path)
-        if duration == 0:
-            # Invalid WAV file
-            if os.path.exists(wav_path):
-                os.remove(wav_path)
-            raise HTTPException(status_code=400, detail=f"Invalid file format {path}")
+    # Always remove .bin file after decode attempt
+    if os.path.exists(path):
+        os.remove(path)
+    if not success:
+        return None
 
-        if duration < 1:
+    # Check duration without loading entire file into memory
+    duration = get_wav_duration(wav_path)
+    if duration == 0:
+        # Invalid WAV file
+        if os.path.exists(wav_path):
             os.remove(wav_path)
-            continue
-        wav_files.append(wav_path)
-    return wav_files
-
-
-def retrieve_vad_segments(path: str, segmented_paths: set, errors: list = None):
-    try:
-        start_timestamp = get_timestamp_from_path(path)
-        voice_segments = vad_is_empty(path, return_segments=True, cache=True)
-    except Exception as e:
-        error_msg = f"VAD failed for {path}: {str(e)}"
-        print(error_msg)
-        if errors is not None:
-            errors.append(error_msg)
-        raise  # Re-raise to ensure thread failure is visible
-
-    segments = []
-    # should we merge more aggressively, to avoid too many small segments? ~ not for now
-    # Pros -> lesser segments, faster, less concurrency
-    # Cons -> less accuracy.
-
-    # edge case, multiple small segments that map towards the same memory .-.
-    # so ... let's merge them if distance < 120 seconds
-    # a better option would be to keep here 1s, and merge them like that after transcribing
-    # but FAL has 10 RPS limit, **let's merge it here for simplicity for now**
-
-    for i, segment in enumerate(voice_segments):
-        if segments and (segment['start'] - segments[-1]['end']) < 120:
-            segments[-1]['end'] = segment['end']
-        else:
-            segments.append(segment)
-
-    print(path, len(segments))
-
-    aseg = AudioSegment.from_wav(path)
-    path_dir = '/'.join(path.split('/')[:-1])
-
-    try:
-        for i, segment in enumerate(segments):
-            if (segment['end'] - segment['start']) < 1:
-                continue
-            segment_timestamp = start_timestamp + segment['start']
-            segment_path = f'{path_dir}/{segment_timestamp}.wav'
-            segment_aseg = aseg[segment['start'] * 1000 : segment['end'] * 1000]
-            segment_aseg.export(segment_path, format='wav')
-            segmented_paths.add(segment_path)
-            # Explicitly delete segment to free memory immediately
-            del segment_aseg
-    finally:
-        # Explicitly delete main audio to free memory
-        del aseg
-
-
-def _reprocess_conversation_after_update(uid: str, conversation_id: str, language: str):
-    """
-    Reprocess a conversation after new segments have been added.
-    This checks if the conversation should still be discarded and regenerates
-    the summary/structured data if it now has sufficient content.
-    """
-    # Fetch the updated conversation with all segments
-    conversation_data = conversations_db.get_conversation(uid, conversation_id)
-    if not conversation_data:
-        print(f'Conversation {conversation_id} not found for reprocessing')
-        return
-
-    # Convert to Conversation object
-    conversation = Conversation(**conversation_data)
-
-    process_conversation(
-        uid=uid,
-        language_code=language or 'en',
-        conversation=conversation,
-        force_process=True,
-        is_reprocess=True,
-    )
-
-    print(f'Successfully reprocessed conversation {conversation_id}')
-
-
-def process_segment(path: str, uid: str, response: dict, source: ConversationSource = ConversationSource.omi):
-    url = get_syncing_file_temporal_signed_url(path)
-
-    def delete_file():
-        time.sleep(480)
-        delete_syncing_temporal_file(path)
-
-    threading.Thread(target=delete_file).start()
+        raise HTTPException(status_code=400, detail=f"Invalid file format {path}")
 
-    words, language = deepgram_prerecorded(url, speakers_count=3, attempts=0, return_language=True)
-    transcript_segments: List[TranscriptSegment] = postprocess_words(words, 0)
-    if not transcript_segments:
-        print('failed to get deepgram segments')
-        return
-
-    timestamp = get_timestamp_from_path(path)
-    segment_end_timestamp = timestamp + transcript_segments[-1].end
-    closest_memory = get_closest_conversation_to_timestamps(uid, timestamp, segment_end_timestamp)
-
-    if not closest_memory:
-        started_at = datetime.fromtimestamp(timestamp, tz=timezone.utc)
-        finished_at = datetime.fromtimestamp(segment_end_timestamp, tz=timezone.utc)
-        create_memory = CreateConversation(
-            started_at=started_at,
-            finished_at=finished_at,
-            transcript_segments=transcript_segments,
-            source=source,
-        )
-        created = process_conversation(uid, language, create_memory)
-        response['new_memories'].add(created.id)
-    else:
-
-        transcript_segments = [s.dict() for s in transcript_segments]
-
-        # assign timestamps to each segment
-        for segment in transcript_segments:
-            segment['timestamp'] = timestamp + segment['start']
-        for segment in closest_memory['transcript_segments']:
-            segment['timestamp'] = closest_memory['started_at'].timestamp() + segment['start']
-
-        # merge and sort segments by start timestamp
-        segments = closest_memory['transcript_segments'] + transcript_segments
-        segments.sort(key=lambda x: x['timestamp'])
-
-        # fix segment.start .end to be relative to the memory
-        for i, segment in enumerate(segments):
-            duration = segment['end'] - segment['start']
-            segment['start'] = segment['timestamp'] - closest_memory['started_at'].timestamp()
-            segment['end'] = segment['start'] + duration
-
-        # Calculate new finished_at based on the latest segment
-        last_segment_end = segments[-1]['end'] if segments else 0
-        new_finished_at = datetime.fromtimestamp(
-            closest_memory['started_at'].timestamp() + last_segment_end, tz=timezone.utc
-        )
-
-        # Ensure finished_at doesn't go backwards
-        if new_finished_at < closest_memory['finished_at']:
-            new_finished_at = closest_memory['finished_at']
-
-        # remove timestamp field
-        for segment in segments:
-            segment.pop('timestamp')
+    if duration < 1:
+        os.remove(wav_path)
+        return None
+    return wav_path
 
-        # save with updated finished_at
-        response['updated_memories'].add(closest_memory['id'])
-        update_conversation_segments(uid, closest_memory['id'], segments, finished_at=new_finished_at)
 
-        # If the conversation was previously discarded, reprocess it with the new segments
-        if closest_memory.get('discarded', False):
-            print(f'Conversation {closest_memory["id"]} was discarded, checking if it should be reprocessed')
-            _reprocess_conversation_after_update(uid, closest_memory['id'], language)
+def decode_files_to_wav(files_path: List[str]):
+    wav_files = []
+    for path in files_path:
+        if wav_path := decode_file_to_wav(path):
+            wav_files.append(wav_path)
+    return wav_files
 
 
 def _cleanup_files(file_paths):
@@ -698,69 +637,57 @@ def _cleanup_files(file_paths):
             print(f"Failed to cleanup file {path}: {e}")
 
 
-@router.post("/v1/sync-local-files")
-async def sync_local_files(files: List[UploadFile] = File(...), uid: str = Depends(auth.get_current_user_uid)):
+def _detect_source(files: List[UploadFile]) -> ConversationSource:
     # Improve a version without timestamp, to consider uploads from the stored in v2 device bytes.
-    # Detect source from filenames
-    source = ConversationSource.omi
     for f in files:
         if f.filename and 'limitless' in f.filename.lower():
-            source = ConversationSource.limitless
-            break
+            return ConversationSource.limitless
+    return ConversationSource.omi
 
-    paths = []
-    wav_paths = []
-    segmented_paths = set()
 
+@router.post("/v1/sync-local-files")
+async def sync_local_files(files: List[UploadFile] = File(...), uid: str = Depends(auth.get_current_user_uid)):
+    source = _detect_source(files)
+    paths = await asyncio.to_thread(retrieve_file_paths, files, uid)
     try:
-        paths = retrieve_file_paths(files, uid)
-        wav_paths = decode_files_to_wav(paths)
-
-        def chunk_threads(threads):
-            chunk_size = 5
-            for i in range(0, len(threads), chunk_size):
-                [t.start() for t in threads[i : i + chunk_size]]
-                [t.join() for t in threads[i : i + chunk_size]]
-
-        vad_errors = []
-        threads = [
-            threading.Thread(target=retrieve_vad_segments, args=(path, segmented_paths, vad_errors))
-            for path in wav_paths
-        ]
-        chunk_threads(threads)
-
-        # Clean up original wav files after VAD segmentation (segments are now in segmented_paths)
-        _cleanup_files(wav_paths)
-        wav_paths = []  # Clear to avoid double cleanup in finally
-
-        # Check for VAD errors - if any failed, abort to prevent data loss
-        if vad_errors:
-            error_detail = f"VAD processing failed for {len(vad_errors)} file(s): {'; '.join(vad_errors[:3])}"
-            if len(vad_errors) > 3:
-                error_detail += f" (and {len(vad_errors) - 3} more)"
-            raise HTTPException(status_code=500, detail=error_detail)
-
-        print('sync_local_files len(segmented_paths)', len(segmented_paths))
-
-        response = {'updated_memories': set(), 'new_memories': set()}
-        threads = [
-            threading.Thread(
-                target=process_segment,
-                args=(
-                    path,
-                    uid,
-                    response,
-                    source,
-                ),
-            )
-            for path in segmented_paths
-        ]
-        chunk_threads(threads)
-
-        # notify through FCM too ?
-        return response
+        job = SyncJob(uid, len(paths))
+        await run_sync_job(job, paths, decode_file_to_wav, source)
     finally:
-        # Clean up any remaining temporary files
-        _cleanup_files(paths)  # .bin files (in case decode_files_to_wav didn't finish)
-        _cleanup_files(wav_paths)  # Original wav files (if VAD didn't complete)
-        _cleanup_files(segmented_paths)  # Segmented wav files after processing
+        _cleanup_files(paths)  # .bin files (in case decoding didn't get to them)
+
+    if job.failed:
+        raise HTTPException(status_code=job.status_code, detail=job.error_detail)
+    print('sync_local_files', job.as_dict()['stages'])
+    # notify through FCM too ?
+    return {'updated_memories': job.updated_memories, 'new_memories': job.new_memories}
+
+
+_running_sync_jobs = set()
+
+
+@router.post("/v2/sync-local-files", status_code=202)
+async def start_sync_local_files(files: List[UploadFile] = File(...), uid: str = Depends(auth.get_current_user_uid)):
+    """Same as v1, but returns a job id at once, poll GET /v2/sync-local-files/{job_id} for progress and results."""
+    source = _detect_source(files)
+    paths = await asyncio.to_thread(retrieve_file_paths, files, uid)
+    job = SyncJob(uid, len(paths))
+    job.save(force=True)
+
+    async def _run():
+        try:
+            await run_sync_job(job, paths, decode_file_to_wav, source)
+        finally:
+            _cleanup_files(paths)
+
+    task = safe_create_task(_run())
+    _running_sync_jobs.add(task)
+    task.add_done_callback(_running_sync_jobs.discard)
+    return {'job_id': job.id, 'status': job.status}
+
+
+@router.get("/v2/sync-local-files/{job_id}")
+def get_sync_local_files_job(job_id: str, uid: str = Depends(auth.get_current_user_uid)):
+    job = redis_db.get_sync_job(uid, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Sync job not found")
+    return job
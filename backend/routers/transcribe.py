@@ -12,7 +12,6 @@ from enum import Enum
 from typing import Dict, List, Optional, Set, Tuple, Callable
 
 import av
-import numpy as np
 import opuslib  # type: ignore
 
 import lc3  # lc3py
@@ -29,7 +28,7 @@ from utils.speaker_assignment import (
     update_speaker_assignment_maps,
     should_update_speaker_to_person_map,
 )
-import database.conversations as conversations_db
+import database.conversations_async as conversations_async
 import database.calendar_meetings as calendar_db
 import database.users as user_db
 from database.users import get_user_transcription_preferences
@@ -66,6 +65,7 @@ from utils.analytics import record_usage
 from utils.app_integrations import trigger_external_integrations, trigger_realtime_integrations
 from utils.apps import is_audio_bytes_app_enabled
 from utils.conversations.location import get_google_maps_location
+from utils.conversations.lifecycle import get_deadlines, get_status_subscriptions
 from utils.conversations.process_conversation import process_conversation, retrieve_in_progress_conversation
 from utils.notifications import send_credit_limit_notification, send_silent_user_notification
 from utils.other import endpoints as auth
@@ -86,17 +86,17 @@ from utils.stt.streaming import (
 from utils.subscription import has_transcription_credits, get_remaining_transcription_seconds
 from utils.translation import TranslationService
 from utils.translation_cache import TranscriptSegmentLanguageCache
+from utils.transcript_persistence import InProgressTranscriptWriter
 from utils.webhooks import get_audio_bytes_webhook_seconds
 from utils.onboarding import OnboardingHandler
 
 from utils.aac import AACDecoder
 from utils.audio import AudioRingBuffer
 from utils.stt.speaker_embedding import (
-    extract_embedding_from_bytes,
-    compare_embeddings,
+    extract_embedding_from_bytes_batched,
     SPEAKER_MATCH_THRESHOLD,
 )
-from utils.speaker_sample_migration import maybe_migrate_person_samples
+from utils.stt.speaker_gallery import SpeakerGallery, load_speaker_gallery
 
 router = APIRouter()
 
@@ -243,7 +243,7 @@ async def _stream_handler(
 
     audio_ring_buffer: Optional[AudioRingBuffer] = None
     speaker_id_segment_queue: asyncio.Queue[dict] = asyncio.Queue(maxsize=100)
-    person_embeddings_cache: Dict[str, dict] = {}  # person_id -> {embedding, name}
+    speaker_gallery: Optional[SpeakerGallery] = None  # shared with the user's other sessions, see speaker_gallery
     speaker_id_enabled = False  # Will be set after private_cloud_sync_enabled is known
 
     # Track background tasks to cancel on cleanup (prevents memory leaks from fire-and-forget tasks)
@@ -295,6 +295,15 @@ async def _stream_handler(
     last_transcript_time: Optional[float] = None
     current_conversation_id = None
 
+    # In-progress conversation, kept in memory and authoritative while this session streams into it.
+    # Transcript changes are persisted as deltas by transcript_writer and compacted at checkpoints.
+    in_progress_conversation: Optional[Conversation] = None
+    transcript_writer: Optional[InProgressTranscriptWriter] = None
+    # Firestore writes of this session run off the event loop, see database/conversations_async.py
+    conversation_writer = conversations_async.ConversationSessionWriter(uid)
+    # Wakes conversation_lifecycle_manager: timeout, status change or end of the session
+    lifecycle_wakeup = asyncio.Event()
+
     freemium_threshold_sent = False  # Track if we've sent the freemium threshold notification
 
     async def _record_usage_periodically():
@@ -431,6 +440,7 @@ async def _stream_handler(
             websocket_close_code = 1011
         finally:
             websocket_active = False
+            lifecycle_wakeup.set()
 
     # Start heart beat
     heartbeat_task = asyncio.create_task(send_heartbeat())
@@ -461,16 +471,30 @@ async def _stream_handler(
     if conversation_creation_timeout < 120:
         conversation_creation_timeout = 120
 
+    # The session is the source of truth for its conversation's status and finished_at: the timeout runs on the
+    # process's shared deadline heap and status changes made elsewhere come through redis, nothing polls the db.
+    conversation_finished_at: Optional[datetime] = None
+    conversation_status_changes: List[Tuple[Optional[str], Optional[str]]] = []
+
+    def _conversation_touched(finished_at: datetime):
+        nonlocal conversation_finished_at
+        conversation_finished_at = finished_at
+        get_deadlines().set(session_id, finished_at.timestamp() + conversation_creation_timeout, lifecycle_wakeup.set)
+
+    def _on_conversation_status(conversation_id: Optional[str], status: Optional[str]):
+        conversation_status_changes.append((conversation_id, status))
+        lifecycle_wakeup.set()
+
     # Stream transcript
     # Callback for when pusher finishes processing a conversation
-    def on_conversation_processed(conversation_id: str):
-        conversation_data = conversations_db.get_conversation(uid, conversation_id)
+    async def on_conversation_processed(conversation_id: str):
+        conversation_data = await conversations_async.get_conversation(uid, conversation_id)
         if conversation_data:
             conversation = Conversation(**conversation_data)
             _send_message_event(ConversationEvent(event_type="memory_created", memory=conversation, messages=[]))
 
-    def on_conversation_processing_started(conversation_id: str):
-        conversation_data = conversations_db.get_conversation(uid, conversation_id)
+    async def on_conversation_processing_started(conversation_id: str):
+        conversation_data = await conversations_async.get_conversation(uid, conversation_id)
         if conversation_data:
             conversation = Conversation(**conversation_data)
             _send_message_event(ConversationEvent(event_type="memory_processing_started", memory=conversation))
@@ -480,7 +504,7 @@ async def _stream_handler(
         conversation = Conversation(**conversation_data)
         if conversation.status != ConversationStatus.processing:
             _send_message_event(ConversationEvent(event_type="memory_processing_started", memory=conversation))
-            conversations_db.update_conversation_status(uid, conversation.id, ConversationStatus.processing)
+            await conversations_async.update_conversation_status(uid, conversation.id, ConversationStatus.processing)
             conversation.status = ConversationStatus.processing
 
         try:
@@ -490,18 +514,18 @@ async def _stream_handler(
                 geolocation = Geolocation(**geolocation)
                 conversation.geolocation = get_google_maps_location(geolocation.latitude, geolocation.longitude)
 
-            conversation = process_conversation(uid, language, conversation)
-            messages = trigger_external_integrations(uid, conversation)
+            conversation = await asyncio.to_thread(process_conversation, uid, language, conversation)
+            messages = await asyncio.to_thread(trigger_external_integrations, uid, conversation)
         except Exception as e:
             print(f"Error processing conversation: {e}", uid, session_id)
-            conversations_db.set_conversation_as_discarded(uid, conversation.id)
+            await conversations_async.set_conversation_as_discarded(uid, conversation.id)
             conversation.discarded = True
             messages = []
 
         _send_message_event(ConversationEvent(event_type="memory_created", memory=conversation, messages=messages))
 
     async def cleanup_processing_conversations():
-        processing = conversations_db.get_processing_conversations(uid)
+        processing = await conversations_async.get_processing_conversations(uid)
         print('finalize_processing_conversations len(processing):', len(processing), uid, session_id)
         if not processing or len(processing) == 0:
             return
@@ -519,16 +543,16 @@ async def _stream_handler(
         await cleanup_processing_conversations()
 
     # Send last completed conversation to client
-    def send_last_conversation():
-        last_conversation = conversations_db.get_last_completed_conversation(uid)
+    async def send_last_conversation():
+        last_conversation = await conversations_async.get_last_completed_conversation(uid)
         if last_conversation:
             _send_message_event(LastConversationEvent(memory_id=last_conversation['id']))
 
-    send_last_conversation()
+    await send_last_conversation()
 
     # Create new stub conversation for next batch
     async def _create_new_in_progress_conversation():
-        nonlocal current_conversation_id
+        nonlocal current_conversation_id, in_progress_conversation, transcript_writer
 
         conversation_source = ConversationSource.omi
         if source:
@@ -552,7 +576,8 @@ async def _stream_handler(
             source=conversation_source,
             private_cloud_sync_enabled=private_cloud_sync_enabled,
         )
-        conversations_db.upsert_conversation(uid, conversation_data=stub_conversation.dict())
+        stub_conversation_data = stub_conversation.dict()
+        await conversations_async.upsert_conversation(uid, conversation_data=stub_conversation_data)
         redis_db.set_in_progress_conversation_id(uid, new_conversation_id)
 
         detected_meeting_id = None
@@ -594,24 +619,76 @@ async def _stream_handler(
         if detected_meeting_id:
             redis_db.set_conversation_meeting_id(new_conversation_id, detected_meeting_id)
 
+        # The stub is fresh, no need to read it back
+        await _checkpoint_in_progress_transcript()
+        in_progress_conversation = stub_conversation
+        transcript_writer = InProgressTranscriptWriter(
+            uid, new_conversation_id, stub_conversation_data.get('data_protection_level')
+        )
+        conversation_writer.set_level(new_conversation_id, transcript_writer.data_protection_level)
         current_conversation_id = new_conversation_id
+        _conversation_touched(stub_conversation.finished_at)
 
         print(f"Created new stub conversation: {new_conversation_id}", uid, session_id)
 
+    async def _checkpoint_in_progress_transcript(conversation_id: Optional[str] = None):
+        """Compacts pending transcript deltas of the in-memory conversation into its transcript blob."""
+        if not transcript_writer or not in_progress_conversation:
+            return
+        if conversation_id and transcript_writer.conversation_id != conversation_id:
+            return
+        try:
+            await conversations_async.run(
+                transcript_writer.checkpoint,
+                list(in_progress_conversation.transcript_segments),
+                through_seq=transcript_writer.last_seq,
+            )
+        except Exception as e:
+            print(f"Error checkpointing transcript: {e}", uid, session_id)
+
+    async def _load_in_progress_conversation() -> Optional[Conversation]:
+        """Returns the in-memory current conversation, reading it from the db only when the conversation changes."""
+        nonlocal in_progress_conversation, transcript_writer
+
+        if in_progress_conversation and in_progress_conversation.id == current_conversation_id:
+            return in_progress_conversation
+
+        await _checkpoint_in_progress_transcript()
+        in_progress_conversation = None
+        transcript_writer = None
+
+        # Deltas may be left behind by a dropped session
+        conversation_id = current_conversation_id
+        await conversations_async.compact_conversation_segments(uid, conversation_id)
+        conversation_data = await conversations_async.get_conversation(uid, conversation_id)
+        if not conversation_data:
+            return None
+
+        in_progress_conversation = Conversation(**conversation_data)
+        transcript_writer = InProgressTranscriptWriter(
+            uid, in_progress_conversation.id, conversation_data.get('data_protection_level')
+        )
+        conversation_writer.set_level(in_progress_conversation.id, transcript_writer.data_protection_level)
+        return in_progress_conversation
+
     async def _process_conversation(conversation_id: str):
         print("_process_conversation", uid, session_id)
-        conversation = conversations_db.get_conversation(uid, conversation_id)
+        await _checkpoint_in_progress_transcript(conversation_id)
+        # Deltas may be left behind by a dropped session
+        await conversations_async.compact_conversation_segments(uid, conversation_id)
+        conversation = await conversations_async.get_conversation(uid, conversation_id)
         if conversation:
             has_content = conversation.get('transcript_segments') or conversation.get('photos')
             if has_content:
                 if PUSHER_ENABLED:
-                    on_conversation_processing_started(conversation_id)
+                    await on_conversation_processing_started(conversation_id)
                     await request_conversation_processing(conversation_id)
                 else:
                     await _create_conversation_fallback(conversation)
             else:
                 print(f'Clean up the conversation {conversation_id}, reason: no content', uid, session_id)
-                conversations_db.delete_conversation(uid, conversation_id)
+                await conversations_async.delete_conversation(uid, conversation_id)
+                conversation_writer.forget(conversation_id)
 
     # Process existing conversations
     async def _prepare_in_progess_conversations():
@@ -631,6 +708,7 @@ async def _stream_handler(
 
             # Continue with the existing conversation
             current_conversation_id = existing_conversation['id']
+            _conversation_touched(finished_at)
             print(
                 f"Resuming conversation {current_conversation_id}. Will timeout in {conversation_creation_timeout - seconds_since_last_segment:.1f}s",
                 uid,
@@ -647,7 +725,7 @@ async def _stream_handler(
     )
     timed_out_conversation_id = await _prepare_in_progess_conversations()
 
-    def _update_in_progress_conversation(
+    async def _update_in_progress_conversation(
         conversation: Conversation,
         segments: List[TranscriptSegment],
         photos: List[ConversationPhoto],
@@ -665,18 +743,31 @@ async def _stream_handler(
                 segment_person_assignment_map,
                 speaker_to_person_map,
             )
-            conversations_db.update_conversation_segments(
-                uid, conversation.id, [segment.dict() for segment in conversation.transcript_segments]
-            )
 
         if photos:
-            conversations_db.store_conversation_photos(uid, conversation.id, photos)
+            await conversation_writer.store_photos(conversation.id, photos)
             # Update source if we now have photos
             if conversation.source != ConversationSource.openglass:
-                conversations_db.update_conversation(uid, conversation.id, {'source': ConversationSource.openglass})
+                conversation_writer.stage(conversation.id, {'source': ConversationSource.openglass})
                 conversation.source = ConversationSource.openglass
 
-        conversations_db.update_conversation_finished_at(uid, conversation.id, finished_at)
+        # Persist only what changed, the full transcript is written at checkpoints.
+        # Fields staged during this tick (started_at, source) go into the same write.
+        await conversations_async.run(
+            transcript_writer.append,
+            updated_segments,
+            removed_ids,
+            finished_at=finished_at,
+            fields=conversation_writer.take(conversation.id),
+        )
+        conversation.finished_at = finished_at
+        _conversation_touched(finished_at)
+        if transcript_writer.should_checkpoint():
+            await conversations_async.run(
+                transcript_writer.checkpoint,
+                list(conversation.transcript_segments),
+                through_seq=transcript_writer.last_seq,
+            )
         return conversation, updated_segments, removed_ids
 
     # STT
@@ -1082,7 +1173,7 @@ async def _stream_handler(
 
                         if result.get("success"):
                             print(f"Conversation processed by pusher: {conversation_id}", uid, session_id)
-                            on_conversation_processed(conversation_id)
+                            await on_conversation_processed(conversation_id)
 
                 except asyncio.TimeoutError:
                     continue  # Check loop conditions again
@@ -1207,38 +1298,50 @@ async def _stream_handler(
     language_cache = TranscriptSegmentLanguageCache()
     translation_service = TranslationService()
 
+    def _translations_for(candidates: List[Tuple[str, str]]) -> List[Tuple[str, str, Optional[str]]]:
+        """
+        (segment id, text) to (segment id, text, translation), None where the text is in the target language already.
+        Language detection and one batched translation call, blocking.
+        """
+        to_translate = [
+            (segment_id, text)
+            for segment_id, text in candidates
+            if not language_cache.is_in_target_language(segment_id, text, translation_language)
+        ]
+        translated = translation_service.translate_batch(translation_language, [text for _, text in to_translate])
+        return [(segment_id, text, result) for (segment_id, text), result in zip(to_translate, translated)]
+
     async def translate(segments: List[TranscriptSegment], conversation_id: str):
         if not translation_language:
             return
 
         try:
-            translated_segments = []
+            by_id = {}
             for segment in segments:
-                if not segment or not segment.id:
-                    continue
-
-                segment_text = segment.text.strip()
-                if not segment_text:
-                    continue
-
-                # Language Detection
-                if language_cache.is_in_target_language(segment.id, segment_text, translation_language):
-                    continue
+                if segment and segment.id and segment.text.strip():
+                    by_id[segment.id] = segment
+            if not by_id:
+                return
 
-                # Translation
-                translated_text = translation_service.translate_text_by_sentence(translation_language, segment_text)
+            # All of this tick's segments in one batch, off the event loop
+            results = await asyncio.to_thread(
+                _translations_for, [(segment_id, segment.text.strip()) for segment_id, segment in by_id.items()]
+            )
 
+            translated_segments = []
+            for segment_id, segment_text, translated_text in results:
+                segment = by_id[segment_id]
                 if translated_text == segment_text:
                     # If translation is same as original, it's likely in the target language.
                     # Delete from cache to allow re-evaluation if more text is added.
-                    language_cache.delete_cache(segment.id)
+                    language_cache.delete_cache(segment_id)
                     continue
 
                 # Create/Update Translation object
                 translation = Translation(lang=translation_language, text=translated_text)
                 if segment.translations is not None:
                     existing_translation_index = next(
-                        (i for i, t in enumerate(segment.translations) if t.lang == language), None
+                        (i for i, t in enumerate(segment.translations) if t.lang == translation_language), None
                     )
                     if existing_translation_index is not None:
                         segment.translations[existing_translation_index] = translation
@@ -1250,20 +1353,9 @@ async def _stream_handler(
             if not translated_segments:
                 return
 
-            # Persist and notify
-            conversation = conversations_db.get_conversation(uid, conversation_id)
-            if conversation:
-                should_update = False
-                for segment in translated_segments:
-                    for i, existing_segment in enumerate(conversation['transcript_segments']):
-                        if existing_segment['id'] == segment.id:
-                            conversation['transcript_segments'][i]['translations'] = segment.dict()['translations']
-                            should_update = True
-                            break
-                if should_update:
-                    conversations_db.update_conversation_segments(
-                        uid, conversation_id, conversation['transcript_segments']
-                    )
+            # Persisted with the session's next transcript write, the segments are the in-memory conversation's own
+            if transcript_writer and transcript_writer.conversation_id == conversation_id:
+                transcript_writer.stage(translated_segments)
 
             if websocket_active:
                 _send_message_event(TranslationEvent(segments=[s.dict() for s in translated_segments]))
@@ -1272,78 +1364,92 @@ async def _stream_handler(
             print(f"Translation error: {e}", uid, session_id)
 
     async def conversation_lifecycle_manager():
-        """Background task that checks conversation timeout and triggers processing every 5 seconds."""
+        """
+        Processes the conversation once it times out and follows status changes made elsewhere. Woken by the shared
+        deadline heap and by redis notifications, it only reads the conversation when notifications may have been
+        missed.
+        """
         nonlocal websocket_active, current_conversation_id, conversation_creation_timeout
 
         print(f"Starting conversation lifecycle manager (timeout: {conversation_creation_timeout}s)", uid, session_id)
 
-        while websocket_active:
-            await asyncio.sleep(5)
+        subscriptions = get_status_subscriptions()
+        subscription = await subscriptions.subscribe(uid, _on_conversation_status)
+        try:
+            while websocket_active:
+                await lifecycle_wakeup.wait()
+                lifecycle_wakeup.clear()
+                if not websocket_active:
+                    break
 
-            if not current_conversation_id:
-                print(f"WARN: the current conversation is not valid", uid, session_id)
-                continue
+                if not current_conversation_id:
+                    print(f"WARN: the current conversation is not valid", uid, session_id)
+                    continue
 
-            conversation = conversations_db.get_conversation(uid, current_conversation_id)
-            if not conversation:
-                print(f"WARN: the current conversation is not found (id: {current_conversation_id})", uid, session_id)
-                await _create_new_in_progress_conversation()
-                continue
+                # Status changes of the current conversation, None when they have to be read back
+                changes = list(conversation_status_changes)
+                conversation_status_changes.clear()
+                status = ConversationStatus.in_progress
+                for conversation_id, changed_status in changes:
+                    if conversation_id is None:
+                        conversation = await conversations_async.get_conversation(uid, current_conversation_id)
+                        changed_status = conversation.get('status') if conversation else 'deleted'
+                    elif conversation_id != current_conversation_id:
+                        continue
+                    status = changed_status
 
-            # Check if conversation status is not in_progress
-            if conversation.get('status') != ConversationStatus.in_progress:
-                print(
-                    f"WARN: conversation {current_conversation_id} status is {conversation.get('status')}, not in_progress. Creating new conversation.",
-                    uid,
-                    session_id,
-                )
-                await _create_new_in_progress_conversation()
-                continue
+                if status == 'deleted':
+                    print(
+                        f"WARN: the current conversation is not found (id: {current_conversation_id})", uid, session_id
+                    )
+                    await _create_new_in_progress_conversation()
+                    continue
 
-            # Check if conversation should be processed
-            finished_at = datetime.fromisoformat(conversation['finished_at'].isoformat())
-            seconds_since_last_update = (datetime.now(timezone.utc) - finished_at).total_seconds()
-            if seconds_since_last_update >= conversation_creation_timeout:
-                print(
-                    f"Conversation {current_conversation_id} timeout reached ({seconds_since_last_update:.1f}s). Processing...",
-                    uid,
-                    session_id,
-                )
-                await _process_conversation(current_conversation_id)
-                await _create_new_in_progress_conversation()
+                # Check if conversation status is not in_progress
+                if status != ConversationStatus.in_progress:
+                    print(
+                        f"WARN: conversation {current_conversation_id} status is {status}, not in_progress. Creating new conversation.",
+                        uid,
+                        session_id,
+                    )
+                    await _create_new_in_progress_conversation()
+                    continue
+
+                # Check if conversation should be processed
+                seconds_since_last_update = (datetime.now(timezone.utc) - conversation_finished_at).total_seconds()
+                if seconds_since_last_update >= conversation_creation_timeout:
+                    print(
+                        f"Conversation {current_conversation_id} timeout reached ({seconds_since_last_update:.1f}s). Processing...",
+                        uid,
+                        session_id,
+                    )
+                    await _process_conversation(current_conversation_id)
+                    await _create_new_in_progress_conversation()
+                    continue
+
+                # Woken early, the deadline fired already or was pushed back
+                _conversation_touched(conversation_finished_at)
+        finally:
+            get_deadlines().remove(session_id)
+            await subscriptions.unsubscribe(uid, subscription)
 
     async def speaker_identification_task():
         """Consume segment queue, accumulate per speaker, trigger match when ready."""
         nonlocal websocket_active, speaker_to_person_map
-        nonlocal person_embeddings_cache, audio_ring_buffer
+        nonlocal speaker_gallery, audio_ring_buffer
 
         if not speaker_id_enabled:
             return
 
-        # Load person embeddings (migrate if needed for v2 API compatibility)
+        # Load person embeddings (migrates people if needed for v2 API compatibility)
         try:
-            people = user_db.get_people(uid)
-            for person in people:
-                # Migrate if needed for v2 API compatibility
-                if person.get('speech_samples'):
-                    person = await maybe_migrate_person_samples(uid, person)
-
-                # Skip cache if migration failed (version still <3) to avoid mixing embedding spaces
-                if person.get('speech_samples_version', 1) < 3:
-                    continue
-
-                emb = person.get('speaker_embedding')
-                if emb:
-                    person_embeddings_cache[person['id']] = {
-                        'embedding': np.array(emb, dtype=np.float32).reshape(1, -1),
-                        'name': person['name'],
-                    }
-            print(f"Speaker ID: loaded {len(person_embeddings_cache)} person embeddings", uid, session_id)
+            speaker_gallery = await load_speaker_gallery(uid)
+            print(f"Speaker ID: loaded {len(speaker_gallery)} person embeddings", uid, session_id)
         except Exception as e:
             print(f"Speaker ID: failed to load embeddings: {e}", uid, session_id)
             return
 
-        if not person_embeddings_cache:
+        if not speaker_gallery:
             print("Speaker ID: no stored embeddings, task disabled", uid, session_id)
             return
 
@@ -1409,15 +1515,12 @@ async def _stream_handler(
                 print(f"Speaker ID: no audio to extract", uid, session_id)
                 return
 
-            # Extract only the needed bytes directly from ring buffer
-            pcm_data = audio_ring_buffer.extract(extract_start, extract_end)
-            if not pcm_data:
+            # Extract only the needed samples directly from ring buffer (no copy, encoded before the next await)
+            samples = audio_ring_buffer.extract_samples(extract_start, extract_end, copy=False)
+            if samples is None or len(samples) == 0:
                 print(f"Speaker ID: failed to extract audio", uid, session_id)
                 return
 
-            # Convert PCM to numpy for WAV encoding
-            samples = np.frombuffer(pcm_data, dtype=np.int16)
-
             # Convert PCM to WAV using av
             output_buffer = io.BytesIO()
             output_container = av.open(output_buffer, mode='w', format='wav')
@@ -1436,27 +1539,23 @@ async def _stream_handler(
             wav_bytes = output_buffer.getvalue()
 
             # Extract embedding (API call)
-            query_embedding = await asyncio.to_thread(extract_embedding_from_bytes, wav_bytes, "query.wav")
+            query_embedding = await extract_embedding_from_bytes_batched(wav_bytes)
 
             # Find best match
-            best_match = None
-            best_distance = float('inf')
+            matches = speaker_gallery.match(query_embedding, k=3)
+            best_distance = matches[0].distance if matches else float('inf')
 
-            # Print all candidates with scores for tuning
+            # Print the closest candidates with scores for tuning
             print(
-                f"Speaker ID: comparing speaker {speaker_id} against {len(person_embeddings_cache)} people:",
+                f"Speaker ID: comparing speaker {speaker_id} against {len(speaker_gallery)} people:",
                 uid,
                 session_id,
             )
-            for person_id, data in person_embeddings_cache.items():
-                distance = compare_embeddings(query_embedding, data['embedding'])
-                print(f"  - {data['name']}: {distance:.4f}", uid, session_id)
-                if distance < best_distance:
-                    best_distance = distance
-                    best_match = (person_id, data['name'])
-
-            if best_match and best_distance < SPEAKER_MATCH_THRESHOLD:
-                person_id, person_name = best_match
+            for match in matches:
+                print(f"  - {match.name}: {match.distance:.4f} (margin={match.margin:.4f})", uid, session_id)
+
+            if matches and best_distance < SPEAKER_MATCH_THRESHOLD:
+                person_id, person_name = matches[0].person_id, matches[0].name
                 print(
                     f"Speaker ID: speaker {speaker_id} -> {person_name} (distance={best_distance:.3f})", uid, session_id
                 )
@@ -1504,8 +1603,8 @@ async def _stream_handler(
             finished_at = datetime.now(timezone.utc)
 
             # Get conversation
-            conversation_data = conversations_db.get_conversation(uid, current_conversation_id)
-            if not conversation_data:
+            conversation = await _load_in_progress_conversation()
+            if not conversation:
                 print(
                     f"Warning: conversation {current_conversation_id} not found during segment processing",
                     uid,
@@ -1523,17 +1622,14 @@ async def _stream_handler(
                 last_transcript_time = time.time()
 
                 # If conversation has no segments yet, set started_at based on when first speech occurred
-                if not conversation_data.get('transcript_segments'):
+                if not conversation.transcript_segments:
                     first_speech_timestamp = first_audio_byte_timestamp + segments_to_process[0]["start"]
                     new_started_at = datetime.fromtimestamp(first_speech_timestamp, tz=timezone.utc)
-                    conversations_db.update_conversation(uid, current_conversation_id, {'started_at': new_started_at})
-                    conversation_data['started_at'] = new_started_at
+                    conversation_writer.stage(conversation.id, {'started_at': new_started_at})
+                    conversation.started_at = new_started_at
 
                 # Calculate unified time offset: audio stream start relative to conversation start
-                conversation_started_at = conversation_data['started_at']
-                if isinstance(conversation_started_at, str):
-                    conversation_started_at = datetime.fromisoformat(conversation_started_at)
-                time_offset = first_audio_byte_timestamp - conversation_started_at.timestamp()
+                time_offset = first_audio_byte_timestamp - conversation.started_at.timestamp()
 
                 # Apply offset to all segments
                 for i, segment in enumerate(segments_to_process):
@@ -1557,8 +1653,9 @@ async def _stream_handler(
                 transcript_segments, _, _ = TranscriptSegment.combine_segments([], newly_processed_segments)
 
             # Update transcript segments
-            conversation = Conversation(**conversation_data)
-            result = _update_in_progress_conversation(conversation, transcript_segments, photos_to_process, finished_at)
+            result = await _update_in_progress_conversation(
+                conversation, transcript_segments, photos_to_process, finished_at
+            )
             if not result or not result[0]:
                 continue
             conversation, updated_segments, removed_ids = result
@@ -1608,7 +1705,7 @@ async def _stream_handler(
                             continue
 
                     # Embeding id speaker indentification
-                    if speaker_id_enabled and person_embeddings_cache:
+                    if speaker_id_enabled and speaker_gallery:
                         started_at_ts = conversation.started_at.timestamp()
                         if (
                             segment.speaker_id is not None
@@ -1947,6 +2044,8 @@ async def _stream_handler(
                                     and send_speaker_sample_request is not None
                                     and current_conversation_id
                                 ):
+                                    # Sample extraction reads the segments from the db
+                                    await _checkpoint_in_progress_transcript(current_conversation_id)
                                     spawn(
                                         send_speaker_sample_request(
                                             person_id=person_id,
@@ -1973,6 +2072,7 @@ async def _stream_handler(
             if not use_custom_stt:
                 await flush_stt_buffer(force=True)
             websocket_active = False
+            lifecycle_wakeup.set()
 
     # Start
     #
@@ -2051,6 +2151,10 @@ async def _stream_handler(
             if transcription_seconds > 0 or words_to_record > 0:
                 record_usage(uid, transcription_seconds=transcription_seconds, words_transcribed=words_to_record)
         websocket_active = False
+        get_deadlines().remove(session_id)
+
+        # Transcript
+        await _checkpoint_in_progress_transcript()
 
         # STT sockets
         try:
@@ -2104,7 +2208,7 @@ async def _stream_handler(
             realtime_segment_buffers.clear()
             realtime_photo_buffers.clear()
             image_chunks.clear()
-            person_embeddings_cache.clear()
+            speaker_gallery = None
         except NameError as e:
             # Variables might not be defined if an error occurred early
             print(f"Cleanup error (safe to ignore): {e}", uid, session_id)
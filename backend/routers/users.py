@@ -25,7 +25,7 @@ from database.redis_db import (
     get_user_webhook_db,
     disable_user_webhook_db,
     enable_user_webhook_db,
-    user_webhook_status_db,
+    get_user_webhooks,
     set_user_preferred_app,
     set_user_data_protection_level,
     get_generic_cache,
@@ -63,6 +63,7 @@ from utils.other.storage import (
     delete_user_person_speech_sample,
 )
 from utils.webhooks import webhook_first_time_setup
+from utils.stt.speaker_gallery import remove_from_speaker_gallery, rename_in_speaker_gallery
 
 router = APIRouter()
 
@@ -162,19 +163,24 @@ def enable_user_webhook_endpoint(wtype: WebhookType, uid: str = Depends(auth.get
 
 @router.get('/v1/users/developer/webhooks/status', tags=['v1'])
 def get_user_webhooks_status(uid: str = Depends(auth.get_current_user_uid)):
-    # This only happens the first time because the user_webhook_status_db function will return None for existing users
-    audio_bytes = user_webhook_status_db(uid, WebhookType.audio_bytes)
-    if audio_bytes is None:
-        audio_bytes = webhook_first_time_setup(uid, WebhookType.audio_bytes)
-    memory_created = user_webhook_status_db(uid, WebhookType.memory_created)
-    if memory_created is None:
-        memory_created = webhook_first_time_setup(uid, WebhookType.memory_created)
-    realtime_transcript = user_webhook_status_db(uid, WebhookType.realtime_transcript)
-    if realtime_transcript is None:
-        realtime_transcript = webhook_first_time_setup(uid, WebhookType.realtime_transcript)
-    day_summary = user_webhook_status_db(uid, WebhookType.day_summary)
-    if day_summary is None:
-        day_summary = webhook_first_time_setup(uid, WebhookType.day_summary)
+    wtypes = [
+        WebhookType.audio_bytes,
+        WebhookType.memory_created,
+        WebhookType.realtime_transcript,
+        WebhookType.day_summary,
+    ]
+    webhooks = get_user_webhooks(uid, wtypes)
+    statuses = {}
+    for wtype in wtypes:
+        status, _ = webhooks[wtype]
+        # This only happens the first time because the status will be None for existing users
+        if status is None:
+            status = webhook_first_time_setup(uid, wtype)
+        statuses[wtype] = status
+    audio_bytes = statuses[WebhookType.audio_bytes]
+    memory_created = statuses[WebhookType.memory_created]
+    realtime_transcript = statuses[WebhookType.realtime_transcript]
+    day_summary = statuses[WebhookType.day_summary]
     return {
         'audio_bytes': audio_bytes,
         'memory_created': memory_created,
@@ -311,6 +317,7 @@ def update_person_name(
     uid: str = Depends(auth.get_current_user_uid),
 ):
     update_person(uid, person_id, value)
+    rename_in_speaker_gallery(uid, person_id, value)
     return {'status': 'ok'}
 
 
@@ -318,6 +325,7 @@ def update_person_name(
 def delete_person_endpoint(person_id: str, uid: str = Depends(auth.get_current_user_uid)):
     delete_person(uid, person_id)
     delete_user_person_speech_samples(uid, person_id)
+    remove_from_speaker_gallery(uid, person_id)
     return {'status': 'ok'}
 
 
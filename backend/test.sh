@@ -19,3 +19,28 @@ pytest tests/unit/test_llm_usage_tracker.py -v
 pytest tests/unit/test_process_conversation_usage_context.py -v
 pytest tests/unit/test_llm_usage_db.py -v
 pytest tests/unit/test_llm_usage_endpoints.py -v
+pytest tests/unit/test_transcript_persistence.py -v
+pytest tests/unit/test_audio_ring_buffer.py -v
+pytest tests/unit/test_embeddings_client.py -v
+pytest tests/unit/test_webhook_dispatcher.py -v
+pytest tests/unit/test_encryption_key_cache.py -v
+pytest tests/unit/test_audio_stream.py -v
+pytest tests/unit/test_vector_store.py -v
+pytest tests/unit/test_conversations_async.py -v
+pytest tests/unit/test_transcript_segment_performance.py -v
+pytest tests/unit/test_enabled_app_set.py -v
+pytest tests/unit/test_conversation_list_reads.py -v
+pytest tests/unit/test_daily_summary_fanout.py -v
+pytest tests/unit/test_public_feed.py -v
+pytest tests/unit/test_speaker_embedding_batch.py -v
+pytest tests/unit/test_speaker_gallery.py -v
+pytest tests/unit/test_job_executor.py -v
+pytest tests/unit/test_redis_batching.py -v
+pytest tests/unit/test_memory_cache.py -v
+pytest tests/unit/test_vad.py -v
+pytest tests/unit/test_offline_sync.py -v
+pytest tests/unit/test_translation.py -v
+pytest tests/unit/test_conversation_lifecycle.py -v
+pytest tests/unit/test_context_packer.py -v
+pytest tests/unit/test_memory_snapshot.py -v
+pytest tests/unit/test_wrapped_stages.py -v
@@ -0,0 +1,141 @@
+"""
+Tests for utils.audio.AudioRingBuffer.
+
+Covers: parity with a byte-by-byte reference buffer (wraparound, oversized writes), zero-copy views,
+int16 sample extraction, and a micro-benchmark of the per-second-of-audio cost at 8 kHz and 16 kHz.
+Run with `-s` to see the benchmark table.
+"""
+
+import random
+import sys
+import time
+from unittest.mock import MagicMock
+
+import numpy as np
+
+sys.modules.setdefault("pyogg", MagicMock())
+
+from utils.audio import AudioRingBuffer
+
+
+class _ReferenceRingBuffer(AudioRingBuffer):
+    """The previous byte-at-a-time implementation, kept as the behavioural reference."""
+
+    def write(self, data: bytes, timestamp: float):
+        for byte in data:
+            self.buffer[self.write_pos] = byte
+            self.write_pos = (self.write_pos + 1) % self.capacity
+        self.total_bytes_written += len(data)
+        self.last_write_timestamp = timestamp
+
+    def extract(self, start_ts: float, end_ts: float):
+        location = self._locate(start_ts, end_ts)
+        if location is None:
+            return None
+        pos, length = location
+        result = bytearray(length)
+        for i in range(length):
+            result[i] = self.buffer[(pos + i) % self.capacity]
+        return bytes(result)
+
+
+def _frames(sample_rate: int, frame_ms: int, seconds: float):
+    frame_bytes = sample_rate * 2 * frame_ms // 1000
+    rng = random.Random(sample_rate)
+    return [rng.randbytes(frame_bytes) for _ in range(int(seconds * 1000 / frame_ms))]
+
+
+class TestAudioRingBufferParity:
+    def test_matches_reference_with_wraparound(self):
+        rng = random.Random(7)
+        buf = AudioRingBuffer(1.0, 8000)
+        ref = _ReferenceRingBuffer(1.0, 8000)
+        ts = 1000.0
+        for _ in range(200):
+            data = rng.randbytes(rng.choice([0, 2, 320, 1000, 5000]))
+            ts += len(data) / buf.bytes_per_second
+            buf.write(data, ts)
+            ref.write(data, ts)
+            assert buf.buffer == ref.buffer
+            assert buf.write_pos == ref.write_pos
+
+            start = ts - rng.uniform(0, 1.5)
+            end = start + rng.uniform(0, 1.0)
+            assert buf.extract(start, end) == ref.extract(start, end)
+
+    def test_oversized_write_keeps_newest_bytes(self):
+        buf = AudioRingBuffer(1.0, 8)  # 16 bytes
+        ref = _ReferenceRingBuffer(1.0, 8)
+        buf.write(b'ab', 1.0)
+        ref.write(b'ab', 1.0)
+        data = bytes(range(50))
+        buf.write(data, 2.0)
+        ref.write(data, 2.0)
+        assert buf.buffer == ref.buffer
+        assert buf.write_pos == ref.write_pos
+        assert buf.extract(0.0, 3.0) == data[-16:]
+
+    def test_empty_buffer_returns_none(self):
+        buf = AudioRingBuffer(1.0, 8000)
+        assert buf.extract(0.0, 1.0) is None
+        assert buf.extract_view(0.0, 1.0) is None
+        assert buf.extract_samples(0.0, 1.0) is None
+
+
+class TestAudioRingBufferViews:
+    def test_contiguous_extract_view_is_zero_copy(self):
+        buf = AudioRingBuffer(1.0, 8000)
+        buf.write(b'\x01\x00' * 4000, 0.5)
+        view = buf.extract_view(0.0, 0.25)
+        assert view.obj is buf.buffer
+
+    def test_wrapped_extract_view_is_joined(self):
+        buf = AudioRingBuffer(1.0, 8)  # 16 bytes
+        buf.write(bytes(range(12)), 1.0)
+        buf.write(bytes(range(12, 24)), 2.0)
+        view = buf.extract_view(0.0, 3.0)
+        assert view.obj is not buf.buffer
+        assert view.tobytes() == bytes(range(8, 24))
+
+    def test_extract_samples_int16(self):
+        buf = AudioRingBuffer(1.0, 8000)
+        samples = np.arange(-100, 100, dtype=np.int16)
+        buf.write(samples.tobytes(), 1.0)
+        extracted = buf.extract_samples(0.0, 1.0)
+        assert extracted.dtype == np.int16
+        np.testing.assert_array_equal(extracted, samples)
+        extracted[0] = 1
+        assert buf.extract_samples(0.0, 1.0)[0] == -100
+
+    def test_extract_samples_without_copy_aliases_buffer(self):
+        buf = AudioRingBuffer(1.0, 8000)
+        buf.write(np.zeros(100, dtype=np.int16).tobytes(), 1.0)
+        samples = buf.extract_samples(0.0, 1.0, copy=False)
+        buf.buffer[0:2] = b'\x05\x00'
+        assert samples[0] == 5
+
+
+class TestAudioRingBufferBenchmark:
+    """Cost per second of audio: 20ms frames written, one 4s extraction per second."""
+
+    SECONDS = 5
+
+    def _cost_per_audio_second(self, cls, sample_rate: int) -> float:
+        buf = cls(60.0, sample_rate)
+        frames = _frames(sample_rate, 20, self.SECONDS)
+        ts = 0.0
+        started = time.perf_counter()
+        for i, frame in enumerate(frames):
+            ts += 0.02
+            buf.write(frame, ts)
+            if i % 50 == 49:
+                buf.extract(ts - 4.0, ts)
+        return (time.perf_counter() - started) / self.SECONDS
+
+    def test_cost_per_second_of_audio(self):
+        print('\nsample rate | reference us/audio-s | bulk us/audio-s | speedup')
+        for sample_rate in [8000, 16000]:
+            reference = self._cost_per_audio_second(_ReferenceRingBuffer, sample_rate)
+            bulk = self._cost_per_audio_second(AudioRingBuffer, sample_rate)
+            print(f'{sample_rate:11d} | {reference * 1e6:20.0f} | {bulk * 1e6:15.0f} | {reference / bulk:6.0f}x')
+            assert bulk * 10 < reference
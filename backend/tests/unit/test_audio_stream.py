@@ -0,0 +1,232 @@
+"""
+Tests for range-aware audio streaming (utils/audio_stream.py).
+
+Covers: WAV header parity with the wave module, byte-for-byte parity with the merge done by
+download_audio_chunks_and_merge (gap-fill silence, missing and unsorted chunks), range slicing, fetching only
+overlapping chunks, and a benchmark of peak memory and time-to-first-byte for a 64KB Range request and a full
+download, merge-then-serve vs streaming. Run with `-s` to see the report.
+"""
+
+import io
+import random
+import threading
+import time
+import tracemalloc
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.audio_stream import build_audio_stream_index, iter_audio_range, wav_header
+
+SAMPLE_RATE = 16000
+
+
+def _pcm_to_wav(pcm_data: bytes) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(SAMPLE_RATE)
+        wav_file.writeframes(pcm_data)
+    return buffer.getvalue()
+
+
+def _reference_merge(chunks: dict, timestamps, fill_gaps=True) -> bytes:
+    """The merge loop of download_audio_chunks_and_merge."""
+    merged = bytearray()
+    if fill_gaps and timestamps and chunks:
+        sorted_timestamps = sorted(timestamps)
+        current_time = sorted_timestamps[0]
+        for timestamp in sorted_timestamps:
+            if timestamp not in chunks:
+                continue
+            pcm = chunks[timestamp]
+            gap_seconds = timestamp - current_time
+            if gap_seconds > 0:
+                merged.extend(bytes(int(gap_seconds * SAMPLE_RATE) * 2))
+            merged.extend(pcm)
+            current_time = timestamp + len(pcm) / (SAMPLE_RATE * 2)
+    else:
+        for timestamp in timestamps:
+            if timestamp in chunks:
+                merged.extend(chunks[timestamp])
+    return bytes(merged)
+
+
+def _chunks(seconds_each, count, start=1_700_000_000.0, gaps=(), seed=1):
+    rng = random.Random(seed)
+    chunks, timestamps, ts = {}, [], start
+    for i in range(count):
+        size = int(seconds_each * SAMPLE_RATE) * 2
+        chunks[round(ts, 3)] = rng.randbytes(size)
+        timestamps.append(round(ts, 3))
+        ts += seconds_each + (gaps[i] if i < len(gaps) else 0)
+    return chunks, timestamps
+
+
+def _stream(index, chunks, start, end, fetched=None):
+    def _fetch(timestamp):
+        if fetched is not None:
+            fetched.append(timestamp)
+        return chunks[timestamp]
+
+    return b''.join(iter_audio_range(index, start, end, _fetch))
+
+
+def _sizes(chunks):
+    return {ts: len(data) for ts, data in chunks.items()}
+
+
+class TestWavHeader:
+    def test_matches_wave_module(self):
+        for pcm_size in [0, 2, 32000, 123456]:
+            assert wav_header(pcm_size, SAMPLE_RATE) == _pcm_to_wav(bytes(pcm_size))[:44]
+
+
+class TestLayoutParity:
+    def test_full_stream_matches_merge_with_gaps_and_missing_chunks(self):
+        chunks, timestamps = _chunks(0.5, 8, gaps=[0, 0.25, 0, 1.0, 0, 0, 0.1])
+        del chunks[timestamps[3]]
+        shuffled = list(timestamps)
+        random.Random(3).shuffle(shuffled)
+
+        for fill_gaps in [True, False]:
+            expected = _reference_merge(chunks, shuffled, fill_gaps)
+            index = build_audio_stream_index(_sizes(chunks), shuffled, fill_gaps, SAMPLE_RATE)
+            assert index.size == len(expected)
+            assert _stream(index, chunks, 0, index.size - 1) == expected
+
+    def test_wav_stream_matches_pcm_to_wav(self):
+        chunks, timestamps = _chunks(0.5, 5, gaps=[0.3, 0, 0.7])
+        expected = _pcm_to_wav(_reference_merge(chunks, timestamps))
+        index = build_audio_stream_index(_sizes(chunks), timestamps, True, SAMPLE_RATE, wav=True)
+        assert index.size == len(expected)
+        assert _stream(index, chunks, 0, index.size - 1) == expected
+
+    def test_random_ranges(self):
+        chunks, timestamps = _chunks(0.25, 12, gaps=[0.1] * 11)
+        expected = _pcm_to_wav(_reference_merge(chunks, timestamps))
+        index = build_audio_stream_index(_sizes(chunks), timestamps, True, SAMPLE_RATE, wav=True)
+        rng = random.Random(5)
+        for _ in range(100):
+            start = rng.randrange(len(expected))
+            end = rng.randrange(start, len(expected))
+            assert _stream(index, chunks, start, end) == expected[start : end + 1]
+        assert _stream(index, chunks, 10, 10_000_000) == expected[10:]
+        assert _stream(index, chunks, len(expected), len(expected) + 5) == b''
+
+
+class TestBoundedFetching:
+    def test_only_overlapping_chunks_are_fetched(self):
+        chunks, timestamps = _chunks(1.0, 10)
+        index = build_audio_stream_index(_sizes(chunks), timestamps, True, SAMPLE_RATE, wav=True)
+        chunk_bytes = SAMPLE_RATE * 2
+
+        fetched = []
+        _stream(index, chunks, 0, 43, fetched)
+        assert fetched == []
+
+        fetched = []
+        start = 44 + 4 * chunk_bytes + 10
+        _stream(index, chunks, start, start + 100, fetched)
+        assert fetched == [timestamps[4]]
+
+    def test_prefetch_limits_chunks_in_flight(self):
+        chunks, timestamps = _chunks(0.1, 30)
+        index = build_audio_stream_index(_sizes(chunks), timestamps, True, SAMPLE_RATE)
+        lock, state = threading.Lock(), {'in_flight': 0, 'peak': 0}
+
+        def _fetch(timestamp):
+            with lock:
+                state['in_flight'] += 1
+                state['peak'] = max(state['peak'], state['in_flight'])
+            time.sleep(0.001)
+            with lock:
+                state['in_flight'] -= 1
+            return chunks[timestamp]
+
+        data = b''.join(iter_audio_range(index, 0, index.size - 1, _fetch, prefetch=3))
+        assert data == _reference_merge(chunks, timestamps)
+        assert state['peak'] <= 3
+
+    def test_unexpected_chunk_size_keeps_layout(self):
+        chunks, timestamps = _chunks(0.5, 3)
+        index = build_audio_stream_index(_sizes(chunks), timestamps, True, SAMPLE_RATE)
+        short = dict(chunks)
+        short[timestamps[1]] = b''  # deleted after listing
+        data = _stream(index, short, 0, index.size - 1)
+        assert len(data) == index.size
+        assert data[index.spans[2].offset :] == chunks[timestamps[2]]
+
+
+class TestStreamingBenchmark:
+    """Merge-then-serve vs streaming for a 30-minute recording of 10s chunks."""
+
+    CHUNK_SECONDS = 10
+    CHUNKS = 180
+    FETCH_LATENCY = 0.002
+
+    def _fetch_factory(self, chunk_size):
+        def _fetch(timestamp):
+            time.sleep(self.FETCH_LATENCY)
+            return bytes([int(timestamp) % 256]) * chunk_size
+
+        return _fetch
+
+    def _merge_then_serve(self, timestamps, fetch, start, end):
+        # Previous endpoint: download (10 workers) + merge every chunk, build the WAV, copy into BytesIO, then slice
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            chunks = dict(zip(timestamps, executor.map(fetch, timestamps)))
+        wav = _pcm_to_wav(_reference_merge(chunks, timestamps))
+        del chunks
+        body = io.BytesIO(wav[start : end + 1])
+        return body.read(64 * 1024)
+
+    def _streaming(self, timestamps, fetch, chunk_size, start, end):
+        index = build_audio_stream_index({ts: chunk_size for ts in timestamps}, timestamps, True, SAMPLE_RATE, True)
+        stream = iter_audio_range(index, start, min(end, index.size - 1), fetch)
+        first = next(stream)
+        for _ in stream:
+            pass
+        return first
+
+    def _measure(self, func, *args):
+        tracemalloc.start()
+        started = time.perf_counter()
+        func(*args)
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return elapsed, peak
+
+    def _ttfb(self, func, *args):
+        started = time.perf_counter()
+        func(*args)
+        return time.perf_counter() - started
+
+    def test_report_peak_memory_and_ttfb(self):
+        chunk_size = self.CHUNK_SECONDS * SAMPLE_RATE * 2
+        timestamps = [1_700_000_000.0 + i * self.CHUNK_SECONDS for i in range(self.CHUNKS)]
+        fetch = self._fetch_factory(chunk_size)
+        total = 44 + chunk_size * self.CHUNKS
+        middle = total // 2
+
+        print(f'\n{self.CHUNKS * self.CHUNK_SECONDS // 60}min recording ({total / 1e6:.0f}MB WAV)')
+        print('request        | merge peak MB  ttfb ms | stream peak MB  ttfb ms')
+        for label, start, end in [('64KB range', middle, middle + 64 * 1024 - 1), ('full file', 0, total - 1)]:
+            merge_ttfb = self._ttfb(self._merge_then_serve, timestamps, fetch, start, end)
+            _, merge_peak = self._measure(self._merge_then_serve, timestamps, fetch, start, end)
+
+            def _first_byte():
+                index = build_audio_stream_index(
+                    {ts: chunk_size for ts in timestamps}, timestamps, True, SAMPLE_RATE, True
+                )
+                return next(iter_audio_range(index, start, end, fetch))
+
+            stream_ttfb = self._ttfb(_first_byte)
+            _, stream_peak = self._measure(self._streaming, timestamps, fetch, chunk_size, start, end)
+            print(
+                f'{label:14s} | {merge_peak / 1e6:13.1f} {merge_ttfb * 1000:8.1f} '
+                f'| {stream_peak / 1e6:14.1f} {stream_ttfb * 1000:8.1f}'
+            )
+            assert stream_peak * 10 < merge_peak
+            assert stream_ttfb < merge_ttfb
@@ -0,0 +1,401 @@
+"""
+Tests for the token-budgeted chat context (utils/retrieval/context_packer.py) and the lazy Firestore reads behind it.
+
+Covers: ranking by relevance and recency, packing to the budget in citation order, transcript excerpts, cached token
+counts, people loaded per page, pages read only as far as the budget goes, and the conversation iterators.
+Ends with an evaluation harness over a synthetic user history: prompt tokens, context build latency and documents
+read per question, everything stringified vs packed, run with `-s` to see the report.
+"""
+
+import os
+import random
+import re
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock
+
+import pytest
+
+os.environ.setdefault(
+    "ENCRYPTION_SECRET",
+    "omi_ZwB2ZNqB2HHpMK6wStk7sTpavJiPTFg7gXUHnc4tFABPU6pZ2c2DKgehtfgi4RZv",
+)
+
+for _name in ["database._client", "database.users", "utils.other.storage"]:
+    sys.modules[_name] = MagicMock()
+
+import database.conversations as conversations_db
+import utils.retrieval.context_packer as context_packer
+from models.conversation import Conversation
+from models.memories import MemoryDB
+from models.other import Person
+from utils.retrieval.context_packer import ContextPacker, TokenCounts, pack_lines, rank_conversations
+
+NOW = datetime(2026, 10, 1, tzinfo=timezone.utc)
+
+
+class _WordEncoding:
+    """Words and punctuation as tokens, stands in for the BPE file that can't be downloaded here."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def encode(self, text, disallowed_special=()):
+        self.calls += 1
+        return re.findall(r'\w+|[^\w\s]', text)
+
+
+@pytest.fixture(autouse=True)
+def encoding(monkeypatch):
+    encoding = _WordEncoding()
+    monkeypatch.setattr(context_packer, '_encoding', encoding)
+    return encoding
+
+
+def _conversation(i, days_ago=0, segments=0, title=None, person_id=None, words=12, overview_sentences=3):
+    created_at = NOW - timedelta(days=days_ago)
+    return {
+        'id': f'c{i}',
+        'created_at': created_at,
+        'started_at': created_at,
+        'finished_at': created_at + timedelta(minutes=30),
+        'structured': {
+            'title': f'conversation {i} about the launch plan' if title is None else title,
+            'overview': (
+                '' if title == '' else ' '.join(['we talked about the launch and the budget.'] * overview_sentences)
+            ),
+            'category': 'work',
+        },
+        'transcript_segments': [
+            {
+                'text': ' '.join(['the release goes out next week'] * (words // 6)),
+                'speaker': f'SPEAKER_0{s % 2}',
+                'speaker_id': s % 2,
+                'is_user': s % 2 == 0,
+                'person_id': person_id if s % 2 else None,
+                'start': s * 5.0,
+                'end': s * 5.0 + 4,
+            }
+            for s in range(segments)
+        ],
+    }
+
+
+def _pages(conversations, page_size=5, reads=None):
+    for i in range(0, len(conversations), page_size):
+        if reads is not None:
+            reads.append(i // page_size)
+        yield conversations[i : i + page_size]
+
+
+# *********************************
+# *********** RANKING *************
+# *********************************
+
+
+def test_rank_mixes_relevance_and_recency():
+    candidates = [_conversation(0, days_ago=365), _conversation(1, days_ago=1), _conversation(2, days_ago=400)]
+    ranked = rank_conversations(candidates, now=NOW)
+    # c0 is the best match but a year old, c1 a fair match from yesterday
+    assert [c['id'] for c in ranked] == ['c1', 'c0', 'c2']
+
+    only_relevance = rank_conversations(candidates, now=NOW, relevance_weight=1.0)
+    assert [c['id'] for c in only_relevance] == ['c0', 'c1', 'c2']
+
+    explicit = rank_conversations(candidates, relevance={'c2': 1.0}, now=NOW, relevance_weight=1.0)
+    assert explicit[0]['id'] == 'c2'
+    assert rank_conversations([]) == []
+
+
+# *********************************
+# ************ PACKING ************
+# *********************************
+
+
+def test_pack_stays_in_budget_and_stops_reading():
+    conversations = [_conversation(i) for i in range(100)]
+    reads = []
+    packed = ContextPacker(budget_tokens=1000, counts=TokenCounts()).pack(_pages(conversations, reads=reads))
+
+    assert packed.truncated
+    assert 0 < len(packed.conversations) < 100
+    assert packed.tokens <= 1000
+    assert abs(context_packer.count_tokens(packed.text) - packed.tokens) <= len(packed.conversations)
+    # Pages past the budget are never read
+    assert len(reads) <= len(packed.conversations) // 5 + 1
+
+    # Numbered in the order of packed.conversations, which cited answers index into
+    numbers = [int(n) for n in re.findall(r'^Conversation #(\d+)$', packed.text, re.M)]
+    assert numbers == list(range(1, len(packed.conversations) + 1))
+    assert [c.id for c in packed.conversations] == [f'c{i}' for i in range(len(numbers))]
+
+
+def test_pack_matches_conversations_to_string_when_everything_fits():
+    conversations = [_conversation(i, segments=4) for i in range(3)]
+    packed = ContextPacker(budget_tokens=100000, counts=TokenCounts()).pack(_pages(conversations))
+    assert not packed.truncated
+    assert packed.text == Conversation.conversations_to_string([Conversation(**c) for c in conversations], False)
+
+
+def test_transcript_excerpts_fit_the_room_left():
+    long_one = _conversation(0, segments=400, words=24)
+    packer = ContextPacker(budget_tokens=2000, use_transcript=True, counts=TokenCounts())
+    packed = packer.pack([[long_one, _conversation(1, segments=2)]])
+
+    assert packed.excerpts == 2 and not packed.truncated
+    assert packed.tokens <= 2000
+    first = packed.text.split(context_packer.CONVERSATIONS_SEPARATOR)[0]
+    assert '\nTranscript:\n' in first and first.endswith(context_packer.EXCERPT_CUT_MARKER)
+    excerpt = first.split('\nTranscript:\n')[1]
+    assert context_packer.count_tokens(excerpt) <= packer.max_excerpt_tokens
+
+
+def test_conversations_without_a_summary_get_an_excerpt():
+    packed = ContextPacker(budget_tokens=5000, counts=TokenCounts()).pack([[_conversation(0, title='', segments=3)]])
+    assert packed.excerpts == 1 and 'the release goes out next week' in packed.text
+
+    # No room for a useful excerpt: the summary alone
+    packed = ContextPacker(budget_tokens=100, counts=TokenCounts()).pack([[_conversation(0, title='', segments=3)]])
+    assert packed.excerpts == 0 and len(packed.conversations) == 1
+
+
+def test_token_counts_are_cached_per_version(encoding):
+    counts = TokenCounts()
+    conversations = [_conversation(i, segments=10) for i in range(5)]
+    ContextPacker(budget_tokens=100000, use_transcript=True, counts=counts).pack(_pages(conversations))
+    assert counts.misses == 10 and counts.hits == 0
+
+    calls = encoding.calls
+    ContextPacker(budget_tokens=100000, use_transcript=True, counts=counts).pack(_pages(conversations))
+    assert counts.hits == 10
+    # Only the short headers are counted again
+    assert encoding.calls - calls == 3 + len(conversations)
+
+    # A new version of a conversation is counted again
+    conversations[0]['structured']['overview'] += ' and the hiring plan'
+    ContextPacker(budget_tokens=100000, counts=counts).pack([[conversations[0]]])
+    assert counts.misses == 11
+
+
+def test_people_are_loaded_once_per_page():
+    loaded = []
+
+    def load_people(person_ids):
+        loaded.append(sorted(person_ids))
+        return [Person(id=pid, name=f'Name {pid}', created_at=NOW, updated_at=NOW) for pid in person_ids]
+
+    conversations = [_conversation(i, segments=2, person_id=f'p{i % 3}') for i in range(6)]
+    packed = ContextPacker(budget_tokens=100000, counts=TokenCounts()).pack(
+        _pages(conversations, page_size=3), load_people=load_people
+    )
+    assert loaded == [['p0', 'p1', 'p2']]
+    assert 'Attendees: Name p1' in packed.text
+
+
+def test_pack_lines():
+    lines = [f'- fact number {i}\n' for i in range(100)]
+    kept, truncated = pack_lines(iter(lines), budget_tokens=50)
+    assert truncated and kept == lines[: len(kept)] and 0 < len(kept) < 100
+    assert pack_lines(lines[:3], budget_tokens=50) == (lines[:3], False)
+
+
+# *********************************
+# ********** FIRESTORE ************
+# *********************************
+
+
+class _FakeDoc:
+    def __init__(self, data):
+        self.id = data['id'] if data else None
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class _FakeQuery:
+    def __init__(self, store):
+        self.store = store
+        self.selected = None
+        self.streamed = 0
+
+    def where(self, filter=None):
+        return self
+
+    def order_by(self, *args, **kwargs):
+        return self
+
+    def limit(self, n):
+        return self
+
+    def offset(self, n):
+        return self
+
+    def select(self, fields):
+        self.selected = fields
+        return self
+
+    def stream(self):
+        for data in self.store.docs:
+            self.streamed += 1
+            yield _FakeDoc({k: v for k, v in data.items() if self.selected is None or k in self.selected})
+
+    def document(self, document_id):
+        return _FakeRef(document_id, self)
+
+    def collection(self, name):
+        return self
+
+
+class _FakeRef:
+    def __init__(self, document_id, query):
+        self.id = document_id
+        self.query = query
+
+    def collection(self, name):
+        return self.query
+
+
+class _FakeDb:
+    def __init__(self, docs):
+        self.docs = docs
+        self.query = _FakeQuery(self)
+        self.get_all_calls = []
+
+    def collection(self, name):
+        return self.query
+
+    def get_all(self, refs, field_paths=None):
+        self.get_all_calls.append(([ref.id for ref in refs], field_paths))
+        by_id = {d['id']: d for d in self.docs}
+        for ref in reversed(refs):
+            data = by_id.get(ref.id)
+            if data is not None and field_paths:
+                data = {k: v for k, v in data.items() if k in field_paths}
+            yield _FakeDoc(data)
+
+
+def test_conversations_by_id_come_in_order_and_page_by_page(monkeypatch):
+    docs = [_conversation(i) for i in range(30)]
+    docs[3]['discarded'] = True
+    db = _FakeDb(docs)
+    monkeypatch.setattr(conversations_db, 'db', db)
+
+    ids = [f'c{i}' for i in (5, 3, 1, 99, 0, 2)]
+    pages = conversations_db.iter_conversations_by_id('u1', ids, page_size=2)
+    assert [c['id'] for c in next(pages)] == ['c5']
+    assert len(db.get_all_calls) == 1
+    assert [[c['id'] for c in page] for page in pages] == [['c1'], ['c0', 'c2']]
+
+    listed = conversations_db.get_conversations_list_fields_by_id('u1', ids)
+    assert [c['id'] for c in listed] == ['c5', 'c1', 'c0', 'c2']
+    assert 'transcript_segments' not in listed[0]
+
+
+def test_conversations_stream_stops_with_the_caller(monkeypatch):
+    db = _FakeDb([_conversation(i, segments=2) for i in range(100)])
+    monkeypatch.setattr(conversations_db, 'db', db)
+
+    pages = conversations_db.iter_conversations('u1', limit=100, page_size=10, include_transcript=False)
+    first = next(pages)
+    pages.close()
+    assert len(first) == 10 and 'transcript_segments' not in first[0]
+    assert db.query.streamed == 10
+
+
+# *********************************
+# ********** EVALUATION ***********
+# *********************************
+
+
+def _history(rng, count=1500):
+    return [
+        _conversation(
+            i,
+            days_ago=rng.uniform(0, 730),
+            segments=rng.randint(20, 300),
+            words=rng.choice([6, 12, 18]),
+            overview_sentences=rng.randint(8, 30),
+        )
+        for i in range(count)
+    ]
+
+
+def _memories(count=3000):
+    return [
+        MemoryDB(
+            id=f'm{i}',
+            uid='u1',
+            content=f'User prefers option {i} for the weekly planning and the morning routine',
+            category='interesting',
+            created_at=NOW,
+            updated_at=NOW,
+        )
+        for i in range(count)
+    ]
+
+
+def test_evaluation_prompt_tokens_and_latency_per_question():
+    """
+    The previous context vs the packed one for the three question shapes: a RAG answer over the 100 vector search
+    matches, a "recap my year" tool call (limit=5000, default max_transcript_segments=0) and a "what do you know about
+    me" memories call (limit=5000). Docs read are full documents, the ranking itself only reads the list fields.
+    """
+    rng = random.Random(7)
+    history = sorted(_history(rng), key=lambda c: c['created_at'], reverse=True)
+    by_id = {c['id']: c for c in history}
+    memories = _memories()
+    tokens = context_packer.count_tokens
+    rows = []
+
+    # RAG: vector search ids, previously every match read whole and stringified
+    matches = rng.sample([c['id'] for c in history], 100)
+    start = time.perf_counter()
+    before = Conversation.conversations_to_string([Conversation(**by_id[c]) for c in matches], False)
+    rows.append(('qa_handler', tokens(before), time.perf_counter() - start, 100))
+
+    reads = []
+    start = time.perf_counter()
+    ranked = rank_conversations([by_id[c] for c in matches], now=NOW)
+    packed = ContextPacker(counts=TokenCounts()).pack(
+        _pages([by_id[c['id']] for c in ranked], page_size=10, reads=reads)
+    )
+    rows[-1] += (tokens(packed.text), time.perf_counter() - start, len(reads) * 10)
+
+    # Recap my year: every conversation of the year, summaries
+    year = [c for c in history if c['created_at'] >= NOW - timedelta(days=365)]
+    start = time.perf_counter()
+    before = Conversation.conversations_to_string(
+        [Conversation(**{**c, 'transcript_segments': []}) for c in year], use_transcript=True
+    )
+    rows.append(('get_conversations_tool', tokens(before), time.perf_counter() - start, len(year)))
+
+    reads = []
+    start = time.perf_counter()
+    packed = ContextPacker(use_transcript=True, counts=TokenCounts()).pack(
+        _pages([{**c, 'transcript_segments': []} for c in year], page_size=20, reads=reads)
+    )
+    rows[-1] += (tokens(packed.text), time.perf_counter() - start, len(reads) * 20)
+
+    # What do you know about me: all the memories
+    start = time.perf_counter()
+    before = MemoryDB.get_memories_as_str(memories)
+    rows.append(('get_memories_tool', tokens(before), time.perf_counter() - start, len(memories)))
+
+    start = time.perf_counter()
+    lines = (MemoryDB.get_memories_as_str([m]) for m in memories)
+    kept, _ = pack_lines(lines)
+    rows[-1] += (tokens(''.join(kept)), time.perf_counter() - start, len(kept))
+
+    print()
+    print(f"budget {context_packer.CHAT_CONTEXT_TOKENS} tokens, {len(history)} conversations, {len(memories)} memories")
+    print(f"{'question':>24} {'prompt tokens':>22} {'context latency (ms)':>24} {'docs read':>14}")
+    for name, tokens_before, latency_before, read_before, tokens_after, latency_after, read_after in rows:
+        print(
+            f"{name:>24} {tokens_before:>10} -> {tokens_after:>7} {latency_before * 1000:>11.1f} -> "
+            f"{latency_after * 1000:>8.1f} {read_before:>6} -> {read_after:>4}"
+        )
+        assert tokens_after <= context_packer.CHAT_CONTEXT_TOKENS * 1.05
+        assert tokens_after < tokens_before and read_after <= read_before
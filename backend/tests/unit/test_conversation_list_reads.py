@@ -0,0 +1,377 @@
+"""
+Tests for the conversation list reads in database/conversations.py.
+
+Covers: bulk photo hydration through with_photos, the transcript-less projection and cursor pagination of
+get_conversations, and a benchmark of the list endpoint reads at 100 and 1000 conversations, the previous
+per-conversation photo reads and offset pagination vs the new path. The benchmark runs against an in-memory
+Firestore with a simulated round trip, or against the Firestore emulator when FIRESTORE_EMULATOR_HOST is set.
+Run with `-s` to see the report.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock
+
+import pytest
+
+os.environ.setdefault(
+    "ENCRYPTION_SECRET",
+    "omi_ZwB2ZNqB2HHpMK6wStk7sTpavJiPTFg7gXUHnc4tFABPU6pZ2c2DKgehtfgi4RZv",
+)
+
+for _name in ["database._client", "database.redis_db", "database.users", "utils.other.storage"]:
+    sys.modules[_name] = MagicMock()
+
+from google.cloud import firestore
+
+import database.conversations as conversations_db
+from database.helpers import prepare_for_read, with_photos
+from utils import encryption
+
+# *********************************
+# ******* FAKE FIRESTORE **********
+# *********************************
+
+
+class _FakeSnapshot:
+    def __init__(self, path, data):
+        self.path = path
+        self.id = path.rsplit('/', 1)[-1]
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class _FakeQuery:
+    def __init__(self, store, path, filters=(), order=None, fields=None, limit=None, offset=0, after=None):
+        self._store = store
+        self.path = path
+        self._filters = list(filters)
+        self._order = order
+        self._fields = fields
+        self._limit = limit
+        self._offset = offset
+        self._after = after
+
+    def _copy(self, **changes):
+        state = dict(
+            filters=self._filters,
+            order=self._order,
+            fields=self._fields,
+            limit=self._limit,
+            offset=self._offset,
+            after=self._after,
+        )
+        state.update(changes)
+        return _FakeQuery(self._store, self.path, **state)
+
+    def where(self, filter):
+        return self._copy(filters=self._filters + [filter])
+
+    def order_by(self, field, direction=None):
+        return self._copy(order=(field, direction == firestore.Query.DESCENDING))
+
+    def select(self, fields):
+        return self._copy(fields=list(fields))
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def offset(self, count):
+        return self._copy(offset=count)
+
+    def start_after(self, snapshot):
+        return self._copy(after=snapshot.id)
+
+    @staticmethod
+    def _matches(data, field_filter):
+        value = data
+        for part in field_filter.field_path.split('.'):
+            value = value.get(part) if isinstance(value, dict) else None
+        if field_filter.op_string == '==':
+            return value == field_filter.value
+        if field_filter.op_string == 'in':
+            return value in field_filter.value
+        if field_filter.op_string == '>=':
+            return value is not None and value >= field_filter.value
+        if field_filter.op_string == '<=':
+            return value is not None and value <= field_filter.value
+        raise NotImplementedError(field_filter.op_string)
+
+    def stream(self):
+        docs = self._store.children(self.path)
+        docs = [(path, data) for path, data in docs if all(self._matches(data, f) for f in self._filters)]
+        if self._order:
+            field, descending = self._order
+            docs.sort(key=lambda doc: doc[1][field], reverse=descending)
+        if self._after is not None:
+            ids = [path.rsplit('/', 1)[-1] for path, _ in docs]
+            docs = docs[ids.index(self._after) + 1 :]
+        skipped = min(self._offset, len(docs))
+        docs = docs[self._offset :]
+        if self._limit is not None:
+            docs = docs[: self._limit]
+        if self._fields is not None:
+            docs = [(path, {k: v for k, v in data.items() if k in self._fields}) for path, data in docs]
+        # Firestore bills a query by the documents returned plus the documents skipped by an offset
+        self._store.round_trip(reads=max(1, len(docs) + skipped), payload=[data for _, data in docs])
+        return [_FakeSnapshot(path, data) for path, data in docs]
+
+
+class _FakeCollection(_FakeQuery):
+    def __init__(self, store, path):
+        super().__init__(store, path)
+
+    def document(self, doc_id):
+        return _FakeDocRef(self._store, f'{self.path}/{doc_id}')
+
+
+class _FakeDocRef:
+    def __init__(self, store, path):
+        self._store = store
+        self.path = path
+
+    def collection(self, name):
+        return _FakeCollection(self._store, f'{self.path}/{name}')
+
+    def get(self, field_paths=None):
+        data = self._store.docs.get(self.path)
+        self._store.round_trip(reads=1, payload=[data] if data else [])
+        return _FakeSnapshot(self.path, data)
+
+
+class _FakeFirestore:
+    """In-memory Firestore, every request costs one simulated round trip and bills the documents it reads."""
+
+    def __init__(self, rtt: float = 0.0):
+        self.rtt = rtt
+        self.docs = {}
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.round_trips = 0
+        self.doc_reads = 0
+        self.bytes_read = 0
+
+    def round_trip(self, reads: int, payload: list):
+        size = sum(len(json.dumps(data, default=str)) for data in payload)
+        with self._lock:
+            self.round_trips += 1
+            self.doc_reads += reads
+            self.bytes_read += size
+        if self.rtt:
+            time.sleep(self.rtt)
+
+    def children(self, path):
+        depth = path.count('/') + 1
+        return [
+            (doc_path, data)
+            for doc_path, data in self.docs.items()
+            if doc_path.startswith(path + '/') and doc_path.count('/') == depth
+        ]
+
+    def collection(self, name):
+        return _FakeCollection(self, name)
+
+
+# *********************************
+# ************ DATA ***************
+# *********************************
+
+BASE_TIME = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+def _conversation(i: int, segments: int = 40) -> dict:
+    return {
+        'id': f'conv-{i:05d}',
+        'created_at': BASE_TIME + timedelta(minutes=i),
+        'started_at': BASE_TIME + timedelta(minutes=i),
+        'finished_at': BASE_TIME + timedelta(minutes=i, seconds=50),
+        'source': 'omi',
+        'language': 'en',
+        'structured': {'title': f'Conversation {i}', 'overview': 'Talked about the release plan. ' * 5, 'emoji': '🧠'},
+        'transcript_segments': [
+            {'id': str(k), 'text': 'we should ship the release on friday after review ' * 2, 'speaker': 'SPEAKER_00'}
+            for k in range(segments)
+        ],
+        'transcript_segments_compressed': False,
+        'discarded': False,
+        'status': 'completed',
+        'data_protection_level': 'standard',
+        'plugins_results': [],
+        'apps_results': [],
+    }
+
+
+def _populate(store, uid: str, count: int, photo_every: int = 3):
+    base = f'users/{uid}/conversations'
+    for i in range(count):
+        conversation = _conversation(i)
+        store.docs[f'{base}/{conversation["id"]}'] = conversation
+        if i % photo_every == 0:
+            for k in range(2):
+                photo = {
+                    'id': f'photo-{i}-{k}',
+                    'base64': f'aW1hZ2Ute2l9LXtrfQ=={i}{k}',
+                    'description': f'photo {k}',
+                    'created_at': BASE_TIME,
+                    'data_protection_level': 'standard',
+                }
+                if k == 1:
+                    photo['data_protection_level'] = 'enhanced'
+                    photo['base64'] = encryption.encrypt(photo['base64'], uid)
+                store.docs[f'{base}/{conversation["id"]}/photos/{photo["id"]}'] = photo
+
+
+def _previous_get_conversations():
+    """get_conversations as it was decorated before: one photos read per conversation."""
+    raw = conversations_db.get_conversations.__wrapped__.__wrapped__
+    return prepare_for_read(
+        decrypt_func=conversations_db._prepare_conversation_for_read,
+        bulk_decrypt_func=conversations_db._prepare_conversations_for_read,
+    )(with_photos(conversations_db.get_conversation_photos)(raw))
+
+
+@pytest.fixture
+def store(monkeypatch):
+    fake = _FakeFirestore()
+    monkeypatch.setattr(conversations_db, 'db', fake)
+    _populate(fake, 'u1', 30)
+    fake.reset_stats()
+    return fake
+
+
+# *********************************
+# ************ TESTS **************
+# *********************************
+
+
+class TestBulkPhotoHydration:
+    def test_matches_per_conversation_reads(self, store):
+        previous = _previous_get_conversations()('u1', limit=30, statuses=['completed'])
+        current = conversations_db.get_conversations('u1', limit=30, statuses=['completed'])
+        assert current == previous
+        photos = {c['id']: c['photos'] for c in current if c['photos']}
+        assert len(photos) == 10
+        # Enhanced photos are decrypted
+        assert all(photo['base64'].startswith('aW1hZ2U') for p in photos.values() for photo in p)
+
+    def test_photos_keyed_by_conversation(self, store):
+        photos = conversations_db.get_conversations_photos('u1', ['conv-00000', 'conv-00001', 'missing'])
+        assert [p['id'] for p in photos['conv-00000']] == ['photo-0-0', 'photo-0-1']
+        assert photos['conv-00001'] == [] and photos['missing'] == []
+        assert conversations_db.get_conversations_photos('u1', []) == {}
+
+    def test_single_conversation_uses_per_item_getter(self, store):
+        conversation = conversations_db.get_conversation('u1', 'conv-00003')
+        assert [p['id'] for p in conversation['photos']] == ['photo-3-0', 'photo-3-1']
+
+
+class TestListReads:
+    def test_projection_skips_transcript(self, store):
+        conversations = conversations_db.get_conversations('u1', limit=5, include_transcript=False)
+        assert [c['id'] for c in conversations] == [f'conv-{i:05d}' for i in range(29, 24, -1)]
+        assert all('transcript_segments' not in c and 'plugins_results' not in c for c in conversations)
+        assert conversations[0]['structured']['title'] == 'Conversation 29'
+        assert 'data_protection_level' in conversations_db.CONVERSATION_LIST_FIELDS
+
+    def test_cursor_pages_match_offset_pages(self, store):
+        by_offset = [
+            [c['id'] for c in conversations_db.get_conversations('u1', limit=7, offset=offset)]
+            for offset in range(0, 30, 7)
+        ]
+        by_cursor, cursor = [], None
+        while True:
+            page = [c['id'] for c in conversations_db.get_conversations('u1', limit=7, start_after=cursor)]
+            if not page:
+                break
+            by_cursor.append(page)
+            cursor = page[-1]
+        assert by_cursor == by_offset
+
+    def test_unknown_cursor_falls_back_to_offset(self, store):
+        page = conversations_db.get_conversations('u1', limit=3, offset=3, start_after='deleted')
+        assert [c['id'] for c in page] == ['conv-00026', 'conv-00025', 'conv-00024']
+
+
+class TestListReadBenchmark:
+    """Paging a user's whole list, 50 conversations per page, a third of the conversations with photos."""
+
+    PAGE = 50
+    RTT = 0.004
+
+    @staticmethod
+    def _previous_pages(uid, count, page):
+        get_conversations = _previous_get_conversations()
+        return [get_conversations(uid, limit=page, offset=offset) for offset in range(0, count, page)]
+
+    @staticmethod
+    def _new_pages(uid, count, page):
+        pages, cursor = [], None
+        for _ in range(0, count, page):
+            pages.append(
+                conversations_db.get_conversations(uid, limit=page, start_after=cursor, include_transcript=False)
+            )
+            cursor = pages[-1][-1]['id']
+        return pages
+
+    def _measure(self, store, uid, count):
+        results = {}
+        for label, func in [('previous', self._previous_pages), ('new', self._new_pages)]:
+            store.reset_stats()
+            started = time.perf_counter()
+            pages = func(uid, count, self.PAGE)
+            elapsed = time.perf_counter() - started
+            results[label] = (elapsed, store.round_trips, store.doc_reads, store.bytes_read, pages)
+        return results
+
+    def _report(self, count, results):
+        print(f'\n{count} conversations, pages of {self.PAGE}:')
+        for label, (elapsed, round_trips, doc_reads, bytes_read, _) in results.items():
+            print(
+                f'  {label:>8}: {elapsed * 1000:7.0f}ms  {round_trips:5d} round trips  '
+                f'{doc_reads:6d} documents billed  {bytes_read / 1024:8.0f}KB read'
+            )
+
+    @pytest.mark.parametrize('count', [100, 1000])
+    def test_report_list_reads(self, monkeypatch, count):
+        store = _FakeFirestore(rtt=self.RTT)
+        monkeypatch.setattr(conversations_db, 'db', store)
+        _populate(store, 'u1', count)
+
+        results = self._measure(store, 'u1', count)
+        self._report(count, results)
+
+        previous, new = results['previous'], results['new']
+        flatten = lambda pages: [(c['id'], c['photos']) for page in pages for c in page]
+        assert flatten(new[4]) == flatten(previous[4])
+        assert new[0] * 3 < previous[0]
+        assert new[2] < previous[2]
+        assert new[3] * 5 < previous[3]
+
+    @pytest.mark.skipif(not os.getenv('FIRESTORE_EMULATOR_HOST'), reason='FIRESTORE_EMULATOR_HOST is not set')
+    @pytest.mark.parametrize('count', [100, 1000])
+    def test_against_emulator(self, monkeypatch, count):
+        client = firestore.Client(project=os.getenv('GOOGLE_CLOUD_PROJECT', 'omi-load-test'))
+        monkeypatch.setattr(conversations_db, 'db', client)
+
+        # The emulator has no billing counters, only wall time is reported
+        staging = _FakeFirestore()
+        uid = f'list-reads-{uuid.uuid4()}'
+        _populate(staging, uid, count)
+        for path, data in staging.docs.items():
+            client.document(path).set(data)
+
+        print(f'\n{count} conversations against the emulator, pages of {self.PAGE}:')
+        for label, func in [('previous', self._previous_pages), ('new', self._new_pages)]:
+            started = time.perf_counter()
+            func(uid, count, self.PAGE)
+            print(f'  {label:>8}: {(time.perf_counter() - started) * 1000:7.0f}ms')
@@ -0,0 +1,395 @@
+"""
+Tests for the non-blocking conversations data layer (database/conversations_async.py).
+
+Covers: the per-session protection level cache, coalescing of staged fields into the transcript delta write,
+and a load test of N concurrent fake websocket sessions, blocking calls on the event loop vs the async layer.
+The load test runs against an in-memory Firestore with a simulated round trip, or against the Firestore emulator
+when FIRESTORE_EMULATOR_HOST is set. Run with `-s` to see the report.
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from unittest.mock import MagicMock
+
+import pytest
+
+os.environ.setdefault(
+    "ENCRYPTION_SECRET",
+    "omi_ZwB2ZNqB2HHpMK6wStk7sTpavJiPTFg7gXUHnc4tFABPU6pZ2c2DKgehtfgi4RZv",
+)
+
+for _name in ["database._client", "database.redis_db", "database.users", "utils.other.storage"]:
+    sys.modules[_name] = MagicMock()
+
+from google.cloud.exceptions import NotFound
+
+import database.conversations as conversations_db
+import database.conversations_async as conversations_async
+from models.conversation import ConversationPhoto
+from models.transcript_segment import TranscriptSegment
+from utils.transcript_persistence import InProgressTranscriptWriter
+
+# *********************************
+# ******* FAKE FIRESTORE **********
+# *********************************
+
+
+class _FakeSnapshot:
+    def __init__(self, data):
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class _FakeDocRef:
+    def __init__(self, store, path):
+        self._store = store
+        self.path = path
+
+    def collection(self, name):
+        return _FakeCollection(self._store, f'{self.path}/{name}')
+
+    def get(self, field_paths=None):
+        self._store.round_trip('read')
+        return _FakeSnapshot(self._store.docs.get(self.path))
+
+    def set(self, data):
+        self._store.round_trip('write')
+        self._store.apply_set(self.path, data)
+
+    def update(self, data):
+        self._store.round_trip('write')
+        self._store.apply_update(self.path, data)
+
+
+class _FakeCollection:
+    def __init__(self, store, path):
+        self._store = store
+        self.path = path
+
+    def document(self, doc_id):
+        return _FakeDocRef(self._store, f'{self.path}/{doc_id}')
+
+
+class _FakeBatch:
+    def __init__(self, store):
+        self._store = store
+        self._ops = []
+
+    def set(self, ref, data):
+        self._ops.append(lambda: self._store.apply_set(ref.path, data))
+
+    def update(self, ref, data):
+        self._ops.append(lambda: self._store.apply_update(ref.path, data))
+
+    def commit(self):
+        self._store.round_trip('write')
+        for op in self._ops:
+            op()
+
+
+class _FakeFirestore:
+    """Thread-safe in-memory Firestore, every request costs one simulated round trip."""
+
+    def __init__(self, rtt: float = 0.0):
+        self.rtt = rtt
+        self.docs = {}
+        self.reads = 0
+        self.writes = 0
+        self._lock = threading.Lock()
+
+    def round_trip(self, kind: str):
+        with self._lock:
+            if kind == 'read':
+                self.reads += 1
+            else:
+                self.writes += 1
+        if self.rtt:
+            time.sleep(self.rtt)
+
+    def apply_set(self, path, data):
+        with self._lock:
+            self.docs[path] = dict(data)
+
+    def apply_update(self, path, data):
+        with self._lock:
+            if path not in self.docs:
+                raise NotFound(path)
+            self.docs[path].update(data)
+
+    def collection(self, name):
+        return _FakeCollection(self, name)
+
+    def batch(self):
+        return _FakeBatch(self)
+
+
+def _conversation_path(uid, conversation_id):
+    return f'users/{uid}/conversations/{conversation_id}'
+
+
+def _new_conversation(uid, conversation_id, level='standard'):
+    data = {'id': conversation_id, 'status': 'in_progress', 'transcript_segments': [], 'data_protection_level': level}
+    prepared = conversations_db._prepare_conversation_for_write(data, uid, level)
+    conversations_db.db.collection('users').document(uid).collection('conversations').document(conversation_id).set(
+        prepared
+    )
+
+
+def _segment(i: int) -> TranscriptSegment:
+    return TranscriptSegment(
+        id=str(uuid.uuid4()),
+        text=f'This is sentence number {i} of a long meeting transcript.',
+        speaker=f'SPEAKER_0{i % 3}',
+        is_user=False,
+        start=float(i),
+        end=float(i) + 0.9,
+    )
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    fake = _FakeFirestore()
+    monkeypatch.setattr(conversations_db, 'db', fake)
+    return fake
+
+
+class TestSyncWritesWithKnownLevel:
+    def test_update_segments_with_level_skips_read(self, fake_db):
+        _new_conversation('u1', 'c1', 'enhanced')
+        reads = fake_db.reads
+        conversations_db.update_conversation_segments('u1', 'c1', [{'id': 's1', 'text': 'hi'}], level='enhanced')
+        assert fake_db.reads == reads
+
+        stored = fake_db.docs[_conversation_path('u1', 'c1')]
+        assert isinstance(stored['transcript_segments'], str)
+        read_back = conversations_db._prepare_conversation_for_read(stored, 'u1')
+        assert read_back['transcript_segments'] == [{'id': 's1', 'text': 'hi'}]
+
+    def test_update_fields_on_missing_conversation(self, fake_db):
+        assert conversations_db.update_conversation_fields('u1', 'missing', {'discarded': True}) is False
+        assert conversations_db.update_conversation_segments('u1', 'missing', [], level='standard') is None
+
+
+class TestConversationSessionWriter:
+    def test_level_is_read_once_per_conversation(self, fake_db):
+        _new_conversation('u1', 'c1', 'enhanced')
+        writer = conversations_async.ConversationSessionWriter('u1')
+
+        async def _run():
+            for i in range(5):
+                await writer.update_segments('c1', [{'id': f's{i}'}])
+                await writer.store_photos('c1', [ConversationPhoto(id=f'p{i}', base64='aGVsbG8=')])
+
+        reads = fake_db.reads
+        asyncio.run(_run())
+        assert writer.level_reads == 1
+        assert fake_db.reads == reads + 1
+
+        photo = fake_db.docs[_conversation_path('u1', 'c1') + '/photos/p0']
+        assert photo['base64'] != 'aGVsbG8='
+        assert conversations_db._prepare_photo_for_read(photo, 'u1')['base64'] == 'aGVsbG8='
+
+    def test_known_level_needs_no_read(self, fake_db):
+        _new_conversation('u1', 'c1')
+        writer = conversations_async.ConversationSessionWriter('u1')
+        writer.set_level('c1', 'standard')
+        asyncio.run(writer.update_segments('c1', []))
+        assert writer.level_reads == 0
+
+    def test_staged_fields_coalesce_into_one_write(self, fake_db):
+        _new_conversation('u1', 'c1')
+        writer = conversations_async.ConversationSessionWriter('u1')
+        writer.set_level('c1', 'standard')
+        started_at = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        writer.stage('c1', {'started_at': started_at, 'source': 'omi'})
+        writer.stage('c1', {'source': 'openglass'})
+
+        writes = fake_db.writes
+        asyncio.run(writer.flush())
+        assert fake_db.writes == writes + 1
+        doc = fake_db.docs[_conversation_path('u1', 'c1')]
+        assert doc['started_at'] == started_at and doc['source'] == 'openglass'
+
+        # Nothing left to write
+        asyncio.run(writer.flush())
+        assert fake_db.writes == writes + 1
+
+    def test_missing_conversation_is_skipped(self, fake_db):
+        writer = conversations_async.ConversationSessionWriter('u1')
+        writer.stage('missing', {'source': 'openglass'})
+        asyncio.run(writer.flush())
+        asyncio.run(writer.update_segments('missing', []))
+        assert fake_db.writes == 0
+
+    def test_staged_fields_ride_on_transcript_delta(self, fake_db):
+        _new_conversation('u1', 'c1')
+        writer = conversations_async.ConversationSessionWriter('u1')
+        transcript = InProgressTranscriptWriter('u1', 'c1')
+        writer.stage('c1', {'source': 'openglass'})
+        finished_at = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+        writes = fake_db.writes
+        transcript.append([_segment(0)], [], finished_at=finished_at, fields=writer.take('c1'))
+        assert fake_db.writes == writes + 1
+        doc = fake_db.docs[_conversation_path('u1', 'c1')]
+        assert doc['source'] == 'openglass' and doc['finished_at'] == finished_at
+
+        # Without new segments the fields still go out in one update
+        transcript.append([], [], finished_at=finished_at, fields={'started_at': finished_at})
+        assert fake_db.writes == writes + 2
+        assert doc['started_at'] == finished_at
+
+    def test_run_does_not_block_the_loop(self):
+        async def _run():
+            started = time.perf_counter()
+            ticks = 0
+
+            async def _ticker():
+                nonlocal ticks
+                while time.perf_counter() - started < 0.05:
+                    ticks += 1
+                    await asyncio.sleep(0.001)
+
+            await asyncio.gather(conversations_async.run(time.sleep, 0.05), _ticker())
+            return ticks
+
+        assert asyncio.run(_run()) > 10
+
+
+# *********************************
+# ********** LOAD TEST ************
+# *********************************
+
+
+class TestConcurrentSessionsLoad:
+    """
+    N fake websocket sessions stream into their in-progress conversations at the same time. Each tick persists a
+    transcript delta; the first tick also moves started_at and every few ticks a photo arrives (photo + source).
+    """
+
+    SESSIONS = 40
+    TICKS = 8
+    TICK_INTERVAL = 0.02
+    PHOTO_EVERY = 3
+    RTT = 0.004
+
+    def _setup(self, uid_prefix):
+        sessions = []
+        for i in range(self.SESSIONS):
+            uid, conversation_id = f'{uid_prefix}-{i}', str(uuid.uuid4())
+            _new_conversation(uid, conversation_id)
+            sessions.append((uid, conversation_id))
+        return sessions
+
+    async def _blocking_session(self, uid, conversation_id):
+        # Previous handler: synchronous Firestore calls straight from the coroutine
+        transcript = InProgressTranscriptWriter(uid, conversation_id)
+        for tick in range(self.TICKS):
+            now = datetime.now(timezone.utc)
+            if tick == 0:
+                conversations_db.update_conversation(uid, conversation_id, {'started_at': now})
+            if tick % self.PHOTO_EVERY == 1:
+                conversations_db.store_conversation_photos(uid, conversation_id, [ConversationPhoto(base64='eA==')])
+                if tick == 1:
+                    conversations_db.update_conversation(uid, conversation_id, {'source': 'openglass'})
+            transcript.append([_segment(tick)], [], finished_at=now)
+            await asyncio.sleep(self.TICK_INTERVAL)
+
+    async def _async_session(self, uid, conversation_id):
+        writer = conversations_async.ConversationSessionWriter(uid)
+        writer.set_level(conversation_id, 'standard')
+        transcript = InProgressTranscriptWriter(uid, conversation_id)
+        for tick in range(self.TICKS):
+            now = datetime.now(timezone.utc)
+            if tick == 0:
+                writer.stage(conversation_id, {'started_at': now})
+            if tick % self.PHOTO_EVERY == 1:
+                await writer.store_photos(conversation_id, [ConversationPhoto(base64='eA==')])
+                if tick == 1:
+                    writer.stage(conversation_id, {'source': 'openglass'})
+            await conversations_async.run(
+                transcript.append, [_segment(tick)], [], finished_at=now, fields=writer.take(conversation_id)
+            )
+            await asyncio.sleep(self.TICK_INTERVAL)
+
+    async def _load(self, session_func, sessions):
+        lags = []
+        done = asyncio.Event()
+
+        async def _monitor():
+            # Event loop responsiveness as seen by every other coroutine (audio receive, heartbeats, ...)
+            while not done.is_set():
+                started = time.perf_counter()
+                await asyncio.sleep(0.001)
+                lags.append(time.perf_counter() - started - 0.001)
+
+        monitor = asyncio.create_task(_monitor())
+        started = time.perf_counter()
+        await asyncio.gather(*(session_func(uid, conversation_id) for uid, conversation_id in sessions))
+        elapsed = time.perf_counter() - started
+        done.set()
+        await monitor
+        lags.sort()
+        return elapsed, lags[len(lags) // 2], lags[-1]
+
+    def _run(self, db, session_func, label):
+        sessions = self._setup(label)
+        reads, writes = db.reads, db.writes
+        elapsed, median_lag, max_lag = asyncio.run(self._load(session_func, sessions))
+
+        for uid, conversation_id in sessions:
+            doc = db.docs[_conversation_path(uid, conversation_id)]
+            assert doc['source'] == 'openglass' and 'started_at' in doc and 'finished_at' in doc
+        ticks = self.SESSIONS * self.TICKS
+        return elapsed, median_lag, max_lag, (db.reads - reads) / ticks, (db.writes - writes) / ticks
+
+    def test_report_event_loop_lag(self, monkeypatch):
+        db = _FakeFirestore(rtt=self.RTT)
+        monkeypatch.setattr(conversations_db, 'db', db)
+
+        results = {}
+        print(f'\n{self.SESSIONS} sessions x {self.TICKS} ticks, simulated Firestore RTT {self.RTT * 1000:.0f}ms')
+        print('layer    | wall ms  loop lag p50 ms  max ms | reads/tick  writes/tick')
+        for label, session_func in [('blocking', self._blocking_session), ('async', self._async_session)]:
+            results[label] = self._run(db, session_func, label)
+            elapsed, median_lag, max_lag, reads, writes = results[label]
+            print(
+                f'{label:8s} | {elapsed * 1000:7.0f} {median_lag * 1000:16.2f} {max_lag * 1000:7.1f} '
+                f'| {reads:10.2f} {writes:12.2f}'
+            )
+
+        blocking, non_blocking = results['blocking'], results['async']
+        assert non_blocking[0] < blocking[0]
+        assert non_blocking[2] < blocking[2]
+        assert non_blocking[3] < blocking[3]
+        assert non_blocking[4] < blocking[4]
+
+    @pytest.mark.skipif(not os.getenv('FIRESTORE_EMULATOR_HOST'), reason='FIRESTORE_EMULATOR_HOST is not set')
+    def test_against_emulator(self, monkeypatch):
+        from google.cloud import firestore
+
+        client = firestore.Client(project=os.getenv('GOOGLE_CLOUD_PROJECT', 'omi-load-test'))
+        monkeypatch.setattr(conversations_db, 'db', client)
+
+        def _read(uid, conversation_id):
+            return client.document(_conversation_path(uid, conversation_id)).get().to_dict()
+
+        print(f'\n{self.SESSIONS} sessions x {self.TICKS} ticks against the emulator')
+        for label, session_func in [('blocking', self._blocking_session), ('async', self._async_session)]:
+            sessions = [(f'{label}-{i}', str(uuid.uuid4())) for i in range(self.SESSIONS)]
+            for uid, conversation_id in sessions:
+                _new_conversation(uid, conversation_id)
+            elapsed, median_lag, max_lag = asyncio.run(self._load(session_func, sessions))
+            for uid, conversation_id in sessions:
+                assert _read(uid, conversation_id)['source'] == 'openglass'
+            print(
+                f'{label:8s} | wall {elapsed * 1000:.0f}ms loop lag p50 {median_lag * 1000:.2f}ms max {max_lag * 1000:.1f}ms'
+            )
@@ -0,0 +1,502 @@
+"""
+Tests for the daily summary fan-out (utils/other/notifications.py, utils/other/fanout.py, database/notifications.py).
+
+Covers: the precomputed timezone offset table, batched token lookup through the fcm_tokens collection group,
+per-stage concurrency limits of the fan-out engine, and resuming a crashed job without a second LLM call or
+notification. The load test pushes 5k fake users (DAILY_SUMMARY_LOAD_USERS) through local Firestore / LLM / FCM
+stubs, within each stage's concurrency limit.
+Run with `-s` to see the report.
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock
+
+import pytz
+
+os.environ.setdefault(
+    "ENCRYPTION_SECRET",
+    "omi_ZwB2ZNqB2HHpMK6wStk7sTpavJiPTFg7gXUHnc4tFABPU6pZ2c2DKgehtfgi4RZv",
+)
+
+for _name in [
+    "database._client",
+    "database.redis_db",
+    "database.users",
+    "utils.other.storage",
+    "utils.llm.external_integrations",
+    "utils.notifications",
+    "utils.webhooks",
+]:
+    sys.modules[_name] = MagicMock()
+
+import database.daily_summaries as daily_summaries_db
+import database.notifications as notification_db
+import utils.other.notifications as daily_notifications
+from utils.other.fanout import FanoutEngine, FanoutStage
+
+# Set DAILY_SUMMARY_LOAD_USERS=100000 for the full size load test
+USERS = int(os.getenv('DAILY_SUMMARY_LOAD_USERS', '5000'))
+
+# *********************************
+# ******* FAKE FIRESTORE **********
+# *********************************
+
+
+class _Ref:
+    def __init__(self, path):
+        self.path = path
+        self.id = path.rsplit('/', 1)[-1]
+
+    @property
+    def parent(self):
+        return _Ref(self.path.rsplit('/', 1)[0])
+
+
+class _Doc:
+    def __init__(self, path, data):
+        self.reference = _Ref(path)
+        self.id = self.reference.id
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data)
+
+
+class _Query:
+    def __init__(self, store, docs):
+        self._store = store
+        self._docs = docs
+        self._filters = []
+        self._fields = None
+
+    def where(self, filter):
+        self._filters.append(filter)
+        return self
+
+    def select(self, fields):
+        self._fields = set(fields)
+        return self
+
+    def stream(self):
+        self._store.round_trip()
+        for path, data in self._docs():
+            if all(f.op_string == 'in' and data.get(f.field_path) in f.value for f in self._filters):
+                if self._fields is not None:
+                    data = {k: v for k, v in data.items() if k in self._fields}
+                yield _Doc(path, data)
+
+
+class _Collection(_Query):
+    def __init__(self, store, path):
+        super().__init__(store, lambda: store.collections.get(path, {}).items())
+        self._path = path
+
+    def document(self, doc_id):
+        return _DocRef(self._store, f'{self._path}/{doc_id}')
+
+
+class _DocRef:
+    def __init__(self, store, path):
+        self._store = store
+        self._path = path
+
+    def collection(self, name):
+        return _Collection(self._store, f'{self._path}/{name}')
+
+    def get(self):
+        self._store.round_trip()
+        collection = self._path.rsplit('/', 1)[0]
+        data = self._store.collections.get(collection, {}).get(self._path)
+        return MagicMock(exists=data is not None, to_dict=lambda: dict(data or {}))
+
+
+class _FakeFirestore:
+    def __init__(self):
+        self.collections = {}
+        self.round_trips = 0
+        self._lock = threading.Lock()
+
+    def round_trip(self):
+        with self._lock:
+            self.round_trips += 1
+
+    def add(self, path, data):
+        collection, doc_id = path.rsplit('/', 1)
+        self.collections.setdefault(collection, {})[path] = data
+
+    def collection(self, name):
+        return _Collection(self, name)
+
+    def collection_group(self, name):
+        def _docs():
+            for path, docs in self.collections.items():
+                if path.rsplit('/', 1)[-1] == name:
+                    yield from docs.items()
+
+        return _Query(self, _docs)
+
+
+TIMEZONES = ['America/New_York', 'Europe/Berlin', 'Asia/Tokyo', 'Asia/Kolkata', 'America/Los_Angeles']
+
+
+def _populate_users(store, count):
+    """
+    Most users have one device, some two, some only a legacy token, some none, some opted out. Every tenth user has
+    a second device in another timezone and every tenth saved no token since the devices' time zones are recorded.
+    """
+    expected = {}
+    for i in range(count):
+        uid = f'user-{i}'
+        tz = TIMEZONES[i % len(TIMEZONES)]
+        user = {'time_zone': tz, 'name': 'x' * 200}
+        tokens = []
+        if i % 10 == 1:
+            user['fcm_token'] = f'legacy-{i}'
+            tokens.append(user['fcm_token'])
+        else:
+            devices = 2 if i % 10 in (2, 6) else (0 if i % 10 == 3 else 1)
+            device_time_zones = []
+            for d in range(devices):
+                device_tz = 'Australia/Sydney' if i % 10 == 6 and d == 1 else tz
+                store.add(f'users/{uid}/fcm_tokens/device-{d}', {'token': f'token-{i}-{d}', 'time_zone': device_tz})
+                tokens.append(f'token-{i}-{d}')
+                device_time_zones.append(device_tz)
+            if i % 10 != 8:
+                user['fcm_token_time_zones'] = sorted(set(device_time_zones))
+        if i % 10 == 4:
+            user['daily_summary_enabled'] = False
+        elif i % 10 == 5:
+            user['daily_summary_hour_local'] = 8
+        elif tokens:
+            expected[uid] = (sorted(tokens), tz)
+        store.add(f'users/{uid}', user)
+    return expected
+
+
+async def _previous_get_users_for_daily_summary(store, timezones, target_local_hour):
+    """Previous token lookup: the users query, then one fcm_tokens stream per matching user."""
+    users = []
+    for user_doc in store.collection('users').where(notification_db.FieldFilter('time_zone', 'in', timezones)).stream():
+        user_data = user_doc.to_dict()
+        if user_data.get('daily_summary_enabled') is False:
+            continue
+        if user_data.get('daily_summary_hour_local', 22) != target_local_hour:
+            continue
+        tokens = [
+            d.to_dict()['token']
+            for d in store.collection('users').document(user_doc.id).collection('fcm_tokens').stream()
+        ]
+        if user_data.get('fcm_token'):
+            tokens.append(user_data['fcm_token'])
+        if tokens:
+            users.append((user_doc.id, tokens, user_data['time_zone']))
+    return users
+
+
+# *********************************
+# ************ TESTS **************
+# *********************************
+
+
+class TestTimezoneTable:
+    def test_matches_per_timezone_lookup(self):
+        base = datetime(2025, 1, 1, tzinfo=pytz.utc)
+        for hours in range(0, 24 * 365, 13):
+            now = base + timedelta(hours=hours, seconds=5)
+            previous = {}
+            for tz_name in pytz.all_timezones:
+                previous.setdefault(now.astimezone(pytz.timezone(tz_name)).hour, set()).add(tz_name)
+            grouped = daily_notifications._get_timezones_grouped_by_hour(now)
+            assert {hour: set(names) for hour, names in grouped.items()} == previous
+            assert set(daily_notifications._get_timezones_at_time(now.strftime('%H:00'), now)) == previous[now.hour]
+
+    def test_summary_window(self):
+        now = datetime(2025, 6, 1, 20, 0, tzinfo=pytz.utc)
+        start, end, date_str = daily_notifications._get_summary_window('America/New_York', now)
+        assert (end - start) == timedelta(hours=24) and end == now
+        assert date_str == '2025-06-01'
+        assert daily_notifications._get_summary_window('Asia/Tokyo', now)[2] == '2025-06-01'
+        assert daily_notifications._get_summary_window('Not/AZone', now)[2] == '2025-06-01'
+
+
+class TestBatchedTokenLookup:
+    def test_users_and_round_trips(self, monkeypatch):
+        store = _FakeFirestore()
+        monkeypatch.setattr(notification_db, 'db', store)
+        expected = _populate_users(store, 5000)
+
+        started = time.perf_counter()
+        users = asyncio.run(notification_db.get_users_for_daily_summary(TIMEZONES, 22))
+        elapsed = time.perf_counter() - started
+        new_round_trips = store.round_trips
+
+        # One users query and one collection group query, the users with devices it can't see are read later by
+        # the fan-out's Firestore stage
+        unread = {uid for uid, tokens, _ in users if tokens is None}
+        assert unread == {f'user-{i}' for i in range(5000) if i % 10 in (1, 6, 8)}
+        assert new_round_trips == 2
+        users = [
+            (uid, notification_db.get_all_tokens(uid) if tokens is None else tokens, tz) for uid, tokens, tz in users
+        ]
+        assert {uid: (sorted(tokens), tz) for uid, tokens, tz in users if tokens} == expected
+        new_round_trips = store.round_trips
+        assert new_round_trips == 2 + 2 * len(unread)
+
+        store.round_trips = 0
+        started = time.perf_counter()
+        previous = asyncio.run(_previous_get_users_for_daily_summary(store, TIMEZONES, 22))
+        previous_elapsed = time.perf_counter() - started
+        assert {uid: sorted(tokens) for uid, tokens, _ in previous} == {uid: t for uid, (t, _) in expected.items()}
+        print(
+            f'\ntoken lookup for 5000 users: {new_round_trips} round trips with {len(unread)} users read one by one '
+            f'({elapsed * 1000:.0f}ms for the queries) vs {store.round_trips} ({previous_elapsed * 1000:.0f}ms)'
+        )
+
+    def test_devices_outside_the_timezone_are_kept(self, monkeypatch):
+        store = _FakeFirestore()
+        monkeypatch.setattr(notification_db, 'db', store)
+        store.add('users/u1', {'time_zone': 'Europe/Berlin', 'fcm_token_time_zones': ['', 'America/New_York']})
+        store.add('users/u1/fcm_tokens/phone', {'token': 'phone-token', 'time_zone': 'Europe/Berlin'})
+        store.add('users/u1/fcm_tokens/laptop', {'token': 'laptop-token', 'time_zone': 'America/New_York'})
+        store.add('users/u1/fcm_tokens/unknown_default', {'token': 'old-token'})
+        store.add('users/u2', {'time_zone': 'Europe/Berlin', 'fcm_token_time_zones': ['Europe/Berlin']})
+        store.add('users/u2/fcm_tokens/phone', {'token': 'u2-token', 'time_zone': 'Europe/Berlin'})
+
+        users = asyncio.run(notification_db.get_users_for_daily_summary(['Europe/Berlin'], 22))
+        assert sorted(users) == [('u1', None, 'Europe/Berlin'), ('u2', ['u2-token'], 'Europe/Berlin')]
+
+        store.round_trips = 0
+        tokens = asyncio.run(notification_db.get_users_token_in_timezones(['Europe/Berlin']))
+        assert sorted(tokens) == ['laptop-token', 'old-token', 'phone-token', 'u2-token']
+        # The users and collection group queries, then u1's devices
+        assert store.round_trips == 3
+
+    def test_firestore_stage_reads_the_tokens_left_out(self, monkeypatch):
+        _Stubs(monkeypatch)
+        reads = []
+        monkeypatch.setattr(notification_db, 'get_all_tokens', lambda uid: reads.append(uid) or [f'{uid}-token'])
+        job = daily_notifications._load_daily_summary_job(('u1', None, 'Europe/Berlin'))
+        assert job.tokens == ['u1-token'] and reads == ['u1']
+        assert daily_notifications._load_daily_summary_job(('u2', ['u2-token'], 'Europe/Berlin')).tokens == ['u2-token']
+        assert reads == ['u1']
+
+        monkeypatch.setattr(notification_db, 'get_all_tokens', lambda uid: [])
+        assert daily_notifications._load_daily_summary_job(('u3', None, 'Europe/Berlin')) is None
+
+    def test_save_token_records_the_device_time_zones(self, monkeypatch):
+        db = MagicMock()
+        monkeypatch.setattr(notification_db, 'db', db)
+        user_ref = db.collection.return_value.document.return_value
+        user_ref.get.return_value = MagicMock(exists=True, to_dict=lambda: {'time_zone': 'Europe/Berlin'})
+        user_ref.collection.return_value.stream.return_value = [
+            MagicMock(to_dict=lambda: {'token': 't1', 'time_zone': 'America/New_York'}),
+            MagicMock(to_dict=lambda: {'token': 't2'}),
+        ]
+
+        notification_db.save_token('u1', {'device_key': 'phone', 'fcm_token': 't3', 'time_zone': 'Europe/Berlin'})
+        update = user_ref.set.call_args_list[-1][0][0]
+        assert update['time_zone'] == 'Europe/Berlin'
+        assert update['fcm_token_time_zones'].values == ['', 'America/New_York', 'Europe/Berlin']
+
+        # Tracked already: only the saved device's time zone is added
+        user_ref.get.return_value = MagicMock(exists=True, to_dict=lambda: {'fcm_token_time_zones': ['Europe/Berlin']})
+        notification_db.save_token('u1', {'device_key': 'laptop', 'fcm_token': 't4'})
+        update = user_ref.set.call_args_list[-1][0][0]
+        assert update == {'fcm_token_time_zones': update['fcm_token_time_zones']}
+        assert update['fcm_token_time_zones'].values == ['']
+
+    def test_failing_collection_group_query_reads_tokens_per_user(self, monkeypatch):
+        store = _FakeFirestore()
+        monkeypatch.setattr(notification_db, 'db', store)
+        expected = _populate_users(store, 200)
+
+        def missing_index(name):
+            raise RuntimeError('400 The query requires a COLLECTION_GROUP_ASC index for collection fcm_tokens')
+
+        monkeypatch.setattr(store, 'collection_group', missing_index)
+        users = asyncio.run(notification_db.get_users_for_daily_summary(TIMEZONES, 22))
+        assert all(tokens is None for _, tokens, _ in users)
+        users = [(uid, notification_db.get_all_tokens(uid), tz) for uid, _, tz in users]
+        assert {uid: (sorted(tokens), tz) for uid, tokens, tz in users if tokens} == expected
+
+        tokens = asyncio.run(notification_db.get_users_token_in_timezones(TIMEZONES))
+        assert sorted(tokens) == sorted(t for i in range(200) for t in notification_db.get_all_tokens(f'user-{i}'))
+
+
+class TestFanoutEngine:
+    def test_concurrency_limits_and_metrics(self):
+        in_flight = {'a': 0, 'b': 0}
+        peak = {'a': 0, 'b': 0}
+        lock = threading.Lock()
+
+        def _stage(name, forward):
+            def _run(item):
+                with lock:
+                    in_flight[name] += 1
+                    peak[name] = max(peak[name], in_flight[name])
+                time.sleep(0.001)
+                with lock:
+                    in_flight[name] -= 1
+                if item % 7 == 0 and name == 'a':
+                    raise RuntimeError('boom')
+                return item if forward(item) else None
+
+            return _run
+
+        delivered = []
+        engine = FanoutEngine(
+            [
+                FanoutStage('a', _stage('a', lambda item: item % 2 == 0), 3),
+                FanoutStage('b', lambda item: delivered.append(item), 2),
+            ],
+            queue_size=4,
+        )
+        metrics = asyncio.run(engine.run(range(200)))
+
+        assert peak['a'] <= 3 and peak['b'] == 0
+        assert sorted(delivered) == [i for i in range(200) if i % 2 == 0 and i % 7 != 0]
+        assert metrics['a']['processed'] == 200 and metrics['a']['failed'] == len(range(0, 200, 7))
+        assert metrics['b']['processed'] == len(delivered)
+
+
+class _Stubs:
+    """Redis checkpoints, Firestore, LLM and FCM of the daily summary job, in memory."""
+
+    def __init__(self, monkeypatch, llm_delay=0.0):
+        self.redis = {}
+        self.summaries = {}
+        self.llm_calls = 0
+        self.sent = []
+        self.llm_delay = llm_delay
+        self.in_flight = {'llm': 0, 'fcm': 0}
+        self.peak = {'llm': 0, 'fcm': 0}
+        self._lock = threading.Lock()
+
+        mod = daily_notifications
+        monkeypatch.setattr(mod, 'has_daily_summary_been_sent', lambda uid, date: ('sent', uid, date) in self.redis)
+        monkeypatch.setattr(
+            mod, 'set_daily_summary_sent', lambda uid, date: self.redis.update({('sent', uid, date): 1})
+        )
+        monkeypatch.setattr(mod, 'get_daily_summary_checkpoint', lambda uid, date: self.redis.get(('cp', uid, date)))
+        monkeypatch.setattr(
+            mod, 'set_daily_summary_checkpoint', lambda uid, date, cp: self.redis.update({('cp', uid, date): cp})
+        )
+        monkeypatch.setattr(mod.conversations_db, 'get_conversations', self._get_conversations)
+        monkeypatch.setattr(daily_summaries_db, 'create_daily_summary', self._create_summary)
+        monkeypatch.setattr(daily_summaries_db, 'get_daily_summary', lambda uid, sid: self.summaries.get(sid))
+        sys.modules['utils.llm.external_integrations'].generate_comprehensive_daily_summary = self._generate
+        monkeypatch.setattr(mod, 'send_notification', self._send)
+        monkeypatch.setattr(mod, 'day_summary_webhook', lambda uid, data: None)
+
+    def _get_conversations(self, uid, start_date=None, end_date=None):
+        # Every tenth user had no conversation today
+        if uid.endswith('7'):
+            return []
+        return [
+            {
+                'id': f'{uid}-c',
+                'created_at': start_date,
+                'started_at': start_date,
+                'finished_at': end_date,
+                'structured': {'title': 'Standup'},
+            }
+        ]
+
+    def _enter(self, stage):
+        with self._lock:
+            self.in_flight[stage] += 1
+            self.peak[stage] = max(self.peak[stage], self.in_flight[stage])
+
+    def _leave(self, stage):
+        with self._lock:
+            self.in_flight[stage] -= 1
+
+    def _generate(self, uid, conversations, date_str, start_date_utc, end_date_utc):
+        self._enter('llm')
+        with self._lock:
+            self.llm_calls += 1
+        if self.llm_delay:
+            time.sleep(self.llm_delay)
+        self._leave('llm')
+        return {'id': f'summary-{uid}', 'headline': 'Busy day', 'overview': 'Shipped it. ' * 20, 'date': date_str}
+
+    def _create_summary(self, uid, summary_data):
+        self.summaries[summary_data['id']] = summary_data
+        return summary_data['id']
+
+    def _send(self, uid, title, body, data=None, tokens=None):
+        self._enter('fcm')
+        with self._lock:
+            self.sent.append(uid)
+        self._leave('fcm')
+
+
+def _users(count):
+    return [(f'user-{i}', [f'token-{i}'], TIMEZONES[i % len(TIMEZONES)]) for i in range(count)]
+
+
+class TestResume:
+    def test_crash_before_sending_resumes_without_second_llm_call(self, monkeypatch):
+        stubs = _Stubs(monkeypatch)
+        users = _users(500)
+        deliver = daily_notifications._deliver_daily_summary
+
+        class _Crash(Exception):
+            pass
+
+        def _crashing_deliver(job):
+            if int(job.uid.split('-')[1]) >= 200:
+                raise _Crash()
+            return deliver(job)
+
+        monkeypatch.setattr(daily_notifications, '_deliver_daily_summary', _crashing_deliver)
+        metrics = asyncio.run(daily_notifications._send_bulk_summary_notification(users))
+        with_conversations = [uid for uid, _, _ in users if not uid.endswith('7')]
+        assert stubs.llm_calls == len(with_conversations)
+        assert metrics['fcm']['failed'] == len([uid for uid in with_conversations if int(uid.split('-')[1]) >= 200])
+
+        monkeypatch.setattr(daily_notifications, '_deliver_daily_summary', deliver)
+        asyncio.run(daily_notifications._send_bulk_summary_notification(users))
+        assert stubs.llm_calls == len(with_conversations)
+        assert sorted(stubs.sent) == sorted(with_conversations)
+
+        # A third run finds every user done
+        asyncio.run(daily_notifications._send_bulk_summary_notification(users))
+        assert sorted(stubs.sent) == sorted(with_conversations)
+
+    def test_crash_while_sending_is_not_resent(self, monkeypatch):
+        stubs = _Stubs(monkeypatch)
+
+        def _failing_send(uid, *args, **kwargs):
+            raise RuntimeError('process killed mid-send')
+
+        monkeypatch.setattr(daily_notifications, 'send_notification', _failing_send)
+        asyncio.run(daily_notifications._send_bulk_summary_notification(_users(10)))
+        monkeypatch.setattr(daily_notifications, 'send_notification', stubs._send)
+        asyncio.run(daily_notifications._send_bulk_summary_notification(_users(10)))
+        assert stubs.sent == []
+
+
+class TestLoad:
+    def test_report_users(self, monkeypatch):
+        stubs = _Stubs(monkeypatch, llm_delay=0.001)
+        monkeypatch.setattr(daily_notifications, 'DAILY_SUMMARY_LLM_CONCURRENCY', 8)
+        monkeypatch.setattr(daily_notifications, 'DAILY_SUMMARY_FCM_CONCURRENCY', 4)
+
+        started = time.perf_counter()
+        metrics = asyncio.run(daily_notifications._send_bulk_summary_notification(_users(USERS)))
+        elapsed = time.perf_counter() - started
+
+        print(f'\n{USERS} users in {elapsed:.1f}s')
+        for stage, stage_metrics in metrics.items():
+            print(f'  {stage:>9}: {stage_metrics}')
+        expected = USERS - USERS // 10
+        assert len(stubs.sent) == expected == len(set(stubs.sent))
+        assert metrics['firestore']['processed'] == USERS
+        assert metrics['llm']['processed'] == metrics['fcm']['processed'] == expected
+        assert 1 < stubs.peak['llm'] <= 8 and stubs.peak['fcm'] <= 4
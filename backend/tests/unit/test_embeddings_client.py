@@ -0,0 +1,210 @@
+"""
+Tests for the batched, cached Doubao embedding client (utils/llm/embeddings.py).
+
+Runs against a local stub embeddings server. Covers: batching by the provider's input limit, the
+multimodal endpoint's single-input requests, dedup + LRU/Redis cache, failures not being cached,
+async API, and a throughput report in embeddings/sec. Run with `-s` to see the report.
+"""
+
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from utils.llm.embeddings import DoubaoEmbeddings, EmbeddingCache
+
+DIMENSIONS = 8
+LATENCY_SECONDS = 0.01
+
+
+def _vector(text: str):
+    digest = hashlib.sha256(text.encode('utf-8')).digest()
+    return [b / 255 for b in digest[:DIMENSIONS]]
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        server = self.server
+        with server.lock:
+            server.requests.append(body)
+            fail = server.fail_next > 0
+            if fail:
+                server.fail_next -= 1
+        time.sleep(LATENCY_SECONDS)
+
+        if fail:
+            payload = {'error': {'code': 'InternalServiceError'}}
+        elif self.path.endswith('/multimodal'):
+            inputs = body['input']
+            payload = {'data': {'embedding': _vector(''.join(i['text'] for i in inputs))}}
+        else:
+            data = [{'index': i, 'embedding': _vector(text)} for i, text in enumerate(body['input'])]
+            payload = {'data': list(reversed(data))}
+
+        encoded = json.dumps(payload).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(encoded)))
+        self.end_headers()
+        self.wfile.write(encoded)
+
+
+@pytest.fixture(scope='module')
+def stub_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _StubHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.requests = []
+    server.fail_next = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture
+def server(stub_server):
+    stub_server.requests.clear()
+    stub_server.fail_next = 0
+    return stub_server
+
+
+def _client(server, path='/api/v3/embeddings', **kwargs):
+    url = f'http://127.0.0.1:{server.server_address[1]}{path}'
+    kwargs.setdefault('max_retries', 1)
+    return DoubaoEmbeddings(api_key='test', url=url, model='stub', dimensions=DIMENSIONS, **kwargs)
+
+
+class _FakeRedis:
+    def __init__(self):
+        self.store = {}
+
+    def mget(self, keys):
+        return [self.store.get(k) for k in keys]
+
+    def pipeline(self, transaction=False):
+        redis = self
+
+        class _Pipe:
+            def set(self, key, value, ex=None):
+                redis.store[key] = value
+
+            def execute(self):
+                pass
+
+        return _Pipe()
+
+
+class TestBatching:
+    def test_batches_up_to_input_limit(self, server):
+        client = _client(server, batch_size=4)
+        texts = [f'text {i}' for i in range(10)]
+        vectors = client.embed_documents(texts)
+
+        assert sorted(len(r['input']) for r in server.requests) == [2, 4, 4]
+        assert vectors == [_vector(t) for t in texts]
+
+    def test_multimodal_endpoint_sends_one_text_per_request(self, server):
+        client = _client(server, path='/api/v3/embeddings/multimodal')
+        assert client.batch_size == 1
+        texts = ['a', 'b', 'c']
+        vectors = client.embed_documents(texts)
+        assert len(server.requests) == 3
+        assert all(r['input'][0]['type'] == 'text' for r in server.requests)
+        assert vectors == [_vector(t) for t in texts]
+
+    def test_missing_api_key_returns_zero_vectors(self, server):
+        client = _client(server)
+        client.api_key = ''
+        assert client.embed_documents(['a']) == [[0.0] * DIMENSIONS]
+        assert server.requests == []
+
+
+class TestCache:
+    def test_duplicates_and_repeats_hit_cache(self, server):
+        client = _client(server, batch_size=16)
+        client.embed_documents(['a', 'b', 'a'])
+        assert [r['input'] for r in server.requests] == [['a', 'b']]
+
+        assert client.embed_query('a') == _vector('a')
+        assert len(server.requests) == 1
+        assert client.cache.hits >= 1
+
+    def test_redis_tier_shared_across_processes(self, server):
+        redis = _FakeRedis()
+        first = _client(server, cache=EmbeddingCache(redis_client=redis))
+        first.embed_documents(['shared'])
+
+        second = _client(server, cache=EmbeddingCache(redis_client=redis))
+        vector = second.embed_query('shared')
+        assert len(server.requests) == 1
+        assert second.cache.redis_hits == 1
+        assert vector == pytest.approx(_vector('shared'), abs=1e-6)
+
+    def test_lru_eviction(self):
+        cache = EmbeddingCache(max_entries=2)
+        cache.set_many({'a': [1.0], 'b': [2.0]})
+        cache.get_many(['a'])
+        cache.set_many({'c': [3.0]})
+        assert set(cache.get_many(['a', 'b', 'c'])) == {'a', 'c'}
+
+    def test_failures_are_zero_and_not_cached(self, server):
+        client = _client(server)
+        server.fail_next = 1
+        assert client.embed_query('flaky') == [0.0] * DIMENSIONS
+        assert client.embed_query('flaky') == _vector('flaky')
+
+
+class TestAsync:
+    def test_aembed_documents(self, server):
+        client = _client(server, batch_size=2, max_concurrency=3)
+
+        async def _run():
+            try:
+                vectors = await client.aembed_documents(['x', 'y', 'z', 'x'])
+                query = await client.aembed_query('y')
+                return vectors, query
+            finally:
+                await client.aclose()
+
+        vectors, query = asyncio.run(_run())
+        assert vectors == [_vector(t) for t in ['x', 'y', 'z', 'x']]
+        assert query == _vector('y')
+        assert len(server.requests) == 2
+
+
+class TestThroughput:
+    N = 200
+
+    def test_report_embeddings_per_second(self, server):
+        texts = [f'memory number {i}' for i in range(self.N)]
+
+        # Previous behaviour: one request per text, one after another
+        sequential = _client(server, batch_size=1, max_concurrency=1)
+        started = time.perf_counter()
+        sequential.embed_documents(texts)
+        sequential_rate = self.N / (time.perf_counter() - started)
+
+        batched = _client(server, batch_size=32, max_concurrency=4)
+        started = time.perf_counter()
+        batched.embed_documents(texts)
+        batched_rate = self.N / (time.perf_counter() - started)
+
+        started = time.perf_counter()
+        batched.embed_documents(texts)
+        cached_rate = self.N / (time.perf_counter() - started)
+
+        print(
+            f'\nembeddings/sec (stub latency {LATENCY_SECONDS * 1000:.0f}ms): '
+            f'sequential={sequential_rate:.0f} batched={batched_rate:.0f} cached={cached_rate:.0f}'
+        )
+        assert batched_rate > 5 * sequential_rate
+        assert cached_rate > batched_rate
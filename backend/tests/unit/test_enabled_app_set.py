@@ -0,0 +1,224 @@
+"""
+Tests for the compiled per-user enabled app sets in utils/apps.py.
+
+Covers: capability bitmasks, compiling once per user, invalidation of one user / every user (locally, from another
+instance over pub/sub, on persona updates), and a benchmark of the per-tick cost of finding realtime apps,
+get_available_apps + filtering vs the compiled set. Run with `-s` to see the report.
+"""
+
+import asyncio
+import json
+import os
+import sys
+import time
+from unittest.mock import MagicMock
+
+import pytest
+
+os.environ.setdefault(
+    "ENCRYPTION_SECRET",
+    "omi_ZwB2ZNqB2HHpMK6wStk7sTpavJiPTFg7gXUHnc4tFABPU6pZ2c2DKgehtfgi4RZv",
+)
+
+for _name in [
+    "database._client",
+    "database.redis_db",
+    "database.users",
+    "utils.other.storage",
+    "utils.llm.persona",
+    "utils.memory_snapshot",
+    "utils.social",
+    "utils.stripe",
+]:
+    sys.modules[_name] = MagicMock()
+
+import database.cache as cache
+import utils.apps as apps_utils
+from database.redis_pubsub import RedisPubSubManager
+from models.app import App
+
+
+def _app_dict(i: int, triggers_on: str = None, capabilities=None) -> dict:
+    data = {
+        'id': f'app-{i}',
+        'name': f'App {i}',
+        'category': 'productivity',
+        'author': 'omi',
+        'description': 'An app ' * 20,
+        'image': '/apps/logo.png',
+        'capabilities': capabilities or ['external_integration'],
+        'approved': True,
+    }
+    if triggers_on:
+        data['external_integration'] = {'triggers_on': triggers_on, 'webhook_url': f'https://example.com/{i}'}
+    return data
+
+
+TRIGGERS = ['transcript_processed', 'audio_bytes', 'memory_creation']
+
+
+@pytest.fixture
+def caches(monkeypatch):
+    """Real memory cache and pub/sub wiring from database/cache.py, without a subscriber thread."""
+    monkeypatch.setattr(RedisPubSubManager, 'start', lambda self: None)
+    monkeypatch.setattr(cache, 'r', MagicMock())
+    monkeypatch.setattr(cache, '_initialized', False)
+    cache._ensure_initialized()
+    yield cache.get_memory_cache(), cache.get_pubsub_manager()
+    monkeypatch.setattr(cache, '_initialized', False)
+
+
+@pytest.fixture
+def available_apps(monkeypatch, caches):
+    calls = []
+
+    def _get_available_apps(uid, include_reviews=False):
+        calls.append(uid)
+        apps = [App(**_app_dict(i, TRIGGERS[i % 3]), enabled=i % 2 == 0) for i in range(6)]
+        apps.append(App(**_app_dict(6, capabilities=['memories', 'chat']), enabled=True))
+        return apps
+
+    monkeypatch.setattr(apps_utils, 'get_available_apps', _get_available_apps)
+    return calls
+
+
+class TestCapabilityMask:
+    def test_mask_matches_model_methods(self):
+        realtime = App(**_app_dict(0, 'transcript_processed'))
+        audio = App(**_app_dict(1, 'audio_bytes'))
+        memories = App(**_app_dict(2, capabilities=['memories', 'persona']))
+
+        assert apps_utils.get_app_capability_mask(realtime) == apps_utils.APP_TRIGGERS_REALTIME
+        assert apps_utils.get_app_capability_mask(audio) == apps_utils.APP_TRIGGERS_REALTIME_AUDIO_BYTES
+        assert apps_utils.get_app_capability_mask(memories) == (
+            apps_utils.APP_WORKS_WITH_MEMORIES | apps_utils.APP_WORKS_WITH_CHAT
+        )
+
+    def test_with_capability(self):
+        app_set = apps_utils.EnabledAppSet(
+            [App(**_app_dict(i, TRIGGERS[i % 3])) for i in range(6)]
+            + [App(**_app_dict(6, capabilities=['memories', 'chat']))]
+        )
+        assert [a.id for a in app_set.with_capability(apps_utils.APP_TRIGGERS_REALTIME)] == ['app-0', 'app-3']
+        assert [a.id for a in app_set.with_capability(apps_utils.APP_TRIGGERS_CONVERSATION_CREATION)] == [
+            'app-2',
+            'app-5',
+        ]
+        both = apps_utils.APP_WORKS_WITH_MEMORIES | apps_utils.APP_WORKS_WITH_CHAT
+        assert [a.id for a in app_set.with_capability(both)] == ['app-6']
+        assert app_set.get('app-6').name == 'App 6'
+        assert sys.getsizeof(app_set) > 7 * 2048
+
+
+class TestEnabledAppSetCache:
+    def test_compiled_once_with_enabled_apps_only(self, available_apps):
+        first = apps_utils.get_enabled_app_set('u1')
+        assert apps_utils.get_enabled_app_set('u1') is first
+        assert apps_utils.peek_enabled_app_set('u1') is first
+        assert available_apps == ['u1']
+        assert [a.id for a in first.apps] == ['app-0', 'app-2', 'app-4', 'app-6']
+        assert [a.id for a in first.with_capability(apps_utils.APP_TRIGGERS_REALTIME)] == ['app-0']
+
+    def test_user_invalidation_is_local_and_published(self, available_apps, caches):
+        _, pubsub = caches
+        pubsub.redis_client = MagicMock()
+        apps_utils.get_enabled_app_set('u1')
+        apps_utils.get_enabled_app_set('u2')
+
+        apps_utils.invalidate_enabled_apps_cache('u1')
+        assert apps_utils.peek_enabled_app_set('u1') is None
+        assert apps_utils.peek_enabled_app_set('u2') is not None
+        channel, message = pubsub.redis_client.publish.call_args[0]
+        assert channel == RedisPubSubManager.CHANNEL
+        assert json.loads(message)['keys'] == ['enabled_apps:u1']
+
+    def test_app_update_drops_every_set(self, available_apps, caches):
+        memory_cache, _ = caches
+        memory_cache.set('get_popular_apps_data', [1], ttl=30)
+        apps_utils.get_enabled_app_set('u1')
+        apps_utils.get_enabled_app_set('u2')
+
+        apps_utils.invalidate_enabled_apps_cache()
+        assert apps_utils.peek_enabled_app_set('u1') is None
+        assert apps_utils.peek_enabled_app_set('u2') is None
+        assert memory_cache.get('get_popular_apps_data') == [1]
+
+    @pytest.mark.parametrize('private', [True, False])
+    def test_persona_update_drops_the_sets_it_is_in(self, available_apps, caches, monkeypatch, private):
+        for name, value in {
+            'get_user_public_memories': lambda uid, limit: [{'content': 'likes tea'}],
+            'get_user_name': lambda uid: 'User',
+            'get_conversations': lambda uid, limit: [],
+            'update_persona_in_db': MagicMock(),
+        }.items():
+            monkeypatch.setattr(apps_utils, name, value)
+        apps_utils.get_enabled_app_set('u1')
+        apps_utils.get_enabled_app_set('u2')
+
+        persona = {'id': 'persona-1', 'uid': 'u1', 'name': 'User', 'connected_accounts': [], 'private': private}
+        asyncio.run(apps_utils.update_persona_prompt(persona))
+        apps_utils.update_persona_in_db.assert_called_once_with(persona)
+        assert apps_utils.peek_enabled_app_set('u1') is None
+        assert (apps_utils.peek_enabled_app_set('u2') is None) is not private
+
+    def test_invalidation_from_another_instance(self, available_apps, caches):
+        _, pubsub = caches
+        apps_utils.get_enabled_app_set('u1')
+        apps_utils.get_enabled_app_set('u2')
+
+        def _receive(keys):
+            pubsub._handle_message(json.dumps({'event': 'invalidate', 'keys': keys}).encode())
+
+        _receive(['enabled_apps:u1'])
+        assert apps_utils.peek_enabled_app_set('u1') is None
+        assert apps_utils.peek_enabled_app_set('u2') is not None
+
+        _receive(['enabled_apps:*'])
+        assert apps_utils.peek_enabled_app_set('u2') is None
+
+
+class TestPerTickBenchmark:
+    """Finding a user's realtime apps on every pusher tick, 200 public apps of which 10 enabled."""
+
+    PUBLIC_APPS = 200
+    TICKS = 300
+
+    def test_report_lookup_cost(self, monkeypatch, caches):
+        memory_cache, _ = caches
+        public = [_app_dict(i, TRIGGERS[i % 3]) for i in range(self.PUBLIC_APPS)]
+        memory_cache.set('get_public_approved_apps_data', public, ttl=3600)
+        enabled = {f'app-{i}' for i in range(0, self.PUBLIC_APPS, 20)}
+
+        for name, value in {
+            'is_tester': lambda uid: False,
+            'get_private_apps': lambda uid: [],
+            'get_public_unapproved_apps': lambda uid: [],
+            'get_apps_listing_counters': lambda uid, ids, include_reviews=True: (enabled, {}, {}),
+        }.items():
+            monkeypatch.setattr(apps_utils, name, value)
+
+        def _previous():
+            apps = apps_utils.get_available_apps('u1')
+            return [app for app in apps if app.triggers_realtime() and app.enabled]
+
+        def _compiled():
+            app_set = apps_utils.peek_enabled_app_set('u1') or apps_utils.get_enabled_app_set('u1')
+            return app_set.with_capability(apps_utils.APP_TRIGGERS_REALTIME)
+
+        assert [a.id for a in _previous()] == [a.id for a in _compiled()]
+        assert len(_compiled()) == len([i for i in range(0, self.PUBLIC_APPS, 20) if i % 3 == 0])
+        # Per-user fields must not leak into the shared public list
+        assert 'enabled' not in public[0]
+
+        timings = {}
+        for label, func in [('get_available_apps', _previous), ('compiled set', _compiled)]:
+            started = time.perf_counter()
+            for _ in range(self.TICKS):
+                func()
+            timings[label] = (time.perf_counter() - started) / self.TICKS * 1e6
+
+        print(
+            f'\nrealtime app lookup per tick ({self.PUBLIC_APPS} public apps): '
+            + ' | '.join(f'{label} {us:.1f}us' for label, us in timings.items())
+        )
+        assert timings['compiled set'] * 20 < timings['get_available_apps']
@@ -0,0 +1,179 @@
+"""
+Tests for the per-uid derived-key cache and bulk encrypt/decrypt API in utils.encryption, and the bulk read
+paths in database/memories.py and database/conversations.py.
+
+Includes a benchmark of decrypt throughput for 500 enhanced memories. Run with `-s` to see the report.
+"""
+
+import os
+import sys
+import time
+from unittest.mock import MagicMock
+
+os.environ.setdefault(
+    "ENCRYPTION_SECRET",
+    "omi_ZwB2ZNqB2HHpMK6wStk7sTpavJiPTFg7gXUHnc4tFABPU6pZ2c2DKgehtfgi4RZv",
+)
+
+for _name in ["database._client", "database.redis_db", "database.users", "utils.other.storage"]:
+    sys.modules[_name] = MagicMock()
+
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+import database.conversations as conversations_db
+import database.memories as memories_db
+from database.helpers import prepare_for_read
+from utils import encryption
+
+
+def _memory(i: int, uid: str, level: str = 'enhanced') -> dict:
+    content = f'User likes hiking trail number {i} on weekends'
+    data = {'id': f'm{i}', 'content': content, 'data_protection_level': level}
+    return memories_db._prepare_data_for_write(data, uid, level)
+
+
+class TestCipherCache:
+    def setup_method(self):
+        encryption.clear_key_cache()
+
+    def test_derives_once_per_uid(self, monkeypatch):
+        calls = []
+        derive_key = encryption.derive_key
+        monkeypatch.setattr(encryption, 'derive_key', lambda uid: calls.append(uid) or derive_key(uid))
+
+        for _ in range(5):
+            assert encryption.decrypt(encryption.encrypt('hello', 'u1'), 'u1') == 'hello'
+        encryption.encrypt('hello', 'u2')
+        assert calls == ['u1', 'u2']
+
+    def test_cached_cipher_matches_derived_key(self):
+        payload = encryption.encrypt('secret', 'u1')
+        aesgcm = AESGCM(encryption.derive_key('u1'))
+        raw = encryption.base64.b64decode(payload)
+        assert aesgcm.decrypt(raw[:12], raw[12:], None) == b'secret'
+
+    def test_entries_expire_after_ttl(self):
+        cache = encryption._CipherCache(max_entries=10, ttl=0)
+        first = cache.get('u1')
+        assert cache.get('u1') is not first
+        assert cache.misses == 2
+
+    def test_bounded_lru(self):
+        cache = encryption._CipherCache(max_entries=2, ttl=3600)
+        a = cache.get('a')
+        cache.get('b')
+        cache.get('a')
+        cache.get('c')
+        assert cache.get('a') is a
+        assert set(cache._entries) == {'a', 'c'}
+
+
+class TestBulkApi:
+    def test_round_trip_preserves_empty_and_non_string_values(self):
+        values = ['one', '', None, 'two']
+        encrypted = encryption.encrypt_many(values, 'u1')
+        assert encrypted[1:3] == ['', None]
+        assert encrypted[0] != 'one'
+        assert encryption.decrypt_many(encrypted + [42], 'u1') == values + [42]
+
+    def test_failed_items_are_returned_unchanged(self):
+        encrypted = encryption.encrypt('ok', 'u1')
+        assert encryption.decrypt_many([encrypted, 'not-encrypted'], 'u1') == ['ok', 'not-encrypted']
+        # Wrong user's key
+        assert encryption.decrypt_many([encrypted], 'u2') == [encrypted]
+
+    def test_empty_list(self):
+        assert encryption.encrypt_many([], 'u1') == []
+        assert encryption.decrypt_many([], 'u1') == []
+
+    def test_decrypt_audio_files(self):
+        files = [
+            encryption.encrypt_audio_chunk(b'\x01' * 10, 'u1') + encryption.encrypt_audio_chunk(b'\x02' * 5, 'u1'),
+            encryption.encrypt_audio_chunk(b'\x03' * 3, 'u1'),
+        ]
+        assert encryption.decrypt_audio_files(files, 'u1') == [b'\x01' * 10 + b'\x02' * 5, b'\x03' * 3]
+
+
+class TestBulkReadPaths:
+    def test_memories_bulk_matches_single(self):
+        memories = [_memory(0, 'u1'), _memory(1, 'u1', 'standard'), {}, _memory(2, 'u1')]
+        single = [memories_db._prepare_memory_for_read(m, 'u1') for m in memories]
+        bulk = memories_db._prepare_memories_for_read(memories, 'u1')
+        assert bulk == single
+        assert bulk[0]['content'] == 'User likes hiking trail number 0 on weekends'
+        # Input documents are left untouched
+        assert memories[0]['content'] != bulk[0]['content']
+
+    def test_conversations_bulk_matches_single(self):
+        segments = [{'id': 's1', 'text': 'hello', 'speaker': 'SPEAKER_00'}]
+        conversations = []
+        for i, level in enumerate(['enhanced', 'standard', 'enhanced']):
+            data = conversations_db._prepare_conversation_for_write(
+                {'id': f'c{i}', 'transcript_segments': segments}, 'u1', level
+            )
+            data['data_protection_level'] = level
+            conversations.append(data)
+        conversations.append({'id': 'c3', 'data_protection_level': 'enhanced', 'transcript_segments': 'garbage'})
+
+        single = [conversations_db._prepare_conversation_for_read(c, 'u1') for c in conversations]
+        bulk = conversations_db._prepare_conversations_for_read(conversations, 'u1')
+        assert bulk == single
+        assert [c['transcript_segments'] for c in bulk] == [segments, segments, segments, []]
+
+    def test_photos_bulk_matches_single(self):
+        photos = [
+            conversations_db._prepare_photo_for_write({'id': 'p1', 'base64': 'aGVsbG8='}, 'u1', 'enhanced'),
+            conversations_db._prepare_photo_for_write({'id': 'p2', 'base64': 'd29ybGQ='}, 'u1', 'standard'),
+        ]
+        single = [conversations_db._prepare_photo_for_read(p, 'u1') for p in photos]
+        assert conversations_db._prepare_photos_for_read(photos, 'u1') == single
+        assert single[0]['base64'] == 'aGVsbG8='
+
+    def test_prepare_for_read_uses_bulk_func_for_lists(self):
+        single, bulk = MagicMock(side_effect=lambda item, uid: item), MagicMock(side_effect=lambda items, uid: items)
+
+        @prepare_for_read(decrypt_func=single, bulk_decrypt_func=bulk)
+        def _get(uid: str, result):
+            return result
+
+        assert _get('u1', [{'a': 1}, {'b': 2}]) == [{'a': 1}, {'b': 2}]
+        bulk.assert_called_once_with([{'a': 1}, {'b': 2}], 'u1')
+        single.assert_not_called()
+
+        assert _get('u1', {'a': 1}) == {'a': 1}
+        single.assert_called_once_with({'a': 1}, 'u1')
+
+
+class TestDecryptThroughput:
+    N = 500
+
+    def test_report_memories_per_second(self):
+        memories = [_memory(i, 'bench-uid') for i in range(self.N)]
+
+        def _uncached_decrypt(encrypted_data, uid):
+            # Previous behaviour: HKDF + AESGCM construction on every call
+            aesgcm = AESGCM(encryption.derive_key(uid))
+            return encryption._decrypt_with(aesgcm, encrypted_data, uid)
+
+        started = time.perf_counter()
+        uncached = [{**m, 'content': _uncached_decrypt(m['content'], 'bench-uid')} for m in memories]
+        uncached_elapsed = time.perf_counter() - started
+
+        encryption.clear_key_cache()
+        started = time.perf_counter()
+        single = [memories_db._prepare_memory_for_read(m, 'bench-uid') for m in memories]
+        single_elapsed = time.perf_counter() - started
+
+        encryption.clear_key_cache()
+        started = time.perf_counter()
+        bulk = memories_db._prepare_memories_for_read(memories, 'bench-uid')
+        bulk_elapsed = time.perf_counter() - started
+
+        assert bulk == single == uncached
+        print(
+            f'\ndecrypt {self.N} memories: '
+            f'uncached={self.N / uncached_elapsed:.0f}/s ({uncached_elapsed * 1000:.1f}ms) '
+            f'cached per-item={self.N / single_elapsed:.0f}/s ({single_elapsed * 1000:.1f}ms) '
+            f'bulk={self.N / bulk_elapsed:.0f}/s ({bulk_elapsed * 1000:.1f}ms)'
+        )
+        assert bulk_elapsed < uncached_elapsed
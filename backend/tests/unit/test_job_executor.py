@@ -0,0 +1,265 @@
+"""
+Tests for the process-wide background job executor (utils/other/job_executor.py).
+
+Covers: per-queue concurrency caps, priorities, backpressure on a full backlog (never on an event loop thread),
+retries with backoff, drain at shutdown and the metrics. Ends with a burst of closed conversations, one thread per
+side effect vs the executor, run with `-s` to see the report.
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from utils.other.job_executor import (  # noqa: E402
+    PRIORITY_HIGH,
+    PRIORITY_LOW,
+    JobExecutor,
+    JobQueueConfig,
+)
+
+
+@pytest.fixture
+def executor():
+    executor = JobExecutor()
+    yield executor
+    executor.drain(timeout=5)
+
+
+class _Tracker:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = 0
+        self.peak = 0
+        self.order = []
+
+    def job(self, name, duration=0.0):
+        with self.lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        time.sleep(duration)
+        with self.lock:
+            self.running -= 1
+            self.order.append(name)
+        return name
+
+
+def test_concurrency_cap(executor):
+    executor.register_queue(JobQueueConfig('q', concurrency=3))
+    tracker = _Tracker()
+
+    futures = [executor.submit('q', tracker.job, i, 0.02) for i in range(20)]
+
+    assert [f.result(timeout=5) for f in futures] == list(range(20))
+    assert tracker.peak == 3
+    assert executor.metrics()['q']['completed'] == 20
+
+
+def test_priorities_then_fifo(executor):
+    executor.register_queue(JobQueueConfig('q', concurrency=1))
+    tracker = _Tracker()
+    gate = threading.Event()
+    executor.submit('q', gate.wait)
+
+    futures = [
+        executor.submit('q', tracker.job, 'low', priority=PRIORITY_LOW),
+        executor.submit('q', tracker.job, 'normal-1'),
+        executor.submit('q', tracker.job, 'high', priority=PRIORITY_HIGH),
+        executor.submit('q', tracker.job, 'normal-2'),
+    ]
+    gate.set()
+    [f.result(timeout=5) for f in futures]
+
+    assert tracker.order == ['high', 'normal-1', 'normal-2', 'low']
+
+
+def test_full_backlog_blocks_then_runs_inline(executor):
+    executor.register_queue(JobQueueConfig('q', concurrency=1, max_backlog=2, submit_timeout=0.1))
+    gate = threading.Event()
+    executor.submit('q', gate.wait)
+    time.sleep(0.05)
+    executor.submit('q', lambda: 'queued-1')
+    executor.submit('q', lambda: 'queued-2')
+
+    caller = threading.current_thread().name
+    started = time.monotonic()
+    future = executor.submit('q', lambda: threading.current_thread().name)
+
+    assert time.monotonic() - started >= 0.1
+    assert future.result(timeout=1) == caller
+    assert executor.metrics()['q']['ran_inline'] == 1
+    gate.set()
+
+
+def test_full_backlog_never_blocks_an_event_loop(executor):
+    executor.register_queue(JobQueueConfig('q', concurrency=1, max_backlog=1, submit_timeout=5))
+    gate = threading.Event()
+    executor.submit('q', gate.wait)
+    time.sleep(0.05)
+    executor.submit('q', lambda: None)
+
+    async def handler():
+        started = time.monotonic()
+        future = executor.submit('q', lambda: threading.current_thread().name)
+        return future, time.monotonic() - started, threading.current_thread().name
+
+    future, elapsed, caller = asyncio.run(handler())
+
+    assert elapsed < 0.5
+    assert not future.done()
+    gate.set()
+    assert future.result(timeout=5) != caller
+    metrics = executor.metrics()['q']
+    assert metrics['overflowed'] == 1
+    assert metrics['ran_inline'] == 0
+
+
+def test_producer_gets_room_when_a_worker_frees_it(executor):
+    executor.register_queue(JobQueueConfig('q', concurrency=1, max_backlog=1, submit_timeout=5))
+    gate = threading.Event()
+    executor.submit('q', gate.wait)
+    time.sleep(0.05)
+    executor.submit('q', lambda: None)
+
+    threading.Timer(0.1, gate.set).start()
+    future = executor.submit('q', lambda: threading.current_thread().name)
+
+    assert future.result(timeout=5).startswith('jobs-q')
+    assert executor.metrics()['q']['ran_inline'] == 0
+
+
+def test_retries_with_backoff(executor):
+    executor.register_queue(JobQueueConfig('q', concurrency=2, max_retries=2, retry_backoff=0.05))
+    attempts = []
+
+    def flaky():
+        attempts.append(time.monotonic())
+        if len(attempts) < 3:
+            raise RuntimeError('transient')
+        return 'ok'
+
+    assert executor.submit('q', flaky).result(timeout=5) == 'ok'
+    assert len(attempts) == 3
+    assert attempts[1] - attempts[0] >= 0.05
+    assert attempts[2] - attempts[1] >= 0.1
+    metrics = executor.metrics()['q']
+    assert metrics['retried'] == 2
+    assert metrics['completed'] == 1
+
+
+def test_failures_without_retries(executor):
+    executor.register_queue(JobQueueConfig('q', max_retries=3, retry_backoff=0.01))
+    calls = []
+
+    def broken():
+        calls.append(1)
+        raise ValueError('bad input')
+
+    with pytest.raises(ValueError):
+        executor.submit('q', broken, max_retries=0).result(timeout=5)
+    assert len(calls) == 1
+    with pytest.raises(ValueError):
+        executor.submit('q', broken).result(timeout=5)
+    assert len(calls) == 5
+    assert executor.metrics()['q']['failed'] == 2
+
+
+def test_drain_waits_for_queued_jobs():
+    executor = JobExecutor()
+    executor.register_queue(JobQueueConfig('q', concurrency=2))
+    done = []
+    for i in range(10):
+        executor.submit('q', lambda i=i: (time.sleep(0.01), done.append(i)))
+
+    assert executor.drain(timeout=5)
+    assert sorted(done) == list(range(10))
+
+    # After the drain the producer runs jobs itself
+    assert executor.submit('q', lambda: threading.current_thread().name).result() == threading.current_thread().name
+
+
+def test_drain_timeout():
+    executor = JobExecutor()
+    executor.register_queue(JobQueueConfig('q', concurrency=1))
+    gate = threading.Event()
+    executor.submit('q', gate.wait)
+
+    assert not executor.drain(timeout=0.05)
+    gate.set()
+
+
+def test_metrics_latencies(executor):
+    executor.register_queue(JobQueueConfig('q', concurrency=1))
+    futures = [executor.submit('q', time.sleep, 0.02) for _ in range(5)]
+    [f.result(timeout=5) for f in futures]
+
+    metrics = executor.metrics()['q']
+    assert metrics['depth'] == 0 and metrics['running'] == 0
+    assert metrics['submitted'] == metrics['completed'] == 5
+    assert metrics['avg_run_ms'] >= 15
+    assert metrics['max_wait_ms'] >= 60
+
+
+def test_concurrency_env_override(executor, monkeypatch):
+    monkeypatch.setenv('JOB_QUEUE_WEBHOOKS_CONCURRENCY', '7')
+    executor.register_queue(JobQueueConfig('webhooks', concurrency=2))
+    assert executor._queues['webhooks'].config.concurrency == 7
+
+
+def test_benchmark_conversation_burst(executor):
+    """500 conversations closed at once, 6 side effects each taking 20ms (an LLM or Firestore call)."""
+    conversations, side_effects, duration = 500, 6, 0.02
+    baseline_threads = threading.active_count()
+
+    peak = [0]
+    stop = threading.Event()
+
+    def sample():
+        while not stop.is_set():
+            peak[0] = max(peak[0], threading.active_count() - baseline_threads)
+            time.sleep(0.002)
+
+    def measure(run):
+        peak[0] = 0
+        stop.clear()
+        sampler = threading.Thread(target=sample)
+        sampler.start()
+        started = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - started
+        stop.set()
+        sampler.join()
+        return peak[0] - 1, elapsed
+
+    def unbounded():
+        threads = [threading.Thread(target=time.sleep, args=(duration,)) for _ in range(conversations * side_effects)]
+        [t.start() for t in threads]
+        [t.join() for t in threads]
+
+    executor.register_queue(JobQueueConfig('extraction', concurrency=16, max_backlog=5000))
+    executor.register_queue(JobQueueConfig('vectors', concurrency=8, max_backlog=5000))
+
+    def bounded():
+        futures = []
+        for _ in range(conversations):
+            futures.append(executor.submit('vectors', time.sleep, duration))
+            for _ in range(side_effects - 1):
+                futures.append(executor.submit('extraction', time.sleep, duration))
+        [f.result(timeout=60) for f in futures]
+
+    unbounded_peak, unbounded_time = measure(unbounded)
+    bounded_peak, bounded_time = measure(bounded)
+
+    metrics = executor.metrics()
+    print(
+        f"\nthread per side effect: peak {unbounded_peak} threads, {unbounded_time:.2f}s"
+        f"\nexecutor (16 + 8 workers): peak {bounded_peak} threads, {bounded_time:.2f}s"
+        f"\nextraction: {metrics['extraction']}\nvectors: {metrics['vectors']}"
+    )
+    assert bounded_peak <= 24
+    assert metrics['extraction']['completed'] == conversations * (side_effects - 1)
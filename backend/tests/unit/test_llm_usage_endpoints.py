@@ -49,6 +49,7 @@ for attr in [
     "disable_user_webhook_db",
     "enable_user_webhook_db",
     "user_webhook_status_db",
+    "get_user_webhooks",
     "set_user_preferred_app",
     "set_user_data_protection_level",
     "get_generic_cache",
@@ -79,6 +80,7 @@ for name in [
     "utils.llm.external_integrations",
     "utils.webhooks",
     "utils.other.storage",
+    "utils.stt.speaker_gallery",
 ]:
     sys.modules[name] = types.ModuleType(name)
 
@@ -98,6 +100,10 @@ sys.modules["utils.llm.external_integrations"].generate_comprehensive_daily_summ
 
 sys.modules["utils.webhooks"].webhook_first_time_setup = MagicMock()
 
+speaker_gallery_mod = sys.modules["utils.stt.speaker_gallery"]
+speaker_gallery_mod.remove_from_speaker_gallery = MagicMock()
+speaker_gallery_mod.rename_in_speaker_gallery = MagicMock()
+
 storage_mod = sys.modules["utils.other.storage"]
 storage_mod.delete_all_conversation_recordings = MagicMock()
 storage_mod.get_speech_sample_signed_urls = MagicMock()
@@ -0,0 +1,369 @@
+"""
+Tests for the sharded in-memory cache (database/cache_manager.py).
+
+Covers: the sampling size estimator, payload-sized and pre-serialized entries, singleflight that leaves no per-key
+state behind, stale-while-revalidate, deletes racing a fetch, per-shard eviction, and Redis read errors counting as a
+miss. Ends with multithreaded benchmarks against the previous single-lock cache that sized entries with json.dumps,
+run with `-s` to see the report.
+"""
+
+import json
+import sys
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from unittest.mock import MagicMock
+
+import pytest
+
+from database.cache_manager import InMemoryCacheManager, SizedValue, estimate_size
+from models.app import App
+
+
+def _app_dict(i: int) -> dict:
+    return {
+        'id': f'app-{i}',
+        'name': f'App {i}',
+        'author': 'someone',
+        'description': 'Does useful things with your conversations. ' * 10,
+        'image': f'https://example.com/{i}.png',
+        'capabilities': ['chat', 'memories', 'external_integration'],
+        'uid': None,
+        'private': False,
+        'approved': True,
+        'deleted': False,
+        'installs': i,
+        'category': 'productivity',
+    }
+
+
+# *********************************
+# *********** SIZING **************
+# *********************************
+
+
+def test_estimate_is_close_to_the_serialized_size():
+    apps = [_app_dict(i) for i in range(2000)]
+    estimated = estimate_size(apps)
+    serialized = sys.getsizeof(json.dumps(apps))
+
+    # Python objects are larger than their JSON, but in the same order of magnitude
+    assert serialized < estimated < serialized * 6
+
+
+def test_estimate_samples_large_containers():
+    items = ['x' * 100] * 16000
+    measured = estimate_size(items) - sys.getsizeof(items)
+    assert measured == pytest.approx(16000 * sys.getsizeof('x' * 100), rel=0.01)
+
+
+def test_estimate_objects():
+    class WithSizeof:
+        def __sizeof__(self):
+            return 12345
+
+    apps = [App(**_app_dict(i)) for i in range(50)]
+    assert estimate_size(WithSizeof()) == sys.getsizeof(WithSizeof())
+    assert estimate_size(apps) > 50 * len(_app_dict(0)['description'])
+    nested = []
+    for _ in range(5000):
+        nested = [nested]
+    assert estimate_size(nested) < 1000
+
+
+def test_sized_value_and_serialized_entries():
+    cache = InMemoryCacheManager(max_memory_mb=1)
+    payload = json.dumps([_app_dict(i) for i in range(10)]).encode()
+
+    cache.get_or_fetch('sized', lambda: SizedValue(json.loads(payload), len(payload)))
+    cache.set_serialized('raw', zlib.compress(payload), loads=lambda b: json.loads(zlib.decompress(b)))
+
+    assert cache.get('sized') == json.loads(payload)
+    assert cache.get('raw') == json.loads(payload)
+    assert cache.get_serialized('raw') == zlib.compress(payload)
+    assert cache.get_serialized('sized') is None
+    assert cache.current_size < 2 * len(payload) + 1000
+
+
+# *********************************
+# ********* SINGLEFLIGHT **********
+# *********************************
+
+
+def test_singleflight_leaves_no_per_key_state():
+    cache = InMemoryCacheManager()
+    calls = []
+    gate = threading.Event()
+
+    def fetch():
+        calls.append(1)
+        gate.wait()
+        return 'value'
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_fetch('k', fetch))) for _ in range(8)]
+    [t.start() for t in threads]
+    time.sleep(0.05)
+    assert cache.get_stats()['in_flight'] == 1
+    gate.set()
+    [t.join() for t in threads]
+
+    assert results == ['value'] * 8
+    assert len(calls) == 1
+    stats = cache.get_stats()
+    assert stats['coalesced'] == 7
+    assert stats['in_flight'] == 0
+
+    for i in range(1000):
+        cache.get_or_fetch(f'key-{i}', lambda: i)
+    assert cache.get_stats()['in_flight'] == 0
+
+
+def test_waiters_get_the_fetch_error():
+    cache = InMemoryCacheManager()
+    gate = threading.Event()
+
+    def failing():
+        gate.wait()
+        raise RuntimeError('firestore down')
+
+    errors = []
+
+    def worker():
+        try:
+            cache.get_or_fetch('k', failing)
+        except RuntimeError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    [t.start() for t in threads]
+    time.sleep(0.05)
+    gate.set()
+    [t.join() for t in threads]
+
+    assert len(errors) == 4
+    assert cache.get_stats()['fetches'] == 1
+    assert cache.get_or_fetch('k', lambda: 'recovered') == 'recovered'
+
+
+def test_delete_during_fetch_is_not_overwritten():
+    cache = InMemoryCacheManager()
+    started, gate = threading.Event(), threading.Event()
+
+    def fetch():
+        started.set()
+        gate.wait()
+        return 'stale'
+
+    thread = threading.Thread(target=cache.get_or_fetch, args=('k', fetch))
+    thread.start()
+    started.wait()
+    cache.delete('k')
+    gate.set()
+    thread.join()
+
+    assert cache.get('k') is None
+
+
+# *********************************
+# *** STALE-WHILE-REVALIDATE ******
+# *********************************
+
+
+def test_stale_value_served_while_refreshing():
+    cache = InMemoryCacheManager()
+    version = [1]
+    refreshing = threading.Event()
+    release = threading.Event()
+
+    def fetch():
+        if version[0] > 1:
+            refreshing.set()
+            release.wait()
+        return version[0]
+
+    assert cache.get_or_fetch('k', fetch, ttl=0.05, stale_ttl=5) == 1
+    time.sleep(0.1)
+    version[0] = 2
+
+    # Expired: plain gets miss, get_or_fetch returns the old value at once and refreshes once in the background
+    assert cache.get('k') is None
+    started = time.perf_counter()
+    assert [cache.get_or_fetch('k', fetch, ttl=0.05, stale_ttl=5) for _ in range(5)] == [1] * 5
+    assert time.perf_counter() - started < 0.05
+    assert refreshing.wait(1)
+    release.set()
+
+    for _ in range(100):
+        if cache.get('k') == 2:
+            break
+        time.sleep(0.01)
+    assert cache.get_or_fetch('k', fetch, ttl=0.05, stale_ttl=5) == 2
+    stats = cache.get_stats()
+    assert stats['refreshes'] == 1
+    assert stats['stale_hits'] == 5
+
+
+def test_failed_refresh_keeps_the_stale_value():
+    cache = InMemoryCacheManager()
+    cache.set('k', 'old', ttl=0, stale_ttl=5)
+    time.sleep(0.01)
+
+    def failing():
+        raise RuntimeError('redis down')
+
+    assert cache.get_or_fetch('k', failing, ttl=0, stale_ttl=5) == 'old'
+    for _ in range(100):
+        if cache.get_stats()['in_flight'] == 0:
+            break
+        time.sleep(0.01)
+    assert cache.get_or_fetch('k', failing, ttl=0, stale_ttl=5) == 'old'
+
+
+def test_past_the_stale_window_fetches_inline():
+    cache = InMemoryCacheManager()
+    cache.set('k', 'old', ttl=0, stale_ttl=0.05)
+    time.sleep(0.1)
+    assert cache.get_or_fetch('k', lambda: 'new') == 'new'
+
+
+# *********************************
+# *********** EVICTION ************
+# *********************************
+
+
+def test_eviction_stays_within_the_budget():
+    cache = InMemoryCacheManager(max_memory_mb=1, shards=4)
+    for i in range(3000):
+        cache.set(f'key-{i}', {'data': 'x' * 1000})
+
+    stats = cache.get_stats()
+    assert cache.current_size <= cache.max_memory_bytes
+    assert stats['evictions'] > 0
+    assert cache.get('key-2999') is not None
+    assert cache.get('key-0') is None
+
+
+def test_delete_prefix_and_clear_across_shards():
+    cache = InMemoryCacheManager(shards=8)
+    for i in range(100):
+        cache.set(f'enabled_apps:{i}', i)
+        cache.set(f'other:{i}', i)
+
+    assert cache.delete_prefix('enabled_apps:') == 100
+    assert cache.get_stats()['entries'] == 100
+    cache.clear()
+    assert cache.get_stats()['entries'] == 0
+    assert cache.current_size == 0
+
+
+def test_redis_payload_read_errors_are_a_miss(monkeypatch):
+    import database.redis_db as redis_db
+
+    monkeypatch.setattr(redis_db, 'r', MagicMock(get=MagicMock(side_effect=ConnectionError('redis down'))))
+    assert redis_db.get_generic_cache_payload('get_public_approved_apps_data') is None
+    assert redis_db.get_generic_cache('get_public_approved_apps_data') is None
+
+
+# *********************************
+# ********** BENCHMARK ************
+# *********************************
+
+
+class _PreviousCache:
+    """The previous cache: one RLock for everything, json.dumps sizing, a lock per key kept forever."""
+
+    def __init__(self):
+        self.cache = OrderedDict()
+        self.lock = threading.RLock()
+        self._fetch_locks = {}
+        self._fetch_lock_manager = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.cache:
+                return None
+            data, timestamp, ttl = self.cache[key]
+            if time.time() - timestamp > ttl:
+                del self.cache[key]
+                return None
+            self.cache.move_to_end(key)
+            return data
+
+    def set(self, key, data, ttl=30):
+        with self.lock:
+            if isinstance(data, (list, dict)):
+                sys.getsizeof(json.dumps(data, default=str))
+            self.cache[key] = (data, time.time(), ttl)
+
+    def get_or_fetch(self, key, fetch_fn, ttl=30):
+        if (value := self.get(key)) is not None:
+            return value
+        with self._fetch_lock_manager:
+            fetch_lock = self._fetch_locks.setdefault(key, threading.Lock())
+        with fetch_lock:
+            if (value := self.get(key)) is not None:
+                return value
+            value = fetch_fn()
+            self.set(key, value, ttl=ttl)
+            return value
+
+
+def test_benchmark_set_sizing_and_concurrent_reads():
+    """
+    Caching the approved apps listing (1500 App models), then 8 threads reading 200 hot keys while one thread
+    keeps re-setting the listing, then 20k distinct keys through get_or_fetch.
+    """
+    apps = [App(**_app_dict(i)) for i in range(1500)]
+    previous, cache = _PreviousCache(), InMemoryCacheManager(max_memory_mb=100)
+
+    results = {}
+    for label, target in [('previous', previous), ('sharded', cache)]:
+        started = time.perf_counter()
+        for _ in range(5):
+            target.set('apps', apps)
+        set_ms = (time.perf_counter() - started) / 5 * 1000
+
+        for i in range(200):
+            target.set(f'hot-{i}', {'i': i})
+        stop = threading.Event()
+        latencies = [[] for _ in range(8)]
+
+        def writer():
+            while not stop.is_set():
+                target.set('apps', apps)
+
+        def reader(n):
+            for j in range(5000):
+                started = time.perf_counter()
+                target.get(f'hot-{(n * 31 + j) % 200}')
+                latencies[n].append(time.perf_counter() - started)
+
+        writer_thread = threading.Thread(target=writer)
+        writer_thread.start()
+        readers = [threading.Thread(target=reader, args=(n,)) for n in range(8)]
+        started = time.perf_counter()
+        [t.start() for t in readers]
+        [t.join() for t in readers]
+        elapsed = time.perf_counter() - started
+        stop.set()
+        writer_thread.join()
+        all_latencies = sorted(x for thread in latencies for x in thread)
+        max_ms = all_latencies[-1] * 1000
+
+        for i in range(20000):
+            target.get_or_fetch(f'distinct-{i}', lambda: i)
+        leftover = len(previous._fetch_locks) if target is previous else cache.get_stats()['in_flight']
+        results[label] = (set_ms, len(all_latencies) / elapsed, max_ms, leftover)
+
+    print()
+    for label, (set_ms, reads, max_ms, leftover) in results.items():
+        print(
+            f"{label:>8}: set(1500 apps) {set_ms:6.2f}ms | with a concurrent writer {reads:8.0f} reads/s, "
+            f"max read {max_ms:6.2f}ms | {leftover} per-key fetch locks left after 20k keys"
+        )
+    assert results['sharded'][0] * 5 < results['previous'][0]
+    assert results['sharded'][1] > results['previous'][1]
+    assert results['sharded'][3] == 0
+    assert results['previous'][3] == 20000
@@ -0,0 +1,476 @@
+"""
+Tests for the per-user memory snapshots (utils/memory_snapshot.py).
+
+Covers: get_memories order and filters from the snapshot, the in-memory cache until a write, delta refresh of the
+changed ids, rebuilds when the changes aren't known, other instances starting from the Redis copy (encrypted for
+enhanced memories), searches over the embedding matrix, partial snapshots falling back to Firestore, and the db
+writes bumping the version. Ends with a benchmark of memory documents read per chat turn, run with `-s` to see the
+report.
+"""
+
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock
+
+import numpy as np
+import pytest
+
+os.environ.setdefault(
+    "ENCRYPTION_SECRET",
+    "omi_ZwB2ZNqB2HHpMK6wStk7sTpavJiPTFg7gXUHnc4tFABPU6pZ2c2DKgehtfgi4RZv",
+)
+
+for _name in ["database._client", "database.users", "utils.other.storage", "utils.llm.clients"]:
+    sys.modules[_name] = MagicMock()
+
+import database.cache as cache
+import database.memories as memories_db
+import database.redis_db as redis_db
+import utils.memory_snapshot as memory_snapshot
+from database.redis_pubsub import RedisPubSubManager
+from models.memories import MemoryDB
+
+NOW = datetime(2026, 10, 1, tzinfo=timezone.utc)
+DIM = 64
+
+
+def _memory(i, days_ago=0.0, manually_added=False, category='interesting', enhanced=False):
+    created_at = NOW - timedelta(days=days_ago, minutes=i)
+    memory = MemoryDB(
+        id=f'm{i:04d}',
+        uid='u1',
+        content=f'fact number {i} about the user',
+        category=category,
+        created_at=created_at,
+        updated_at=created_at,
+        manually_added=manually_added,
+    )
+    memory.scoring = MemoryDB.calculate_score(memory)
+    data = memory.dict()
+    data['category'] = data['category'].value
+    if enhanced:
+        data['data_protection_level'] = 'enhanced'
+    return data
+
+
+def _firestore_order(memories):
+    """get_memories order the Firestore way: docs without the ordered fields skipped, nulls last, then the filter."""
+    listed = [m for m in memories if 'scoring' in m and 'created_at' in m]
+    by_date = sorted(listed, key=lambda m: (m['created_at'], m['id']), reverse=True)
+    scored = sorted([m for m in by_date if m['scoring'] is not None], key=lambda m: m['scoring'], reverse=True)
+    ordered = scored + [m for m in by_date if m['scoring'] is None]
+    return [m for m in ordered if m.get('user_review') is not False]
+
+
+class _Redis:
+    """Versions, changed ids and snapshot copies per user, in place of Redis."""
+
+    def __init__(self):
+        self.versions = {}
+        self.changes = {}
+        self.blobs = {}
+        self.kept = 500
+
+    def get_memories_version(self, uid):
+        return self.versions.get(uid, 0)
+
+    def bump_memories_version(self, uid, memory_ids=None):
+        version = self.versions[uid] = self.versions.get(uid, 0) + 1
+        changes = self.changes.setdefault(uid, {})
+        for memory_id in memory_ids if memory_ids is not None else ['*']:
+            changes[memory_id] = version
+        while len(changes) > self.kept:
+            del changes[min(changes, key=changes.get)]
+        return version
+
+    def get_memories_changes(self, uid, since_version):
+        changes = self.changes.get(uid, {})
+        if len(changes) >= self.kept and min(changes.values()) > since_version:
+            return None
+        ids = [memory_id for memory_id, version in changes.items() if version > since_version]
+        return None if '*' in ids else ids
+
+    def get_memory_snapshot(self, uid, part='memories'):
+        return self.blobs.get((uid, part))
+
+    def set_memory_snapshot(self, uid, data, part='memories', ttl=None):
+        self.blobs[(uid, part)] = data
+
+
+class _Store:
+    """The user's memories and their vectors, counting what's read, in place of Firestore and the vector index."""
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.memories = {}
+        self.vectors = {}
+        self.full_reads = 0
+        self.docs_read = 0
+        self.vectors_fetched = 0
+        self.fallbacks = 0
+
+    def write(self, *memories, vectors=None):
+        for memory in memories:
+            self.memories[memory['id']] = memory
+        self.vectors.update(vectors or {})
+        self.redis.bump_memories_version('u1', [m['id'] for m in memories] + list(vectors or {}))
+
+    def delete(self, memory_id):
+        self.memories.pop(memory_id)
+        self.vectors.pop(memory_id, None)
+        self.redis.bump_memories_version('u1', [memory_id])
+
+    def get_all_memories(self, uid, limit):
+        self.full_reads += 1
+        ordered = _firestore_order(list(self.memories.values()))
+        self.docs_read += min(len(self.memories), limit)
+        return [dict(m) for m in ordered[:limit]], len(self.memories) < limit
+
+    def get_memories_by_ids(self, uid, memory_ids):
+        self.docs_read += len(memory_ids)
+        return [dict(self.memories[m]) for m in memory_ids if m in self.memories]
+
+    def fetch_memory_vectors(self, uid, memory_ids):
+        self.vectors_fetched += len(memory_ids)
+        return {m: list(self.vectors[m]) for m in memory_ids if m in self.vectors}
+
+    def get_memories(self, uid, limit=100, offset=0, categories=[], start_date=None, end_date=None):
+        self.fallbacks += 1
+        self.docs_read += limit
+        return [dict(m) for m in _firestore_order(list(self.memories.values()))[offset : offset + limit]]
+
+
+@pytest.fixture
+def memory_cache(monkeypatch):
+    monkeypatch.setattr(RedisPubSubManager, 'start', lambda self: None)
+    monkeypatch.setattr(cache, 'r', MagicMock())
+    monkeypatch.setattr(cache, '_initialized', False)
+    cache._ensure_initialized()
+    return cache.get_memory_cache()
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    fake = _Redis()
+    for name in [
+        'get_memories_version',
+        'bump_memories_version',
+        'get_memories_changes',
+        'get_memory_snapshot',
+        'set_memory_snapshot',
+    ]:
+        monkeypatch.setattr(memory_snapshot.redis_db, name, getattr(fake, name))
+    return fake
+
+
+@pytest.fixture
+def store(monkeypatch, redis, memory_cache):
+    fake = _Store(redis)
+    monkeypatch.setattr(memory_snapshot.memories_db, 'get_all_memories', fake.get_all_memories)
+    monkeypatch.setattr(memory_snapshot.memories_db, 'get_memories_by_ids', fake.get_memories_by_ids)
+    monkeypatch.setattr(memory_snapshot.memories_db, 'get_memories', fake.get_memories)
+    monkeypatch.setattr(memory_snapshot.vector_db, 'fetch_memory_vectors', fake.fetch_memory_vectors)
+    return fake
+
+
+def _fill(store, count=30, seed=0):
+    rng = np.random.default_rng(seed)
+    memories = [
+        _memory(
+            i, days_ago=float(rng.uniform(0, 60)), manually_added=i % 7 == 0, category=['interesting', 'system'][i % 2]
+        )
+        for i in range(count)
+    ]
+    memories[3]['scoring'] = None
+    memories[4]['user_review'] = False
+    del memories[5]['scoring']
+    store.memories = {m['id']: m for m in memories}
+    store.vectors = {m['id']: rng.standard_normal(DIM).tolist() for m in memories}
+    return memories
+
+
+def _ids(memories):
+    return [m['id'] for m in memories]
+
+
+# *********************************
+# ************ READS **************
+# *********************************
+
+
+def test_reads_match_get_memories(store):
+    _fill(store)
+    snapshot = memory_snapshot.get_memory_snapshot('u1')
+    expected = _firestore_order(list(store.memories.values()))
+
+    assert _ids(snapshot.get(limit=100)) == _ids(expected)
+    assert 'm0005' not in snapshot and 'm0004' not in snapshot
+    assert _ids(snapshot.get(limit=5, offset=3)) == _ids(expected[3:8])
+    assert _ids(snapshot.get(categories=['system'])) == _ids([m for m in expected if m['category'] == 'system'])
+
+    start, end = NOW - timedelta(days=30), (NOW - timedelta(days=10)).replace(tzinfo=None)
+    in_range = [m for m in expected if NOW - timedelta(days=30) <= m['created_at'] <= NOW - timedelta(days=10)]
+    assert _ids(snapshot.get(start_date=start, end_date=end)) == _ids(in_range)
+
+    # Copies, the cached snapshot stays as it was
+    snapshot.get(limit=1)[0]['content'] = 'changed'
+    assert snapshot.get(limit=1)[0]['content'] != 'changed'
+
+
+def test_cached_until_a_write_then_refreshed_with_the_changes(store):
+    memories = _fill(store)
+    first = memory_snapshot.get_memory_snapshot('u1')
+    assert memory_snapshot.get_memory_snapshot('u1') is first
+    assert store.full_reads == 1 and store.docs_read == 30
+
+    edited = dict(memories[10], content='edited fact', edited=True)
+    store.write(edited)
+    store.delete('m0011')
+    store.write(_memory(99, manually_added=True))
+
+    updated = memory_snapshot.get_memory_snapshot('u1')
+    assert store.full_reads == 1 and store.docs_read == 30 + 3
+    assert _ids(updated.get(limit=100)) == _ids(_firestore_order(list(store.memories.values())))
+    assert 'm0099' in updated and 'm0011' not in updated
+    assert 'edited fact' in [m['content'] for m in updated.get(limit=100)]
+    # Readers of the older version aren't affected
+    assert 'm0011' in first and 'm0099' not in first
+
+
+def test_rebuilds_when_the_changes_are_not_known(store, redis, monkeypatch):
+    _fill(store)
+    memory_snapshot.get_memory_snapshot('u1')
+
+    redis.bump_memories_version('u1')
+    memory_snapshot.get_memory_snapshot('u1')
+    assert store.full_reads == 2
+
+    monkeypatch.setattr(memory_snapshot, 'MAX_DELTA_IDS', 3)
+    redis.bump_memories_version('u1', ['m0001', 'm0002', 'm0003', 'm0006'])
+    memory_snapshot.get_memory_snapshot('u1')
+    assert store.full_reads == 3
+
+    # Changes trimmed past the snapshot's version
+    redis.kept = 2
+    for memory_id in ['m0001', 'm0002', 'm0003']:
+        redis.bump_memories_version('u1', [memory_id])
+    memory_snapshot.get_memory_snapshot('u1')
+    assert store.full_reads == 4
+
+
+def test_other_instances_start_from_redis(store, redis, memory_cache):
+    memories = [_memory(i, enhanced=i % 2 == 0) for i in range(6)]
+    store.memories = {m['id']: m for m in memories}
+    first = memory_snapshot.get_memory_snapshot('u1')
+
+    blob = redis.blobs[('u1', 'memories')]
+    assert blob[:1] == b'e' and b'fact number' not in blob
+
+    memory_cache.clear()
+    store.write(_memory(50))
+    restored = memory_snapshot.get_memory_snapshot('u1')
+    assert store.full_reads == 1 and store.docs_read == 6 + 1
+    assert [m for m in restored.get(limit=100) if m['id'] != 'm0050'] == first.get(limit=100)
+    assert isinstance(restored.get(limit=1)[0]['created_at'], datetime)
+
+
+# *********************************
+# ************ SEARCH *************
+# *********************************
+
+
+def _brute_force(store, query, k):
+    listed = _ids(_firestore_order(list(store.memories.values())))
+    similarities = {
+        m: float(np.dot(store.vectors[m], query) / np.linalg.norm(store.vectors[m]) / np.linalg.norm(query))
+        for m in listed
+        if m in store.vectors
+    }
+    return sorted(similarities, key=similarities.get, reverse=True)[:k]
+
+
+def test_search_matches_brute_force_and_follows_changes(store, memory_cache, monkeypatch):
+    _fill(store, count=200)
+    listed = len(_firestore_order(list(store.memories.values())))
+    query = np.random.default_rng(1).standard_normal(DIM)
+    monkeypatch.setattr(memory_snapshot, 'embeddings', MagicMock(embed_query=lambda text: query.tolist()))
+
+    results = memory_snapshot.search_memories('u1', 'anything', limit=5)
+    assert [m['id'] for m, _ in results] == _brute_force(store, query, 5)
+    assert all(a >= b for (_, a), (_, b) in zip(results, results[1:]))
+    assert store.vectors_fetched == listed
+
+    # A memory moved right next to the query: one vector fetched again
+    target = results[-1][0]['id']
+    store.write(vectors={target: (query * 3).tolist()})
+    results = memory_snapshot.search_memories('u1', 'anything', limit=5)
+    assert results[0][0]['id'] == target and results[0][1] == pytest.approx(1.0, abs=1e-5)
+    assert store.vectors_fetched == listed + 1
+
+    # Another instance: the float16 copy from Redis, nothing fetched
+    memory_cache.clear()
+    again = memory_snapshot.search_memories('u1', 'anything', limit=5)
+    assert [m['id'] for m, _ in again] == _brute_force(store, query, 5)
+    assert store.vectors_fetched == listed + 1
+
+
+def test_search_falls_back_when_redis_is_down(store, monkeypatch):
+    _fill(store)
+
+    def down(*args):
+        raise ConnectionError('redis down')
+
+    monkeypatch.setattr(memory_snapshot.redis_db, 'get_memories_version', down)
+    assert memory_snapshot.search_memories('u1', 'anything') is None
+
+
+def test_partial_snapshots_fall_back_to_firestore(store, monkeypatch):
+    monkeypatch.setattr(memory_snapshot, 'MEMORY_SNAPSHOT_LIMIT', 10)
+    _fill(store)
+    snapshot = memory_snapshot.get_memory_snapshot('u1')
+    assert not snapshot.complete and len(snapshot) <= 10
+
+    assert len(memory_snapshot.get_memories('u1', limit=5)) == 5 and store.fallbacks == 0
+    memory_snapshot.get_memories('u1', limit=50)
+    memory_snapshot.get_memories('u1', limit=5, categories=['system'])
+    assert store.fallbacks == 2
+    assert memory_snapshot.search_memories('u1', 'anything') is None
+
+    # An older memory changed: past the end of the snapshot, it stays out
+    oldest = _firestore_order(list(store.memories.values()))[-1]
+    store.write(dict(oldest, content='still old'))
+    assert oldest['id'] not in memory_snapshot.get_memory_snapshot('u1')
+
+
+# *********************************
+# ************ WRITES *************
+# *********************************
+
+
+def test_memory_writes_bump_the_version(memory_cache, monkeypatch):
+    bumps = []
+    monkeypatch.setattr(memories_db.redis_db, 'bump_memories_version', lambda uid, ids=None: bumps.append((uid, ids)))
+    monkeypatch.setattr(memories_db, 'db', MagicMock())
+
+    memories_db.create_memory('u1', _memory(1))
+    memories_db.save_memories('u1', [_memory(2), _memory(3)])
+    memories_db.edit_memory('u1', 'm0001', 'new content')
+    memories_db.review_memory('u1', 'm0002', False)
+    memories_db.delete_memory('u1', 'm0003')
+    memories_db.delete_all_memories('u1')
+
+    assert bumps == [
+        ('u1', ['m0001']),
+        ('u1', ['m0002', 'm0003']),
+        ('u1', ['m0001']),
+        ('u1', ['m0002']),
+        ('u1', ['m0003']),
+        ('u1', None),
+    ]
+
+
+@pytest.mark.parametrize('delete', ['delete_memories', 'delete_all_memories'])
+def test_deleting_all_memories_evicts_the_snapshot(store, redis, memory_cache, delete, monkeypatch):
+    _fill(store)
+    memory_snapshot.get_memory_snapshot('u1', with_vectors=True)
+    key = memories_db.memory_snapshot_cache_key('u1')
+    assert memory_cache.get(key) is not None and redis.blobs
+
+    monkeypatch.setattr(memories_db.redis_db, 'delete_memory_snapshot', lambda uid: redis.blobs.clear())
+    monkeypatch.setattr(memories_db, 'db', MagicMock())
+    getattr(memories_db, delete)('u1')
+    assert memory_cache.get(key) is None and not redis.blobs
+
+
+def test_bump_errors_do_not_fail_the_write(monkeypatch):
+    def down(*args):
+        raise ConnectionError('redis down')
+
+    monkeypatch.setattr(memories_db.redis_db, 'bump_memories_version', down)
+    monkeypatch.setattr(memories_db, 'db', MagicMock())
+    memories_db.delete_memory('u1', 'm0001')
+
+
+def test_all_memories_without_the_rejected_ones(monkeypatch):
+    docs = [MagicMock(id=f'm{i}', to_dict=MagicMock(return_value={'user_review': i != 2 and None})) for i in range(4)]
+    db = MagicMock()
+    query = db.collection.return_value.document.return_value.collection.return_value
+    query.order_by.return_value.order_by.return_value.limit.return_value.stream.return_value = docs
+    monkeypatch.setattr(memories_db, 'db', db)
+
+    memories, complete = memories_db.get_all_memories('u1', limit=10)
+    assert _ids(memories) == ['m0', 'm1', 'm3'] and complete
+    assert memories_db.get_all_memories('u1', limit=4)[1] is False
+
+
+def test_changes_since_a_version(monkeypatch):
+    class _Pipeline:
+        def __init__(self, scores):
+            self.scores, self.ops = scores, []
+
+        def zcard(self, key):
+            self.ops.append(len(self.scores))
+
+        def zrange(self, key, start, end, withscores=False):
+            self.ops.append(sorted(((m.encode(), s) for m, s in self.scores.items()), key=lambda x: x[1])[:1])
+
+        def zrangebyscore(self, key, low, high):
+            since = float(low.lstrip('('))
+            self.ops.append([m.encode() for m, s in self.scores.items() if s > since])
+
+        def execute(self):
+            return self.ops
+
+    def changes(scores, since, kept=500):
+        monkeypatch.setattr(redis_db, 'MEMORIES_CHANGES_KEPT', kept)
+        monkeypatch.setattr(redis_db, 'r', MagicMock(pipeline=lambda: _Pipeline(scores)))
+        return redis_db.get_memories_changes('u1', since)
+
+    assert changes({'a': 1, 'b': 3, 'c': 4}, since=2) == ['b', 'c']
+    assert changes({'a': 1, 'b': 3, '*': 4}, since=2) is None
+    # Full and trimmed past since: unknown
+    assert changes({'b': 3, 'c': 4}, since=1, kept=2) is None
+    assert changes({'b': 3, 'c': 4}, since=3, kept=2) == ['c']
+
+
+# *********************************
+# ********** BENCHMARK ************
+# *********************************
+
+
+def test_benchmark_memory_reads_per_chat_turn(store, monkeypatch):
+    """
+    A chat session of a user with 800 memories: every turn builds the prompt memories (limit 1000), calls
+    get_memories_tool (limit 50) and search_memories_tool (limit 5), and every fifth turn saves 3 new memories. The
+    previous readers queried Firestore, and decrypted, every time.
+    """
+    _fill(store, count=800)
+    monkeypatch.setattr(memory_snapshot, 'embeddings', MagicMock(embed_query=lambda text: [1.0] * DIM))
+    turns, listed = 50, len(_firestore_order(list(store.memories.values())))
+
+    previous_reads = 0
+    for turn in range(turns):
+        previous_reads += listed + 50 + 5  # get_prompt_data, get_memories_tool, find_similar_memories + get_all
+
+    start = time.perf_counter()
+    for turn in range(turns):
+        if turn and turn % 5 == 0:
+            new = [_memory(1000 + turn * 3 + i) for i in range(3)]
+            store.write(*new, vectors={m['id']: [0.5] * DIM for m in new})
+        memory_snapshot.get_memories('u1', limit=1000)
+        memory_snapshot.get_memories('u1', limit=50)
+        memory_snapshot.search_memories('u1', 'question', limit=5)
+    elapsed = (time.perf_counter() - start) / turns
+
+    print()
+    print(f"{listed} memories, {turns} chat turns, 3 new memories every 5 turns")
+    print(f"  previous: {previous_reads / turns:7.1f} memory docs read and decrypted per turn")
+    print(
+        f"  snapshot: {store.docs_read / turns:7.1f} memory docs read per turn "
+        f"({store.full_reads} full read, {store.vectors_fetched / turns:.1f} vectors fetched per turn), "
+        f"{elapsed * 1000:.2f}ms per turn for the three reads"
+    )
+    assert store.full_reads == 1 and store.fallbacks == 0
+    assert store.docs_read < previous_reads / 20
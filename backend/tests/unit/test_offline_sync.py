@@ -0,0 +1,508 @@
+"""
+Tests for the offline sync pipeline (utils/conversations/offline_sync.py, utils/other/fanout.py,
+utils/other/scheduler.py).
+
+Covers: stage concurrency, fan-out and bounded queues, shared stage pools, per-item failures, the delayed-call thread, merging transcripts per
+target conversation (existing, created by the sync, discarded), and whole syncs: files cleaned up, progress saved,
+a VAD failure writing nothing. Ends with a benchmark of the previous fixed groups of 5 threads per step and one
+rewrite per segment vs the pipeline, run with `-s` to see the report.
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from unittest.mock import MagicMock
+
+import numpy as np
+import pytest
+
+os.environ.setdefault(
+    "ENCRYPTION_SECRET",
+    "omi_ZwB2ZNqB2HHpMK6wStk7sTpavJiPTFg7gXUHnc4tFABPU6pZ2c2DKgehtfgi4RZv",
+)
+
+for _name in [
+    "database._client",
+    "database.users",
+    "utils.other.storage",
+    "utils.conversations.process_conversation",
+    "utils.stt.pre_recorded",
+]:
+    sys.modules[_name] = MagicMock()
+
+import utils.conversations.offline_sync as offline_sync
+from models.transcript_segment import TranscriptSegment
+from utils.conversations.offline_sync import ConversationMerger, SyncJob, SyncTranscript, run_sync_job
+from utils.other.fanout import FanoutEngine, FanoutStage
+from utils.other.scheduler import DelayedCalls
+
+BASE = 1735000000  # a timestamp in the allowed sync range
+
+
+def _segments(*spans, text='hello'):
+    return [TranscriptSegment(text=text, is_user=False, start=start, end=end) for start, end in spans]
+
+
+def _transcript(timestamp, *spans, language='en'):
+    return SyncTranscript(f'/tmp/{timestamp}.wav', timestamp, _segments(*spans), language)
+
+
+def _conversation(conversation_id, started_at, finished_at, segments=(), discarded=False):
+    return {
+        'id': conversation_id,
+        'started_at': datetime.fromtimestamp(started_at, tz=timezone.utc),
+        'finished_at': datetime.fromtimestamp(finished_at, tz=timezone.utc),
+        'transcript_segments': [s.dict() for s in _segments(*segments)],
+        'discarded': discarded,
+    }
+
+
+class _Firestore:
+    """Stored conversations, with the matching rule of get_closest_conversation_to_timestamps."""
+
+    def __init__(self, *conversations, latency=0.0):
+        self.conversations = {c['id']: c for c in conversations}
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.writes = []
+        self.created = []
+
+    def closest(self, uid, start, end):
+        time.sleep(self.latency)
+        with self.lock:
+            matches = [
+                c
+                for c in self.conversations.values()
+                if c['finished_at'].timestamp() >= start - 120 and c['started_at'].timestamp() <= end + 120
+            ]
+        if not matches:
+            return None
+        return min(
+            matches,
+            key=lambda c: min(abs(c['started_at'].timestamp() - start), abs(c['finished_at'].timestamp() - end)),
+        )
+
+    def update_segments(self, uid, conversation_id, segments, finished_at=None):
+        time.sleep(self.latency)
+        with self.lock:
+            self.writes.append((conversation_id, len(segments)))
+            self.conversations[conversation_id]['transcript_segments'] = segments
+            if finished_at:
+                self.conversations[conversation_id]['finished_at'] = finished_at
+
+    def process_conversation(self, uid, language, create):
+        time.sleep(self.latency)
+        with self.lock:
+            conversation_id = f'new-{len(self.created)}'
+            self.created.append(create)
+            self.conversations[conversation_id] = {
+                'id': conversation_id,
+                'started_at': create.started_at,
+                'finished_at': create.finished_at,
+                'transcript_segments': [s.dict() for s in create.transcript_segments],
+            }
+        return MagicMock(id=conversation_id)
+
+
+@pytest.fixture
+def firestore(monkeypatch):
+    store = _Firestore()
+    monkeypatch.setattr(offline_sync, 'get_closest_conversation_to_timestamps', store.closest)
+    monkeypatch.setattr(offline_sync, 'update_conversation_segments', store.update_segments)
+    monkeypatch.setattr(offline_sync, 'process_conversation', store.process_conversation)
+    return store
+
+
+# *********************************
+# *********** PIPELINE ************
+# *********************************
+
+
+class _Tracker:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = {}
+        self.peak = {}
+
+    def stage(self, name, duration, fanout=1):
+        def run(item):
+            with self.lock:
+                self.running[name] = self.running.get(name, 0) + 1
+                self.peak[name] = max(self.peak.get(name, 0), self.running[name])
+            time.sleep(duration)
+            with self.lock:
+                self.running[name] -= 1
+            return [(item, i) for i in range(fanout)]
+
+        return run
+
+
+def _counts(metrics):
+    keys = ('received', 'running', 'processed', 'forwarded', 'failed')
+    return {name: {key: m.as_dict()[key] for key in keys} for name, m in metrics.items()}
+
+
+def test_stages_run_concurrently_within_their_caps():
+    tracker = _Tracker()
+    stages = [
+        FanoutStage('a', tracker.stage('a', 0.005, fanout=3), 2, fanout=True, queue_size=2),
+        FanoutStage('b', tracker.stage('b', 0.01), 4, fanout=True, queue_size=4),
+        FanoutStage('c', tracker.stage('c', 0.001), 1, fanout=True, queue_size=4),
+    ]
+    engine = FanoutEngine(stages)
+
+    asyncio.run(engine.run(range(20)))
+
+    assert tracker.peak == {'a': 2, 'b': 4, 'c': 1}
+    assert _counts(engine.metrics) == {
+        'a': {'received': 20, 'running': 0, 'processed': 20, 'forwarded': 60, 'failed': 0},
+        'b': {'received': 60, 'running': 0, 'processed': 60, 'forwarded': 60, 'failed': 0},
+        'c': {'received': 60, 'running': 0, 'processed': 60, 'forwarded': 0, 'failed': 0},
+    }
+
+
+def test_a_shared_pool_outlives_the_run():
+    tracker = _Tracker()
+    shared = ThreadPoolExecutor(max_workers=2)
+    try:
+        for _ in range(2):
+            engine = FanoutEngine([FanoutStage('a', tracker.stage('a', 0.005), 4, fanout=True, executor=shared)])
+            asyncio.run(engine.run(range(10)))
+            assert engine.metrics['a'].processed == 10
+    finally:
+        shared.shutdown()
+
+    # Four workers per run, but the pool caps the calls in flight
+    assert tracker.peak == {'a': 2}
+
+
+def test_a_slow_stage_holds_back_the_ones_before_it():
+    produced, consumed = [], []
+
+    def fast(item):
+        produced.append(item)
+        return [item]
+
+    def slow(item):
+        time.sleep(0.01)
+        consumed.append(item)
+        return []
+
+    def check_progress(progress):
+        # Never more ahead than the queue plus the items in the workers' hands
+        assert len(produced) - len(consumed) <= 3 + 2 + 1
+
+    stages = [FanoutStage('fast', fast, 1, fanout=True, queue_size=2), FanoutStage('slow', slow, 2, queue_size=3)]
+    asyncio.run(FanoutEngine(stages, on_progress=check_progress).run(range(50)))
+    assert sorted(consumed) == list(range(50))
+
+
+def test_a_failed_item_does_not_stop_the_others():
+    errors = []
+
+    def flaky(item):
+        if item % 5 == 0:
+            raise RuntimeError(f'bad {item}')
+        return [item]
+
+    results = []
+    stages = [FanoutStage('flaky', flaky, 3, fanout=True, queue_size=2), FanoutStage('out', results.append, 1)]
+    engine = FanoutEngine(stages, on_error=lambda s, i, e: errors.append((s.name, i)))
+    asyncio.run(engine.run(range(20)))
+
+    assert sorted(results) == [i for i in range(20) if i % 5]
+    assert sorted(errors) == [('flaky', i) for i in (0, 5, 10, 15)]
+    assert engine.metrics['flaky'].failed == 4
+
+
+# *********************************
+# ********** SCHEDULER ************
+# *********************************
+
+
+def test_delayed_calls_share_one_thread():
+    calls = DelayedCalls()
+    done = []
+    threads_before = threading.active_count()
+
+    for i in range(50):
+        calls.schedule(0.05 if i % 2 else 0.01, done.append, i)
+    cancelled = calls.schedule(0.02, done.append, 'cancelled')
+    calls.cancel(cancelled)
+
+    assert threading.active_count() <= threads_before + 1
+    for _ in range(100):
+        if len(done) == 50:
+            break
+        time.sleep(0.01)
+    assert sorted(done) == list(range(50))
+    assert done[:25] == list(range(0, 50, 2))
+    assert calls.pending() == 0
+
+
+def test_run_all_runs_what_is_left():
+    calls = DelayedCalls()
+    done = []
+    calls.schedule(60, done.append, 'later')
+    calls.schedule(60, lambda: 1 / 0)
+    calls.run_all()
+    assert done == ['later']
+    assert calls.pending() == 0
+
+
+# *********************************
+# ************ MERGE **************
+# *********************************
+
+
+def test_transcripts_of_one_conversation_are_written_once(firestore):
+    firestore.conversations['c1'] = _conversation('c1', BASE, BASE + 60, segments=[(0, 10), (30, 40)])
+    merger = ConversationMerger('u1')
+    job = SyncJob('u1', files=1)
+
+    # Out of order, the last two only match c1 once the first ones extend it
+    merger.add(_transcript(BASE + 100, (0, 20)))
+    merger.add(_transcript(BASE + 15, (0, 5)))
+    merger.add(_transcript(BASE + 230, (0, 30)))
+    merger.add(_transcript(BASE + 370, (0, 10)))
+    merger.flush(job)
+
+    assert firestore.writes == [('c1', 6)]
+    assert job.updated_memories == {'c1'} and job.new_memories == set()
+    segments = firestore.conversations['c1']['transcript_segments']
+    assert [s['start'] for s in segments] == [0, 15, 30, 100, 230, 370]
+    assert [s['end'] - s['start'] for s in segments] == [10, 5, 10, 20, 30, 10]
+    assert firestore.conversations['c1']['finished_at'].timestamp() == BASE + 380
+    assert 'timestamp' not in segments[0]
+
+
+def test_unmatched_transcripts_become_one_conversation_per_gap(firestore):
+    merger = ConversationMerger('u1')
+    job = SyncJob('u1', files=1)
+
+    merger.add(_transcript(BASE, (0, 30)))
+    merger.add(_transcript(BASE + 60, (2, 40)))
+    merger.add(_transcript(BASE + 3600, (0, 10)))
+    merger.flush(job)
+
+    assert len(firestore.created) == 2
+    first, second = sorted(firestore.created, key=lambda c: c.started_at)
+    assert first.started_at.timestamp() == BASE and first.finished_at.timestamp() == BASE + 100
+    assert [(s.start, s.end) for s in first.transcript_segments] == [(0, 30), (62, 100)]
+    assert second.started_at.timestamp() == BASE + 3600
+    assert job.new_memories == {'new-0', 'new-1'}
+    assert firestore.writes == []
+
+
+def test_discarded_conversations_are_reprocessed(firestore, monkeypatch):
+    firestore.conversations['c1'] = _conversation('c1', BASE, BASE + 60, segments=[(0, 10)], discarded=True)
+    reprocessed = []
+    monkeypatch.setattr(offline_sync, 'reprocess_conversation_after_update', lambda *args: reprocessed.append(args))
+    merger = ConversationMerger('u1')
+
+    merger.add(_transcript(BASE + 20, (0, 10), language='es'))
+    merger.add(_transcript(BASE + 40, (0, 10), language='es'))
+    merger.flush(SyncJob('u1', files=1))
+
+    assert reprocessed == [('u1', 'c1', 'es')]
+
+
+def test_a_failed_write_is_reported_and_the_rest_written(firestore, monkeypatch):
+    firestore.conversations['c1'] = _conversation('c1', BASE, BASE + 60)
+
+    def failing(*args, **kwargs):
+        raise RuntimeError('firestore down')
+
+    monkeypatch.setattr(offline_sync, 'update_conversation_segments', failing)
+    merger = ConversationMerger('u1')
+    merger.add(_transcript(BASE + 10, (0, 5)))
+    merger.add(_transcript(BASE + 9000, (0, 5)))
+    job = SyncJob('u1', files=1)
+    merger.flush(job)
+
+    assert job.new_memories == {'new-0'}
+    assert job.errors == [{'stage': 'merge', 'file': None, 'error': 'firestore down'}]
+
+
+# *********************************
+# ************* SYNC **************
+# *********************************
+
+
+def _write_recording(path, speech_spans, seconds):
+    """A 16kHz WAV with tones where the speech is, enough for the energy VAD."""
+    rate = 16000
+    samples = np.random.default_rng(0).standard_normal(seconds * rate) * 0.001
+    for start, end in speech_spans:
+        t = np.arange(int((end - start) * rate)) / rate
+        samples[int(start * rate) : int(start * rate) + len(t)] += 0.3 * np.sin(2 * np.pi * 220 * t)
+    with wave.open(str(path), 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes((samples * 32767).astype('<i2').tobytes())
+
+
+@pytest.fixture
+def sync_env(tmp_path, monkeypatch, firestore):
+    monkeypatch.setenv('VAD_BACKEND', 'energy')
+    monkeypatch.setattr(offline_sync, 'SYNC_PROGRESS_INTERVAL', 0)
+    saved, uploads, deleted = [], [], []
+    monkeypatch.setattr(offline_sync.redis_db, 'set_sync_job', lambda uid, job_id, job: saved.append(job))
+    monkeypatch.setattr(offline_sync.redis_db, 'get_generic_cache', lambda key: None)
+    monkeypatch.setattr(offline_sync.redis_db, 'set_generic_cache', lambda *args, **kwargs: None)
+    monkeypatch.setattr(offline_sync, 'get_syncing_file_temporal_signed_url', lambda p: uploads.append(p) or p)
+    monkeypatch.setattr(offline_sync, 'schedule_call', lambda delay, func, path: deleted.append((delay, path)))
+
+    def transcribe(url, **kwargs):
+        with wave.open(url, 'rb') as wav:
+            duration = wav.getnframes() / wav.getframerate()
+        return [{'start': 0.0, 'end': duration}], 'en'
+
+    monkeypatch.setattr(offline_sync, 'deepgram_prerecorded', transcribe)
+    monkeypatch.setattr(
+        offline_sync, 'postprocess_words', lambda words, _: _segments(*[(w['start'], w['end']) for w in words])
+    )
+
+    def decode(path):
+        """The .bin files here are WAVs already."""
+        os.rename(path, path.replace('.bin', '.wav'))
+        return path.replace('.bin', '.wav')
+
+    return tmp_path, decode, saved, uploads, deleted
+
+
+def test_sync_writes_each_conversation_once_and_cleans_up(sync_env, firestore):
+    tmp_path, decode, saved, uploads, deleted = sync_env
+    firestore.conversations['c1'] = _conversation('c1', BASE, BASE + 400, segments=[(0, 30)])
+    paths = []
+    for i, offset in enumerate([0, 300, 7200]):
+        path = tmp_path / f'recording_{BASE + offset}.bin'
+        _write_recording(path, [(1, 4), (150, 160)] if i < 2 else [(1, 6)], seconds=180 if i < 2 else 10)
+        paths.append(str(path))
+
+    job = asyncio.run(run_sync_job(SyncJob('u1', len(paths)), paths, decode))
+
+    assert job.status == 'completed'
+    # The 4 segments of the recordings at 0s and 300s are in c1: one write. 7200s is a new conversation.
+    assert firestore.writes == [('c1', 5)]
+    assert job.updated_memories == {'c1'} and job.new_memories == {'new-0'}
+    assert len(uploads) == 5
+    assert sorted(p for _, p in deleted) == sorted(uploads)
+    assert all(delay == offline_sync.SYNC_TEMPORAL_FILE_GRACE for delay, _ in deleted)
+    assert list(tmp_path.iterdir()) == []
+
+    assert saved[0]['status'] == 'running'
+    assert saved[-1]['status'] == 'completed'
+    decode_progress = saved[-1]['stages']['decode']
+    assert (decode_progress['received'], decode_progress['running'], decode_progress['processed']) == (3, 0, 3)
+    assert decode_progress['failed'] == 0
+    assert saved[-1]['stages']['transcribe']['processed'] == 5
+    assert saved[-1]['new_memories'] == ['new-0']
+
+
+def test_a_vad_failure_writes_nothing(sync_env, firestore, monkeypatch):
+    tmp_path, decode, saved, _, _ = sync_env
+    paths = []
+    for offset in [0, 3600]:
+        path = tmp_path / f'recording_{BASE + offset}.bin'
+        _write_recording(path, [(1, 4)], seconds=10)
+        paths.append(str(path))
+    split = offline_sync.split_vad_segments
+
+    def failing_split(path):
+        if str(BASE + 3600) in path:
+            os.remove(path)
+            raise RuntimeError('vad down')
+        return split(path)
+
+    monkeypatch.setattr(offline_sync, 'split_vad_segments', failing_split)
+
+    job = asyncio.run(run_sync_job(SyncJob('u1', len(paths)), paths, decode))
+
+    assert job.failed and job.status_code == 500
+    assert job.error_detail == f'VAD processing failed for 1 file(s): recording_{BASE + 3600}.wav: vad down'
+    assert firestore.writes == [] and firestore.created == []
+    assert list(tmp_path.iterdir()) == []
+    assert saved[-1]['status'] == 'failed'
+
+
+# *********************************
+# ********** BENCHMARK ************
+# *********************************
+
+
+def test_benchmark_previous_groups_of_five_vs_pipeline(tmp_path, firestore, monkeypatch):
+    """
+    40 files of 3 segments each, all belonging to 4 existing conversations, with simulated latencies: decode 20ms,
+    VAD 30ms, STT 150-450ms, Firestore 30ms. The previous flow decoded sequentially, then ran VAD and then
+    transcribe+merge in groups of 5 threads, each group waiting for its slowest member, and rewrote the conversation
+    for every segment.
+    """
+    rng = np.random.default_rng(0)
+    files, per_file = 40, 3
+    firestore.latency = 0.03
+    for c in range(4):
+        firestore.conversations[f'c{c}'] = _conversation(f'c{c}', BASE + c * 36000, BASE + c * 36000 + 400)
+    paths = [f'{tmp_path}/rec_{BASE + (i % 4) * 36000 + (i // 4) * 30}.bin' for i in range(files)]
+    stt_latency = {}
+
+    def decode(path):
+        time.sleep(0.02)
+        return path.replace('.bin', '.wav')
+
+    def vad(path):
+        time.sleep(0.03)
+        base = offline_sync.get_timestamp_from_path(path)
+        segments = [f'{tmp_path}/{base + s * 5}.wav' for s in range(per_file)]
+        stt_latency.update({s: rng.uniform(0.15, 0.45) for s in segments})
+        return segments
+
+    def transcribe(path):
+        time.sleep(stt_latency[path])
+        return SyncTranscript(path, offline_sync.get_timestamp_from_path(path), _segments((0, 4)), 'en')
+
+    # Previous: fixed groups of 5 threads per step, one read-modify-write per segment
+    def previous():
+        def chunk_threads(threads):
+            for i in range(0, len(threads), 5):
+                [t.start() for t in threads[i : i + 5]]
+                [t.join() for t in threads[i : i + 5]]
+
+        wav_paths = [decode(p) for p in paths]
+        segment_paths = []
+        chunk_threads([threading.Thread(target=lambda p=p: segment_paths.extend(vad(p))) for p in wav_paths])
+
+        def process_segment(path):
+            merger = ConversationMerger('u1')
+            merger.add(transcribe(path))
+            merger.flush(SyncJob('u1', 1))
+
+        chunk_threads([threading.Thread(target=process_segment, args=(p,)) for p in segment_paths])
+
+    started = time.perf_counter()
+    previous()
+    previous_s = time.perf_counter() - started
+    previous_writes = len(firestore.writes)
+
+    firestore.writes.clear()
+    monkeypatch.setattr(offline_sync, 'split_vad_segments', vad)
+    monkeypatch.setattr(offline_sync, 'transcribe_segment', transcribe)
+    monkeypatch.setattr(offline_sync.redis_db, 'set_sync_job', lambda *args: None)
+    started = time.perf_counter()
+    job = asyncio.run(run_sync_job(SyncJob('u1', files), paths, decode))
+    pipeline_s = time.perf_counter() - started
+    pipeline_writes = len(firestore.writes)
+
+    print()
+    print(f"previous: {previous_s:5.2f}s, {previous_writes:3d} conversation rewrites")
+    print(f"pipeline: {pipeline_s:5.2f}s, {pipeline_writes:3d} conversation rewrites")
+    assert job.status == 'completed'
+    assert previous_writes == files * per_file
+    assert pipeline_writes == 4
+    assert pipeline_s * 1.5 < previous_s
@@ -48,6 +48,8 @@ for attr in [
     "find_similar_memories",
     "upsert_memory_vector",
     "delete_memory_vector",
+    "upsert_memory_vectors",
+    "delete_memory_vectors",
     "upsert_vector2",
     "update_vector_metadata",
 ]:
@@ -87,8 +89,9 @@ for name in [
         sys.modules[name] = types.ModuleType(name)
 
 utils_apps = sys.modules["utils.apps"]
-for attr in ["get_available_apps", "update_personas_async", "sync_update_persona_prompt"]:
+for attr in ["get_available_apps", "get_enabled_app_set", "update_personas_async", "sync_update_persona_prompt"]:
     setattr(utils_apps, attr, MagicMock())
+utils_apps.APP_WORKS_WITH_MEMORIES = 1
 
 utils_analytics = sys.modules["utils.analytics"]
 utils_analytics.record_usage = MagicMock()
@@ -172,3 +175,18 @@ def test_get_structured_uses_track_usage_and_resets_on_exception():
     assert captured["ctx"].uid == "user-ctx"
     assert captured["ctx"].feature == usage_tracker.Features.CONVERSATION_PROCESSING
     assert usage_tracker.get_current_context() is None
+
+
+def test_failing_app_is_left_out_and_processing_goes_on(monkeypatch):
+    app = MagicMock(id="summary-app")
+    conversation = MagicMock(id="conv-1", suggested_summarization_apps=["summary-app"], apps_results=[])
+    record_usage = MagicMock()
+    monkeypatch.setattr(process_conversation, "get_default_conversation_summarized_apps", lambda: [app], raising=False)
+    monkeypatch.setattr(process_conversation, "get_enabled_app_set", MagicMock())
+    monkeypatch.setattr(process_conversation, "get_app_result", MagicMock(side_effect=RuntimeError("llm timeout")))
+    monkeypatch.setattr(process_conversation, "record_app_usage", record_usage)
+
+    process_conversation._trigger_apps("user-1", conversation, app_id="summary-app")
+
+    assert conversation.apps_results == []
+    record_usage.assert_not_called()
@@ -0,0 +1,408 @@
+"""
+Tests for the public conversations feed (utils/conversations/public_feed.py).
+
+Covers: stable publish-time ordering, the transcript-less batched hydration, snapshot pages vs live pages past
+the snapshot, unpublishing (locally and from another instance over pub/sub), the legacy set backfill, and a
+benchmark of a feed page, the previous sequential full reads vs the snapshot. Run with `-s` to see the report.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock
+
+import pytest
+
+os.environ.setdefault(
+    "ENCRYPTION_SECRET",
+    "omi_ZwB2ZNqB2HHpMK6wStk7sTpavJiPTFg7gXUHnc4tFABPU6pZ2c2DKgehtfgi4RZv",
+)
+
+for _name in ["database._client", "database.users", "utils.other.storage"]:
+    sys.modules[_name] = MagicMock()
+
+import database.cache as cache
+import database.conversations as conversations_db
+import database.redis_db as redis_db
+import utils.conversations.public_feed as public_feed
+from database.redis_pubsub import RedisPubSubManager
+
+# *********************************
+# ********* FAKE REDIS ************
+# *********************************
+
+
+class _FakePipeline:
+    def __init__(self, redis):
+        self._redis = redis
+        self._calls = []
+
+    def __getattr__(self, name):
+        def _queue(*args, **kwargs):
+            self._calls.append((name, args, kwargs))
+            return self
+
+        return _queue
+
+    def execute(self):
+        self._redis.round_trips += 1
+        results = [getattr(self._redis, name)(*args, _counted=False, **kwargs) for name, args, kwargs in self._calls]
+        self._calls = []
+        return results
+
+
+def _command(func):
+    def _run(self, *args, _counted=True, **kwargs):
+        if _counted:
+            self.round_trips += 1
+        return func(self, *args, **kwargs)
+
+    return _run
+
+
+def _b(value) -> bytes:
+    return value if isinstance(value, bytes) else str(value).encode()
+
+
+class _FakeRedis:
+    """The commands the feed uses, bytes in and out like redis-py."""
+
+    def __init__(self):
+        self.data = {}
+        self.round_trips = 0
+
+    def pipeline(self):
+        return _FakePipeline(self)
+
+    @_command
+    def get(self, key):
+        return self.data.get(key)
+
+    @_command
+    def set(self, key, value, ex=None):
+        self.data[key] = _b(value)
+
+    @_command
+    def mget(self, keys):
+        return [self.data.get(key) for key in keys]
+
+    @_command
+    def delete(self, *keys):
+        return sum(1 for key in keys if self.data.pop(key, None) is not None)
+
+    @_command
+    def expire(self, key, ttl):
+        return key in self.data
+
+    @_command
+    def sadd(self, key, *members):
+        self.data.setdefault(key, set()).update(_b(m) for m in members)
+
+    @_command
+    def srem(self, key, member):
+        members = self.data.get(key, set())
+        removed = _b(member) in members
+        members.discard(_b(member))
+        return int(removed)
+
+    @_command
+    def smembers(self, key):
+        return set(self.data.get(key, set()))
+
+    @_command
+    def scard(self, key):
+        return len(self.data.get(key, set()))
+
+    @_command
+    def zadd(self, key, mapping, nx=False):
+        zset = self.data.setdefault(key, {})
+        for member, score in mapping.items():
+            if not (nx and _b(member) in zset):
+                zset[_b(member)] = score
+
+    @_command
+    def zrem(self, key, member):
+        return int(self.data.get(key, {}).pop(_b(member), None) is not None)
+
+    @_command
+    def zcard(self, key):
+        return len(self.data.get(key, {}))
+
+    def _ranked(self, key, reverse):
+        return [
+            m for m, _ in sorted(self.data.get(key, {}).items(), key=lambda item: (item[1], item[0]), reverse=reverse)
+        ]
+
+    @_command
+    def zrange(self, key, start, stop):
+        ranked = self._ranked(key, False)
+        return ranked[start:] if stop == -1 else ranked[start : stop + 1]
+
+    @_command
+    def zrevrange(self, key, start, stop):
+        ranked = self._ranked(key, True)
+        return ranked[start:] if stop == -1 else ranked[start : stop + 1]
+
+    @_command
+    def rpush(self, key, *values):
+        self.data.setdefault(key, []).extend(_b(v) for v in values)
+
+    @_command
+    def lrange(self, key, start, stop):
+        values = self.data.get(key, [])
+        return list(values[start:] if stop == -1 else values[start : stop + 1])
+
+
+# *********************************
+# ******* FAKE FIRESTORE **********
+# *********************************
+
+
+class _Snapshot:
+    def __init__(self, ref, data):
+        self.reference = ref
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class _DocRef:
+    def __init__(self, store, path):
+        self._store = store
+        self.path = path
+
+    def collection(self, name):
+        return _CollectionRef(self._store, f'{self.path}/{name}')
+
+    def get(self, field_paths=None):
+        data = self._store.docs.get(self.path)
+        self._store.round_trip([data] if data else [])
+        return _Snapshot(self, data)
+
+
+class _CollectionRef:
+    def __init__(self, store, path):
+        self._store = store
+        self.path = path
+
+    def document(self, doc_id):
+        return _DocRef(self._store, f'{self.path}/{doc_id}')
+
+    def stream(self):
+        docs = [data for path, data in self._store.docs.items() if path.rsplit('/', 1)[0] == self.path]
+        self._store.round_trip(docs)
+        return [_Snapshot(None, data) for data in docs]
+
+
+class _FakeFirestore:
+    def __init__(self, rtt: float = 0.0):
+        self.rtt = rtt
+        self.docs = {}
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.round_trips = 0
+        self.doc_reads = 0
+        self.bytes_read = 0
+
+    def round_trip(self, payload):
+        with self._lock:
+            self.round_trips += 1
+            self.doc_reads += max(1, len(payload))
+            self.bytes_read += sum(len(json.dumps(data, default=str)) for data in payload)
+        if self.rtt:
+            time.sleep(self.rtt)
+
+    def collection(self, name):
+        return _CollectionRef(self, name)
+
+    def get_all(self, refs, field_paths=None):
+        results = []
+        for ref in refs:
+            data = self.docs.get(ref.path)
+            if data is not None and field_paths is not None:
+                data = {k: v for k, v in data.items() if k in field_paths}
+            results.append(_Snapshot(ref, data))
+        self.round_trip([s.to_dict() for s in results if s.exists])
+        return results
+
+
+BASE_TIME = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+def _conversation(i: int) -> dict:
+    return {
+        'id': f'conv-{i:05d}',
+        'created_at': BASE_TIME + timedelta(minutes=i),
+        'started_at': BASE_TIME + timedelta(minutes=i),
+        'finished_at': BASE_TIME + timedelta(minutes=i, seconds=30),
+        'structured': {'title': f'Public {i}', 'overview': 'Notes from the meetup. ' * 10, 'emoji': '🎤'},
+        'transcript_segments': [{'id': str(k), 'text': 'welcome everyone to the meetup ' * 3} for k in range(60)],
+        'geolocation': {'latitude': 1.0, 'longitude': 2.0, 'address': 'Somewhere'},
+        'visibility': 'public',
+        'discarded': False,
+        'status': 'completed',
+        'data_protection_level': 'standard',
+    }
+
+
+@pytest.fixture
+def env(monkeypatch):
+    redis = _FakeRedis()
+    store = _FakeFirestore()
+    monkeypatch.setattr(redis_db, 'r', redis)
+    monkeypatch.setattr(conversations_db, 'db', store)
+    monkeypatch.setattr(RedisPubSubManager, 'start', lambda self: None)
+    monkeypatch.setattr(cache, 'r', redis)
+    monkeypatch.setattr(cache, '_initialized', False)
+    cache._ensure_initialized()
+    yield redis, store
+    monkeypatch.setattr(cache, '_initialized', False)
+
+
+def _publish(store, count, start=0):
+    for i in range(start, start + count):
+        uid = f'user-{i % 7}'
+        conversation = _conversation(i)
+        store.docs[f'users/{uid}/conversations/{conversation["id"]}'] = conversation
+        public_feed.publish_conversation(uid, conversation['id'], published_at=1_700_000_000 + i)
+
+
+def _ids(conversations):
+    return [c['id'] for c in conversations]
+
+
+class TestFeedPages:
+    def test_newest_first_without_transcript_or_geolocation(self, env):
+        _, store = env
+        _publish(store, 30)
+        page = public_feed.get_public_conversations_page(0, 10)
+        assert _ids(page) == [f'conv-{i:05d}' for i in range(29, 19, -1)]
+        assert all('transcript_segments' not in c and 'geolocation' not in c for c in page)
+        assert page[0]['structured']['title'] == 'Public 29'
+        # Pages are contiguous and stable
+        pages = [_ids(public_feed.get_public_conversations_page(offset, 10)) for offset in range(0, 30, 10)]
+        assert sum(pages, []) == [f'conv-{i:05d}' for i in range(29, -1, -1)]
+        assert public_feed.get_public_conversations_page(30, 10) == []
+
+    def test_pages_past_the_snapshot(self, env, monkeypatch):
+        _, store = env
+        monkeypatch.setattr(public_feed, 'PUBLIC_FEED_SNAPSHOT_SIZE', 20)
+        _publish(store, 50)
+        # A snapshot entry that is no longer public shrinks the snapshot, ranks after it must not shift
+        store.docs['users/user-3/conversations/conv-00045']['visibility'] = 'private'
+        expected = [f'conv-{i:05d}' for i in range(49, -1, -1) if i != 45]
+        assert len(public_feed.get_public_feed_snapshot()) == 19
+        got = []
+        for offset in range(0, 60, 7):
+            got += _ids(public_feed.get_public_conversations_page(offset, 7))
+        assert got[:19] == expected[:19]
+        assert got[19:] == [f'conv-{i:05d}' for i in range(29, -1, -1)][: len(got) - 19]
+
+    def test_snapshot_shared_through_redis(self, env):
+        redis, store = env
+        _publish(store, 10)
+        public_feed.get_public_conversations_page(0, 5)
+        # Another instance: empty memory cache, the snapshot comes from Redis without Firestore reads
+        cache.get_memory_cache().clear()
+        store.reset_stats()
+        assert _ids(public_feed.get_public_conversations_page(0, 3)) == ['conv-00009', 'conv-00008', 'conv-00007']
+        assert store.round_trips == 0
+
+
+class TestUnpublish:
+    def test_unpublish_drops_snapshot(self, env):
+        redis, store = env
+        _publish(store, 10)
+        public_feed.get_public_conversations_page(0, 10)
+        pubsub = cache.get_pubsub_manager()
+        pubsub.redis_client = MagicMock()
+
+        public_feed.unpublish_conversation('conv-00009')
+        assert 'conv-00009' not in _ids(public_feed.get_public_conversations_page(0, 10))
+        channel, message = pubsub.redis_client.publish.call_args[0]
+        assert json.loads(message)['keys'] == [public_feed.PUBLIC_FEED_CACHE_KEY]
+        assert redis_db.get_conversation_uid('conv-00009') == ''
+
+        # Unknown conversations don't touch the snapshot
+        pubsub.redis_client.reset_mock()
+        public_feed.unpublish_conversation('never-public')
+        pubsub.redis_client.publish.assert_not_called()
+
+    def test_invalidation_from_another_instance(self, env):
+        _, store = env
+        _publish(store, 3)
+        public_feed.get_public_conversations_page(0, 3)
+        assert cache.get_memory_cache().get(public_feed.PUBLIC_FEED_CACHE_KEY) is not None
+        message = {'event': 'invalidate', 'keys': [public_feed.PUBLIC_FEED_CACHE_KEY]}
+        cache.get_pubsub_manager()._handle_message(json.dumps(message).encode())
+        assert cache.get_memory_cache().get(public_feed.PUBLIC_FEED_CACHE_KEY) is None
+
+    def test_legacy_set_is_backfilled(self, env):
+        redis, store = env
+        for i in range(5):
+            uid = 'legacy-user'
+            store.docs[f'users/{uid}/conversations/conv-{i:05d}'] = _conversation(i)
+            redis.sadd('public-memories', f'conv-{i:05d}')
+            redis_db.store_conversation_to_uid(f'conv-{i:05d}', uid)
+        redis.sadd('public-memories', 'deleted-one')
+        redis_db.store_conversation_to_uid('deleted-one', 'legacy-user')
+
+        assert _ids(public_feed.get_public_conversations_page(0, 10)) == [f'conv-{i:05d}' for i in range(4, -1, -1)]
+        assert redis_db.get_public_feed_counts() == (5, 5)
+
+
+class TestFeedBenchmark:
+    PUBLIC = 3000
+    PAGE = 100
+    RTT = 0.002
+
+    def _previous_page(self, offset, limit):
+        """Previous endpoint: whole set and uid lookup, then one full get_conversation per conversation."""
+        conversation_ids = redis_db.get_public_conversations()
+        conversation_uids = redis_db.get_conversation_uids(conversation_ids)
+        data = [[uid, conversation_id] for conversation_id, uid in conversation_uids.items() if uid]
+        conversations = []
+        for uid, conversation_id in data[offset : offset + limit]:
+            conversation = conversations_db.get_conversation(uid=uid, conversation_id=conversation_id)
+            if conversation and conversation.get('visibility') == 'public':
+                conversations.append(conversation)
+        return conversations
+
+    def test_report_feed_page(self, env):
+        redis, store = env
+        _publish(store, self.PUBLIC)
+        store.rtt = self.RTT
+
+        results = {}
+        for label, func in [
+            ('previous', self._previous_page),
+            ('cold snapshot', public_feed.get_public_conversations_page),
+            ('warm snapshot', public_feed.get_public_conversations_page),
+            ('past snapshot', lambda offset, limit: public_feed.get_public_conversations_page(offset + 2000, limit)),
+        ]:
+            store.reset_stats()
+            redis.round_trips = 0
+            started = time.perf_counter()
+            page = func(0, self.PAGE)
+            elapsed = time.perf_counter() - started
+            results[label] = (elapsed, store.round_trips, store.bytes_read, redis.round_trips, page)
+
+        print(f'\nfeed page of {self.PAGE} with {self.PUBLIC} public conversations:')
+        for label, (elapsed, round_trips, bytes_read, redis_round_trips, _) in results.items():
+            print(
+                f'  {label:>14}: {elapsed * 1000:7.1f}ms  {round_trips:4d} Firestore round trips  '
+                f'{bytes_read / 1024:7.0f}KB read  {redis_round_trips:3d} Redis round trips'
+            )
+
+        assert len(results['warm snapshot'][4]) == self.PAGE
+        assert _ids(results['past snapshot'][4]) == [f'conv-{i:05d}' for i in range(999, 899, -1)]
+        assert results['warm snapshot'][1] == 0
+        assert results['warm snapshot'][0] * 20 < results['previous'][0]
+        assert results['past snapshot'][1] == 1
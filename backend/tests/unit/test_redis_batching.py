@@ -0,0 +1,378 @@
+"""
+Tests for the batched Redis access layer in database/redis_db.py.
+
+Covers: the request-scoped read-through memo and its invalidation on writes, the webhook status/url MGET helpers
+(sync and async client), the one-pipeline app listing counters, the request middleware, and a benchmark of the
+Redis round trips of a pusher tick before and after. Run with `-s` to see the report.
+"""
+
+import asyncio
+import os
+import sys
+import time
+from unittest.mock import MagicMock
+
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+
+os.environ.setdefault(
+    "ENCRYPTION_SECRET",
+    "omi_ZwB2ZNqB2HHpMK6wStk7sTpavJiPTFg7gXUHnc4tFABPU6pZ2c2DKgehtfgi4RZv",
+)
+
+for _name in ["database._client", "database.users", "database.notifications", "utils.notifications"]:
+    sys.modules[_name] = MagicMock()
+
+import database.redis_db as redis_db
+import utils.webhooks as webhooks
+from database.redis_db import redis_request_memo
+from models.users import WebhookType
+from utils.other.request_memo import RedisRequestMemoMiddleware
+
+# *********************************
+# ********* FAKE REDIS ************
+# *********************************
+
+
+def _b(value) -> bytes:
+    return value if isinstance(value, bytes) else str(value).encode()
+
+
+class _FakePipeline:
+    def __init__(self, redis):
+        self._redis = redis
+        self._calls = []
+
+    def __getattr__(self, name):
+        def _queue(*args, **kwargs):
+            self._calls.append((name, args, kwargs))
+            return self
+
+        return _queue
+
+    def execute(self):
+        self._redis.count()
+        results = [getattr(self._redis, name)(*args, _counted=False, **kwargs) for name, args, kwargs in self._calls]
+        self._calls = []
+        return results
+
+
+def _command(func):
+    def _run(self, *args, _counted=True, **kwargs):
+        if _counted:
+            self.count()
+        return func(self, *args, **kwargs)
+
+    return _run
+
+
+class _FakeRedis:
+    """The commands used here, bytes in and out like redis-py, counting round trips (a pipeline is one)."""
+
+    def __init__(self, latency: float = 0.0):
+        self.data = {}
+        self.round_trips = 0
+        self.latency = latency
+
+    def count(self):
+        self.round_trips += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def pipeline(self, transaction=True):
+        return _FakePipeline(self)
+
+    @_command
+    def get(self, key):
+        return self.data.get(key)
+
+    @_command
+    def set(self, key, value, ex=None):
+        self.data[key] = _b(value)
+
+    @_command
+    def exists(self, key):
+        return int(key in self.data)
+
+    @_command
+    def mget(self, keys):
+        return [self.data.get(key) for key in keys]
+
+    @_command
+    def sadd(self, key, *values):
+        self.data.setdefault(key, set()).update(_b(v) for v in values)
+
+    @_command
+    def srem(self, key, *values):
+        self.data.get(key, set()).difference_update(_b(v) for v in values)
+
+    @_command
+    def smembers(self, key):
+        return set(self.data.get(key, set()))
+
+
+class _FakeAsyncRedis:
+    def __init__(self, redis: _FakeRedis):
+        self.redis = redis
+
+    async def mget(self, keys):
+        if self.redis.latency:
+            await asyncio.sleep(self.redis.latency)
+        return self.redis.mget(keys)
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    redis = _FakeRedis()
+    monkeypatch.setattr(redis_db, 'r', redis)
+    monkeypatch.setattr(redis_db, 'get_async_redis', lambda: _FakeAsyncRedis(redis))
+    return redis
+
+
+def _set_webhook(uid: str, wtype: WebhookType, url: str, enabled: bool = True):
+    redis_db.set_user_webhook_db(uid, wtype, url)
+    if enabled:
+        redis_db.enable_user_webhook_db(uid, wtype)
+    else:
+        redis_db.disable_user_webhook_db(uid, wtype)
+
+
+# *********************************
+# ************* MEMO **************
+# *********************************
+
+
+def test_memo_reads_once_per_scope(fake_redis):
+    redis_db.enable_app('u1', 'app-1')
+    fake_redis.round_trips = 0
+
+    redis_db.get_enabled_apps('u1')
+    redis_db.get_enabled_apps('u1')
+    assert fake_redis.round_trips == 2
+
+    with redis_request_memo():
+        assert redis_db.get_enabled_apps('u1') == ['app-1']
+        assert redis_db.get_enabled_apps('u1') == ['app-1']
+        redis_db.get_enabled_apps('u2')
+        # Nested scopes share the outer memo
+        with redis_request_memo():
+            redis_db.get_enabled_apps('u1')
+    assert fake_redis.round_trips == 4
+
+    with redis_request_memo():
+        redis_db.get_enabled_apps('u1')
+    assert fake_redis.round_trips == 5
+
+
+def test_writes_clear_the_memo(fake_redis):
+    with redis_request_memo():
+        assert redis_db.get_enabled_apps('u1') == []
+        redis_db.enable_app('u1', 'app-1')
+        assert redis_db.get_enabled_apps('u1') == ['app-1']
+
+        assert not redis_db.has_credit_limit_notification_been_sent('u1')
+        redis_db.set_credit_limit_notification_sent('u1')
+        assert redis_db.has_credit_limit_notification_been_sent('u1')
+
+        assert redis_db.get_user_webhook('u1', WebhookType.day_summary) == (None, '')
+        _set_webhook('u1', WebhookType.day_summary, 'https://example.com/day')
+        assert redis_db.get_user_webhook('u1', WebhookType.day_summary) == (True, 'https://example.com/day')
+
+
+def test_memo_is_per_task(fake_redis):
+    async def reader(results):
+        with redis_request_memo():
+            results.append(redis_db.get_enabled_apps('u1'))
+            await asyncio.sleep(0.01)
+            results.append(redis_db.get_enabled_apps('u1'))
+
+    async def run():
+        first, second = [], []
+        task = asyncio.create_task(reader(first))
+        await asyncio.sleep(0)
+        redis_db.enable_app('u1', 'app-1')
+        await asyncio.gather(task, reader(second))
+        return first, second
+
+    first, second = asyncio.run(run())
+
+    # The first task's memo isn't cleared by a write outside of its scope, the second task reads fresh
+    assert first == [[], []]
+    assert second == [['app-1'], ['app-1']]
+
+
+# *********************************
+# *********** WEBHOOKS ************
+# *********************************
+
+
+def test_get_user_webhook_is_one_mget(fake_redis):
+    _set_webhook('u1', WebhookType.realtime_transcript, 'https://example.com/rt')
+    _set_webhook('u1', WebhookType.audio_bytes, 'https://example.com/audio,10', enabled=False)
+    fake_redis.round_trips = 0
+
+    assert redis_db.get_user_webhook('u1', WebhookType.realtime_transcript) == (True, 'https://example.com/rt')
+    assert redis_db.get_user_webhook('u1', WebhookType.audio_bytes) == (False, 'https://example.com/audio,10')
+    assert redis_db.get_user_webhook('u1', WebhookType.memory_created) == (None, '')
+    assert fake_redis.round_trips == 3
+
+    # Same answers as the single-key helpers
+    for wtype in [WebhookType.realtime_transcript, WebhookType.audio_bytes, WebhookType.memory_created]:
+        assert redis_db.get_user_webhook('u1', wtype) == (
+            redis_db.user_webhook_status_db('u1', wtype),
+            redis_db.get_user_webhook_db('u1', wtype),
+        )
+
+
+def test_get_user_webhooks_fills_the_memo(fake_redis):
+    _set_webhook('u1', WebhookType.day_summary, 'https://example.com/day')
+    wtypes = [WebhookType.audio_bytes, WebhookType.memory_created, WebhookType.realtime_transcript]
+    fake_redis.round_trips = 0
+
+    with redis_request_memo():
+        webhooks_by_type = redis_db.get_user_webhooks('u1', wtypes + [WebhookType.day_summary])
+        assert webhooks_by_type[WebhookType.day_summary] == (True, 'https://example.com/day')
+        assert webhooks_by_type[WebhookType.audio_bytes] == (None, '')
+        assert redis_db.get_user_webhook_db('u1', WebhookType.day_summary) == 'https://example.com/day'
+        assert redis_db.user_webhook_status_db('u1', WebhookType.day_summary) is True
+        assert redis_db.get_user_webhooks('u1', wtypes) == {wtype: (None, '') for wtype in wtypes}
+    assert fake_redis.round_trips == 1
+
+
+def test_async_webhook_lookup(fake_redis):
+    _set_webhook('u1', WebhookType.realtime_transcript, 'https://example.com/rt')
+    fake_redis.round_trips = 0
+
+    async def run():
+        with redis_request_memo():
+            first = await redis_db.aget_user_webhook('u1', WebhookType.realtime_transcript)
+            second = await redis_db.aget_user_webhook('u1', WebhookType.realtime_transcript)
+            sync = redis_db.get_user_webhook('u1', WebhookType.realtime_transcript)
+        return first, second, sync
+
+    assert asyncio.run(run()) == ((True, 'https://example.com/rt'),) * 3
+    assert fake_redis.round_trips == 1
+
+
+def test_async_client_per_event_loop():
+    async def get_twice():
+        return redis_db.get_async_redis(), redis_db.get_async_redis()
+
+    first, second = asyncio.run(get_twice())
+    other, _ = asyncio.run(get_twice())
+    assert first is second
+    assert other is not first
+
+
+# *********************************
+# ************* APPS **************
+# *********************************
+
+
+def test_apps_listing_counters_in_one_pipeline(fake_redis):
+    app_ids = ['a', 'b', 'c']
+    redis_db.enable_app('u1', 'b')
+    fake_redis.set('plugins:a:installs', 12)
+    fake_redis.set('plugins:c:reviews', str({'u1': {'score': 4, 'review': 'ok'}}))
+    fake_redis.round_trips = 0
+
+    enabled, installs, reviews = redis_db.get_apps_listing_counters('u1', app_ids)
+
+    assert fake_redis.round_trips == 1
+    assert enabled == {'b'} == set(redis_db.get_enabled_apps('u1'))
+    assert installs == redis_db.get_apps_installs_count(app_ids) == {'a': 12, 'b': 0, 'c': 0}
+    assert reviews == redis_db.get_apps_reviews(app_ids)
+    assert reviews['c']['u1']['score'] == 4
+
+    fake_redis.round_trips = 0
+    assert redis_db.get_apps_listing_counters(None, app_ids, include_reviews=False) == (set(), installs, {})
+    assert redis_db.get_apps_listing_counters(None, []) == (set(), {}, {})
+    assert fake_redis.round_trips == 1
+
+    with redis_request_memo():
+        redis_db.get_apps_listing_counters('u1', app_ids)
+        assert redis_db.get_enabled_apps('u1') == ['b']
+    assert fake_redis.round_trips == 2
+
+
+# *********************************
+# ********** MIDDLEWARE ***********
+# *********************************
+
+
+def test_middleware_scopes_the_memo_to_a_request(fake_redis):
+    app = FastAPI()
+    app.add_middleware(RedisRequestMemoMiddleware)
+
+    def enabled_apps_dependency(uid: str = 'u1'):
+        return redis_db.get_enabled_apps(uid)
+
+    @app.get('/apps')
+    def apps(enabled: list = Depends(enabled_apps_dependency)):
+        return {'before': enabled, 'again': redis_db.get_enabled_apps('u1')}
+
+    client = TestClient(app)
+    assert client.get('/apps').json() == {'before': [], 'again': []}
+    assert fake_redis.round_trips == 1
+
+    redis_db.enable_app('u1', 'app-1')
+    assert client.get('/apps').json() == {'before': ['app-1'], 'again': ['app-1']}
+    assert fake_redis.round_trips == 3
+
+
+# *********************************
+# ********** BENCHMARK ************
+# *********************************
+
+
+def test_benchmark_pusher_tick_round_trips(fake_redis, monkeypatch):
+    """
+    One pusher tick of a user with the realtime transcript and audio bytes webhooks set: 4 conversations in the
+    transcript flush, 6 audio bytes webhook items, Redis 1ms away.
+    """
+    conversations, audio_items, ticks = 4, 6, 20
+    _set_webhook('u1', WebhookType.realtime_transcript, 'https://example.com/rt')
+    _set_webhook('u1', WebhookType.audio_bytes, 'https://example.com/audio,5')
+    fake_redis.latency = 0.001
+
+    class _Dispatcher:
+        posts = 0
+
+        async def post(self, url, **kwargs):
+            _Dispatcher.posts += 1
+            return None
+
+    monkeypatch.setattr(webhooks, 'get_webhook_dispatcher', lambda: _Dispatcher())
+
+    async def previous_tick():
+        """The status and the url read one after the other, on the event loop, for every call."""
+        for _ in range(conversations + audio_items):
+            if redis_db.user_webhook_status_db('u1', WebhookType.realtime_transcript):
+                redis_db.get_user_webhook_db('u1', WebhookType.realtime_transcript)
+
+    async def tick():
+        with redis_request_memo():
+            for _ in range(conversations):
+                await webhooks.realtime_transcript_webhook('u1', [{'text': 'hi'}])
+        with redis_request_memo():
+            for _ in range(audio_items):
+                await webhooks.send_audio_bytes_developer_webhook('u1', 16000, bytearray(b'\x00\x00'))
+
+    def measure(run):
+        fake_redis.round_trips = 0
+        started = time.perf_counter()
+        for _ in range(ticks):
+            asyncio.run(run())
+        return fake_redis.round_trips / ticks, (time.perf_counter() - started) / ticks * 1000
+
+    previous_trips, previous_ms = measure(previous_tick)
+    trips, ms = measure(tick)
+
+    print(
+        f"\nprevious: {previous_trips:.0f} round trips per tick, {previous_ms:.1f}ms"
+        f"\nbatched + memo: {trips:.0f} round trips per tick, {ms:.1f}ms"
+    )
+    assert previous_trips == 2 * (conversations + audio_items)
+    assert trips == 2
+    assert _Dispatcher.posts == ticks * (conversations + audio_items)
@@ -0,0 +1,350 @@
+"""
+Tests for batched speaker embedding inference: the diarizer's /v2/embedding/batch endpoint and the
+client-side micro-batcher that coalesces requests of concurrent sessions.
+
+The embedding model is a numpy stand-in with the same batch interface as the pyannote adapter, so this runs on
+CPU without model weights.
+"""
+
+import asyncio
+import io
+import os
+import sys
+import threading
+import time
+import wave
+
+import numpy as np
+import pytest
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import Response
+from fastapi.testclient import TestClient
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.join(BACKEND_DIR, "diarizer"))
+
+import embedding_batch  # noqa: E402
+from embedding_batch import BatchEmbedder, decode_embeddings, encode_embeddings, join_length_prefixed  # noqa: E402
+import utils.stt.speaker_embedding as speaker_embedding  # noqa: E402
+
+FRAME = 160
+DIM = 32
+FORWARD_LATENCY = 0.01
+
+
+class StubModel:
+    """Frame-level random projection followed by weighted statistics pooling, like wespeaker's head."""
+
+    def __init__(self, latency: float = 0.0):
+        self.projection = np.random.default_rng(0).standard_normal((FRAME, DIM // 2)).astype(np.float32)
+        self.latency = latency
+        self.calls = 0
+        self.batch_sizes = []
+
+    def __call__(self, waveforms: np.ndarray, weights: np.ndarray) -> np.ndarray:
+        self.calls += 1
+        self.batch_sizes.append(len(waveforms))
+        if self.latency:
+            time.sleep(self.latency)
+        frames = waveforms.shape[1] // FRAME
+        features = waveforms[:, : frames * FRAME].reshape(len(waveforms), frames, FRAME) @ self.projection
+        frame_weights = weights[:, : frames * FRAME].reshape(len(waveforms), frames, FRAME).mean(axis=2)
+        frame_weights = frame_weights[:, :, None]
+        total = frame_weights.sum(axis=1)
+        mean = (features * frame_weights).sum(axis=1) / total
+        std = np.sqrt((((features - mean[:, None, :]) ** 2) * frame_weights).sum(axis=1) / total)
+        return np.concatenate([mean, std], axis=1)
+
+
+def _wav(samples: np.ndarray, sample_rate: int = 16000) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(samples.astype("<i2").tobytes())
+    return buffer.getvalue()
+
+
+def _clip(seed: int, seconds: float) -> np.ndarray:
+    return (np.random.default_rng(seed).standard_normal(int(16000 * seconds)) * 3000).astype(np.int16)
+
+
+def _make_app(model: StubModel) -> FastAPI:
+    """Mirrors the diarizer's routes, with the stub model in place of pyannote."""
+    embedder = BatchEmbedder(model)
+    app = FastAPI()
+    app.state.single_calls = 0
+    app.state.batch_calls = 0
+
+    @app.post("/v2/embedding/batch")
+    async def embedding_v2_batch(request: Request, sample_rate: int = 16000):
+        app.state.batch_calls += 1
+        try:
+            blobs = await embedding_batch.read_batch_blobs(request)
+            payload = embedder.embed_blobs(blobs, sample_rate)
+        except embedding_batch.BadBlobsError as e:
+            raise HTTPException(status_code=400, detail=e.detail())
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return Response(content=payload, media_type="application/octet-stream")
+
+    @app.post("/v2/embedding")
+    async def embedding_v2(request: Request):
+        app.state.single_calls += 1
+        form = await request.form()
+        waveform = embedding_batch.decode_audio(await form["file"].read())
+        return embedder.embed([waveform])[0].tolist()
+
+    return app
+
+
+@pytest.fixture
+def hosted_api(monkeypatch):
+    """Points the speaker embedding client at a TestClient of the mirrored diarizer."""
+    model = StubModel(latency=FORWARD_LATENCY)
+    app = _make_app(model)
+    client = TestClient(app)
+    lock = threading.Lock()
+
+    def fake_post(url, timeout=None, **kwargs):
+        with lock:
+            return client.post(url.replace("http://diarizer", ""), **kwargs)
+
+    monkeypatch.setenv("HOSTED_SPEAKER_EMBEDDING_API_URL", "http://diarizer")
+    monkeypatch.setattr(speaker_embedding.requests, "post", fake_post)
+    monkeypatch.setattr(speaker_embedding, "_batch_endpoint_missing", False)
+    return app, model
+
+
+def test_batch_matches_single_inference():
+    model = StubModel()
+    embedder = BatchEmbedder(model)
+    waveforms = [_clip(i, seconds).astype(np.float32) / 32768.0 for i, seconds in enumerate([0.5, 1.3, 3.0, 2.2])]
+
+    batched = embedder.embed(waveforms)
+    singles = np.concatenate([embedder.embed([waveform]) for waveform in waveforms])
+
+    assert model.batch_sizes[0] == len(waveforms)
+    np.testing.assert_allclose(batched, singles, rtol=1e-4, atol=1e-5)
+
+
+def test_batch_rejects_empty_and_oversized():
+    embedder = BatchEmbedder(StubModel(), max_batch_size=2)
+    with pytest.raises(ValueError):
+        embedder.embed([])
+    with pytest.raises(ValueError):
+        embedder.embed([np.ones(16000, dtype=np.float32)] * 3)
+    with pytest.raises(ValueError):
+        embedder.embed([np.ones(16000, dtype=np.float32), np.zeros(0, dtype=np.float32)])
+
+
+def test_decode_audio_wav_raw_and_resample():
+    samples = _clip(1, 1.0)
+    from_wav = embedding_batch.decode_audio(_wav(samples))
+    from_raw = embedding_batch.decode_audio(samples.astype("<i2").tobytes())
+    np.testing.assert_array_equal(from_wav, from_raw)
+    assert from_wav.dtype == np.float32
+
+    resampled = embedding_batch.decode_audio(_wav(_clip(2, 1.0)[:8000], sample_rate=8000))
+    assert len(resampled) == 16000
+
+
+def test_length_prefixed_round_trip():
+    blobs = [b"", b"a", b"abc" * 100]
+    assert embedding_batch.split_length_prefixed(join_length_prefixed(blobs)) == blobs
+    with pytest.raises(ValueError):
+        embedding_batch.split_length_prefixed(join_length_prefixed(blobs)[:-1])
+
+
+def test_payload_round_trip():
+    embeddings = np.random.default_rng(3).standard_normal((5, DIM)).astype(np.float32)
+    payload = encode_embeddings(embeddings)
+    assert len(payload) == 8 + 5 * DIM * 4
+    np.testing.assert_array_equal(decode_embeddings(payload), embeddings)
+
+
+def test_endpoint_multipart_and_length_prefixed():
+    model = StubModel()
+    client = TestClient(_make_app(model))
+    clips = [_wav(_clip(i, 1.0 + i / 2)) for i in range(3)]
+
+    multipart = client.post(
+        "/v2/embedding/batch", files=[("files", (f"{i}.wav", clip, "audio/wav")) for i, clip in enumerate(clips)]
+    )
+    prefixed = client.post(
+        "/v2/embedding/batch",
+        content=join_length_prefixed(clips),
+        headers={"Content-Type": "application/octet-stream"},
+    )
+
+    assert multipart.status_code == prefixed.status_code == 200
+    assert multipart.headers["content-type"] == "application/octet-stream"
+    assert decode_embeddings(multipart.content).shape == (3, DIM)
+    np.testing.assert_array_equal(decode_embeddings(multipart.content), decode_embeddings(prefixed.content))
+    assert model.batch_sizes == [3, 3]
+
+
+def test_endpoint_rejects_bad_body():
+    client = TestClient(_make_app(StubModel()))
+    response = client.post(
+        "/v2/embedding/batch", content=b"\xff\xff\xff\xff", headers={"Content-Type": "application/octet-stream"}
+    )
+    assert response.status_code == 400
+
+
+def test_endpoint_lists_the_bad_blobs():
+    model = StubModel()
+    client = TestClient(_make_app(model))
+    clips = [_wav(_clip(0, 1.0)), b"RIFF not a wav", _wav(_clip(1, 1.0)), b""]
+    response = client.post(
+        "/v2/embedding/batch", content=join_length_prefixed(clips), headers={"Content-Type": "application/octet-stream"}
+    )
+    assert response.status_code == 400
+    assert response.json()["detail"]["bad_blobs"] == [1, 3]
+    assert model.calls == 0
+
+
+def test_client_batch_matches_single_requests(hosted_api):
+    clips = [_wav(_clip(i, 1.0 + i / 3)) for i in range(4)]
+
+    batched = speaker_embedding.extract_embeddings_from_bytes_batch(clips)
+    singles = [speaker_embedding.extract_embedding_from_bytes(clip) for clip in clips]
+
+    assert [embedding.shape for embedding in batched] == [(1, DIM)] * 4
+    for a, b in zip(batched, singles):
+        assert speaker_embedding.compare_embeddings(a, b) < 1e-4
+
+
+def test_client_falls_back_without_batch_endpoint(monkeypatch):
+    app = _make_app(StubModel())
+    app.router.routes = [route for route in app.router.routes if getattr(route, "path", "") != "/v2/embedding/batch"]
+    client = TestClient(app)
+    monkeypatch.setenv("HOSTED_SPEAKER_EMBEDDING_API_URL", "http://diarizer")
+    monkeypatch.setattr(
+        speaker_embedding.requests,
+        "post",
+        lambda url, timeout=None, **kw: client.post(url[len("http://diarizer") :], **kw),
+    )
+    monkeypatch.setattr(speaker_embedding, "_batch_endpoint_missing", False)
+
+    embeddings = speaker_embedding.extract_embeddings_from_bytes_batch([_wav(_clip(0, 1.0)), _wav(_clip(1, 1.0))])
+
+    assert len(embeddings) == 2
+    assert app.state.single_calls == 2
+    assert speaker_embedding._batch_endpoint_missing
+
+
+def test_batcher_coalesces_concurrent_sessions(hosted_api):
+    app, model = hosted_api
+    clips = [_wav(_clip(i, 1.0)) for i in range(10)]
+
+    async def run():
+        batcher = speaker_embedding.EmbeddingBatcher(window=0.05, max_batch_size=4)
+        results = await asyncio.gather(*[batcher.embed(clip) for clip in clips])
+        return batcher, results
+
+    batcher, results = asyncio.run(run())
+
+    assert batcher.items == 10
+    assert batcher.batches == app.state.batch_calls == 3
+    assert sorted(model.batch_sizes) == [2, 4, 4]
+    expected = speaker_embedding.extract_embeddings_from_bytes_batch(clips)
+    for result, embedding in zip(results, expected):
+        np.testing.assert_allclose(result, embedding, rtol=1e-5, atol=1e-6)
+
+
+def test_batcher_propagates_errors(monkeypatch):
+    def failing(audio_data):
+        raise RuntimeError("diarizer down")
+
+    monkeypatch.setattr(speaker_embedding, "extract_embeddings_from_bytes_batch", failing)
+
+    async def run():
+        batcher = speaker_embedding.EmbeddingBatcher(window=0.01)
+        return await asyncio.gather(batcher.embed(b"a"), batcher.embed(b"b"), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+def test_batcher_fails_only_the_bad_clips(hosted_api):
+    app, model = hosted_api
+    clips = [_wav(_clip(i, 1.0)) for i in range(4)]
+    clips[2] = b"RIFF not a wav"
+
+    async def run():
+        batcher = speaker_embedding.EmbeddingBatcher(window=0.01)
+        results = await asyncio.gather(*[batcher.embed(clip) for clip in clips], return_exceptions=True)
+        return batcher, results
+
+    batcher, results = asyncio.run(run())
+
+    assert isinstance(results[2], speaker_embedding.BadClipsError)
+    assert app.state.batch_calls == batcher.batches == 2
+    assert model.batch_sizes == [3]
+    good = [clip for i, clip in enumerate(clips) if i != 2]
+    expected = speaker_embedding.extract_embeddings_from_bytes_batch(good)
+    for result, embedding in zip([r for i, r in enumerate(results) if i != 2], expected):
+        np.testing.assert_allclose(result, embedding, rtol=1e-5, atol=1e-6)
+
+
+def test_batcher_keeps_its_send_tasks(monkeypatch):
+    monkeypatch.setattr(
+        speaker_embedding, "extract_embeddings_from_bytes_batch", lambda data: [np.ones((1, DIM))] * len(data)
+    )
+
+    async def run():
+        batcher = speaker_embedding.EmbeddingBatcher(window=0.01, max_batch_size=1)
+        pending = asyncio.ensure_future(batcher.embed(b"a"))
+        await asyncio.sleep(0)
+        sending = len(batcher._sending)
+        await pending
+        await asyncio.sleep(0)
+        return sending, len(batcher._sending)
+
+    assert asyncio.run(run()) == (1, 0)
+
+
+def test_batcher_is_shared_per_event_loop():
+    async def get_twice():
+        return speaker_embedding.get_embedding_batcher(), speaker_embedding.get_embedding_batcher()
+
+    first, second = asyncio.run(get_twice())
+    other, _ = asyncio.run(get_twice())
+    assert first is second
+    assert other is not first
+
+
+def test_benchmark_single_vs_batched(hosted_api):
+    """64 sessions asking for an embedding at about the same time, one HTTP call each vs micro-batched."""
+    app, model = hosted_api
+    clips = [_wav(_clip(i, 1.5)) for i in range(64)]
+
+    async def single():
+        return await asyncio.gather(
+            *[asyncio.to_thread(speaker_embedding.extract_embedding_from_bytes, clip) for clip in clips]
+        )
+
+    async def batched():
+        batcher = speaker_embedding.EmbeddingBatcher(window=0.02, max_batch_size=32)
+        return await asyncio.gather(*[batcher.embed(clip) for clip in clips])
+
+    start = time.perf_counter()
+    asyncio.run(single())
+    single_time = time.perf_counter() - start
+    single_calls, single_forwards = app.state.single_calls, model.calls
+
+    start = time.perf_counter()
+    asyncio.run(batched())
+    batched_time = time.perf_counter() - start
+    batched_calls, batched_forwards = app.state.batch_calls, model.calls - single_forwards
+
+    print(
+        f"\nsingle: {single_calls} calls, {single_forwards} forwards, {single_time:.3f}s"
+        f"\nbatched: {batched_calls} calls, {batched_forwards} forwards, {batched_time:.3f}s"
+    )
+    assert single_calls == 64
+    assert batched_calls == batched_forwards == 2
+    assert batched_time < single_time
@@ -0,0 +1,311 @@
+"""
+Tests for the per-user speaker gallery (utils/stt/speaker_gallery.py).
+
+Covers: matrix matching against the per-pair cosine distances it replaces, top-k with margins, in-place add,
+replace and remove, and the Redis-versioned in-memory cache shared across sessions. Ends with a matching
+throughput benchmark for galleries of 10 to 10k people, run with `-s` to see the report.
+"""
+
+import asyncio
+import os
+import sys
+import time
+from unittest.mock import MagicMock
+
+import numpy as np
+import pytest
+
+os.environ.setdefault(
+    "ENCRYPTION_SECRET",
+    "omi_ZwB2ZNqB2HHpMK6wStk7sTpavJiPTFg7gXUHnc4tFABPU6pZ2c2DKgehtfgi4RZv",
+)
+
+for _name in ["database._client", "database.users", "utils.other.storage", "utils.speaker_sample_migration"]:
+    sys.modules[_name] = MagicMock()
+
+import database.cache as cache
+import utils.stt.speaker_gallery as speaker_gallery
+from database.redis_pubsub import RedisPubSubManager
+from utils.stt.speaker_embedding import compare_embeddings, find_best_match
+from utils.stt.speaker_gallery import SpeakerGallery
+
+DIM = 256
+
+
+def _embeddings(count: int, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).standard_normal((count, DIM)).astype(np.float32)
+
+
+def _people(embeddings: np.ndarray, version: int = 3) -> list:
+    return [
+        {'id': f'p{i}', 'name': f'Person {i}', 'speech_samples_version': version, 'speaker_embedding': e.tolist()}
+        for i, e in enumerate(embeddings)
+    ]
+
+
+@pytest.fixture
+def versions(monkeypatch):
+    """Per-uid gallery versions, in place of Redis."""
+    store = {}
+
+    def bump(uid):
+        store[uid] = store.get(uid, 0) + 1
+        return store[uid]
+
+    monkeypatch.setattr(speaker_gallery.redis_db, 'get_speaker_gallery_version', lambda uid: store.get(uid, 0))
+    monkeypatch.setattr(speaker_gallery.redis_db, 'bump_speaker_gallery_version', bump)
+    return store
+
+
+@pytest.fixture
+def memory_cache(monkeypatch):
+    monkeypatch.setattr(RedisPubSubManager, 'start', lambda self: None)
+    monkeypatch.setattr(cache, 'r', MagicMock())
+    monkeypatch.setattr(cache, '_initialized', False)
+    cache._ensure_initialized()
+    return cache.get_memory_cache()
+
+
+@pytest.fixture
+def people_db(monkeypatch):
+    people = {}
+    get_people = MagicMock(side_effect=lambda uid: [dict(p) for p in people.get(uid, [])])
+    monkeypatch.setattr(speaker_gallery.users_db, 'get_people', get_people)
+
+    async def no_migration(uid, person):
+        return person
+
+    monkeypatch.setattr(speaker_gallery, 'maybe_migrate_person_samples', no_migration)
+    return people, get_people
+
+
+# *********************************
+# *********** MATCHING ************
+# *********************************
+
+
+def test_match_agrees_with_pairwise_cosine():
+    embeddings = _embeddings(50)
+    gallery = SpeakerGallery.from_people(_people(embeddings))
+    query = embeddings[17] + 0.3 * _embeddings(1, seed=1)[0]
+
+    matches = gallery.match(query, k=5)
+
+    distances = [compare_embeddings(query.reshape(1, -1), e.reshape(1, -1)) for e in embeddings]
+    expected = np.argsort(distances)[:5]
+    assert [m.person_id for m in matches] == [f'p{i}' for i in expected]
+    np.testing.assert_allclose([m.distance for m in matches], np.sort(distances)[:5], atol=1e-5)
+    assert matches[0].person_id == 'p17'
+    assert matches[0].name == 'Person 17'
+
+
+def test_margins_are_gaps_to_the_next_candidate():
+    gallery = SpeakerGallery.from_people(_people(_embeddings(20)))
+    query = _embeddings(1, seed=2)[0]
+
+    top3 = gallery.match(query, k=3)
+    top4 = gallery.match(query, k=4)
+
+    for i in range(3):
+        assert top3[i].margin == pytest.approx(top4[i + 1].distance - top4[i].distance, abs=1e-6)
+        assert top3[i].margin >= 0
+    single = SpeakerGallery.from_people(_people(_embeddings(1)))
+    assert single.match(query, k=3)[0].margin == float('inf')
+
+
+def test_best_match_threshold():
+    embeddings = _embeddings(10)
+    gallery = SpeakerGallery.from_people(_people(embeddings))
+
+    assert gallery.best_match(embeddings[3]).person_id == 'p3'
+    assert gallery.best_match(_embeddings(1, seed=9)[0]) is None
+    assert SpeakerGallery().match(embeddings[0]) == []
+    assert SpeakerGallery().best_match(embeddings[0]) is None
+
+
+def test_find_best_match_single_cdist():
+    embeddings = _embeddings(30)
+    candidates = [e.reshape(1, -1) for e in embeddings]
+    assert find_best_match(embeddings[4].reshape(1, -1), candidates)[0] == 4
+    assert find_best_match(_embeddings(1, seed=5), candidates) is None
+    assert find_best_match(embeddings[0].reshape(1, -1), []) is None
+
+
+def test_from_people_skips_old_versions_and_bad_embeddings():
+    people = _people(_embeddings(3))
+    people[0]['speech_samples_version'] = 2
+    people[1]['speaker_embedding'] = [0.0] * DIM
+    people.append({'id': 'short', 'name': 'x', 'speech_samples_version': 3, 'speaker_embedding': [1.0, 2.0]})
+    people.append({'id': 'none', 'name': 'y', 'speech_samples_version': 3})
+
+    gallery = SpeakerGallery.from_people(people)
+
+    assert gallery.ids == ['p2']
+
+
+# *********************************
+# ******* INCREMENTAL UPDATES *****
+# *********************************
+
+
+def test_add_replace_remove_in_place():
+    embeddings = _embeddings(40)
+    gallery = SpeakerGallery()
+    for i, e in enumerate(embeddings):
+        gallery.add(f'p{i}', f'Person {i}', e)
+    assert len(gallery) == 40
+    assert gallery.matrix.shape == (40, DIM)
+    np.testing.assert_allclose(np.linalg.norm(gallery.matrix, axis=1), 1.0, rtol=1e-5)
+
+    # Replace: same row, new embedding and name
+    gallery.add('p5', 'Renamed', embeddings[6])
+    assert len(gallery) == 40
+    assert gallery.match(embeddings[6], k=2)[0].distance == pytest.approx(0.0, abs=1e-5)
+    assert {m.name for m in gallery.match(embeddings[6], k=2)} == {'Renamed', 'Person 6'}
+
+    # Remove moves the last row into the hole
+    assert gallery.remove('p0')
+    assert not gallery.remove('p0')
+    assert 'p0' not in gallery
+    assert len(gallery) == 39
+    for i in range(1, 40):
+        # p5 and p6 share an embedding now
+        if i not in (5, 6):
+            assert gallery.best_match(embeddings[i]).person_id == f'p{i}'
+    assert gallery.rename('p39', 'Last')
+    assert gallery.best_match(embeddings[39]).name == 'Last'
+    assert not gallery.rename('p0', 'Gone')
+
+    with pytest.raises(ValueError):
+        gallery.add('x', 'x', [1.0, 2.0])
+    with pytest.raises(ValueError):
+        gallery.match([1.0, 2.0])
+
+
+def test_sizeof_counts_the_matrix():
+    gallery = SpeakerGallery.from_people(_people(_embeddings(100)))
+    assert sys.getsizeof(gallery) >= 100 * DIM * 4
+
+
+# *********************************
+# ************ CACHE **************
+# *********************************
+
+
+def test_sessions_share_the_cached_gallery(versions, memory_cache, people_db):
+    people, get_people = people_db
+    people['u1'] = _people(_embeddings(5))
+
+    first = asyncio.run(speaker_gallery.load_speaker_gallery('u1'))
+    second = asyncio.run(speaker_gallery.load_speaker_gallery('u1'))
+
+    assert first is second
+    assert len(first) == 5
+    assert get_people.call_count == 1
+
+
+def test_version_bump_elsewhere_rebuilds(versions, memory_cache, people_db):
+    people, get_people = people_db
+    people['u1'] = _people(_embeddings(5))
+    first = asyncio.run(speaker_gallery.load_speaker_gallery('u1'))
+
+    # Another instance changed a person
+    people['u1'] = people['u1'][:3]
+    versions['u1'] = versions.get('u1', 0) + 1
+
+    assert speaker_gallery.get_cached_speaker_gallery('u1') is None
+    second = asyncio.run(speaker_gallery.load_speaker_gallery('u1'))
+    assert second is not first
+    assert len(second) == 3
+    assert second.version == versions['u1']
+    assert get_people.call_count == 2
+
+
+def test_local_updates_apply_in_place(versions, memory_cache, people_db):
+    people, get_people = people_db
+    embeddings = _embeddings(6)
+    people['u1'] = _people(embeddings[:5])
+    gallery = asyncio.run(speaker_gallery.load_speaker_gallery('u1'))
+
+    speaker_gallery.add_to_speaker_gallery('u1', 'p5', 'Person 5', embeddings[5].tolist())
+    speaker_gallery.rename_in_speaker_gallery('u1', 'p1', 'Bob')
+    speaker_gallery.remove_from_speaker_gallery('u1', 'p2')
+
+    cached = speaker_gallery.get_cached_speaker_gallery('u1')
+    assert cached is gallery
+    assert gallery.version == versions['u1'] == 3
+    assert sorted(gallery.ids) == ['p0', 'p1', 'p3', 'p4', 'p5']
+    assert gallery.best_match(embeddings[5]).person_id == 'p5'
+    assert gallery.best_match(embeddings[1]).name == 'Bob'
+    assert get_people.call_count == 1
+
+
+def test_local_update_after_missed_change_drops_cache(versions, memory_cache, people_db):
+    people, _ = people_db
+    people['u1'] = _people(_embeddings(3))
+    asyncio.run(speaker_gallery.load_speaker_gallery('u1'))
+    versions['u1'] = versions.get('u1', 0) + 1
+
+    speaker_gallery.rename_in_speaker_gallery('u1', 'p0', 'Alice')
+
+    assert memory_cache.get('speaker_gallery:u1') is None
+
+
+def test_migration_during_load_bumps_version(versions, memory_cache, people_db, monkeypatch):
+    people, _ = people_db
+    people['u1'] = _people(_embeddings(2), version=2)
+    for person in people['u1']:
+        person['speech_samples'] = ['sample.wav']
+
+    async def migrate(uid, person):
+        return dict(person, speech_samples_version=3)
+
+    monkeypatch.setattr(speaker_gallery, 'maybe_migrate_person_samples', migrate)
+
+    gallery = asyncio.run(speaker_gallery.load_speaker_gallery('u1'))
+
+    assert len(gallery) == 2
+    assert versions['u1'] == 1
+    assert gallery.version == 1
+    assert speaker_gallery.get_cached_speaker_gallery('u1') is gallery
+
+
+# *********************************
+# ********** BENCHMARK ************
+# *********************************
+
+
+def test_benchmark_matching_throughput():
+    """Matches per second, the per-person cosine loop it replaces vs the gallery's matrix-vector product."""
+    print()
+    for size in [10, 100, 1000, 10000]:
+        embeddings = _embeddings(size)
+        candidates = {f'p{i}': {'embedding': e.reshape(1, -1)} for i, e in enumerate(embeddings)}
+        gallery = SpeakerGallery.from_people(_people(embeddings))
+        queries = embeddings[np.arange(20) % size] + 0.1 * _embeddings(20, seed=3)
+
+        loop_rounds = max(1, 2000 // size)
+        start = time.perf_counter()
+        for _ in range(loop_rounds):
+            for query in queries:
+                query = query.reshape(1, -1)
+                best, best_distance = None, float('inf')
+                for person_id, data in candidates.items():
+                    distance = compare_embeddings(query, data['embedding'])
+                    if distance < best_distance:
+                        best, best_distance = person_id, distance
+        loop_rate = loop_rounds * len(queries) / (time.perf_counter() - start)
+
+        gallery_rounds = max(1, 20000 // size)
+        start = time.perf_counter()
+        for _ in range(gallery_rounds):
+            for query in queries:
+                match = gallery.match(query, k=3)[0]
+        gallery_rate = gallery_rounds * len(queries) / (time.perf_counter() - start)
+
+        assert match.person_id == best
+        print(
+            f"{size:>6} people: loop {loop_rate:>10.0f}/s, gallery {gallery_rate:>10.0f}/s, "
+            f"{gallery_rate / loop_rate:.0f}x"
+        )
+        assert gallery_rate > loop_rate
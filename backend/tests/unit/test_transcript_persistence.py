@@ -0,0 +1,421 @@
+"""
+Tests for incremental transcript persistence of in-progress conversations.
+
+Covers: delta replay, writer checkpoint policy, compaction of left-over deltas and its races with new appends,
+merging deltas on reads, and a benchmark of transcript bytes written / latency per tick against transcript length
+(full rewrite vs deltas).
+Run with `-s` to see the benchmark table.
+"""
+
+import os
+import sys
+import threading
+import time
+import uuid
+from unittest.mock import MagicMock
+
+import pytest
+
+os.environ.setdefault(
+    "ENCRYPTION_SECRET",
+    "omi_ZwB2ZNqB2HHpMK6wStk7sTpavJiPTFg7gXUHnc4tFABPU6pZ2c2DKgehtfgi4RZv",
+)
+
+for _name in ["database._client", "database.redis_db", "database.users", "utils.other.storage"]:
+    sys.modules[_name] = MagicMock()
+
+import database.conversations as conversations_db
+from models.transcript_segment import TranscriptSegment
+from utils.transcript_persistence import InProgressTranscriptWriter
+
+# *********************************
+# ******* FAKE FIRESTORE **********
+# *********************************
+
+
+class _FakeSnapshot:
+    def __init__(self, data):
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class _FakeDocRef:
+    def __init__(self, store, path):
+        self._store = store
+        self.path = path
+
+    def collection(self, name):
+        return _FakeCollection(self._store, f'{self.path}/{name}')
+
+    def get(self, field_paths=None):
+        return _FakeSnapshot(self._store.docs.get(self.path))
+
+    def set(self, data):
+        self._store.docs[self.path] = dict(data)
+
+    def update(self, data):
+        self._store.docs.setdefault(self.path, {}).update(data)
+
+    def delete(self):
+        self._store.docs.pop(self.path, None)
+
+
+class _FakeCollection:
+    def __init__(self, store, path):
+        self._store = store
+        self.path = path
+        self._order_by = None
+
+    def document(self, doc_id):
+        return _FakeDocRef(self._store, f'{self.path}/{doc_id}')
+
+    def order_by(self, field):
+        self._order_by = field
+        return self
+
+    def _paths(self):
+        prefix = self.path + '/'
+        return [p for p in self._store.docs if p.startswith(prefix) and '/' not in p[len(prefix) :]]
+
+    def list_documents(self):
+        return [_FakeDocRef(self._store, p) for p in self._paths()]
+
+    def stream(self):
+        docs = [_FakeSnapshot(self._store.docs[p]) for p in self._paths()]
+        if self._order_by:
+            docs.sort(key=lambda d: d.to_dict()[self._order_by])
+        return docs
+
+
+class _FakeBatch:
+    def __init__(self):
+        self._ops = []
+
+    def set(self, ref, data):
+        self._ops.append(lambda: ref.set(data))
+
+    def update(self, ref, data):
+        self._ops.append(lambda: ref.update(data))
+
+    def delete(self, ref):
+        self._ops.append(ref.delete)
+
+    def commit(self):
+        for op in self._ops:
+            op()
+
+
+class _FakeDb:
+    def __init__(self):
+        self.docs = {}
+
+    def collection(self, name):
+        return _FakeCollection(self, name)
+
+    def batch(self):
+        return _FakeBatch()
+
+
+def _segment(i: int, text: str = None) -> TranscriptSegment:
+    return TranscriptSegment(
+        id=str(uuid.uuid4()),
+        text=text or f'This is sentence number {i} of a long meeting transcript.',
+        speaker=f'SPEAKER_0{i % 3}',
+        is_user=False,
+        start=float(i),
+        end=float(i) + 0.9,
+    )
+
+
+def _new_conversation(fake_db, uid, conversation_id, segments=None, level='standard'):
+    conversations_db.db = fake_db
+    data = {'id': conversation_id, 'status': 'in_progress', 'transcript_segments': segments or []}
+    prepared = conversations_db._prepare_conversation_for_write(data, uid, level)
+    prepared['data_protection_level'] = level
+    fake_db.collection('users').document(uid).collection('conversations').document(conversation_id).set(prepared)
+
+
+def _read_segments(uid, conversation_id):
+    ref = conversations_db.db.collection('users').document(uid).collection('conversations').document(conversation_id)
+    return conversations_db._prepare_conversation_for_read(ref.get().to_dict(), uid)['transcript_segments']
+
+
+class TestApplySegmentsDeltas:
+    def test_appends_new_segments_in_order(self):
+        merged = conversations_db.apply_segments_deltas(
+            [{'id': 'a'}], [{'segments': [{'id': 'b'}], 'removed_ids': []}, {'segments': [{'id': 'c'}]}]
+        )
+        assert [s['id'] for s in merged] == ['a', 'b', 'c']
+
+    def test_replaces_updated_segment_in_place(self):
+        merged = conversations_db.apply_segments_deltas(
+            [{'id': 'a', 'text': 'x'}, {'id': 'b', 'text': 'y'}], [{'segments': [{'id': 'a', 'text': 'x2'}]}]
+        )
+        assert merged == [{'id': 'a', 'text': 'x2'}, {'id': 'b', 'text': 'y'}]
+
+    def test_removes_ids(self):
+        merged = conversations_db.apply_segments_deltas(
+            [{'id': 'a'}, {'id': 'b'}], [{'segments': [{'id': 'c'}], 'removed_ids': ['b']}]
+        )
+        assert [s['id'] for s in merged] == ['a', 'c']
+
+    def test_replay_is_idempotent(self):
+        deltas = [{'segments': [{'id': 'b'}], 'removed_ids': ['a']}]
+        once = conversations_db.apply_segments_deltas([{'id': 'a'}], deltas)
+        twice = conversations_db.apply_segments_deltas(once, deltas)
+        assert once == twice == [{'id': 'b'}]
+
+
+class TestInProgressTranscriptWriter:
+    def setup_method(self):
+        self.db = _FakeDb()
+        self.uid = 'uid-1'
+        self.conversation_id = 'conv-1'
+        _new_conversation(self.db, self.uid, self.conversation_id)
+
+    def test_append_writes_delta_not_blob(self):
+        writer = InProgressTranscriptWriter(self.uid, self.conversation_id)
+        segments = [_segment(0), _segment(1)]
+        writer.append(segments, [])
+
+        assert _read_segments(self.uid, self.conversation_id) == []
+        deltas = conversations_db.get_conversation_segments_deltas(self.uid, self.conversation_id)
+        assert len(deltas) == 1
+        assert [s['id'] for s in deltas[0]['segments']] == [s.id for s in segments]
+        assert writer.has_pending_deltas
+
+    def test_checkpoint_writes_blob_and_drops_deltas(self):
+        writer = InProgressTranscriptWriter(self.uid, self.conversation_id)
+        segments = [_segment(0), _segment(1)]
+        writer.append(segments[:1], [])
+        writer.append(segments[1:], [])
+        writer.checkpoint(segments)
+
+        assert [s['id'] for s in _read_segments(self.uid, self.conversation_id)] == [s.id for s in segments]
+        assert conversations_db.get_conversation_segments_deltas(self.uid, self.conversation_id) == []
+        assert not writer.has_pending_deltas
+        assert writer.checkpoint(segments) == 0
+
+    def test_checkpoint_after_max_pending_deltas(self):
+        writer = InProgressTranscriptWriter(
+            self.uid, self.conversation_id, checkpoint_interval=3600, max_pending_deltas=3
+        )
+        segments = []
+        for i in range(3):
+            segments.append(_segment(i))
+            writer.append(segments[-1:], [])
+            writer.maybe_checkpoint(segments)
+
+        assert writer.checkpoints_written == 1
+        assert len(_read_segments(self.uid, self.conversation_id)) == 3
+
+    def test_checkpoint_after_interval(self):
+        writer = InProgressTranscriptWriter(self.uid, self.conversation_id, checkpoint_interval=0)
+        writer.append([_segment(0)], [])
+        assert writer.should_checkpoint()
+
+    def test_empty_append_only_bumps_finished_at(self, monkeypatch):
+        writer = InProgressTranscriptWriter(self.uid, self.conversation_id)
+        update_finished_at = MagicMock()
+        monkeypatch.setattr(conversations_db, 'update_conversation_finished_at', update_finished_at)
+        assert writer.append([], [], finished_at='now') == 0
+        update_finished_at.assert_called_once_with(self.uid, self.conversation_id, 'now')
+        assert not writer.has_pending_deltas
+
+    def test_staged_segments_go_with_the_next_append(self):
+        writer = InProgressTranscriptWriter(self.uid, self.conversation_id)
+        translated, updated = _segment(0), _segment(1)
+        writer.stage([translated, updated])
+        writer.append([updated], [])
+
+        deltas = conversations_db.get_conversation_segments_deltas(self.uid, self.conversation_id)
+        assert len(deltas) == 1
+        assert [s['id'] for s in deltas[0]['segments']] == [updated.id, translated.id]
+        writer.append([], [])
+        assert writer.deltas_written == 1
+
+    def test_checkpoint_writes_staged_segments(self):
+        writer = InProgressTranscriptWriter(self.uid, self.conversation_id)
+        segment = _segment(0)
+        writer.stage([segment])
+        assert writer.checkpoint([segment]) > 0
+        assert [s['id'] for s in _read_segments(self.uid, self.conversation_id)] == [segment.id]
+        assert writer.checkpoint([segment]) == 0
+
+    def test_staged_segments_survive_a_failed_write(self, monkeypatch):
+        writer = InProgressTranscriptWriter(self.uid, self.conversation_id)
+        segment = _segment(0)
+        writer.stage([segment])
+        monkeypatch.setattr(
+            conversations_db, 'append_conversation_segments_delta', MagicMock(side_effect=RuntimeError('down'))
+        )
+        with pytest.raises(RuntimeError):
+            writer.append([], [])
+        monkeypatch.undo()
+        conversations_db.db = self.db
+        writer.append([], [])
+        deltas = conversations_db.get_conversation_segments_deltas(self.uid, self.conversation_id)
+        assert [s['id'] for s in deltas[0]['segments']] == [segment.id]
+
+    def test_enhanced_deltas_round_trip(self):
+        _new_conversation(self.db, self.uid, 'conv-enhanced', level='enhanced')
+        writer = InProgressTranscriptWriter(self.uid, 'conv-enhanced', 'enhanced')
+        segment = _segment(0)
+        writer.append([segment], [])
+
+        raw = self.db.docs[f'users/{self.uid}/conversations/conv-enhanced/transcript_deltas/{writer.session}-{0:010d}']
+        assert isinstance(raw['segments'], str)
+        deltas = conversations_db.get_conversation_segments_deltas(self.uid, 'conv-enhanced')
+        assert deltas[0]['segments'][0]['text'] == segment.text
+
+    def test_two_sessions_keep_each_others_deltas(self):
+        dropped = InProgressTranscriptWriter(self.uid, self.conversation_id)
+        resumed = InProgressTranscriptWriter(self.uid, self.conversation_id)
+        first, second, third = _segment(0), _segment(1), _segment(2)
+        dropped.append([first], [])
+        resumed.append([second], [])
+        dropped.append([third], [])
+
+        deltas = conversations_db.get_conversation_segments_deltas(self.uid, self.conversation_id)
+        order = [(dropped.session, 0), (resumed.session, 0), (dropped.session, 1)]
+        assert [(d['session'], d['seq']) for d in deltas] == order
+        assert conversations_db.compact_conversation_segments(self.uid, self.conversation_id) is True
+        assert [s['id'] for s in _read_segments(self.uid, self.conversation_id)] == [first.id, second.id, third.id]
+
+
+class TestCompactConversationSegments:
+    def test_compacts_left_over_deltas(self):
+        fake_db = _FakeDb()
+        existing = _segment(0)
+        _new_conversation(fake_db, 'uid', 'conv', [existing.dict()])
+        writer = InProgressTranscriptWriter('uid', 'conv')
+
+        # Session drops after writing deltas, before a checkpoint
+        updated = existing.model_copy(deep=True)
+        updated.text += ' More words.'
+        writer.append([updated, _segment(1)], [])
+
+        assert conversations_db.compact_conversation_segments('uid', 'conv') is True
+        segments = _read_segments('uid', 'conv')
+        assert [s['text'] for s in segments][0].endswith('More words.')
+        assert len(segments) == 2
+        assert conversations_db.compact_conversation_segments('uid', 'conv') is False
+
+
+class TestCheckpointRace:
+    def setup_method(self):
+        self.db = _FakeDb()
+        _new_conversation(self.db, 'uid', 'conv')
+        self.writer = InProgressTranscriptWriter('uid', 'conv')
+
+    def _delta_seqs(self):
+        return [d['seq'] for d in conversations_db.get_conversation_segments_deltas('uid', 'conv')]
+
+    def test_stale_checkpoint_keeps_newer_deltas(self):
+        first, second = _segment(0), _segment(1)
+        self.writer.append([first], [])
+        # The checkpoint takes its segments, then waits in the pool behind the next append
+        snapshot, through_seq = [first], self.writer.last_seq
+        self.writer.append([second], [])
+        self.writer.checkpoint(snapshot, through_seq=through_seq)
+
+        assert self._delta_seqs() == [1]
+        assert self.writer.has_pending_deltas
+        merged = conversations_db.merge_conversation_segments_deltas(
+            'uid', {'id': 'conv', 'transcript_segments': _read_segments('uid', 'conv')}
+        )
+        assert [s['id'] for s in merged['transcript_segments']] == [first.id, second.id]
+
+        self.writer.checkpoint([first, second], through_seq=self.writer.last_seq)
+        assert self._delta_seqs() == []
+        assert not self.writer.has_pending_deltas
+
+    def test_slow_compaction_keeps_an_append_made_meanwhile(self, monkeypatch):
+        first, second = _segment(0), _segment(1)
+        self.writer.append([first], [])
+
+        read, release = threading.Event(), threading.Event()
+        checkpoint_segments = conversations_db.checkpoint_conversation_segments
+
+        def slow_checkpoint(*args, **kwargs):
+            read.set()
+            release.wait(5)
+            return checkpoint_segments(*args, **kwargs)
+
+        monkeypatch.setattr(conversations_db, 'checkpoint_conversation_segments', slow_checkpoint)
+        compaction = threading.Thread(target=conversations_db.compact_conversation_segments, args=('uid', 'conv'))
+        compaction.start()
+        assert read.wait(5)
+        self.writer.append([second], [])
+        release.set()
+        compaction.join(5)
+
+        assert [s['id'] for s in _read_segments('uid', 'conv')] == [first.id]
+        assert self._delta_seqs() == [1]
+
+
+class TestMergeConversationSegmentsDeltas:
+    def test_merges_in_memory_and_keeps_the_deltas(self):
+        fake_db = _FakeDb()
+        existing = _segment(0)
+        _new_conversation(fake_db, 'uid', 'conv', [existing.dict()])
+        writer = InProgressTranscriptWriter('uid', 'conv')
+        added = _segment(1)
+        writer.append([added], [])
+
+        conversation = {'id': 'conv', 'transcript_segments': _read_segments('uid', 'conv')}
+        merged = conversations_db.merge_conversation_segments_deltas('uid', conversation)
+
+        assert [s['id'] for s in merged['transcript_segments']] == [existing.id, added.id]
+        assert [s['id'] for s in _read_segments('uid', 'conv')] == [existing.id]
+        assert len(conversations_db.get_conversation_segments_deltas('uid', 'conv')) == 1
+
+    def test_no_conversation(self):
+        assert conversations_db.merge_conversation_segments_deltas('uid', None) is None
+
+
+class TestPersistenceBenchmark:
+    """Transcript bytes written and latency per 0.6s tick, full rewrite vs deltas."""
+
+    TICKS = 20
+
+    def _run(self, transcript_length: int, incremental: bool):
+        fake_db = _FakeDb()
+        segments = [_segment(i) for i in range(transcript_length)]
+        _new_conversation(fake_db, 'uid', 'conv', [s.dict() for s in segments])
+        writer = InProgressTranscriptWriter('uid', 'conv', checkpoint_interval=3600, max_pending_deltas=10**6)
+
+        bytes_written = 0
+        started = time.perf_counter()
+        for i in range(transcript_length, transcript_length + self.TICKS):
+            new_segment = _segment(i)
+            segments.append(new_segment)
+            if incremental:
+                bytes_written += writer.append([new_segment], [])
+            else:
+                payload = conversations_db._prepare_conversation_for_write(
+                    {'transcript_segments': [s.dict() for s in segments]}, 'uid', 'standard'
+                )
+                bytes_written += len(payload['transcript_segments'])
+        elapsed = time.perf_counter() - started
+        if incremental:
+            bytes_written += writer.checkpoint(segments)
+        return bytes_written / self.TICKS, elapsed / self.TICKS * 1000
+
+    def test_bytes_per_tick_do_not_grow_with_transcript(self):
+        print('\nsegments | full rewrite B/tick  ms/tick | deltas B/tick  ms/tick (B/tick incl. closing checkpoint)')
+        results = {}
+        for length in [100, 1000, 3000]:
+            full_bytes, full_ms = self._run(length, incremental=False)
+            delta_bytes, delta_ms = self._run(length, incremental=True)
+            results[length] = (full_bytes, delta_bytes)
+            print(f'{length:8d} | {full_bytes:12.0f} {full_ms:8.2f} | {delta_bytes:12.0f} {delta_ms:8.2f}')
+
+        for full_bytes, delta_bytes in results.values():
+            assert delta_bytes < full_bytes
+        # Full rewrites scale with the transcript, deltas (amortized over one checkpoint) much less so
+        assert results[3000][0] > 10 * results[100][0]
+        assert results[3000][1] < results[3000][0] / 10
@@ -0,0 +1,154 @@
+"""
+Performance budget for TranscriptSegment on 10k-segment transcripts.
+
+Covers: parity of the linear can_display_seconds with the previous pairwise check, combine_segments keeping the
+whole transcript normalized while touching only new segments, and time budgets for can_display_seconds,
+segments_as_string and a 0.6s streaming tick of combine_segments. Run with `-s` to see the report.
+"""
+
+import random
+import time
+
+from models.transcript_segment import TranscriptSegment, _normalize_text
+
+SEGMENTS = 10_000
+
+# Budgets leave several times the measured time as headroom, they catch a return to quadratic or per-transcript work
+CAN_DISPLAY_SECONDS_BUDGET_MS = 50
+SEGMENTS_AS_STRING_BUDGET_MS = 500
+COMBINE_TICK_BUDGET_MS = 2
+
+WORDS = ['we', 'should', 'ship', 'the', 'release', 'on', 'friday', 'after', 'review', 'okay', 'sure', 'maybe']
+
+
+def _segment(i: int, rng: random.Random, start: float = None) -> TranscriptSegment:
+    start = float(i * 2) if start is None else start
+    text = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(3, 12))).capitalize()
+    text += rng.choice(['.', '?', '!', '', ' ,', ' .'])
+    return TranscriptSegment(
+        text=text,
+        speaker=f'SPEAKER_0{rng.randint(0, 2)}',
+        is_user=False,
+        start=start,
+        end=start + 1.5,
+    )
+
+
+def _transcript(n: int, seed: int = 1):
+    rng = random.Random(seed)
+    return [_segment(i, rng) for i in range(n)]
+
+
+def _pairwise_can_display_seconds(segments):
+    """Previous implementation, O(n^2)."""
+    for i in range(len(segments)):
+        for j in range(i + 1, len(segments)):
+            if segments[i].start > segments[j].end or segments[i].end > segments[j].start:
+                return False
+    return True
+
+
+def _elapsed_ms(func, *args, repeat: int = 3) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+class TestCanDisplaySecondsParity:
+    def test_matches_pairwise_check_on_random_layouts(self):
+        rng = random.Random(7)
+        for _ in range(300):
+            n = rng.randint(0, 12)
+            segments = []
+            for _ in range(n):
+                start = rng.choice([rng.uniform(0, 20), float(rng.randint(0, 10))])
+                segments.append(TranscriptSegment(text='x', is_user=False, start=start, end=start + rng.uniform(0, 3)))
+            assert TranscriptSegment.can_display_seconds(segments) == _pairwise_can_display_seconds(segments)
+
+    def test_sequential_transcript_can_display_seconds(self):
+        segments = _transcript(500)
+        assert TranscriptSegment.can_display_seconds(segments) is True
+        assert _pairwise_can_display_seconds(segments) is True
+
+    def test_late_overlap_is_detected(self):
+        segments = _transcript(500)
+        segments[-1].start = segments[-2].start
+        assert TranscriptSegment.can_display_seconds(segments) is False
+        assert TranscriptSegment.can_display_seconds([]) is True
+
+
+class TestCombineSegmentsNormalization:
+    def test_streamed_transcript_stays_normalized(self):
+        rng = random.Random(3)
+        segments = []
+        for i in range(400):
+            new_segments = [_segment(i * 3 + k, rng) for k in range(rng.randint(1, 3))]
+            segments, updated, _ = TranscriptSegment.combine_segments(segments, new_segments)
+            assert all(segment.text == _normalize_text(segment.text) for segment in updated)
+        # A full normalization pass, as done on every call before, would change nothing
+        assert all(segment.text == _normalize_text(segment.text) for segment in segments)
+
+    def test_existing_segments_are_not_rewritten(self):
+        rng = random.Random(4)
+        segments, _, _ = TranscriptSegment.combine_segments([], [_segment(i, rng) for i in range(50)])
+        # Pretend an older segment holds text the previous full pass would have touched
+        segments[0].text = 'Hello , world .'
+        TranscriptSegment.combine_segments(segments, [_segment(1000, rng, start=5000.0)])
+        assert segments[0].text == 'Hello , world .'
+
+
+class TestPerformanceBudget:
+    def test_can_display_seconds_budget(self):
+        segments = _transcript(SEGMENTS)
+        elapsed = _elapsed_ms(TranscriptSegment.can_display_seconds, segments)
+        # The pairwise check is measured on 1k segments, 10k would take minutes
+        pairwise = _elapsed_ms(_pairwise_can_display_seconds, segments[:1000], repeat=1)
+        print(
+            f'\ncan_display_seconds: {SEGMENTS} segments {elapsed:.2f}ms | pairwise on 1000 segments {pairwise:.0f}ms'
+        )
+        assert elapsed < CAN_DISPLAY_SECONDS_BUDGET_MS
+
+    def test_segments_as_string_budget(self):
+        segments = _transcript(SEGMENTS)
+        elapsed = _elapsed_ms(lambda: TranscriptSegment.segments_as_string(segments, include_timestamps=True))
+        print(f'\nsegments_as_string: {SEGMENTS} segments with timestamps {elapsed:.1f}ms')
+        assert elapsed < SEGMENTS_AS_STRING_BUDGET_MS
+        text = TranscriptSegment.segments_as_string(segments[:2], include_timestamps=True)
+        assert text.startswith('[0:00:00 - 0:00:01] Speaker ')
+        assert '\n\n[0:00:02 - 0:00:03] Speaker ' in text
+
+    def test_combine_tick_budget(self):
+        rng = random.Random(5)
+        segments, _, _ = TranscriptSegment.combine_segments([], _transcript(SEGMENTS))
+        assert len(segments) > SEGMENTS // 4
+
+        next_start = segments[-1].end + 10
+        timings, full_pass_timings = [], []
+        for tick in range(50):
+            new_segments = [
+                _segment(0, rng, start=next_start + tick * 4),
+                _segment(0, rng, start=next_start + tick * 4 + 2),
+            ]
+            started = time.perf_counter()
+            segments, _, _ = TranscriptSegment.combine_segments(segments, new_segments)
+            timings.append(time.perf_counter() - started)
+
+            # The per-call work the previous implementation added on top: normalizing the whole transcript
+            started = time.perf_counter()
+            for segment in segments:
+                _normalize_text(segment.text)
+            full_pass_timings.append(time.perf_counter() - started)
+
+        timings.sort()
+        full_pass_timings.sort()
+        tick_ms = timings[len(timings) // 2] * 1000
+        full_pass_ms = full_pass_timings[len(full_pass_timings) // 2] * 1000
+        print(
+            f'\ncombine_segments tick on {len(segments)} segments: {tick_ms:.3f}ms '
+            f'(previous full normalization pass alone: {full_pass_ms:.2f}ms)'
+        )
+        assert tick_ms < COMBINE_TICK_BUDGET_MS
+        assert tick_ms < full_pass_ms
@@ -0,0 +1,276 @@
+"""
+Tests for batched translation with the shared cache (utils/translation.py).
+
+Covers: one translate_text call per batch, the API limits splitting a batch, the process LRU and the redis layer
+shared between services, failures keeping the original text uncached, the language detection cache under
+concurrent calls. Ends with a benchmark of a live meeting, translate_text calls per minute of speech with the
+previous per-sentence calls and per-session cache vs batches per tick and the shared cache, run with `-s` to see
+the report.
+"""
+
+import hashlib
+import random
+import sys
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import pytest
+
+sys.modules['google.cloud.translate_v3'] = MagicMock()
+
+import utils.translation as translation
+from utils.translation import TranslationCache, TranslationService, split_into_sentences
+
+
+class _FakeClient:
+    def __init__(self, fail=False):
+        self.calls = []
+        self.fail = fail
+
+    def translate_text(self, contents, parent, mime_type, target_language_code):
+        self.calls.append(list(contents))
+        if self.fail:
+            raise RuntimeError('quota exceeded')
+        return SimpleNamespace(
+            translations=[SimpleNamespace(translated_text=f'[{target_language_code}] {text}') for text in contents]
+        )
+
+
+class _FakeRedis:
+    def __init__(self):
+        self.values = {}
+        self.round_trips = 0
+
+    def get_cached_translations(self, dest_language, text_hashes):
+        self.round_trips += 1
+        return [self.values.get((dest_language, h)) for h in text_hashes]
+
+    def cache_translations(self, dest_language, translations, ttl=None):
+        self.round_trips += 1
+        self.values.update({(dest_language, h): t for h, t in translations.items()})
+
+
+@pytest.fixture
+def client(monkeypatch):
+    client = _FakeClient()
+    monkeypatch.setattr(translation, '_client', client)
+    return client
+
+
+@pytest.fixture
+def shared(monkeypatch):
+    redis = _FakeRedis()
+    monkeypatch.setattr(translation.redis_db, 'get_cached_translations', redis.get_cached_translations)
+    monkeypatch.setattr(translation.redis_db, 'cache_translations', redis.cache_translations)
+    return redis
+
+
+def test_one_call_for_all_uncached_sentences(client, shared):
+    service = TranslationService(TranslationCache())
+    texts = ['Hello there. How are you?', 'Fine, thanks.', '', 'Hello there.']
+
+    translated = service.translate_batch('es', texts)
+
+    assert translated == [
+        '[es] Hello there. [es] How are you?',
+        '[es] Fine, [es] thanks.',
+        '',
+        '[es] Hello there.',
+    ]
+    assert len(client.calls) == 1
+    assert sorted(client.calls[0]) == sorted({'Hello there.', 'How are you?', 'Fine,', 'thanks.'})
+
+    service.translate_batch('es', ['How are you? Good.'])
+    assert client.calls[1] == ['Good.']
+    assert service.stats.api_calls == 2 and service.stats.sentences_translated == 5
+
+
+def test_batches_respect_the_api_limits(client, shared, monkeypatch):
+    monkeypatch.setattr(translation, 'MAX_BATCH_CONTENTS', 10)
+    monkeypatch.setattr(translation, 'MAX_BATCH_CODEPOINTS', 200)
+    service = TranslationService(TranslationCache())
+
+    service.translate_batch('de', [f'Sentence number {i}.' for i in range(25)])
+    service.translate_batch('de', [f'Sentence {i} is a much longer one that takes up some room.' for i in range(8)])
+
+    assert [len(call) for call in client.calls[:3]] == [10, 10, 5]
+    assert all(sum(len(s) for s in call) < 200 for call in client.calls)
+    assert len(client.calls) == 3 + 3
+
+
+def test_cache_is_shared_through_redis(client, shared):
+    TranslationService(TranslationCache()).translate_batch('fr', ['Good morning. See you later.'])
+
+    # Another instance: empty process cache, finds both sentences in redis
+    other = TranslationService(TranslationCache())
+    assert other.translate_batch('fr', ['Good morning. See you later.']) == ['[fr] Good morning. [fr] See you later.']
+    assert len(client.calls) == 1
+    assert other.stats.cache_hits == 2
+
+    # Same language only
+    other.translate_batch('it', ['Good morning.'])
+    assert len(client.calls) == 2
+
+
+def test_process_cache_saves_the_redis_round_trip(client, shared):
+    service = TranslationService(TranslationCache())
+    service.translate_batch('fr', ['Good morning.'])
+    trips = shared.round_trips
+    service.translate_batch('fr', ['Good morning.'])
+    assert shared.round_trips == trips
+
+
+def test_lru_eviction():
+    cache = TranslationCache(max_size=3)
+    cache._remember('es', {'a': '1', 'b': '2', 'c': '3'})
+    cache._remember('es', {'a': '1'})
+    cache._remember('es', {'d': '4'})
+    assert list(cache._entries) == [('c', 'es'), ('a', 'es'), ('d', 'es')]
+
+
+def test_failures_keep_the_text_and_are_not_cached(shared, monkeypatch):
+    failing = _FakeClient(fail=True)
+    monkeypatch.setattr(translation, '_client', failing)
+    service = TranslationService(TranslationCache())
+
+    assert service.translate_batch('es', ['Hello. Bye.']) == ['Hello. Bye.']
+    assert service.translate_text('es', 'Hello.') == 'Hello.'
+    assert shared.values == {}
+
+
+def test_redis_errors_fall_back_to_the_api(client, monkeypatch):
+    def down(*args, **kwargs):
+        raise ConnectionError('redis down')
+
+    monkeypatch.setattr(translation.redis_db, 'get_cached_translations', down)
+    monkeypatch.setattr(translation.redis_db, 'cache_translations', down)
+    service = TranslationService(TranslationCache())
+
+    assert service.translate_batch('es', ['Hello.']) == ['[es] Hello.']
+    assert service.translate_batch('es', ['Hello.']) == ['[es] Hello.']
+    assert len(client.calls) == 1
+
+
+def test_single_text_helpers(client, shared):
+    service = TranslationService(TranslationCache())
+    assert service.translate_text_by_sentence('es', '') == ''
+    assert service.translate_text_by_sentence('es', 'One. Two.') == '[es] One. [es] Two.'
+    assert service.translate_text('es', 'One.') == '[es] One.'
+    assert len(client.calls) == 1
+
+
+def test_detection_cache_under_concurrent_calls(monkeypatch):
+    monkeypatch.setattr(translation, 'detection_cache', OrderedDict())
+    monkeypatch.setattr(translation, 'MAX_DETECTION_CACHE_SIZE', 50)
+    monkeypatch.setattr(translation, '_detect_with_langdetect', lambda text, hint=None: 'en')
+
+    def detect(worker):
+        return [translation.detect_language(f'a long enough sentence number {i % 200}') for i in range(worker, 2000)]
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = [language for languages in executor.map(detect, range(8)) for language in languages]
+    assert set(results) == {'en'}
+    assert len(translation.detection_cache) <= 50
+
+
+# *********************************
+# ********** BENCHMARK ************
+# *********************************
+
+
+class _PreviousTranslationService:
+    """The previous service: a 1000-entry cache per session, one translate_text call per uncached sentence."""
+
+    def __init__(self):
+        self.translation_cache = OrderedDict()
+
+    def translate_text_by_sentence(self, dest_language, text):
+        return ' '.join(self.translate_text(dest_language, s) for s in split_into_sentences(text))
+
+    def translate_text(self, dest_language, text):
+        key = f'{hashlib.md5(text.encode()).hexdigest()}:{dest_language}'
+        if key in self.translation_cache:
+            self.translation_cache.move_to_end(key)
+            return self.translation_cache[key]
+        response = translation._client.translate_text(
+            contents=[text], parent='', mime_type='text/plain', target_language_code=dest_language
+        )
+        if len(self.translation_cache) >= 1000:
+            self.translation_cache.popitem(last=False)
+        self.translation_cache[key] = response.translations[0].translated_text
+        return self.translation_cache[key]
+
+
+_BACKCHANNELS = ['Yeah.', 'Okay.', 'Right.', 'Exactly.', 'Sounds good.', 'I see.', 'Thank you.', 'Sure.']
+_WORDS = (
+    'we should ship the release on friday after the review but the tests are still failing on the build server '
+    'and marketing wants the new screenshots before the announcement goes out next week so let us sync tomorrow'
+).split()
+
+
+def _meeting_ticks(rng, minutes=1.0, words_per_minute=150, tick=0.6):
+    """
+    Per STT tick the segments it updated: 3 speakers, the current segment grows word by word and about one tick in
+    three also revises the previous one. Returns the list of ticks, each a list of segment texts.
+    """
+    ticks = []
+    current, previous = [], None
+    words_per_tick = words_per_minute / 60 * tick
+    carry = 0.0
+    for _ in range(int(minutes * 60 / tick)):
+        carry += words_per_tick
+        while carry >= 1:
+            carry -= 1
+            if rng.random() < 0.08:
+                current.append(rng.choice(_BACKCHANNELS))
+            else:
+                word = rng.choice(_WORDS)
+                current.append(word + ('.' if rng.random() < 0.12 else ',' if rng.random() < 0.08 else ''))
+        updated = [' '.join(current)]
+        if previous is not None and rng.random() < 0.33:
+            previous = previous.rstrip('.') + '.'
+            updated.append(previous)
+        ticks.append([u for u in updated if u])
+        if len(current) > rng.randint(12, 30):
+            previous, current = ' '.join(current), []
+    return ticks
+
+
+def test_benchmark_calls_per_minute_of_speech(client, shared):
+    rng = random.Random(0)
+    sessions = [_meeting_ticks(rng, minutes=5) for _ in range(10)]
+    minutes = 5 * len(sessions)
+
+    for ticks in sessions:
+        previous = _PreviousTranslationService()
+        for texts in ticks:
+            for text in texts:
+                previous.translate_text_by_sentence('es', text)
+    previous_calls = len(client.calls)
+    tick_count = sum(len(ticks) for ticks in sessions)
+    previous_sentences = sum(len(c) for c in client.calls)
+
+    client.calls.clear()
+    cache = TranslationCache()
+    for ticks in sessions:
+        service = TranslationService(cache)
+        for texts in ticks:
+            service.translate_batch('es', texts)
+    batched_calls = len(client.calls)
+    batched_sentences = sum(len(c) for c in client.calls)
+
+    print()
+    print(f"   ticks: {tick_count / minutes:6.1f} per minute of speech, 3 speakers, 150 words per minute")
+    print(
+        f"previous: {previous_calls / minutes:6.1f} translate_text calls per minute of speech "
+        f"({previous_sentences / minutes:6.1f} sentences)"
+    )
+    print(
+        f" batched: {batched_calls / minutes:6.1f} translate_text calls per minute of speech "
+        f"({batched_sentences / minutes:6.1f} sentences, shared cache across the {len(sessions)} sessions)"
+    )
+    assert batched_calls < previous_calls
+    assert batched_calls <= tick_count
+    assert batched_sentences <= previous_sentences
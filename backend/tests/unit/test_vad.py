@@ -0,0 +1,381 @@
+"""
+Tests for the VAD backends (utils/stt/vad.py).
+
+Covers: segment smoothing, block streaming (carry between blocks, stereo, other rates and sample widths), backend
+selection, the hosted backend, caching, range copies for sync and speech profiles (extensible and undecodable WAVs
+too). Ends with a benchmark on synthesized speech with known segments at three noise levels, run with `-s` to see
+the report.
+"""
+
+import struct
+import time
+import tracemalloc
+import wave
+
+import numpy as np
+import pytest
+from fastapi import HTTPException
+from pydub import AudioSegment
+from scipy.signal import lfilter
+
+from utils.stt import vad
+from utils.stt.vad import EnergyVad, WebRtcVad, copy_wav_ranges, frames_to_segments, get_vad_backend, read_wav_blocks
+
+SAMPLE_RATE = 16000
+
+
+def _write_wav(path, samples: np.ndarray, sample_rate: int = SAMPLE_RATE, channels: int = 1):
+    with wave.open(str(path), 'wb') as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes((np.clip(samples, -1, 1) * 32767).astype('<i2').tobytes())
+
+
+def _speech_like(rng, seconds: float, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """A gliding harmonic source through three formant filters, a random vowel every 150ms syllable."""
+    n = int(seconds * sample_rate)
+    t = np.arange(n) / sample_rate
+    f0 = 110 + 40 * np.sin(2 * np.pi * 0.7 * t + rng.uniform(0, 6)) + rng.uniform(0, 60)
+    phase = 2 * np.pi * np.cumsum(f0) / sample_rate
+    source = sum(np.sin(k * phase) / k for k in range(1, 30))
+
+    out = np.zeros(n)
+    syllable = int(0.15 * sample_rate)
+    for start in range(0, n, syllable):
+        chunk = source[start : start + syllable]
+        voiced = np.zeros_like(chunk)
+        for formant, bandwidth in [
+            (rng.uniform(300, 800), 80),
+            (rng.uniform(900, 2200), 100),
+            (rng.uniform(2300, 3000), 120),
+        ]:
+            r = np.exp(-np.pi * bandwidth / sample_rate)
+            theta = 2 * np.pi * formant / sample_rate
+            voiced += lfilter([1 - r], [1, -2 * r * np.cos(theta), r * r], chunk)
+        out[start : start + syllable] = voiced * np.hanning(len(chunk)) ** 0.5
+    out *= 0.6 + 0.4 * np.sin(2 * np.pi * 4 * t) ** 2
+    return out / np.max(np.abs(out))
+
+
+def _recording(path, rng, seconds: float = 60, noise_db: float = -45, sample_rate: int = SAMPLE_RATE):
+    """Utterances of 0.8-4s with 0.6-5s pauses over white noise and 50Hz hum. Returns the true (start, end)s."""
+    samples = np.zeros(int(seconds * sample_rate))
+    truth = []
+    t = rng.uniform(0.5, 2)
+    while t < seconds - 3:
+        duration = min(rng.uniform(0.8, 4), seconds - t)
+        first = int(t * sample_rate)
+        utterance = _speech_like(rng, duration, sample_rate) * rng.uniform(0.1, 0.5)
+        samples[first : first + len(utterance)] = utterance
+        truth.append((t, t + duration))
+        t += duration + rng.uniform(0.6, 5)
+    samples += rng.standard_normal(len(samples)) * 10 ** (noise_db / 20)
+    samples += 0.003 * np.sin(2 * np.pi * 50 * np.arange(len(samples)) / sample_rate)
+    _write_wav(path, samples, sample_rate)
+    return truth
+
+
+def _score(segments, truth, seconds, resolution=0.01):
+    """Precision, recall and F1 of the speech time, at 10ms resolution."""
+    expected = np.zeros(int(seconds / resolution), dtype=bool)
+    found = np.zeros_like(expected)
+    for start, end in truth:
+        expected[int(start / resolution) : int(end / resolution)] = True
+    for segment in segments:
+        found[int(segment['start'] / resolution) : int(segment['end'] / resolution)] = True
+    hits = (expected & found).sum()
+    precision = hits / max(found.sum(), 1)
+    recall = hits / max(expected.sum(), 1)
+    return precision, recall, 2 * precision * recall / max(precision + recall, 1e-9)
+
+
+# *********************************
+# ********** SEGMENTS *************
+# *********************************
+
+
+def test_frames_to_segments_bridges_pauses_and_drops_blips():
+    frame = 0.03
+    speech = np.zeros(200, dtype=bool)
+    speech[10:30] = True  # 0.30-0.90s
+    speech[35:60] = True  # 150ms pause: bridged
+    speech[100:104] = True  # 120ms blip: dropped
+    speech[150:200] = True  # runs to the end: padding is clipped at the duration
+
+    assert frames_to_segments(speech, frame) == [{'start': 0.27, 'end': 1.83}, {'start': 4.47, 'end': 6.0}]
+    assert frames_to_segments(np.zeros(0, dtype=bool), frame) == []
+    assert frames_to_segments(np.zeros(50, dtype=bool), frame) == []
+
+
+def test_read_wav_blocks_streams_mono_int16(tmp_path):
+    stereo = np.stack([np.full(SAMPLE_RATE * 3, 0.5), np.full(SAMPLE_RATE * 3, -0.25)], axis=1).ravel()
+    _write_wav(tmp_path / 'stereo.wav', stereo, channels=2)
+
+    blocks = list(read_wav_blocks(str(tmp_path / 'stereo.wav'), block_seconds=1))
+    assert [len(samples) for _, samples in blocks] == [SAMPLE_RATE] * 3
+    assert all(rate == SAMPLE_RATE and samples.dtype == np.int16 for rate, samples in blocks)
+    assert abs(int(blocks[0][1][0]) - int(0.125 * 32767)) <= 1
+
+
+def _pcm(samples: np.ndarray, sample_width: int) -> bytes:
+    """Little-endian PCM of samples in [-1, 1], 8-bit unsigned like the WAV format."""
+    if sample_width == 1:
+        return (np.clip(samples, -1, 1) * 127 + 128).astype(np.uint8).tobytes()
+    scaled = (np.clip(samples, -1, 1) * (2 ** (8 * sample_width - 1) - 1)).astype('<i4')
+    return scaled.view(np.uint8).reshape(-1, 4)[:, :sample_width].tobytes()
+
+
+def _write_extensible_wav(path, samples: np.ndarray, sample_width: int = 3, sample_rate: int = SAMPLE_RATE):
+    """A mono WAVE_FORMAT_EXTENSIBLE file, the header the wave module rejects."""
+    data = _pcm(samples, sample_width)
+    pcm_guid = struct.pack('<IHH', 1, 0x0000, 0x0010) + bytes.fromhex('800000aa00389b71')
+    bits = sample_width * 8
+    header = struct.pack('<HHIIHH', 0xFFFE, 1, sample_rate, sample_rate * sample_width, sample_width, bits)
+    fmt = header + struct.pack('<HHI', 22, bits, 0x4) + pcm_guid
+    chunks = b'WAVE' + b'fmt ' + struct.pack('<I', len(fmt)) + fmt + b'data' + struct.pack('<I', len(data)) + data
+    with open(path, 'wb') as file:
+        file.write(b'RIFF' + struct.pack('<I', len(chunks)) + chunks)
+
+
+@pytest.mark.parametrize('sample_width', [1, 3, 4])
+def test_other_sample_widths_read_as_int16(tmp_path, sample_width):
+    samples = np.random.default_rng(2).uniform(-0.9, 0.9, SAMPLE_RATE * 2)
+    _write_wav(tmp_path / '16bit.wav', samples)
+    with wave.open(str(tmp_path / 'other.wav'), 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(sample_width)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes(_pcm(samples, sample_width))
+
+    expected = np.concatenate([b for _, b in read_wav_blocks(str(tmp_path / '16bit.wav'))])
+    read = np.concatenate([b for _, b in read_wav_blocks(str(tmp_path / 'other.wav'))])
+    assert read.dtype == np.int16 and len(read) == len(expected)
+    # Off by the rounding of each width, 8-bit steps are 256 apart
+    assert np.max(np.abs(read.astype(int) - expected)) <= (512 if sample_width == 1 else 2)
+
+
+def test_backends_are_abstract():
+    with pytest.raises(TypeError):
+        vad.VadBackend()
+    with pytest.raises(TypeError):
+        vad.FrameVad()
+
+
+@pytest.mark.parametrize('backend', [EnergyVad, WebRtcVad])
+def test_segments_are_the_same_whatever_the_block_size(tmp_path, monkeypatch, backend):
+    truth = _recording(tmp_path / 'a.wav', np.random.default_rng(1), seconds=30)
+
+    whole = backend().segments(str(tmp_path / 'a.wav'))
+    # Blocks that don't divide into frames, so samples are carried between them
+    monkeypatch.setattr(vad, 'read_wav_blocks', lambda p, block_seconds=1.013: read_wav_blocks(p, block_seconds))
+    streamed = backend().segments(str(tmp_path / 'a.wav'))
+
+    assert len(whole) > len(truth) // 2
+    if backend is WebRtcVad:
+        assert streamed == whole
+    else:
+        # The energy floor starts from the first block's quiet frames, so edges may move by a frame
+        assert len(streamed) == len(whole)
+        assert all(abs(a['start'] - b['start']) <= 0.06 for a, b in zip(streamed, whole))
+
+
+def test_webrtc_resamples_other_rates(tmp_path):
+    rng = np.random.default_rng(2)
+    truth_16k = _recording(tmp_path / '16k.wav', rng, seconds=20)
+    samples = AudioSegment.from_wav(str(tmp_path / '16k.wav')).set_frame_rate(22050)
+    samples.export(str(tmp_path / '22k.wav'), format='wav')
+
+    _, _, f1 = _score(WebRtcVad().segments(str(tmp_path / '22k.wav')), truth_16k, 20)
+    assert f1 > 0.85
+
+
+def test_silence_has_no_segments(tmp_path):
+    _write_wav(tmp_path / 'silence.wav', np.random.default_rng(3).standard_normal(SAMPLE_RATE * 5) * 1e-4)
+    assert EnergyVad().segments(str(tmp_path / 'silence.wav')) == []
+    assert WebRtcVad().segments(str(tmp_path / 'silence.wav')) == []
+
+
+# *********************************
+# *********** BACKENDS ************
+# *********************************
+
+
+def test_backend_selection(monkeypatch):
+    monkeypatch.delenv('VAD_BACKEND', raising=False)
+    assert isinstance(get_vad_backend(), WebRtcVad)
+    monkeypatch.setenv('VAD_BACKEND', 'energy')
+    assert isinstance(get_vad_backend(), EnergyVad)
+    assert isinstance(get_vad_backend('hosted'), vad.HostedVad)
+    with pytest.raises(ValueError):
+        get_vad_backend('silero')
+
+
+def test_hosted_backend_uploads_the_file(tmp_path, monkeypatch):
+    _write_wav(tmp_path / 'a.wav', np.zeros(SAMPLE_RATE))
+    calls = []
+
+    class Response:
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return [{'start': 0.1, 'end': 0.9}]
+
+    def post(url, files, timeout):
+        calls.append((url, files['file'][0], len(files['file'][1].read())))
+        return Response()
+
+    monkeypatch.setenv('HOSTED_VAD_API_URL', 'http://vad.local/v1/vad')
+    monkeypatch.setattr(vad.requests, 'post', post)
+
+    assert get_vad_backend('hosted').segments(str(tmp_path / 'a.wav')) == [{'start': 0.1, 'end': 0.9}]
+    assert calls == [('http://vad.local/v1/vad', 'a.wav', 44 + SAMPLE_RATE * 2)]
+
+
+def test_vad_is_empty_caches_per_backend(tmp_path, monkeypatch):
+    _recording(tmp_path / 'a.wav', np.random.default_rng(4), seconds=10)
+    cached = {}
+    monkeypatch.setattr(vad.redis_db, 'get_generic_cache', lambda key: cached.get(key))
+    monkeypatch.setattr(vad.redis_db, 'set_generic_cache', lambda key, value, ttl: cached.__setitem__(key, value))
+    monkeypatch.setenv('VAD_BACKEND', 'energy')
+
+    segments = vad.vad_is_empty(str(tmp_path / 'a.wav'), return_segments=True, cache=True)
+    assert segments
+    assert list(cached) == [f'vad_is_empty:energy:{tmp_path / "a.wav"}']
+    assert vad.vad_is_empty(str(tmp_path / 'a.wav'), cache=True) is False
+
+    monkeypatch.setenv('VAD_BACKEND', 'webrtc')
+    vad.vad_is_empty(str(tmp_path / 'a.wav'), cache=True)
+    assert len(cached) == 2
+
+
+# *********************************
+# ********* RANGE COPIES **********
+# *********************************
+
+
+def test_copy_wav_ranges_matches_pydub_slices(tmp_path):
+    rng = np.random.default_rng(5)
+    _write_wav(tmp_path / 'a.wav', rng.uniform(-0.5, 0.5, SAMPLE_RATE * 12))
+    ranges = [(0.5, 2.25), (7.0, 11.5), (11.9, 20.0)]
+
+    copy_wav_ranges(str(tmp_path / 'a.wav'), ranges, str(tmp_path / 'out.wav'))
+
+    audio = AudioSegment.from_wav(str(tmp_path / 'a.wav'))
+    expected = sum((audio[start * 1000 : end * 1000] for start, end in ranges), AudioSegment.empty())
+    copied = AudioSegment.from_wav(str(tmp_path / 'out.wav'))
+    assert copied.frame_rate == SAMPLE_RATE
+    assert copied.raw_data == expected.raw_data
+
+
+def test_speech_profile_trimming(tmp_path, monkeypatch):
+    path = str(tmp_path / 'profile.wav')
+    _write_wav(path, np.random.default_rng(6).uniform(-0.5, 0.5, SAMPLE_RATE * 20))
+    segments = [{'start': 1.0, 'end': 3.0}, {'start': 3.5, 'end': 5.0}, {'start': 10.0, 'end': 12.0}]
+    monkeypatch.setattr(vad, 'vad_is_empty', lambda *args, **kwargs: [dict(s) for s in segments])
+    original = AudioSegment.from_wav(path)
+
+    vad.apply_vad_for_speech_profile(path)
+
+    # Segments less than 1s apart are joined, every joined segment but the last keeps 1s of what follows it
+    expected = original[1000:6000] + original[10000:12000]
+    assert AudioSegment.from_wav(path).raw_data == expected.raw_data
+    assert [p.name for p in tmp_path.iterdir()] == ['profile.wav']
+
+    monkeypatch.setattr(vad, 'vad_is_empty', lambda *args, **kwargs: [])
+    with pytest.raises(HTTPException) as error:
+        vad.apply_vad_for_speech_profile(path)
+    assert error.value.status_code == 400
+
+
+def test_speech_profile_extensible_and_undecodable_wavs(tmp_path, monkeypatch):
+    path = str(tmp_path / 'profile.wav')
+    samples = np.random.default_rng(7).uniform(-0.5, 0.5, SAMPLE_RATE * 8)
+    _write_extensible_wav(path, samples)
+    with pytest.raises(wave.Error):
+        wave.open(path, 'rb')
+    monkeypatch.setattr(vad, 'vad_is_empty', lambda *args, **kwargs: [{'start': 1.0, 'end': 3.0}])
+
+    # Rewritten as 16-bit PCM, then trimmed
+    vad.apply_vad_for_speech_profile(path)
+    with wave.open(path, 'rb') as wav:
+        assert (wav.getsampwidth(), wav.getframerate(), wav.getnframes()) == (2, SAMPLE_RATE, SAMPLE_RATE * 2)
+        trimmed = np.frombuffer(wav.readframes(wav.getnframes()), dtype='<i2').astype(int)
+    expected = (np.clip(samples, -1, 1) * 32767).astype(int)[SAMPLE_RATE : SAMPLE_RATE * 3]
+    assert np.max(np.abs(trimmed - expected)) <= 2
+
+    with open(path, 'wb') as file:
+        file.write(b'not audio at all' * 100)
+    with pytest.raises(HTTPException) as error:
+        vad.apply_vad_for_speech_profile(path)
+    assert error.value.status_code == 400
+
+
+# *********************************
+# ********** BENCHMARK ************
+# *********************************
+
+
+def test_benchmark_accuracy_and_throughput(tmp_path):
+    """
+    Ten 60s recordings per noise level, segment accuracy against the known utterances and CPU throughput in
+    audio-hours per CPU-minute. Then splitting a 10 minute recording into its segments, the sync path, with a
+    whole-file pydub load (previous) and with range copies, time and peak memory.
+    """
+    rng = np.random.default_rng(0)
+    seconds, files = 60, 10
+    results = {}
+    for noise_db in (-60, -45, -35):
+        recordings = []
+        for i in range(files):
+            path = str(tmp_path / f'{noise_db}-{i}.wav')
+            recordings.append((path, _recording(path, rng, seconds=seconds, noise_db=noise_db)))
+        for backend in (EnergyVad(), WebRtcVad()):
+            scores, cpu = [], 0.0
+            for path, truth in recordings:
+                started = time.process_time()
+                segments = backend.segments(path)
+                cpu += time.process_time() - started
+                scores.append(_score(segments, truth, seconds))
+            precision, recall, f1 = np.mean(scores, axis=0)
+            results[(noise_db, backend.name)] = (precision, recall, f1, files * seconds / 3600 / (cpu / 60))
+
+    long_path = str(tmp_path / 'long.wav')
+    _recording(long_path, rng, seconds=600)
+    segments = WebRtcVad().segments(long_path)
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    audio = AudioSegment.from_wav(long_path)
+    for i, segment in enumerate(segments):
+        audio[segment['start'] * 1000 : segment['end'] * 1000].export(str(tmp_path / f'p{i}.wav'), format='wav')
+    del audio
+    pydub_ms = (time.perf_counter() - started) * 1000
+    pydub_peak = tracemalloc.get_traced_memory()[1] / 2**20
+
+    tracemalloc.reset_peak()
+    started = time.perf_counter()
+    for i, segment in enumerate(segments):
+        copy_wav_ranges(long_path, [(segment['start'], segment['end'])], str(tmp_path / f'c{i}.wav'))
+    copy_ms = (time.perf_counter() - started) * 1000
+    copy_peak = tracemalloc.get_traced_memory()[1] / 2**20
+    tracemalloc.stop()
+
+    print()
+    for (noise_db, name), (precision, recall, f1, rate) in results.items():
+        print(
+            f"noise {noise_db:>4}dB {name:>7}: precision {precision:.3f} recall {recall:.3f} F1 {f1:.3f} | "
+            f"{rate:6.1f} audio-hours per CPU-minute"
+        )
+    print(
+        f"split 10 min into {len(segments)} segments: pydub {pydub_ms:6.1f}ms, peak {pydub_peak:5.1f}MB | "
+        f"range copies {copy_ms:6.1f}ms, peak {copy_peak:5.1f}MB"
+    )
+
+    for noise_db in (-60, -45, -35):
+        assert results[(noise_db, 'webrtc')][2] > 0.9
+    for noise_db in (-60, -45):
+        assert results[(noise_db, 'energy')][2] > 0.9
+    assert all(rate > 10 for *_, rate in results.values())
+    assert copy_peak * 4 < pydub_peak
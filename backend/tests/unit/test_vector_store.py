@@ -0,0 +1,362 @@
+"""
+Tests for the local vector index backend (database/vector_store.py) and the bulk paths in database/vector_db.py.
+
+Covers: Pinecone-style metadata filters (including the query_vectors_by_metadata shape), per-uid partitions,
+upsert/update/delete/fetch, persistence with memory-mapped reload and batched flushes, IVF recall across deletes,
+and a recall/latency benchmark at 10k and 100k vectors (1M with OMI_VECTOR_BENCH_1M=1). Run with `-s` to see the
+benchmark table.
+"""
+
+import importlib
+import os
+import sys
+import time
+from datetime import datetime, timezone
+from unittest.mock import MagicMock
+
+import numpy as np
+import pytest
+
+from database.vector_store import LocalVectorIndex, matches_filter
+
+DIMENSIONS = 32
+
+
+def _vectors(n, dimensions=DIMENSIONS, seed=0):
+    return np.random.default_rng(seed).standard_normal((n, dimensions)).astype(np.float32)
+
+
+def _items(uid, vectors, start=0, **metadata):
+    return [
+        {
+            'id': f'{uid}-c{start + i}',
+            'values': v.tolist(),
+            'metadata': {'uid': uid, 'memory_id': f'c{start + i}', **metadata},
+        }
+        for i, v in enumerate(vectors)
+    ]
+
+
+class TestMatchesFilter:
+    META = {'uid': 'u1', 'created_at': 100, 'topics': ['work', 'travel'], 'people': [], 'category': 'core'}
+
+    @pytest.mark.parametrize(
+        'filter,expected',
+        [
+            ({'uid': 'u1'}, True),
+            ({'uid': 'u2'}, False),
+            ({'uid': {'$eq': 'u1'}}, True),
+            ({'uid': {'$ne': 'u1'}}, False),
+            ({'created_at': {'$gte': 100, '$lte': 200}}, True),
+            ({'created_at': {'$gt': 100}}, False),
+            ({'created_at': {'$lt': 'z'}}, False),
+            ({'topics': {'$in': ['travel', 'food']}}, True),
+            ({'topics': {'$in': []}}, False),
+            ({'topics': {'$nin': ['work']}}, False),
+            ({'topics': 'work'}, True),
+            ({'people': {'$in': ['alice']}}, False),
+            ({'entities': {'$in': ['x']}}, False),
+            ({'entities': {'$nin': ['x']}}, True),
+            ({'$or': [{'people': {'$in': ['alice']}}, {'topics': {'$in': ['work']}}]}, True),
+            ({'$and': [{'uid': {'$eq': 'u1'}}, {'created_at': {'$gte': 101}}]}, False),
+            (None, True),
+        ],
+    )
+    def test_operators(self, filter, expected):
+        assert matches_filter(self.META, filter) is expected
+
+    def test_unknown_operator(self):
+        with pytest.raises(ValueError):
+            matches_filter(self.META, {'uid': {'$regex': 'u'}})
+
+
+class TestLocalVectorIndex:
+    def test_query_is_scoped_to_uid_partition(self):
+        index = LocalVectorIndex()
+        vectors = _vectors(20)
+        index.upsert(_items('u1', vectors[:10]), namespace='ns1')
+        index.upsert(_items('u2', vectors[10:]), namespace='ns1')
+
+        result = index.query(vector=vectors[3].tolist(), top_k=3, filter={'uid': 'u1'}, namespace='ns1')
+        assert result['matches'][0]['id'] == 'u1-c3'
+        assert result['matches'][0]['score'] == pytest.approx(1.0, abs=1e-5)
+        assert all(m['id'].startswith('u1-') for m in result['matches'])
+        assert 'metadata' not in result['matches'][0]
+
+        unfiltered = index.query(vector=vectors[15].tolist(), top_k=1, namespace='ns1', include_metadata=True)
+        assert unfiltered['matches'][0]['metadata']['uid'] == 'u2'
+
+    def test_metadata_filters_and_ranking(self):
+        index = LocalVectorIndex()
+        vectors = _vectors(50, seed=1)
+        items = _items('u1', vectors)
+        for i, item in enumerate(items):
+            item['metadata'].update({'created_at': i, 'topics': ['even'] if i % 2 == 0 else ['odd']})
+        index.upsert(items, namespace='ns1')
+
+        query = vectors[7]
+        flt = {'$and': [{'uid': {'$eq': 'u1'}}, {'$or': [{'topics': {'$in': ['even']}}]}, {'created_at': {'$gte': 10}}]}
+        result = index.query(vector=query.tolist(), top_k=5, filter=flt, namespace='ns1', include_metadata=True)
+
+        normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        scores = normalized @ (query / np.linalg.norm(query))
+        expected = [f'u1-c{i}' for i in np.argsort(-scores) if i % 2 == 0 and i >= 10][:5]
+        assert [m['id'] for m in result['matches']] == expected
+
+    def test_upsert_overwrites_update_and_delete(self):
+        index = LocalVectorIndex()
+        vectors = _vectors(5)
+        index.upsert(_items('u1', vectors), namespace='ns1')
+        index.upsert(_items('u1', vectors[:1][::-1] * -1), namespace='ns1')
+        assert index.describe_index_stats()['total_vector_count'] == 5
+
+        index.update('u1-c1', set_metadata={'topics': ['new']}, namespace='ns1')
+        fetched = index.fetch(['u1-c1', 'missing'], namespace='ns1')['vectors']
+        assert list(fetched) == ['u1-c1']
+        assert fetched['u1-c1']['metadata'] == {'uid': 'u1', 'memory_id': 'c1', 'topics': ['new']}
+
+        index.delete(ids=['u1-c0', 'u1-c2', 'missing'], namespace='ns1')
+        remaining = index.query(vector=vectors[4].tolist(), top_k=10, filter={'uid': 'u1'}, namespace='ns1')
+        assert sorted(m['id'] for m in remaining['matches']) == ['u1-c1', 'u1-c3', 'u1-c4']
+
+        index.delete(filter={'uid': 'u1', 'topics': {'$in': ['new']}}, namespace='ns1')
+        assert index.fetch(['u1-c1'], namespace='ns1')['vectors'] == {}
+
+    def test_namespaces_are_isolated(self):
+        index = LocalVectorIndex()
+        vectors = _vectors(2)
+        index.upsert(_items('u1', vectors[:1]), namespace='ns1')
+        index.upsert(_items('u1', vectors[1:]), namespace='ns2')
+        assert index.query(vector=vectors[0].tolist(), top_k=5, namespace='ns2')['matches'][0]['id'] == 'u1-c0'
+        assert len(index.query(vector=vectors[0].tolist(), top_k=5, namespace='ns2')['matches']) == 1
+
+    def test_dimension_mismatch(self):
+        index = LocalVectorIndex()
+        index.upsert(_items('u1', _vectors(1)), namespace='ns1')
+        with pytest.raises(ValueError):
+            index.upsert(_items('u1', _vectors(1, dimensions=8), start=1), namespace='ns1')
+
+    def test_query_many_matches_query(self):
+        index = LocalVectorIndex()
+        vectors = _vectors(100, seed=2)
+        index.upsert(_items('u1', vectors), namespace='ns1')
+        queries = _vectors(4, seed=3).tolist()
+        batched = index.query_many(queries, top_k=5, filter={'uid': 'u1'}, namespace='ns1')
+        single = [index.query(vector=q, top_k=5, filter={'uid': 'u1'}, namespace='ns1') for q in queries]
+        assert batched == single
+
+
+class TestPersistence:
+    def test_round_trip_with_memory_map(self, tmp_path):
+        vectors = _vectors(30)
+        index = LocalVectorIndex(path=str(tmp_path), flush_interval=0)
+        index.upsert(_items('u/1', vectors[:20]), namespace='ns1')
+        index.upsert(_items('u2', vectors[20:]), namespace='ns1')
+        index.delete(ids=['u/1-c5'], namespace='ns1')
+
+        reloaded = LocalVectorIndex(path=str(tmp_path), flush_interval=0)
+        result = reloaded.query(vector=vectors[7].tolist(), top_k=1, filter={'uid': 'u/1'}, namespace='ns1')
+        assert result['matches'][0]['id'] == 'u/1-c7'
+        assert reloaded.fetch(['u/1-c5'], namespace='ns1')['vectors'] == {}
+        assert isinstance(reloaded._namespaces['ns1']['u2'].vectors, np.memmap)
+
+        # Writes to a memory-mapped partition copy it first
+        reloaded.upsert(_items('u2', vectors[:1], start=99), namespace='ns1')
+        assert reloaded.describe_index_stats()['namespaces']['ns1']['vector_count'] == 30
+
+        reloaded.delete(filter={'uid': 'u2'}, namespace='ns1')
+        assert not any(name.startswith('u2') for name in os.listdir(tmp_path / 'ns1'))
+
+    def test_without_flush_interval_needs_flush(self, tmp_path):
+        index = LocalVectorIndex(path=str(tmp_path), flush_interval=None)
+        index.upsert(_items('u1', _vectors(3)), namespace='ns1')
+        assert not (tmp_path / 'ns1').exists()
+        index.flush()
+        assert LocalVectorIndex(path=str(tmp_path)).describe_index_stats()['total_vector_count'] == 0
+        assert len(LocalVectorIndex(path=str(tmp_path)).fetch(['u1-c0'], namespace='ns1')['vectors']) == 1
+
+    def test_writes_are_flushed_together(self, tmp_path):
+        vectors = _vectors(20)
+        index = LocalVectorIndex(path=str(tmp_path), flush_interval=0.05)
+        writes = []
+        write_partition = index._write_partition
+        index._write_partition = lambda *args: writes.append(args[1]) or write_partition(*args)
+
+        for i in range(20):
+            index.upsert(_items('u1', vectors[i : i + 1], start=i), namespace='ns1')
+        index.delete(ids=['u1-c3'], namespace='ns1')
+        assert writes == []
+
+        deadline = time.monotonic() + 5
+        while not writes and time.monotonic() < deadline:
+            time.sleep(0.01)
+        time.sleep(0.1)
+        assert writes == ['u1']
+        reloaded = LocalVectorIndex(path=str(tmp_path), flush_interval=None)
+        assert reloaded.fetch(['u1-c3'], namespace='ns1')['vectors'] == {}
+        assert reloaded.describe_index_stats()['total_vector_count'] == 19
+
+
+def _clustered(n, dimensions, clusters, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dimensions)).astype(np.float32)
+    labels = rng.integers(0, clusters, n)
+    return (centers[labels] + 0.5 * rng.standard_normal((n, dimensions))).astype(np.float32)
+
+
+def _recall(index, uid, base, queries, k, ids=None):
+    normalized = base / np.linalg.norm(base, axis=1, keepdims=True)
+    ids = np.arange(len(base)) if ids is None else ids
+    hits = 0
+    for query in queries:
+        truth = set(ids[np.argsort(-(normalized @ (query / np.linalg.norm(query))))[:k]].tolist())
+        result = index.query(vector=query.tolist(), top_k=k, filter={'uid': uid}, namespace='ns1')
+        hits += len(truth & {int(m['id'].rsplit('c', 1)[1]) for m in result['matches']})
+    return hits / (k * len(queries))
+
+
+class TestIVF:
+    def test_ivf_recall_and_filtered_fallback(self):
+        base = _clustered(4000, DIMENSIONS, 40)
+        index = LocalVectorIndex(ivf_min_size=1000, nprobe=16)
+        items = _items('u1', base)
+        items[123]['metadata']['rare'] = True
+        index.upsert(items, namespace='ns1')
+
+        queries = _clustered(20, DIMENSIONS, 40, seed=9)
+        assert _recall(index, 'u1', base, queries, 10) >= 0.9
+        assert index._namespaces['ns1']['u1'].ivf is not None
+
+        # A filter that only matches outside the probed lists still finds its row
+        result = index.query(vector=queries[0].tolist(), top_k=1, filter={'uid': 'u1', 'rare': True}, namespace='ns1')
+        assert result['matches'][0]['id'] == 'u1-c123'
+
+    def test_deletes_keep_the_ivf(self):
+        base = _clustered(4000, DIMENSIONS, 40)
+        index = LocalVectorIndex(ivf_min_size=1000, nprobe=16)
+        index.upsert(_items('u1', base), namespace='ns1')
+        queries = _clustered(20, DIMENSIONS, 40, seed=9)
+        index.query(vector=queries[0].tolist(), top_k=1, filter={'uid': 'u1'}, namespace='ns1')
+        partition = index._namespaces['ns1']['u1']
+        ivf = partition.ivf
+
+        # A few deletes are tombstones, the IVF is untouched and the deleted rows never come back
+        top = index.query(vector=base[5].tolist(), top_k=3, filter={'uid': 'u1'}, namespace='ns1')['matches']
+        index.delete(ids=[match['id'] for match in top], namespace='ns1')
+        assert partition.ivf is ivf and partition.tombstones == 3
+        result = index.query(vector=base[5].tolist(), top_k=10, filter={'uid': 'u1'}, namespace='ns1')
+        assert not {match['id'] for match in top} & {match['id'] for match in result['matches']}
+
+        # Past the tombstone ratio the rows are compacted, the IVF lists renumbered instead of rebuilt
+        index.delete(ids=[f'u1-c{i}' for i in range(2000, 3000)], namespace='ns1')
+        deleted = {match['id'] for match in top} | {f'u1-c{i}' for i in range(2000, 3000)}
+        assert partition.tombstones == 0 and partition.size == partition.count == 4000 - len(deleted)
+        assert partition.ivf is not None and partition.ivf.centroids is ivf.centroids
+        remaining = np.array([i for i in range(4000) if f'u1-c{i}' in partition.positions])
+        assert sorted(int(row) for rows in partition.ivf.lists for row in rows) == list(range(partition.ivf.built_size))
+        assert _recall(index, 'u1', base[remaining], queries, 10, ids=remaining) >= 0.9
+
+
+class _FakeEmbeddings:
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    def embed_documents(self, texts):
+        return [np.random.default_rng(abs(hash(text)) % 2**32).standard_normal(DIMENSIONS).tolist() for text in texts]
+
+
+@pytest.fixture
+def vector_db(monkeypatch):
+    monkeypatch.setenv('VECTOR_DB_BACKEND', 'local')
+    monkeypatch.delenv('VECTOR_DB_LOCAL_PATH', raising=False)
+    clients = MagicMock()
+    clients.embeddings = _FakeEmbeddings()
+    monkeypatch.setitem(sys.modules, 'utils.llm.clients', clients)
+    monkeypatch.delitem(sys.modules, 'database.vector_db', raising=False)
+    module = importlib.import_module('database.vector_db')
+    yield module
+    sys.modules.pop('database.vector_db', None)
+
+
+class TestVectorDbLocalBackend:
+    def test_bulk_paths_and_metadata_query(self, vector_db):
+        assert isinstance(vector_db.index, LocalVectorIndex)
+        conversations = [MagicMock(id=f'c{i}') for i in range(150)]
+        vectors = _vectors(150).tolist()
+        metadata = [{'topics': ['work'] if i % 3 == 0 else ['home'], 'people': [], 'entities': []} for i in range(150)]
+        upsert = MagicMock(wraps=vector_db.index.upsert)
+        vector_db.index.upsert = upsert
+        vector_db.upsert_vectors2_bulk('u1', conversations, vectors, metadata)
+        assert upsert.call_count == 2  # batches of UPSERT_BATCH_SIZE
+
+        now = datetime.now(timezone.utc)
+        ids = vector_db.query_vectors_by_metadata(
+            'u1', vectors[3], [datetime(2020, 1, 1, tzinfo=timezone.utc), now], [], ['work'], [], [], limit=5
+        )
+        assert ids[0] == 'c3'
+        assert all(int(i[1:]) % 3 == 0 for i in ids)
+
+        vector_db.delete_vectors('u1', [f'c{i}' for i in range(0, 150, 3)])
+        assert vector_db.query_vectors_by_metadata('u1', vectors[3], [], [], ['work'], [], [], limit=5) == []
+        assert 'c3' not in vector_db.query_vectors('anything', 'u1', k=150)
+
+    def test_query_vectors_many_matches_query_vectors(self, vector_db):
+        texts = [f'topic {i}' for i in range(20)]
+        vectors = vector_db.embeddings.embed_documents(texts)
+        vector_db.upsert_vectors('u1', vectors, [MagicMock(id=f'c{i}') for i in range(20)])
+        many = vector_db.query_vectors_many(['topic 4', 'topic 9'], 'u1', k=3)
+        assert many == [vector_db.query_vectors('topic 4', 'u1', k=3), vector_db.query_vectors('topic 9', 'u1', k=3)]
+        assert [ids[0] for ids in many] == ['c4', 'c9']
+
+    def test_memory_vectors_bulk(self, vector_db):
+        memories = [(f'm{i}', f'memory {i}', 'core') for i in range(5)]
+        vector_db.upsert_memory_vectors('u1', memories)
+        assert vector_db.find_similar_memories('u1', 'memory 2', threshold=0.99)[0]['memory_id'] == 'm2'
+        vector_db.delete_memory_vectors('u1', ['m2'])
+        assert vector_db.find_similar_memories('u1', 'memory 2', threshold=0.99) == []
+        assert vector_db.search_memories_by_vector('u1', 'memory 3', limit=1) == ['m3']
+
+
+class TestBenchmark:
+    DIMENSIONS = 256
+    QUERIES = 50
+
+    def _run(self, n):
+        base = _clustered(n, self.DIMENSIONS, max(16, n // 500), seed=n)
+        queries = _clustered(self.QUERIES, self.DIMENSIONS, max(16, n // 500), seed=n)
+        index = LocalVectorIndex(ivf_min_size=10**12)
+        started = time.perf_counter()
+        for i in range(0, n, 10000):
+            index.upsert(_items('u1', base[i : i + 10000], start=i), namespace='ns1')
+        upsert_rate = n / (time.perf_counter() - started)
+
+        def _latency(idx):
+            started = time.perf_counter()
+            for query in queries:
+                idx.query(vector=query.tolist(), top_k=10, filter={'uid': 'u1'}, namespace='ns1')
+            return (time.perf_counter() - started) / self.QUERIES * 1000
+
+        flat_ms = _latency(index)
+        index.ivf_min_size = 10000
+        started = time.perf_counter()
+        index._namespaces['ns1']['u1'].maybe_build_ivf(index.ivf_min_size)
+        build_s = time.perf_counter() - started
+        ivf_ms = _latency(index)
+        recall = _recall(index, 'u1', base, queries[:20], 10)
+        print(
+            f'{n:9d} | {upsert_rate:10.0f} | {flat_ms:8.2f} | {ivf_ms:7.2f} | {recall:9.3f} | {build_s:7.2f}',
+            flush=True,
+        )
+        return flat_ms, ivf_ms, recall
+
+    def test_recall_and_latency(self):
+        sizes = [10_000, 100_000]
+        if os.getenv('OMI_VECTOR_BENCH_1M'):
+            sizes.append(1_000_000)
+        print(f'\n{self.DIMENSIONS}-d vectors, top_k=10, one uid partition')
+        print('  vectors | upserts/s  | flat ms  | ivf ms  | recall@10 | build s')
+        for n in sizes:
+            flat_ms, ivf_ms, recall = self._run(n)
+            assert recall >= 0.8
+            if n >= 100_000:
+                assert ivf_ms < flat_ms
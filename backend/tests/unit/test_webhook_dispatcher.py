@@ -0,0 +1,196 @@
+"""
+Tests for the shared async webhook dispatcher (utils/webhook_dispatcher.py).
+
+Covers: circuit breaker open / half-open / close, per-destination and per-user concurrency limits, isolation of a
+slow destination from healthy ones and of a busy user from the others, and coalescing of queued transcript batches.
+"""
+
+import asyncio
+
+import httpx
+
+from utils.webhook_dispatcher import CircuitBreaker, WebhookDispatcher, coalesce_transcript_batches
+
+
+def _dispatcher(handler, **kwargs) -> WebhookDispatcher:
+    dispatcher = WebhookDispatcher(**kwargs)
+    dispatcher._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return dispatcher
+
+
+class TestCircuitBreaker:
+    def test_opens_after_threshold_and_half_opens_after_timeout(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10)
+        breaker.record_failure(0)
+        assert breaker.allow(1)
+        breaker.record_failure(1)
+        assert not breaker.allow(2)
+
+        # Single trial after the cool-down
+        assert breaker.allow(12)
+        assert not breaker.allow(12)
+
+        # Failed trial re-opens immediately
+        breaker.record_failure(12)
+        assert not breaker.allow(13)
+        assert breaker.allow(23)
+        breaker.record_success()
+        assert breaker.is_closed and breaker.allow(24)
+
+
+class TestWebhookDispatcher:
+    def test_skips_destination_while_circuit_open(self):
+        calls = []
+
+        async def handler(request):
+            calls.append(str(request.url))
+            return httpx.Response(503)
+
+        async def _run():
+            dispatcher = _dispatcher(handler, failure_threshold=3, reset_timeout=60)
+            responses = [await dispatcher.post('https://down.example.com/hook', json={}) for _ in range(5)]
+            await dispatcher.aclose()
+            return dispatcher, responses
+
+        dispatcher, responses = asyncio.run(_run())
+        assert [r.status_code for r in responses[:3]] == [503, 503, 503]
+        assert responses[3:] == [None, None]
+        assert len(calls) == 3
+        assert not dispatcher._destinations['https://down.example.com'].breaker.is_closed
+
+    def test_transport_errors_return_none(self):
+        async def handler(request):
+            raise httpx.ConnectError('refused', request=request)
+
+        async def _run():
+            dispatcher = _dispatcher(handler)
+            response = await dispatcher.post('https://broken.example.com/hook', content=b'abc')
+            await dispatcher.aclose()
+            return dispatcher, response
+
+        dispatcher, response = asyncio.run(_run())
+        assert response is None
+        assert dispatcher._destinations['https://broken.example.com'].breaker.consecutive_failures == 1
+
+    def test_client_errors_do_not_trip_circuit(self):
+        calls = []
+
+        async def handler(request):
+            calls.append(str(request.url))
+            return httpx.Response(404)
+
+        async def _run():
+            dispatcher = _dispatcher(handler, failure_threshold=1)
+            responses = [await dispatcher.post('https://app.example.com/hook', json={}) for _ in range(3)]
+            await dispatcher.aclose()
+            return dispatcher, responses
+
+        dispatcher, responses = asyncio.run(_run())
+        assert [r.status_code for r in responses] == [404, 404, 404]
+        assert len(calls) == 3
+        assert dispatcher._destinations['https://app.example.com'].breaker.is_closed
+
+    def test_per_destination_concurrency_limit(self):
+        in_flight = {'slow.example.com': 0, 'fast.example.com': 0}
+        peak = dict(in_flight)
+
+        async def handler(request):
+            host = request.url.host
+            in_flight[host] += 1
+            peak[host] = max(peak[host], in_flight[host])
+            await asyncio.sleep(0.05 if host == 'slow.example.com' else 0.001)
+            in_flight[host] -= 1
+            return httpx.Response(200, json={})
+
+        async def _run():
+            dispatcher = _dispatcher(handler, per_destination_concurrency=2)
+            slow = [dispatcher.post('https://slow.example.com/hook', json={}) for _ in range(6)]
+            fast = [dispatcher.post('https://fast.example.com/hook', json={}) for _ in range(6)]
+
+            async def _timed(coros):
+                await asyncio.gather(*coros)
+                return asyncio.get_running_loop().time()
+
+            started = asyncio.get_running_loop().time()
+            slow_done, fast_done = await asyncio.gather(_timed(slow), _timed(fast))
+            await dispatcher.aclose()
+            return slow_done - started, fast_done - started
+
+        slow_elapsed, fast_elapsed = asyncio.run(_run())
+        assert peak == {'slow.example.com': 2, 'fast.example.com': 2}
+        # 6 requests / 2 slots * 50ms for the slow endpoint; the fast one isn't held up behind it
+        assert slow_elapsed >= 0.15
+        assert fast_elapsed < slow_elapsed / 2
+
+    def test_one_user_does_not_take_every_slot_of_a_shared_destination(self):
+        in_flight, peak = {}, {}
+
+        async def handler(request):
+            uid = request.url.params['uid']
+            in_flight[uid] = in_flight.get(uid, 0) + 1
+            peak[uid] = max(peak.get(uid, 0), in_flight[uid])
+            await asyncio.sleep(0.05 if uid == 'busy' else 0.001)
+            in_flight[uid] -= 1
+            return httpx.Response(200, json={})
+
+        async def _run():
+            dispatcher = _dispatcher(handler, per_destination_concurrency=8, per_user_concurrency=2)
+            url = 'https://app.example.com/hook?uid={}'
+            busy = [dispatcher.post(url.format('busy'), json={}, uid='busy') for _ in range(6)]
+            others = [dispatcher.post(url.format(f'u{i}'), json={}, uid=f'u{i}') for i in range(6)]
+
+            async def _timed(coros):
+                await asyncio.gather(*coros)
+                return asyncio.get_running_loop().time()
+
+            started = asyncio.get_running_loop().time()
+            busy_done, others_done = await asyncio.gather(_timed(busy), _timed(others))
+            destination = dispatcher._destinations['https://app.example.com']
+            await dispatcher.aclose()
+            return busy_done - started, others_done - started, destination
+
+        busy_elapsed, others_elapsed, destination = asyncio.run(_run())
+        assert peak['busy'] == 2
+        assert others_elapsed < busy_elapsed / 2
+        # Per-user slots are dropped once idle
+        assert destination.user_semaphores == {} and destination.in_flight == 0
+
+    def test_destination_is_scheme_host_port(self):
+        assert WebhookDispatcher.destination_of('https://Hook.Example.com:8443/a?uid=1') == (
+            'https://hook.example.com:8443'
+        )
+
+    def test_evicts_idle_destinations(self):
+        async def handler(request):
+            return httpx.Response(200)
+
+        async def _run():
+            dispatcher = _dispatcher(handler, max_destinations=2)
+            for i in range(4):
+                await dispatcher.post(f'https://host{i}.example.com/hook', json={})
+            await dispatcher.aclose()
+            return dispatcher
+
+        assert list(asyncio.run(_run())._destinations) == ['https://host2.example.com', 'https://host3.example.com']
+
+
+class TestCoalesceTranscriptBatches:
+    def test_groups_by_conversation_and_keeps_latest_segment(self):
+        batch = [
+            {'memory_id': 'c1', 'segments': [{'id': 'a', 'text': 'hel'}]},
+            {'memory_id': 'c1', 'segments': [{'id': 'a', 'text': 'hello'}, {'id': 'b', 'text': 'world'}]},
+            {'memory_id': 'c2', 'segments': [{'id': 'x', 'text': 'other'}]},
+            {'memory_id': 'c1', 'segments': [{'id': 'c', 'text': '!'}]},
+        ]
+        coalesced = coalesce_transcript_batches(batch)
+        assert [memory_id for memory_id, _ in coalesced] == ['c1', 'c2']
+        assert coalesced[0][1] == [
+            {'id': 'a', 'text': 'hello'},
+            {'id': 'b', 'text': 'world'},
+            {'id': 'c', 'text': '!'},
+        ]
+        assert coalesced[1][1] == [{'id': 'x', 'text': 'other'}]
+
+    def test_segments_without_ids_are_kept(self):
+        coalesced = coalesce_transcript_batches([{'memory_id': None, 'segments': [{'text': 'a'}, {'text': 'b'}]}])
+        assert coalesced == [(None, [{'text': 'a'}, {'text': 'b'}])]
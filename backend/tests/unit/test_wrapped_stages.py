@@ -0,0 +1,423 @@
+"""
+Tests for the Wrapped 2025 stage graph (utils/other/stage_graph.py, utils/wrapped/generate_2025.py).
+
+Covers: dependency order and the concurrency cap of the stage graph, fallbacks, failures, checkpoints restored
+without running again, the shared conversations context against building it per analysis, conversations read page
+by page, and a retry that only runs the analyses not checkpointed. Ends with a benchmark of the wall-clock time per
+user with a stubbed LLM, the sequential generation vs the stage graph, run with `-s` to see the report.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock
+
+import pytest
+
+os.environ.setdefault(
+    "ENCRYPTION_SECRET",
+    "omi_ZwB2ZNqB2HHpMK6wStk7sTpavJiPTFg7gXUHnc4tFABPU6pZ2c2DKgehtfgi4RZv",
+)
+
+for _name in ["database._client", "database.users", "utils.other.storage", "utils.llm.clients", "utils.notifications"]:
+    sys.modules[_name] = MagicMock()
+
+import utils.wrapped.generate_2025 as wrapped
+from models.conversation import Conversation
+from utils.other.stage_graph import GraphStage, run_stage_graph
+
+START = datetime(2025, 12, 31, tzinfo=timezone.utc)
+
+# *********************************
+# ********** STAGE GRAPH **********
+# *********************************
+
+
+def _sleeper(name, seconds, log, value=None):
+    def func(inputs):
+        log.append(('start', name, sorted(inputs)))
+        time.sleep(seconds)
+        log.append(('end', name))
+        return value if value is not None else name
+
+    return func
+
+
+def test_stages_run_after_their_dependencies_up_to_the_cap():
+    log, running, peak, lock = [], [0], [0], threading.Lock()
+
+    def tracked(name):
+        def func(inputs):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.03)
+            with lock:
+                running[0] -= 1
+            log.append(name)
+            return {k: v for k, v in inputs.items()}
+
+        return func
+
+    stages = [GraphStage('read', tracked('read'))]
+    stages += [GraphStage(f'analysis-{i}', tracked(f'analysis-{i}'), after=['read']) for i in range(6)]
+    stages += [GraphStage('save', tracked('save'), after=[f'analysis-{i}' for i in range(6)])]
+
+    start = time.perf_counter()
+    run = run_stage_graph(stages, max_workers=3)
+    elapsed = time.perf_counter() - start
+
+    assert log[0] == 'read' and log[-1] == 'save'
+    assert peak[0] == 3
+    # read, two rounds of three analyses, save
+    assert elapsed < 0.03 * 4 + 0.1
+    assert sorted(run.results['save']) == [f'analysis-{i}' for i in range(6)]
+    assert run.failed == [] and run.restored == [] and len(run.timings) == 8
+
+
+def test_failing_stage_gets_its_fallback_and_the_rest_runs():
+    log, done = [], []
+
+    def boom(inputs):
+        raise RuntimeError('quota exceeded')
+
+    stages = [
+        GraphStage('read', _sleeper('read', 0, log)),
+        GraphStage('analysis', boom, after=['read'], fallback={'name': 'default'}),
+        GraphStage('other', _sleeper('other', 0, log), after=['read'], fallback={}),
+        GraphStage('save', lambda r: r['analysis']['name'], after=['analysis', 'other']),
+    ]
+    run = run_stage_graph(stages, on_done=lambda stage, result, failed: done.append((stage.name, failed)))
+
+    assert run.results['save'] == 'default'
+    assert run.failed == ['analysis']
+    assert sorted(done) == [('analysis', True), ('other', False), ('read', False), ('save', False)]
+    # The fallback handed out is a copy
+    run.results['analysis']['name'] = 'changed'
+    assert stages[1].fallback == {'name': 'default'}
+
+
+def test_failing_stage_without_fallback_fails_the_run():
+    log = []
+
+    def boom(inputs):
+        raise RuntimeError('firestore down')
+
+    stages = [
+        GraphStage('read', boom),
+        GraphStage('analysis', _sleeper('analysis', 0, log), after=['read']),
+    ]
+    with pytest.raises(RuntimeError, match='firestore down'):
+        run_stage_graph(stages)
+    assert log == []
+
+
+def test_done_stages_are_not_run_again():
+    log, done = [], []
+    stages = [
+        GraphStage('read', _sleeper('read', 0, log, value='pages')),
+        GraphStage('a', _sleeper('a', 0, log), after=['read']),
+        GraphStage('b', _sleeper('b', 0, log), after=['read']),
+        GraphStage('c', lambda r: r['a'] + r['b'], after=['a', 'b']),
+    ]
+    run = run_stage_graph(stages, done={'a': 'from checkpoint'}, on_done=lambda s, r, f: done.append(s.name))
+
+    assert run.restored == ['a']
+    assert [entry for entry in log if entry[0] == 'start'] == [('start', 'read', []), ('start', 'b', ['read'])]
+    assert run.results['c'] == 'from checkpointb'
+    assert sorted(done) == ['b', 'c', 'read']
+
+
+def test_unknown_and_cyclic_dependencies_are_rejected():
+    noop = lambda r: None
+    with pytest.raises(ValueError, match='unknown'):
+        run_stage_graph([GraphStage('a', noop, after=['b'])])
+    with pytest.raises(ValueError, match='depend on each other'):
+        run_stage_graph([GraphStage('a', noop, after=['b']), GraphStage('b', noop, after=['a']), GraphStage('c', noop)])
+    with pytest.raises(ValueError, match='Duplicate'):
+        run_stage_graph([GraphStage('a', noop), GraphStage('a', noop)])
+
+
+# *********************************
+# ********* YEAR CONTEXT **********
+# *********************************
+
+
+def _conversation(i, segments=4, overview_words=40):
+    created_at = START - timedelta(hours=7 * i)
+    return {
+        'id': f'c{i}',
+        'created_at': created_at,
+        'started_at': created_at,
+        'finished_at': created_at + timedelta(minutes=20),
+        'status': 'completed',
+        'structured': {
+            'title': f'conversation {i} about the roadmap',
+            'overview': ' '.join(['we went over the plan for the quarter and who does what'] * (overview_words // 12)),
+            'category': ['work', 'personal', 'health'][i % 3],
+        },
+        'transcript_segments': [
+            {
+                'text': 'honestly i think we should ship it, sounds good to me' if s % 2 == 0 else 'makes sense',
+                'speaker': f'SPEAKER_0{s % 2}',
+                'speaker_id': s % 2,
+                'is_user': s % 2 == 0,
+                'start': s * 30.0,
+                'end': s * 30.0 + 25,
+            }
+            for s in range(segments)
+        ],
+    }
+
+
+def _context_per_analysis(conversations, max_chars=800000):
+    """The context every analysis used to build for itself."""
+    context_parts, total_chars = [], 0
+    for conv in conversations:
+        if not conv.created_at:
+            continue
+        date_str = conv.created_at.strftime("%Y-%m-%d %H:%M")
+        title = conv.structured.title if conv.structured else "Untitled"
+        overview = conv.structured.overview if conv.structured else ""
+        entry = f"[{date_str}] {title}: {overview}\n"
+        if total_chars + len(entry) > max_chars:
+            break
+        context_parts.append(entry)
+        total_chars += len(entry)
+    return "\n".join(context_parts)
+
+
+def test_shared_context_matches_the_context_of_each_analysis():
+    conversations = [Conversation(**_conversation(i, overview_words=12 * (1 + i % 5))) for i in range(400)]
+    digest = wrapped._YearDigest()
+    digest.context = wrapped._ConversationsContext(max_chars=50000)
+    for conversation in conversations:
+        digest.add(conversation)
+
+    for max_chars in [None, 40000, 12345, 300, 10]:
+        expected = _context_per_analysis(conversations, max_chars or 50000)
+        assert digest.context.text(max_chars) == expected
+    assert digest.context.text(40000) is digest.context.text(40000)
+
+
+def test_digest_stats_match_the_full_list():
+    data = [_conversation(i, segments=i % 6) for i in range(120)]
+    digest = wrapped._YearDigest()
+    for conversation in data:
+        digest.add(Conversation(**conversation))
+    conversations = [Conversation(**c) for c in data]
+
+    stats = wrapped._compute_all_stats(digest, [{'completed': True}, {'completed': False}])
+
+    assert stats['total_conversations'] == 120
+    assert stats['days_active'] == len({c.created_at.date() for c in conversations})
+    expected_seconds = sum(wrapped._compute_conversation_duration(c) for c in conversations)
+    assert stats['total_time_hours'] == round(expected_seconds / 3600, 1)
+    assert stats['top_categories'] == ['work', 'personal', 'health']
+    phrases = wrapped._find_signature_phrases(conversations)
+    assert stats['signature_phrase'] == {
+        'phrase': max(phrases.items(), key=lambda x: x[1])[0],
+        'count': max(phrases.values()),
+    }
+    assert stats['action_items_completion_rate'] == 0.5
+
+
+# *********************************
+# ********** GENERATION ***********
+# *********************************
+
+_ANSWERS = {
+    'DECISION STYLE': {'name': 'Strategic Questioner', 'description': 'You ask first.'},
+    'MOST USED PHRASES': {'phrases': [{'phrase': 'ship it', 'context': 'always'}]},
+    'most memorable days': {'most_fun_day': {'title': 'Launch party'}},
+    'FUNNIEST': {'title': 'The demo'},
+    'EMBARRASSING': {'title': 'Wrong meeting'},
+    'TOP 5 PEOPLE': [{'name': 'Ana'}],
+    "COULDN'T STOP TALKING": {'show': 'Severance'},
+    'MOVIES': {'movies': ['Arrival']},
+    'STRUGGLE': {'struggle': {'title': 'Sleep'}, 'personal_win': {'title': 'Marathon'}},
+}
+
+
+class _FakeLLM:
+    def __init__(self, delay=0.0, fail_on=None):
+        self.delay = delay
+        self.fail_on = fail_on
+        self.prompts = []
+        self.lock = threading.Lock()
+
+    def invoke(self, prompt):
+        with self.lock:
+            self.prompts.append(prompt)
+        time.sleep(self.delay)
+        for key, answer in _ANSWERS.items():
+            if key in prompt:
+                if key == self.fail_on:
+                    raise RuntimeError('503 from Gemini')
+                return MagicMock(content=json.dumps(answer))
+        raise AssertionError(f'unexpected prompt: {prompt[:80]}')
+
+
+class _FakeWrapped:
+    def __init__(self):
+        self.doc = {'status': 'processing'}
+        self.progress = []
+
+    def get_wrapped(self, uid, year):
+        return dict(self.doc)
+
+    def save_wrapped_stage(self, uid, year, stage, result, progress=None):
+        self.doc.setdefault('stages', {})[stage] = json.loads(json.dumps(result))
+        self.progress.append(progress)
+
+    def update_wrapped_progress(self, uid, year, progress):
+        self.progress.append(progress)
+
+    def update_wrapped_status(self, uid, year, status, result=None, error=None):
+        self.doc.update({'status': status, 'result': result, 'error': error})
+        if status == 'done':
+            self.doc.pop('stages', None)
+
+
+@pytest.fixture
+def year(monkeypatch):
+    state = MagicMock(pages=0)
+    data = [_conversation(i) for i in range(250)]
+
+    def iter_conversations(uid, limit, offset, include_discarded, statuses, start_date, end_date, page_size):
+        assert statuses == ['completed'] and limit == wrapped.MAX_CONVERSATIONS
+        for i in range(0, len(data), page_size):
+            state.pages += 1
+            yield [dict(c) for c in data[i : i + page_size]]
+
+    fake = _FakeWrapped()
+    for name in ['get_wrapped', 'save_wrapped_stage', 'update_wrapped_progress', 'update_wrapped_status']:
+        monkeypatch.setattr(wrapped.wrapped_db, name, getattr(fake, name))
+    monkeypatch.setattr(wrapped.conversations_db, 'iter_conversations', iter_conversations)
+    monkeypatch.setattr(
+        wrapped.conversations_db,
+        'get_conversations_without_photos',
+        MagicMock(side_effect=AssertionError('the year is streamed')),
+    )
+    monkeypatch.setattr(wrapped.action_items_db, 'get_action_items', lambda **kwargs: [{'completed': True}])
+    monkeypatch.setattr(wrapped, '_send_wrapped_ready_notification', MagicMock())
+    monkeypatch.setattr(wrapped, 'CONVERSATIONS_PAGE_SIZE', 100)
+    state.fake = fake
+    return state
+
+
+def test_generation_streams_the_year_and_runs_every_analysis(year, monkeypatch):
+    llm = _FakeLLM()
+    monkeypatch.setattr(wrapped, 'llm_gemini_flash', llm)
+
+    wrapped.generate_wrapped_2025('u1')
+
+    doc = year.fake.doc
+    assert doc['status'] == 'done', doc.get('error')
+    result = doc['result']
+    assert year.pages == 3
+    assert result['total_conversations'] == 250
+    assert result['decision_style']['name'] == 'Strategic Questioner'
+    assert result['top_phrases'] == [{'phrase': 'ship it', 'context': 'always'}]
+    assert result['top_buddies'] == [{'name': 'Ana'}]
+    assert result['movie_recommendations'] == ['Arrival']
+    assert result['struggle'] == {'title': 'Sleep'} and result['personal_win'] == {'title': 'Marathon'}
+    assert len(llm.prompts) == 9
+    # Progress only goes forward and checkpoints were dropped once the result was saved
+    pcts = [p['pct'] for p in year.fake.progress]
+    assert pcts == sorted(pcts) and pcts[-1] >= 0.95
+    assert 'stages' not in doc
+
+
+def test_retry_only_runs_the_analyses_not_checkpointed(year, monkeypatch):
+    failing = _FakeLLM(fail_on='MOVIES')
+    monkeypatch.setattr(wrapped, 'llm_gemini_flash', failing)
+
+    # The movies analysis fails and the run dies before saving, as a crashed instance would
+    def crash(uid, year_, status, result=None, error=None):
+        if status == 'done':
+            raise RuntimeError('instance restarted')
+        year.fake.doc.update({'status': status, 'error': error})
+
+    monkeypatch.setattr(wrapped.wrapped_db, 'update_wrapped_status', crash)
+    wrapped.generate_wrapped_2025('u1')
+    assert year.fake.doc['status'] == 'error'
+    assert sorted(year.fake.doc['stages']) == sorted(set(wrapped.CHECKPOINTED_STAGES) - {'movie_recommendations'})
+
+    retry = _FakeLLM()
+    monkeypatch.setattr(wrapped, 'llm_gemini_flash', retry)
+    monkeypatch.setattr(wrapped.wrapped_db, 'update_wrapped_status', year.fake.update_wrapped_status)
+    wrapped.generate_wrapped_2025('u1')
+
+    assert year.fake.doc['status'] == 'done'
+    assert len(retry.prompts) == 1 and 'MOVIES' in retry.prompts[0]
+    assert year.fake.doc['result']['movie_recommendations'] == ['Arrival']
+    assert year.fake.doc['result']['funniest_event'] == {'title': 'The demo'}
+
+
+# *********************************
+# ********** BENCHMARK ************
+# *********************************
+
+
+def test_benchmark_wall_clock_per_user(year, monkeypatch):
+    """
+    One user with 2000 conversations, a Gemini call stubbed at 200ms. Before: the year read in one call, then the
+    nine analyses one after another, each building its own context. After: the stage graph.
+    """
+    delay, count = 0.2, 2000
+    data = [_conversation(i, overview_words=60) for i in range(count)]
+
+    def iter_conversations(uid, limit, offset, include_discarded, statuses, start_date, end_date, page_size):
+        for i in range(0, len(data), page_size):
+            yield [dict(c) for c in data[i : i + page_size]]
+
+    monkeypatch.setattr(wrapped.conversations_db, 'iter_conversations', iter_conversations)
+
+    def before():
+        llm = _FakeLLM(delay)
+        monkeypatch.setattr(wrapped, 'llm_gemini_flash', llm)
+        start = time.perf_counter()
+        conversations = [Conversation(**dict(c)) for c in data]
+        held = len(conversations)
+        stats = {'total_conversations': len(conversations)}
+        builds = 0
+        for analysis, max_chars in [
+            (lambda c: wrapped._determine_archetype_with_llm(c, stats), 300000),
+            (wrapped._find_top_phrases_with_llm, 400000),
+            (wrapped._analyze_memorable_days_with_llm, 800000),
+            (wrapped._find_funniest_event_with_llm, 800000),
+            (wrapped._find_most_embarrassing_event_with_llm, 800000),
+            (wrapped._find_top_buddies_with_llm, 800000),
+            (wrapped._find_obsessions_with_llm, 800000),
+            (wrapped._find_movie_recommendations_with_llm, 800000),
+            (wrapped._find_struggles_and_wins_with_llm, 800000),
+        ]:
+            analysis(_context_per_analysis(conversations, max_chars))
+            builds += 1
+        return time.perf_counter() - start, builds, held, len(llm.prompts)
+
+    def after():
+        llm = _FakeLLM(delay)
+        monkeypatch.setattr(wrapped, 'llm_gemini_flash', llm)
+        start = time.perf_counter()
+        wrapped.generate_wrapped_2025('u1')
+        assert year.fake.doc['status'] == 'done'
+        return time.perf_counter() - start, len(llm.prompts)
+
+    before_seconds, builds, held, before_calls = before()
+    after_seconds, after_calls = after()
+
+    print()
+    print(f"Wrapped for one user, {count} conversations, Gemini stubbed at {delay * 1000:.0f}ms per call")
+    print(f"  before: {before_seconds:5.2f}s wall clock, {before_calls} calls in a row, {builds} context builds")
+    print(f"          {held} conversations with transcripts held at once")
+    print(
+        f"  after:  {after_seconds:5.2f}s wall clock, {after_calls} calls {wrapped.WRAPPED_STAGE_CONCURRENCY} at a"
+        f" time, 1 context build, pages of {wrapped.CONVERSATIONS_PAGE_SIZE} conversations"
+    )
+    assert before_calls == after_calls == 9
+    assert after_seconds < before_seconds / 2
@@ -1,3 +1,4 @@
+import asyncio
 import threading
 from typing import List, Any
 from datetime import datetime
@@ -15,8 +16,16 @@ from models.app import App, UsageHistoryType
 from models.chat import Message
 from models.conversation import Conversation, ConversationSource
 from models.notification_message import NotificationMessage
-from utils.apps import get_available_apps
+from utils.apps import (
+    APP_TRIGGERS_CONVERSATION_CREATION,
+    APP_TRIGGERS_REALTIME,
+    APP_TRIGGERS_REALTIME_AUDIO_BYTES,
+    EnabledAppSet,
+    get_enabled_app_set,
+    peek_enabled_app_set,
+)
 from utils.notifications import send_notification
+from utils.webhook_dispatcher import get_webhook_dispatcher
 from utils.llm.clients import generate_embedding
 from utils.llm.proactive_notification import get_proactive_message
 from database.vector_db import query_vectors_by_metadata
@@ -90,8 +99,7 @@ def trigger_external_integrations(uid: str, conversation: Conversation) -> list:
     if not conversation or conversation.discarded:
         return []
 
-    apps: List[App] = get_available_apps(uid)
-    filtered_apps = [app for app in apps if app.triggers_on_conversation_creation() and app.enabled]
+    filtered_apps = get_enabled_app_set(uid).with_capability(APP_TRIGGERS_CONVERSATION_CREATION)
     if not filtered_apps:
         return []
 
@@ -162,13 +170,13 @@ def trigger_external_integrations(uid: str, conversation: Conversation) -> list:
 async def trigger_realtime_integrations(uid: str, segments: list[dict], conversation_id: str | None):
     print("trigger_realtime_integrations", uid)
     """REALTIME STREAMING"""
-    _trigger_realtime_integrations(uid, segments, conversation_id)
+    return await _trigger_realtime_integrations(uid, segments, conversation_id)
 
 
 async def trigger_realtime_audio_bytes(uid: str, sample_rate: int, data: bytearray):
     print("trigger_realtime_audio_bytes", uid)
     """REALTIME AUDIO STREAMING"""
-    _trigger_realtime_audio_bytes(uid, sample_rate, data)
+    return await _trigger_realtime_audio_bytes(uid, sample_rate, data)
 
 
 # proactive notification
@@ -266,39 +274,39 @@ def _process_proactive_notification(uid: str, app: App, data):
     return message
 
 
-def _trigger_realtime_audio_bytes(uid: str, sample_rate: int, data: bytearray):
-    apps: List[App] = get_available_apps(uid)
-    filtered_apps = [app for app in apps if app.triggers_realtime_audio_bytes() and app.enabled]
+async def _get_enabled_app_set(uid: str) -> EnabledAppSet:
+    # A cache hit is a dict lookup, only a miss (Redis/Firestore) goes to a thread
+    return peek_enabled_app_set(uid) or await asyncio.to_thread(get_enabled_app_set, uid)
+
+
+async def _trigger_realtime_audio_bytes(uid: str, sample_rate: int, data: bytearray):
+    app_set = await _get_enabled_app_set(uid)
+    filtered_apps = app_set.with_capability(APP_TRIGGERS_REALTIME_AUDIO_BYTES)
     if not filtered_apps:
         return {}
 
-    threads = []
     results = {}
+    dispatcher = get_webhook_dispatcher()
+    content = bytes(data)
 
-    def _single(app: App):
+    async def _single(app: App):
         if not app.external_integration.webhook_url:
             return
 
         url = app.external_integration.webhook_url
         url += f'?sample_rate={sample_rate}&uid={uid}'
-        try:
-            response = requests.post(url, data=data, headers={'Content-Type': 'application/octet-stream'}, timeout=15)
+        response = await dispatcher.post(
+            url, content=content, headers={'Content-Type': 'application/octet-stream'}, timeout=15, uid=uid
+        )
+        if response is not None:
             print('trigger_realtime_audio_bytes', app.id, 'status:', response.status_code)
-        except Exception as e:
-            print(f"Plugin integration error: {e}")
-            return
 
-    for app in filtered_apps:
-        threads.append(threading.Thread(target=_single, args=(app,)))
-
-    [t.start() for t in threads]
-    [t.join() for t in threads]
+    await asyncio.gather(*[_single(app) for app in filtered_apps])
 
     return results
 
 
-def _trigger_realtime_integrations(uid: str, segments: List[dict], conversation_id: str | None) -> dict:
-    # Process mentor notification first (built-in feature)
+def _process_mentor_notification(uid: str, segments: List[dict]) -> dict:
     from utils.mentor_notifications import process_mentor_notification
 
     mentor_results = {}
@@ -314,28 +322,70 @@ def _trigger_realtime_integrations(uid: str, segments: List[dict], conversation_
             image='https://raw.githubusercontent.com/BasedHardware/Omi/main/assets/images/app_logo.png',
             capabilities={'proactive_notification'},
             enabled=True,
-            proactive_notification_scopes=['user_name', 'user_facts', 'user_context', 'user_chat']
+            proactive_notification_scopes=['user_name', 'user_facts', 'user_context', 'user_chat'],
         )
         mentor_message = _process_proactive_notification(uid, mentor_app, mentor_notification)
         if mentor_message:
             mentor_results['mentor'] = mentor_message
             print(f"Sent mentor notification to user {uid}")
+    return mentor_results
 
-    apps: List[App] = get_available_apps(uid)
-    filtered_apps = [app for app in apps if app.triggers_realtime() and app.enabled]
+
+def _handle_realtime_app_response(uid: str, app: App, conversation_id: str | None, response_data) -> str | None:
+    if (app.uid is None or app.uid != uid) and conversation_id is not None:
+        record_app_usage(
+            uid,
+            app.id,
+            UsageHistoryType.transcript_processed_external_integration,
+            conversation_id=conversation_id,
+        )
+
+    if not response_data:
+        return None
+
+    result = None
+
+    # message
+    message = response_data.get('message', '')
+    if message and len(message) > 5:
+        send_app_notification(uid, app.name, app.id, message)
+        result = message
+
+    # proactive_notification
+    noti = response_data.get('notification', None)
+    if app.has_capability("proactive_notification"):
+        message = _process_proactive_notification(uid, app, noti)
+        if message:
+            result = message
+
+    return result
+
+
+def _add_app_messages(uid: str, results: dict) -> list:
+    messages = []
+    for key, message in results.items():
+        if not message:
+            continue
+        messages.append(add_app_message(message, key, uid))
+    return messages
+
+
+async def _trigger_realtime_integrations(uid: str, segments: List[dict], conversation_id: str | None):
+    # Process mentor notification first (built-in feature)
+    mentor_results = await asyncio.to_thread(_process_mentor_notification, uid, segments)
+
+    app_set = await _get_enabled_app_set(uid)
+    filtered_apps = app_set.with_capability(APP_TRIGGERS_REALTIME)
     if not filtered_apps:
         # Return mentor results if any, even if no external apps
         if mentor_results:
-            messages = []
-            for key, message in mentor_results.items():
-                messages.append(add_app_message(message, key, uid))
-            return messages
+            return await asyncio.to_thread(_add_app_messages, uid, mentor_results)
         return {}
 
-    threads = []
     results = {}
+    dispatcher = get_webhook_dispatcher()
 
-    def _single(app: App):
+    async def _single(app: App):
         if not app.external_integration.webhook_url:
             return
 
@@ -346,7 +396,9 @@ def _trigger_realtime_integrations(uid: str, segments: List[dict], conversation_
             url += '?uid=' + uid
 
         try:
-            response = requests.post(url, json={"session_id": uid, "segments": segments}, timeout=10)
+            response = await dispatcher.post(url, json={"session_id": uid, "segments": segments}, timeout=10, uid=uid)
+            if response is None:
+                return
             if response.status_code != 200:
                 print(
                     'trigger_realtime_integrations',
@@ -358,53 +410,19 @@ def _trigger_realtime_integrations(uid: str, segments: List[dict], conversation_
                 )
                 return
 
-            if (app.uid is None or app.uid != uid) and conversation_id is not None:
-                record_app_usage(
-                    uid,
-                    app.id,
-                    UsageHistoryType.transcript_processed_external_integration,
-                    conversation_id=conversation_id,
-                )
-
-            response_data = response.json()
-            if not response_data:
-                return
-
-            # message
-            message = response_data.get('message', '')
-            # print('Plugin', plugin.id, 'response message:', message)
-            if message and len(message) > 5:
-                send_app_notification(uid, app.name, app.id, message)
+            message = await asyncio.to_thread(_handle_realtime_app_response, uid, app, conversation_id, response.json())
+            if message:
                 results[app.id] = message
 
-            # proactive_notification
-            noti = response_data.get('notification', None)
-            # print('Plugin', plugin.id, 'response notification:', noti)
-            if app.has_capability("proactive_notification"):
-                message = _process_proactive_notification(uid, app, noti)
-                if message:
-                    results[app.id] = message
-
         except Exception as e:
             print(f"App integration error: {e}")
             return
 
-    for app in filtered_apps:
-        threads.append(threading.Thread(target=_single, args=(app,)))
-
-    [t.start() for t in threads]
-    [t.join() for t in threads]
+    await asyncio.gather(*[_single(app) for app in filtered_apps])
 
     # Merge mentor results with app results
     all_results = {**mentor_results, **results}
-
-    messages = []
-    for key, message in all_results.items():
-        if not message:
-            continue
-        messages.append(add_app_message(message, key, uid))
-
-    return messages
+    return await asyncio.to_thread(_add_app_messages, uid, all_results)
 
 
 def send_app_notification(user_id: str, app_name: str, app_id: str, message: str):
@@ -1,3 +1,4 @@
+import json
 import math
 import os
 import threading
@@ -7,7 +8,8 @@ from typing import List, Tuple, Dict, Any
 import hashlib
 import secrets
 from database.cache import get_memory_cache, get_pubsub_manager
-from database.redis_db import delete_generic_cache
+from database.cache_manager import SizedValue
+from database.redis_db import delete_generic_cache, get_generic_cache_payload
 from database.apps import (
     get_private_apps_db,
     get_public_unapproved_apps_db,
@@ -37,18 +39,16 @@ from database.apps import (
 from database.auth import get_user_name
 from database.conversations import get_conversations
 import database.users as users_db
-from database.memories import get_memories, get_user_public_memories
+from database.memories import get_user_public_memories
 from database.redis_db import (
     get_enabled_apps,
-    get_app_reviews,
     get_generic_cache,
     set_generic_cache,
     set_app_usage_history_cache,
     get_app_usage_history_cache,
     get_app_money_made_cache,
     set_app_money_made_cache,
-    get_apps_installs_count,
-    get_apps_reviews,
+    get_apps_listing_counters,
     get_app_cache_by_id,
     set_app_cache_by_id,
     set_app_review_cache,
@@ -70,6 +70,7 @@ from models.app import App, UsageHistoryItem, UsageHistoryType
 from models.conversation import Conversation
 from models.other import Person
 from utils import stripe
+from utils.memory_snapshot import get_memories
 from utils.llm.persona import condense_conversations, condense_memories, generate_persona_description, condense_tweets
 from utils.social import get_twitter_timeline, TwitterProfile, get_twitter_profile
 
@@ -77,6 +78,9 @@ MarketplaceAppReviewUIDs = (
     os.getenv('MARKETPLACE_APP_REVIEWERS').split(',') if os.getenv('MARKETPLACE_APP_REVIEWERS') else []
 )
 
+# The public listings are served this long past their TTL while one thread refreshes them, invalidations drop them
+PUBLIC_APPS_STALE_TTL = 60
+
 
 # ********************************
 # ************ TESTER ************
@@ -176,8 +180,7 @@ def get_popular_apps() -> List[App]:
 
         # Process apps (add installs, reviews, ratings)
         app_ids = [app['id'] for app in popular_apps]
-        apps_install = get_apps_installs_count(app_ids)
-        apps_reviews = get_apps_reviews(app_ids)
+        _, apps_install, apps_reviews = get_apps_listing_counters(None, app_ids)
 
         apps = []
         for app in popular_apps:
@@ -193,7 +196,7 @@ def get_popular_apps() -> List[App]:
         return apps
 
     # Singleflight: only ONE request fetches, others wait
-    return memory_cache.get_or_fetch(cache_key, fetch_and_process, ttl=30) or []
+    return memory_cache.get_or_fetch(cache_key, fetch_and_process, ttl=30, stale_ttl=PUBLIC_APPS_STALE_TTL) or []
 
 
 def get_available_apps(uid: str, include_reviews: bool = False) -> List[App]:
@@ -204,9 +207,9 @@ def get_available_apps(uid: str, include_reviews: bool = False) -> List[App]:
 
     def fetch_public_approved():
         """Fetch from Redis or DB (called only once with singleflight)."""
-        if data := get_generic_cache(cache_key):
+        if payload := get_generic_cache_payload(cache_key):
             print('get_public_approved_apps_data from Redis cache')
-            return data
+            return SizedValue(json.loads(payload), len(payload))
         print('get_public_approved_apps_data from db')
         data = get_public_approved_apps_db()
         # Reduce cache size by excluding large fields
@@ -215,21 +218,22 @@ def get_available_apps(uid: str, include_reviews: bool = False) -> List[App]:
         return reduced_data
 
     # Singleflight: only ONE request fetches, others wait
-    public_approved_data = memory_cache.get_or_fetch(cache_key, fetch_public_approved, ttl=30) or []
+    public_approved_data = (
+        memory_cache.get_or_fetch(cache_key, fetch_public_approved, ttl=30, stale_ttl=PUBLIC_APPS_STALE_TTL) or []
+    )
 
     private_data = get_private_apps(uid)
     public_unapproved_data = get_public_unapproved_apps(uid)
     tester_apps = get_apps_for_tester_db(uid) if tester else []
-    user_enabled = set(get_enabled_apps(uid))
     all_apps = private_data + public_approved_data + public_unapproved_data + tester_apps
     apps = []
 
     app_ids = [app['id'] for app in all_apps]
-    apps_install = get_apps_installs_count(app_ids)
-    apps_review = get_apps_reviews(app_ids) if include_reviews else {}
+    user_enabled, apps_install, apps_review = get_apps_listing_counters(uid, app_ids, include_reviews)
 
     for app in all_apps:
-        app_dict = app
+        # The public list is shared through the memory cache, never write per-user fields into it
+        app_dict = dict(app)
         app_dict['enabled'] = app['id'] in user_enabled
         app_dict['rejected'] = app['approved'] is False
         app_dict['installs'] = apps_install.get(app['id'], 0)
@@ -247,6 +251,97 @@ def get_available_apps(uid: str, include_reviews: bool = False) -> List[App]:
     return apps
 
 
+# ******************************************************
+# ************* COMPILED ENABLED APP SETS **************
+# ******************************************************
+#
+# The realtime paths (every transcript batch, every audio-bytes trigger, every processed conversation) only need
+# the user's enabled apps that have one capability. They are compiled once per user into App models plus a
+# capability bitmask and kept in the memory cache, so a tick is a dict lookup instead of Redis reads and model
+# validation. Enabling/disabling an app drops the user's set, updating an app drops every set, on all instances.
+
+APP_WORKS_WITH_MEMORIES = 1 << 0
+APP_WORKS_WITH_CHAT = 1 << 1
+APP_TRIGGERS_CONVERSATION_CREATION = 1 << 2
+APP_TRIGGERS_REALTIME = 1 << 3
+APP_TRIGGERS_REALTIME_AUDIO_BYTES = 1 << 4
+
+_APP_CAPABILITY_CHECKS = {
+    APP_WORKS_WITH_MEMORIES: App.works_with_memories,
+    APP_WORKS_WITH_CHAT: App.works_with_chat,
+    APP_TRIGGERS_CONVERSATION_CREATION: App.triggers_on_conversation_creation,
+    APP_TRIGGERS_REALTIME: App.triggers_realtime,
+    APP_TRIGGERS_REALTIME_AUDIO_BYTES: App.triggers_realtime_audio_bytes,
+}
+
+ENABLED_APPS_CACHE_TTL = 60 * 5  # invalidated on changes, the TTL only bounds missed invalidations
+ENABLED_APPS_CACHE_PREFIX = 'enabled_apps:'
+
+
+def get_app_capability_mask(app: App) -> int:
+    mask = 0
+    for bit, check in _APP_CAPABILITY_CHECKS.items():
+        if check(app):
+            mask |= bit
+    return mask
+
+
+class EnabledAppSet:
+    """
+    Enabled apps of one user, compiled once. The App objects are shared by every caller, treat them as read-only.
+    """
+
+    def __init__(self, apps: List[App]):
+        self.apps: Tuple[App, ...] = tuple(apps)
+        self.masks: Dict[str, int] = {app.id: get_app_capability_mask(app) for app in self.apps}
+        self._by_id = {app.id: app for app in self.apps}
+        self._by_capability = {
+            bit: tuple(app for app in self.apps if self.masks[app.id] & bit) for bit in _APP_CAPABILITY_CHECKS
+        }
+        # Rough footprint for the memory cache's size accounting
+        self._size_bytes = 1024 + sum(len(app.name or '') + len(app.description or '') + 2048 for app in self.apps)
+
+    def with_capability(self, capability: int) -> Tuple[App, ...]:
+        """Apps having every capability bit in `capability`."""
+        if (apps := self._by_capability.get(capability)) is not None:
+            return apps
+        return tuple(app for app in self.apps if (self.masks[app.id] & capability) == capability)
+
+    def get(self, app_id: str) -> App | None:
+        return self._by_id.get(app_id)
+
+    def __sizeof__(self) -> int:
+        return self._size_bytes
+
+
+def _enabled_apps_cache_key(uid: str) -> str:
+    return f'{ENABLED_APPS_CACHE_PREFIX}{uid}'
+
+
+def get_enabled_app_set(uid: str) -> EnabledAppSet:
+    def _compile():
+        return EnabledAppSet([app for app in get_available_apps(uid) if app.enabled])
+
+    return get_memory_cache().get_or_fetch(_enabled_apps_cache_key(uid), _compile, ttl=ENABLED_APPS_CACHE_TTL)
+
+
+def peek_enabled_app_set(uid: str) -> EnabledAppSet | None:
+    """The cached set if there is one, without touching Redis or Firestore."""
+    return get_memory_cache().get(_enabled_apps_cache_key(uid))
+
+
+def invalidate_enabled_apps_cache(uid: str | None = None):
+    """Drops the compiled enabled app set of one user, or of every user when uid is None, on all instances."""
+    memory_cache = get_memory_cache()
+    if uid:
+        cache_key = _enabled_apps_cache_key(uid)
+        memory_cache.delete(cache_key)
+    else:
+        cache_key = f'{ENABLED_APPS_CACHE_PREFIX}*'
+        memory_cache.delete_prefix(ENABLED_APPS_CACHE_PREFIX)
+    get_pubsub_manager().publish_invalidation([cache_key])
+
+
 def get_available_app_by_id(app_id: str, uid: str | None) -> dict | None:
     cached_app = get_app_cache_by_id(app_id)
     if cached_app:
@@ -271,7 +366,8 @@ def get_available_app_by_id_with_reviews(app_id: str, uid: str | None) -> dict |
         return None
     app['money_made'] = get_app_money_made_amount(app['id']) if not app['private'] else None
     app['usage_count'] = get_app_usage_count(app['id']) if not app['private'] else None
-    reviews = get_app_reviews(app['id'])
+    user_enabled, apps_install, apps_reviews = get_apps_listing_counters(uid, [app['id']])
+    reviews = apps_reviews.get(app['id'], {})
     sorted_reviews = reviews.values()
     rating_avg = sum([x['score'] for x in sorted_reviews]) / len(sorted_reviews) if reviews else None
     app['reviews'] = [details for details in reviews.values() if details['review']]
@@ -280,11 +376,9 @@ def get_available_app_by_id_with_reviews(app_id: str, uid: str | None) -> dict |
     app['user_review'] = reviews.get(uid)
 
     # enabled
-    user_enabled = set(get_enabled_apps(uid))
     app['enabled'] = app['id'] in user_enabled
 
     # install
-    apps_install = get_apps_installs_count([app['id']])
     app['installs'] = apps_install.get(app['id'], 0)
     return app
 
@@ -352,8 +446,7 @@ def get_approved_available_apps(include_reviews: bool = False) -> list[App]:
 
         # Process apps (add installs, reviews, etc.)
         app_ids = [app['id'] for app in all_apps]
-        apps_installs = get_apps_installs_count(app_ids)
-        apps_reviews = get_apps_reviews(app_ids) if include_reviews else {}
+        _, apps_installs, apps_reviews = get_apps_listing_counters(None, app_ids, include_reviews)
 
         apps = []
         for app in all_apps:
@@ -372,7 +465,7 @@ def get_approved_available_apps(include_reviews: bool = False) -> list[App]:
         return apps
 
     # Singleflight: only ONE request fetches, others wait
-    return memory_cache.get_or_fetch(cache_key, fetch_and_process, ttl=30) or []
+    return memory_cache.get_or_fetch(cache_key, fetch_and_process, ttl=30, stale_ttl=PUBLIC_APPS_STALE_TTL) or []
 
 
 def set_app_review(app_id: str, uid: str, review: dict):
@@ -800,6 +893,8 @@ Use these facts, conversations and tweets to shape your personality. Responses s
 
     update_persona_in_db(persona)
     delete_app_cache_by_id(persona['id'])
+    # Anyone can have a public persona enabled
+    invalidate_enabled_apps_cache(persona['uid'] if persona.get('private') else None)
 
 
 def increment_username(username: str):
@@ -1,12 +1,17 @@
 import wave
 from typing import Optional, Tuple
 
+import numpy as np
 from pydub import AudioSegment
 from pyogg import OpusDecoder
 
 
 class AudioRingBuffer:
-    """Circular buffer storing last N seconds of PCM16 mono audio with timestamp tracking."""
+    """Circular buffer storing last N seconds of PCM16 mono audio with timestamp tracking.
+
+    Writes and reads are bulk slice copies (at most two segments on wraparound), so the cost per frame
+    does not depend on the frame size in Python-level operations.
+    """
 
     def __init__(self, duration_seconds: float, sample_rate: int):
         self.sample_rate = sample_rate
@@ -19,11 +24,24 @@ class AudioRingBuffer:
 
     def write(self, data: bytes, timestamp: float):
         """Append audio data with timestamp."""
-        for byte in data:
-            self.buffer[self.write_pos] = byte
-            self.write_pos = (self.write_pos + 1) % self.capacity
-        self.total_bytes_written += len(data)
+        size = len(data)
+        self.total_bytes_written += size
         self.last_write_timestamp = timestamp
+        if size == 0 or self.capacity == 0:
+            return
+
+        view = memoryview(data)
+        # Only the newest `capacity` bytes can survive
+        if size > self.capacity:
+            view = view[size - self.capacity :]
+            self.write_pos = (self.write_pos + size - self.capacity) % self.capacity
+            size = self.capacity
+
+        first = min(size, self.capacity - self.write_pos)
+        self.buffer[self.write_pos : self.write_pos + first] = view[:first]
+        if first < size:
+            self.buffer[: size - first] = view[first:]
+        self.write_pos = (self.write_pos + size) % self.capacity
 
     def get_time_range(self) -> Optional[Tuple[float, float]]:
         """Return (start_ts, end_ts) of audio currently in buffer."""
@@ -33,8 +51,8 @@ class AudioRingBuffer:
         buffer_duration = bytes_in_buffer / self.bytes_per_second
         return (self.last_write_timestamp - buffer_duration, self.last_write_timestamp)
 
-    def extract(self, start_ts: float, end_ts: float) -> Optional[bytes]:
-        """Extract audio for absolute timestamp range."""
+    def _locate(self, start_ts: float, end_ts: float) -> Optional[Tuple[int, int]]:
+        """Return (physical start position, length) of the PCM16 bytes for an absolute timestamp range."""
         time_range = self.get_time_range()
         if time_range is None:
             return None
@@ -57,12 +75,43 @@ class AudioRingBuffer:
         if length <= 0:
             return None
 
+        return (buffer_logical_start + start_offset) % self.capacity, length
+
+    def extract_view(self, start_ts: float, end_ts: float) -> Optional[memoryview]:
+        """
+        Extract audio for absolute timestamp range without copying when it does not wrap around.
+
+        The returned view aliases the ring buffer and is overwritten by later writes, consume it right away.
+        """
+        location = self._locate(start_ts, end_ts)
+        if location is None:
+            return None
+
+        pos, length = location
+        if pos + length <= self.capacity:
+            return memoryview(self.buffer)[pos : pos + length]
+
+        # Wraparound: join the two segments
+        first = self.capacity - pos
         result = bytearray(length)
-        for i in range(length):
-            pos = (buffer_logical_start + start_offset + i) % self.capacity
-            result[i] = self.buffer[pos]
+        result[:first] = memoryview(self.buffer)[pos:]
+        result[first:] = memoryview(self.buffer)[: length - first]
+        return memoryview(result)
+
+    def extract(self, start_ts: float, end_ts: float) -> Optional[bytes]:
+        """Extract audio for absolute timestamp range."""
+        view = self.extract_view(start_ts, end_ts)
+        if view is None:
+            return None
+        return view.tobytes()
 
-        return bytes(result)
+    def extract_samples(self, start_ts: float, end_ts: float, copy: bool = True) -> Optional[np.ndarray]:
+        """Extract audio for absolute timestamp range as int16 samples (a view into the buffer if copy=False)."""
+        view = self.extract_view(start_ts, end_ts)
+        if view is None:
+            return None
+        samples = np.frombuffer(view, dtype=np.int16)
+        return samples.copy() if copy else samples
 
 
 def merge_wav_files(dest_file_path: str, source_files: [str], silent_seconds: [int]):
@@ -0,0 +1,193 @@
+"""
+Live session conversation lifecycle without polling the db: silence timeouts on one deadline heap shared by every
+session of the process, status changes made elsewhere (processing from REST, merge, delete) through redis pub/sub.
+"""
+
+import asyncio
+import heapq
+import itertools
+import json
+import time
+import weakref
+from typing import Callable, Dict, List, Optional, Tuple
+
+from database import redis_db
+
+StatusHandler = Callable[[Optional[str], Optional[str]], None]
+
+
+class Deadlines:
+    """
+    Callbacks by key at a deadline (epoch seconds), one heap and one task per event loop. Pushing a deadline back,
+    which every transcript tick does, only updates the key, its heap entry is moved once it comes up.
+    """
+
+    def __init__(self):
+        # key -> [deadline, callback, seq of the live heap entry]
+        self._entries: Dict[str, list] = {}
+        self._heap: List[Tuple[float, int, str]] = []
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def set(self, key: str, deadline: float, callback: Callable[[], None]):
+        entry = self._entries.get(key)
+        if entry is not None and deadline >= entry[0]:
+            entry[0], entry[1] = deadline, callback
+            return
+
+        seq = next(self._seq)
+        self._entries[key] = [deadline, callback, seq]
+        heapq.heappush(self._heap, (deadline, seq, key))
+        if self._heap[0][1] == seq:
+            self._wakeup.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def remove(self, key: str):
+        self._entries.pop(key, None)
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            self._heap = [(e[0], e[2], k) for k, e in self._entries.items()]
+            heapq.heapify(self._heap)
+
+    def __len__(self):
+        return len(self._entries)
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            now = time.time()
+            while self._heap and self._heap[0][0] <= now:
+                _, seq, key = heapq.heappop(self._heap)
+                entry = self._entries.get(key)
+                if entry is None or entry[2] != seq:
+                    continue
+                if entry[0] > now:
+                    entry[2] = next(self._seq)
+                    heapq.heappush(self._heap, (entry[0], entry[2], key))
+                    continue
+                del self._entries[key]
+                try:
+                    entry[1]()
+                except Exception as e:
+                    print(f"Deadline callback {key} failed: {e}")
+
+            if not self._entries:
+                self._heap.clear()
+                return
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self._heap[0][0] - now)
+            except asyncio.TimeoutError:
+                pass
+
+
+class StatusSubscriptions:
+    """
+    Conversation status notifications for the users with a live session in this process, one pub/sub connection
+    per event loop. Handlers get (conversation_id, status), or (None, None) after a reconnect when notifications may
+    have been missed.
+    """
+
+    RECONNECT_DELAY = 5
+
+    def __init__(self):
+        self._handlers: Dict[str, Dict[int, StatusHandler]] = {}
+        self._tokens = itertools.count()
+        self._pubsub = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def subscribe(self, uid: str, handler: StatusHandler) -> int:
+        token = next(self._tokens)
+        handlers = self._handlers.setdefault(uid, {})
+        handlers[token] = handler
+        if len(handlers) == 1:
+            try:
+                if self._pubsub is None:
+                    self._pubsub = redis_db.get_async_redis().pubsub(ignore_subscribe_messages=True)
+                await self._pubsub.subscribe(redis_db.conversation_status_channel(uid))
+            except Exception as e:
+                # The reader resubscribes everyone once redis is back
+                print(f"Conversation status subscribe error: {e}")
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return token
+
+    async def unsubscribe(self, uid: str, token: int):
+        handlers = self._handlers.get(uid)
+        if handlers is None or handlers.pop(token, None) is None or handlers:
+            return
+        del self._handlers[uid]
+        try:
+            if self._pubsub is not None:
+                await self._pubsub.unsubscribe(redis_db.conversation_status_channel(uid))
+        except Exception as e:
+            print(f"Conversation status unsubscribe error: {e}")
+
+    async def _run(self):
+        while True:
+            while self._handlers:
+                try:
+                    if self._pubsub is None:
+                        await self._reconnect()
+                    message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if message and message['type'] == 'message':
+                        self._dispatch(message['channel'], message['data'])
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    print(f"Conversation status listener error: {e}")
+                    await self._close()
+                    await asyncio.sleep(self.RECONNECT_DELAY)
+            await self._close()
+            # Someone may have subscribed while closing
+            if not self._handlers:
+                return
+
+    async def _reconnect(self):
+        self._pubsub = redis_db.get_async_redis().pubsub(ignore_subscribe_messages=True)
+        await self._pubsub.subscribe(*[redis_db.conversation_status_channel(uid) for uid in self._handlers])
+        for handlers in list(self._handlers.values()):
+            for handler in list(handlers.values()):
+                handler(None, None)
+
+    async def _close(self):
+        pubsub, self._pubsub = self._pubsub, None
+        if pubsub is not None:
+            try:
+                await pubsub.aclose()
+            except Exception:
+                pass
+
+    def _dispatch(self, channel: bytes, data: bytes):
+        uid = channel.decode()[len('users:') :].rsplit(':', 1)[0]
+        try:
+            notification = json.loads(data)
+        except ValueError:
+            return
+        for handler in list(self._handlers.get(uid, {}).values()):
+            try:
+                handler(notification.get('conversation_id'), notification.get('status'))
+            except Exception as e:
+                print(f"Conversation status handler failed: {e}")
+
+
+_deadlines: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Deadlines]' = weakref.WeakKeyDictionary()
+_subscriptions: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, StatusSubscriptions]' = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_deadlines() -> Deadlines:
+    loop = asyncio.get_running_loop()
+    deadlines = _deadlines.get(loop)
+    if deadlines is None:
+        deadlines = _deadlines[loop] = Deadlines()
+    return deadlines
+
+
+def get_status_subscriptions() -> StatusSubscriptions:
+    loop = asyncio.get_running_loop()
+    subscriptions = _subscriptions.get(loop)
+    if subscriptions is None:
+        subscriptions = _subscriptions[loop] = StatusSubscriptions()
+    return subscriptions
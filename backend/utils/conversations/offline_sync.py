@@ -0,0 +1,472 @@
+"""
+Offline sync of device recordings (SD card / limitless uploads) into conversations.
+
+decode -> vad -> transcribe -> merge, connected by bounded queues (utils/other/fanout.py):
+- decode: a .bin upload to a WAV
+- vad: a WAV to its speech segments, one WAV each
+- transcribe: a segment through the pre-recorded STT
+- merge: matches each transcript to the conversation it belongs to, existing or one this sync creates, and keeps it
+  in memory. Once everything is transcribed each conversation is written once, with all its new segments.
+
+Stage workers run on process-wide executors, so concurrent syncs share the same bounded pool per stage. A failed
+decode or VAD fails the sync before anything is written, a failed transcription only loses that segment.
+Progress is kept in redis for `GET /v2/sync-local-files/{job_id}`.
+"""
+
+import asyncio
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+from fastapi import HTTPException
+
+from database import conversations as conversations_db
+from database import redis_db
+from database.conversations import get_closest_conversation_to_timestamps, update_conversation_segments
+from models.conversation import Conversation, ConversationSource, CreateConversation
+from models.transcript_segment import TranscriptSegment
+from utils.conversations.process_conversation import process_conversation
+from utils.other.fanout import FanoutEngine, FanoutStage, StageMetrics
+from utils.other.scheduler import schedule_call
+from utils.other.storage import delete_syncing_temporal_file, get_syncing_file_temporal_signed_url
+from utils.stt.pre_recorded import deepgram_prerecorded, postprocess_words
+from utils.stt.vad import copy_wav_ranges, vad_is_empty
+
+SYNC_VAD_MERGE_GAP = 120  # seconds, speech closer than this in one file is transcribed as one segment
+SYNC_MIN_SEGMENT_SECONDS = 1
+SYNC_MATCH_WINDOW = 120  # seconds around a conversation that still count as part of it
+SYNC_TEMPORAL_FILE_GRACE = 30  # seconds the uploaded segment stays readable after its transcription returned
+SYNC_PROGRESS_INTERVAL = 1.0  # seconds between progress writes to redis
+
+# Per sync: workers of each stage, and how many items may wait between stages
+SYNC_STAGE_WORKERS = {'decode': 2, 'vad': 4, 'transcribe': 8, 'merge': 1}
+SYNC_QUEUE_SIZE = 16
+
+# Per process: shared by all running syncs
+_executors = {
+    'decode': ThreadPoolExecutor(int(os.getenv('SYNC_DECODE_CONCURRENCY', 4)), thread_name_prefix='sync-decode'),
+    'vad': ThreadPoolExecutor(
+        int(os.getenv('SYNC_VAD_CONCURRENCY', os.cpu_count() or 4)), thread_name_prefix='sync-vad'
+    ),
+    'transcribe': ThreadPoolExecutor(
+        int(os.getenv('SYNC_TRANSCRIBE_CONCURRENCY', 16)), thread_name_prefix='sync-transcribe'
+    ),
+    'merge': ThreadPoolExecutor(int(os.getenv('SYNC_MERGE_CONCURRENCY', 8)), thread_name_prefix='sync-merge'),
+}
+
+
+def get_timestamp_from_path(path: str):
+    timestamp = int(path.split('/')[-1].split('_')[-1].split('.')[0])
+    if timestamp > 1e10:
+        return int(timestamp / 1000)
+    return timestamp
+
+
+def _remove(path: str):
+    try:
+        if path and os.path.exists(path):
+            os.remove(path)
+    except Exception as e:
+        print(f"Failed to cleanup file {path}: {e}")
+
+
+# **********************************************
+# ****************** JOBS **********************
+# **********************************************
+
+
+class SyncJob:
+    def __init__(self, uid: str, files: int, job_id: Optional[str] = None):
+        self.id = job_id or str(uuid.uuid4())
+        self.uid = uid
+        self.files = files
+        self.status = 'queued'  # queued, running, completed, failed
+        self.status_code = 200
+        self.errors: List[dict] = []
+        self.progress: Dict[str, StageMetrics] = {}
+        self.new_memories = set()
+        self.updated_memories = set()
+        self.created_at = datetime.now(timezone.utc)
+        self._saved_at = 0.0
+
+    @property
+    def failed(self) -> bool:
+        return self.status == 'failed'
+
+    def fail(self, stage: str, path: str, error: Exception):
+        """A decode or VAD error, nothing will be written."""
+        message = error.detail if isinstance(error, HTTPException) else str(error)
+        self.errors.append({'stage': stage, 'file': os.path.basename(path), 'error': message})
+        if not self.failed:
+            self.status = 'failed'
+            self.status_code = error.status_code if isinstance(error, HTTPException) else 500
+
+    @property
+    def error_detail(self) -> str:
+        errors = [e for e in self.errors if e['stage'] in ('decode', 'vad')]
+        stages = '/'.join(sorted({e['stage'].upper() for e in errors}))
+        messages = [f"{e['file']}: {e['error']}" for e in errors]
+        detail = f"{stages} processing failed for {len(messages)} file(s): {'; '.join(messages[:3])}"
+        if len(messages) > 3:
+            detail += f" (and {len(messages) - 3} more)"
+        return detail
+
+    def as_dict(self) -> dict:
+        return {
+            'id': self.id,
+            'status': self.status,
+            'files': self.files,
+            'created_at': self.created_at.isoformat(),
+            'stages': {name: progress.as_dict() for name, progress in self.progress.items()},
+            'new_memories': sorted(self.new_memories),
+            'updated_memories': sorted(self.updated_memories),
+            'errors': self.errors,
+            'error': self.error_detail if self.failed else None,
+        }
+
+    def save(self, force: bool = False):
+        """At most once per SYNC_PROGRESS_INTERVAL unless forced."""
+        now = time.monotonic()
+        if not force and now - self._saved_at < SYNC_PROGRESS_INTERVAL:
+            return
+        self._saved_at = now
+        try:
+            redis_db.set_sync_job(self.uid, self.id, self.as_dict())
+        except Exception as e:
+            print(f'sync job {self.id}: failed to save progress: {e}')
+
+
+# **********************************************
+# **************** STAGES **********************
+# **********************************************
+
+
+def split_vad_segments(path: str) -> List[str]:
+    """
+    Writes the speech of a WAV to one file per segment, named after its start timestamp, and removes the WAV.
+    Speech closer than SYNC_VAD_MERGE_GAP is kept in one segment.
+    """
+    try:
+        start_timestamp = get_timestamp_from_path(path)
+        voice_segments = vad_is_empty(path, return_segments=True, cache=True)
+
+        # edge case, multiple small segments that map towards the same memory .-.
+        # so ... let's merge them if distance < 120 seconds
+        segments = []
+        for segment in voice_segments:
+            if segments and (segment['start'] - segments[-1]['end']) < SYNC_VAD_MERGE_GAP:
+                segments[-1]['end'] = segment['end']
+            else:
+                segments.append(dict(segment))
+        print(path, len(segments))
+
+        # Only the segments are read from the file, it's never loaded whole
+        path_dir = os.path.dirname(path)
+        segment_paths = []
+        for segment in segments:
+            if (segment['end'] - segment['start']) < SYNC_MIN_SEGMENT_SECONDS:
+                continue
+            segment_path = f'{path_dir}/{start_timestamp + segment["start"]}.wav'
+            copy_wav_ranges(path, [(segment['start'], segment['end'])], segment_path)
+            segment_paths.append(segment_path)
+        return segment_paths
+    finally:
+        _remove(path)
+
+
+@dataclass
+class SyncTranscript:
+    path: str
+    timestamp: float
+    segments: List[TranscriptSegment]
+    language: Optional[str] = None
+    closest: Optional[dict] = None  # the stored conversation around it, see ConversationMerger.lookup
+    looked_up: bool = False
+
+    @property
+    def end_timestamp(self) -> float:
+        return self.timestamp + self.segments[-1].end
+
+
+def transcribe_segment(path: str) -> Optional[SyncTranscript]:
+    """
+    Uploads a segment for the pre-recorded STT. The upload is deleted SYNC_TEMPORAL_FILE_GRACE seconds after the
+    transcription returns, the local file right away.
+    """
+    try:
+        url = get_syncing_file_temporal_signed_url(path)
+        try:
+            words, language = deepgram_prerecorded(url, speakers_count=3, attempts=0, return_language=True)
+        finally:
+            schedule_call(SYNC_TEMPORAL_FILE_GRACE, delete_syncing_temporal_file, path)
+    finally:
+        _remove(path)
+
+    transcript_segments: List[TranscriptSegment] = postprocess_words(words, 0)
+    if not transcript_segments:
+        print('failed to get deepgram segments')
+        return None
+    return SyncTranscript(path, get_timestamp_from_path(path), transcript_segments, language)
+
+
+# **********************************************
+# ***************** MERGE **********************
+# **********************************************
+
+
+@dataclass
+class _Target:
+    """A conversation the sync adds to: an existing one (conversation set) or one it creates."""
+
+    started_at: float
+    finished_at: float
+    conversation: Optional[dict] = None
+    transcripts: List[SyncTranscript] = field(default_factory=list)
+
+    def matches(self, start: float, end: float) -> bool:
+        return self.finished_at >= start - SYNC_MATCH_WINDOW and self.started_at <= end + SYNC_MATCH_WINDOW
+
+    def distance(self, start: float, end: float) -> float:
+        return min(abs(self.started_at - start), abs(self.finished_at - end))
+
+
+class ConversationMerger:
+    """
+    Collects the transcripts of a sync by target conversation, then writes each conversation once.
+
+    A transcript goes to the closest conversation around it, the same rule as get_closest_conversation_to_timestamps,
+    looking at the stored conversations and at the ones this sync already added to or is going to create.
+    """
+
+    def __init__(self, uid: str, source: ConversationSource = ConversationSource.omi):
+        self.uid = uid
+        self.source = source
+        self.existing: Dict[str, _Target] = {}
+        self.created: List[_Target] = []
+
+    def lookup(self, transcript: SyncTranscript):
+        """Finds the stored conversation around the transcript, thread-safe, so lookups can run ahead of add()."""
+        transcript.closest = get_closest_conversation_to_timestamps(
+            self.uid, transcript.timestamp, transcript.end_timestamp
+        )
+        transcript.looked_up = True
+
+    def add(self, transcript: SyncTranscript):
+        """Not thread-safe, one caller at a time."""
+        start, end = transcript.timestamp, transcript.end_timestamp
+        candidates = [t for t in [*self.existing.values(), *self.created] if t.matches(start, end)]
+
+        if not transcript.looked_up:
+            self.lookup(transcript)
+        closest = transcript.closest
+        if closest and closest['id'] not in self.existing:
+            target = _Target(closest['started_at'].timestamp(), closest['finished_at'].timestamp(), closest)
+            self.existing[closest['id']] = target
+            candidates.append(target)
+
+        if candidates:
+            target = min(candidates, key=lambda t: t.distance(start, end))
+        else:
+            target = _Target(start, end)
+            self.created.append(target)
+        target.transcripts.append(transcript)
+        target.started_at = min(target.started_at, start)
+        target.finished_at = max(target.finished_at, end)
+
+    @property
+    def pending(self) -> int:
+        return sum(len(t.transcripts) for t in [*self.existing.values(), *self.created])
+
+    def flush(self, job: SyncJob, executor: Optional[ThreadPoolExecutor] = None):
+        """Writes every collected conversation once, in parallel on executor."""
+        targets = [t for t in self.existing.values() if t.transcripts] + self.created
+        executor = executor or _executors['merge']
+        futures = [(target, executor.submit(self._write, target)) for target in targets]
+        for target, future in futures:
+            try:
+                conversation_id, created = future.result()
+            except Exception as e:
+                print(f'sync job {job.id}: failed to write a conversation: {type(e).__name__} {e}')
+                job.errors.append({'stage': 'merge', 'file': None, 'error': str(e)})
+                continue
+            (job.new_memories if created else job.updated_memories).add(conversation_id)
+        self.existing, self.created = {}, []
+
+    def _write(self, target: _Target):
+        language = target.transcripts[0].language
+        if target.conversation is None:
+            segments = []
+            for transcript in sorted(target.transcripts, key=lambda t: t.timestamp):
+                offset = transcript.timestamp - target.started_at
+                for segment in transcript.segments:
+                    segment.start += offset
+                    segment.end += offset
+                    segments.append(segment)
+            create_memory = CreateConversation(
+                started_at=datetime.fromtimestamp(target.started_at, tz=timezone.utc),
+                finished_at=datetime.fromtimestamp(target.finished_at, tz=timezone.utc),
+                transcript_segments=segments,
+                source=self.source,
+            )
+            created = process_conversation(self.uid, language, create_memory)
+            return created.id, True
+
+        conversation = target.conversation
+        conversation_start = conversation['started_at'].timestamp()
+        # assign timestamps to each segment
+        segments = []
+        for segment in conversation['transcript_segments']:
+            segment['timestamp'] = conversation_start + segment['start']
+            segments.append(segment)
+        for transcript in target.transcripts:
+            for segment in transcript.segments:
+                segment = segment.dict()
+                segment['timestamp'] = transcript.timestamp + segment['start']
+                segments.append(segment)
+
+        # merge and sort segments by start timestamp, then make start/end relative to the conversation again
+        segments.sort(key=lambda x: x['timestamp'])
+        for segment in segments:
+            duration = segment['end'] - segment['start']
+            segment['start'] = segment.pop('timestamp') - conversation_start
+            segment['end'] = segment['start'] + duration
+
+        # finished_at from the latest segment, it never goes backwards
+        last_segment_end = segments[-1]['end'] if segments else 0
+        new_finished_at = datetime.fromtimestamp(conversation_start + last_segment_end, tz=timezone.utc)
+        if new_finished_at < conversation['finished_at']:
+            new_finished_at = conversation['finished_at']
+
+        update_conversation_segments(self.uid, conversation['id'], segments, finished_at=new_finished_at)
+
+        # If the conversation was previously discarded, reprocess it with the new segments
+        if conversation.get('discarded', False):
+            print(f'Conversation {conversation["id"]} was discarded, checking if it should be reprocessed')
+            reprocess_conversation_after_update(self.uid, conversation['id'], language)
+        return conversation['id'], False
+
+
+def reprocess_conversation_after_update(uid: str, conversation_id: str, language: str):
+    """
+    Reprocess a conversation after new segments have been added.
+    This checks if the conversation should still be discarded and regenerates
+    the summary/structured data if it now has sufficient content.
+    """
+    conversation_data = conversations_db.get_conversation(uid, conversation_id)
+    if not conversation_data:
+        print(f'Conversation {conversation_id} not found for reprocessing')
+        return
+
+    process_conversation(
+        uid=uid,
+        language_code=language or 'en',
+        conversation=Conversation(**conversation_data),
+        force_process=True,
+        is_reprocess=True,
+    )
+    print(f'Successfully reprocessed conversation {conversation_id}')
+
+
+# **********************************************
+# ***************** RUN ************************
+# **********************************************
+
+
+async def run_sync_job(
+    job: SyncJob,
+    paths: List[str],
+    decode: Callable[[str], Optional[str]],
+    source: ConversationSource = ConversationSource.omi,
+) -> SyncJob:
+    """
+    Syncs the uploaded .bin files at paths. decode turns one into a WAV and returns its path, or None to skip it.
+    The job ends completed or failed, and every local file the sync made is gone.
+    """
+    merger = ConversationMerger(job.uid, source)
+    local_paths = set(paths)
+
+    def decode_stage(path: str):
+        if job.failed:
+            _remove(path)
+            return []
+        wav_path = decode(path)
+        if wav_path:
+            local_paths.add(wav_path)
+        return [wav_path] if wav_path else []
+
+    def vad_stage(path: str):
+        if job.failed:
+            _remove(path)
+            return []
+        segment_paths = split_vad_segments(path)
+        local_paths.update(segment_paths)
+        return segment_paths
+
+    def transcribe_stage(path: str):
+        if job.failed:
+            _remove(path)
+            return []
+        transcript = transcribe_segment(path)
+        if not transcript:
+            return []
+        # The Firestore lookup here, in parallel, leaves the single merge worker with the in-memory part only
+        merger.lookup(transcript)
+        return [transcript]
+
+    def merge_stage(transcript: SyncTranscript):
+        merger.add(transcript)
+        return []
+
+    def on_error(stage: FanoutStage, path, error: Exception):
+        if stage.name in ('decode', 'vad'):
+            job.fail(stage.name, path, error)
+            job.save(force=True)
+        else:
+            name = os.path.basename(path) if isinstance(path, str) else None
+            job.errors.append({'stage': stage.name, 'file': name, 'error': str(error)})
+
+    def on_progress(progress: Dict[str, StageMetrics]):
+        job.progress = progress
+        job.save()
+
+    stages = [
+        FanoutStage(
+            name,
+            func,
+            SYNC_STAGE_WORKERS[name],
+            fanout=True,
+            queue_size=SYNC_QUEUE_SIZE,
+            executor=_executors[name],
+        )
+        for name, func in [
+            ('decode', decode_stage),
+            ('vad', vad_stage),
+            ('transcribe', transcribe_stage),
+            ('merge', merge_stage),
+        ]
+    ]
+
+    job.status = 'running'
+    job.save(force=True)
+    try:
+        engine = FanoutEngine(stages, on_progress=on_progress, on_error=on_error)
+        await engine.run(paths)
+        job.progress = engine.metrics
+        if not job.failed:
+            print(f'sync job {job.id}: writing {merger.pending} transcripts')
+            # Not on the merge executor, flush waits for the writes it submits there
+            await asyncio.to_thread(merger.flush, job)
+            job.status = 'completed'
+    except Exception as e:
+        job.status, job.status_code = 'failed', 500
+        job.errors.append({'stage': 'sync', 'file': None, 'error': str(e)})
+        raise
+    finally:
+        for path in local_paths:
+            _remove(path)
+        job.save(force=True)
+    return job
@@ -20,7 +20,7 @@ import database.trends as trends_db
 import database.action_items as action_items_db
 import database.folders as folders_db
 import database.calendar_meetings as calendar_db
-from database.vector_db import find_similar_memories, upsert_memory_vector, delete_memory_vector
+from database.vector_db import find_similar_memories, upsert_memory_vectors, delete_memory_vectors
 from utils.llm.memories import resolve_memory_conflict
 from database.apps import record_app_usage, get_omi_personas_by_uid_db, get_app_by_id_db
 from database.vector_db import upsert_vector2, update_vector_metadata
@@ -39,7 +39,12 @@ from models.other import Person
 from models.task import Task, TaskStatus, TaskAction, TaskActionProvider
 from models.trend import Trend
 from models.notification_message import NotificationMessage
-from utils.apps import get_available_apps, update_personas_async, sync_update_persona_prompt
+from utils.apps import (
+    APP_WORKS_WITH_MEMORIES,
+    get_enabled_app_set,
+    update_personas_async,
+    sync_update_persona_prompt,
+)
 from utils.llm.conversation_processing import (
     get_transcript_structure,
     get_app_result,
@@ -70,6 +75,28 @@ from utils.webhooks import conversation_created_webhook
 from utils.notifications import send_action_item_data_message
 from utils.task_sync import auto_sync_action_items_batch
 from utils.other.storage import precache_conversation_audio
+from utils.other.job_executor import (
+    JobQueueConfig,
+    PRIORITY_HIGH,
+    PRIORITY_LOW,
+    get_job_executor,
+    submit_job,
+)
+
+# Background side effects of processed conversations, bounded and shared by the whole process.
+# Only idempotent jobs are retried: vector upserts and persona prompt rebuilds.
+CONVERSATION_VECTORS_QUEUE = 'conversation_vectors'
+CONVERSATION_EXTRACTION_QUEUE = 'conversation_extraction'
+CONVERSATION_WEBHOOKS_QUEUE = 'conversation_webhooks'
+PERSONA_UPDATES_QUEUE = 'persona_updates'
+TASK_SYNC_QUEUE = 'task_sync'
+
+_job_executor = get_job_executor()
+_job_executor.register_queue(JobQueueConfig(CONVERSATION_VECTORS_QUEUE, concurrency=8, max_retries=2))
+_job_executor.register_queue(JobQueueConfig(CONVERSATION_EXTRACTION_QUEUE, concurrency=16))
+_job_executor.register_queue(JobQueueConfig(CONVERSATION_WEBHOOKS_QUEUE, concurrency=16))
+_job_executor.register_queue(JobQueueConfig(PERSONA_UPDATES_QUEUE, concurrency=4, max_retries=1, retry_backoff=5.0))
+_job_executor.register_queue(JobQueueConfig(TASK_SYNC_QUEUE, concurrency=4))
 
 
 def _get_structured(
@@ -271,8 +298,7 @@ def _trigger_apps(
     default_apps_dict = {app.id: app for app in default_apps}
 
     # Also get user's installed apps (only used for preferred app lookup and reprocessing)
-    apps: List[App] = get_available_apps(uid)
-    conversation_apps = [app for app in apps if app.works_with_memories() and app.enabled]
+    conversation_apps = get_enabled_app_set(uid).with_capability(APP_WORKS_WITH_MEMORIES)
 
     # Combined dict for looking up preferred apps or specific app_id requests
     all_apps_dict = {app.id: app for app in conversation_apps}
@@ -315,21 +341,22 @@ def _trigger_apps(
     # Clear existing app results
     conversation.apps_results = []
 
-    threads = []
-
-    def execute_app(app):
-        result = get_app_result(
-            conversation.get_transcript(False, people=people), conversation.photos, app, language_code=language_code
-        ).strip()
+    # At most one app runs, in the caller's thread since its result is needed right away.
+    # An app that fails is left out, the conversation is still processed.
+    for app in filtered_apps:
+        try:
+            result = get_app_result(
+                conversation.get_transcript(False, people=people), conversation.photos, app, language_code=language_code
+            ).strip()
+        except Exception as e:
+            print(f"Error running app {app.id} on conversation {conversation.id}: {e}", uid)
+            continue
         conversation.apps_results.append(AppResult(app_id=app.id, content=result))
         if not is_reprocess:
-            record_app_usage(uid, app.id, UsageHistoryType.memory_created_prompt, conversation_id=conversation.id)
-
-    for app in filtered_apps:
-        threads.append(threading.Thread(target=execute_app, args=(app,)))
-
-    [t.start() for t in threads]
-    [t.join() for t in threads]
+            try:
+                record_app_usage(uid, app.id, UsageHistoryType.memory_created_prompt, conversation_id=conversation.id)
+            except Exception as e:
+                print(f"Error recording usage of app {app.id}: {e}", uid)
 
 
 def _update_goal_progress(uid: str, conversation: Conversation):
@@ -355,8 +382,7 @@ def _extract_memories(uid: str, conversation: Conversation):
     # Delete old memories for this conversation (if reprocessing)
     # Also get the IDs to delete from Pinecone
     existing_memory_ids = memories_db.get_memory_ids_for_conversation(uid, conversation.id)
-    for memory_id in existing_memory_ids:
-        delete_memory_vector(uid, memory_id)
+    delete_memory_vectors(uid, existing_memory_ids)
     memories_db.delete_memories_for_conversation(uid, conversation.id)
 
     new_memories: List[Memory] = []
@@ -413,8 +439,8 @@ def _extract_memories(uid: str, conversation: Conversation):
         memory_db_obj.is_locked = is_locked
         parsed_memories.append(memory_db_obj)
 
+    delete_memory_vectors(uid, memories_to_delete)
     for memory_id in memories_to_delete:
-        delete_memory_vector(uid, memory_id)
         memories_db.delete_memory(uid, memory_id)
 
     if len(parsed_memories) == 0:
@@ -424,8 +450,10 @@ def _extract_memories(uid: str, conversation: Conversation):
     print(f"Saving {len(parsed_memories)} memories for conversation {conversation.id}")
     memories_db.save_memories(uid, [fact.dict() for fact in parsed_memories])
 
-    for memory_db_obj in parsed_memories:
-        upsert_memory_vector(uid, memory_db_obj.id, memory_db_obj.content, memory_db_obj.category.value)
+    upsert_memory_vectors(
+        uid,
+        [(memory_db_obj.id, memory_db_obj.content, memory_db_obj.category.value) for memory_db_obj in parsed_memories],
+    )
 
     if len(parsed_memories) > 0:
         record_usage(uid, memories_created=len(parsed_memories))
@@ -517,7 +545,7 @@ def _save_action_items(uid: str, conversation: Conversation):
         def _run_auto_sync():
             asyncio.run(auto_sync_action_items_batch(uid, created_items))
 
-        threading.Thread(target=_run_auto_sync, daemon=True).start()
+        submit_job(TASK_SYNC_QUEUE, _run_auto_sync)
 
 
 def save_structured_vector(uid: str, conversation: Conversation, update_only: bool = False):
@@ -655,21 +683,12 @@ def process_conversation(
         _trigger_apps(
             uid, conversation, is_reprocess=is_reprocess, app_id=app_id, language_code=language_code, people=people
         )
-        (
-            threading.Thread(
-                target=save_structured_vector,
-                args=(
-                    uid,
-                    conversation,
-                ),
-            ).start()
-            if not is_reprocess
-            else None
-        )
-        threading.Thread(target=_extract_memories, args=(uid, conversation)).start()
-        threading.Thread(target=_extract_trends, args=(uid, conversation)).start()
-        threading.Thread(target=_save_action_items, args=(uid, conversation)).start()
-        threading.Thread(target=_update_goal_progress, args=(uid, conversation)).start()
+        if not is_reprocess:
+            submit_job(CONVERSATION_VECTORS_QUEUE, save_structured_vector, uid, conversation)
+        submit_job(CONVERSATION_EXTRACTION_QUEUE, _extract_memories, uid, conversation, priority=PRIORITY_HIGH)
+        submit_job(CONVERSATION_EXTRACTION_QUEUE, _save_action_items, uid, conversation, priority=PRIORITY_HIGH)
+        submit_job(CONVERSATION_EXTRACTION_QUEUE, _update_goal_progress, uid, conversation)
+        submit_job(CONVERSATION_EXTRACTION_QUEUE, _extract_trends, uid, conversation, priority=PRIORITY_LOW)
 
     # Create audio files from chunks if private cloud sync was enabled
     if not is_reprocess and conversation.private_cloud_sync_enabled:
@@ -693,15 +712,9 @@ def process_conversation(
         folders_db.update_folder_conversation_count(uid, assigned_folder_id)
 
     if not is_reprocess:
-        threading.Thread(
-            target=conversation_created_webhook,
-            args=(
-                uid,
-                conversation,
-            ),
-        ).start()
+        submit_job(CONVERSATION_WEBHOOKS_QUEUE, conversation_created_webhook, uid, conversation)
         # Update persona prompts with new conversation
-        threading.Thread(target=update_personas_async, args=(uid,)).start()
+        submit_job(PERSONA_UPDATES_QUEUE, update_personas_async, uid, priority=PRIORITY_LOW)
 
         # Disable important conversation for now
         # Send important conversation notification for long conversations (>30 minutes)
@@ -917,4 +930,5 @@ def retrieve_in_progress_conversation(uid):
 
     if not existing:
         existing = conversations_db.get_in_progress_conversation(uid)
-    return existing
+    # A streaming session may still be writing deltas, so they're merged in memory, not compacted here
+    return conversations_db.merge_conversation_segments_deltas(uid, existing)
@@ -0,0 +1,145 @@
+"""
+Public conversations feed.
+
+- Redis sorted set of public conversation ids scored by publish time, so pages are stable and cost
+  O(page size) instead of reading the whole public set
+- Conversations are hydrated with batched get_all reads, without transcripts or geolocation
+- The first PUBLIC_FEED_SNAPSHOT_SIZE conversations are kept as a snapshot of compressed items, rebuilt every
+  PUBLIC_FEED_SNAPSHOT_TTL seconds, shared through Redis and served from the in-memory cache. Unpublishing a
+  conversation drops the snapshot on every instance through pub/sub.
+"""
+
+import json
+import zlib
+from datetime import datetime
+from typing import List, Optional
+
+import database.conversations as conversations_db
+import database.redis_db as redis_db
+from database.cache import get_memory_cache, get_pubsub_manager
+
+PUBLIC_FEED_CACHE_KEY = 'public_conversations_feed'
+PUBLIC_FEED_SNAPSHOT_SIZE = 1000
+PUBLIC_FEED_SNAPSHOT_TTL = 60 * 5  # rebuild interval of the shared snapshot
+PUBLIC_FEED_MEMORY_TTL = 60
+
+
+class PublicFeedSnapshot:
+    """The head of the feed, one zlib-compressed JSON conversation per item, decoded per page."""
+
+    def __init__(self, items: List[bytes], covered: int):
+        self.items = items
+        # Feed ranks the snapshot was built from, larger than len(items) when some were no longer public
+        self.covered = covered
+
+    @property
+    def complete(self) -> bool:
+        """True when the snapshot holds the whole feed, pages past its end are empty."""
+        return self.covered < PUBLIC_FEED_SNAPSHOT_SIZE
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def __sizeof__(self) -> int:
+        return object.__sizeof__(self) + sum(len(item) for item in self.items)
+
+    def page(self, offset: int, limit: int) -> List[dict]:
+        return [json.loads(zlib.decompress(item)) for item in self.items[offset : offset + limit]]
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def _encode(conversation: dict) -> bytes:
+    return zlib.compress(json.dumps(conversation, default=_json_default).encode('utf-8'))
+
+
+def _hydrate(conversation_ids: List[str]) -> List[dict]:
+    conversation_uids = redis_db.get_conversation_uids(conversation_ids)
+    data = [
+        (conversation_uids[conversation_id], conversation_id)
+        for conversation_id in conversation_ids
+        if conversation_uids.get(conversation_id)
+    ]
+    return conversations_db.get_public_conversations(data)
+
+
+def _backfill_legacy_public_conversations():
+    """Adds conversations made public before the feed existed, scored by their creation time."""
+    legacy, feed = redis_db.get_public_feed_counts()
+    if legacy <= feed:
+        return
+    missing = redis_db.get_public_feed_missing_ids()
+    published_at_by_id = {
+        conversation['id']: conversation['created_at'].timestamp()
+        for conversation in _hydrate(missing)
+        if isinstance(conversation.get('created_at'), datetime)
+    }
+    redis_db.add_public_conversations_to_feed(published_at_by_id)
+    # Deleted or no longer public, drop them so the sets stay the same size
+    for conversation_id in missing:
+        if conversation_id not in published_at_by_id:
+            redis_db.remove_public_conversation(conversation_id)
+    print(f'public feed: backfilled {len(published_at_by_id)} of {len(missing)} legacy public conversations')
+
+
+def rebuild_public_feed_snapshot() -> PublicFeedSnapshot:
+    """Hydrates the head of the feed and shares it through Redis."""
+    _backfill_legacy_public_conversations()
+    conversation_ids = redis_db.get_public_conversation_ids(0, PUBLIC_FEED_SNAPSHOT_SIZE)
+    items = [_encode(conversation) for conversation in _hydrate(conversation_ids)]
+    # The first item is the header
+    header = json.dumps({'covered': len(conversation_ids)}).encode('utf-8')
+    redis_db.set_public_feed_snapshot([header] + items, ttl=PUBLIC_FEED_SNAPSHOT_TTL)
+    return PublicFeedSnapshot(items, covered=len(conversation_ids))
+
+
+def _load_snapshot() -> PublicFeedSnapshot:
+    stored = redis_db.get_public_feed_snapshot()
+    if not stored:
+        return rebuild_public_feed_snapshot()
+    return PublicFeedSnapshot(stored[1:], covered=json.loads(stored[0])['covered'])
+
+
+def get_public_feed_snapshot() -> PublicFeedSnapshot:
+    return get_memory_cache().get_or_fetch(PUBLIC_FEED_CACHE_KEY, _load_snapshot, ttl=PUBLIC_FEED_MEMORY_TTL)
+
+
+def get_public_conversations_page(offset: int = 0, limit: int = 100) -> List[dict]:
+    """
+    A page of public conversations, newest published first. Pages inside the snapshot are served from memory,
+    deeper pages read only their own range of the sorted set.
+    """
+    if limit <= 0:
+        return []
+    snapshot = get_public_feed_snapshot()
+    conversations = snapshot.page(offset, limit)
+    if len(conversations) == limit or snapshot.complete:
+        return conversations
+
+    # Past the snapshot, ranks continue after the ones it was built from
+    start = snapshot.covered + max(0, offset - len(snapshot))
+    conversation_ids = redis_db.get_public_conversation_ids(start, limit - len(conversations))
+    return conversations + _hydrate(conversation_ids)
+
+
+def publish_conversation(uid: str, conversation_id: str, published_at: Optional[float] = None):
+    """Adds the conversation to the feed, it shows up in the snapshot on its next rebuild."""
+    redis_db.store_conversation_to_uid(conversation_id, uid)
+    redis_db.add_public_conversation(conversation_id, published_at)
+
+
+def unpublish_conversation(conversation_id: str):
+    """Removes the conversation from the feed and drops the snapshot everywhere so it's gone right away."""
+    redis_db.remove_conversation_to_uid(conversation_id)
+    if redis_db.remove_public_conversation(conversation_id):
+        invalidate_public_feed()
+
+
+def invalidate_public_feed():
+    redis_db.delete_public_feed_snapshot()
+    get_memory_cache().delete(PUBLIC_FEED_CACHE_KEY)
+    get_pubsub_manager().publish_invalidation([PUBLIC_FEED_CACHE_KEY])
@@ -1,6 +1,10 @@
 import base64
 import os
 import struct
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional
 
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
@@ -27,15 +31,73 @@ def derive_key(uid: str) -> bytes:
     return hkdf.derive(ENCRYPTION_SECRET)
 
 
-def encrypt(data: str, uid: str) -> str:
+# *********************************
+# ******* DERIVED KEY CACHE *******
+# *********************************
+
+KEY_CACHE_MAX_ENTRIES = int(os.getenv('ENCRYPTION_KEY_CACHE_MAX_ENTRIES', '10000'))
+KEY_CACHE_TTL = int(os.getenv('ENCRYPTION_KEY_CACHE_TTL', '3600'))
+
+
+class _CipherCache:
     """
-    Encrypts a string using a user-specific key.
-    Returns a base64 encoded string containing nonce + ciphertext + tag.
+    Bounded LRU of per-uid AESGCM objects with a TTL, so HKDF runs once per user instead of once per field.
     """
-    if not data:
-        return data
-    key = derive_key(uid)
-    aesgcm = AESGCM(key)
+
+    def __init__(self, max_entries: int = KEY_CACHE_MAX_ENTRIES, ttl: float = KEY_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple] = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Stats
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, uid: str) -> AESGCM:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(uid)
+            if entry is not None and now - entry[1] < self.ttl:
+                self._entries.move_to_end(uid)
+                self.hits += 1
+                return entry[0]
+
+        # Derive outside the lock; concurrent misses for the same uid produce identical keys
+        aesgcm = AESGCM(derive_key(uid))
+        with self._lock:
+            self.misses += 1
+            self._entries[uid] = (aesgcm, now)
+            self._entries.move_to_end(uid)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return aesgcm
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_cipher_cache = _CipherCache()
+
+
+def get_cipher(uid: str) -> AESGCM:
+    """
+    Returns the cached AESGCM object for a user's derived key.
+    """
+    return _cipher_cache.get(uid)
+
+
+def clear_key_cache():
+    _cipher_cache.clear()
+
+
+# *********************************
+# ******* FIELD ENCRYPTION ********
+# *********************************
+
+
+def _encrypt_with(aesgcm: AESGCM, data: str) -> str:
     nonce = os.urandom(12)  # GCM standard nonce size
 
     # Data must be bytes
@@ -49,17 +111,8 @@ def encrypt(data: str, uid: str) -> str:
     return base64.b64encode(encrypted_payload).decode('utf-8')
 
 
-def decrypt(encrypted_data: str, uid: str) -> str:
-    """
-    Decrypts a base64 encoded string using a user-specific key.
-    """
-    if not encrypted_data or not isinstance(encrypted_data, str):
-        return encrypted_data
-
+def _decrypt_with(aesgcm: AESGCM, encrypted_data: str, uid: str) -> str:
     try:
-        key = derive_key(uid)
-        aesgcm = AESGCM(key)
-
         encrypted_payload = base64.b64decode(encrypted_data.encode('utf-8'))
 
         # Extract nonce and ciphertext
@@ -77,6 +130,51 @@ def decrypt(encrypted_data: str, uid: str) -> str:
         return encrypted_data
 
 
+def encrypt(data: str, uid: str) -> str:
+    """
+    Encrypts a string using a user-specific key.
+    Returns a base64 encoded string containing nonce + ciphertext + tag.
+    """
+    if not data:
+        return data
+    return _encrypt_with(get_cipher(uid), data)
+
+
+def decrypt(encrypted_data: str, uid: str) -> str:
+    """
+    Decrypts a base64 encoded string using a user-specific key.
+    """
+    if not encrypted_data or not isinstance(encrypted_data, str):
+        return encrypted_data
+    return _decrypt_with(get_cipher(uid), encrypted_data, uid)
+
+
+def encrypt_many(values: List[Optional[str]], uid: str) -> List[Optional[str]]:
+    """
+    Encrypts a list of strings for one user with a single key lookup.
+    Empty values are returned unchanged, as with encrypt().
+    """
+    if not values:
+        return []
+    aesgcm = get_cipher(uid)
+    return [_encrypt_with(aesgcm, value) if value else value for value in values]
+
+
+def decrypt_many(values: List[Optional[str]], uid: str) -> List[Optional[str]]:
+    """
+    Decrypts a list of base64 encoded strings for one user with a single key lookup.
+    Non-string values and values that fail to decrypt are returned unchanged, as with decrypt().
+    """
+    if not values:
+        return []
+    aesgcm = get_cipher(uid)
+    return [_decrypt_with(aesgcm, value, uid) if value and isinstance(value, str) else value for value in values]
+
+
+# Length prefix + nonce + GCM tag added to each encrypted audio chunk
+ENCRYPTED_AUDIO_CHUNK_OVERHEAD = 4 + 12 + 16
+
+
 def encrypt_audio_chunk(data: bytes, uid: str) -> bytes:
     """
     Encrypt audio chunk and return length-prefixed binary format.
@@ -84,8 +182,7 @@ def encrypt_audio_chunk(data: bytes, uid: str) -> bytes:
 
     This format allows concatenating multiple encrypted chunks without decryption.
     """
-    key = derive_key(uid)
-    aesgcm = AESGCM(key)
+    aesgcm = get_cipher(uid)
     nonce = os.urandom(12)
 
     # Encrypt (includes authentication tag)
@@ -99,7 +196,7 @@ def encrypt_audio_chunk(data: bytes, uid: str) -> bytes:
     return struct.pack('>I', length) + encrypted_payload
 
 
-def decrypt_audio_chunk(encrypted_data: bytes, uid: str, offset: int = 0):
+def decrypt_audio_chunk(encrypted_data: bytes, uid: str, offset: int = 0, aesgcm: Optional[AESGCM] = None):
     """
     Decrypt a single length-prefixed chunk.
     Returns: (decrypted_data, bytes_consumed)
@@ -116,24 +213,34 @@ def decrypt_audio_chunk(encrypted_data: bytes, uid: str, offset: int = 0):
     ciphertext = encrypted_payload[12:]
 
     # Decrypt
-    key = derive_key(uid)
-    aesgcm = AESGCM(key)
+    if aesgcm is None:
+        aesgcm = get_cipher(uid)
     decrypted = aesgcm.decrypt(nonce, ciphertext, None)
 
     return decrypted, 4 + length
 
 
-def decrypt_audio_file(encrypted_data: bytes, uid: str) -> bytes:
+def decrypt_audio_file(encrypted_data: bytes, uid: str, aesgcm: Optional[AESGCM] = None) -> bytes:
     """
     Decrypt an entire merged audio file (multiple concatenated chunks).
     Each chunk is length-prefixed, allowing simple concatenation during merge.
     """
+    if aesgcm is None:
+        aesgcm = get_cipher(uid)
     decrypted_audio = bytearray()
     offset = 0
 
     while offset < len(encrypted_data):
-        chunk_data, bytes_consumed = decrypt_audio_chunk(encrypted_data, uid, offset)
+        chunk_data, bytes_consumed = decrypt_audio_chunk(encrypted_data, uid, offset, aesgcm)
         decrypted_audio.extend(chunk_data)
         offset += bytes_consumed
 
     return bytes(decrypted_audio)
+
+
+def decrypt_audio_files(encrypted_files: List[bytes], uid: str) -> List[bytes]:
+    """
+    Decrypt several merged audio files for one user with a single key lookup.
+    """
+    aesgcm = get_cipher(uid)
+    return [decrypt_audio_file(data, uid, aesgcm) for data in encrypted_files]
@@ -0,0 +1,300 @@
+"""
+Embedding client for the Doubao (ByteDance) embeddings API.
+
+- Deduplicates and caches embeddings by content hash (in-process LRU, optionally backed by Redis with TTL)
+- Batches uncached texts up to the provider's input limit per request
+- Reuses pooled HTTP connections and runs large jobs with bounded concurrency
+- Offers async variants (aembed_documents / aembed_query) for coroutine call sites
+"""
+
+import asyncio
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional
+
+import httpx
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class EmbeddingCache:
+    """
+    Thread-safe LRU of embeddings keyed by content hash, with an optional Redis tier.
+
+    Vectors are stored as float32 bytes in Redis to keep entries compact.
+    """
+
+    def __init__(self, max_entries: int = 10000, redis_client=None, ttl: int = 60 * 60 * 24 * 7):
+        self.max_entries = max_entries
+        self.redis_client = redis_client
+        self.ttl = ttl
+        self._entries: OrderedDict[str, List[float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Stats
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(model: str, dimensions: int, text: str) -> str:
+        digest = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        return f'embeddings:{model}:{dimensions}:{digest}'
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        found: Dict[str, List[float]] = {}
+        with self._lock:
+            for key in keys:
+                vector = self._entries.get(key)
+                if vector is not None:
+                    self._entries.move_to_end(key)
+                    found[key] = vector
+            self.hits += len(found)
+
+        missing = [key for key in keys if key not in found]
+        if missing and self.redis_client is not None:
+            try:
+                values = self.redis_client.mget(missing)
+            except Exception as e:
+                print(f'Embedding cache redis get error: {e}')
+                values = [None] * len(missing)
+
+            from_redis = {}
+            for key, value in zip(missing, values):
+                if value:
+                    from_redis[key] = np.frombuffer(value, dtype=np.float32).tolist()
+            if from_redis:
+                self._set_local(from_redis)
+                found.update(from_redis)
+                with self._lock:
+                    self.redis_hits += len(from_redis)
+
+        with self._lock:
+            self.misses += len(keys) - len(found)
+        return found
+
+    def set_many(self, items: Dict[str, List[float]]):
+        if not items:
+            return
+        self._set_local(items)
+        if self.redis_client is None:
+            return
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            for key, vector in items.items():
+                pipe.set(key, np.asarray(vector, dtype=np.float32).tobytes(), ex=self.ttl)
+            pipe.execute()
+        except Exception as e:
+            print(f'Embedding cache redis set error: {e}')
+
+    def _set_local(self, items: Dict[str, List[float]]):
+        with self._lock:
+            for key, vector in items.items():
+                self._entries[key] = vector
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class DoubaoEmbeddings:
+    """Batched, cached client for the Doubao embeddings API with retry logic."""
+
+    def __init__(
+        self,
+        api_key: str,
+        url: str,
+        model: str,
+        dimensions: int = 1024,
+        batch_size: Optional[int] = None,
+        max_concurrency: int = 4,
+        timeout: float = 30,
+        max_retries: int = 3,
+        cache: Optional[EmbeddingCache] = None,
+    ):
+        self.api_key = api_key
+        self.url = url
+        self.model = model
+        self.dimensions = dimensions
+        # The multimodal endpoint fuses all inputs of a request into one embedding, so it can't batch texts
+        if batch_size is None:
+            batch_size = 1 if url.rstrip('/').endswith('/multimodal') else 256
+        self.batch_size = max(1, batch_size)
+        self.max_concurrency = max(1, max_concurrency)
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.cache = cache if cache is not None else EmbeddingCache()
+
+        self._session: Optional[requests.Session] = None
+        self._session_lock = threading.Lock()
+        self._async_client: Optional[httpx.AsyncClient] = None
+
+        # Stats
+        self.requests_sent = 0
+
+    # ********************
+    # ****** HTTP ********
+    # ********************
+
+    @property
+    def _multimodal(self) -> bool:
+        return self.url.rstrip('/').endswith('/multimodal')
+
+    def _headers(self) -> dict:
+        return {'Content-Type': 'application/json', 'Authorization': f'Bearer {self.api_key}'}
+
+    def _payload(self, texts: List[str]) -> dict:
+        if self._multimodal:
+            inputs = [{'type': 'text', 'text': text} for text in texts]
+        else:
+            inputs = texts
+        return {'model': self.model, 'input': inputs, 'dimensions': self.dimensions, 'encoding_format': 'float'}
+
+    def _parse(self, data: dict, count: int) -> List[List[float]]:
+        result = data.get('data') if isinstance(data, dict) else None
+        # Multimodal endpoint: {'data': {'embedding': [...]}}
+        if isinstance(result, dict) and 'embedding' in result and count == 1:
+            return [result['embedding']]
+        # Text endpoint: {'data': [{'index': i, 'embedding': [...]}, ...]}
+        if isinstance(result, list) and len(result) == count:
+            ordered = sorted(result, key=lambda item: item.get('index', 0))
+            return [item['embedding'] for item in ordered]
+        raise ValueError(f'Doubao embedding error: {data}')
+
+    def _get_session(self) -> requests.Session:
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_concurrency)
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
+                    self._session = session
+        return self._session
+
+    def _get_async_client(self) -> httpx.AsyncClient:
+        if self._async_client is None or self._async_client.is_closed:
+            self._async_client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency
+                ),
+            )
+        return self._async_client
+
+    def _post_batch(self, texts: List[str]) -> List[List[float]]:
+        last_error = None
+        for attempt in range(self.max_retries):
+            try:
+                self.requests_sent += 1
+                response = self._get_session().post(
+                    self.url, headers=self._headers(), json=self._payload(texts), timeout=self.timeout
+                )
+                return self._parse(response.json(), len(texts))
+            except Exception as e:
+                last_error = str(e)
+                if attempt < self.max_retries - 1:
+                    time.sleep(1 * (attempt + 1))  # 1s, 2s backoff
+
+        print(f"Doubao embedding failed after {self.max_retries} retries: {last_error}, returning zero embedding")
+        return [None] * len(texts)
+
+    async def _apost_batch(self, texts: List[str]) -> List[List[float]]:
+        last_error = None
+        for attempt in range(self.max_retries):
+            try:
+                self.requests_sent += 1
+                response = await self._get_async_client().post(
+                    self.url, headers=self._headers(), json=self._payload(texts)
+                )
+                return self._parse(response.json(), len(texts))
+            except Exception as e:
+                last_error = str(e)
+                if attempt < self.max_retries - 1:
+                    await asyncio.sleep(1 * (attempt + 1))
+
+        print(f"Doubao embedding failed after {self.max_retries} retries: {last_error}, returning zero embedding")
+        return [None] * len(texts)
+
+    # ********************
+    # ****** CORE ********
+    # ********************
+
+    def _batches(self, texts: List[str]) -> Iterable[List[str]]:
+        for i in range(0, len(texts), self.batch_size):
+            yield texts[i : i + self.batch_size]
+
+    def _lookup(self, texts: List[str]):
+        keys = {text: EmbeddingCache.key(self.model, self.dimensions, text) for text in texts}
+        cached = self.cache.get_many(list(set(keys.values())))
+        missing = list(dict.fromkeys(text for text in texts if keys[text] not in cached))
+        return keys, cached, missing
+
+    def _store(self, keys: Dict[str, str], cached: Dict[str, List[float]], missing: List[str], vectors: list):
+        fresh = {}
+        for text, vector in zip(missing, vectors):
+            # Failures are returned as zero vectors but never cached
+            if vector is not None:
+                fresh[keys[text]] = vector
+        self.cache.set_many(fresh)
+        cached.update(fresh)
+
+    def _assemble(self, texts: List[str], keys: Dict[str, str], cached: Dict[str, List[float]]) -> List[List[float]]:
+        zero = [0.0] * self.dimensions
+        return [cached.get(keys[text], zero) for text in texts]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        if not self.api_key:
+            print("Warning: DOUBAO_API_KEY not set, returning zero embeddings")
+            return [[0.0] * self.dimensions for _ in texts]
+
+        keys, cached, missing = self._lookup(texts)
+        if missing:
+            batches = list(self._batches(missing))
+            if len(batches) == 1:
+                results = [self._post_batch(batches[0])]
+            else:
+                with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(batches))) as executor:
+                    results = list(executor.map(self._post_batch, batches))
+            self._store(keys, cached, missing, [vector for batch in results for vector in batch])
+        return self._assemble(texts, keys, cached)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        if not self.api_key:
+            print("Warning: DOUBAO_API_KEY not set, returning zero embeddings")
+            return [[0.0] * self.dimensions for _ in texts]
+
+        keys, cached, missing = await asyncio.to_thread(self._lookup, texts)
+        if missing:
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+
+            async def _run(batch: List[str]):
+                async with semaphore:
+                    return await self._apost_batch(batch)
+
+            results = await asyncio.gather(*[_run(batch) for batch in self._batches(missing)])
+            vectors = [vector for batch in results for vector in batch]
+            await asyncio.to_thread(self._store, keys, cached, missing, vectors)
+        return self._assemble(texts, keys, cached)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
@@ -9,9 +9,9 @@ from datetime import datetime, timezone, timedelta
 from typing import Optional, Dict, List
 
 import database.goals as goals_db
-import database.memories as memories_db
 import database.conversations as conversations_db
 import database.chat as chat_db
+from utils import memory_snapshot
 from database.vector_db import query_vectors as vector_search
 from utils.llm.clients import llm_mini, llm_medium
 
@@ -86,7 +86,7 @@ def _get_goal_context(uid: str, goal_title: str) -> Dict[str, str]:
     # 4. User memories/facts
     memory_context = ""
     try:
-        memories = memories_db.get_memories(uid, limit=30, offset=0)
+        memories = memory_snapshot.get_memories(uid, limit=30, offset=0)
         memory_texts = [m.get('content', '')[:150] for m in memories[:15] if m.get('content')]
         memory_context = '\n'.join(memory_texts)
     except Exception as e:
@@ -103,7 +103,7 @@ def suggest_goal(uid: str) -> Dict:
     """Generate an AI-suggested goal based on user's memories and conversations."""
     try:
         # Get user's memories for context
-        memories = memories_db.get_memories(uid, limit=100, offset=0)
+        memories = memory_snapshot.get_memories(uid, limit=100, offset=0)
         
         if not memories:
             # Default suggestion when no memories
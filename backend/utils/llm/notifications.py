@@ -1,7 +1,7 @@
 import random
 from typing import Tuple, List
 from .clients import llm_medium
-from database.memories import get_memories
+from utils.memory_snapshot import get_memories
 
 
 async def get_relevant_memories(uid: str, limit: int = 100) -> List[dict]:
@@ -1,8 +1,8 @@
 from typing import List, Tuple, Optional
 
-import database.memories as memories_db
 from database.auth import get_user_name
 from models.memories import Memory, MemoryCategory
+from utils import memory_snapshot
 
 
 def get_prompt_memories(uid: str) -> str:
@@ -47,8 +47,7 @@ def safe_create_memory(memory_data):
 
 
 def get_prompt_data(uid: str) -> Tuple[str, List[Memory], List[Memory]]:
-    # TODO: cache this
-    existing_memories = memories_db.get_memories(uid, limit=1000)
+    existing_memories = memory_snapshot.get_memories(uid, limit=1000)
 
     # Use a safer approach to create Memory objects from existing memories
     user_made = []
@@ -0,0 +1,341 @@
+"""
+Per-user memory snapshots, so chat, agent tools, personas and notifications don't read and decrypt the user's
+memories from Firestore on every use.
+
+- A snapshot is the user's memories in get_memories order, rejected ones left out, and once a search needs them
+  their embeddings as one L2-normalized float32 matrix, so a search is a single matrix-vector product
+- Shared across requests through the in-memory cache and across instances through Redis: the memories compressed
+  (and encrypted with the user's key when they have enhanced memories), the embeddings as float16 under their own
+  key, only read by searches
+- Versioned in Redis: every memory write bumps the user's version with the ids it changed, a snapshot a few versions
+  behind reads only those again (delta refresh), one further behind is rebuilt
+"""
+
+import base64
+import json
+import zlib
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+import database.memories as memories_db
+import database.redis_db as redis_db
+import database.vector_db as vector_db
+from database.cache import get_memory_cache
+from utils import encryption
+from utils.llm.clients import embeddings
+
+# The most memories a reader asks for at once (GET /v3/memories, the chat tools)
+MEMORY_SNAPSHOT_LIMIT = 5000
+MEMORY_SNAPSHOT_CACHE_TTL = 60 * 30
+# More changed memories than this and a rebuild is cheaper than reading them by id
+MAX_DELTA_IDS = 200
+
+
+def _order_key(memory: dict):
+    # Firestore order: scoring desc (strings before nulls), created_at desc, then document id desc
+    scoring = memory.get('scoring')
+    return scoring is not None, scoring or '', memory['created_at'], memory['id']
+
+
+def _listed(memory: Optional[dict]) -> bool:
+    """Whether get_memories returns the memory: the ordered by fields set, Firestore skips docs without them."""
+    if not memory or 'id' not in memory:
+        return False
+    return 'scoring' in memory and 'created_at' in memory and memory.get('user_review') is not False
+
+
+def _aware(value: Optional[datetime]) -> Optional[datetime]:
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def _normalize(vectors) -> np.ndarray:
+    matrix = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return {'__datetime__': value.isoformat()}
+    raise TypeError(f'{type(value).__name__} is not serializable')
+
+
+def _json_object(value: dict):
+    if len(value) == 1 and '__datetime__' in value:
+        return datetime.fromisoformat(value['__datetime__'])
+    return value
+
+
+class MemorySnapshot:
+    """
+    One version of a user's memories. Treated as immutable once cached: a refresh builds a new snapshot, so readers
+    holding this one never see it change.
+    """
+
+    def __init__(
+        self,
+        uid: str,
+        version: int,
+        memories: List[dict],
+        complete: bool,
+        vector_ids: Optional[List[str]] = None,
+        vectors: Optional[np.ndarray] = None,
+    ):
+        self.uid = uid
+        self.version = version
+        self.memories = memories
+        # False when the user has more memories than MEMORY_SNAPSHOT_LIMIT, the snapshot holds the first ones
+        self.complete = complete
+        self.vector_ids = vector_ids
+        self.vectors = vectors
+        self._positions = {memory['id']: i for i, memory in enumerate(memories)}
+
+    @property
+    def has_vectors(self) -> bool:
+        return self.vectors is not None
+
+    def __len__(self) -> int:
+        return len(self.memories)
+
+    def __contains__(self, memory_id: str) -> bool:
+        return memory_id in self._positions
+
+    def __sizeof__(self) -> int:
+        vectors = 0 if self.vectors is None else self.vectors.nbytes + 80 * len(self.vector_ids)
+        memories = sum(len(memory.get('content') or '') + 600 for memory in self.memories)
+        return object.__sizeof__(self) + memories + vectors
+
+    def covers(
+        self,
+        limit: int,
+        offset: int = 0,
+        categories: Optional[List[str]] = None,
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None,
+    ) -> bool:
+        """Whether get() returns what get_memories would, a filtered read needs all the memories."""
+        if self.complete:
+            return True
+        return not (categories or start_date or end_date) and offset + limit <= len(self.memories)
+
+    def get(
+        self,
+        limit: int = 100,
+        offset: int = 0,
+        categories: Optional[List[str]] = None,
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None,
+    ) -> List[dict]:
+        """Same arguments as database.memories.get_memories, copies of the memories so callers can change them."""
+        start_date, end_date = _aware(start_date), _aware(end_date)
+        memories = self.memories
+        if categories or start_date or end_date:
+            memories = [
+                memory
+                for memory in memories
+                if (not categories or memory.get('category') in categories)
+                and (start_date is None or memory['created_at'] >= start_date)
+                and (end_date is None or memory['created_at'] <= end_date)
+            ]
+        return [dict(memory) for memory in memories[offset : offset + limit]]
+
+    def search(self, query_vector, limit: int = 10) -> List[Tuple[dict, float]]:
+        """The memories closest to the query embedding with their cosine similarity, closest first."""
+        if not self.vector_ids or limit <= 0:
+            return []
+        query = _normalize(query_vector).reshape(-1)
+        if len(query) != self.vectors.shape[1]:
+            raise ValueError(f'query dimension {len(query)}, snapshot has {self.vectors.shape[1]}')
+        similarities = self.vectors @ query
+        count = min(limit, len(similarities))
+        top = np.argpartition(-similarities, count - 1)[:count] if count < len(similarities) else np.arange(count)
+        top = top[np.argsort(-similarities[top], kind='stable')]
+        return [
+            (dict(self.memories[self._positions[self.vector_ids[i]]]), float(similarities[i]))
+            for i in top
+            if self.vector_ids[i] in self._positions
+        ]
+
+    def with_changes(
+        self,
+        version: int,
+        changed_ids: Iterable[str],
+        memories: List[dict],
+        vectors: Optional[Dict[str, List[float]]] = None,
+    ) -> 'MemorySnapshot':
+        """
+        The next version: changed_ids were written since this one, memories are those of them that still exist and
+        vectors their embeddings, required when this snapshot has embeddings.
+        """
+        changed = set(changed_ids)
+        kept = [memory for memory in self.memories if memory['id'] not in changed]
+        added = [memory for memory in memories if _listed(memory)]
+        if not self.complete and self.memories:
+            # Past the last memory there may be others this snapshot doesn't hold
+            last = _order_key(self.memories[-1])
+            added = [memory for memory in added if _order_key(memory) >= last]
+        updated = sorted(kept + added, key=_order_key, reverse=True)
+
+        vector_ids, matrix = None, None
+        if self.has_vectors:
+            rows = [i for i, memory_id in enumerate(self.vector_ids) if memory_id not in changed]
+            vectors = vectors or {}
+            fresh = [(m['id'], vectors[m['id']]) for m in added if m['id'] in vectors]
+            vector_ids = [self.vector_ids[i] for i in rows] + [memory_id for memory_id, _ in fresh]
+            matrix = self.vectors[rows]
+            if fresh:
+                added_rows = _normalize([vector for _, vector in fresh])
+                matrix = np.vstack([matrix, added_rows]) if len(matrix) else added_rows
+        return MemorySnapshot(self.uid, version, updated, self.complete, vector_ids, matrix)
+
+    def with_vectors(self, vectors: Dict[str, List[float]]) -> 'MemorySnapshot':
+        vector_ids = [memory['id'] for memory in self.memories if memory['id'] in vectors]
+        if vector_ids:
+            matrix = _normalize([vectors[memory_id] for memory_id in vector_ids])
+        else:
+            matrix = np.zeros((0, 0), dtype=np.float32)
+        return MemorySnapshot(self.uid, self.version, self.memories, self.complete, vector_ids, matrix)
+
+    def to_bytes(self) -> bytes:
+        payload = {'version': self.version, 'complete': self.complete, 'memories': self.memories}
+        data = zlib.compress(json.dumps(payload, default=_json_default, separators=(',', ':')).encode())
+        if any(memory.get('data_protection_level') == 'enhanced' for memory in self.memories):
+            return b'e' + encryption.encrypt(base64.b64encode(data).decode(), self.uid).encode()
+        return b'p' + data
+
+    @classmethod
+    def from_bytes(cls, uid: str, data: bytes) -> 'MemorySnapshot':
+        if data[:1] == b'e':
+            data = base64.b64decode(encryption.decrypt(data[1:].decode(), uid))
+        else:
+            data = data[1:]
+        payload = json.loads(zlib.decompress(data), object_hook=_json_object)
+        return cls(uid, payload['version'], payload['memories'], payload['complete'])
+
+    def vectors_to_bytes(self) -> bytes:
+        """float16 halves the size, far below the precision a ranking needs."""
+        header = {'version': self.version, 'ids': self.vector_ids, 'dim': int(self.vectors.shape[1])}
+        return json.dumps(header, separators=(',', ':')).encode() + b'\n' + self.vectors.astype(np.float16).tobytes()
+
+    def with_vectors_from_bytes(self, data: bytes) -> Optional['MemorySnapshot']:
+        """This snapshot with the embeddings stored by vectors_to_bytes, None when those are of another version."""
+        header, matrix = data.split(b'\n', 1)
+        header = json.loads(header)
+        if header['version'] != self.version:
+            return None
+        vectors = np.frombuffer(matrix, dtype=np.float16).astype(np.float32).reshape(len(header['ids']), header['dim'])
+        return MemorySnapshot(self.uid, self.version, self.memories, self.complete, header['ids'], vectors)
+
+
+def _from_redis(uid: str) -> Optional[MemorySnapshot]:
+    try:
+        data = redis_db.get_memory_snapshot(uid)
+        return MemorySnapshot.from_bytes(uid, data) if data else None
+    except Exception as e:
+        print(f"Memory snapshot: can't read the Redis snapshot: {e}", uid)
+        return None
+
+
+def _vectors_from_redis(snapshot: MemorySnapshot) -> Optional[MemorySnapshot]:
+    try:
+        data = redis_db.get_memory_snapshot(snapshot.uid, part='vectors')
+        return snapshot.with_vectors_from_bytes(data) if data else None
+    except Exception as e:
+        print(f"Memory snapshot: can't read the Redis embeddings: {e}", snapshot.uid)
+        return None
+
+
+def _store(snapshot: MemorySnapshot, memories_changed: bool, vectors_changed: bool):
+    get_memory_cache().set(memories_db.memory_snapshot_cache_key(snapshot.uid), snapshot, ttl=MEMORY_SNAPSHOT_CACHE_TTL)
+    try:
+        if memories_changed:
+            redis_db.set_memory_snapshot(snapshot.uid, snapshot.to_bytes())
+        if vectors_changed and snapshot.has_vectors:
+            redis_db.set_memory_snapshot(snapshot.uid, snapshot.vectors_to_bytes(), part='vectors')
+    except Exception as e:
+        print(f"Memory snapshot: can't write to Redis: {e}", snapshot.uid)
+
+
+def get_memory_snapshot(uid: str, with_vectors: bool = False) -> MemorySnapshot:
+    """
+    The user's latest snapshot: from the in-memory cache, else from Redis, brought up to date with the memories
+    changed since, else read from Firestore.
+
+    Args:
+        uid: user id
+        with_vectors: load the embeddings too, for search()
+    """
+    # Read before the memories so a write made while loading leaves this snapshot stale
+    version = redis_db.get_memories_version(uid)
+    snapshot = get_memory_cache().get(memories_db.memory_snapshot_cache_key(uid))
+    if snapshot is not None and snapshot.version == version and (snapshot.has_vectors or not with_vectors):
+        return snapshot
+
+    if snapshot is None:
+        snapshot = _from_redis(uid)
+    memories_changed = vectors_changed = False
+    if with_vectors and snapshot is not None and not snapshot.has_vectors:
+        snapshot = _vectors_from_redis(snapshot) or snapshot
+
+    if snapshot is not None and snapshot.version != version:
+        changed_ids = None
+        if snapshot.version < version:
+            changed_ids = redis_db.get_memories_changes(uid, snapshot.version)
+        if changed_ids is not None and len(changed_ids) <= MAX_DELTA_IDS:
+            memories = memories_db.get_memories_by_ids(uid, changed_ids) if changed_ids else []
+            vectors = vector_db.fetch_memory_vectors(uid, changed_ids) if snapshot.has_vectors and changed_ids else {}
+            snapshot = snapshot.with_changes(version, changed_ids, memories, vectors)
+        else:
+            snapshot = None
+        memories_changed = vectors_changed = True
+
+    if snapshot is None:
+        memories, complete = memories_db.get_all_memories(uid, MEMORY_SNAPSHOT_LIMIT)
+        snapshot = MemorySnapshot(uid, version, memories, complete)
+        memories_changed = True
+    if with_vectors and not snapshot.has_vectors:
+        snapshot = snapshot.with_vectors(vector_db.fetch_memory_vectors(uid, [m['id'] for m in snapshot.memories]))
+        vectors_changed = True
+
+    _store(snapshot, memories_changed, vectors_changed)
+    return snapshot
+
+
+def get_memories(
+    uid: str,
+    limit: int = 100,
+    offset: int = 0,
+    categories: Optional[List[str]] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+) -> List[dict]:
+    """database.memories.get_memories from the snapshot, from Firestore when the snapshot doesn't hold all of them."""
+    try:
+        snapshot = get_memory_snapshot(uid)
+    except Exception as e:
+        print(f"Memory snapshot: falling back to Firestore: {e}", uid)
+        snapshot = None
+    if snapshot is not None and snapshot.covers(limit, offset, categories, start_date, end_date):
+        return snapshot.get(limit, offset, categories, start_date, end_date)
+    return memories_db.get_memories(uid, limit, offset, categories or [], start_date, end_date)
+
+
+def search_memories(uid: str, query: str, limit: int = 10) -> Optional[List[Tuple[dict, float]]]:
+    """
+    The memories closest to the query, from the snapshot's embeddings. None when the snapshot can't answer (no
+    embeddings, more memories than it holds, or Redis / the index failing), for the caller to query the vector
+    index instead.
+    """
+    try:
+        snapshot = get_memory_snapshot(uid, with_vectors=True)
+    except Exception as e:
+        print(f"Memory snapshot: falling back to the vector index: {e}", uid)
+        return None
+    if not snapshot.complete or not snapshot.vector_ids:
+        return None
+    return snapshot.search(embeddings.embed_query(query), limit)
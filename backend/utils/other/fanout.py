@@ -0,0 +1,163 @@
+"""
+Bounded fan-out of jobs through blocking stages (daily summaries: Firestore reads, LLM calls, FCM sends; offline
+sync: decode, VAD, transcription, merge).
+
+- Each stage runs its blocking function on its own thread pool, the pool size is the stage's concurrency limit.
+  A stage may run on a shared pool instead, then its concurrency only caps the workers of this run
+- Stages are connected by bounded queues, so a slow stage back-pressures the ones before it instead of
+  buffering every user in memory
+- A stage returns the item for the next stage, or None when the job is done for that item. A `fanout` stage
+  returns a list of items instead
+- A stage function that raises fails that item only
+- Per-stage throughput and progress metrics
+"""
+
+import asyncio
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+DEFAULT_QUEUE_SIZE = 256
+
+
+@dataclass
+class FanoutStage:
+    name: str
+    func: Callable[[Any], Any]
+    concurrency: int
+    fanout: bool = False  # func returns a list of items for the next stage
+    queue_size: Optional[int] = None  # of the stage's inbox, the engine's queue_size if None
+    executor: Optional[Executor] = None  # a shared pool, left running after the run
+
+
+@dataclass
+class StageMetrics:
+    received: int = 0
+    running: int = 0
+    processed: int = 0
+    forwarded: int = 0
+    failed: int = 0
+    busy_time: float = 0.0
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    def as_dict(self) -> dict:
+        wall = (self.finished_at - self.started_at) if self.started_at and self.finished_at else 0.0
+        return {
+            'received': self.received,
+            'running': self.running,
+            'processed': self.processed,
+            'forwarded': self.forwarded,
+            'failed': self.failed,
+            'per_second': round(self.processed / wall, 1) if wall else 0.0,
+            'avg_ms': round(self.busy_time / self.processed * 1000, 2) if self.processed else 0.0,
+        }
+
+
+class FanoutEngine:
+    """
+    on_progress gets the metrics on every change, keep it cheap. on_error gets (stage, item, exception) of every
+    failed item.
+    """
+
+    def __init__(
+        self,
+        stages: List[FanoutStage],
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+        on_progress: Optional[Callable[[Dict[str, StageMetrics]], None]] = None,
+        on_error: Optional[Callable[[FanoutStage, Any, Exception], None]] = None,
+    ):
+        self.stages = stages
+        self.queue_size = queue_size
+        self.on_progress = on_progress
+        self.on_error = on_error
+        self.metrics: Dict[str, StageMetrics] = {stage.name: StageMetrics() for stage in stages}
+
+    def _changed(self):
+        if self.on_progress:
+            self.on_progress(self.metrics)
+
+    async def _put(self, stage: FanoutStage, queue: asyncio.Queue, item: Any):
+        self.metrics[stage.name].received += 1
+        self._changed()
+        await queue.put(item)
+
+    async def _worker(
+        self,
+        stage: FanoutStage,
+        executor: Executor,
+        inbox: asyncio.Queue,
+        next_stage: Optional[FanoutStage],
+        outbox: Optional[asyncio.Queue],
+    ):
+        loop = asyncio.get_running_loop()
+        metrics = self.metrics[stage.name]
+        while True:
+            item = await inbox.get()
+            try:
+                started = time.perf_counter()
+                if metrics.started_at is None:
+                    metrics.started_at = started
+                metrics.running += 1
+                try:
+                    result = await loop.run_in_executor(executor, stage.func, item)
+                except Exception as e:
+                    print(f'fanout stage {stage.name} failed: {type(e).__name__} {e}')
+                    metrics.failed += 1
+                    result = None
+                    if self.on_error:
+                        self.on_error(stage, item, e)
+                finally:
+                    metrics.running -= 1
+                finished = time.perf_counter()
+                metrics.processed += 1
+                metrics.busy_time += finished - started
+                metrics.finished_at = finished
+                self._changed()
+                if result is None or outbox is None:
+                    continue
+                for output in result if stage.fanout else [result]:
+                    metrics.forwarded += 1
+                    await self._put(next_stage, outbox, output)
+            finally:
+                # Always, so run() can't wait forever on an item
+                inbox.task_done()
+
+    async def run(self, items: Iterable[Any]) -> Dict[str, dict]:
+        """Pushes every item through the stages and returns the per-stage metrics."""
+        queues = [asyncio.Queue(maxsize=stage.queue_size or self.queue_size) for stage in self.stages]
+        # Only the pools made here are shut down afterwards
+        own_executors = {
+            stage.name: ThreadPoolExecutor(max_workers=stage.concurrency, thread_name_prefix=f'fanout-{stage.name}')
+            for stage in self.stages
+            if stage.executor is None
+        }
+        workers = []
+        for i, stage in enumerate(self.stages):
+            executor = stage.executor or own_executors[stage.name]
+            next_stage = self.stages[i + 1] if i + 1 < len(self.stages) else None
+            outbox = queues[i + 1] if next_stage else None
+            workers.append(
+                [
+                    asyncio.create_task(self._worker(stage, executor, queues[i], next_stage, outbox))
+                    for _ in range(stage.concurrency)
+                ]
+            )
+
+        try:
+            for item in items:
+                await self._put(self.stages[0], queues[0], item)
+            # A stage's queue drains only after its items were forwarded, so the stages finish in order
+            for queue, stage_workers in zip(queues, workers):
+                await queue.join()
+                for worker in stage_workers:
+                    worker.cancel()
+        finally:
+            for stage_workers in workers:
+                for worker in stage_workers:
+                    worker.cancel()
+            for executor in own_executors.values():
+                executor.shutdown(wait=False)
+
+        return {name: metrics.as_dict() for name, metrics in self.metrics.items()}
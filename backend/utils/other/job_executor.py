@@ -0,0 +1,323 @@
+"""
+Process-wide executor for background side effects (vector upserts, memory extraction, webhooks, ...).
+
+- Named queues, each with its own worker threads, so one slow dependency can't starve the others
+- Per-queue concurrency cap and bounded backlog: a producer waits for room when the backlog is full and runs
+  the job itself if it's still full after the queue's submit timeout, so work is slowed down rather than dropped.
+  A producer on an event loop thread never waits nor runs the job: it's queued past the backlog limit instead
+- Priorities inside a queue, FIFO within a priority
+- Retries with exponential backoff for the jobs that are safe to run again
+- Graceful drain at shutdown
+- Per-queue depth, wait and run time metrics for sizing the workers
+"""
+
+import asyncio
+import atexit
+import heapq
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 5
+PRIORITY_LOW = 10
+
+
+@dataclass
+class JobQueueConfig:
+    name: str
+    concurrency: int = 4
+    max_backlog: int = 1000
+    max_retries: int = 0
+    retry_backoff: float = 1.0  # seconds before the first retry, doubled every attempt
+    submit_timeout: float = 5.0  # how long a producer waits for room before running the job itself
+
+
+@dataclass(order=True)
+class _Job:
+    priority: int
+    seq: int
+    func: Callable = field(compare=False)
+    args: tuple = field(compare=False)
+    kwargs: dict = field(compare=False)
+    future: Future = field(compare=False)
+    max_retries: int = field(compare=False)
+    enqueued_at: float = field(compare=False)
+    attempts: int = field(default=0, compare=False)
+
+
+@dataclass
+class JobQueueMetrics:
+    submitted: int = 0
+    completed: int = 0
+    failed: int = 0
+    retried: int = 0
+    ran_inline: int = 0
+    overflowed: int = 0
+    wait_time: float = 0.0
+    max_wait_time: float = 0.0
+    run_time: float = 0.0
+
+    def as_dict(self, depth: int, delayed: int, running: int) -> dict:
+        started = self.completed + self.failed + self.retried
+        return {
+            'depth': depth,
+            'delayed': delayed,
+            'running': running,
+            'submitted': self.submitted,
+            'completed': self.completed,
+            'failed': self.failed,
+            'retried': self.retried,
+            'ran_inline': self.ran_inline,
+            'overflowed': self.overflowed,
+            'avg_wait_ms': round(self.wait_time / started * 1000, 2) if started else 0.0,
+            'max_wait_ms': round(self.max_wait_time * 1000, 2),
+            'avg_run_ms': round(self.run_time / started * 1000, 2) if started else 0.0,
+        }
+
+
+class _JobQueue:
+    def __init__(self, config: JobQueueConfig):
+        self.config = config
+        self.condition = threading.Condition()
+        self.ready: List[_Job] = []  # heap by (priority, seq)
+        self.delayed: List[Tuple[float, int, _Job]] = []  # heap by retry time
+        self.running = 0
+        self.workers: List[threading.Thread] = []
+        self.metrics = JobQueueMetrics()
+        self.stopping = False
+
+    @property
+    def backlog(self) -> int:
+        return len(self.ready) + len(self.delayed)
+
+    @property
+    def idle(self) -> bool:
+        return not self.ready and not self.delayed and self.running == 0
+
+
+def _on_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+
+class JobExecutor:
+    """
+    Example:
+        executor = JobExecutor()
+        executor.register_queue(JobQueueConfig('webhooks', concurrency=8, max_retries=2))
+        executor.submit('webhooks', send_webhook, uid, payload, priority=PRIORITY_HIGH)
+    """
+
+    def __init__(self):
+        self._queues: Dict[str, _JobQueue] = {}
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+        self._accepting = True
+
+    def register_queue(self, config: JobQueueConfig):
+        """
+        Registers a queue, registering a name twice keeps the first config.
+        JOB_QUEUE_<NAME>_CONCURRENCY overrides the concurrency.
+        """
+        override = os.getenv(f'JOB_QUEUE_{config.name.upper()}_CONCURRENCY')
+        if override:
+            config.concurrency = int(override)
+        with self._lock:
+            if config.name not in self._queues:
+                self._queues[config.name] = _JobQueue(config)
+
+    def submit(
+        self,
+        queue_name: str,
+        func: Callable,
+        *args,
+        priority: int = PRIORITY_NORMAL,
+        max_retries: Optional[int] = None,
+        **kwargs,
+    ) -> Future:
+        """
+        Queues func(*args, **kwargs) and returns a Future of its result. Called from an event loop thread it
+        returns right away, even when the backlog is full.
+
+        Args:
+            queue_name: a registered queue
+            priority: lower runs first, see PRIORITY_*
+            max_retries: overrides the queue's retries, 0 for jobs that aren't safe to run twice
+        """
+        queue = self._queues[queue_name]
+        job = _Job(
+            priority=priority,
+            seq=next(self._seq),
+            func=func,
+            args=args,
+            kwargs=kwargs,
+            future=Future(),
+            max_retries=queue.config.max_retries if max_retries is None else max_retries,
+            enqueued_at=time.monotonic(),
+        )
+
+        with queue.condition:
+            queue.metrics.submitted += 1
+            if self._accepting and not queue.stopping and _on_event_loop():
+                # Waiting or running the job here would stall every coroutine of the loop
+                if queue.backlog >= queue.config.max_backlog:
+                    queue.metrics.overflowed += 1
+                heapq.heappush(queue.ready, job)
+                self._ensure_workers(queue)
+                queue.condition.notify_all()
+                return job.future
+            if self._accepting and not queue.stopping:
+                deadline = time.monotonic() + queue.config.submit_timeout
+                while queue.backlog >= queue.config.max_backlog and not queue.stopping:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    queue.condition.wait(remaining)
+                if queue.backlog < queue.config.max_backlog and not queue.stopping:
+                    heapq.heappush(queue.ready, job)
+                    self._ensure_workers(queue)
+                    queue.condition.notify_all()
+                    return job.future
+            queue.metrics.ran_inline += 1
+
+        # Backlog still full, or shutting down: the producer runs it
+        print(f'job_executor: {queue_name} is full, running {getattr(func, "__name__", func)} inline')
+        self._run(queue, job, inline=True)
+        return job.future
+
+    def _ensure_workers(self, queue: _JobQueue):
+        queue.workers = [worker for worker in queue.workers if worker.is_alive()]
+        while len(queue.workers) < queue.config.concurrency and len(queue.workers) < len(queue.ready) + queue.running:
+            worker = threading.Thread(
+                target=self._worker,
+                args=(queue,),
+                name=f'jobs-{queue.config.name}-{len(queue.workers)}',
+                daemon=True,
+            )
+            queue.workers.append(worker)
+            worker.start()
+
+    def _worker(self, queue: _JobQueue):
+        while True:
+            with queue.condition:
+                job = None
+                while job is None:
+                    now = time.monotonic()
+                    while queue.delayed and queue.delayed[0][0] <= now:
+                        heapq.heappush(queue.ready, heapq.heappop(queue.delayed)[2])
+                    if queue.ready:
+                        job = heapq.heappop(queue.ready)
+                        break
+                    if queue.stopping:
+                        return
+                    timeout = queue.delayed[0][0] - now if queue.delayed else None
+                    queue.condition.wait(timeout)
+                queue.running += 1
+                # Room in the backlog for a waiting producer
+                queue.condition.notify_all()
+            try:
+                self._run(queue, job)
+            finally:
+                with queue.condition:
+                    queue.running -= 1
+                    queue.condition.notify_all()
+
+    def _run(self, queue: _JobQueue, job: _Job, inline: bool = False):
+        started = time.monotonic()
+        wait = started - job.enqueued_at
+        job.attempts += 1
+        try:
+            result = job.func(*job.args, **job.kwargs)
+            error = None
+        except Exception as e:
+            result, error = None, e
+        run_time = time.monotonic() - started
+
+        with queue.condition:
+            metrics = queue.metrics
+            metrics.wait_time += wait
+            metrics.max_wait_time = max(metrics.max_wait_time, wait)
+            metrics.run_time += run_time
+            if error is None:
+                metrics.completed += 1
+            elif job.attempts <= job.max_retries and not inline and not queue.stopping:
+                metrics.retried += 1
+                delay = queue.config.retry_backoff * (2 ** (job.attempts - 1))
+                job.enqueued_at = time.monotonic() + delay
+                heapq.heappush(queue.delayed, (job.enqueued_at, job.seq, job))
+                queue.condition.notify_all()
+                print(
+                    f'job_executor: {queue.config.name} {getattr(job.func, "__name__", job.func)} failed '
+                    f'({type(error).__name__} {error}), retry {job.attempts}/{job.max_retries} in {delay:.1f}s'
+                )
+                return
+            else:
+                metrics.failed += 1
+
+        if error is None:
+            job.future.set_result(result)
+        else:
+            print(
+                f'job_executor: {queue.config.name} {getattr(job.func, "__name__", job.func)} failed: '
+                f'{type(error).__name__} {error}'
+            )
+            job.future.set_exception(error)
+
+    def metrics(self) -> Dict[str, dict]:
+        """Per-queue depth (ready jobs), delayed retries, running jobs, counters and latencies."""
+        result = {}
+        for name, queue in list(self._queues.items()):
+            with queue.condition:
+                result[name] = queue.metrics.as_dict(len(queue.ready), len(queue.delayed), queue.running)
+        return result
+
+    def drain(self, timeout: float = 30.0) -> bool:
+        """
+        Stops taking jobs and waits up to timeout for the queued and running ones, pending retries are dropped.
+        Later submits run inline. Returns True when everything finished.
+        """
+        self._accepting = False
+        deadline = time.monotonic() + timeout
+        drained = True
+        for queue in list(self._queues.values()):
+            with queue.condition:
+                queue.delayed.clear()
+                while not queue.idle:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        drained = False
+                        break
+                    queue.condition.wait(remaining)
+                queue.stopping = True
+                queue.condition.notify_all()
+        metrics = self.metrics()
+        if any(queue['submitted'] for queue in metrics.values()):
+            print(f'job_executor: drained={drained} {metrics}')
+        return drained
+
+
+_executor: Optional[JobExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_job_executor() -> JobExecutor:
+    """The process-wide executor (lazy init), drained at exit."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = JobExecutor()
+                atexit.register(_executor.drain)
+    return _executor
+
+
+def submit_job(queue_name: str, func: Callable, *args, **kwargs) -> Future:
+    return get_job_executor().submit(queue_name, func, *args, **kwargs)
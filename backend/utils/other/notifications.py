@@ -1,20 +1,33 @@
-import asyncio
-import concurrent.futures
+import functools
+import os
 import threading
+from dataclasses import dataclass, field
 from datetime import datetime, time, timedelta
+from typing import List, Optional
 
 import pytz
 
 import database.chat as chat_db
 import database.conversations as conversations_db
 import database.notifications as notification_db
-from database.redis_db import set_daily_summary_sent, has_daily_summary_been_sent
+from database.redis_db import (
+    set_daily_summary_sent,
+    has_daily_summary_been_sent,
+    set_daily_summary_checkpoint,
+    get_daily_summary_checkpoint,
+)
 from models.notification_message import NotificationMessage
 from models.conversation import Conversation
 from utils.llm.external_integrations import get_conversation_summary
 from utils.notifications import send_bulk_notification, send_notification
+from utils.other.fanout import FanoutEngine, FanoutStage
 from utils.webhooks import day_summary_webhook
 
+# Concurrency limits of the daily summary fan-out stages
+DAILY_SUMMARY_FIRESTORE_CONCURRENCY = int(os.getenv('DAILY_SUMMARY_FIRESTORE_CONCURRENCY', '32'))
+DAILY_SUMMARY_LLM_CONCURRENCY = int(os.getenv('DAILY_SUMMARY_LLM_CONCURRENCY', '16'))
+DAILY_SUMMARY_FCM_CONCURRENCY = int(os.getenv('DAILY_SUMMARY_FCM_CONCURRENCY', '32'))
+
 
 def should_run_job():
     """
@@ -39,100 +52,159 @@ async def send_daily_summary_notification():
 
     Groups timezones by their current local hour, then for each hour group,
     queries users in those timezones who have that hour preference.
+    All users then go through one bounded fan-out (Firestore, LLM and FCM stages).
     """
     try:
         # Group timezones by their current local hour
         timezones_by_hour = _get_timezones_grouped_by_hour()
 
+        users = []
         for target_hour, timezones in timezones_by_hour.items():
             # Get users in those timezones who want notifications at this hour
-            users = await notification_db.get_users_for_daily_summary(timezones, target_hour)
+            hour_users = await notification_db.get_users_for_daily_summary(timezones, target_hour)
+            if hour_users:
+                print(f"Sending daily summary to {len(hour_users)} users at local hour {target_hour}")
+                users.extend(hour_users)
 
-            if users:
-                print(f"Sending daily summary to {len(users)} users at local hour {target_hour}")
-                await _send_bulk_summary_notification(users)
+        if users:
+            await _send_bulk_summary_notification(users)
 
     except Exception as e:
         print(f"Error sending daily summary: {e}")
         return None
 
 
-def _get_timezones_grouped_by_hour() -> dict[int, list[str]]:
+@functools.lru_cache(maxsize=2)
+def _get_timezone_offset_table(utc_hour: datetime) -> dict[int, list[str]]:
+    """
+    All timezones grouped by their UTC offset in minutes at the given UTC hour.
+    Offsets only move on DST transitions, so the table is built once per hour for the ~600 timezones.
+    """
+    table = {}
+    for tz_name in pytz.all_timezones:
+        offset = utc_hour.astimezone(pytz.timezone(tz_name)).utcoffset()
+        table.setdefault(int(offset.total_seconds() // 60), []).append(tz_name)
+    return table
+
+
+def _get_local_times(now: Optional[datetime] = None) -> list[tuple[datetime, list[str]]]:
+    """Current local time of every UTC offset, with the timezones at that offset."""
+    now = now or datetime.now(pytz.utc)
+    table = _get_timezone_offset_table(now.replace(minute=0, second=0, microsecond=0))
+    return [(now + timedelta(minutes=offset), tz_names) for offset, tz_names in table.items()]
+
+
+def _get_timezones_grouped_by_hour(now: Optional[datetime] = None) -> dict[int, list[str]]:
     """Group all timezones by their current local hour."""
     timezones_by_hour = {}
-    for tz_name in pytz.all_timezones:
-        tz = pytz.timezone(tz_name)
-        current_hour = datetime.now(tz).hour
-        if current_hour not in timezones_by_hour:
-            timezones_by_hour[current_hour] = []
-        timezones_by_hour[current_hour].append(tz_name)
+    for local_time, tz_names in _get_local_times(now):
+        timezones_by_hour.setdefault(local_time.hour, []).extend(tz_names)
     return timezones_by_hour
 
 
-def _send_summary_notification(user_data: tuple):
-    uid = user_data[0]
-    user_tz_name = user_data[2] if len(user_data) > 2 else None
+@dataclass
+class _DailySummaryJob:
+    uid: str
+    tokens: Optional[list]
+    date_str: str
+    start_date_utc: datetime
+    end_date_utc: datetime
+    conversations: List[Conversation] = field(default_factory=list)
+    summary_data: Optional[dict] = None
 
-    # Calculate past 24 hours for conversation fetching
-    # date_str is set based on current hour:
-    #   - Before 12 PM (noon): use previous day's date
-    #   - 12 PM or after: use current day's date
-    start_date_utc = None
-    end_date_utc = None
-    date_str = None
+
+def _get_summary_window(user_tz_name: Optional[str], now_utc: Optional[datetime] = None):
+    """
+    Past 24 hours for conversation fetching, and the date of the summary:
+      - Before 12 PM (noon): use previous day's date
+      - 12 PM or after: use current day's date
+    Falls back to UTC if the timezone is not available.
+    """
+    now_utc = now_utc or datetime.now(pytz.utc)
+    now_local = now_utc
     if user_tz_name:
         try:
-            user_tz = pytz.timezone(user_tz_name)
-            now_in_user_tz = datetime.now(user_tz)
-
-            # Use past 24 hours for conversation range
-            end_date_utc = now_in_user_tz.astimezone(pytz.utc)
-            start_date_utc = (now_in_user_tz - timedelta(hours=24)).astimezone(pytz.utc)
-
-            # Determine display date based on current hour
-            if now_in_user_tz.hour < 12:
-                # Before noon: show previous day
-                display_date = now_in_user_tz.date() - timedelta(days=1)
-            else:
-                # Noon or after: show current day
-                display_date = now_in_user_tz.date()
-            date_str = display_date.strftime('%Y-%m-%d')
+            now_local = now_utc.astimezone(pytz.timezone(user_tz_name))
         except Exception as e:
             print(e)
 
-    # Fallback to UTC if timezone not available
-    if not start_date_utc or not end_date_utc:
-        now_utc = datetime.now(pytz.utc)
+    end_date_utc = now_local.astimezone(pytz.utc)
+    start_date_utc = (now_local - timedelta(hours=24)).astimezone(pytz.utc)
+    if now_local.hour < 12:
+        display_date = now_local.date() - timedelta(days=1)
+    else:
+        display_date = now_local.date()
+    return start_date_utc, end_date_utc, display_date.strftime('%Y-%m-%d')
 
-        # Use past 24 hours for conversation range
-        end_date_utc = now_utc
-        start_date_utc = now_utc - timedelta(hours=24)
 
-        # Determine display date based on current hour
-        if now_utc.hour < 12:
-            display_date = now_utc.date() - timedelta(days=1)
-        else:
-            display_date = now_utc.date()
-        date_str = display_date.strftime('%Y-%m-%d')
+def _load_daily_summary_job(user_data: tuple) -> Optional[_DailySummaryJob]:
+    """
+    Firestore stage: skips users already done (or resumed past the LLM), reads the tokens get_users_for_daily_summary
+    left out and the day's conversations.
+    """
+    uid = user_data[0]
+    user_tz_name = user_data[2] if len(user_data) > 2 else None
+    start_date_utc, end_date_utc, date_str = _get_summary_window(user_tz_name)
+    job = _DailySummaryJob(
+        uid=uid,
+        tokens=user_data[1] if len(user_data) > 1 else None,
+        date_str=date_str,
+        start_date_utc=start_date_utc,
+        end_date_utc=end_date_utc,
+    )
 
     # Check if summary already sent for this date
     if has_daily_summary_been_sent(uid, date_str):
-        return
+        return None
+
+    if job.tokens is None:
+        # Devices get_users_for_daily_summary couldn't see from the timezone query
+        job.tokens = notification_db.get_all_tokens(uid)
+        if not job.tokens:
+            return None
+
+    checkpoint = get_daily_summary_checkpoint(uid, date_str) or {}
+    if checkpoint.get('stage') == 'sending':
+        # A previous run crashed while sending, don't risk a second notification
+        return None
+    if checkpoint.get('stage') == 'stored':
+        import database.daily_summaries as daily_summaries_db
+
+        job.summary_data = daily_summaries_db.get_daily_summary(uid, checkpoint['summary_id'])
+        if job.summary_data:
+            return job
 
     conversations_data = conversations_db.get_conversations(uid, start_date=start_date_utc, end_date=end_date_utc)
     if not conversations_data or len(conversations_data) == 0:
-        return
+        return None
+
+    job.conversations = [Conversation(**convo_data) for convo_data in conversations_data]
+    return job
 
-    conversations = [Conversation(**convo_data) for convo_data in conversations_data]
+
+def _generate_daily_summary(job: _DailySummaryJob) -> _DailySummaryJob:
+    """LLM stage: generates and stores the summary, then checkpoints so a restart does not pay for it again."""
+    if job.summary_data:
+        return job
 
     # Generate comprehensive daily summary
     from utils.llm.external_integrations import generate_comprehensive_daily_summary
     import database.daily_summaries as daily_summaries_db
 
-    summary_data = generate_comprehensive_daily_summary(uid, conversations, date_str, start_date_utc, end_date_utc)
+    job.summary_data = generate_comprehensive_daily_summary(
+        job.uid, job.conversations, job.date_str, job.start_date_utc, job.end_date_utc
+    )
 
     # Store in database
-    summary_id = daily_summaries_db.create_daily_summary(uid, summary_data)
+    summary_id = daily_summaries_db.create_daily_summary(job.uid, job.summary_data)
+    set_daily_summary_checkpoint(job.uid, job.date_str, {'stage': 'stored', 'summary_id': summary_id})
+    return job
+
+
+def _deliver_daily_summary(job: _DailySummaryJob) -> None:
+    """FCM stage: sends the notification and the webhook, at most once per user and date."""
+    uid, summary_data = job.uid, job.summary_data
+    set_daily_summary_checkpoint(uid, job.date_str, {'stage': 'sending', 'summary_id': summary_data['id']})
 
     # Create notification with deep link to summary page
     daily_summary_title = f"{summary_data.get('day_emoji', '📅')} {summary_data.get('headline', 'Your Daily Summary')}"
@@ -147,26 +219,40 @@ def _send_summary_notification(user_data: tuple):
         from_integration='false',
         type='day_summary',
         notification_type='daily_summary',
-        navigate_to=f"/daily-summary/{summary_id}",
+        navigate_to=f"/daily-summary/{summary_data['id']}",
     )
 
     # Also send webhook with the full summary data
     threading.Thread(target=day_summary_webhook, args=(uid, str(summary_data))).start()
 
-    tokens = user_data[1] if len(user_data) > 1 else None
     send_notification(
-        uid, daily_summary_title, summary_body, NotificationMessage.get_message_as_dict(ai_message), tokens=tokens
+        uid, daily_summary_title, summary_body, NotificationMessage.get_message_as_dict(ai_message), tokens=job.tokens
     )
 
     # Mark that summary was sent for this date
-    set_daily_summary_sent(uid, date_str)
+    set_daily_summary_sent(uid, job.date_str)
 
 
-async def _send_bulk_summary_notification(users: list):
-    loop = asyncio.get_running_loop()
-    with concurrent.futures.ThreadPoolExecutor() as pool:
-        tasks = [loop.run_in_executor(pool, _send_summary_notification, user_tokens) for user_tokens in users]
-        await asyncio.gather(*tasks)
+def _send_summary_notification(user_data: tuple):
+    job = _load_daily_summary_job(user_data)
+    if job:
+        _deliver_daily_summary(_generate_daily_summary(job))
+
+
+def _get_daily_summary_engine() -> FanoutEngine:
+    return FanoutEngine(
+        [
+            FanoutStage('firestore', _load_daily_summary_job, DAILY_SUMMARY_FIRESTORE_CONCURRENCY),
+            FanoutStage('llm', _generate_daily_summary, DAILY_SUMMARY_LLM_CONCURRENCY),
+            FanoutStage('fcm', _deliver_daily_summary, DAILY_SUMMARY_FCM_CONCURRENCY),
+        ]
+    )
+
+
+async def _send_bulk_summary_notification(users: list) -> dict:
+    metrics = await _get_daily_summary_engine().run(users)
+    print(f"Daily summary fan-out for {len(users)} users: {metrics}")
+    return metrics
 
 
 async def send_daily_notification():
@@ -197,11 +283,9 @@ async def _get_users_in_timezone(target_time: str):
     return await notification_db.get_users_token_in_timezones(timezones_in_time)
 
 
-def _get_timezones_at_time(target_time):
+def _get_timezones_at_time(target_time, now: Optional[datetime] = None):
     target_timezones = []
-    for tz_name in pytz.all_timezones:
-        tz = pytz.timezone(tz_name)
-        current_time = datetime.now(tz).strftime("%H:%M")
-        if current_time == target_time:
-            target_timezones.append(tz_name)
+    for local_time, tz_names in _get_local_times(now):
+        if local_time.strftime("%H:%M") == target_time:
+            target_timezones.extend(tz_names)
     return target_timezones
@@ -0,0 +1,15 @@
+from starlette.middleware.base import BaseHTTPMiddleware
+from fastapi import Request
+
+from database.redis_db import redis_request_memo
+
+
+class RedisRequestMemoMiddleware(BaseHTTPMiddleware):
+    """
+    Scopes the Redis read-through memo to the request, so a flag or setting read by several dependencies and
+    helpers of the same request costs one round trip.
+    """
+
+    async def dispatch(self, request: Request, call_next):
+        with redis_request_memo():
+            return await call_next(request)
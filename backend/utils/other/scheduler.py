@@ -0,0 +1,84 @@
+"""
+Delayed calls (temporary file cleanup, ...) on one shared thread, instead of a thread that sleeps per call.
+"""
+
+import atexit
+import heapq
+import itertools
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+
+class DelayedCalls:
+    def __init__(self):
+        self._heap: List[Tuple[float, int, Callable, tuple]] = []
+        self._cancelled = set()
+        self._condition = threading.Condition()
+        self._seq = itertools.count()
+        self._thread: Optional[threading.Thread] = None
+
+    def schedule(self, delay: float, func: Callable, *args) -> int:
+        """Calls func(*args) in delay seconds, returns a handle for cancel()."""
+        with self._condition:
+            handle = next(self._seq)
+            heapq.heappush(self._heap, (time.monotonic() + delay, handle, func, args))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='delayed-calls', daemon=True)
+                self._thread.start()
+            self._condition.notify()
+            return handle
+
+    def cancel(self, handle: int):
+        with self._condition:
+            if any(entry[1] == handle for entry in self._heap):
+                self._cancelled.add(handle)
+
+    def pending(self) -> int:
+        with self._condition:
+            return len(self._heap) - len(self._cancelled)
+
+    def run_all(self):
+        """Runs every pending call now, at exit nothing scheduled is left behind."""
+        with self._condition:
+            due, self._heap = sorted(self._heap), []
+            cancelled, self._cancelled = self._cancelled, set()
+        for _, handle, func, args in due:
+            if handle not in cancelled:
+                self._call(func, args)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._heap or self._heap[0][0] > time.monotonic():
+                    self._condition.wait(self._heap[0][0] - time.monotonic() if self._heap else None)
+                _, handle, func, args = heapq.heappop(self._heap)
+                if handle in self._cancelled:
+                    self._cancelled.discard(handle)
+                    continue
+            self._call(func, args)
+
+    @staticmethod
+    def _call(func: Callable, args: tuple):
+        try:
+            func(*args)
+        except Exception as e:
+            print(f'delayed call {getattr(func, "__name__", func)} failed: {type(e).__name__} {e}')
+
+
+_delayed_calls: Optional[DelayedCalls] = None
+_delayed_calls_lock = threading.Lock()
+
+
+def get_delayed_calls() -> DelayedCalls:
+    global _delayed_calls
+    if _delayed_calls is None:
+        with _delayed_calls_lock:
+            if _delayed_calls is None:
+                _delayed_calls = DelayedCalls()
+                atexit.register(_delayed_calls.run_all)
+    return _delayed_calls
+
+
+def schedule_call(delay: float, func: Callable, *args) -> int:
+    return get_delayed_calls().schedule(delay, func, *args)
@@ -0,0 +1,123 @@
+"""
+Runs blocking stages as a dependency graph: a stage starts as soon as the stages it depends on are done, at most
+max_workers at a time, so independent stages (LLM calls, Firestore reads) overlap instead of waiting on each other.
+
+- A stage gets the results of the stages it runs after, by name, and returns its own
+- A failing stage with a fallback gets the fallback as its result and the stages after it still run, a failing
+  stage without one fails the whole run
+- Results passed in done (checkpoints of an earlier attempt) are used as they are, those stages don't run again
+"""
+
+import copy
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+NO_FALLBACK = object()
+
+
+@dataclass
+class GraphStage:
+    name: str
+    func: Callable[[Dict[str, Any]], Any]  # results of the stages in after, by name -> result, blocking
+    after: List[str] = field(default_factory=list)
+    fallback: Any = NO_FALLBACK  # result when func raises
+
+
+@dataclass
+class GraphRun:
+    results: Dict[str, Any] = field(default_factory=dict)
+    restored: List[str] = field(default_factory=list)  # taken from done
+    failed: List[str] = field(default_factory=list)  # ran into their fallback
+    timings: Dict[str, float] = field(default_factory=dict)  # seconds per stage that ran
+
+
+def _check(stages: List[GraphStage]):
+    names = [stage.name for stage in stages]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Duplicate stage names: {names}")
+    for stage in stages:
+        unknown = [name for name in stage.after if name not in names]
+        if unknown:
+            raise ValueError(f"Stage {stage.name} runs after unknown stages {unknown}")
+
+    # Kahn's algorithm, whatever is left over is on a cycle
+    left = {stage.name: set(stage.after) for stage in stages}
+    ready = [name for name, after in left.items() if not after]
+    while ready:
+        name = ready.pop()
+        del left[name]
+        for other, after in left.items():
+            if name in after:
+                after.discard(name)
+                if not after:
+                    ready.append(other)
+    if left:
+        raise ValueError(f"Stages {sorted(left)} depend on each other")
+
+
+def _call(func: Callable, inputs: Dict[str, Any]):
+    start = time.perf_counter()
+    try:
+        return func(inputs), None, time.perf_counter() - start
+    except Exception as e:
+        traceback.print_exc()
+        return None, e, time.perf_counter() - start
+
+
+def run_stage_graph(
+    stages: List[GraphStage],
+    max_workers: int = 4,
+    done: Optional[Dict[str, Any]] = None,
+    on_done: Optional[Callable[[GraphStage, Any, bool], None]] = None,
+) -> GraphRun:
+    """
+    Args:
+        stages: in the order they are preferred when more are ready than there are workers
+        done: results of stages that don't need to run again, by name
+        on_done: called from the calling thread with (stage, result, failed) every time a stage finishes, to
+            checkpoint it or report progress; its errors are printed and ignored
+
+    Raises:
+        ValueError: unknown or cyclic dependencies
+        Exception: the error of a stage without a fallback, the stages not started yet are dropped
+    """
+    _check(stages)
+    run = GraphRun()
+    for stage in stages:
+        if done and stage.name in done:
+            run.results[stage.name] = done[stage.name]
+            run.restored.append(stage.name)
+
+    pending = [stage for stage in stages if stage.name not in run.results]
+    running: Dict[Future, GraphStage] = {}
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='stage')
+    try:
+        while pending or running:
+            for stage in [s for s in pending if all(name in run.results for name in s.after)]:
+                pending.remove(stage)
+                inputs = {name: run.results[name] for name in stage.after}
+                running[executor.submit(_call, stage.func, inputs)] = stage
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage = running.pop(future)
+                result, error, seconds = future.result()
+                run.timings[stage.name] = seconds
+                if error is not None:
+                    if stage.fallback is NO_FALLBACK:
+                        raise error
+                    print(f"stage_graph: {stage.name} failed after {seconds:.2f}s, using its fallback: {error}")
+                    result = copy.deepcopy(stage.fallback)
+                    run.failed.append(stage.name)
+                run.results[stage.name] = result
+                if on_done:
+                    try:
+                        on_done(stage, result, error is not None)
+                    except Exception as e:
+                        print(f"stage_graph: on_done failed for {stage.name}: {e}")
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    return run
@@ -3,7 +3,7 @@ import io
 import json
 import os
 import wave
-from typing import List
+from typing import Dict, List
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import threading
 
@@ -552,6 +552,49 @@ def download_audio_chunks_and_merge(
     return bytes(merged_data)
 
 
+def get_audio_chunk_sizes(uid: str, conversation_id: str, timestamps: List[float]) -> Dict[float, dict]:
+    """
+    Look up storage path and decoded PCM size of each chunk with a single listing, without downloading.
+    Like download_audio_chunks_and_merge, encrypted chunks take precedence over unencrypted ones.
+
+    Returns:
+        Dict of timestamp -> {'path': str, 'encrypted': bool, 'pcm_size': int}, chunks not found are absent
+    """
+    if not private_cloud_sync_bucket:
+        return {}
+    bucket = storage_client.bucket(private_cloud_sync_bucket)
+    prefix = f'chunks/{uid}/{conversation_id}/'
+
+    blobs = {}
+    for blob in bucket.list_blobs(prefix=prefix):
+        blobs[blob.name[len(prefix) :]] = blob.size or 0
+
+    chunks = {}
+    for timestamp in timestamps:
+        formatted_timestamp = f'{timestamp:.3f}'
+        if f'{formatted_timestamp}.enc' in blobs:
+            # Uploaded chunks hold a single length-prefixed encrypted record
+            size = blobs[f'{formatted_timestamp}.enc'] - encryption.ENCRYPTED_AUDIO_CHUNK_OVERHEAD
+            chunks[timestamp] = {'path': f'{prefix}{formatted_timestamp}.enc', 'encrypted': True, 'pcm_size': size}
+        elif f'{formatted_timestamp}.bin' in blobs:
+            size = blobs[f'{formatted_timestamp}.bin']
+            chunks[timestamp] = {'path': f'{prefix}{formatted_timestamp}.bin', 'encrypted': False, 'pcm_size': size}
+    return chunks
+
+
+def download_audio_chunk_pcm(uid: str, path: str, encrypted: bool) -> bytes:
+    """Download a single chunk and normalize it to PCM. Returns empty bytes if the chunk is gone."""
+    bucket = storage_client.bucket(private_cloud_sync_bucket)
+    try:
+        chunk_data = bucket.blob(path).download_as_bytes()
+    except NotFound:
+        print(f"Warning: Chunk not found {path}")
+        return b''
+    if encrypted:
+        return encryption.decrypt_audio_file(chunk_data, uid)
+    return chunk_data
+
+
 def get_cached_merged_audio_path(uid: str, conversation_id: str, audio_file_id: str) -> str:
     """Get the GCS path for a cached merged audio file."""
     return f'merged/{uid}/{conversation_id}/{audio_file_id}.wav'
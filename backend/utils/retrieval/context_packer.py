@@ -0,0 +1,256 @@
+"""
+Fits retrieved conversations and memories into a token budget for chat prompts.
+
+Candidates are ranked by relevance and recency, read from Firestore page by page only as far as the budget goes,
+and each conversation goes in as its summary or with a transcript excerpt cut to the room left. Token counts are
+cached per conversation version, so the same conversation isn't tokenized again on the next question.
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+import tiktoken
+
+from models.conversation import Conversation
+from models.other import Person
+from models.transcript_segment import TranscriptSegment
+
+CHAT_CONTEXT_TOKENS = int(os.getenv('CHAT_CONTEXT_TOKENS', 12000))
+RECENCY_HALF_LIFE_DAYS = 30
+RELEVANCE_WEIGHT = 0.7
+MIN_EXCERPT_TOKENS = 120
+MAX_TOKEN_COUNTS = 20000
+
+CONVERSATIONS_SEPARATOR = "\n\n---------------------\n\n"
+TRANSCRIPT_HEADING = "\nTranscript:\n"
+EXCERPT_CUT_MARKER = "\n[...]"
+
+_encoding = None
+_encoding_lock = threading.Lock()
+
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None:
+        with _encoding_lock:
+            if _encoding is None:
+                try:
+                    _encoding = tiktoken.encoding_for_model('gpt-4')
+                except Exception as e:
+                    # No BPE file (offline), estimate from the length instead
+                    print(f"context_packer: tiktoken unavailable, estimating token counts: {e}")
+                    _encoding = False
+    return _encoding
+
+
+def estimate_tokens(text: str) -> int:
+    """About 4 characters per token for English, good enough to size candidates before counting."""
+    return (len(text) + 3) // 4
+
+
+def count_tokens(text: str) -> int:
+    encoding = _get_encoding()
+    if not encoding:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+class TokenCounts:
+    """Token counts by (conversation id, version), a version being the digest of the text that was counted."""
+
+    def __init__(self, max_size: int = MAX_TOKEN_COUNTS):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._counts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def count(self, conversation_id: str, text: str) -> int:
+        key = (conversation_id, hashlib.md5(text.encode()).hexdigest())
+        with self._lock:
+            if key in self._counts:
+                self._counts.move_to_end(key)
+                self.hits += 1
+                return self._counts[key]
+        tokens = count_tokens(text)
+        with self._lock:
+            self.misses += 1
+            self._counts[key] = tokens
+            if len(self._counts) > self.max_size:
+                self._counts.popitem(last=False)
+        return tokens
+
+
+token_counts = TokenCounts()
+
+
+def rank_conversations(
+    conversations: List[dict],
+    relevance: Optional[Dict[str, float]] = None,
+    now: Optional[datetime] = None,
+    relevance_weight: float = RELEVANCE_WEIGHT,
+    half_life_days: float = RECENCY_HALF_LIFE_DAYS,
+) -> List[dict]:
+    """
+    Orders conversations by a mix of relevance (0..1, by default from their order, as the vector search returns
+    them) and recency (halves every half_life_days). Only needs the list fields.
+    """
+    if not conversations:
+        return []
+    now = now or datetime.now(timezone.utc)
+    if relevance is None:
+        relevance = {c['id']: 1 - i / len(conversations) for i, c in enumerate(conversations)}
+
+    def score(conversation: dict) -> float:
+        created_at = conversation.get('created_at') or now
+        if created_at.tzinfo is None:
+            created_at = created_at.replace(tzinfo=timezone.utc)
+        age_days = max(0.0, (now - created_at).total_seconds() / 86400)
+        recency = 0.5 ** (age_days / half_life_days)
+        return relevance_weight * relevance.get(conversation['id'], 0) + (1 - relevance_weight) * recency
+
+    return sorted(conversations, key=score, reverse=True)
+
+
+@dataclass
+class PackedContext:
+    text: str = ''
+    conversations: List[Conversation] = field(default_factory=list)
+    tokens: int = 0
+    excerpts: int = 0
+    # The budget ran out before the candidates did
+    truncated: bool = False
+
+
+class ContextPacker:
+    """
+    Packs conversations, in the order they come, until the next one doesn't fit the budget. Every conversation gets
+    its summary, plus a transcript excerpt when use_transcript is set or when it has no summary yet. An excerpt is
+    cut to the room left, at most max_excerpt_tokens, and dropped when less than MIN_EXCERPT_TOKENS would fit.
+    """
+
+    def __init__(
+        self,
+        budget_tokens: int = CHAT_CONTEXT_TOKENS,
+        use_transcript: bool = False,
+        include_timestamps: bool = False,
+        max_excerpt_tokens: Optional[int] = None,
+        counts: TokenCounts = None,
+    ):
+        self.budget_tokens = budget_tokens
+        self.use_transcript = use_transcript
+        self.include_timestamps = include_timestamps
+        self.max_excerpt_tokens = max_excerpt_tokens or max(MIN_EXCERPT_TOKENS, budget_tokens // 4)
+        self.counts = counts or token_counts
+        self._separator_tokens = count_tokens(CONVERSATIONS_SEPARATOR)
+        self._heading_tokens = count_tokens(TRANSCRIPT_HEADING)
+        self._cut_marker_tokens = count_tokens(EXCERPT_CUT_MARKER)
+
+    def pack(
+        self,
+        pages: Iterable[List[Union[dict, Conversation]]],
+        load_people: Optional[Callable[[List[str]], List[Person]]] = None,
+    ) -> PackedContext:
+        """
+        Args:
+            pages: conversations in rank order, in pages, read no further than the budget goes
+            load_people: people by id, called once per page for the speakers not seen yet (attendees, speaker names)
+        """
+        packed = PackedContext()
+        blocks: List[str] = []
+        people: Dict[str, Person] = {}
+        for page in pages:
+            conversations = [c if isinstance(c, Conversation) else Conversation(**c) for c in page]
+            if load_people:
+                missing = {pid for c in conversations for pid in c.get_person_ids() if pid not in people}
+                if missing:
+                    people.update({p.id: p for p in load_people(list(missing))})
+
+            for conversation in conversations:
+                separator_tokens = self._separator_tokens if blocks else 0
+                header = f"Conversation #{len(blocks) + 1}\n"
+                header_tokens = count_tokens(header)
+                room = self.budget_tokens - packed.tokens - separator_tokens - header_tokens
+                block = self._block(conversation, list(people.values()), room)
+                if block is None:
+                    packed.truncated = True
+                    break
+                text, tokens, excerpt = block
+                blocks.append(header + text)
+                packed.tokens += separator_tokens + header_tokens + tokens
+                packed.excerpts += excerpt
+                packed.conversations.append(conversation)
+            if packed.truncated:
+                break
+        if packed.truncated and hasattr(pages, 'close'):
+            pages.close()
+
+        packed.text = CONVERSATIONS_SEPARATOR.join(blocks)
+        return packed
+
+    def _block(self, conversation: Conversation, people: List[Person], room: int):
+        """(text, tokens, has excerpt) of the conversation in room tokens, None when even its summary doesn't fit."""
+        summary = _summary(conversation, people)
+        summary_tokens = self.counts.count(conversation.id, summary)
+        if summary_tokens > room:
+            return None
+
+        has_summary = bool(conversation.structured.title or conversation.structured.overview)
+        wants_excerpt = self.use_transcript or not has_summary
+        if not wants_excerpt or not conversation.transcript_segments:
+            return summary, summary_tokens, 0
+
+        transcript = TranscriptSegment.segments_as_string(
+            conversation.transcript_segments, include_timestamps=self.include_timestamps, people=people
+        )
+        photo_descriptions = conversation.get_photos_descriptions(include_timestamps=self.include_timestamps)
+        if photo_descriptions != 'None':
+            transcript += f"\nPhoto Descriptions from a wearable camera:\n{photo_descriptions}"
+        room_for_excerpt = min(room - summary_tokens, self.max_excerpt_tokens) - self._heading_tokens
+        if room_for_excerpt < MIN_EXCERPT_TOKENS:
+            return summary, summary_tokens, 0
+
+        transcript_tokens = self.counts.count(conversation.id, transcript)
+        if transcript_tokens > room_for_excerpt:
+            transcript = _cut(transcript, transcript_tokens, room_for_excerpt - self._cut_marker_tokens)
+            transcript_tokens = count_tokens(transcript)
+            while transcript_tokens > room_for_excerpt and '\n\n' in transcript:
+                transcript = _cut(transcript, transcript_tokens, int(transcript_tokens * 0.9))
+                transcript_tokens = count_tokens(transcript)
+            if transcript_tokens > room_for_excerpt:
+                return summary, summary_tokens, 0
+
+        text = f"{summary}{TRANSCRIPT_HEADING}{transcript}"
+        return text, summary_tokens + self._heading_tokens + transcript_tokens, 1
+
+
+def _summary(conversation: Conversation, people: List[Person]) -> str:
+    """The conversations_to_string block of the conversation, without its number."""
+    text = Conversation.conversations_to_string([conversation], False, people=people)
+    return text.split('\n', 1)[1] if '\n' in text else text
+
+
+def _cut(transcript: str, tokens: int, target_tokens: int) -> str:
+    """The transcript cut at a line break to about target_tokens, marked as cut."""
+    chars = int(len(transcript) * max(target_tokens, 0) / max(tokens, 1))
+    cut = transcript[:chars]
+    if '\n\n' in cut:
+        cut = cut[: cut.rindex('\n\n')]
+    return cut.rstrip() + EXCERPT_CUT_MARKER
+
+
+def pack_lines(lines: Iterable[str], budget_tokens: int = CHAT_CONTEXT_TOKENS) -> Tuple[List[str], bool]:
+    """The first lines that fit the budget, and whether some were left out."""
+    kept, used = [], 0
+    for line in lines:
+        tokens = count_tokens(line)
+        if used + tokens > budget_tokens:
+            return kept, True
+        kept.append(line)
+        used += tokens
+    return kept, False
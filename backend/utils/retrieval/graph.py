@@ -41,6 +41,7 @@ from utils.other.chat_file import FileChatTool
 from utils.other.endpoints import timeit
 from utils.app_integrations import get_github_docs_content
 from utils.retrieval.agentic import execute_agentic_chat_stream
+from utils.retrieval.context_packer import ContextPacker, rank_conversations
 from utils.observability.langsmith import get_chat_tracer_callbacks
 from utils.llm.clients import llm_mini as model, llm_medium_stream
 
@@ -326,10 +327,11 @@ def query_vectors(state: GraphState):
         dates=state.get("filters", {}).get("dates", []),
         limit=100,
     )
-    memories = conversations_db.get_conversations_by_id(uid, memories_id)
+    # List fields only, enough to rank them: qa_handler reads the rest as far as the prompt budget goes
+    memories = conversations_db.get_conversations_list_fields_by_id(uid, memories_id)
 
     # Filter out locked conversations if user doesn't have premium access
-    memories = [m for m in memories if not m.get('is_locked', False)]
+    memories = rank_conversations([m for m in memories if not m.get('is_locked', False)])
 
     # stream
     # if state.get('streaming', False):
@@ -345,18 +347,15 @@ def query_vectors(state: GraphState):
 
 def qa_handler(state: GraphState):
     uid = state.get("uid")
-    memories = state.get("memories_found", [])
+    candidates = state.get("memories_found", [])
 
-    all_person_ids = []
-    for m in memories:
-        # m is a dict
-        segments = m.get('transcript_segments', [])
-        all_person_ids.extend([s.get('person_id') for s in segments if s.get('person_id')])
-
-    people = []
-    if all_person_ids:
-        people_data = users_db.get_people_by_ids(uid, list(set(all_person_ids)))
-        people = [Person(**p) for p in people_data]
+    # Ranked candidates in, as many as fit the prompt budget, in the order cited answers refer to them
+    context = ContextPacker().pack(
+        conversations_db.iter_conversations_by_id(uid, [m['id'] for m in candidates]),
+        load_people=lambda person_ids: [Person(**p) for p in users_db.get_people_by_ids(uid, person_ids)],
+    )
+    memories = context.conversations
+    print(f"qa_handler context: {len(memories)}/{len(candidates)} conversations, {context.tokens} tokens")
 
     # streaming
     streaming = state.get("streaming")
@@ -365,26 +364,26 @@ def qa_handler(state: GraphState):
         response: str = qa_rag_stream(
             uid,
             state.get("parsed_question"),
-            Conversation.conversations_to_string(memories, False, people=people),
+            context.text,
             state.get("plugin_selected"),
             cited=state.get("cited"),
             messages=state.get("messages"),
             tz=state.get("tz"),
             callbacks=[state.get('callback')],
         )
-        return {"answer": response, "ask_for_nps": True}
+        return {"answer": response, "ask_for_nps": True, "memories_found": memories}
 
     # no streaming
     response: str = qa_rag(
         uid,
         state.get("parsed_question"),
-        Conversation.conversations_to_string(memories, False, people=people),
+        context.text,
         state.get("plugin_selected"),
         cited=state.get("cited"),
         messages=state.get("messages"),
         tz=state.get("tz"),
     )
-    return {"answer": response, "ask_for_nps": True}
+    return {"answer": response, "ask_for_nps": True, "memories_found": memories}
 
 
 def file_chat_question(state: GraphState):
@@ -4,7 +4,7 @@ from typing import List, Tuple
 
 import database.users as users_db
 from database.conversations import get_conversations_by_id
-from database.vector_db import query_vectors
+from database.vector_db import query_vectors_many
 from models.conversation import Conversation
 from models.other import Person
 from models.transcript_segment import TranscriptSegment
@@ -12,12 +12,14 @@ from utils.llm.chat import chunk_extraction, retrieve_memory_context_params
 from utils.llm.clients import num_tokens_from_string
 
 
-def retrieve_for_topic(uid: str, topic: str, start_timestamp, end_timestamp, k: int, memories_id) -> List[str]:
-    result = query_vectors(topic, uid, starts_at=start_timestamp, ends_at=end_timestamp, k=k)
-    print('retrieve_for_topic', topic, [start_timestamp, end_timestamp], 'found:', len(result), 'vectors')
-    for memory_id in result:
-        memories_id[memory_id].append(topic)
-    return result
+def retrieve_for_topics(uid: str, topics: List[str], start_timestamp, end_timestamp, k: int, memories_id):
+    # One embedding request for all topics instead of one per topic
+    results = query_vectors_many(topics, uid, starts_at=start_timestamp, ends_at=end_timestamp, k=k)
+    for topic, result in zip(topics, results):
+        print('retrieve_for_topic', topic, [start_timestamp, end_timestamp], 'found:', len(result), 'vectors')
+        for memory_id in result:
+            memories_id[memory_id].append(topic)
+    return results
 
 
 def retrieve_memories_for_topics(uid: str, topics: List[str], dates_range: List):
@@ -25,24 +27,12 @@ def retrieve_memories_for_topics(uid: str, topics: List[str], dates_range: List)
     end_timestamp = dates_range[1].timestamp() if len(dates_range) == 2 else None
 
     memories_id = defaultdict(list)
-    threads = []
     top_k = 10 if len(topics) == 1 else 5
-    for topic in topics:
-        t = threading.Thread(
-            target=retrieve_for_topic, args=(uid, topic, start_timestamp, end_timestamp, top_k, memories_id)
-        )
-        threads.append(t)
-    [t.start() for t in threads]
-    [t.join() for t in threads]
+    retrieve_for_topics(uid, topics, start_timestamp, end_timestamp, top_k, memories_id)
 
     # FIXME, fix the source of the issue, not this patch
     if not memories_id and len(dates_range) == 2:
-        threads = []
-        for topic in topics:
-            t = threading.Thread(target=retrieve_for_topic, args=(uid, topic, None, None, top_k, memories_id))
-            threads.append(t)
-        [t.start() for t in threads]
-        [t.join() for t in threads]
+        retrieve_for_topics(uid, topics, None, None, top_k, memories_id)
 
     return memories_id, get_conversations_by_id(uid, memories_id.keys())
 
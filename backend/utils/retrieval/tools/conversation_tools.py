@@ -16,6 +16,7 @@ import database.vector_db as vector_db
 from models.conversation import Conversation
 from models.other import Person
 from utils.llm.clients import embeddings
+from utils.retrieval.context_packer import ContextPacker
 
 # Import agent_config_context for fallback config access
 try:
@@ -52,6 +53,8 @@ def get_conversations_tool(
     - Set max_transcript_segments=0 to exclude transcripts (reduce context size)
     - This prevents missing conversations and avoids context overflow from transcripts
     Examples: "summarize my week", "what did I do this month", "recap my year"
+    Conversations are returned newest first up to a fixed context size. When more matched than fit, the result
+    ends with a note giving the offset to continue from.
 
     Transcript retrieval guidance:
     - By default (max_transcript_segments=0), no transcript segments are included
@@ -162,8 +165,8 @@ def get_conversations_tool(
     if statuses:
         status_list = [s.strip() for s in statuses.split(',') if s.strip()]
 
-    # Get conversations
-    conversations_data = conversations_db.get_conversations(
+    # Get conversations, newest first, read page by page only as far as the context budget goes
+    pages = conversations_db.iter_conversations(
         uid,
         limit=limit,
         offset=offset,
@@ -171,11 +174,54 @@ def get_conversations_tool(
         end_date=end_dt,
         include_discarded=include_discarded,
         statuses=status_list,
+        include_transcript=include_transcript and max_transcript_segments != 0,
+        include_photos=include_transcript and max_transcript_segments != 0,
     )
 
-    print(f"📊 get_conversations_tool - found {len(conversations_data) if conversations_data else 0} conversations")
+    def _conversation_pages():
+        for page in pages:
+            conversations = []
+            for conv_data in page:
+                try:
+                    conversation = Conversation(**conv_data)
+
+                    # Limit transcript segments if needed (mimicking integration.py pattern)
+                    if (
+                        max_transcript_segments != -1
+                        and conversation.transcript_segments
+                        and len(conversation.transcript_segments) > max_transcript_segments
+                    ):
+                        conversation.transcript_segments = conversation.transcript_segments[:max_transcript_segments]
+
+                    conversations.append(conversation)
+                except Exception as e:
+                    print(f"Error parsing conversation {conv_data.get('id')}: {str(e)}")
+                    continue
+            yield conversations
+
+    # Only load people if transcripts will be included (people are used for speaker names in transcripts)
+    def _load_people(person_ids: List[str]) -> List[Person]:
+        return [Person(**p) for p in users_db.get_people_by_ids(uid, person_ids)]
 
-    if not conversations_data:
+    try:
+        context = ContextPacker(use_transcript=include_transcript, include_timestamps=include_timestamps).pack(
+            _conversation_pages(), load_people=_load_people if include_transcript else None
+        )
+    except Exception as e:
+        error_msg = f"Error formatting conversations: {str(e)}"
+        print(f"❌ get_conversations_tool - {error_msg}")
+        import traceback
+
+        traceback.print_exc()
+        return f"Found conversations but encountered an error formatting them: {str(e)}"
+
+    conversations = context.conversations
+    print(
+        f"📊 get_conversations_tool - packed {len(conversations)} conversations, {context.tokens} tokens, "
+        f"{context.excerpts} transcript excerpts, truncated: {context.truncated}"
+    )
+
+    if not conversations:
         date_info = ""
         if start_dt and end_dt:
             date_info = f" between {start_dt.strftime('%Y-%m-%d')} and {end_dt.strftime('%Y-%m-%d')}"
@@ -188,74 +234,26 @@ def get_conversations_tool(
         print(f"⚠️ get_conversations_tool - {msg}")
         return msg
 
-    try:
-        # Only load people if transcripts will be included (people are used for speaker names in transcripts)
-        people = []
-        if include_transcript:
-            # Get all person IDs from all conversations
-            all_person_ids = set()
-            for conv_data in conversations_data:
-                segments = conv_data.get('transcript_segments', [])
-                all_person_ids.update([s.get('person_id') for s in segments if s.get('person_id')])
-
-            print(f"🔍 get_conversations_tool - Found {len(all_person_ids)} unique person IDs")
-
-            # Fetch people data
-            if all_person_ids:
-                people_data = users_db.get_people_by_ids(uid, list(all_person_ids))
-                people = [Person(**p) for p in people_data]
-                print(f"🔍 get_conversations_tool - Loaded {len(people)} people")
-        else:
-            print(f"🔍 get_conversations_tool - Skipping people loading (transcript not included)")
-
-        # Convert to Conversation objects
-        conversations = []
-        for conv_data in conversations_data:
-            try:
-                conversation = Conversation(**conv_data)
-
-                # Limit transcript segments if needed (mimicking integration.py pattern)
-                if (
-                    max_transcript_segments != -1
-                    and conversation.transcript_segments
-                    and len(conversation.transcript_segments) > max_transcript_segments
-                ):
-                    conversation.transcript_segments = conversation.transcript_segments[:max_transcript_segments]
-
-                conversations.append(conversation)
-            except Exception as e:
-                print(f"Error parsing conversation {conv_data.get('id')}: {str(e)}")
-                continue
-
-        print(f"🔍 get_conversations_tool - Converted {len(conversations)} conversation objects")
-
-        # Store conversations in config for citation tracking (as lightweight dicts)
-        conversations_collected = config['configurable'].get('conversations_collected', [])
-        for conv in conversations:
-            conv_dict = conv.dict()
-            # Remove heavy fields to reduce memory usage
-            conv_dict.pop('transcript_segments', None)
-            conv_dict.pop('photos', None)
-            conv_dict.pop('audio_files', None)
-            conversations_collected.append(conv_dict)
-        print(
-            f"📚 get_conversations_tool - Added {len(conversations)} conversations to collection (total: {len(conversations_collected)})"
-        )
+    # Store conversations in config for citation tracking (as lightweight dicts)
+    conversations_collected = config['configurable'].get('conversations_collected', [])
+    for conv in conversations:
+        conv_dict = conv.dict()
+        # Remove heavy fields to reduce memory usage
+        conv_dict.pop('transcript_segments', None)
+        conv_dict.pop('photos', None)
+        conv_dict.pop('audio_files', None)
+        conversations_collected.append(conv_dict)
+    print(
+        f"📚 get_conversations_tool - Added {len(conversations)} conversations to collection (total: {len(conversations_collected)})"
+    )
 
-        # Return formatted string
-        result = Conversation.conversations_to_string(
-            conversations, use_transcript=include_transcript, include_timestamps=include_timestamps, people=people
+    result = context.text
+    if context.truncated:
+        result += (
+            f"\n\n(Only the {len(conversations)} most recent conversations fit in the context. "
+            f"Use offset={offset + len(conversations)} or a narrower date range to see older ones.)"
         )
-        print(f"🔍 get_conversations_tool - Generated result string, length: {len(result)}")
-        return result
-
-    except Exception as e:
-        error_msg = f"Error formatting conversations: {str(e)}"
-        print(f"❌ get_conversations_tool - {error_msg}")
-        import traceback
-
-        traceback.print_exc()
-        return f"Found {len(conversations_data)} conversations but encountered an error formatting them: {str(e)}"
+    return result
 
 
 @tool
@@ -12,6 +12,8 @@ from langchain_core.runnables import RunnableConfig
 import database.memories as memory_db
 import database.vector_db as vector_db
 from models.memories import MemoryDB
+from utils import memory_snapshot
+from utils.retrieval.context_packer import pack_lines
 
 # Import agent_config_context for fallback config access
 try:
@@ -74,6 +76,8 @@ def get_memories_tool(
       * Questions about a specific narrow topic
     - **Ask user for confirmation** before fetching 500+ memories for very broad analysis, as it may take longer
     - **Maximum limit is 5000 per call** - use pagination (offset parameter) if more are needed
+    - Memories are returned best scored first up to a fixed context size, a note at the end gives the offset to
+      continue from when more matched than fit
 
     Args:
         limit: Number of memories to retrieve (default: 50, recommended: 50-200, max per call: 5000)
@@ -145,21 +149,26 @@ def get_memories_tool(
         except ValueError as e:
             return f"Error: Invalid end_date format. Expected YYYY-MM-DDTHH:MM:SS+HH:MM in user's timezone: {end_date} - {str(e)}"
 
-    # Get memories
-    memories = []
+    # Get memories, best scored first, formatted only as far as the context budget goes
+    def _memory_lines(memories):
+        for memory_data in memories:
+            try:
+                yield MemoryDB.get_memories_as_str([MemoryDB(**memory_data)])
+            except Exception as e:
+                print(f"Error creating MemoryDB object: {e}")
+                continue
+
     try:
-        memories = memory_db.get_memories(uid, limit=limit, offset=offset, start_date=start_dt, end_date=end_dt)
+        memories = memory_snapshot.get_memories(uid, limit=limit, offset=offset, start_date=start_dt, end_date=end_dt)
+        memory_lines, truncated = pack_lines(_memory_lines(memories))
     except Exception as e:
         print(e)
+        memory_lines, truncated = [], False
 
-    memories_count = len(memories) if memories else 0
-    print(f"📊 get_memories_tool - found {memories_count} memories")
-
-    # Log warning if large number of memories retrieved
-    if memories_count >= 500:
-        print(f"⚠️ Large number of memories retrieved ({memories_count}). Consider if all are needed.")
+    memories_count = len(memory_lines)
+    print(f"📊 get_memories_tool - found {memories_count} memories, truncated: {truncated}")
 
-    if not memories:
+    if not memory_lines:
         date_info = ""
         if start_dt and end_dt:
             date_info = f" between {start_dt.strftime('%Y-%m-%d')} and {end_dt.strftime('%Y-%m-%d')}"
@@ -172,21 +181,14 @@ def get_memories_tool(
         print(f"⚠️ get_memories_tool - {msg}")
         return msg
 
-    # Convert dictionaries to MemoryDB objects for proper formatting
-    memory_objects = []
-    for memory_data in memories:
-        try:
-            memory_objects.append(MemoryDB(**memory_data))
-        except Exception as e:
-            print(f"Error creating MemoryDB object: {e}")
-            continue
-
-    if not memory_objects:
-        return "Error: Could not parse memories data"
-
     # Format memories using the Memory model's string formatter
-    result = f"User Memories ({len(memory_objects)} total):\n\n"
-    result += MemoryDB.get_memories_as_str(memory_objects)
+    result = f"User Memories ({memories_count} total):\n\n"
+    result += ''.join(memory_lines)
+    if truncated:
+        result += (
+            f"\n(Only the {memories_count} most relevant memories fit in the context. "
+            f"Use offset={offset + memories_count} to see more.)"
+        )
 
     return result.strip()
 
@@ -256,26 +258,27 @@ def search_memories_tool(
     limit = min(limit, 20)
 
     try:
-        # Perform vector search on memories (no threshold, just return top matches)
-        matches = vector_db.find_similar_memories(uid, query, threshold=0.0, limit=limit)
-
-        print(f"📊 search_memories_tool - found {len(matches)} results for query: '{query}'")
-
-        if not matches:
+        # Search the memory snapshot's embeddings, the vector index when the snapshot can't answer
+        scored = memory_snapshot.search_memories(uid, query, limit=limit)
+        if scored is not None:
+            memories_data = [memory_data for memory_data, _ in scored]
+            scores_by_id = {memory_data['id']: score for memory_data, score in scored}
+        else:
+            # Perform vector search on memories (no threshold, just return top matches)
+            matches = vector_db.find_similar_memories(uid, query, threshold=0.0, limit=limit)
+            memory_ids = [match.get('memory_id') for match in matches if match.get('memory_id')]
+            scores_by_id = {match.get('memory_id'): match.get('score', 0) for match in matches}
+            memories_data = memory_db.get_memories_by_ids(uid, memory_ids) if memory_ids else []
+
+        print(f"📊 search_memories_tool - found {len(memories_data)} results for query: '{query}'")
+
+        if not memories_data:
             msg = (
                 f"No memories found matching '{query}'. The user may not have any recorded facts about this topic yet."
             )
             print(f"⚠️ search_memories_tool - {msg}")
             return msg
 
-        memory_ids = [match.get('memory_id') for match in matches if match.get('memory_id')]
-        scores_by_id = {match.get('memory_id'): match.get('score', 0) for match in matches}
-
-        if not memory_ids:
-            return f"Found matches but no valid memory IDs for query: '{query}'"
-
-        memories_data = memory_db.get_memories_by_ids(uid, memory_ids)
-
         # Convert to MemoryDB objects with scores
         memory_objects = []
         for memory_data in memories_data:
@@ -15,7 +15,8 @@ from utils.other.storage import (
 )
 from utils.speaker_sample import verify_and_transcribe_sample
 from utils.speaker_sample_migration import maybe_migrate_person_samples
-from utils.stt.speaker_embedding import extract_embedding_from_bytes
+from utils.stt.speaker_embedding import extract_embedding_from_bytes_batched
+from utils.stt.speaker_gallery import add_to_speaker_gallery
 
 
 def _pcm_to_wav_bytes(pcm_data: bytes, sample_rate: int) -> bytes:
@@ -437,10 +438,11 @@ async def extract_speaker_samples(
 
                 # Extract and store speaker embedding (reuse wav_bytes from verification)
                 try:
-                    embedding = await asyncio.to_thread(extract_embedding_from_bytes, wav_bytes, "sample.wav")
+                    embedding = await extract_embedding_from_bytes_batched(wav_bytes)
                     # Convert numpy array to list for Firestore storage
                     embedding_list = embedding.flatten().tolist()
-                    users_db.set_person_speaker_embedding(uid, person_id, embedding_list)
+                    if users_db.set_person_speaker_embedding(uid, person_id, embedding_list):
+                        add_to_speaker_gallery(uid, person_id, (person or {}).get('name', ''), embedding_list)
                     print(
                         f"Stored speaker embedding for person {person_id} (dim={len(embedding_list)})",
                         uid,
@@ -1,5 +1,8 @@
+import asyncio
 import os
-from typing import Optional, Tuple
+import struct
+import weakref
+from typing import List, Optional, Set, Tuple
 
 import numpy as np
 import requests
@@ -9,6 +12,24 @@ from scipy.spatial.distance import cdist
 # Based on VoxCeleb 1 test set EER of 2.8%
 SPEAKER_MATCH_THRESHOLD = 0.45
 
+# Micro-batching of embedding requests across sessions, see EmbeddingBatcher
+EMBEDDING_BATCH_WINDOW = float(os.getenv('SPEAKER_EMBEDDING_BATCH_WINDOW_MS', '20')) / 1000
+EMBEDDING_BATCH_MAX_SIZE = int(os.getenv('SPEAKER_EMBEDDING_BATCH_MAX_SIZE', '32'))
+
+_LENGTH_PREFIX = struct.Struct('<I')
+_PAYLOAD_HEADER = struct.Struct('<II')
+
+# Set once the hosted API turned out not to have the batch endpoint
+_batch_endpoint_missing = False
+
+
+class BadClipsError(ValueError):
+    """Clips of a batch the embedding API couldn't decode, by index; the others can be sent again without them."""
+
+    def __init__(self, indexes: List[int], message: str):
+        super().__init__(message)
+        self.indexes = indexes
+
 
 def _get_api_url() -> str:
     """Get the speaker embedding API URL from environment."""
@@ -82,6 +103,153 @@ def extract_embedding_from_bytes(audio_data: bytes, filename: str = "audio.wav")
     return embedding
 
 
+def extract_embeddings_from_bytes_batch(audio_data: List[bytes]) -> List[np.ndarray]:
+    """
+    Extract speaker embeddings of many audio clips with one request to the hosted batch API.
+
+    Falls back to one request per clip when the hosted API has no batch endpoint.
+
+    Args:
+        audio_data: Raw audio bytes (wav format) per clip
+
+    Returns:
+        numpy arrays of shape (1, D), in the order of audio_data
+
+    Raises:
+        BadClipsError: the API rejected some of the clips, nothing is returned for the others
+    """
+    global _batch_endpoint_missing
+
+    if not audio_data:
+        return []
+    if _batch_endpoint_missing:
+        return [extract_embedding_from_bytes(data) for data in audio_data]
+
+    api_url = _get_api_url()
+
+    body = b''.join(_LENGTH_PREFIX.pack(len(data)) + data for data in audio_data)
+    response = requests.post(
+        f"{api_url}/v2/embedding/batch",
+        data=body,
+        headers={'Content-Type': 'application/octet-stream'},
+        timeout=300,
+    )
+    if response.status_code in (404, 405):
+        print("Speaker embedding: batch endpoint not available, falling back to single requests")
+        _batch_endpoint_missing = True
+        return [extract_embedding_from_bytes(data) for data in audio_data]
+    if response.status_code == 400:
+        try:
+            detail = response.json().get('detail')
+        except ValueError:
+            detail = None
+        if isinstance(detail, dict) and detail.get('bad_blobs'):
+            raise BadClipsError(detail['bad_blobs'], detail.get('message', 'bad audio clips'))
+    response.raise_for_status()
+
+    # uint32 count, uint32 dimension, then count x dimension float32
+    payload = response.content
+    count, dim = _PAYLOAD_HEADER.unpack_from(payload)
+    if count != len(audio_data):
+        raise ValueError(f"Expected {len(audio_data)} embeddings, got {count}")
+    embeddings = np.frombuffer(payload, dtype='<f4', offset=_PAYLOAD_HEADER.size, count=count * dim)
+    embeddings = embeddings.astype(np.float32).reshape(count, dim)
+    return [embeddings[i : i + 1] for i in range(count)]
+
+
+class EmbeddingBatcher:
+    """
+    Coalesces embedding requests of concurrent sessions into batch API calls.
+
+    The first request of a batch waits up to `window` seconds for others to join, a full batch is sent right away.
+    Each batch is a single call to extract_embeddings_from_bytes_batch on a worker thread. Clips the API rejects
+    fail on their own, the rest of their batch is sent again without them.
+    """
+
+    def __init__(self, window: float = EMBEDDING_BATCH_WINDOW, max_batch_size: int = EMBEDDING_BATCH_MAX_SIZE):
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self._pending: List[Tuple[bytes, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._sending: Set[asyncio.Task] = set()
+        self.batches = 0
+        self.items = 0
+
+    async def embed(self, audio_data: bytes) -> np.ndarray:
+        """Embedding of one wav clip, numpy array of shape (1, D)."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((audio_data, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if batch:
+            # The loop only keeps weak references to its tasks
+            task = asyncio.get_running_loop().create_task(self._send(batch))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    async def _send(self, batch: List[Tuple[bytes, asyncio.Future]]):
+        self.batches += 1
+        self.items += len(batch)
+        try:
+            embeddings = await asyncio.to_thread(extract_embeddings_from_bytes_batch, [data for data, _ in batch])
+        except BadClipsError as e:
+            rest = [item for i, item in enumerate(batch) if i not in e.indexes]
+            if len(rest) == len(batch):
+                self._fail(batch, e)
+                return
+            self._fail([item for i, item in enumerate(batch) if i in e.indexes], e)
+            if rest:
+                await self._send(rest)
+            return
+        except Exception as e:
+            self._fail(batch, e)
+            return
+        for (_, future), embedding in zip(batch, embeddings):
+            if not future.done():
+                future.set_result(embedding)
+
+    @staticmethod
+    def _fail(batch: List[Tuple[bytes, asyncio.Future]], error: Exception):
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(error)
+
+
+_batchers: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, EmbeddingBatcher]" = weakref.WeakKeyDictionary()
+
+
+def get_embedding_batcher() -> EmbeddingBatcher:
+    """The batcher of the running event loop, shared by all sessions on it."""
+    loop = asyncio.get_running_loop()
+    batcher = _batchers.get(loop)
+    if batcher is None:
+        batcher = _batchers[loop] = EmbeddingBatcher()
+    return batcher
+
+
+async def extract_embedding_from_bytes_batched(audio_data: bytes) -> np.ndarray:
+    """
+    Extract speaker embedding from audio bytes, batched with concurrent requests of other sessions.
+
+    Args:
+        audio_data: Raw audio bytes (wav format)
+
+    Returns:
+        numpy array of shape (1, D) where D is embedding dimension
+    """
+    return await get_embedding_batcher().embed(audio_data)
+
+
 def compare_embeddings(embedding1: np.ndarray, embedding2: np.ndarray) -> float:
     """
     Compare two speaker embeddings using cosine distance.
@@ -161,14 +329,10 @@ def find_best_match(
     if not candidate_embeddings:
         return None
 
-    best_idx = -1
-    best_distance = float('inf')
-
-    for idx, candidate in enumerate(candidate_embeddings):
-        distance = compare_embeddings(query_embedding, candidate)
-        if distance < best_distance:
-            best_distance = distance
-            best_idx = idx
+    # One cdist call for all candidates, see speaker_gallery for a cached per-user matrix
+    distances = cdist(query_embedding.reshape(1, -1), np.vstack(candidate_embeddings), metric="cosine")[0]
+    best_idx = int(np.argmin(distances))
+    best_distance = float(distances[best_idx])
 
     if best_distance < threshold:
         return best_idx, best_distance
@@ -0,0 +1,252 @@
+"""
+Per-user speaker gallery for embedding based speaker identification.
+
+- The people's embeddings are kept as one contiguous, L2-normalized float32 matrix, so matching a query is a
+  single matrix-vector product instead of one cosine distance per person
+- Top-k matches with the margin to the next candidate
+- People are added, replaced and removed in place when their speech samples change
+- Galleries are shared across sessions through the in-memory cache and versioned in Redis: every change bumps the
+  user's version, a cached gallery of an older version is rebuilt on its next use
+"""
+
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import numpy as np
+
+import database.redis_db as redis_db
+import database.users as users_db
+from database.cache import get_memory_cache
+from utils.speaker_sample_migration import maybe_migrate_person_samples
+from utils.stt.speaker_embedding import SPEAKER_MATCH_THRESHOLD
+
+SPEAKER_GALLERY_CACHE_TTL = 60 * 30
+_INITIAL_CAPACITY = 16
+
+
+@dataclass
+class SpeakerMatch:
+    person_id: str
+    name: str
+    distance: float  # cosine distance, 0.0 = identical
+    margin: float  # distance gap to the next candidate, inf when there is none
+
+
+def _normalize(embedding) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+    norm = np.linalg.norm(vector)
+    if not np.isfinite(norm) or norm == 0:
+        raise ValueError('embedding has no direction')
+    return vector / norm
+
+
+class SpeakerGallery:
+    """
+    One user's people and their embeddings. Rows live in a buffer that grows by doubling, removing a person
+    moves the last row into its place, so add and remove don't copy the matrix.
+    """
+
+    def __init__(self, version: int = 0):
+        self.version = version
+        self.ids: List[str] = []
+        self.names: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._buffer: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_people(cls, people: List[dict], version: int = 0) -> 'SpeakerGallery':
+        """Gallery of the people with a v2 speaker embedding (speech_samples_version 3)."""
+        gallery = cls(version=version)
+        for person in people:
+            # Older versions hold embeddings of another model, they'd never match
+            if person.get('speech_samples_version', 1) < 3 or not person.get('speaker_embedding'):
+                continue
+            try:
+                gallery.add(person['id'], person.get('name', ''), person['speaker_embedding'])
+            except ValueError as e:
+                print(f"Speaker gallery: skipping person {person['id']}: {e}")
+        return gallery
+
+    @property
+    def dim(self) -> Optional[int]:
+        return None if self._buffer is None else self._buffer.shape[1]
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """(people, dim) normalized embeddings, row i belongs to ids[i]."""
+        if self._buffer is None:
+            return np.zeros((0, 0), dtype=np.float32)
+        return self._buffer[: len(self.ids)]
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, person_id: str) -> bool:
+        return person_id in self._rows
+
+    def __sizeof__(self) -> int:
+        buffer = 0 if self._buffer is None else self._buffer.nbytes
+        return object.__sizeof__(self) + buffer + sum(len(i) + len(n) + 100 for i, n in zip(self.ids, self.names))
+
+    def add(self, person_id: str, name: str, embedding):
+        """Adds the person, or replaces their embedding and name."""
+        vector = _normalize(embedding)
+        with self._lock:
+            if self._buffer is None:
+                self._buffer = np.zeros((_INITIAL_CAPACITY, len(vector)), dtype=np.float32)
+            if len(vector) != self._buffer.shape[1]:
+                raise ValueError(f'embedding dimension {len(vector)}, gallery has {self._buffer.shape[1]}')
+
+            row = self._rows.get(person_id)
+            if row is None:
+                row = len(self.ids)
+                if row == len(self._buffer):
+                    grown = np.zeros((len(self._buffer) * 2, self._buffer.shape[1]), dtype=np.float32)
+                    grown[:row] = self._buffer
+                    self._buffer = grown
+                self._rows[person_id] = row
+                self.ids.append(person_id)
+                self.names.append(name)
+            else:
+                self.names[row] = name
+            self._buffer[row] = vector
+
+    def remove(self, person_id: str) -> bool:
+        with self._lock:
+            row = self._rows.pop(person_id, None)
+            if row is None:
+                return False
+            last = len(self.ids) - 1
+            if row != last:
+                self._buffer[row] = self._buffer[last]
+                self.ids[row] = self.ids[last]
+                self.names[row] = self.names[last]
+                self._rows[self.ids[row]] = row
+            self.ids.pop()
+            self.names.pop()
+            return True
+
+    def rename(self, person_id: str, name: str) -> bool:
+        with self._lock:
+            row = self._rows.get(person_id)
+            if row is None:
+                return False
+            self.names[row] = name
+            return True
+
+    def match(self, query: np.ndarray, k: int = 1) -> List[SpeakerMatch]:
+        """
+        The k closest people to the query embedding, closest first.
+
+        Args:
+            query: embedding of shape (D,) or (1, D)
+            k: number of matches
+
+        Returns:
+            Up to k SpeakerMatch, each with the distance gap to the one after it
+        """
+        vector = _normalize(query)
+        with self._lock:
+            count = len(self.ids)
+            if count == 0 or k <= 0:
+                return []
+            if len(vector) != self._buffer.shape[1]:
+                raise ValueError(f'query dimension {len(vector)}, gallery has {self._buffer.shape[1]}')
+            similarities = self._buffer[:count] @ vector
+            # One extra candidate for the margin of the k-th match
+            candidates = min(k + 1, count)
+            if candidates < count:
+                top = np.argpartition(-similarities, candidates - 1)[:candidates]
+            else:
+                top = np.arange(count)
+            top = top[np.argsort(-similarities[top], kind='stable')]
+            distances = 1.0 - similarities[top]
+            ids = [self.ids[i] for i in top]
+            names = [self.names[i] for i in top]
+
+        matches = []
+        for i in range(min(k, len(top))):
+            margin = float(distances[i + 1] - distances[i]) if i + 1 < len(top) else float('inf')
+            matches.append(SpeakerMatch(ids[i], names[i], float(distances[i]), margin))
+        return matches
+
+    def best_match(self, query: np.ndarray, threshold: float = SPEAKER_MATCH_THRESHOLD) -> Optional[SpeakerMatch]:
+        """The closest person if closer than threshold."""
+        matches = self.match(query, k=1)
+        if matches and matches[0].distance < threshold:
+            return matches[0]
+        return None
+
+
+def _cache_key(uid: str) -> str:
+    return f'speaker_gallery:{uid}'
+
+
+def get_cached_speaker_gallery(uid: str) -> Optional[SpeakerGallery]:
+    """The user's gallery from the in-memory cache, None when missing or older than the Redis version."""
+    gallery = get_memory_cache().get(_cache_key(uid))
+    if gallery is None or gallery.version != redis_db.get_speaker_gallery_version(uid):
+        return None
+    return gallery
+
+
+async def load_speaker_gallery(uid: str) -> SpeakerGallery:
+    """
+    The user's gallery, from the cache or built from their people. People with old speech samples are migrated
+    first, like on every speaker identification start.
+    """
+    gallery = get_cached_speaker_gallery(uid)
+    if gallery is not None:
+        return gallery
+
+    # Read before the people so a change made while loading leaves this gallery stale
+    version = redis_db.get_speaker_gallery_version(uid)
+    people = users_db.get_people(uid)
+    migrated = False
+    for i, person in enumerate(people):
+        if person.get('speech_samples'):
+            was_migrated = person.get('speech_samples_version', 1) >= 3
+            people[i] = person = await maybe_migrate_person_samples(uid, person)
+            migrated = migrated or (not was_migrated and person.get('speech_samples_version', 1) >= 3)
+
+    if migrated:
+        # Galleries other instances built before the migration miss these people
+        version = redis_db.bump_speaker_gallery_version(uid)
+    gallery = SpeakerGallery.from_people(people, version=version)
+    get_memory_cache().set(_cache_key(uid), gallery, ttl=SPEAKER_GALLERY_CACHE_TTL)
+    return gallery
+
+
+def _update_cached_gallery(uid: str, apply):
+    """Bumps the user's version and applies the change to the cached gallery if it was the latest one."""
+    cache = get_memory_cache()
+    key = _cache_key(uid)
+    version = redis_db.bump_speaker_gallery_version(uid)
+    gallery = cache.get(key)
+    if gallery is None:
+        return
+    if gallery.version != version - 1:
+        # Missed a change made on another instance
+        cache.delete(key)
+        return
+    try:
+        apply(gallery)
+    except ValueError as e:
+        print(f"Speaker gallery: dropping cached gallery: {e}", uid)
+        cache.delete(key)
+        return
+    gallery.version = version
+
+
+def add_to_speaker_gallery(uid: str, person_id: str, name: str, embedding):
+    _update_cached_gallery(uid, lambda gallery: gallery.add(person_id, name, embedding))
+
+
+def remove_from_speaker_gallery(uid: str, person_id: str):
+    _update_cached_gallery(uid, lambda gallery: gallery.remove(person_id))
+
+
+def rename_in_speaker_gallery(uid: str, person_id: str, name: str):
+    _update_cached_gallery(uid, lambda gallery: gallery.rename(person_id, name))
@@ -1,4 +1,21 @@
+"""
+Voice activity detection for recorded files (offline sync, speech profiles, post-processing).
+
+Backends, picked with `VAD_BACKEND`:
+- `webrtc` (default): WebRTC's GMM VAD, in process on CPU
+- `energy`: frame energy against an adaptive noise floor, in process, numpy only
+- `hosted`: the VAD microservice at `HOSTED_VAD_API_URL`, one upload per file
+
+The in-process backends stream the WAV in blocks of frames, they never load the whole file. Every backend returns
+the speech segments as [{'start': seconds, 'end': seconds}].
+"""
+
 import os
+import shutil
+import tempfile
+import wave
+from abc import ABC, abstractmethod
+from typing import Iterator, List, Optional, Tuple
 
 import numpy as np
 import requests
@@ -7,36 +24,283 @@ from pydub import AudioSegment
 
 from database import redis_db
 
+VAD_FRAME_MS = 30
+VAD_BLOCK_SECONDS = 10
+VAD_MIN_SPEECH_MS = 250
+VAD_MIN_SILENCE_MS = 300
+VAD_SPEECH_PAD_MS = 30
+
+
+def _to_int16(data: bytes, sample_width: int) -> np.ndarray:
+    """8, 16, 24 or 32-bit PCM samples to int16, keeping their top 16 bits."""
+    if sample_width == 1:
+        return (np.frombuffer(data, dtype=np.uint8).astype(np.int16) - 128) << 8
+    if sample_width == 2:
+        return np.frombuffer(data, dtype='<i2')
+    if sample_width in (3, 4):
+        return np.frombuffer(data, dtype=np.uint8).reshape(-1, sample_width)[:, -2:].copy().view('<i2').ravel()
+    raise ValueError(f'{sample_width * 8}-bit PCM is not supported')
+
+
+def read_wav_blocks(file_path: str, block_seconds: float = VAD_BLOCK_SECONDS) -> Iterator[Tuple[int, np.ndarray]]:
+    """
+    Streams a PCM WAV as mono int16 blocks.
+
+    Yields:
+        (sample_rate, samples) per block of about block_seconds
+    """
+    with wave.open(file_path, 'rb') as wav:
+        sample_rate, channels, sample_width = wav.getframerate(), wav.getnchannels(), wav.getsampwidth()
+        frames_per_block = max(1, int(sample_rate * block_seconds))
+        while True:
+            data = wav.readframes(frames_per_block)
+            if not data:
+                return
+            samples = _to_int16(data, sample_width)
+            if channels > 1:
+                samples = samples.reshape(-1, channels).mean(axis=1).astype(np.int16)
+            yield sample_rate, samples
+
+
+def frames_to_segments(
+    speech: np.ndarray,
+    frame_seconds: float,
+    min_speech_ms: int = VAD_MIN_SPEECH_MS,
+    min_silence_ms: int = VAD_MIN_SILENCE_MS,
+    speech_pad_ms: int = VAD_SPEECH_PAD_MS,
+    duration: Optional[float] = None,
+) -> List[dict]:
+    """
+    Per-frame speech flags to segments: pauses shorter than min_silence_ms are bridged, segments shorter than
+    min_speech_ms dropped, the rest padded by speech_pad_ms on both sides.
+    """
+    if len(speech) == 0:
+        return []
+    flags = np.concatenate([[False], speech.astype(bool), [False]])
+    edges = np.flatnonzero(flags[1:] != flags[:-1])
+    runs = edges.reshape(-1, 2) * frame_seconds
+
+    segments = []
+    for start, end in runs:
+        if segments and start - segments[-1][1] < min_silence_ms / 1000:
+            segments[-1][1] = end
+        else:
+            segments.append([start, end])
+
+    duration = len(speech) * frame_seconds if duration is None else duration
+    pad = speech_pad_ms / 1000
+    return [
+        {'start': round(max(0.0, start - pad), 3), 'end': round(min(duration, end + pad), 3)}
+        for start, end in segments
+        if end - start >= min_speech_ms / 1000
+    ]
+
+
+def ensure_pcm_wav(file_path: str):
+    """
+    Rewrites file_path as a 16-bit PCM WAV when the wave module can't open it (WAVE_FORMAT_EXTENSIBLE or float
+    samples), so it can be streamed and trimmed.
+
+    Raises:
+        HTTPException: 400 when pydub can't decode it either
+    """
+    try:
+        with wave.open(file_path, 'rb'):
+            return
+    except (wave.Error, EOFError) as e:
+        print('ensure_pcm_wav: converting', file_path, e)
+    try:
+        audio = AudioSegment.from_file(file_path)
+    except Exception as e:
+        print('ensure_pcm_wav: could not decode', file_path, e)
+        raise HTTPException(status_code=400, detail="Invalid audio file, must be a WAV")
+    audio.set_sample_width(2).export(file_path, format='wav').close()
+
+
+class VadBackend(ABC):
+    name = ''
+
+    @abstractmethod
+    def segments(self, file_path: str) -> List[dict]:
+        """Speech segments of the WAV at file_path."""
+
+
+class HostedVad(VadBackend):
+    """The VAD microservice, the whole file is uploaded."""
+
+    name = 'hosted'
+
+    def __init__(self, url: Optional[str] = None, timeout: int = 300):
+        self.url = url or os.getenv('HOSTED_VAD_API_URL')
+        self.timeout = timeout
+
+    def segments(self, file_path: str) -> List[dict]:
+        with open(file_path, 'rb') as file:
+            files = {'file': (file_path.split('/')[-1], file, 'audio/wav')}
+            response = requests.post(self.url, files=files, timeout=self.timeout)
+            response.raise_for_status()  # Raise exception for HTTP errors
+            return response.json()
+
+
+class FrameVad(VadBackend):
+    """Classifies fixed-size frames of the streamed audio, then smooths them into segments."""
+
+    def __init__(self, frame_ms: int = VAD_FRAME_MS):
+        self.frame_ms = frame_ms
+
+    def reset(self):
+        """Called before every file."""
+
+    @abstractmethod
+    def classify(self, frames: np.ndarray, sample_rate: int) -> np.ndarray:
+        """(n, frame_samples) int16 frames to n speech flags."""
+
+    def segments(self, file_path: str) -> List[dict]:
+        self.reset()
+        flags = []
+        frame_seconds = self.frame_ms / 1000
+        carry = np.zeros(0, dtype=np.int16)
+        total = 0
+        sample_rate = 16000
+        for sample_rate, samples in read_wav_blocks(file_path):
+            total += len(samples)
+            samples = np.concatenate([carry, samples]) if len(carry) else samples
+            frame_samples = sample_rate * self.frame_ms // 1000
+            usable = len(samples) // frame_samples * frame_samples
+            carry = samples[usable:]
+            if usable:
+                flags.append(self.classify(samples[:usable].reshape(-1, frame_samples), sample_rate))
+        speech = np.concatenate(flags) if flags else np.zeros(0, dtype=bool)
+        return frames_to_segments(speech, frame_seconds, duration=total / sample_rate)
+
+
+class EnergyVad(FrameVad):
+    """
+    Frame energy against a noise floor that follows quiet frames quickly and loud ones slowly, so it adapts to
+    the background of each recording.
+    """
+
+    name = 'energy'
+
+    def __init__(self, threshold_db: float = 8.0, min_level_db: float = -50.0, frame_ms: int = VAD_FRAME_MS):
+        super().__init__(frame_ms)
+        self.threshold_db = threshold_db
+        self.min_level_db = min_level_db
+        self._floor: Optional[float] = None
+
+    def reset(self):
+        self._floor = None
+
+    def classify(self, frames: np.ndarray, sample_rate: int) -> np.ndarray:
+        x = frames.astype(np.float32) / 32768.0
+        x = x - x.mean(axis=1, keepdims=True)
+        levels = 10 * np.log10(np.mean(x * x, axis=1) + 1e-10)
+
+        floors = np.empty_like(levels)
+        floor = self._floor if self._floor is not None else float(np.percentile(levels, 10))
+        for i, level in enumerate(levels):
+            floor = level if level < floor else floor + 0.001 * (level - floor)
+            floors[i] = floor
+        self._floor = floor
+        return (levels > floors + self.threshold_db) & (levels > self.min_level_db)
+
+
+class WebRtcVad(FrameVad):
+    """WebRTC's VAD, audio at other rates than 8/16/32/48 kHz is resampled to 16 kHz."""
+
+    name = 'webrtc'
+    SAMPLE_RATES = (8000, 16000, 32000, 48000)
+
+    def __init__(self, aggressiveness: int = 2, frame_ms: int = VAD_FRAME_MS):
+        import webrtcvad
+
+        if frame_ms not in (10, 20, 30):
+            raise ValueError('webrtc VAD frames are 10, 20 or 30 ms')
+        super().__init__(frame_ms)
+        self._vad = webrtcvad.Vad(aggressiveness)
+
+    def classify(self, frames: np.ndarray, sample_rate: int) -> np.ndarray:
+        if sample_rate not in self.SAMPLE_RATES:
+            target = 16000 * self.frame_ms // 1000
+            positions = np.linspace(0, frames.shape[1] - 1, target)
+            frames = np.stack([np.interp(positions, np.arange(frames.shape[1]), f) for f in frames])
+            frames, sample_rate = frames.astype(np.int16), 16000
+        frames = frames.astype('<i2')
+        return np.fromiter(
+            (self._vad.is_speech(f.tobytes(), sample_rate) for f in frames), dtype=bool, count=len(frames)
+        )
+
+
+_BACKENDS = {'hosted': HostedVad, 'energy': EnergyVad, 'webrtc': WebRtcVad}
+
+
+def get_vad_backend(name: Optional[str] = None) -> VadBackend:
+    """The backend named by VAD_BACKEND (default: webrtc)."""
+    name = name or os.getenv('VAD_BACKEND', 'webrtc')
+    if name not in _BACKENDS:
+        raise ValueError(f'Unknown VAD backend {name}, expected one of {", ".join(_BACKENDS)}')
+    return _BACKENDS[name]()
+
+
 def vad_is_empty(file_path, return_segments: bool = False, cache: bool = False):
     """
-    VAD via hosted microservice.
+    Speech segments of a WAV file, or whether it has none.
 
     NOTE:
-    - This backend intentionally does **not** ship a local Torch VAD to keep the main image small.
-    - Configure `HOSTED_VAD_API_URL` to point to your VAD service (e.g. your own Docker microservice).
+    - This backend intentionally does **not** ship a local Torch VAD to keep the main image small, the in-process
+      backends are WebRTC's and an energy detector.
+    - Set `VAD_BACKEND=hosted` and `HOSTED_VAD_API_URL` to use your VAD service (e.g. your own Docker microservice).
     """
-    caching_key = f'vad_is_empty:{file_path}'
+    backend = get_vad_backend()
+    caching_key = f'vad_is_empty:{backend.name}:{file_path}'
     if cache:
         if exists := redis_db.get_generic_cache(caching_key):
             if return_segments:
                 return exists
             return len(exists) == 0
 
-    with open(file_path, 'rb') as file:
-        files = {'file': (file_path.split('/')[-1], file, 'audio/wav')}
-        response = requests.post(os.getenv('HOSTED_VAD_API_URL'), files=files, timeout=300)
-        response.raise_for_status()  # Raise exception for HTTP errors
-        segments = response.json()
-        if cache:
-            redis_db.set_generic_cache(caching_key, segments, ttl=60 * 60 * 24)
-        if return_segments:
-            return segments
-        print('vad_is_empty', len(segments) == 0)
-        return len(segments) == 0
+    segments = backend.segments(file_path)
+    if cache:
+        redis_db.set_generic_cache(caching_key, segments, ttl=60 * 60 * 24)
+    if return_segments:
+        return segments
+    print('vad_is_empty', len(segments) == 0)
+    return len(segments) == 0
+
+
+def copy_wav_ranges(file_path: str, ranges: List[Tuple[float, float]], output_path: str):
+    """
+    Writes the (start, end) second ranges of a WAV, back to back, to output_path (which may be file_path),
+    reading only those ranges.
+    """
+    with wave.open(file_path, 'rb') as source:
+        params = source.getparams()
+        rate = source.getframerate()
+        fd, temp_path = tempfile.mkstemp(suffix='.wav', dir=os.path.dirname(os.path.abspath(output_path)))
+        os.close(fd)
+        try:
+            with wave.open(temp_path, 'wb') as output:
+                output.setparams(params)
+                for start, end in ranges:
+                    first = min(params.nframes, max(0, int(start * rate)))
+                    last = min(params.nframes, max(first, int(end * rate)))
+                    source.setpos(first)
+                    remaining = last - first
+                    while remaining > 0:
+                        chunk = source.readframes(min(remaining, rate * VAD_BLOCK_SECONDS))
+                        if not chunk:
+                            break
+                        output.writeframes(chunk)
+                        remaining -= len(chunk) // (params.sampwidth * params.nchannels)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+    shutil.move(temp_path, output_path)
 
 
 def apply_vad_for_speech_profile(file_path: str):
     print('apply_vad_for_speech_profile', file_path)
+    ensure_pcm_wav(file_path)
     voice_segments = vad_is_empty(file_path, return_segments=True)
     if len(voice_segments) == 0:  # TODO: front error on post-processing, audio sent is bad.
         raise HTTPException(status_code=400, detail="Audio is empty")
@@ -47,22 +311,9 @@ def apply_vad_for_speech_profile(file_path: str):
         else:
             joined_segments.append(segment)
 
-    # Load audio file once instead of repeatedly in the loop
-    full_audio = AudioSegment.from_wav(file_path)
-
-    try:
-        # trim silence out of file_path, but leave 1 sec of silence within chunks
-        trimmed_aseg = AudioSegment.empty()
-        for i, segment in enumerate(joined_segments):
-            start = segment['start'] * 1000
-            end = segment['end'] * 1000
-            trimmed_aseg += full_audio[start:end]
-            if i < len(joined_segments) - 1:
-                trimmed_aseg += full_audio[end : end + 1000]
-
-        # file_path.replace('.wav', '-cleaned.wav')
-        trimmed_aseg.export(file_path, format="wav")
-    finally:
-        # Explicitly free memory
-        del full_audio
-        del trimmed_aseg
+    # trim silence out of file_path, but leave 1 sec of silence within chunks
+    ranges = []
+    for i, segment in enumerate(joined_segments):
+        end = segment['end'] + 1 if i < len(joined_segments) - 1 else segment['end']
+        ranges.append((segment['start'], end))
+    copy_wav_ranges(file_path, ranges, file_path)
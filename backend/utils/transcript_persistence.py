@@ -0,0 +1,179 @@
+"""Incremental transcript persistence for in-progress conversations.
+
+The streaming session keeps the transcript in memory and is the source of truth while the
+conversation is in progress. Each tick only the changed segments are appended as a small delta
+document; the full compressed (and possibly encrypted) `transcript_segments` blob is rewritten
+at checkpoints and when the conversation is closed.
+"""
+
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import database.conversations as conversations_db
+from models.transcript_segment import TranscriptSegment
+
+CHECKPOINT_INTERVAL_SECONDS = 60.0
+CHECKPOINT_MAX_PENDING_DELTAS = 100
+
+
+class InProgressTranscriptWriter:
+    """
+    Persists transcript changes of one in-progress conversation as append-only deltas.
+
+    The writer does not own the segments list, callers pass the current segments when checkpointing.
+    Writes may run on a worker thread (see database/conversations_async.py), they are serialized per writer.
+    A checkpoint queued behind an append may carry older segments, so callers pass `through_seq` (`last_seq` when
+    the segments were taken) and only the deltas up to it are dropped.
+    """
+
+    def __init__(
+        self,
+        uid: str,
+        conversation_id: str,
+        data_protection_level: str = 'standard',
+        checkpoint_interval: float = CHECKPOINT_INTERVAL_SECONDS,
+        max_pending_deltas: int = CHECKPOINT_MAX_PENDING_DELTAS,
+    ):
+        self.uid = uid
+        self.conversation_id = conversation_id
+        self.data_protection_level = data_protection_level or 'standard'
+        self.checkpoint_interval = checkpoint_interval
+        self.max_pending_deltas = max_pending_deltas
+
+        # Delta ids are `{session}-{seq}`, another session on the same conversation counts from 0 too
+        self.session = uuid.uuid4().hex[:12]
+        self._seq = 0
+        # Highest seq folded into the transcript blob
+        self._checkpointed_seq = -1
+        self._pending_deltas = 0
+        self._last_checkpoint_at = time.monotonic()
+        self._lock = threading.Lock()
+        # Segments changed between ticks (translations), written with the next append or checkpoint. Own lock, so
+        # staging from the event loop never waits on a write in progress.
+        self._staged: Dict[str, TranscriptSegment] = {}
+        self._staged_lock = threading.Lock()
+
+        # Stats
+        self.bytes_written = 0
+        self.deltas_written = 0
+        self.checkpoints_written = 0
+
+    @property
+    def last_seq(self) -> int:
+        """Seq of the last delta written, -1 if none."""
+        return self._seq - 1
+
+    @property
+    def has_pending_deltas(self) -> bool:
+        return self._pending_deltas > 0
+
+    def stage(self, segments: List[TranscriptSegment]):
+        """Segments changed outside a tick, they go with the next append (or checkpoint) instead of their own write."""
+        with self._staged_lock:
+            for segment in segments:
+                self._staged[segment.id] = segment
+
+    def _take_staged(self, updated_segments: List[TranscriptSegment]) -> List[TranscriptSegment]:
+        with self._staged_lock:
+            staged, self._staged = self._staged, {}
+        updated_ids = {segment.id for segment in updated_segments}
+        return list(updated_segments) + [segment for segment in staged.values() if segment.id not in updated_ids]
+
+    def _restage(self, segments: List[TranscriptSegment]):
+        with self._staged_lock:
+            for segment in segments:
+                self._staged.setdefault(segment.id, segment)
+
+    def append(
+        self,
+        updated_segments: List[TranscriptSegment],
+        removed_ids: Optional[List[str]] = None,
+        finished_at: Optional[datetime] = None,
+        fields: Optional[dict] = None,
+    ) -> int:
+        """Writes one delta; other conversation `fields` changed this tick and staged segments go into the same write."""
+        with self._lock:
+            updated_segments = self._take_staged(updated_segments)
+            if not updated_segments and not removed_ids:
+                if fields:
+                    conversation_fields = dict(fields)
+                    if finished_at:
+                        conversation_fields['finished_at'] = finished_at
+                    conversations_db.update_conversation_fields(
+                        self.uid, self.conversation_id, conversation_fields, self.data_protection_level
+                    )
+                elif finished_at:
+                    conversations_db.update_conversation_finished_at(self.uid, self.conversation_id, finished_at)
+                return 0
+
+            try:
+                written = conversations_db.append_conversation_segments_delta(
+                    self.uid,
+                    self.conversation_id,
+                    self.session,
+                    self._seq,
+                    [segment.dict() for segment in updated_segments],
+                    removed_ids or [],
+                    self.data_protection_level,
+                    finished_at=finished_at,
+                    fields=fields,
+                )
+            except Exception:
+                self._restage(updated_segments)
+                raise
+            self._seq += 1
+            self._pending_deltas += 1
+            self.deltas_written += 1
+            self.bytes_written += written
+            return written
+
+    def should_checkpoint(self) -> bool:
+        if not self._pending_deltas:
+            return False
+        if self._pending_deltas >= self.max_pending_deltas:
+            return True
+        return time.monotonic() - self._last_checkpoint_at >= self.checkpoint_interval
+
+    def checkpoint(
+        self,
+        segments: List[TranscriptSegment],
+        finished_at: Optional[datetime] = None,
+        through_seq: Optional[int] = None,
+    ) -> int:
+        """Writes `segments` as the transcript blob, they must include every delta up to `through_seq` (default all)."""
+        with self._lock:
+            through_seq = self.last_seq if through_seq is None else min(through_seq, self.last_seq)
+            folded = [
+                {'session': self.session, 'seq': seq} for seq in range(self._checkpointed_seq + 1, through_seq + 1)
+            ]
+            with self._staged_lock:
+                staged, self._staged = self._staged, {}
+            if not folded and not staged:
+                return 0
+
+            try:
+                written = conversations_db.checkpoint_conversation_segments(
+                    self.uid,
+                    self.conversation_id,
+                    [segment.dict() for segment in segments],
+                    self.data_protection_level,
+                    folded,
+                    finished_at=finished_at,
+                )
+            except Exception:
+                self._restage(list(staged.values()))
+                raise
+            self._checkpointed_seq = max(self._checkpointed_seq, through_seq)
+            self._pending_deltas -= len(folded)
+            self._last_checkpoint_at = time.monotonic()
+            self.checkpoints_written += 1
+            self.bytes_written += written
+            return written
+
+    def maybe_checkpoint(self, segments: List[TranscriptSegment]) -> int:
+        if not self.should_checkpoint():
+            return 0
+        return self.checkpoint(segments)
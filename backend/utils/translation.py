@@ -1,16 +1,21 @@
 import os
 import hashlib
 import re
+import threading
 from collections import OrderedDict
-from typing import List
+from dataclasses import dataclass
+from typing import Dict, List
 
 from google.cloud import translate_v3
 from langdetect import detect as langdetect_detect, DetectorFactory
 from langdetect.lang_detect_exception import LangDetectException
 
+from database import redis_db
+
 
 # LRU Cache for language detection
 detection_cache = OrderedDict()
+_detection_cache_lock = threading.Lock()
 MAX_DETECTION_CACHE_SIZE = 1000
 
 PROJECT_ID = os.environ.get("GOOGLE_CLOUD_PROJECT")
@@ -205,9 +210,10 @@ def detect_language(text: str, remove_non_lexical: bool = False, hint_language:
     if not text_for_detection:
         return None
 
-    if text_for_detection in detection_cache:
-        detection_cache.move_to_end(text_for_detection)
-        return detection_cache[text_for_detection]
+    with _detection_cache_lock:
+        if text_for_detection in detection_cache:
+            detection_cache.move_to_end(text_for_detection)
+            return detection_cache[text_for_detection]
 
     # Count words to determine which detection method to use
     word_count = len(text_for_detection.split())
@@ -224,9 +230,10 @@ def detect_language(text: str, remove_non_lexical: bool = False, hint_language:
 
         # Cache the result
         if detected_language:
-            if len(detection_cache) >= MAX_DETECTION_CACHE_SIZE:
-                detection_cache.popitem(last=False)
-            detection_cache[text_for_detection] = detected_language
+            with _detection_cache_lock:
+                if len(detection_cache) >= MAX_DETECTION_CACHE_SIZE:
+                    detection_cache.popitem(last=False)
+                detection_cache[text_for_detection] = detected_language
             return detected_language
 
     except Exception as e:
@@ -245,14 +252,131 @@ def split_into_sentences(text: str) -> List[str]:
     return [s.strip() for s in sentences if s.strip()]
 
 
+# Google Cloud Translation v3 limits per translate_text call
+MAX_BATCH_CONTENTS = 1024
+MAX_BATCH_CODEPOINTS = 30000
+MAX_TRANSLATION_CACHE_SIZE = 20000
+
+
+def _text_hash(text: str) -> str:
+    return hashlib.md5(text.encode()).hexdigest()
+
+
+class TranslationCache:
+    """
+    Sentence translations by (text hash, language): a process-wide LRU in front of redis, so every session and
+    every instance shares what was already translated.
+    """
+
+    def __init__(self, max_size: int = MAX_TRANSLATION_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, dest_language: str, text_hashes: List[str]) -> Dict[str, str]:
+        found = {}
+        with self._lock:
+            for text_hash in text_hashes:
+                key = (text_hash, dest_language)
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    found[text_hash] = self._entries[key]
+        missing = [text_hash for text_hash in text_hashes if text_hash not in found]
+        if missing:
+            try:
+                cached = redis_db.get_cached_translations(dest_language, missing)
+            except Exception as e:
+                print(f"Translation cache read error: {e}")
+                cached = []
+            shared = {text_hash: text for text_hash, text in zip(missing, cached) if text is not None}
+            self._remember(dest_language, shared)
+            found.update(shared)
+        return found
+
+    def set_many(self, dest_language: str, translations: Dict[str, str]):
+        self._remember(dest_language, translations)
+        try:
+            redis_db.cache_translations(dest_language, translations)
+        except Exception as e:
+            print(f"Translation cache write error: {e}")
+
+    def _remember(self, dest_language: str, translations: Dict[str, str]):
+        with self._lock:
+            for text_hash, text in translations.items():
+                self._entries[(text_hash, dest_language)] = text
+                self._entries.move_to_end((text_hash, dest_language))
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+translation_cache = TranslationCache()
+
+
+@dataclass
+class TranslationStats:
+    api_calls: int = 0
+    sentences_translated: int = 0
+    cache_hits: int = 0
+
+
 class TranslationService:
-    def __init__(self):
-        self.translation_cache = OrderedDict()
-        self.MAX_CACHE_SIZE = 1000
+    def __init__(self, cache: TranslationCache = None):
+        self.cache = cache or translation_cache
+        self.stats = TranslationStats()
+
+    def translate_batch(self, dest_language: str, texts: List[str]) -> List[str]:
+        """
+        Translates texts sentence by sentence, the sentences that aren't cached go out in as few translate_text
+        calls as the API limits allow. Blocking, call it off the event loop.
 
-    def _get_cache_key(self, text_hash: str, dest_language: str) -> str:
-        """Generate a cache key from text hash and language"""
-        return f"{text_hash}:{dest_language}"
+        Returns:
+            The translations in the order of texts, a sentence that failed to translate is kept as is
+        """
+        sentences_per_text = [split_into_sentences(text) if text else [] for text in texts]
+        hashes = {}
+        for sentences in sentences_per_text:
+            for sentence in sentences:
+                hashes.setdefault(sentence, _text_hash(sentence))
+
+        cached = self.cache.get_many(dest_language, list(set(hashes.values())))
+        translated = {sentence: cached[text_hash] for sentence, text_hash in hashes.items() if text_hash in cached}
+        self.stats.cache_hits += len(translated)
+
+        missing = [sentence for sentence in hashes if sentence not in translated]
+        for batch in self._batches(missing):
+            try:
+                response = _client.translate_text(
+                    contents=batch,
+                    parent=_parent,
+                    mime_type=_mime_type,
+                    target_language_code=dest_language,
+                )
+                self.stats.api_calls += 1
+            except Exception as e:
+                print(f"Translation error: {e}")
+                continue
+            results = {sentence: t.translated_text for sentence, t in zip(batch, response.translations)}
+            self.stats.sentences_translated += len(results)
+            translated.update(results)
+            self.cache.set_many(dest_language, {hashes[sentence]: text for sentence, text in results.items()})
+
+        return [' '.join(translated.get(s, s) for s in sentences) for sentences in sentences_per_text]
+
+    @staticmethod
+    def _batches(sentences: List[str]):
+        batch, codepoints = [], 0
+        for sentence in sentences:
+            if batch and (len(batch) >= MAX_BATCH_CONTENTS or codepoints + len(sentence) >= MAX_BATCH_CODEPOINTS):
+                yield batch
+                batch, codepoints = [], 0
+            batch.append(sentence)
+            codepoints += len(sentence)
+        if batch:
+            yield batch
 
     def translate_text_by_sentence(self, dest_language: str, text: str) -> str:
         """
@@ -261,55 +385,34 @@ class TranslationService:
         """
         if not text:
             return ""
-
-        sentences = split_into_sentences(text)
-        translated_sentences = []
-        for sentence in sentences:
-            # Each sentence translation will hit the cache if seen before.
-            translated_sentences.append(self.translate_text(dest_language, sentence))
-
-        return ' '.join(translated_sentences)
+        return self.translate_batch(dest_language, [text])[0]
 
     def translate_text(self, dest_language: str, text: str) -> str:
         """
         Translates text to the specified destination language using Google Cloud Translation API.
-        Uses a cache to avoid redundant translations.
+        Uses the shared cache to avoid redundant translations.
 
         Args:
             dest_language: The language code to translate to (e.g., 'en', 'es', 'fr')
             text: The text to translate
 
         Returns:
-            The translated text as a string
+            The translated text as a string, the original text if translation fails
         """
-        # Generate hash for the text
-        text_hash = hashlib.md5(text.encode()).hexdigest()
-
-        # Check if translation is in cache
-        cache_key = self._get_cache_key(text_hash, dest_language)
-        if cache_key in self.translation_cache:
-            # Move the item to the end of the OrderedDict to mark it as recently used
-            translated_text = self.translation_cache.pop(cache_key)
-            self.translation_cache[cache_key] = translated_text
-            return translated_text
-
+        text_hash = _text_hash(text)
+        if cached := self.cache.get_many(dest_language, [text_hash]).get(text_hash):
+            self.stats.cache_hits += 1
+            return cached
         try:
-            # Not in cache, perform translation
             response = _client.translate_text(
                 contents=[text],
                 parent=_parent,
                 mime_type=_mime_type,
                 target_language_code=dest_language,
             )
-
+            self.stats.api_calls += 1
             translated_text = response.translations[0].translated_text
-
-            # Add to cache
-            if len(self.translation_cache) >= self.MAX_CACHE_SIZE:
-                # Remove oldest item (first item in OrderedDict)
-                self.translation_cache.popitem(last=False)
-
-            self.translation_cache[cache_key] = translated_text
+            self.cache.set_many(dest_language, {text_hash: translated_text})
             return translated_text
         except Exception as e:
             print(f"Translation error: {e}")
@@ -0,0 +1,229 @@
+"""
+Shared async HTTP dispatcher for realtime app integrations and developer webhooks.
+
+- One pooled httpx.AsyncClient per process instead of blocking requests.post calls on the event loop
+- Concurrency limits per user and destination (scheme://host:port), so one slow endpoint can't hog the pool and
+  one user can't take all the slots of an endpoint shared by many (a popular app), plus a higher cap per destination
+- Circuit breaker per destination: after repeated failures the endpoint is skipped for a cool-down,
+  then a single trial request decides whether to close the circuit again
+"""
+
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+DEFAULT_TIMEOUT = 15.0
+MAX_CONNECTIONS = 200
+# Requests in flight to one destination, across users, and per user
+PER_DESTINATION_CONCURRENCY = int(os.getenv('WEBHOOK_PER_DESTINATION_CONCURRENCY', '64'))
+PER_USER_DESTINATION_CONCURRENCY = int(os.getenv('WEBHOOK_PER_USER_DESTINATION_CONCURRENCY', '4'))
+FAILURE_THRESHOLD = 5
+RESET_TIMEOUT = 30.0
+MAX_DESTINATIONS = 10000
+
+
+@dataclass
+class CircuitBreaker:
+    failure_threshold: int = FAILURE_THRESHOLD
+    reset_timeout: float = RESET_TIMEOUT
+    consecutive_failures: int = 0
+    opened_at: Optional[float] = None
+    trial_in_flight: bool = False
+
+    @property
+    def is_closed(self) -> bool:
+        return self.opened_at is None
+
+    def allow(self, now: float) -> bool:
+        if self.opened_at is None:
+            return True
+        # Half-open: let one trial request through after the cool-down
+        if now - self.opened_at >= self.reset_timeout and not self.trial_in_flight:
+            self.trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def record_failure(self, now: float):
+        self.consecutive_failures += 1
+        if self.trial_in_flight or self.consecutive_failures >= self.failure_threshold:
+            self.opened_at = now
+        self.trial_in_flight = False
+
+
+@dataclass
+class _Destination:
+    semaphore: asyncio.Semaphore
+    breaker: CircuitBreaker
+    in_flight: int = 0  # requests holding or waiting for a slot
+    # Per user, dropped once the user has nothing in flight
+    user_semaphores: Dict[str, asyncio.Semaphore] = field(default_factory=dict)
+    user_requests: Dict[str, int] = field(default_factory=dict)
+
+
+class WebhookDispatcher:
+    """
+    Sends webhook requests through a shared connection pool.
+
+    `post` never raises for transport errors: it returns the response, or None if the request failed
+    or the destination's circuit is open.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = MAX_CONNECTIONS,
+        per_destination_concurrency: int = PER_DESTINATION_CONCURRENCY,
+        per_user_concurrency: int = PER_USER_DESTINATION_CONCURRENCY,
+        failure_threshold: int = FAILURE_THRESHOLD,
+        reset_timeout: float = RESET_TIMEOUT,
+        timeout: float = DEFAULT_TIMEOUT,
+        max_destinations: int = MAX_DESTINATIONS,
+    ):
+        self.max_connections = max_connections
+        self.per_destination_concurrency = per_destination_concurrency
+        self.per_user_concurrency = per_user_concurrency
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.timeout = timeout
+        self.max_destinations = max_destinations
+
+        self._client: Optional[httpx.AsyncClient] = None
+        self._destinations: OrderedDict[str, _Destination] = OrderedDict()
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=50),
+            )
+        return self._client
+
+    @staticmethod
+    def destination_of(url: str) -> str:
+        parts = urlsplit(url)
+        return f'{parts.scheme}://{parts.netloc}'.lower()
+
+    def _get_destination(self, key: str) -> _Destination:
+        destination = self._destinations.get(key)
+        if destination is None:
+            destination = _Destination(
+                semaphore=asyncio.Semaphore(self.per_destination_concurrency),
+                breaker=CircuitBreaker(self.failure_threshold, self.reset_timeout),
+            )
+            self._destinations[key] = destination
+            self._evict()
+        else:
+            self._destinations.move_to_end(key)
+        return destination
+
+    def _evict(self):
+        if len(self._destinations) <= self.max_destinations:
+            return
+        # Drop the least recently used idle, healthy destinations
+        for key in list(self._destinations.keys()):
+            if len(self._destinations) <= self.max_destinations:
+                break
+            destination = self._destinations[key]
+            if destination.breaker.is_closed and not destination.in_flight:
+                del self._destinations[key]
+
+    @asynccontextmanager
+    async def _user_slot(self, destination: _Destination, uid: Optional[str]):
+        if not uid:
+            yield
+            return
+        semaphore = destination.user_semaphores.get(uid)
+        if semaphore is None:
+            semaphore = destination.user_semaphores[uid] = asyncio.Semaphore(self.per_user_concurrency)
+        destination.user_requests[uid] = destination.user_requests.get(uid, 0) + 1
+        try:
+            async with semaphore:
+                yield
+        finally:
+            destination.user_requests[uid] -= 1
+            if not destination.user_requests[uid]:
+                del destination.user_requests[uid]
+                del destination.user_semaphores[uid]
+
+    async def post(
+        self,
+        url: str,
+        json=None,
+        content: Optional[bytes] = None,
+        headers: Optional[Dict[str, str]] = None,
+        timeout: Optional[float] = None,
+        uid: Optional[str] = None,
+    ) -> Optional[httpx.Response]:
+        """uid: the user the request is sent for, caps that user's requests in flight to the destination."""
+        key = self.destination_of(url)
+        destination = self._get_destination(key)
+
+        if not destination.breaker.allow(time.monotonic()):
+            return None
+
+        destination.in_flight += 1
+        try:
+            async with self._user_slot(destination, uid), destination.semaphore:
+                response = None
+                try:
+                    response = await self._get_client().post(
+                        url,
+                        json=json,
+                        content=content,
+                        headers=headers,
+                        timeout=timeout if timeout is not None else self.timeout,
+                    )
+                except Exception as e:
+                    print(f"Webhook dispatch error: {key} {type(e).__name__}: {e}")
+
+                # Only transport errors and server errors count against the endpoint
+                if response is None or response.status_code >= 500:
+                    was_closed = destination.breaker.is_closed
+                    destination.breaker.record_failure(time.monotonic())
+                    if was_closed and not destination.breaker.is_closed:
+                        print(f"Webhook circuit open: {key} for {self.reset_timeout}s")
+                else:
+                    destination.breaker.record_success()
+                return response
+        finally:
+            destination.in_flight -= 1
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+def coalesce_transcript_batches(batch: List[dict]) -> List[Tuple[Optional[str], List[dict]]]:
+    """
+    Merges queued transcript items ({'segments', 'memory_id'}) into one segment list per conversation.
+
+    Segments sent more than once (updated while queued) keep their position and latest content.
+    """
+    groups: OrderedDict[Optional[str], OrderedDict] = OrderedDict()
+    for item in batch:
+        segments_by_id = groups.setdefault(item.get('memory_id'), OrderedDict())
+        for segment in item.get('segments') or []:
+            segments_by_id[segment.get('id') or id(segment)] = segment
+    return [(memory_id, list(segments.values())) for memory_id, segments in groups.items()]
+
+
+_dispatcher: Optional[WebhookDispatcher] = None
+
+
+def get_webhook_dispatcher() -> WebhookDispatcher:
+    global _dispatcher
+    if _dispatcher is None:
+        _dispatcher = WebhookDispatcher()
+    return _dispatcher
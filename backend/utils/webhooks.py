@@ -7,8 +7,9 @@ import requests
 import websockets
 
 from database.redis_db import (
+    aget_user_webhook,
+    get_user_webhook,
     get_user_webhook_db,
-    user_webhook_status_db,
     disable_user_webhook_db,
     enable_user_webhook_db,
     set_user_webhook_db,
@@ -18,6 +19,7 @@ from models.users import WebhookType
 import database.notifications as notification_db
 import database.users as users_db
 from utils.notifications import send_notification
+from utils.webhook_dispatcher import get_webhook_dispatcher
 
 
 def _json_serialize_datetime(obj: Any) -> Any:
@@ -57,10 +59,9 @@ def _add_speaker_names_to_payload(uid, payload: dict):
 
 
 def conversation_created_webhook(uid, memory: Conversation):
-    toggled = user_webhook_status_db(uid, WebhookType.memory_created)
+    toggled, webhook_url = get_user_webhook(uid, WebhookType.memory_created)
 
     if toggled:
-        webhook_url = get_user_webhook_db(uid, WebhookType.memory_created)
         if not webhook_url:
             return
         webhook_url += f'?uid={uid}'
@@ -82,9 +83,8 @@ def conversation_created_webhook(uid, memory: Conversation):
 
 
 def day_summary_webhook(uid, summary: str):
-    toggled = user_webhook_status_db(uid, WebhookType.day_summary)
+    toggled, webhook_url = get_user_webhook(uid, WebhookType.day_summary)
     if toggled:
-        webhook_url = get_user_webhook_db(uid, WebhookType.day_summary)
         if not webhook_url:
             return
         webhook_url += f'?uid={uid}'
@@ -104,20 +104,22 @@ def day_summary_webhook(uid, summary: str):
 
 async def realtime_transcript_webhook(uid, segments: List[dict]):
     print("realtime_transcript_webhook", uid)
-    toggled = user_webhook_status_db(uid, WebhookType.realtime_transcript)
+    toggled, webhook_url = await aget_user_webhook(uid, WebhookType.realtime_transcript)
 
     if toggled:
-        webhook_url = get_user_webhook_db(uid, WebhookType.realtime_transcript)
         if not webhook_url:
             return
         webhook_url += f'?uid={uid}'
         try:
-            response = requests.post(
+            response = await get_webhook_dispatcher().post(
                 webhook_url,
                 json={'segments': segments, 'session_id': uid},
                 headers={'Content-Type': 'application/json'},
                 timeout=15,
+                uid=uid,
             )
+            if response is None:
+                return
             print('realtime_transcript_webhook:', webhook_url, response.status_code)
             if response.status_code == 200:
                 response_data = response.json()
@@ -125,7 +127,7 @@ async def realtime_transcript_webhook(uid, segments: List[dict]):
                     return
                 message = response_data.get('message', '')
                 if len(message) > 5:
-                    send_webhook_notification(uid, message)
+                    await asyncio.to_thread(send_webhook_notification, uid, message)
         except Exception as e:
             print(f"Error sending realtime transcript to developer webhook: {e}")
     else:
@@ -133,9 +135,8 @@ async def realtime_transcript_webhook(uid, segments: List[dict]):
 
 
 def get_audio_bytes_webhook_seconds(uid: str):
-    toggled = user_webhook_status_db(uid, WebhookType.audio_bytes)
+    toggled, webhook_url = get_user_webhook(uid, WebhookType.audio_bytes)
     if toggled:
-        webhook_url = get_user_webhook_db(uid, WebhookType.audio_bytes)
         if not webhook_url:
             return
         parts = webhook_url.split(',')
@@ -152,17 +153,22 @@ def get_audio_bytes_webhook_seconds(uid: str):
 async def send_audio_bytes_developer_webhook(uid: str, sample_rate: int, data: bytearray):
     print("send_audio_bytes_developer_webhook", uid)
     # TODO: add a lock, send shorter segments, validate regex.
-    toggled = user_webhook_status_db(uid, WebhookType.audio_bytes)
+    toggled, webhook_url = await aget_user_webhook(uid, WebhookType.audio_bytes)
     if toggled:
-        webhook_url = get_user_webhook_db(uid, WebhookType.audio_bytes)
         webhook_url = webhook_url.split(',')[0]
         if not webhook_url:
             return
         webhook_url += f'?sample_rate={sample_rate}&uid={uid}'
         try:
-            response = requests.post(
-                webhook_url, data=data, headers={'Content-Type': 'application/octet-stream'}, timeout=15
+            response = await get_webhook_dispatcher().post(
+                webhook_url,
+                content=bytes(data),
+                headers={'Content-Type': 'application/octet-stream'},
+                timeout=15,
+                uid=uid,
             )
+            if response is None:
+                return
             print('send_audio_bytes_developer_webhook:', webhook_url, response.status_code)
         except Exception as e:
             print(f"Error sending audio bytes to developer webhook: {e}")
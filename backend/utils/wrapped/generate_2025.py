@@ -4,9 +4,12 @@ Wrapped 2025 generation logic.
 Computes analytics from user's 2025 data and generates LLM-based insights.
 """
 
+import os
+import threading
+from bisect import bisect_right
 from collections import Counter
 from datetime import datetime, timezone
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
 import database.wrapped as wrapped_db
 import database.conversations as conversations_db
@@ -15,6 +18,7 @@ from database.wrapped import WrappedStatus
 from models.conversation import Conversation
 from utils.llm.clients import llm_gemini_flash
 from utils.notifications import send_notification
+from utils.other.stage_graph import GraphStage, run_stage_graph
 import json
 
 
@@ -22,6 +26,13 @@ import json
 YEAR_2025_START = datetime(2025, 1, 1, 0, 0, 0, tzinfo=timezone.utc)
 YEAR_2025_END = datetime(2026, 1, 1, 0, 0, 0, tzinfo=timezone.utc)
 
+MAX_CONVERSATIONS = 10000
+CONVERSATIONS_PAGE_SIZE = 100
+CONTEXT_MAX_CHARS = 800000
+
+# How many analyses run at the same time for a user
+WRAPPED_STAGE_CONCURRENCY = int(os.getenv('WRAPPED_STAGE_CONCURRENCY', 4))
+
 # Common phrases to look for (safe, non-sensitive)
 SIGNATURE_PHRASES = [
     "let's do this",
@@ -112,17 +123,16 @@ def _find_signature_phrases(conversations: List[Conversation], sample_size: int
     return dict(phrase_counts)
 
 
-def _determine_archetype_with_llm(conversations: List[Conversation], stats: Dict[str, Any]) -> Dict[str, str]:
+DECISION_STYLE_FALLBACK = {"name": "Reflective Executor", "description": "You think deeply, then move decisively."}
+
+
+def _determine_archetype_with_llm(context: str, stats: Dict[str, Any]) -> Dict[str, str]:
     """Use Gemini to determine decision style archetype based on conversation patterns."""
     print(f"[Wrapped]   - Starting decision style analysis with Gemini...")
 
-    try:
-        context = _build_conversations_context(conversations, max_chars=300000)
-        print(f"[Wrapped]     - Built context: {len(context)} chars")
-
-        archetypes_str = "\n".join([f"- {a['name']}: {a['description']}" for a in DECISION_ARCHETYPES])
+    archetypes_str = "\n".join([f"- {a['name']}: {a['description']}" for a in DECISION_ARCHETYPES])
 
-        prompt = f"""Analyze these conversation summaries and determine this person's DECISION STYLE and PERSONALITY archetype.
+    prompt = f"""Analyze these conversation summaries and determine this person's DECISION STYLE and PERSONALITY archetype.
 
 CONVERSATIONS:
 {context}
@@ -144,40 +154,38 @@ Return as JSON (no markdown):
 
 Make the description specific to THIS person based on what you see in their conversations, not generic."""
 
-        print(f"[Wrapped]     - Calling Gemini for decision style...")
-        response = llm_gemini_flash.invoke(prompt)
-        content = response.content.strip()
-        print(f"[Wrapped]     - Gemini response received: {len(content)} chars")
+    print(f"[Wrapped]     - Calling Gemini for decision style...")
+    response = llm_gemini_flash.invoke(prompt)
+    content = response.content.strip()
+    print(f"[Wrapped]     - Gemini response received: {len(content)} chars")
 
-        if "```json" in content:
-            content = content.split("```json")[1].split("```")[0].strip()
-        elif "```" in content:
-            content = content.split("```")[1].split("```")[0].strip()
+    if "```json" in content:
+        content = content.split("```json")[1].split("```")[0].strip()
+    elif "```" in content:
+        content = content.split("```")[1].split("```")[0].strip()
 
-        result = json.loads(content)
-        if isinstance(result, list) and len(result) > 0:
-            result = result[0]
+    result = json.loads(content)
+    if isinstance(result, list) and len(result) > 0:
+        result = result[0]
 
-        print(f"[Wrapped]     - Decision style: {result.get('name')}")
-        return result
+    print(f"[Wrapped]     - Decision style: {result.get('name')}")
+    return result
 
-    except Exception as e:
-        print(f"[Wrapped]     - ERROR in decision style analysis: {e}")
-        import traceback
 
-        traceback.print_exc()
-        return {"name": "Reflective Executor", "description": "You think deeply, then move decisively."}
+TOP_PHRASES_FALLBACK = [
+    {"phrase": "Let's do this", "context": "When starting something new"},
+    {"phrase": "Makes sense", "context": "When agreeing with ideas"},
+    {"phrase": "I think", "context": "When sharing opinions"},
+    {"phrase": "We should", "context": "When suggesting actions"},
+    {"phrase": "Sounds good", "context": "When approving plans"},
+]
 
 
-def _find_top_phrases_with_llm(conversations: List[Conversation]) -> List[Dict[str, Any]]:
+def _find_top_phrases_with_llm(context: str) -> List[Dict[str, Any]]:
     """Use Gemini to find the user's top 5 most used phrases."""
     print(f"[Wrapped]   - Starting top phrases analysis with Gemini...")
 
-    try:
-        context = _build_conversations_context(conversations, max_chars=400000)
-        print(f"[Wrapped]     - Built context: {len(context)} chars")
-
-        prompt = f"""Analyze these conversation summaries and identify this person's TOP 5 MOST USED PHRASES or expressions.
+    prompt = f"""Analyze these conversation summaries and identify this person's TOP 5 MOST USED PHRASES or expressions.
 
 CONVERSATIONS:
 {context}
@@ -202,44 +210,41 @@ Return as JSON (no markdown):
 
 Be specific with actual phrases from their conversations. Avoid generic filler words like "um", "like", "you know"."""
 
-        print(f"[Wrapped]     - Calling Gemini for top phrases...")
-        response = llm_gemini_flash.invoke(prompt)
-        content = response.content.strip()
-        print(f"[Wrapped]     - Gemini response received: {len(content)} chars")
+    print(f"[Wrapped]     - Calling Gemini for top phrases...")
+    response = llm_gemini_flash.invoke(prompt)
+    content = response.content.strip()
+    print(f"[Wrapped]     - Gemini response received: {len(content)} chars")
 
-        if "```json" in content:
-            content = content.split("```json")[1].split("```")[0].strip()
-        elif "```" in content:
-            content = content.split("```")[1].split("```")[0].strip()
+    if "```json" in content:
+        content = content.split("```json")[1].split("```")[0].strip()
+    elif "```" in content:
+        content = content.split("```")[1].split("```")[0].strip()
 
-        result = json.loads(content)
-        phrases = result.get("phrases", []) if isinstance(result, dict) else result
+    result = json.loads(content)
+    phrases = result.get("phrases", []) if isinstance(result, dict) else result
 
-        print(f"[Wrapped]     - Found {len(phrases)} top phrases")
-        return phrases[:5]
+    print(f"[Wrapped]     - Found {len(phrases)} top phrases")
+    return phrases[:5]
 
-    except Exception as e:
-        print(f"[Wrapped]     - ERROR in top phrases analysis: {e}")
-        import traceback
-
-        traceback.print_exc()
-        return [
-            {"phrase": "Let's do this", "context": "When starting something new"},
-            {"phrase": "Makes sense", "context": "When agreeing with ideas"},
-            {"phrase": "I think", "context": "When sharing opinions"},
-            {"phrase": "We should", "context": "When suggesting actions"},
-            {"phrase": "Sounds good", "context": "When approving plans"},
-        ]
 
+class _ConversationsContext:
+    """
+    Context string of the year's conversations for the Gemini analyses (title + overview for broad coverage), built
+    once as the conversations are read and shared by every analysis. A smaller max_chars gets the same entries cut
+    earlier, as building it again with that max_chars would.
+    """
 
-def _build_conversations_context(conversations: List[Conversation], max_chars: int = 800000) -> str:
-    """Build a context string from conversations for Gemini analysis (title + overview for broad coverage)."""
-    context_parts = []
-    total_chars = 0
+    def __init__(self, max_chars: int = CONTEXT_MAX_CHARS):
+        self.max_chars = max_chars
+        self.entries: List[str] = []
+        self._ends: List[int] = []  # chars up to the end of each entry, separators not counted
+        self._full = False
+        self._texts: Dict[int, str] = {}
+        self._lock = threading.Lock()
 
-    for conv in conversations:
-        if not conv.created_at:
-            continue
+    def add(self, conv: Conversation):
+        if self._full or not conv.created_at:
+            return
 
         date_str = conv.created_at.strftime("%Y-%m-%d %H:%M")
         title = conv.structured.title if conv.structured else "Untitled"
@@ -248,25 +253,103 @@ def _build_conversations_context(conversations: List[Conversation], max_chars: i
         # Use only title and overview for broader coverage (no transcript)
         entry = f"[{date_str}] {title}: {overview}\n"
 
-        if total_chars + len(entry) > max_chars:
-            break
+        end = (self._ends[-1] if self._ends else 0) + len(entry)
+        if end > self.max_chars:
+            self._full = True
+            return
 
-        context_parts.append(entry)
-        total_chars += len(entry)
+        self.entries.append(entry)
+        self._ends.append(end)
 
-    return "\n".join(context_parts)
+    def text(self, max_chars: Optional[int] = None) -> str:
+        count = bisect_right(self._ends, min(max_chars or self.max_chars, self.max_chars))
+        with self._lock:
+            if count not in self._texts:
+                self._texts[count] = "\n".join(self.entries[:count])
+            return self._texts[count]
 
 
-def _analyze_memorable_days_with_llm(conversations: List[Conversation]) -> Dict[str, Any]:
+class _YearDigest:
+    """
+    What the stats and the Gemini analyses need from the year's conversations, added page by page as they are read
+    so the transcripts of the whole year are never held at once.
+    """
+
+    def __init__(self, phrases_sample_size: int = 50):
+        self.phrases_sample_size = phrases_sample_size
+        self.total_conversations = 0
+        self.first_created_at = None
+        self.last_created_at = None
+        self.active_days = set()
+        self.total_seconds = 0.0
+        self.category_counts = Counter()
+        self.phrase_counts = Counter()
+        self.context = _ConversationsContext()
+
+    def add(self, conv: Conversation):
+        # Signature phrases are looked for in the first conversations only, for performance
+        if self.total_conversations < self.phrases_sample_size:
+            self.phrase_counts.update(_find_signature_phrases([conv]))
+
+        self.total_conversations += 1
+        if conv.created_at:
+            self.first_created_at = self.first_created_at or conv.created_at
+            self.last_created_at = conv.created_at
+            self.active_days.add(conv.created_at.date())
+        self.total_seconds += _compute_conversation_duration(conv)
+
+        cat = conv.structured.category.value if conv.structured and conv.structured.category else "other"
+        self.category_counts[cat] += 1
+
+        self.context.add(conv)
+
+
+def _read_year_conversations(uid: str) -> _YearDigest:
+    """Stream the year's completed conversations page by page into a digest."""
+    digest = _YearDigest()
+    pages = conversations_db.iter_conversations(
+        uid=uid,
+        limit=MAX_CONVERSATIONS,
+        offset=0,
+        include_discarded=False,
+        statuses=["completed"],
+        start_date=YEAR_2025_START,
+        end_date=YEAR_2025_END,
+        page_size=CONVERSATIONS_PAGE_SIZE,
+    )
+    for page in pages:
+        for conversation in page:
+            digest.add(Conversation(**conversation))
+    return digest
+
+
+MEMORABLE_DAYS_FALLBACK = {
+    "most_fun_day": {
+        "date": "Unknown",
+        "title": "A Great Day",
+        "description": "You had some memorable moments this year!",
+        "emoji": "🎉",
+    },
+    "most_productive_day": {
+        "date": "Unknown",
+        "title": "Getting Things Done",
+        "description": "You crushed it on productivity!",
+        "emoji": "💪",
+    },
+    "most_stressful_day": {
+        "date": "Unknown",
+        "title": "A Challenging Day",
+        "description": "You pushed through some tough moments.",
+        "emoji": "😤",
+    },
+}
+
+
+def _analyze_memorable_days_with_llm(context: str) -> Dict[str, Any]:
     """Use Gemini to analyze and find the most memorable days of the year."""
     print(f"[Wrapped]   - Starting memorable days analysis with Gemini...")
 
-    try:
-        # Build context from all conversations
-        context = _build_conversations_context(conversations)
-        print(f"[Wrapped]     - Built context: {len(context)} chars from {len(conversations)} conversations")
-
-        prompt = f"""Analyze these conversation transcripts from someone's year and identify the most memorable days.
+    prompt = f"""Analyze these conversation transcripts from someone's year and identify the most memorable days.
 
 CONVERSATIONS:
 {context}
@@ -304,57 +387,35 @@ Return your analysis as JSON (no markdown):
 IMPORTANT: Each description MUST be exactly 15-20 words. No more, no less.
 Be specific and reference actual events from the conversations. Make titles catchy and memorable."""
 
-        print(f"[Wrapped]     - Calling Gemini for memorable days...")
-        response = llm_gemini_flash.invoke(prompt)
-        content = response.content.strip()
-        print(f"[Wrapped]     - Gemini response received: {len(content)} chars")
+    print(f"[Wrapped]     - Calling Gemini for memorable days...")
+    response = llm_gemini_flash.invoke(prompt)
+    content = response.content.strip()
+    print(f"[Wrapped]     - Gemini response received: {len(content)} chars")
 
-        # Parse JSON
-        if "```json" in content:
-            content = content.split("```json")[1].split("```")[0].strip()
-        elif "```" in content:
-            content = content.split("```")[1].split("```")[0].strip()
+    # Parse JSON
+    if "```json" in content:
+        content = content.split("```json")[1].split("```")[0].strip()
+    elif "```" in content:
+        content = content.split("```")[1].split("```")[0].strip()
 
-        result = json.loads(content)
-        print(f"[Wrapped]     - Successfully parsed memorable days")
-        return result
+    result = json.loads(content)
+    print(f"[Wrapped]     - Successfully parsed memorable days")
+    return result
 
-    except Exception as e:
-        print(f"[Wrapped]     - ERROR in memorable days analysis: {e}")
-        import traceback
 
-        traceback.print_exc()
-        return {
-            "most_fun_day": {
-                "date": "Unknown",
-                "title": "A Great Day",
-                "description": "You had some memorable moments this year!",
-                "emoji": "🎉",
-            },
-            "most_productive_day": {
-                "date": "Unknown",
-                "title": "Getting Things Done",
-                "description": "You crushed it on productivity!",
-                "emoji": "💪",
-            },
-            "most_stressful_day": {
-                "date": "Unknown",
-                "title": "A Challenging Day",
-                "description": "You pushed through some tough moments.",
-                "emoji": "😤",
-            },
-        }
+FUNNIEST_EVENT_FALLBACK = {
+    "date": "Unknown",
+    "title": "A Hilarious Moment",
+    "story": "You had some funny moments this year that made you laugh!",
+    "emoji": "😂",
+}
 
 
-def _find_funniest_event_with_llm(conversations: List[Conversation]) -> Dict[str, Any]:
+def _find_funniest_event_with_llm(context: str) -> Dict[str, Any]:
     """Use Gemini to find the funniest event/moment from the year."""
     print(f"[Wrapped]   - Starting funniest event analysis with Gemini...")
 
-    try:
-        context = _build_conversations_context(conversations)
-        print(f"[Wrapped]     - Built context: {len(context)} chars")
-
-        prompt = f"""Analyze these conversation transcripts and find the FUNNIEST moment or event from this person's year.
+    prompt = f"""Analyze these conversation transcripts and find the FUNNIEST moment or event from this person's year.
 
 CONVERSATIONS:
 {context}
@@ -379,42 +440,34 @@ Return the single funniest event as JSON (no markdown):
 IMPORTANT: The story MUST be exactly 20-30 words. No more, no less.
 Pick something genuinely funny and retell it in an entertaining way. Make the user smile when they read it!"""
 
-        print(f"[Wrapped]     - Calling Gemini for funniest event...")
-        response = llm_gemini_flash.invoke(prompt)
-        content = response.content.strip()
-        print(f"[Wrapped]     - Gemini response received: {len(content)} chars")
+    print(f"[Wrapped]     - Calling Gemini for funniest event...")
+    response = llm_gemini_flash.invoke(prompt)
+    content = response.content.strip()
+    print(f"[Wrapped]     - Gemini response received: {len(content)} chars")
 
-        if "```json" in content:
-            content = content.split("```json")[1].split("```")[0].strip()
-        elif "```" in content:
-            content = content.split("```")[1].split("```")[0].strip()
+    if "```json" in content:
+        content = content.split("```json")[1].split("```")[0].strip()
+    elif "```" in content:
+        content = content.split("```")[1].split("```")[0].strip()
 
-        result = json.loads(content)
-        print(f"[Wrapped]     - Successfully parsed funniest event: {result.get('title', 'Unknown')}")
-        return result
+    result = json.loads(content)
+    print(f"[Wrapped]     - Successfully parsed funniest event: {result.get('title', 'Unknown')}")
+    return result
 
-    except Exception as e:
-        print(f"[Wrapped]     - ERROR in funniest event analysis: {e}")
-        import traceback
 
-        traceback.print_exc()
-        return {
-            "date": "Unknown",
-            "title": "A Hilarious Moment",
-            "story": "You had some funny moments this year that made you laugh!",
-            "emoji": "😂",
-        }
+EMBARRASSING_EVENT_FALLBACK = {
+    "date": "Unknown",
+    "title": "That Awkward Moment",
+    "story": "We've all had those moments - you handled it like a champ!",
+    "emoji": "😅",
+}
 
 
-def _find_most_embarrassing_event_with_llm(conversations: List[Conversation]) -> Dict[str, Any]:
+def _find_most_embarrassing_event_with_llm(context: str) -> Dict[str, Any]:
     """Use Gemini to find the most embarrassing moment from the year."""
     print(f"[Wrapped]   - Starting most embarrassing event analysis with Gemini...")
 
-    try:
-        context = _build_conversations_context(conversations)
-        print(f"[Wrapped]     - Built context: {len(context)} chars")
-
-        prompt = f"""Analyze these conversation transcripts and find the MOST EMBARRASSING moment or event from this person's year.
+    prompt = f"""Analyze these conversation transcripts and find the MOST EMBARRASSING moment or event from this person's year.
 
 CONVERSATIONS:
 {context}
@@ -439,42 +492,45 @@ Return the most embarrassing event as JSON (no markdown):
 IMPORTANT: The story MUST be exactly 20-30 words. No more, no less.
 Frame it in a lighthearted, relatable way - we've all been there! Make it funny rather than cruel."""
 
-        print(f"[Wrapped]     - Calling Gemini for most embarrassing event...")
-        response = llm_gemini_flash.invoke(prompt)
-        content = response.content.strip()
-        print(f"[Wrapped]     - Gemini response received: {len(content)} chars")
+    print(f"[Wrapped]     - Calling Gemini for most embarrassing event...")
+    response = llm_gemini_flash.invoke(prompt)
+    content = response.content.strip()
+    print(f"[Wrapped]     - Gemini response received: {len(content)} chars")
 
-        if "```json" in content:
-            content = content.split("```json")[1].split("```")[0].strip()
-        elif "```" in content:
-            content = content.split("```")[1].split("```")[0].strip()
+    if "```json" in content:
+        content = content.split("```json")[1].split("```")[0].strip()
+    elif "```" in content:
+        content = content.split("```")[1].split("```")[0].strip()
 
-        result = json.loads(content)
-        print(f"[Wrapped]     - Successfully parsed embarrassing event: {result.get('title', 'Unknown')}")
-        return result
+    result = json.loads(content)
+    print(f"[Wrapped]     - Successfully parsed embarrassing event: {result.get('title', 'Unknown')}")
+    return result
 
-    except Exception as e:
-        print(f"[Wrapped]     - ERROR in embarrassing event analysis: {e}")
-        import traceback
 
-        traceback.print_exc()
-        return {
-            "date": "Unknown",
-            "title": "That Awkward Moment",
-            "story": "We've all had those moments - you handled it like a champ!",
-            "emoji": "😅",
-        }
+TOP_BUDDIES_FALLBACK = [
+    {
+        "name": "Your #1",
+        "relationship": "Close Friend",
+        "context": "Always there when you needed them!",
+        "emoji": "👋",
+    },
+    {
+        "name": "Your Confidant",
+        "relationship": "Best Friend",
+        "context": "Shared your best moments together.",
+        "emoji": "🤝",
+    },
+    {"name": "Work Buddy", "relationship": "Colleague", "context": "Made work days more fun.", "emoji": "💼"},
+    {"name": "Family", "relationship": "Family", "context": "Your support system all year.", "emoji": "❤️"},
+    {"name": "The Fun One", "relationship": "Friend", "context": "Always up for an adventure.", "emoji": "🎉"},
+]
 
 
-def _find_top_buddies_with_llm(conversations: List[Conversation]) -> List[Dict[str, Any]]:
+def _find_top_buddies_with_llm(context: str) -> List[Dict[str, Any]]:
     """Use Gemini to find the top 5 people the user interacted with most."""
     print(f"[Wrapped]   - Starting top buddies analysis with Gemini...")
 
-    try:
-        context = _build_conversations_context(conversations)
-        print(f"[Wrapped]     - Built context: {len(context)} chars")
-
-        prompt = f"""Analyze these conversation transcripts and identify the TOP 5 PEOPLE this person interacted with, talked about, or mentioned most frequently throughout the year.
+    prompt = f"""Analyze these conversation transcripts and identify the TOP 5 PEOPLE this person interacted with, talked about, or mentioned most frequently throughout the year.
 
 CONVERSATIONS:
 {context}
@@ -502,59 +558,41 @@ IMPORTANT:
 - The context should be specific and memorable, not generic
 - Each context MUST be 10-15 words max"""
 
-        print(f"[Wrapped]     - Calling Gemini for top buddies...")
-        response = llm_gemini_flash.invoke(prompt)
-        content = response.content.strip()
-        print(f"[Wrapped]     - Gemini response received: {len(content)} chars")
+    print(f"[Wrapped]     - Calling Gemini for top buddies...")
+    response = llm_gemini_flash.invoke(prompt)
+    content = response.content.strip()
+    print(f"[Wrapped]     - Gemini response received: {len(content)} chars")
 
-        if "```json" in content:
-            content = content.split("```json")[1].split("```")[0].strip()
-        elif "```" in content:
-            content = content.split("```")[1].split("```")[0].strip()
+    if "```json" in content:
+        content = content.split("```json")[1].split("```")[0].strip()
+    elif "```" in content:
+        content = content.split("```")[1].split("```")[0].strip()
 
-        result = json.loads(content)
-        if not isinstance(result, list):
-            result = [result]
+    result = json.loads(content)
+    if not isinstance(result, list):
+        result = [result]
 
-        # Ensure we have exactly 5
-        result = result[:5]
+    # Ensure we have exactly 5
+    result = result[:5]
 
-        print(f"[Wrapped]     - Successfully parsed {len(result)} buddies")
-        return result
+    print(f"[Wrapped]     - Successfully parsed {len(result)} buddies")
+    return result
 
-    except Exception as e:
-        print(f"[Wrapped]     - ERROR in top buddies analysis: {e}")
-        import traceback
 
-        traceback.print_exc()
-        return [
-            {
-                "name": "Your #1",
-                "relationship": "Close Friend",
-                "context": "Always there when you needed them!",
-                "emoji": "👋",
-            },
-            {
-                "name": "Your Confidant",
-                "relationship": "Best Friend",
-                "context": "Shared your best moments together.",
-                "emoji": "🤝",
-            },
-            {"name": "Work Buddy", "relationship": "Colleague", "context": "Made work days more fun.", "emoji": "💼"},
-            {"name": "Family", "relationship": "Family", "context": "Your support system all year.", "emoji": "❤️"},
-            {"name": "The Fun One", "relationship": "Friend", "context": "Always up for an adventure.", "emoji": "🎉"},
-        ]
+OBSESSIONS_FALLBACK = {
+    "show": "Not mentioned",
+    "movie": "Not mentioned",
+    "book": "Not mentioned",
+    "celebrity": "Not mentioned",
+    "food": "Not mentioned",
+}
 
 
-def _find_obsessions_with_llm(conversations: List[Conversation]) -> Dict[str, Any]:
+def _find_obsessions_with_llm(context: str) -> Dict[str, Any]:
     """Find what shows, movies, books, celebrities, and food the user couldn't stop talking about."""
     print(f"[Wrapped]   - Starting obsessions analysis with Gemini...")
 
-    try:
-        context = _build_conversations_context(conversations)
-        print(f"[Wrapped]     - Built context: {len(context)} chars")
-
-        prompt = f"""Analyze these conversation summaries and find what this person COULDN'T STOP TALKING ABOUT in 2025.
+    prompt = f"""Analyze these conversation summaries and find what this person COULDN'T STOP TALKING ABOUT in 2025.
 
 CONVERSATIONS:
 {context}
@@ -578,46 +616,38 @@ Return as JSON (no markdown):
 
 Be specific with actual names. If something isn't clearly mentioned, make your best inference or use "Not mentioned"."""
 
-        print(f"[Wrapped]     - Calling Gemini for obsessions...")
-        response = llm_gemini_flash.invoke(prompt)
-        content = response.content.strip()
-        print(f"[Wrapped]     - Gemini response received: {len(content)} chars")
+    print(f"[Wrapped]     - Calling Gemini for obsessions...")
+    response = llm_gemini_flash.invoke(prompt)
+    content = response.content.strip()
+    print(f"[Wrapped]     - Gemini response received: {len(content)} chars")
 
-        if "```json" in content:
-            content = content.split("```json")[1].split("```")[0].strip()
-        elif "```" in content:
-            content = content.split("```")[1].split("```")[0].strip()
+    if "```json" in content:
+        content = content.split("```json")[1].split("```")[0].strip()
+    elif "```" in content:
+        content = content.split("```")[1].split("```")[0].strip()
 
-        result = json.loads(content)
-        if isinstance(result, list) and len(result) > 0:
-            result = result[0]
+    result = json.loads(content)
+    if isinstance(result, list) and len(result) > 0:
+        result = result[0]
 
-        print(f"[Wrapped]     - Obsessions found: {result}")
-        return result
+    print(f"[Wrapped]     - Obsessions found: {result}")
+    return result
 
-    except Exception as e:
-        print(f"[Wrapped]     - ERROR in obsessions analysis: {e}")
-        import traceback
 
-        traceback.print_exc()
-        return {
-            "show": "Not mentioned",
-            "movie": "Not mentioned",
-            "book": "Not mentioned",
-            "celebrity": "Not mentioned",
-            "food": "Not mentioned",
-        }
+MOVIE_RECOMMENDATIONS_FALLBACK = [
+    "The Social Network",
+    "Inception",
+    "Interstellar",
+    "The Pursuit of Happyness",
+    "The Shawshank Redemption",
+]
 
 
-def _find_movie_recommendations_with_llm(conversations: List[Conversation]) -> List[str]:
+def _find_movie_recommendations_with_llm(context: str) -> List[str]:
     """Find 5 movies the user would recommend to friends based on their conversations."""
     print(f"[Wrapped]   - Starting movie recommendations analysis with Gemini...")
 
-    try:
-        context = _build_conversations_context(conversations)
-        print(f"[Wrapped]     - Built context: {len(context)} chars")
-
-        prompt = f"""Analyze these conversation summaries and determine 5 MOVIES this person would recommend to friends.
+    prompt = f"""Analyze these conversation summaries and determine 5 MOVIES this person would recommend to friends.
 
 CONVERSATIONS:
 {context}
@@ -634,47 +664,36 @@ Return as JSON (no markdown):
 
 Include a mix of movies they mentioned AND movies that match their vibe/interests. Use actual movie titles."""
 
-        print(f"[Wrapped]     - Calling Gemini for movie recommendations...")
-        response = llm_gemini_flash.invoke(prompt)
-        content = response.content.strip()
-        print(f"[Wrapped]     - Gemini response received: {len(content)} chars")
+    print(f"[Wrapped]     - Calling Gemini for movie recommendations...")
+    response = llm_gemini_flash.invoke(prompt)
+    content = response.content.strip()
+    print(f"[Wrapped]     - Gemini response received: {len(content)} chars")
 
-        if "```json" in content:
-            content = content.split("```json")[1].split("```")[0].strip()
-        elif "```" in content:
-            content = content.split("```")[1].split("```")[0].strip()
+    if "```json" in content:
+        content = content.split("```json")[1].split("```")[0].strip()
+    elif "```" in content:
+        content = content.split("```")[1].split("```")[0].strip()
 
-        result = json.loads(content)
-        if isinstance(result, list):
-            return result[:5]
+    result = json.loads(content)
+    if isinstance(result, list):
+        return result[:5]
 
-        movies = result.get("movies", [])
-        print(f"[Wrapped]     - Movie recommendations: {movies}")
-        return movies[:5]
+    movies = result.get("movies", [])
+    print(f"[Wrapped]     - Movie recommendations: {movies}")
+    return movies[:5]
 
-    except Exception as e:
-        print(f"[Wrapped]     - ERROR in movie recommendations: {e}")
-        import traceback
 
-        traceback.print_exc()
-        return [
-            "The Social Network",
-            "Inception",
-            "Interstellar",
-            "The Pursuit of Happyness",
-            "The Shawshank Redemption",
-        ]
+STRUGGLES_AND_WINS_FALLBACK = {
+    "struggle": {"title": "Balancing Everything", "description": "Finding time for everything that matters"},
+    "personal_win": {"title": "Growth Mindset", "description": "You became more self-aware and intentional"},
+}
 
 
-def _find_struggles_and_wins_with_llm(conversations: List[Conversation]) -> Dict[str, Any]:
+def _find_struggles_and_wins_with_llm(context: str) -> Dict[str, Any]:
     """Find the biggest struggle and personal win of the year."""
     print(f"[Wrapped]   - Starting struggles and wins analysis with Gemini...")
 
-    try:
-        context = _build_conversations_context(conversations)
-        print(f"[Wrapped]     - Built context: {len(context)} chars")
-
-        prompt = f"""Analyze these conversation summaries and identify the most significant STRUGGLE and WIN from this person's year.
+    prompt = f"""Analyze these conversation summaries and identify the most significant STRUGGLE and WIN from this person's year.
 
 CONVERSATIONS:
 {context}
@@ -699,207 +718,216 @@ Return as JSON (no markdown):
 
 Be specific and empathetic. These should feel personal and meaningful."""
 
-        print(f"[Wrapped]     - Calling Gemini for struggles and wins...")
-        response = llm_gemini_flash.invoke(prompt)
-        content = response.content.strip()
-        print(f"[Wrapped]     - Gemini response received: {len(content)} chars")
+    print(f"[Wrapped]     - Calling Gemini for struggles and wins...")
+    response = llm_gemini_flash.invoke(prompt)
+    content = response.content.strip()
+    print(f"[Wrapped]     - Gemini response received: {len(content)} chars")
 
-        if "```json" in content:
-            content = content.split("```json")[1].split("```")[0].strip()
-        elif "```" in content:
-            content = content.split("```")[1].split("```")[0].strip()
+    if "```json" in content:
+        content = content.split("```json")[1].split("```")[0].strip()
+    elif "```" in content:
+        content = content.split("```")[1].split("```")[0].strip()
 
-        result = json.loads(content)
-        if isinstance(result, list) and len(result) > 0:
-            result = result[0]
+    result = json.loads(content)
+    if isinstance(result, list) and len(result) > 0:
+        result = result[0]
 
-        print(f"[Wrapped]     - Struggles and wins found")
-        return result
+    print(f"[Wrapped]     - Struggles and wins found")
+    return result
 
-    except Exception as e:
-        print(f"[Wrapped]     - ERROR in struggles and wins analysis: {e}")
-        import traceback
 
-        traceback.print_exc()
-        return {
-            "struggle": {"title": "Balancing Everything", "description": "Finding time for everything that matters"},
-            "personal_win": {"title": "Growth Mindset", "description": "You became more self-aware and intentional"},
-        }
+# Progress shown while a stage is the first one in the table not done yet
+STAGE_PROGRESS = {
+    "conversations": "Fetching conversations...",
+    "action_items": "Fetching action items...",
+    "stats": "Computing statistics...",
+    "decision_style": "Analyzing your personality...",
+    "top_phrases": "Finding your catchphrases...",
+    "memorable_days": "Finding your memorable days...",
+    "funniest_event": "Finding your funniest moment...",
+    "most_embarrassing_event": "Finding your most cringe moment...",
+    "top_buddies": "Finding your top buddies...",
+    "obsessions": "Finding your obsessions...",
+    "movie_recommendations": "Generating movie recommendations...",
+    "struggles_and_wins": "Finding your wins and struggles...",
+}
+
+# The Gemini analyses, checkpointed as they finish. The reads and stats run again on a retry, they are cheap next
+# to the analyses and too big to keep.
+CHECKPOINTED_STAGES = [
+    "decision_style",
+    "top_phrases",
+    "memorable_days",
+    "funniest_event",
+    "most_embarrassing_event",
+    "top_buddies",
+    "obsessions",
+    "movie_recommendations",
+    "struggles_and_wins",
+]
 
 
-def generate_wrapped_2025(uid: str, year: int = 2025):
+def _wrapped_stages(uid: str) -> List[GraphStage]:
     """
-    Generate Wrapped 2025 for a user.
-
-    This fetches all 2025 data, computes analytics, generates LLM insights,
-    and stores the result in Firestore.
+    The generation as a graph: the conversations and action items are read side by side, every analysis only needs
+    the shared conversations context (the decision style also needs the stats), so they all run concurrently.
     """
-    import time
-
-    start_time = time.time()
-
-    try:
-        print(f"[Wrapped] ========== Starting Wrapped 2025 generation for user {uid} ==========")
-        print(f"[Wrapped] Date range: {YEAR_2025_START} to {YEAR_2025_END}")
 
-        # Step 1: Fetch conversations
-        step_start = time.time()
-        _update_progress(uid, year, "Fetching conversations...", 0.1)
-        print(f"[Wrapped] Step 1: Fetching conversations...")
+    def context(results: Dict[str, Any], max_chars: Optional[int] = None) -> str:
+        return results["conversations"].context.text(max_chars)
 
-        conversations_data = conversations_db.get_conversations_without_photos(
-            uid=uid,
-            limit=10000,  # Get all conversations for the year
-            offset=0,
-            include_discarded=False,
-            statuses=["completed"],
-            start_date=YEAR_2025_START,
-            end_date=YEAR_2025_END,
-        )
-
-        conversations = [Conversation(**c) for c in conversations_data]
-        print(
-            f"[Wrapped] Step 1 complete: Found {len(conversations)} conversations for 2025 (took {time.time() - step_start:.2f}s)"
-        )
-
-        if conversations:
-            print(f"[Wrapped]   - First conversation date: {conversations[0].created_at}")
-            print(f"[Wrapped]   - Last conversation date: {conversations[-1].created_at}")
-
-        # Step 2: Fetch action items
-        step_start = time.time()
-        _update_progress(uid, year, "Fetching action items...", 0.2)
-        print(f"[Wrapped] Step 2: Fetching action items...")
-
-        action_items = action_items_db.get_action_items(
+    def action_items(_) -> List[dict]:
+        return action_items_db.get_action_items(
             uid=uid,
             start_date=YEAR_2025_START,
             end_date=YEAR_2025_END,
             limit=10000,
         )
-        print(
-            f"[Wrapped] Step 2 complete: Found {len(action_items)} action items for 2025 (took {time.time() - step_start:.2f}s)"
-        )
-
-        completed_count = sum(1 for item in action_items if item.get("completed", False))
-        print(f"[Wrapped]   - Completed: {completed_count}, Pending: {len(action_items) - completed_count}")
-
-        # Step 3: Compute basic stats
-        step_start = time.time()
-        _update_progress(uid, year, "Computing statistics...", 0.3)
-        print(f"[Wrapped] Step 3: Computing statistics...")
-
-        result = _compute_all_stats(conversations, action_items)
-        print(f"[Wrapped] Step 3 complete: Statistics computed (took {time.time() - step_start:.2f}s)")
-        print(f"[Wrapped]   - Total hours: {result.get('total_time_hours', 0)}")
-        print(f"[Wrapped]   - Top categories: {result.get('top_categories', [])}")
-        print(f"[Wrapped]   - Signature phrase: {result.get('signature_phrase', {})}")
-
-        # Step 4: Determine decision style with Gemini
-        step_start = time.time()
-        _update_progress(uid, year, "Analyzing your personality...", 0.50)
-        print(f"[Wrapped] Step 4: Analyzing decision style with Gemini...")
-
-        decision_style = _determine_archetype_with_llm(conversations, result)
-        result["decision_style"] = decision_style
-        print(f"[Wrapped] Step 4 complete: Decision style analyzed (took {time.time() - step_start:.2f}s)")
-        print(f"[Wrapped]   - Archetype: {decision_style.get('name')}")
-
-        # Step 5: Find top phrases with Gemini
-        step_start = time.time()
-        _update_progress(uid, year, "Finding your catchphrases...", 0.58)
-        print(f"[Wrapped] Step 5: Finding top phrases with Gemini...")
-
-        top_phrases = _find_top_phrases_with_llm(conversations)
-        result["top_phrases"] = top_phrases
-        print(f"[Wrapped] Step 5 complete: Top phrases found (took {time.time() - step_start:.2f}s)")
-        print(f"[Wrapped]   - Top phrases: {len(top_phrases)} found")
-
-        # Step 6: Analyze memorable days with Gemini
-        step_start = time.time()
-        _update_progress(uid, year, "Finding your memorable days...", 0.65)
-        print(f"[Wrapped] Step 6: Analyzing memorable days with Gemini...")
-
-        memorable_days = _analyze_memorable_days_with_llm(conversations)
-        result["memorable_days"] = memorable_days
-        print(f"[Wrapped] Step 6 complete: Memorable days analyzed (took {time.time() - step_start:.2f}s)")
-        print(f"[Wrapped]   - Most fun day: {memorable_days.get('most_fun_day', {}).get('title', 'N/A')}")
-        print(f"[Wrapped]   - Most productive day: {memorable_days.get('most_productive_day', {}).get('title', 'N/A')}")
-        print(f"[Wrapped]   - Most stressful day: {memorable_days.get('most_stressful_day', {}).get('title', 'N/A')}")
-
-        # Step 7: Find funniest event with Gemini
-        step_start = time.time()
-        _update_progress(uid, year, "Finding your funniest moment...", 0.72)
-        print(f"[Wrapped] Step 7: Finding funniest event with Gemini...")
-
-        funniest_event = _find_funniest_event_with_llm(conversations)
-        result["funniest_event"] = funniest_event
-        print(f"[Wrapped] Step 7 complete: Funniest event found (took {time.time() - step_start:.2f}s)")
-        print(f"[Wrapped]   - Funniest: {funniest_event.get('title', 'N/A')}")
-
-        # Step 8: Find most embarrassing event with Gemini
-        step_start = time.time()
-        _update_progress(uid, year, "Finding your most cringe moment...", 0.78)
-        print(f"[Wrapped] Step 8: Finding most embarrassing event with Gemini...")
-
-        embarrassing_event = _find_most_embarrassing_event_with_llm(conversations)
-        result["most_embarrassing_event"] = embarrassing_event
-        print(f"[Wrapped] Step 8 complete: Embarrassing event found (took {time.time() - step_start:.2f}s)")
-        print(f"[Wrapped]   - Most embarrassing: {embarrassing_event.get('title', 'N/A')}")
-
-        # Step 9: Find top buddies with Gemini
-        step_start = time.time()
-        _update_progress(uid, year, "Finding your top buddies...", 0.80)
-        print(f"[Wrapped] Step 9: Finding top buddies with Gemini...")
 
-        top_buddies = _find_top_buddies_with_llm(conversations)
-        result["top_buddies"] = top_buddies
-        print(f"[Wrapped] Step 9 complete: Top buddies found (took {time.time() - step_start:.2f}s)")
-        print(f"[Wrapped]   - Top buddies: {len(top_buddies)} found")
+    return [
+        GraphStage("conversations", lambda _: _read_year_conversations(uid)),
+        GraphStage("action_items", action_items),
+        GraphStage(
+            "stats",
+            lambda r: _compute_all_stats(r["conversations"], r["action_items"]),
+            after=["conversations", "action_items"],
+        ),
+        GraphStage(
+            "decision_style",
+            lambda r: _determine_archetype_with_llm(context(r, 300000), r["stats"]),
+            after=["conversations", "stats"],
+            fallback=DECISION_STYLE_FALLBACK,
+        ),
+        GraphStage(
+            "top_phrases",
+            lambda r: _find_top_phrases_with_llm(context(r, 400000)),
+            after=["conversations"],
+            fallback=TOP_PHRASES_FALLBACK,
+        ),
+        GraphStage(
+            "memorable_days",
+            lambda r: _analyze_memorable_days_with_llm(context(r)),
+            after=["conversations"],
+            fallback=MEMORABLE_DAYS_FALLBACK,
+        ),
+        GraphStage(
+            "funniest_event",
+            lambda r: _find_funniest_event_with_llm(context(r)),
+            after=["conversations"],
+            fallback=FUNNIEST_EVENT_FALLBACK,
+        ),
+        GraphStage(
+            "most_embarrassing_event",
+            lambda r: _find_most_embarrassing_event_with_llm(context(r)),
+            after=["conversations"],
+            fallback=EMBARRASSING_EVENT_FALLBACK,
+        ),
+        GraphStage(
+            "top_buddies",
+            lambda r: _find_top_buddies_with_llm(context(r)),
+            after=["conversations"],
+            fallback=TOP_BUDDIES_FALLBACK,
+        ),
+        GraphStage(
+            "obsessions",
+            lambda r: _find_obsessions_with_llm(context(r)),
+            after=["conversations"],
+            fallback=OBSESSIONS_FALLBACK,
+        ),
+        GraphStage(
+            "movie_recommendations",
+            lambda r: _find_movie_recommendations_with_llm(context(r)),
+            after=["conversations"],
+            fallback=MOVIE_RECOMMENDATIONS_FALLBACK,
+        ),
+        GraphStage(
+            "struggles_and_wins",
+            lambda r: _find_struggles_and_wins_with_llm(context(r)),
+            after=["conversations"],
+            fallback=STRUGGLES_AND_WINS_FALLBACK,
+        ),
+    ]
 
-        # Step 10: Find obsessions (shows, movies, books, celebrities, food)
-        step_start = time.time()
-        _update_progress(uid, year, "Finding your obsessions...", 0.86)
-        print(f"[Wrapped] Step 10: Finding obsessions with Gemini...")
 
-        obsessions = _find_obsessions_with_llm(conversations)
-        result["obsessions"] = obsessions
-        print(f"[Wrapped] Step 10 complete: Obsessions found (took {time.time() - step_start:.2f}s)")
-        print(f"[Wrapped]   - Obsessions: {obsessions}")
+def generate_wrapped_2025(uid: str, year: int = 2025):
+    """
+    Generate Wrapped 2025 for a user.
 
-        # Step 11: Find movie recommendations
-        step_start = time.time()
-        _update_progress(uid, year, "Generating movie recommendations...", 0.90)
-        print(f"[Wrapped] Step 11: Finding movie recommendations with Gemini...")
+    This fetches all 2025 data, computes analytics, generates LLM insights,
+    and stores the result in Firestore.
 
-        movie_recs = _find_movie_recommendations_with_llm(conversations)
-        result["movie_recommendations"] = movie_recs
-        print(f"[Wrapped] Step 11 complete: Movie recommendations found (took {time.time() - step_start:.2f}s)")
-        print(f"[Wrapped]   - Movies: {movie_recs}")
+    The steps run as a stage graph (see _wrapped_stages), WRAPPED_STAGE_CONCURRENCY at a time. Every finished
+    analysis is checkpointed on the wrapped document, a retry after an error or a stuck run only runs the rest.
+    """
+    import time
 
-        # Step 12: Find struggles and wins
-        step_start = time.time()
-        _update_progress(uid, year, "Finding your wins and struggles...", 0.94)
-        print(f"[Wrapped] Step 12: Finding struggles and wins with Gemini...")
+    start_time = time.time()
 
-        struggles_wins = _find_struggles_and_wins_with_llm(conversations)
-        result["struggle"] = struggles_wins.get("struggle", {})
-        result["personal_win"] = struggles_wins.get("personal_win", {})
-        print(f"[Wrapped] Step 12 complete: Struggles and wins found (took {time.time() - step_start:.2f}s)")
+    try:
+        print(f"[Wrapped] ========== Starting Wrapped 2025 generation for user {uid} ==========")
+        print(f"[Wrapped] Date range: {YEAR_2025_START} to {YEAR_2025_END}")
 
-        # Step 13: Save result
+        wrapped = wrapped_db.get_wrapped(uid, year) or {}
+        checkpoints = {
+            name: result for name, result in (wrapped.get("stages") or {}).items() if name in CHECKPOINTED_STAGES
+        }
+        if checkpoints:
+            print(f"[Wrapped] Resuming, already done: {sorted(checkpoints)}")
+
+        stages = _wrapped_stages(uid)
+        finished = set(checkpoints)
+        _update_progress(uid, year, STAGE_PROGRESS["conversations"], 0.1)
+
+        def on_done(stage: GraphStage, stage_result: Any, failed: bool):
+            finished.add(stage.name)
+            step = next((STAGE_PROGRESS[s.name] for s in stages if s.name not in finished), "Saving your Wrapped...")
+            progress = {"step": step, "pct": round(0.1 + 0.85 * len(finished) / len(stages), 2)}
+            print(f"[Wrapped] Stage {stage.name} {'failed' if failed else 'complete'} ({len(finished)}/{len(stages)})")
+
+            if stage.name == "conversations":
+                print(f"[Wrapped]   - Found {stage_result.total_conversations} conversations for 2025")
+                print(f"[Wrapped]   - First conversation date: {stage_result.first_created_at}")
+                print(f"[Wrapped]   - Last conversation date: {stage_result.last_created_at}")
+                print(f"[Wrapped]   - Built context: {len(stage_result.context.text())} chars")
+
+            if stage.name in CHECKPOINTED_STAGES and not failed:
+                wrapped_db.save_wrapped_stage(uid, year, stage.name, stage_result, progress)
+            else:
+                wrapped_db.update_wrapped_progress(uid, year, progress)
+
+        run = run_stage_graph(stages, WRAPPED_STAGE_CONCURRENCY, done=checkpoints, on_done=on_done)
+        for name, seconds in sorted(run.timings.items(), key=lambda x: -x[1]):
+            print(f"[Wrapped]   - {name}: {seconds:.2f}s")
+        if run.failed:
+            print(f"[Wrapped]   - Used fallbacks for: {run.failed}")
+
+        results = run.results
+        result = dict(results["stats"])
+        result["decision_style"] = results["decision_style"]
+        result["top_phrases"] = results["top_phrases"]
+        result["memorable_days"] = results["memorable_days"]
+        result["funniest_event"] = results["funniest_event"]
+        result["most_embarrassing_event"] = results["most_embarrassing_event"]
+        result["top_buddies"] = results["top_buddies"]
+        result["obsessions"] = results["obsessions"]
+        result["movie_recommendations"] = results["movie_recommendations"]
+        result["struggle"] = results["struggles_and_wins"].get("struggle", {})
+        result["personal_win"] = results["struggles_and_wins"].get("personal_win", {})
+        print(f"[Wrapped] Stages complete (took {time.time() - start_time:.2f}s)")
+
+        # Save result
         step_start = time.time()
         _update_progress(uid, year, "Saving your Wrapped...", 0.98)
-        print(f"[Wrapped] Step 13: Saving result to Firestore...")
+        print(f"[Wrapped] Saving result to Firestore...")
 
         wrapped_db.update_wrapped_status(uid, year, WrappedStatus.DONE, result=result)
-        print(f"[Wrapped] Step 13 complete: Result saved (took {time.time() - step_start:.2f}s)")
+        print(f"[Wrapped] Result saved (took {time.time() - step_start:.2f}s)")
 
-        # Step 14: Send notification
+        # Send notification
         step_start = time.time()
-        print(f"[Wrapped] Step 14: Sending notification...")
+        print(f"[Wrapped] Sending notification...")
         _send_wrapped_ready_notification(uid)
-        print(f"[Wrapped] Step 14 complete: Notification sent (took {time.time() - step_start:.2f}s)")
+        print(f"[Wrapped] Notification sent (took {time.time() - step_start:.2f}s)")
 
         total_time = time.time() - start_time
         print(f"[Wrapped] ========== Wrapped 2025 generation completed for user {uid} ==========")
@@ -915,39 +943,31 @@ def generate_wrapped_2025(uid: str, year: int = 2025):
         wrapped_db.update_wrapped_status(uid, year, WrappedStatus.ERROR, error=str(e))
 
 
-def _compute_all_stats(conversations: List[Conversation], action_items: List[dict]) -> Dict[str, Any]:
-    """Compute all analytics stats from conversations and action items."""
-    print(f"[Wrapped]   - Computing stats from {len(conversations)} conversations, {len(action_items)} action items")
+def _compute_all_stats(digest: _YearDigest, action_items: List[dict]) -> Dict[str, Any]:
+    """Compute all analytics stats from the conversations digest and action items."""
+    print(
+        f"[Wrapped]   - Computing stats from {digest.total_conversations} conversations, {len(action_items)} action items"
+    )
     result = {}
 
     # === Section 1: Your Year in Numbers ===
     print(f"[Wrapped]   - Section 1: Year in Numbers...")
-    total_conversations = len(conversations)
+    total_conversations = digest.total_conversations
     result["total_conversations"] = total_conversations
 
     # Days active (unique days with conversations)
-    active_days = set()
-    for conv in conversations:
-        if conv.created_at:
-            active_days.add(conv.created_at.date())
-    result["days_active"] = len(active_days)
-    print(f"[Wrapped]     - Days active: {len(active_days)}")
+    result["days_active"] = len(digest.active_days)
+    print(f"[Wrapped]     - Days active: {len(digest.active_days)}")
 
     # Total time
-    total_seconds = sum(_compute_conversation_duration(c) for c in conversations)
-    result["total_time_hours"] = round(total_seconds / 3600, 1)
+    result["total_time_hours"] = round(digest.total_seconds / 3600, 1)
     print(f"[Wrapped]     - Total time: {result['total_time_hours']} hours across {total_conversations} conversations")
 
     # === Section 2: What You Talked About ===
     print(f"[Wrapped]   - Section 2: Topics & Categories...")
-    category_counts = Counter()
-
-    for conv in conversations:
-        cat = conv.structured.category.value if conv.structured and conv.structured.category else "other"
-        category_counts[cat] += 1
 
     # Top categories
-    top_cats = category_counts.most_common(5)
+    top_cats = digest.category_counts.most_common(5)
     result["top_categories"] = [cat for cat, _ in top_cats]
     result["category_breakdown"] = [{"category": cat, "count": count} for cat, count in top_cats]
 
@@ -964,7 +984,7 @@ def _compute_all_stats(conversations: List[Conversation], action_items: List[dic
     # === Section 4: Voice Patterns ===
     print(f"[Wrapped]   - Section 4: Voice Patterns...")
     # Signature phrases
-    phrase_counts = _find_signature_phrases(conversations)
+    phrase_counts = digest.phrase_counts
     print(f"[Wrapped]     - Found {len(phrase_counts)} signature phrases")
     if phrase_counts:
         top_phrase = max(phrase_counts.items(), key=lambda x: x[1])